@@ -0,0 +1,77 @@
+"""
+Раздача сгенерированных изображений из /static/generated_images.
+
+Файлы хранилища (services/content/image_store.py) названы хешем содержимого,
+поэтому отдаются с сильным ETag и Cache-Control: immutable на год: браузер и
+CDN не перезапрашивают их вовсе, а условный запрос получает 304 без тела.
+Файлы со старыми именами (flux_<время>_<промпт>.png) отдаются с ETag по
+размеру и времени изменения и коротким сроком кэширования.
+"""
+import os
+import re
+
+from fastapi import APIRouter, HTTPException, Request, status
+from fastapi.responses import FileResponse, Response
+
+from ..services.content.image_store import STORED_NAME, URL_PREFIX, get_image_store
+
+router = APIRouter()
+
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+LEGACY_CACHE_CONTROL = "public, max-age=3600"
+
+_SAFE_NAME = re.compile(r"^[\w\-.]+$")
+
+MEDIA_TYPES = {
+    "png": "image/png",
+    "jpg": "image/jpeg",
+    "jpeg": "image/jpeg",
+    "gif": "image/gif",
+    "webp": "image/webp",
+}
+
+
+def _etag_matches(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    # Слабое сравнение, как требует RFC 9110 для If-None-Match
+    candidates = {tag.strip().removeprefix("W/") for tag in header.split(",")}
+    return etag in candidates
+
+
+@router.get(URL_PREFIX + "/{filename}", include_in_schema=False)
+async def get_generated_image(filename: str, request: Request):
+    """Отдает изображение с кэширующими заголовками"""
+    if not _SAFE_NAME.match(filename) or filename.startswith("."):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Image not found")
+
+    store = get_image_store()
+    path = store.path(filename)
+    try:
+        stat = os.stat(path)
+    except OSError:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Image not found")
+
+    stored = STORED_NAME.match(filename)
+    if stored:
+        # Имя - хеш содержимого: ETag не зависит от времени изменения и совпадает между серверами
+        etag = f'"{stored.group("digest")}{stored.group("variant") or ""}.{stored.group("ext")}"'
+        cache_control = IMMUTABLE_CACHE_CONTROL
+    else:
+        etag = f'"{stat.st_size:x}-{int(stat.st_mtime):x}"'
+        cache_control = LEGACY_CACHE_CONTROL
+
+    headers = {"ETag": etag, "Cache-Control": cache_control}
+    if _etag_matches(request, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    ext = filename.rsplit(".", 1)[-1].lower()
+    return FileResponse(
+        path,
+        media_type=MEDIA_TYPES.get(ext, "application/octet-stream"),
+        headers=headers,
+        stat_result=stat
+    )
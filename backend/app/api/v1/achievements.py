@@ -17,7 +17,6 @@ from ...schemas.achievements import (
 )
 from ...models.user import User
 from ...models.achievements import Achievement, UserAchievement
-from ...core.constants import ActionType
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
@@ -68,31 +67,22 @@ async def check_achievement(
         request: AchievementCheckRequest,
         session: AsyncSession = Depends(get_db)
 ):
-    """Проверить достижения после действия пользователя"""
-    try:
-        # Convert string to enum if needed
-        action_type_enum = None
-        try:
-            action_type_enum = ActionType(request.action_type)
-        except (ValueError, TypeError) as e:
-            logger.warning(f"Invalid action_type: {request.action_type}. Error: {str(e)}")
-            # Fall back to treating it as a string
-            action_type_enum = request.action_type
+    """Вернуть прогресс достижений после действия пользователя.
 
+    Только чтение: прогресс обновляется на сервере при самом действии
+    (декораторы check_achievements), поэтому повторные вызовы клиента
+    не увеличивают счетчики.
+    """
+    try:
         manager = AchievementManager(session)
-        await manager.check_achievements(
-            request.user_id,
-            action_type_enum,
-            request.action_data
-        )
-        await session.commit()
+        progress = await manager.get_user_achievements_progress(request.user_id)
 
         return {
             "status": "success",
-            "message": "Achievements checked successfully"
+            "message": "Achievements checked successfully",
+            "progress": progress
         }
     except Exception as e:
-        await session.rollback()
         logger.error(f"Error checking achievements: {str(e)}")
         raise HTTPException(
             status_code=400,
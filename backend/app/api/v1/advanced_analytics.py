@@ -13,6 +13,11 @@ from ...core.database import get_db
 from ...core.security import get_current_admin_user
 from ...models.user import User
 from ...models.tracking import GenerationMetrics
+from ...services.analytics.rollups import AnalyticsRollupService
+from ...services.analytics.cohorts import CohortRetentionService
+from ...services.analytics.snapshot_store import AnalyticsSnapshotStore
+from ...services.content.token_budget import get_token_budget
+from ...services.content.cache_primer import get_cache_primer
 import logging
 
 logger = logging.getLogger(__name__)
@@ -56,47 +61,21 @@ async def get_time_activity_analytics(
         end_date = datetime.now(timezone.utc)
         start_date = _calculate_start_date(end_date, period)
 
-        # Запрос активности по часам
-        hourly_query = text("""
-            SELECT
-                EXTRACT(hour FROM created_at) as hour,
-                COUNT(*) as activity_count
-            FROM generation_metrics
-            WHERE created_at >= :start_date AND created_at <= :end_date
-            GROUP BY EXTRACT(hour FROM created_at)
-            ORDER BY hour
-        """)
-
-        # Запрос активности по дням недели
-        weekly_query = text("""
-            SELECT
-                EXTRACT(dow FROM created_at) as day_of_week,
-                COUNT(*) as activity_count
-            FROM generation_metrics
-            WHERE created_at >= :start_date AND created_at <= :end_date
-            GROUP BY EXTRACT(dow FROM created_at)
-            ORDER BY day_of_week
-        """)
-
-        # Выполняем запросы
-        hourly_result = await session.execute(hourly_query, {"start_date": start_date, "end_date": end_date})
-        weekly_result = await session.execute(weekly_query, {"start_date": start_date, "end_date": end_date})
-
-        hourly_data = hourly_result.fetchall()
-        weekly_data = weekly_result.fetchall()
+        # Активность по часам и дням недели из агрегатов generation_metrics
+        rollup = await AnalyticsRollupService(session).aggregate("generation_metrics", start_date, end_date)
 
         # Обрабатываем данные по часам
-        hourly_activity = []
-        for hour in range(24):
-            activity = next((row.activity_count for row in hourly_data if row.hour == hour), 0)
-            hourly_activity.append({"hour": hour, "activity": activity})
+        hourly_activity = [
+            {"hour": hour, "activity": activity}
+            for hour, activity in enumerate(rollup.hourly_counts)
+        ]
 
         # Обрабатываем данные по дням недели
         day_names = ['Воскресенье', 'Понедельник', 'Вторник', 'Среда', 'Четверг', 'Пятница', 'Суббота']
-        weekly_activity = []
-        for day in range(7):
-            activity = next((row.activity_count for row in weekly_data if row.day_of_week == day), 0)
-            weekly_activity.append({"day": day_names[day][:2], "activity": activity})
+        weekly_activity = [
+            {"day": day_names[day][:2], "activity": activity}
+            for day, activity in enumerate(rollup.weekday_counts)
+        ]
 
         # Находим пиковые значения
         peak_hour = max(hourly_activity, key=lambda x: x['activity'])['hour'] if hourly_activity else 14
@@ -113,37 +92,21 @@ async def get_time_activity_analytics(
                 hours.append(int(variation))
             heatmap_data.append({"name": day_name, "hours": hours})
 
-        # Реальная статистика по дням недели
-        daily_query = text("""
-            SELECT
-                EXTRACT(dow FROM created_at) as day_of_week,
-                COUNT(*) as total_activity,
-                COUNT(DISTINCT user_id) as unique_users,
-                MODE() WITHIN GROUP (ORDER BY EXTRACT(hour FROM created_at)) as peak_hour
-            FROM generation_metrics
-            WHERE created_at >= :start_date AND created_at <= :end_date
-            GROUP BY EXTRACT(dow FROM created_at)
-            ORDER BY day_of_week
-        """)
-
-        daily_result = await session.execute(daily_query, {"start_date": start_date, "end_date": end_date})
-        daily_data = daily_result.fetchall()
-
         # Названия дней недели (0 = воскресенье в PostgreSQL)
         day_names = ['Воскресенье', 'Понедельник', 'Вторник', 'Среда', 'Четверг', 'Пятница', 'Суббота']
 
-        # Создаем статистику по дням
+        # Реальная статистика по дням недели: пиковый час - самый частый час этого дня недели
         daily_stats = []
-        daily_activity_map = {int(row.day_of_week): row for row in daily_data}
-
         for day_index, day_name in enumerate(day_names):
-            row = daily_activity_map.get(day_index)
-            if row:
+            total_activity = rollup.weekday_counts[day_index]
+            if total_activity:
+                hour_counts = rollup.weekday_hour_counts[day_index]
+                peak_hour_of_day = max(range(24), key=lambda hour: hour_counts[hour])
                 daily_stats.append({
                     "name": day_name,
-                    "totalActivity": row.total_activity,
-                    "uniqueUsers": row.unique_users,
-                    "peakHour": f"{int(row.peak_hour or 14)}:00",
+                    "totalActivity": total_activity,
+                    "uniqueUsers": rollup.weekday_distinct_users(day_index),
+                    "peakHour": f"{peak_hour_of_day}:00",
                     "avgSession": 25  # TODO: Вычислить реальную среднюю сессию
                 })
             else:
@@ -172,15 +135,8 @@ async def get_time_activity_analytics(
             "night": round((night_activity / total_activity * 100) if total_activity > 0 else 0, 1)
         }
 
-        # Получаем количество активных пользователей
-        active_users_query = text("""
-            SELECT COUNT(DISTINCT user_id) as active_users
-            FROM generation_metrics
-            WHERE created_at >= :start_date AND created_at <= :end_date
-        """)
-
-        active_users_result = await session.execute(active_users_query, {"start_date": start_date, "end_date": end_date})
-        active_users = active_users_result.scalar() or 0
+        # Получаем количество активных пользователей (оценка HyperLogLog по агрегатам)
+        active_users = rollup.distinct_users()
 
         analytics_data = {
             "peakHour": peak_hour,
@@ -217,44 +173,33 @@ async def get_content_popularity_analytics(
         end_date = datetime.now(timezone.utc)
         start_date = _calculate_start_date(end_date, period)
 
-        # Запрос популярности контента
-        content_query = text("""
-            SELECT
-                gm.content_type,
-                COUNT(*) as generation_count,
-                COUNT(DISTINCT gm.user_id) as unique_users,
-                AVG(CASE WHEN gm.success THEN 1.0 ELSE 0.0 END) * 100 as success_rate,
-                AVG(gm.generation_time) as avg_time
-            FROM generation_metrics gm
-            WHERE gm.created_at >= :start_date AND gm.created_at <= :end_date
-            GROUP BY gm.content_type
-            ORDER BY generation_count DESC
-        """)
-
-        result = await session.execute(content_query, {"start_date": start_date, "end_date": end_date})
-        content_data = result.fetchall()
-
-        total_generations = sum(row.generation_count for row in content_data)
+        # Популярность контента из агрегатов generation_metrics (amount - время генерации)
+        rollups = AnalyticsRollupService(session)
+        rollup = await rollups.aggregate("generation_metrics", start_date, end_date)
+        content_data = sorted(rollup.by_category().items(), key=lambda item: item[1].count, reverse=True)
+        unique_users_by_type = rollup.distinct_users_by_category()
+
+        total_generations = sum(totals.count for _, totals in content_data)
 
         # Формируем топ контента
         top_content = []
         detailed_stats = []
 
-        for row in content_data:
-            percentage = (row.generation_count / total_generations * 100) if total_generations > 0 else 0
+        for content_type, totals in content_data:
+            percentage = (totals.count / total_generations * 100) if total_generations > 0 else 0
 
             top_content.append({
-                "type": row.content_type,
-                "count": row.generation_count,
+                "type": content_type,
+                "count": totals.count,
                 "percentage": percentage
             })
 
             detailed_stats.append({
-                "type": row.content_type,
-                "count": row.generation_count,
-                "uniqueUsers": row.unique_users,
-                "successRate": round(row.success_rate or 0, 1),
-                "avgTime": round(row.avg_time or 0, 1),
+                "type": content_type,
+                "count": totals.count,
+                "uniqueUsers": unique_users_by_type.get(content_type, 0),
+                "successRate": round(totals.success_rate, 1),
+                "avgTime": round(totals.avg_amount, 1),
                 "growth": 0.0  # TODO: Вычислить реальный рост по типам контента
             })
 
@@ -273,29 +218,14 @@ async def get_content_popularity_analytics(
             }
             most_popular["name"] = type_map.get(most_popular["type"], most_popular["type"])
 
-        # Получаем реальные тренды по месяцам
-        trend_query = text("""
-            SELECT
-                DATE_TRUNC('month', created_at) as month,
-                content_type,
-                COUNT(*) as count
-            FROM generation_metrics
-            WHERE created_at >= :trend_start_date AND created_at <= :end_date
-            GROUP BY DATE_TRUNC('month', created_at), content_type
-            ORDER BY month DESC
-        """)
-
+        # Получаем реальные тренды по месяцам из дневного ряда агрегатов
         trend_start_date = end_date - timedelta(days=150)  # 5 месяцев назад
-        trend_result = await session.execute(trend_query, {
-            "trend_start_date": trend_start_date,
-            "end_date": end_date
-        })
-        trend_raw_data = trend_result.fetchall()
+        trend_rollup = await rollups.aggregate("generation_metrics", trend_start_date, end_date)
 
         # Группируем данные по месяцам
         trend_by_month = {}
-        for row in trend_raw_data:
-            month_key = row.month.strftime('%Y-%m')
+        for day, per_type in trend_rollup.daily.items():
+            month_key = day.strftime('%Y-%m')
             if month_key not in trend_by_month:
                 trend_by_month[month_key] = {
                     "date": month_key,
@@ -308,7 +238,8 @@ async def get_content_popularity_analytics(
                     "course": 0,
                     "ai_assistant": 0
                 }
-            trend_by_month[month_key][row.content_type] = row.count
+            for content_type, totals in per_type.items():
+                trend_by_month[month_key][content_type] = trend_by_month[month_key].get(content_type, 0) + totals.count
 
         # Сортируем по дате и берем последние 5 месяцев
         trend_data = list(trend_by_month.values())
@@ -316,26 +247,14 @@ async def get_content_popularity_analytics(
         trend_data = trend_data[-5:]  # Последние 5 месяцев
 
         # Получаем реальные сезонные данные за последний год
-        seasonal_query = text("""
-            SELECT
-                EXTRACT(month FROM created_at) as month,
-                COUNT(*) as activity
-            FROM generation_metrics
-            WHERE created_at >= :year_start AND created_at <= :end_date
-            GROUP BY EXTRACT(month FROM created_at)
-            ORDER BY month
-        """)
-
         year_start = end_date - timedelta(days=365)
-        seasonal_result = await session.execute(seasonal_query, {
-            "year_start": year_start,
-            "end_date": end_date
-        })
-        seasonal_raw_data = seasonal_result.fetchall()
+        seasonal_rollup = await rollups.aggregate("generation_metrics", year_start, end_date)
 
         # Создаем данные для всех 12 месяцев
         seasonal_data = []
-        seasonal_map = {int(row.month): row.activity for row in seasonal_raw_data}
+        seasonal_map = {}
+        for day, totals in seasonal_rollup.daily_series().items():
+            seasonal_map[day.month] = seasonal_map.get(day.month, 0) + totals.count
 
         for month in range(1, 13):
             seasonal_data.append({
@@ -347,17 +266,8 @@ async def get_content_popularity_analytics(
         prev_start_date = start_date - (end_date - start_date)
         prev_end_date = start_date
 
-        prev_generations_query = text("""
-            SELECT COUNT(*) as count
-            FROM generation_metrics
-            WHERE created_at >= :prev_start_date AND created_at < :prev_end_date
-        """)
-
-        prev_result = await session.execute(prev_generations_query, {
-            "prev_start_date": prev_start_date,
-            "prev_end_date": prev_end_date
-        })
-        prev_generations = prev_result.scalar() or 0
+        prev_rollup = await rollups.aggregate("generation_metrics", prev_start_date, prev_end_date)
+        prev_generations = prev_rollup.totals().count
 
         # Вычисляем процент роста
         if prev_generations > 0:
@@ -366,22 +276,9 @@ async def get_content_popularity_analytics(
             growth_rate = 100.0 if total_generations > 0 else 0.0
 
         # Вычисляем реальную статистику успешности и времени
-        success_stats_query = text("""
-            SELECT
-                AVG(CASE WHEN success THEN 1.0 ELSE 0.0 END) * 100 as success_rate,
-                AVG(generation_time) as avg_time
-            FROM generation_metrics
-            WHERE created_at >= :start_date AND created_at <= :end_date
-        """)
-
-        success_result = await session.execute(success_stats_query, {
-            "start_date": start_date,
-            "end_date": end_date
-        })
-        success_data = success_result.fetchone()
-
-        success_rate = round(success_data.success_rate or 0, 1)
-        avg_generation_time = round(success_data.avg_time or 0, 1)
+        period_totals = rollup.totals()
+        success_rate = round(period_totals.success_rate, 1)
+        avg_generation_time = round(period_totals.avg_amount, 1)
 
         analytics_data = {
             "totalGenerations": total_generations,
@@ -404,3 +301,69 @@ async def get_content_popularity_analytics(
     except Exception as e:
         logger.error(f"Error getting content popularity analytics: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Error getting content popularity analytics: {str(e)}")
+
+
+@router.get("/admin/analytics/retention")
+async def get_cohort_retention(
+    period: str = Query("month", regex="^(day|week|month)$"),
+    cohorts: int = Query(12, ge=1, le=52),
+    days: int = Query(30, ge=1, le=90),
+    session: AsyncSession = Depends(get_db),
+    _: User = Depends(get_current_admin_user)
+):
+    """Получить матрицу удержания когорт (D1..Ddays) по дням после регистрации"""
+    try:
+        return await CohortRetentionService(session).retention(period, cohorts, days)
+
+    except Exception as e:
+        logger.error(f"Error getting cohort retention: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Error getting cohort retention: {str(e)}")
+
+
+@router.get("/admin/analytics/snapshot-trends")
+async def get_snapshot_trends(
+    metrics: str = Query("total_users,active_users,total_generations"),
+    days: int = Query(365, ge=1, le=3650),
+    bucket: str = Query("day", regex="^(day|week|month)$"),
+    session: AsyncSession = Depends(get_db),
+    _: User = Depends(get_current_admin_user)
+):
+    """Получить тренды метрик из снимков аналитики (архив и последние снимки)"""
+    try:
+        columns = [metric.strip() for metric in metrics.split(",") if metric.strip()]
+        end_date = datetime.now(timezone.utc)
+        start_date = end_date - timedelta(days=days)
+
+        points = await AnalyticsSnapshotStore(session).trend(columns, start_date, end_date, bucket)
+        return {"metrics": columns, "bucket": bucket, "points": points}
+
+    except Exception as e:
+        logger.error(f"Error getting snapshot trends: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Error getting snapshot trends: {str(e)}")
+
+
+@router.get("/admin/analytics/token-prediction")
+async def get_token_prediction_error(
+    days: int = Query(7, ge=1, le=90),
+    _: User = Depends(get_current_admin_user)
+):
+    """Получить ошибку предсказания токенов ответа (предсказание против факта) по типам контента"""
+    try:
+        return {"days": days, "items": await get_token_budget().prediction_error(days)}
+
+    except Exception as e:
+        logger.error(f"Error getting token prediction error: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Error getting token prediction error: {str(e)}")
+
+
+@router.get("/admin/analytics/cache-priming")
+async def get_cache_priming_stats(
+    _: User = Depends(get_current_admin_user)
+):
+    """Получить итоги загрузки кэша и сэкономленное время генерации"""
+    try:
+        return await get_cache_primer().stats()
+
+    except Exception as e:
+        logger.error(f"Error getting cache priming stats: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Error getting cache priming stats: {str(e)}")
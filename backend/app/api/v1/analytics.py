@@ -12,6 +12,8 @@ from app.models.content import Generation
 from app.models.payment import Payment
 from app.models.point_transaction import PointTransaction
 from app.core.constants import ContentType, TariffType
+from app.services.analytics.rollups import AnalyticsRollupService
+from app.services.analytics.financial_queries import FinancialAnalyticsQueries
 from sqlalchemy import text
 from datetime import timezone
 
@@ -20,6 +22,7 @@ router = APIRouter()
 @router.get("/financial")
 async def get_financial_analytics(
     period: str = Query("month", description="Период: week, month, quarter, year, all"),
+    exact: bool = Query(False, description="Точные значения из payments вместо агрегатов"),
     current_user: User = Depends(get_current_user),
     db: AsyncSession = Depends(get_db)
 ):
@@ -43,69 +46,56 @@ async def get_financial_analytics(
     else:  # all
         start_date = datetime(2020, 1, 1, tzinfo=timezone.utc)
 
-    # Получаем реальные данные о платежах
-    try:
-        # Получаем платежи за тарифы в указанном периоде
-        tariff_payments_result = await db.execute(
-            select(Payment).where(
-                Payment.created_at >= start_date,
-                Payment.status == "completed",
-                Payment.payment_type == "tariff"
-            )
-        )
-        tariff_payments = tariff_payments_result.scalars().all()
-
-        # Получаем платежи за баллы в указанном периоде
-        points_payments_result = await db.execute(
-            select(Payment).where(
-                Payment.created_at >= start_date,
-                Payment.status == "completed",
-                Payment.payment_type == "points"
-            )
-        )
-        points_payments = points_payments_result.scalars().all()
-
-        # Подсчитываем общий доход
-        total_revenue = sum(p.amount for p in tariff_payments + points_payments)
-
-        # Подсчитываем доходы по тарифам
-        tariff_revenue = {}
-        tariff_names = {
-            "tariff_2": "Стандарт",
-            "tariff_4": "Премиум",
-            "tariff_6": "VIP"
-        }
+    rollups = AnalyticsRollupService(db)
+    queries = FinancialAnalyticsQueries(db)
+    payments_rollup = None
 
-        for payment in tariff_payments:
-            tariff_type = payment.meta_data.get("tariff_type") if payment.meta_data else None
-            if tariff_type:
-                if tariff_type not in tariff_revenue:
-                    tariff_revenue[tariff_type] = {"count": 0, "revenue": 0}
-                tariff_revenue[tariff_type]["count"] += 1
-                tariff_revenue[tariff_type]["revenue"] += payment.amount
+    # Получаем данные о платежах из агрегатов (дневные + почасовые + свежий хвост)
+    if not exact:
+        try:
+            payments_rollup = await rollups.aggregate("payments", start_date, now, categories=["tariff", "points"])
+        except Exception as e:
+            print(f"Payment rollups unavailable, using SQL aggregates: {e}")
+            await db.rollback()
 
-        # Подсчитываем доходы от баллов
-        points_revenue = sum(p.amount for p in points_payments)
+    try:
+        if payments_rollup is not None:
+            # Подсчитываем общий доход
+            total_revenue = payments_rollup.totals().amount
+
+            # Подсчитываем доходы по тарифам
+            tariff_revenue = {}
+            for tariff_type, totals in payments_rollup.by_tariff(categories=["tariff"]).items():
+                if tariff_type != "none":
+                    tariff_revenue[tariff_type] = {"count": totals.count, "revenue": totals.amount}
+
+            # Подсчитываем доходы от баллов
+            points_totals = payments_rollup.totals(categories=["points"])
+            points_revenue = points_totals.amount
+            points_count = points_totals.count
+            paying_users = payments_rollup.distinct_users()
+        else:
+            # Точные значения: суммы, группировка по тарифу и COUNT(DISTINCT) считаются в SQL
+            summary = await queries.payment_summary(start_date, now)
+            tariff_revenue = await queries.tariff_revenue(start_date, now)
+            total_revenue = summary["total_revenue"]
+            points_revenue = summary["points_revenue"]
+            points_count = summary["points_count"]
+            paying_users = summary["paying_users"]
 
         # Получаем количество активных пользователей
         total_users_result = await db.execute(
             select(func.count(User.id)).where(User.role == "user")
         )
         total_users = total_users_result.scalar() or 0
-        paying_users = len(set(p.user_id for p in tariff_payments + points_payments))
 
     except Exception as e:
         # Если таблица payments не существует, используем данные из активных тарифов
         print(f"Payment table not found, using active tariffs: {e}")
+        await db.rollback()
 
-        # Получаем пользователей с активными тарифами
-        result = await db.execute(
-            select(User).where(
-                User.tariff.isnot(None),
-                User.tariff_valid_until >= now
-            )
-        )
-        active_tariff_users = result.scalars().all()
+        # Получаем количество пользователей с активными тарифами по каждому тарифу
+        active_tariff_counts = await queries.active_tariff_counts(now)
 
         # Подсчитываем доходы по тарифам (симуляция на основе активных пользователей)
         tariff_revenue = {}
@@ -116,22 +106,22 @@ async def get_financial_analytics(
         }
 
         total_revenue = 0
-        for user in active_tariff_users:
-            tariff_type = user.tariff.value if user.tariff else None
-            if tariff_type and tariff_type in tariff_prices:
-                if tariff_type not in tariff_revenue:
-                    tariff_revenue[tariff_type] = {"count": 0, "revenue": 0}
-                tariff_revenue[tariff_type]["count"] += 1
-                tariff_revenue[tariff_type]["revenue"] += tariff_prices[tariff_type]
-                total_revenue += tariff_prices[tariff_type]
+        for tariff_type, count in active_tariff_counts.items():
+            if tariff_type in tariff_prices:
+                tariff_revenue[tariff_type] = {
+                    "count": count,
+                    "revenue": count * tariff_prices[tariff_type]
+                }
+                total_revenue += count * tariff_prices[tariff_type]
 
         # Получаем общее количество пользователей
         total_users_result = await db.execute(
             select(func.count(User.id)).where(User.role == "user")
         )
         total_users = total_users_result.scalar() or 0
-        paying_users = len(active_tariff_users)
+        paying_users = sum(active_tariff_counts.values())
         points_revenue = 0
+        points_count = 0
 
     # Подсчитываем метрики
     arpu = total_revenue / total_users if total_users > 0 else 0
@@ -158,10 +148,10 @@ async def get_financial_analytics(
     if points_revenue > 0:
         top_tariffs.append({
             "name": "Баллы",
-            "subscribers": len([p for p in points_payments]) if 'points_payments' in locals() else 0,
+            "subscribers": points_count,
             "revenue": points_revenue,
             "share": (points_revenue / total_revenue * 100) if total_revenue > 0 else 0,
-            "averageCheck": points_revenue / len(points_payments) if 'points_payments' in locals() and points_payments else 0
+            "averageCheck": points_revenue / points_count if points_count > 0 else 0
         })
 
     # Сортируем по доходу
@@ -172,21 +162,14 @@ async def get_financial_analytics(
     days_count = (now - start_date).days
 
     try:
-        # Получаем реальные доходы по дням
+        # Получаем реальные доходы по дням из дневного ряда агрегатов или одним GROUP BY
+        if payments_rollup is not None:
+            daily_revenue = {day: totals.amount for day, totals in payments_rollup.daily_series().items()}
+        else:
+            daily_revenue = await queries.daily_revenue(start_date, now)
         for i in range(min(days_count, 30)):  # Максимум 30 точек для графика
             day_start = start_date + timedelta(days=i)
-            day_end = day_start + timedelta(days=1)
-
-            # Получаем платежи за этот день
-            day_payments_result = await db.execute(
-                select(Payment).where(
-                    Payment.created_at >= day_start,
-                    Payment.created_at < day_end,
-                    Payment.status == "completed"
-                )
-            )
-            day_payments = day_payments_result.scalars().all()
-            day_revenue = sum(p.amount for p in day_payments)
+            day_revenue = daily_revenue.get(day_start.date(), 0)
 
             revenue_history.append({
                 "date": day_start.strftime("%d.%m"),
@@ -210,15 +193,11 @@ async def get_financial_analytics(
     try:
         # Получаем доходы за предыдущий период для сравнения
         prev_start_date = start_date - (now - start_date)
-        prev_payments_result = await db.execute(
-            select(Payment).where(
-                Payment.created_at >= prev_start_date,
-                Payment.created_at < start_date,
-                Payment.status == "completed"
-            )
-        )
-        prev_payments = prev_payments_result.scalars().all()
-        prev_revenue = sum(p.amount for p in prev_payments)
+        if payments_rollup is not None:
+            prev_rollup = await rollups.aggregate("payments", prev_start_date, start_date, categories=["tariff", "points"])
+            prev_revenue = prev_rollup.totals().amount
+        else:
+            prev_revenue = await queries.revenue(prev_start_date, start_date)
 
         if prev_revenue > 0:
             revenue_growth = ((total_revenue - prev_revenue) / prev_revenue) * 100
@@ -338,70 +317,31 @@ async def get_time_activity_analytics(
     hours_data = [0] * 24
     days_data = [0] * 7
     day_names = ["Воскресенье", "Понедельник", "Вторник", "Среда", "Четверг", "Пятница", "Суббота"]
+    rollups = AnalyticsRollupService(db)
 
     # В зависимости от типа активности получаем разные данные
     if activity_type == "purchases":
-        # Получаем покупки тарифов и баллов
+        # Получаем покупки тарифов и баллов из агрегатов (часы и дни недели в UTC)
         try:
             # Покупки через Payment
-            payment_hourly = await db.execute(
-                select(
-                    func.extract('hour', Payment.created_at).label('hour'),
-                    func.count(Payment.id).label('count')
-                ).where(
-                    Payment.created_at >= start_date,
-                    Payment.status == "completed"
-                ).group_by(func.extract('hour', Payment.created_at))
-            )
-            
-            payment_daily = await db.execute(
-                select(
-                    func.extract('dow', Payment.created_at).label('day'),
-                    func.count(Payment.id).label('count')
-                ).where(
-                    Payment.created_at >= start_date,
-                    Payment.status == "completed"
-                ).group_by(func.extract('dow', Payment.created_at))
-            )
-            
-            # Обрабатываем данные платежей
-            for activity in payment_hourly.all():
-                hours_data[int(activity.hour)] += activity.count
-            
-            for activity in payment_daily.all():
-                days_data[int(activity.day)] += activity.count
+            payments_rollup = await rollups.aggregate("payments", start_date, now)
+            for hour, count in enumerate(payments_rollup.hourly_counts):
+                hours_data[hour] += count
+            for day, count in enumerate(payments_rollup.weekday_counts):
+                days_data[day] += count
                 
         except Exception as e:
             print(f"Payment table not available: {e}")
         
         try:
             # Покупки баллов через PointTransaction
-            points_hourly = await db.execute(
-                select(
-                    func.extract('hour', PointTransaction.created_at).label('hour'),
-                    func.count(PointTransaction.id).label('count')
-                ).where(
-                    PointTransaction.created_at >= start_date,
-                    PointTransaction.transaction_type.in_(["purchase", "admin_add"])
-                ).group_by(func.extract('hour', PointTransaction.created_at))
+            points_rollup = await rollups.aggregate(
+                "point_transactions", start_date, now, categories=["purchase", "admin_add"]
             )
-            
-            points_daily = await db.execute(
-                select(
-                    func.extract('dow', PointTransaction.created_at).label('day'),
-                    func.count(PointTransaction.id).label('count')
-                ).where(
-                    PointTransaction.created_at >= start_date,
-                    PointTransaction.transaction_type.in_(["purchase", "admin_add"])
-                ).group_by(func.extract('dow', PointTransaction.created_at))
-            )
-            
-            # Обрабатываем данные транзакций баллов
-            for activity in points_hourly.all():
-                hours_data[int(activity.hour)] += activity.count
-            
-            for activity in points_daily.all():
-                days_data[int(activity.day)] += activity.count
+            for hour, count in enumerate(points_rollup.hourly_counts):
+                hours_data[hour] += count
+            for day, count in enumerate(points_rollup.weekday_counts):
+                days_data[day] += count
                 
         except Exception as e:
             print(f"PointTransaction table not available: {e}")
@@ -440,31 +380,10 @@ async def get_time_activity_analytics(
             print(f"Login analytics error: {e}")
             
     else:  # "generations" или "all"
-        # Получаем активность генераций (оригинальная логика)
-        hourly_result = await db.execute(
-            select(
-                func.extract('hour', Generation.created_at).label('hour'),
-                func.count(Generation.id).label('count')
-            ).where(
-                Generation.created_at >= start_date
-            ).group_by(func.extract('hour', Generation.created_at))
-        )
-        
-        daily_result = await db.execute(
-            select(
-                func.extract('dow', Generation.created_at).label('day'),
-                func.count(Generation.id).label('count')
-            ).where(
-                Generation.created_at >= start_date
-            ).group_by(func.extract('dow', Generation.created_at))
-        )
-        
-        # Обрабатываем данные генераций
-        for activity in hourly_result.all():
-            hours_data[int(activity.hour)] = activity.count
-        
-        for activity in daily_result.all():
-            days_data[int(activity.day)] = activity.count
+        # Получаем активность генераций из агрегатов
+        generations_rollup = await rollups.aggregate("generations", start_date, now)
+        hours_data = list(generations_rollup.hourly_counts)
+        days_data = list(generations_rollup.weekday_counts)
 
     # Рассчитываем среднюю продолжительность сессии
     try:
@@ -544,17 +463,9 @@ async def get_content_popularity_analytics(
     )
     popular_prompts = prompts_result.all()
 
-    # Получаем статистику по типам контента
-    content_result = await db.execute(
-        select(
-            Generation.type,
-            func.count(Generation.id).label('count'),
-            func.count(func.distinct(Generation.user_id)).label('unique_users')
-        ).where(
-            Generation.created_at >= start_date
-        ).group_by(Generation.type)
-    )
-    content_stats = content_result.all()
+    # Получаем статистику по типам контента из агрегатов (уникальные пользователи - оценка HyperLogLog)
+    generations_rollup = await AnalyticsRollupService(db).aggregate("generations", start_date, now)
+    unique_users_by_type = generations_rollup.distinct_users_by_category()
 
     # Формируем данные
     content_type_names = {
@@ -569,13 +480,14 @@ async def get_content_popularity_analytics(
     }
 
     popular_content = []
-    for stat in content_stats:
+    for content_type, totals in generations_rollup.by_category().items():
+        unique_users = unique_users_by_type.get(content_type, 0)
         popular_content.append({
-            "type": stat.type,
-            "name": content_type_names.get(stat.type, stat.type),
-            "count": stat.count,
-            "uniqueUsers": stat.unique_users,
-            "avgPerUser": stat.count / stat.unique_users if stat.unique_users > 0 else 0
+            "type": content_type,
+            "name": content_type_names.get(content_type, content_type),
+            "count": totals.count,
+            "uniqueUsers": unique_users,
+            "avgPerUser": totals.count / unique_users if unique_users > 0 else 0
         })
 
     # Сортируем по популярности
@@ -604,6 +516,7 @@ async def get_points_analytics(
     tariff: str = Query("all", regex="^(all|basic|tariff_2|tariff_4|tariff_6|none)$"),
     page: int = Query(1, ge=1),
     limit: int = Query(10, ge=1, le=100),
+    exact: bool = Query(False, description="Точные значения из point_transactions вместо агрегатов"),
     current_user: User = Depends(get_current_admin_user),
     db: AsyncSession = Depends(get_db)
 ):
@@ -670,20 +583,32 @@ async def get_points_analytics(
         result = await db.execute(transactions_query, params)
         transactions = result.fetchall()
 
-        # Получаем общее количество записей
-        count_query = text("""
-            SELECT COUNT(*)
-            FROM point_transactions pt
-            JOIN users u ON pt.user_id = u.id
-            WHERE pt.created_at >= :start_date AND pt.created_at <= :end_date
-        """)
+        # Счетчики и статистика считаются по агрегатам транзакций (тариф - текущий тариф пользователя)
+        purchase_types = ["purchase", "admin_add"]
+        usage_types = ["generation", "admin_subtract"]
+        operation_categories = {"purchase": purchase_types, "usage": usage_types}.get(operation_type)
+        if tariff == "all":
+            tariff_values = None
+        elif tariff == "none":
+            tariff_values = ["none", "basic"]
+        else:
+            tariff_values = [tariff]
+
+        if exact:
+            # Точные счетчики одним запросом с FILTER и COUNT(DISTINCT)
+            queries = FinancialAnalyticsQueries(db)
+            points_summary = await queries.points_summary(start_date, now, operation_categories, tariff_values)
+            tariff_data = await queries.points_purchases_by_tariff(start_date, now)
+        else:
+            rollups = AnalyticsRollupService(db)
+            points_rollup = await rollups.aggregate("point_transactions", start_date, now)
+            points_summary = None
 
-        if filters:
-            count_query = text(str(count_query) + " AND " + " AND ".join([f for f in filters if "LIMIT" not in f and "OFFSET" not in f]))
-
-        count_params = {k: v for k, v in params.items() if k not in ["limit", "offset"]}
-        total_result = await db.execute(count_query, count_params)
-        total_count = total_result.scalar() or 0
+        # Получаем общее количество записей
+        if points_summary is not None:
+            total_count = points_summary["total_count"]
+        else:
+            total_count = points_rollup.totals(operation_categories, tariff_values).count
 
         # Преобразуем данные
         items = []
@@ -730,72 +655,41 @@ async def get_points_analytics(
             })
 
         # Вычисляем статистику
-        stats_query = text("""
-            SELECT
-                SUM(CASE WHEN pt.transaction_type IN ('purchase', 'admin_add') THEN pt.amount ELSE 0 END) as total_purchased,
-                SUM(CASE WHEN pt.transaction_type IN ('generation', 'admin_subtract') THEN ABS(pt.amount) ELSE 0 END) as total_used,
-                COUNT(DISTINCT pt.user_id) as unique_users
-            FROM point_transactions pt
-            JOIN users u ON pt.user_id = u.id
-            WHERE pt.created_at >= :start_date AND pt.created_at <= :end_date
-        """)
-
-        if filters:
-            stats_query = text(str(stats_query) + " AND " + " AND ".join([f for f in filters if "LIMIT" not in f and "OFFSET" not in f]))
-
-        stats_result = await db.execute(stats_query, count_params)
-        stats_row = stats_result.fetchone()
-
-        # Статистика по тарифам (покупки)
-        tariff_stats_query = text("""
-            SELECT
-                COALESCE(u.tariff, 'none') as tariff,
-                SUM(pt.amount) as total_points
-            FROM point_transactions pt
-            JOIN users u ON pt.user_id = u.id
-            WHERE pt.created_at >= :start_date AND pt.created_at <= :end_date
-                AND pt.transaction_type IN ('purchase', 'admin_add')
-            GROUP BY COALESCE(u.tariff, 'none')
-        """)
-
-        tariff_result = await db.execute(tariff_stats_query, count_params)
-        tariff_data = {row.tariff: row.total_points for row in tariff_result.fetchall()}
-
-        # Статистика по типам контента (использование) - получаем из generation_metrics
-        content_stats_query = text("""
-            SELECT
-                gm.content_type,
-                COUNT(*) * 8 as total_points  -- Предполагаем 8 баллов за генерацию
-            FROM generation_metrics gm
-            JOIN users u ON gm.user_id = u.id
-            WHERE gm.created_at >= :start_date AND gm.created_at <= :end_date
-                AND gm.with_points = true
-            GROUP BY gm.content_type
-        """)
-
-        content_result = await db.execute(content_stats_query, count_params)
-        content_data = {row.content_type: row.total_points for row in content_result.fetchall()}
-
-        # Добавляем изображения (15 баллов за изображение)
-        image_stats_query = text("""
-            SELECT
-                COUNT(*) * 15 as total_points
-            FROM generation_metrics gm
-            JOIN users u ON gm.user_id = u.id
-            WHERE gm.created_at >= :start_date AND gm.created_at <= :end_date
-                AND gm.content_type = 'image'
-                AND gm.with_points = true
-        """)
+        if points_summary is not None:
+            total_purchased = points_summary["total_purchased"]
+            total_used = points_summary["total_used"]
+            unique_users = points_summary["unique_users"]
+        else:
+            if operation_categories is None:
+                operation_categories_set = set(purchase_types + usage_types)
+            else:
+                operation_categories_set = set(operation_categories)
+            total_purchased = points_rollup.totals(
+                [t for t in purchase_types if t in operation_categories_set], tariff_values
+            ).amount
+            total_used = points_rollup.totals(
+                [t for t in usage_types if t in operation_categories_set], tariff_values
+            ).amount_abs
+            unique_users = points_rollup.distinct_users(operation_categories, tariff_values)
+
+            # Статистика по тарифам (покупки)
+            tariff_data = {
+                tariff_name: totals.amount
+                for tariff_name, totals in points_rollup.by_tariff(categories=purchase_types).items()
+            }
 
-        image_result = await db.execute(image_stats_query, count_params)
-        image_points = image_result.scalar() or 0
-        if image_points > 0:
-            content_data["image"] = image_points
+        # Статистика по типам контента (использование) - оценка по generation_metrics:
+        # 8 баллов за генерацию, 15 баллов за изображение
+        metrics_rollup = await AnalyticsRollupService(db).aggregate("generation_metrics", start_date, now)
+        content_data = {
+            content_type: totals.count * (15 if content_type == "image" else 8)
+            for content_type, totals in metrics_rollup.by_category().items()
+        }
 
         stats = {
-            "total_purchased": stats_row.total_purchased or 0,
-            "total_used": stats_row.total_used or 0,
-            "unique_users": stats_row.unique_users or 0,
+            "total_purchased": total_purchased,
+            "total_used": total_used,
+            "unique_users": unique_users,
             "by_tariff": tariff_data,
             "by_content_type": content_data
         }
@@ -855,43 +749,21 @@ async def get_tariffs_analytics(
         start_date = now - timedelta(days=365 * 3)  # 3 года назад
 
     try:
-        # Получаем статистику генераций по тарифам
-        tariff_usage_query = text("""
-            SELECT
-                COALESCE(u.tariff, 'basic') as tariff,
-                gm.content_type,
-                COUNT(*) as generation_count
-            FROM generation_metrics gm
-            JOIN users u ON gm.user_id = u.id
-            WHERE gm.created_at >= :start_date AND gm.created_at <= :end_date
-            GROUP BY COALESCE(u.tariff, 'basic'), gm.content_type
-            ORDER BY tariff, generation_count DESC
-        """)
-
-        result = await db.execute(tariff_usage_query, {
-            "start_date": start_date,
-            "end_date": now
-        })
-        usage_data = result.fetchall()
-
-        # Получаем общую статистику по тарифам
-        tariff_stats_query = text("""
-            SELECT
-                COALESCE(u.tariff, 'basic') as tariff,
-                COUNT(DISTINCT u.id) as user_count,
-                COUNT(gm.id) as total_generations
-            FROM users u
-            LEFT JOIN generation_metrics gm ON u.id = gm.user_id
-                AND gm.created_at >= :start_date AND gm.created_at <= :end_date
-            GROUP BY COALESCE(u.tariff, 'basic')
-            ORDER BY total_generations DESC
-        """)
-
-        stats_result = await db.execute(tariff_stats_query, {
-            "start_date": start_date,
-            "end_date": now
-        })
-        stats_data = stats_result.fetchall()
+        # Получаем статистику генераций по тарифам из агрегатов generation_metrics
+        metrics_rollup = await AnalyticsRollupService(db).aggregate("generation_metrics", start_date, now)
+        generations_by_tariff: Dict[str, Dict[str, int]] = {}
+        for (content_type, tariff_name), group in metrics_rollup.groups.items():
+            tariff_name = "basic" if tariff_name == "none" else tariff_name
+            by_type = generations_by_tariff.setdefault(tariff_name, {})
+            by_type[content_type] = by_type.get(content_type, 0) + group.count
+
+        # Получаем количество пользователей по тарифам
+        users_result = await db.execute(text("""
+            SELECT LOWER(COALESCE(tariff::text, 'basic')) as tariff, COUNT(*) as user_count
+            FROM users
+            GROUP BY 1
+        """))
+        user_counts = {row.tariff: row.user_count for row in users_result.fetchall()}
 
         # Получаем историю покупок тарифов
         purchases_query = text("""
@@ -922,29 +794,30 @@ async def get_tariffs_analytics(
         content_types = ['lesson_plan', 'exercise', 'game', 'image', 'text_analysis', 'concept_explanation', 'course', 'ai_assistant']
 
         # Инициализируем структуру для каждого тарифа
-        for stat in stats_data:
-            tariff = stat.tariff
+        tariffs_order = sorted(
+            set(user_counts) | set(generations_by_tariff),
+            key=lambda name: sum(generations_by_tariff.get(name, {}).values()),
+            reverse=True
+        )
+        for tariff in tariffs_order:
             by_tariff[tariff] = {
-                "total": stat.total_generations or 0,
-                "user_count": stat.user_count or 0,
+                "total": sum(generations_by_tariff.get(tariff, {}).values()),
+                "user_count": user_counts.get(tariff, 0),
                 "by_type": {content_type: 0 for content_type in content_types},
                 "by_type_percent": {content_type: 0 for content_type in content_types},
                 "popular_types": []
             }
 
         # Заполняем данные по типам контента
-        for usage in usage_data:
-            tariff = usage.tariff
-            content_type = usage.content_type
-            count = usage.generation_count
+        for tariff, counts in generations_by_tariff.items():
+            for content_type, count in counts.items():
+                if content_type in by_tariff[tariff]["by_type"]:
+                    by_tariff[tariff]["by_type"][content_type] = count
 
-            if tariff in by_tariff and content_type in by_tariff[tariff]["by_type"]:
-                by_tariff[tariff]["by_type"][content_type] = count
-
-                # Вычисляем процент
-                total = by_tariff[tariff]["total"]
-                if total > 0:
-                    by_tariff[tariff]["by_type_percent"][content_type] = round((count / total) * 100, 1)
+                    # Вычисляем процент
+                    total = by_tariff[tariff]["total"]
+                    if total > 0:
+                        by_tariff[tariff]["by_type_percent"][content_type] = round((count / total) * 100, 1)
 
         # Формируем популярные типы для каждого тарифа
         for tariff in by_tariff:
@@ -1009,4 +882,53 @@ async def get_tariffs_analytics(
             "total_users": 0,
             "purchase_history": [],
             "generated_at": now.isoformat()
-        }
\ No newline at end of file
+        }
+
+@router.get("/active-users")
+async def get_active_users(
+    source: str = Query("feature_usage", regex="^(feature_usage|generations)$"),
+    current_user: User = Depends(get_current_admin_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """DAU/WAU/MAU по скетчам HyperLogLog из агрегатов (оценка, ошибка ~2%)"""
+    now = datetime.now(timezone.utc)
+    try:
+        active = await AnalyticsRollupService(db).active_users(now, source)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error getting active users: {str(e)}")
+
+    return {
+        **active,
+        "stickiness": active["dau"] / active["mau"] * 100 if active["mau"] else 0,
+        "source": source,
+        "generated_at": now.isoformat()
+    }
+
+
+@router.get("/generation-latency")
+async def get_generation_latency(
+    period: str = Query("week", regex="^(day|week|month|quarter|year)$"),
+    current_user: User = Depends(get_current_admin_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """p50/p95/p99 времени генерации по скетчам DDSketch из агрегатов generation_metrics"""
+    now = datetime.now(timezone.utc)
+    days = {"day": 1, "week": 7, "month": 30, "quarter": 90, "year": 365}[period]
+    try:
+        latency = await AnalyticsRollupService(db).generation_latency(now - timedelta(days=days), now)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error getting generation latency: {str(e)}")
+
+    def _format(stats: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            "count": stats["count"],
+            "mean": stats["mean"],
+            **{f"p{int(q * 100)}": value for q, value in stats["quantiles"].items()}
+        }
+
+    return {
+        **_format(latency),
+        "by_type": {content_type: _format(stats) for content_type, stats in latency["by_type"].items()},
+        "period": period,
+        "generated_at": now.isoformat()
+    }
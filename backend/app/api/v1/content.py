@@ -4,6 +4,7 @@ from sqlalchemy import select, text
 from typing import Dict, Any, Optional, List
 from ...core.database import get_db
 from ...core.cache import CacheService, get_cache_service as get_core_cache_service
+from ...core.config import settings
 from ...core.memory import memory_optimized
 from ...models import User, Generation, DailyUsage
 from ...services.content.generator import ContentGenerator
@@ -44,6 +45,7 @@ from ...core.decorators import (
     track_feature_usage
 )
 from ...services.content.prompt_translator import prompt_translation_service
+from ...services.content.transcript_service import get_transcript_service
 from ...decorators.premium_access import check_premium_access
 from ...core.constants import ContentType, ActionType
 from pydantic import BaseModel
@@ -1196,18 +1198,8 @@ async def generate_lesson_plan_from_transcript(
     try:
         generator = ContentGenerator(session)
 
-        # Получаем транскрипт из кэша или YouTube
-        transcript_key = f"transcript:{request.video_id}:{request.language}"
-        transcript = await cache.get_cached_data(transcript_key)
-
-        if not transcript:
-            transcript = await generator.process_video_transcript(
-                video_id=request.video_id,
-                subtitle_language=request.language,
-                use_cache=False,
-                force_queue=False
-            )
-            await cache.cache_data(transcript_key, transcript, ttl=86400)
+        # Первый кусок транскрипта (хранится сжатым в video_transcripts)
+        transcript = await transcript_for_prompt(request.video_id, request.language)
 
         # Форматируем промпт с текстом транскрипта
         # Fixed: call format_prompt function correctly, not as a coroutine
@@ -1298,18 +1290,8 @@ async def generate_exercises_from_transcript(
     try:
         generator = ContentGenerator(session)
 
-        # Получаем транскрипт из кэша или YouTube
-        transcript_key = f"transcript:{request.video_id}:{request.language}"
-        transcript = await cache.get_cached_data(transcript_key)
-
-        if not transcript:
-            transcript = await generator.process_video_transcript(
-                video_id=request.video_id,
-                subtitle_language=request.language,
-                use_cache=False,
-                force_queue=False
-            )
-            await cache.cache_data(transcript_key, transcript, ttl=86400)
+        # Первый кусок транскрипта (хранится сжатым в video_transcripts)
+        transcript = await transcript_for_prompt(request.video_id, request.language)
 
         # Форматируем промпт с текстом транскрипта
         # Fixed: call format_prompt function correctly, not as a coroutine
@@ -1400,18 +1382,8 @@ async def generate_games_from_transcript(
     try:
         generator = ContentGenerator(session)
 
-        # Получаем транскрипт из кэша или YouTube
-        transcript_key = f"transcript:{request.video_id}:{request.language}"
-        transcript = await cache.get_cached_data(transcript_key)
-
-        if not transcript:
-            transcript = await generator.process_video_transcript(
-                video_id=request.video_id,
-                subtitle_language=request.language,
-                use_cache=False,
-                force_queue=False
-            )
-            await cache.cache_data(transcript_key, transcript, ttl=86400)
+        # Первый кусок транскрипта (хранится сжатым в video_transcripts)
+        transcript = await transcript_for_prompt(request.video_id, request.language)
 
         # Форматируем промпт с текстом транскрипта
         # Fixed: call format_prompt function correctly, not as a coroutine
@@ -1471,6 +1443,20 @@ async def generate_games_from_transcript(
             detail=str(e)
         )
 
+async def transcript_for_prompt(video_id: str, language: str) -> str:
+    """
+    Начало транскрипта для промпта: первый кусок не длиннее
+    TRANSCRIPT_PROMPT_CHARS по границам сегментов, без сборки всего текста
+    длинного видео
+    """
+    chunks = get_transcript_service().iter_chunks(video_id, language, settings.TRANSCRIPT_PROMPT_CHARS)
+    try:
+        async for chunk in chunks:
+            return chunk.text
+    finally:
+        await chunks.aclose()
+    return ""
+
 # Modified: Changed from async def to regular def
 def format_prompt(data: dict, prompt_type: str, transcript: str = None) -> str:
     """
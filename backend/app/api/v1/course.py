@@ -28,7 +28,9 @@ from ...schemas.course import (
     GeneratedGameResponse
 )
 from ...core.security import get_current_user
-from ...core.exceptions import NotFoundException
+from ...core import UserRole
+from ...core.exceptions import AccessDeniedError, NotFoundException
+from ...core.query_counter import query_budget
 # Импортируем переименованные декораторы для генератора курсов
 from ...core.decorators import (
     check_course_generation_limits,
@@ -74,6 +76,7 @@ async def generate_course(
 
 # --- НОВЫЙ РОУТ ДЛЯ МАТЕРИАЛОВ УРОКА ---
 @router.get("/lessons/{lesson_id}/materials", response_model="LessonMaterialsResponse") # Используем строку для response_model
+@query_budget(5)  # урок + активности + курс, счетчик дневного использования
 @track_course_usage(ContentType.LESSON_MATERIAL) # Изменено
 @memory_optimized()
 async def get_lesson_materials(
@@ -573,6 +576,7 @@ async def create_course(
             )
 
 @router.get("/courses/{course_id}", response_model=Course)
+@query_budget(3)  # курс + уроки + активности (профиль course_full)
 async def get_course(
     course_id: int,
     session: AsyncSession = Depends(get_db)
@@ -623,16 +627,28 @@ async def delete_course(
     session: AsyncSession = Depends(get_db),
     current_user = Depends(get_current_user)
 ):
-    """Удаляет курс"""
+    """Удаляет курс (только автор курса или администратор)"""
     async with CourseManager(session) as course_manager:
         try:
-            success = await course_manager.delete_course(course_id)
+            success = await course_manager.delete_course(
+                course_id,
+                current_user.id,
+                is_admin=current_user.role == UserRole.ADMIN
+            )
             if not success:
                 raise HTTPException(
                     status_code=status.HTTP_404_NOT_FOUND,
                     detail="Course not found"
                 )
             return {"message": "Course deleted successfully"}
+        except HTTPException:
+            raise
+        except AccessDeniedError as e:
+            logger.warning(f"Permission denied: {str(e)}")
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="Not enough permissions"
+            )
         except Exception as e:
             raise HTTPException(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -640,6 +656,7 @@ async def delete_course(
             )
 
 @router.get("/courses/{course_id}/progress")
+@query_budget(2)  # курс + агрегат по урокам
 async def get_course_progress(
     course_id: int,
     session: AsyncSession = Depends(get_db)
@@ -13,15 +13,22 @@ router = APIRouter()
 @router.post("/admin/maintenance/run", summary="Запустить все задачи обслуживания")
 async def run_all_maintenance(
     background_tasks: BackgroundTasks,
+    dry_run: bool = False,
     db: AsyncSession = Depends(get_db),
     current_user = Depends(get_current_admin_user)  # Только для администраторов
 ):
     """
     Запускает все задачи обслуживания системы в фоновом режиме.
+    В режиме dry_run задачи выполняются сразу и только подсчитывают
+    затрагиваемые строки, ничего не изменяя.
     
     Returns:
-        dict: Информация о запуске задач
+        dict: Информация о запуске задач или результаты dry run
     """
+    if dry_run:
+        async with DailyMaintenanceService(db, dry_run=True) as service:
+            return await service.run_all_maintenance_tasks()
+
     # Создаем функцию для выполнения в фоне
     async def run_tasks():
         async with DailyMaintenanceService(db) as service:
@@ -7,6 +7,7 @@ from ...core.security import get_current_user
 from ...models.user import User
 from ...models.point_transaction import PointTransaction
 from ...services.points.manager import PointsManager
+from ...services.referral.closure import ReferralClosureService
 from ...schemas.points import TransactionType
 from typing import Dict, Any
 import uuid
@@ -143,6 +144,13 @@ async def use_invite_code(
                 detail="Cannot use your own invite code"
             )
 
+        # Подвешиваем поддерево пользователя под пригласившего в той же транзакции
+        if not await ReferralClosureService(session).link(inviter.id, current_user.id):
+            raise HTTPException(
+                status_code=400,
+                detail="Invite code would create a referral cycle"
+            )
+
         # Обновляем данные нового пользователя
         current_user.invited_by_code = invite_code
 
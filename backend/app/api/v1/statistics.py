@@ -1,14 +1,15 @@
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Query, Request
 import asyncio # Добавлен импорт
 from sqlalchemy.ext.asyncio import AsyncSession
 from typing import Optional, List, Dict, Any
 from datetime import datetime, timedelta, timezone
 import logging
-from fastapi.responses import StreamingResponse
-from ...utils.excel_export import export_to_excel
+from fastapi.responses import FileResponse, StreamingResponse
 from ...core.database import get_db
 from ...core.cache import CacheService, get_cache_service
 from ...services.statistics.collector import StatisticsCollector
+from ...services.export import ExportJobManager, GENERATION_EXPORT_COLUMNS, generation_batches, streaming_response
+from ...services.export.streaming import MEDIA_TYPES
 from ...services.optimization.query_optimizer import QueryOptimizer
 from ...core.constants import StatisticsPeriod, StatisticsMetric
 from ...core.security import get_current_admin_user
@@ -529,6 +530,8 @@ async def get_detailed_generations(
 
 @router.get("/admin/generations/export")
 async def export_generations_to_excel(
+    request: Request,
+    background_tasks: BackgroundTasks,
     period: str = Query("week", regex="^(day|week|month|all|custom)$"),
     type: Optional[str] = Query(None),
     user_id: Optional[int] = Query(None),
@@ -536,12 +539,18 @@ async def export_generations_to_excel(
     end_date: Optional[str] = Query(None),
     sort_by: str = Query("created_at", regex="^(id|user_id|type|created_at)$"),
     sort_order: str = Query("desc", regex="^(asc|desc)$"),
-    session: AsyncSession = Depends(get_db),
+    format: str = Query("xlsx", regex="^(xlsx|csv|json)$"),
+    background: bool = Query(False, description="Сформировать файл в фоне и вернуть ссылку на задачу"),
     _: dict = Depends(get_current_admin_user)
 ):
-    """Экспорт генераций в Excel файл"""
-    logger.info(f"=== ADMIN GENERATIONS EXPORT API CALLED ===")
-    logger.info(f"Parameters: period={period}, type={type}, user_id={user_id}, start_date={start_date}, end_date={end_date}, sort_by={sort_by}, sort_order={sort_order}")
+    """
+    Экспорт генераций в Excel, CSV или JSON
+
+    Строки читаются из БД пачками и сразу отдаются клиенту, поэтому память не
+    растет с размером выборки. При background=true файл формируется в фоне,
+    а ответ содержит ссылки на статус и скачивание.
+    """
+    logger.info(f"Parameters: period={period}, type={type}, user_id={user_id}, start_date={start_date}, end_date={end_date}, sort_by={sort_by}, sort_order={sort_order}, format={format}")
 
     try:
         # Определяем временной период
@@ -557,8 +566,6 @@ async def export_generations_to_excel(
                 date_end = datetime.fromisoformat(end_date)
                 if not date_end.tzinfo:
                     date_end = date_end.replace(tzinfo=timezone.utc)
-
-                logger.info(f"Using custom date range: {date_start} to {date_end}")
             except ValueError as e:
                 logger.error(f"Error parsing custom dates: {e}")
                 # Используем период по умолчанию при ошибке парсинга дат
@@ -572,112 +579,78 @@ async def export_generations_to_excel(
         else:  # all
             date_start = None
 
-        logger.info(f"Date range: start_date={date_start}, end_date={date_end}")
-
-        # Переименовываем переменные для совместимости с остальным кодом
-        start_date = date_start
-        end_date = date_end
-
-        # Получаем детальный список генераций
-        from sqlalchemy import select, func
-        from ...models import Generation, User
-        from ...core.constants import ContentType
-
-        # Формируем запрос с фильтрами
-        query = select(Generation)
-
-        # Применяем фильтр по периоду, если указан
-        if start_date:
-            query = query.where(Generation.created_at >= start_date)
-        query = query.where(Generation.created_at <= end_date)
-
-        # Применяем фильтр по типу, если указан
-        if type:
-            try:
-                content_type = ContentType(type)
-                query = query.where(Generation.type == content_type)
-                logger.info(f"Applied type filter: {type}")
-            except ValueError:
-                # Если тип не соответствует enum, игнорируем фильтр
-                logger.warning(f"Invalid content type filter: {type}")
+        filters = dict(
+            start_date=date_start,
+            end_date=date_end,
+            type=type,
+            user_id=user_id,
+            sort_by=sort_by,
+            sort_order=sort_order
+        )
 
-        # Применяем фильтр по пользователю, если указан
-        if user_id:
-            query = query.where(Generation.user_id == user_id)
-            logger.info(f"Applied user_id filter: {user_id}")
+        # Формируем имя файла с датой и периодом
+        now = datetime.now(timezone.utc).strftime("%Y-%m-%d")
+        filename = f"generations_export_{period}_{now}"
 
-        # Применяем сортировку
-        sort_column = getattr(Generation, sort_by)
-        if sort_order == 'desc':
-            query = query.order_by(sort_column.desc())
-        else:
-            query = query.order_by(sort_column.asc())
+        if background:
+            jobs = ExportJobManager()
+            job = jobs.create("generations", format, filename)
+            background_tasks.add_task(
+                jobs.run,
+                job["job_id"],
+                generation_batches(**filters),
+                GENERATION_EXPORT_COLUMNS,
+                "Генерации"
+            )
+            return _export_job_response(request, job)
+
+        return streaming_response(
+            generation_batches(**filters),
+            GENERATION_EXPORT_COLUMNS,
+            format,
+            filename,
+            sheet_name="Генерации"
+        )
 
-        # Выполняем запрос (без пагинации для экспорта)
-        result = await session.execute(query)
-        generations = result.scalars().all()
-        logger.info(f"Query executed successfully, got {len(generations)} generations for export")
+    except Exception as e:
+        logger.error(f"Error exporting generations: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Error exporting generations: {str(e)}")
 
-        # Получаем информацию о пользователях для экспорта
-        user_ids = list(set(gen.user_id for gen in generations))
-        users_query = select(User).where(User.id.in_(user_ids))
-        users_result = await session.execute(users_query)
-        users = {user.id: user for user in users_result.scalars().all()}
 
-        # Преобразуем результаты в словари для экспорта
-        generations_list = []
-        for gen in generations:
-            try:
-                # Получаем информацию о пользователе
-                user = users.get(gen.user_id)
-                user_name = f"{user.first_name or ''} {user.last_name or ''}".strip() if user else ""
-                user_name = user_name or (user.username if user else "")
-                user_name = user_name or f"ID: {gen.user_id}"
+def _export_job_response(request: Request, job: Dict[str, Any]) -> Dict[str, Any]:
+    """Состояние задачи экспорта со ссылками на статус и файл"""
+    response = dict(job)
+    response["status_url"] = str(request.url_for("get_export_job", job_id=job["job_id"]))
+    if job["status"] == "done":
+        response["download_url"] = str(request.url_for("download_export", job_id=job["job_id"]))
+    return response
 
-                gen_dict = {
-                    "id": gen.id,
-                    "user_id": gen.user_id,
-                    "user_name": user_name,
-                    "type": gen.type.value,  # Преобразуем enum в строку
-                    "type_formatted": gen.type.value.replace("_", " ").title(),
-                    "content": gen.content,
-                    "prompt": gen.prompt,
-                    "created_at": gen.created_at.isoformat()
-                }
-                generations_list.append(gen_dict)
-            except Exception as gen_error:
-                logger.error(f"Error processing generation for export: {str(gen_error)}")
-
-        # Определяем маппинг полей для экспорта
-        column_mapping = {
-            "id": "ID",
-            "user_id": "ID пользователя",
-            "user_name": "Имя пользователя",
-            "type": "Тип генерации",
-            "type_formatted": "Тип (форматированный)",
-            "content": "Содержимое",
-            "prompt": "Запрос",
-            "created_at": "Дата создания"
-        }
 
-        # Формируем имя файла с датой и периодом
-        now = datetime.now(timezone.utc).strftime("%Y-%m-%d")
-        filename = f"generations_export_{period}_{now}"
+@router.get("/admin/exports/{job_id}", name="get_export_job")
+async def get_export_job(
+    job_id: str,
+    request: Request,
+    _: dict = Depends(get_current_admin_user)
+):
+    """Статус фонового экспорта"""
+    job = ExportJobManager().get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Export job not found")
+    return _export_job_response(request, job)
 
-        # Экспортируем данные в Excel
-        return export_to_excel(
-            data=generations_list,
-            filename=filename,
-            sheet_name="Генерации",
-            column_mapping=column_mapping
-        )
 
-    except Exception as e:
-        logger.error(f"Error exporting generations to Excel: {str(e)}")
-        # Добавляем трассировку стека для более подробной информации об ошибке
-        import traceback
-        logger.error(f"Traceback: {traceback.format_exc()}")
-        raise HTTPException(status_code=500, detail=f"Error exporting generations to Excel: {str(e)}")
+@router.get("/admin/exports/{job_id}/download", name="download_export")
+async def download_export(
+    job_id: str,
+    _: dict = Depends(get_current_admin_user)
+):
+    """Скачивание готового файла фонового экспорта"""
+    jobs = ExportJobManager()
+    path = jobs.file_path(job_id)
+    if not path:
+        raise HTTPException(status_code=404, detail="Export file not ready or expired")
+    job = jobs.get(job_id)
+    return FileResponse(path, media_type=MEDIA_TYPES[job["format"]], filename=job["filename"])
 
 
 @router.get("/statistics/generations")
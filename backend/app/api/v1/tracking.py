@@ -17,7 +17,8 @@ async def log_usage(
 ):
    async with UsageTracker(session) as tracker:
        try:
-           log = await tracker.log_usage(log_data)
+           # Эндпоинт возвращает сохраненную запись с id, поэтому пишем синхронно
+           log = await tracker.log_usage(log_data, deferred=False)
            if log is None:
                # Если log_usage вернул None, значит произошла ошибка,
                # но мы хотим вернуть успешный ответ, чтобы не блокировать пользователя
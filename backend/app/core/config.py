@@ -98,6 +98,21 @@ class Settings(BaseSettings):
     # Настройки для очистки данных
     TRANSCRIPT_CACHE_HOURS: int = Field(default=24)  # Время жизни транскрипта
     CLEANUP_HOUR: int = Field(default=3)  # Час для запуска очистки
+    USAGE_HISTORY_DAYS: int = Field(default=30)  # Сколько дней хранить daily_usage
+    MAINTENANCE_BATCH_SIZE: int = Field(default=10000)  # Строк за один шаг обслуживания
+
+    # Настройки секционирования журналов
+    LOG_PARTITIONING_ENABLED: bool = Field(default=True)  # Переводить журналы в помесячные секции
+    LOG_PARTITION_MONTHS_AHEAD: int = Field(default=3)  # На сколько месяцев вперед создавать секции
+    LOG_PARTITION_DETACH_ONLY: bool = Field(default=False)  # Только отсоединять старые секции (для архивации)
+    INDEX_ADVISOR_ENABLED: bool = Field(default=True)  # Создавать индексы горячих запросов при старте
+    LOG_RETENTION_DAYS: ClassVar[Dict[str, int]] = {
+        "usage_logs": 30,
+        "user_activity_logs": 180,
+        "feature_usage": 90,
+        "generation_metrics": 180,
+        "detailed_generation_metrics": 90,
+    }
 
     # Настройки приглашений
     REQUIRED_INVITES: int = Field(default=5)
@@ -107,6 +122,99 @@ class Settings(BaseSettings):
     BATCH_SIZE: int = Field(default=1000)
     MAX_MEMORY_USAGE: int = Field(default=1024)  # MB
 
+    # Настройки пайплайна трекинга действий
+    TRACKING_QUEUE_MAXSIZE: int = Field(default=10000)  # Максимум событий в очереди
+    TRACKING_BATCH_SIZE: int = Field(default=500)  # Событий в одном сбросе в БД
+    TRACKING_FLUSH_INTERVAL: float = Field(default=1.0)  # Секунд между сбросами
+    TRACKING_ENQUEUE_TIMEOUT: float = Field(default=0.05)  # Ожидание места в очереди перед сбросом на диск
+    TRACKING_SPILL_DIR: str = Field(default="data/tracking_spill")  # Каталог для событий при недоступной БД
+
+    # Настройки агрегатов аналитики (rollups)
+    ROLLUP_LAG_SECONDS: int = Field(default=300)  # Задержка перед сверткой завершившегося часа
+    ROLLUP_CHUNK_HOURS: int = Field(default=168)  # Часов в одной транзакции свертки
+    ROLLUP_STALE_SECONDS: int = Field(default=3600)  # Отставание, после которого свертка запускается из запроса
+    ROLLUP_SKETCH_PRECISION: int = Field(default=11)  # Точность HyperLogLog (2^p регистров)
+    ROLLUP_QUANTILE_ACCURACY: float = Field(default=0.01)  # Относительная точность квантилей DDSketch
+
+    # Параллельные запросы дашбордов (services/analytics/query_fanout.py)
+    ANALYTICS_FANOUT_CONNECTIONS: int = Field(default=4)  # Соединений из пула на один дашборд
+    ANALYTICS_FANOUT_STATEMENT_TIMEOUT_MS: int = Field(default=15000)  # 0 - без ограничения
+
+    # Потоковые экспорты (services/export)
+    EXPORT_DIR: str = Field(default="data/exports")  # Каталог файлов фоновых экспортов
+    EXPORT_BATCH_SIZE: int = Field(default=2000)  # Строк в одной пачке серверного курсора
+    EXPORT_TTL_HOURS: int = Field(default=24)  # Время хранения готовых файлов
+
+    # Внутрипроцессный кэш аналитики (services/analytics/cache_service.py)
+    ANALYTICS_CACHE_MAX_ENTRIES: int = Field(default=10000)  # Максимум записей
+    ANALYTICS_CACHE_MAX_BYTES: int = Field(default=64 * 1024 * 1024)  # Примерный объем данных
+    ANALYTICS_CACHE_STALE_SECONDS: int = Field(default=300)  # Отдача устаревшего значения на время пересчета
+    ANALYTICS_CACHE_LOCK_STRIPES: int = Field(default=64)  # Блокировок пересчета на весь кэш
+    ANALYTICS_CACHE_REDIS: bool = Field(default=False)  # Общий слой в Redis для всех воркеров
+
+    # Колоночный архив снимков аналитики (services/analytics/snapshot_archive.py)
+    ANALYTICS_ARCHIVE_DIR: str = Field(default="data/analytics_archive")  # Каталог помесячных партиций
+    ANALYTICS_ARCHIVE_HOT_DAYS: int = Field(default=30)  # Снимки моложе этого остаются в analytics_data
+
+    # Экспорт курсов в PDF/DOCX (services/course/export_renderer.py)
+    COURSE_EXPORT_WORKERS: int = Field(default=2)  # Процессов рендеринга; 0 - в потоке без пула
+    COURSE_EXPORT_CACHE_DIR: str = Field(default="data/course_exports")  # Готовые файлы по хешу содержимого
+    COURSE_EXPORT_CACHE_TTL_HOURS: int = Field(default=168)  # Хранение файлов без обращений
+
+    # Хранилище сгенерированных изображений (services/content/image_store.py)
+    IMAGE_STORE_DIR: str = Field(default="static/generated_images")  # Файлы по хешу содержимого
+    IMAGE_VARIANT_WORKERS: int = Field(default=2)  # Процессов для WebP и миниатюр; 0 - в потоке
+    IMAGE_THUMBNAIL_SIZE: int = Field(default=256)  # Наибольшая сторона миниатюры, px
+    IMAGE_WEBP_QUALITY: int = Field(default=80)  # Качество WebP-вариантов
+    IMAGE_DOWNLOAD_TIMEOUT: int = Field(default=60)  # Таймаут скачивания изображения провайдера, сек
+    IMAGE_STORE_MIRROR_REMOTE: bool = Field(default=False)  # Сохранять локально и изображения, пришедшие ссылкой
+
+    # Перевод промптов изображений (services/content/prompt_translator.py)
+    TRANSLATION_MEMORY_LOCAL_ENTRIES: int = Field(default=2000)  # Переводов в LRU процесса
+    TRANSLATION_MEMORY_MAX_ENTRIES: int = Field(default=100000)  # Строк в prompt_translations
+    TRANSLATION_MEMORY_TTL_HOURS: int = Field(default=24 * 30)  # Срок хранения без обращений
+    TRANSLATION_MEMORY_PRUNE_SECONDS: int = Field(default=600)  # Не чаще одной очистки таблицы
+    TRANSLATION_BATCH_WINDOW_MS: int = Field(default=50)  # Ожидание других промптов для общего запроса
+    TRANSLATION_BATCH_SIZE: int = Field(default=16)  # Промптов в одном запросе к LLM
+    TRANSLATION_RATE_PER_SECOND: float = Field(default=1.0)  # Запросов к LLM в секунду
+    TRANSLATION_RATE_BURST: int = Field(default=3)  # Запросов, пропускаемых без ожидания
+
+    # Транскрипты видео (services/content/transcript_service.py)
+    TRANSCRIPT_FETCH_WORKERS: int = Field(default=4)  # Потоков для загрузки транскриптов
+    TRANSCRIPT_FETCH_TIMEOUT: int = Field(default=30)  # Таймаут загрузки транскрипта, сек
+    TRANSCRIPT_FAILURE_TTL_SECONDS: int = Field(default=300)  # Сколько помнить неудачную загрузку
+    TRANSCRIPT_PROMPT_CHARS: int = Field(default=5000)  # Символов транскрипта в одном куске для промпта
+
+    # Map-reduce для длинных текстов (services/content/text_pipeline.py)
+    TEXT_PIPELINE_CHUNK_TOKENS: int = Field(default=2500)  # Токенов в куске; более длинный текст делится
+    TEXT_PIPELINE_OVERLAP_TOKENS: int = Field(default=150)  # Перекрытие с предыдущим куском
+    TEXT_PIPELINE_CONCURRENCY: int = Field(default=4)  # Одновременных запросов к LLM на один текст
+    TEXT_PIPELINE_CACHE_TTL: int = Field(default=7 * 24 * 3600)  # Время жизни результатов кусков, сек
+    TEXT_PIPELINE_LEVEL_SAMPLES: int = Field(default=4)  # Кусков для определения уровня текста
+
+    # Бюджет токенов генерации (services/content/token_budget.py)
+    TOKEN_BUDGET_PERCENTILE: float = Field(default=0.9)  # Перцентиль фактических токенов ответа
+    TOKEN_BUDGET_HEADROOM: float = Field(default=1.3)  # Запас над перцентилем для max_tokens
+    TOKEN_BUDGET_LOOKBACK_DAYS: int = Field(default=14)  # Глубина истории generation_metrics, дней
+    TOKEN_BUDGET_MIN_SAMPLES: int = Field(default=30)  # Генераций вида запроса до использования истории
+    TOKEN_BUDGET_REFRESH_SECONDS: int = Field(default=600)  # Период пересчета перцентилей, сек
+
+    # Кэш генераций (services/content/prompt_cache.py)
+    PROMPT_CACHE_SIMILARITY: Dict[str, float] = Field(default={})  # Порог сходства почти совпадающих промптов по типу контента (например, {"lesson_plan": 0.6}); тип без порога - только точный ключ
+    PROMPT_CACHE_MAX_CHANGED_WORDS: int = Field(default=0)  # Допустимо различающихся слов у почти совпадающих промптов
+    PROMPT_CACHE_INDEX_TTL: int = Field(default=3600)  # Время жизни индекса, сек (как у кэша генераций)
+
+    # Заблаговременная загрузка кэша (services/content/cache_primer.py)
+    CACHE_PRIMING_ENABLED: bool = Field(default=True)  # Загрузка при старте и по расписанию AnalyticsScheduler
+    CACHE_PRIMING_INTERVAL: int = Field(default=1800)  # Период загрузки, сек (меньше времени жизни кэша генераций)
+    CACHE_PRIMING_LOOKBACK_DAYS: int = Field(default=7)  # Окно популярности по generations и feature_usage, дней
+    CACHE_PRIMING_TOP_PROMPTS: int = Field(default=50)  # Популярных промптов за запуск
+    CACHE_PRIMING_MIN_REQUESTS: int = Field(default=3)  # Повторов промпта, чтобы считаться популярным
+    CACHE_PRIMING_TOP_TEMPLATES: int = Field(default=20)  # Популярных шаблонов курсов за запуск
+    CACHE_PRIMING_MAX_GENERATIONS: int = Field(default=5)  # Генераций за запуск для промптов без готового результата
+    CACHE_PRIMING_GENERATION_DELAY: float = Field(default=30.0)  # Пауза перед каждой генерацией, сек
+    CACHE_PRIMING_MIN_SPARE_CAPACITY: float = Field(default=0.5)  # Свободная доля квоты провайдера для генерации
+
     # Настройки логирования
     LOG_LEVEL: str = Field(default="INFO")
     LOG_FORMAT: str = Field(
@@ -157,10 +265,11 @@ class Settings(BaseSettings):
             "aggregated": 365  # 1 год для агрегированных данных
         },
         "scheduler": {
-            "refresh_materialized_views": 3600,  # 1 час
+            "refresh_materialized_views": 600,   # 10 минут (только при изменении данных)
             "cleanup_old_data": 86400,           # 1 день
             "save_analytics_snapshot": 43200,    # 12 часов
-            "refresh_cache": 1800                # 30 минут
+            "refresh_cache": 1800,               # 30 минут
+            "refresh_rollups": 300               # 5 минут
         }
     }
 
@@ -4,6 +4,7 @@ from sqlalchemy.orm import declarative_base, registry
 from sqlalchemy.pool import AsyncAdaptedQueuePool
 from cachetools import LRUCache
 from .config import settings
+from .query_counter import install_query_counter
 import logging
 from ..core.constants import TariffType, TARIFF_LIMITS
 
@@ -35,6 +36,9 @@ engine = create_async_engine(
     execution_options={"compiled_cache": compiled_cache}
 )
 
+# Подсчет запросов для бюджетов эндпоинтов (QueryBudgetMiddleware)
+install_query_counter(engine)
+
 # Создаем фабрику сессий
 async_session = async_sessionmaker(
     engine,
@@ -107,8 +111,8 @@ async def init_db():
 
         # Явно импортируем все модели до создания таблиц
         from app.models import (
-            User, Achievement, UserAchievement, UserAction,
-            Generation, Image, VideoTranscript,
+            User, Achievement, UserAchievement, UserAction, UserAchievementCounters,
+            Generation, Image, VideoTranscript, PromptTranslation,
             UsageLog, DailyUsage, UsageStatistics, GenerationMetrics,
             UserActivityLog, TariffPlan, UserTariff, PriceChange,
             UserStatistics, ServerStatistics,
@@ -116,7 +120,10 @@ async def init_db():
             AnalyticsData, DetailedGenerationMetrics,
             Course, Lesson, Activity, LessonTemplate,
             PricingRule, SpecialOffer, Discount, DiscountType,
-            AppliedDiscount, RuleType, ScheduledMessage
+            AppliedDiscount, RuleType, ScheduledMessage,
+            ReferralClosure, ReferralSubtreeCount,
+            AnalyticsRollupHourly, AnalyticsRollupDaily, AnalyticsRollupWatermark,
+            MaterializedViewRefresh, UserActivityBitmap, UserActivityBitmapDelta
         )
 
         async with engine.begin() as conn:
@@ -133,6 +140,15 @@ async def init_db():
         # Применяем миграции
         await apply_migrations()
 
+        # Переводим журналы в помесячные секции и создаем будущие секции
+        await ensure_log_partitions()
+
+        # Создаем индексы для горячих запросов аналитики (после секционирования)
+        await ensure_required_indexes()
+
+        # Заполняем таблицу замыкания реферального дерева для существующих пользователей
+        await backfill_referral_closure()
+
         # Create default tariffs
         await create_default_tariffs()
 
@@ -366,6 +382,86 @@ async def apply_migrations():
                                 table_rec.column_name, table_rec.table_name;
                 END LOOP;
             END $$;
+            """,
+
+            # Перевод payments.meta_data в JSONB (индексы создает ensure_required_indexes)
+            """
+            DO $$
+            BEGIN
+                IF EXISTS (
+                    SELECT 1
+                    FROM information_schema.columns
+                    WHERE table_name = 'payments' AND column_name = 'meta_data' AND data_type = 'json'
+                ) THEN
+                    ALTER TABLE payments ALTER COLUMN meta_data TYPE jsonb USING meta_data::jsonb;
+                    RAISE NOTICE 'Column meta_data in payments converted to jsonb';
+                END IF;
+            END $$;
+            """,
+
+            # Скетчи распределений в агрегатах; generation_metrics сворачивается заново,
+            # чтобы заполнить value_sketch для уже свернутых часов
+            """
+            DO $$
+            BEGIN
+                IF NOT EXISTS (
+                    SELECT 1
+                    FROM information_schema.columns
+                    WHERE table_name = 'analytics_rollup_hourly' AND column_name = 'value_sketch'
+                ) THEN
+                    ALTER TABLE analytics_rollup_hourly ADD COLUMN value_sketch BYTEA;
+                    ALTER TABLE analytics_rollup_daily ADD COLUMN IF NOT EXISTS value_sketch BYTEA;
+                    DELETE FROM analytics_rollup_watermarks WHERE source = 'generation_metrics';
+                    RAISE NOTICE 'Column value_sketch added to analytics rollups';
+                END IF;
+            END $$;
+            """,
+
+            # Последние учтенные id и время изменения строк источников агрегатов
+            # (поиск опоздавших и измененных строк)
+            """
+            ALTER TABLE analytics_rollup_watermarks ADD COLUMN IF NOT EXISTS last_id BIGINT;
+            """,
+            """
+            ALTER TABLE analytics_rollup_watermarks ADD COLUMN IF NOT EXISTS last_changed_at TIMESTAMP WITH TIME ZONE;
+            """,
+
+            # Счетчики достижений считаются по строкам generations/images после
+            # последних учтенных id; старые счетчики пересобираются из истории
+            """
+            DO $$
+            BEGIN
+                IF NOT EXISTS (
+                    SELECT 1
+                    FROM information_schema.columns
+                    WHERE table_name = 'user_achievement_counters' AND column_name = 'last_generation_id'
+                ) THEN
+                    ALTER TABLE user_achievement_counters
+                        ADD COLUMN last_generation_id INTEGER NOT NULL DEFAULT 0,
+                        ADD COLUMN last_image_id INTEGER NOT NULL DEFAULT 0;
+                    DELETE FROM user_achievement_counters;
+                    RAISE NOTICE 'Achievement counters will be rebuilt from history';
+                END IF;
+            END $$;
+            """,
+
+            # Сжатые транскрипты видео
+            """
+            ALTER TABLE video_transcripts ADD COLUMN IF NOT EXISTS transcript_gz BYTEA;
+            """,
+
+            # Бюджет токенов: предсказание и факт для каждой генерации
+            """
+            ALTER TABLE generation_metrics
+                ADD COLUMN IF NOT EXISTS prompt_tokens INTEGER,
+                ADD COLUMN IF NOT EXISTS predicted_tokens INTEGER,
+                ADD COLUMN IF NOT EXISTS max_tokens INTEGER,
+                ADD COLUMN IF NOT EXISTS request_kind VARCHAR(50);
+            """,
+            """
+            CREATE INDEX IF NOT EXISTS ix_generation_metrics_token_profile
+                ON generation_metrics (content_type, request_kind, created_at)
+                WHERE success AND request_kind IS NOT NULL;
             """
         ]
 
@@ -380,6 +476,79 @@ async def apply_migrations():
         raise
 
 
+async def ensure_log_partitions():
+    """Секционирует журналы с большим объемом записей по месяцам.
+
+    Новые таблицы уже создаются секционированными из метаданных моделей,
+    существующие обычные таблицы переводятся один раз с копированием данных.
+    При LOG_PARTITIONING_ENABLED=False таблицы не переводятся, а
+    секционированным создается только секция по умолчанию.
+    """
+    try:
+        from ..services.maintenance.partitioning import LogPartitionManager
+
+        async with engine.begin() as conn:
+            # Воркеры стартуют одновременно: перевод таблиц выполняет только один
+            await conn.execute(text("SELECT pg_advisory_xact_lock(hashtext('log_partitions'))"))
+            manager = LogPartitionManager(conn)
+
+            if not settings.LOG_PARTITIONING_ENABLED:
+                # Новые таблицы все равно создаются секционированными, и без
+                # секции по умолчанию в них нельзя записать ни одной строки
+                defaults = await manager.ensure_default_partitions()
+                logger.info(f"Log partitioning disabled, default partitions ensured: {defaults}")
+                return
+
+            created = await manager.ensure_all()
+            logger.info(f"Log partitions ensured: {created}")
+    except Exception as e:
+        logger.error(f"Error ensuring log partitions: {e}")
+        raise
+
+
+async def ensure_required_indexes():
+    """Создает недостающие индексы из services/optimization/index_advisor.py.
+
+    Индексы обычных таблиц строятся CONCURRENTLY, поэтому соединение работает
+    в режиме AUTOCOMMIT и не блокирует запись в таблицы.
+    """
+    if not settings.INDEX_ADVISOR_ENABLED:
+        logger.info("Index advisor disabled, skipping")
+        return
+
+    try:
+        from ..services.optimization.index_advisor import IndexAdvisor
+
+        async with engine.connect() as conn:
+            conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+            created = await IndexAdvisor(conn).apply(concurrently=True)
+            logger.info(f"Required indexes ensured, created: {created}")
+    except Exception as e:
+        logger.error(f"Error ensuring required indexes: {e}")
+
+
+async def backfill_referral_closure(force: bool = False):
+    """Заполняет таблицу замыкания реферального дерева по users.invited_by_code.
+
+    Выполняется один раз, пока таблица пуста; force=True перестраивает ее заново.
+    """
+    try:
+        from ..services.referral.closure import ReferralClosureService
+
+        async with engine.begin() as conn:
+            if not force:
+                result = await conn.execute(text("SELECT EXISTS (SELECT 1 FROM referral_closure)"))
+                if result.scalar():
+                    logger.info("Referral closure already populated, skipping backfill")
+                    return
+
+            stats = await ReferralClosureService(conn).rebuild()
+            logger.info(f"Referral closure backfill completed: {stats}")
+    except Exception as e:
+        logger.error(f"Error backfilling referral closure: {e}")
+        raise
+
+
 async def cleanup_db():
     """Очистка подключений при выключении"""
     compiled_cache.clear()
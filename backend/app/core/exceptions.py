@@ -32,6 +32,10 @@ class ExportError(BaseAppException):
     """Raised when course export fails"""
     pass
 
+class QueryBudgetExceededError(BaseAppException):
+    """Raised when an endpoint executes more SQL queries than its budget"""
+    pass
+
 class PointsBaseException(Exception):
     """Базовое исключение для системы баллов"""
     def __init__(self, message: str, user_id: Optional[int] = None):
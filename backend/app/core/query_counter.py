@@ -0,0 +1,109 @@
+# app/core/query_counter.py
+"""
+Подсчет SQL-запросов в рамках запроса к API и бюджеты запросов эндпоинтов.
+
+Счетчик подключается к движку (install_query_counter) и считает каждое
+выполнение курсора в текущем контексте count_queries(). Эндпоинт объявляет
+бюджет декоратором @query_budget(n) (сразу под @router.get), а
+QueryBudgetMiddleware считает запросы каждого HTTP-запроса, отдает их число
+в заголовке X-DB-Queries и при превышении бюджета пишет предупреждение,
+а в тестах (settings.TESTING) падает с QueryBudgetExceededError - так N+1
+в эндпоинте ловится тестом, а не на проде.
+"""
+import logging
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator, List, Optional
+
+from sqlalchemy import event
+
+from .config import settings
+from .exceptions import QueryBudgetExceededError
+
+logger = logging.getLogger(__name__)
+
+QUERY_COUNT_HEADER = b"x-db-queries"
+
+_current_counter: ContextVar[Optional["QueryCounter"]] = ContextVar("query_counter", default=None)
+
+
+class QueryCounter:
+    """SQL-запросы, выполненные внутри count_queries()"""
+
+    def __init__(self):
+        self.statements: List[str] = []
+
+    @property
+    def count(self) -> int:
+        return len(self.statements)
+
+    def assert_max(self, limit: int, label: str = "block"):
+        """Падает с QueryBudgetExceededError, если запросов больше limit"""
+        if self.count > limit:
+            raise QueryBudgetExceededError(
+                f"{label} executed {self.count} queries, budget is {limit}:\n" + "\n".join(self.statements)
+            )
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    counter = _current_counter.get()
+    if counter is not None:
+        counter.statements.append(statement)
+
+
+def install_query_counter(engine) -> None:
+    """Подключает счетчик к движку (AsyncEngine или Engine); повторный вызов ничего не делает"""
+    sync_engine = getattr(engine, "sync_engine", engine)
+    if not event.contains(sync_engine, "before_cursor_execute", _before_cursor_execute):
+        event.listen(sync_engine, "before_cursor_execute", _before_cursor_execute)
+
+
+@contextmanager
+def count_queries() -> Iterator[QueryCounter]:
+    """Считает запросы движков с install_query_counter внутри блока"""
+    counter = QueryCounter()
+    token = _current_counter.set(counter)
+    try:
+        yield counter
+    finally:
+        _current_counter.reset(token)
+
+
+def query_budget(limit: int):
+    """Бюджет SQL-запросов эндпоинта; ставится сразу под @router.get(...)"""
+    def decorator(func):
+        func.__query_budget__ = limit
+        return func
+    return decorator
+
+
+class QueryBudgetMiddleware:
+    """ASGI middleware: число запросов в X-DB-Queries и проверка бюджета эндпоинта"""
+
+    def __init__(self, app, strict: Optional[bool] = None):
+        self.app = app
+        self.strict = settings.TESTING if strict is None else strict
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        with count_queries() as counter:
+            async def send_with_count(message):
+                if message["type"] == "http.response.start":
+                    headers = list(message.get("headers", []))
+                    headers.append((QUERY_COUNT_HEADER, str(counter.count).encode()))
+                    message = {**message, "headers": headers}
+                await send(message)
+
+            await self.app(scope, receive, send_with_count)
+
+        # endpoint попадает в scope при сопоставлении маршрута
+        budget = getattr(scope.get("endpoint"), "__query_budget__", None)
+        if budget is None or counter.count <= budget:
+            return
+        label = f"{scope.get('method')} {scope.get('path')}"
+        if self.strict:
+            counter.assert_max(budget, label)
+        logger.warning(f"{label} executed {counter.count} queries, budget is {budget}")
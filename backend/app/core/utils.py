@@ -2,8 +2,9 @@
 Утилиты для работы с различными типами данных и преобразованиями.
 """
 import logging
-from typing import Optional, TypeVar, Type, Any, Union
+from typing import Optional, TypeVar, Type, Any, Union, Tuple
 from enum import Enum
+from datetime import date, datetime, time, timedelta, timezone
 
 from .constants import ContentType, ActionType
 
@@ -76,4 +77,25 @@ def safe_action_type(value: Any) -> Optional[ActionType]:
     Returns:
         Экземпляр ActionType или None, если конвертация не удалась
     """
-    return safe_enum_convert(value, ActionType) 
\ No newline at end of file
+    return safe_enum_convert(value, ActionType) 
+
+def day_range(value: Union[date, datetime], days: int = 1) -> Tuple[datetime, datetime]:
+    """
+    Полуоткрытый интервал [начало дня, начало дня + days) в UTC.
+
+    Условие created_at >= start AND created_at < end использует индексы и
+    отсечение секций, в отличие от DATE(created_at) = :day.
+
+    Args:
+        value: Дата или момент времени внутри первого дня
+        days: Длина интервала в днях
+
+    Returns:
+        Кортеж (start, end) с timezone-aware datetime
+    """
+    if isinstance(value, datetime):
+        if value.tzinfo is not None:
+            value = value.astimezone(timezone.utc)
+        value = value.date()
+    start = datetime.combine(value, time.min, tzinfo=timezone.utc)
+    return start, start + timedelta(days=days)
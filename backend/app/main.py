@@ -13,6 +13,8 @@ from fastapi.responses import JSONResponse
 from pydantic import BaseModel, Field
 from app.adapters import create_adapter
 from app.adapters.base import AdapterError
+from app.api.generated_images import router as generated_images_router
+from app.core.query_counter import QueryBudgetMiddleware
 
 # Initialize FastAPI application
 app = FastAPI(
@@ -33,6 +35,12 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Count SQL queries per request and enforce endpoint query budgets
+app.add_middleware(QueryBudgetMiddleware)
+
+# Serve generated images with content-hash ETags and immutable caching
+app.include_router(generated_images_router)
+
 # Initialize AI adapter
 try:
     adapter = create_adapter()
@@ -291,6 +299,27 @@ async def shutdown_event():
     """Run on application shutdown."""
     print("👋 Shutting down AI Educational Content Generator")
 
+    # Drain queued tracking events; unwritten ones go to the spill files
+    try:
+        from app.services.tracking.event_bus import tracking_event_bus
+        await tracking_event_bus.stop()
+    except Exception as e:
+        print(f"⚠️ Failed to flush tracking events: {e}")
+
+    # Stop the course export rendering worker processes
+    try:
+        from app.services.course.export_renderer import get_course_export_renderer
+        get_course_export_renderer().shutdown()
+    except Exception as e:
+        print(f"⚠️ Failed to stop export renderer: {e}")
+
+    # Stop the image variant worker processes
+    try:
+        from app.services.content.image_store import get_image_store
+        get_image_store().shutdown()
+    except Exception as e:
+        print(f"⚠️ Failed to stop image store: {e}")
+
 
 if __name__ == "__main__":
     import uvicorn
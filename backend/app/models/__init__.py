@@ -1,5 +1,5 @@
 from .user import User
-from .achievements import Achievement, UserAchievement, UserAction
+from .achievements import Achievement, UserAchievement, UserAction, UserAchievementCounters
 from .tracking import (
     UsageLog,
     DailyUsage,
@@ -14,7 +14,7 @@ from .statistics import (
 )
 from .feature_usage import FeatureUsage, FeatureUsageMetrics
 from .analytics_data import AnalyticsData, DetailedGenerationMetrics, PurchaseAnalytics # Добавлено PurchaseAnalytics
-from .content import Generation, Image, VideoTranscript
+from .content import Generation, Image, VideoTranscript, PromptTranslation
 from .point_transaction import PointTransaction
 from .course import Course, Lesson, Activity, LessonTemplate
 from .link_click import LinkClick
@@ -31,6 +31,11 @@ from .point_transaction import PointTransaction
 from .promocode import PromoCode, PromoCodeUsage, PromoCodeType, PromoCodeUsageType
 from .broadcast import ScheduledMessage
 from .payment import Payment
+from .referral import ReferralClosure, ReferralSubtreeCount
+from .analytics_rollup import (
+    AnalyticsRollupHourly, AnalyticsRollupDaily, AnalyticsRollupWatermark, MaterializedViewRefresh,
+    UserActivityBitmap, UserActivityBitmapDelta
+)
 
 __all__ = [
     # Пользователи
@@ -40,11 +45,13 @@ __all__ = [
     'Achievement',
     'UserAchievement',
     'UserAction',
+    'UserAchievementCounters',
 
     # Контент
     'Generation',
     'Image',
     'VideoTranscript',
+    'PromptTranslation',
 
     # Трекинг и статистика
     'UsageLog',
@@ -103,5 +110,17 @@ __all__ = [
     'ScheduledMessage',
 
     # Платежи
-    'Payment'
+    'Payment',
+
+    # Реферальное дерево
+    'ReferralClosure',
+    'ReferralSubtreeCount',
+
+    # Агрегаты аналитики
+    'AnalyticsRollupHourly',
+    'AnalyticsRollupDaily',
+    'AnalyticsRollupWatermark',
+    'MaterializedViewRefresh',
+    'UserActivityBitmap',
+    'UserActivityBitmapDelta'
 ]
@@ -1,7 +1,7 @@
 from sqlalchemy.ext.asyncio import AsyncAttrs
 from sqlalchemy.orm import Mapped, mapped_column, relationship
-from sqlalchemy import ForeignKey, JSON, Enum, String
-from datetime import datetime, timezone
+from sqlalchemy import ForeignKey, JSON, Enum, String, Date, Index
+from datetime import datetime, timezone, date
 from typing import Optional, Dict
 from ..core.database import Base
 from ..core.constants import ActionType, ContentType
@@ -37,6 +37,28 @@ class UserAchievement(AsyncAttrs, Base):
     user = relationship("User", back_populates="achievements", lazy="selectin")
     achievement = relationship("Achievement", back_populates="user_achievements", lazy="selectin")
 
+    __table_args__ = (
+        Index('idx_user_achievements_user_achievement', 'user_id', 'achievement_id'),
+    )
+
+
+class UserAchievementCounters(AsyncAttrs, Base):
+    """Материализованные счетчики пользователя для инкрементальной проверки достижений"""
+    __tablename__ = "user_achievement_counters"
+
+    user_id: Mapped[int] = mapped_column(ForeignKey("users.id"), primary_key=True)
+    generations_total: Mapped[int] = mapped_column(default=0)
+    generations_by_type: Mapped[Dict] = mapped_column(JSON, default=dict)
+    images_count: Mapped[int] = mapped_column(default=0)
+    invites_count: Mapped[int] = mapped_column(default=0)
+    streak_days: Mapped[int] = mapped_column(default=0)
+    last_active_date: Mapped[Optional[date]] = mapped_column(Date, nullable=True)
+    # Последние учтенные generations.id и images.id: счетчики считаются по
+    # сохраненным строкам, поэтому повторная проверка ничего не добавляет
+    last_generation_id: Mapped[int] = mapped_column(default=0)
+    last_image_id: Mapped[int] = mapped_column(default=0)
+    updated_at: Mapped[datetime] = mapped_column(default=lambda: datetime.now(timezone.utc))
+
 
 class UserAction(AsyncAttrs, Base):
     __tablename__ = "user_actions"
@@ -1,10 +1,11 @@
 from sqlalchemy.ext.asyncio import AsyncAttrs
 from sqlalchemy.orm import Mapped, mapped_column
-from sqlalchemy import ForeignKey, JSON, Enum, func, String, DateTime # Добавлен импорт String
+from sqlalchemy import ForeignKey, JSON, Enum, func, String, DateTime, Identity # Добавлен импорт String
 from datetime import datetime, timezone
 from typing import Dict, List, Optional
 from ..core.database import Base
 from ..core.constants import ContentType
+from ..core.utils import day_range
 from .user import User
 
 class AnalyticsData(AsyncAttrs, Base):
@@ -46,8 +47,9 @@ class AnalyticsData(AsyncAttrs, Base):
             func.count(User.id).filter(User.last_active >= date)
         )
 
+        day_start, day_end = day_range(date)
         new_users = await session.scalar(
-            func.count(User.id).filter(func.date(User.created_at) == date)
+            func.count(User.id).filter(User.created_at >= day_start, User.created_at < day_end)
         )
 
         # Создаем снапшот
@@ -63,10 +65,13 @@ class AnalyticsData(AsyncAttrs, Base):
 
 class DetailedGenerationMetrics(AsyncAttrs, Base):
     __tablename__ = "detailed_generation_metrics"
+    # Помесячное секционирование, см. services/maintenance/partitioning.py
+    __table_args__ = {"postgresql_partition_by": "RANGE (date)"}
 
     # Основные поля
-    id: Mapped[int] = mapped_column(primary_key=True)
-    date: Mapped[datetime] = mapped_column(DateTime(timezone=True), index=True, default=lambda: datetime.now(timezone.utc))
+    # id - identity на PostgreSQL: autoincrement в составном ключе SQLite не поддерживает
+    id: Mapped[int] = mapped_column(Identity(), primary_key=True)
+    date: Mapped[datetime] = mapped_column(DateTime(timezone=True), primary_key=True, index=True, default=lambda: datetime.now(timezone.utc))
     content_type: Mapped[ContentType] = mapped_column()
 
     # Метрики
@@ -86,9 +91,10 @@ class DetailedGenerationMetrics(AsyncAttrs, Base):
         from .content import Generation  # Импорт здесь во избежание циклических зависимостей
 
         # Базовый запрос для фильтрации по дате и типу контента
+        day_start, day_end = day_range(date)
         base_query = (
             Generation.__table__.select()
-            .where(func.date(Generation.created_at) == date)
+            .where(Generation.created_at >= day_start, Generation.created_at < day_end)
             .where(Generation.type == content_type)
         )
 
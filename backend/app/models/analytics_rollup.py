@@ -0,0 +1,127 @@
+from sqlalchemy.ext.asyncio import AsyncAttrs
+from sqlalchemy.orm import Mapped, mapped_column
+from sqlalchemy import String, DateTime, Date, JSON, BigInteger, LargeBinary, Text, Index
+from datetime import datetime, date, timezone
+from typing import List, Optional
+from ..core.database import Base
+
+
+class AnalyticsRollupHourly(AsyncAttrs, Base):
+    """Почасовые агрегаты событий аналитики.
+
+    Одна строка - один час по одному источнику (payments, generations и т.д.),
+    категории (тип платежа, тип контента...) и тарифу.
+    """
+    __tablename__ = "analytics_rollup_hourly"
+
+    source: Mapped[str] = mapped_column(String(32), primary_key=True)
+    bucket_start: Mapped[datetime] = mapped_column(DateTime(timezone=True), primary_key=True)
+    category: Mapped[str] = mapped_column(String(64), primary_key=True)
+    tariff: Mapped[str] = mapped_column(String(32), primary_key=True)
+
+    events_count: Mapped[int] = mapped_column(BigInteger, default=0)
+    success_count: Mapped[int] = mapped_column(BigInteger, default=0)
+    amount_sum: Mapped[float] = mapped_column(default=0.0)
+    amount_abs_sum: Mapped[float] = mapped_column(default=0.0)
+    # HyperLogLog-скетч уникальных пользователей (services/analytics/sketches.py)
+    users_sketch: Mapped[Optional[bytes]] = mapped_column(LargeBinary, nullable=True)
+    # DDSketch распределения значения источника (например, длительности генерации)
+    value_sketch: Mapped[Optional[bytes]] = mapped_column(LargeBinary, nullable=True)
+
+
+class AnalyticsRollupDaily(AsyncAttrs, Base):
+    """Дневные агрегаты, собираемые из почасовых"""
+    __tablename__ = "analytics_rollup_daily"
+
+    source: Mapped[str] = mapped_column(String(32), primary_key=True)
+    day: Mapped[date] = mapped_column(Date, primary_key=True)
+    category: Mapped[str] = mapped_column(String(64), primary_key=True)
+    tariff: Mapped[str] = mapped_column(String(32), primary_key=True)
+
+    events_count: Mapped[int] = mapped_column(BigInteger, default=0)
+    success_count: Mapped[int] = mapped_column(BigInteger, default=0)
+    amount_sum: Mapped[float] = mapped_column(default=0.0)
+    amount_abs_sum: Mapped[float] = mapped_column(default=0.0)
+    users_sketch: Mapped[Optional[bytes]] = mapped_column(LargeBinary, nullable=True)
+    value_sketch: Mapped[Optional[bytes]] = mapped_column(LargeBinary, nullable=True)
+    # Количество событий по часам суток (UTC), 24 значения
+    hourly_counts: Mapped[List[int]] = mapped_column(JSON, default=list)
+
+
+class AnalyticsRollupWatermark(AsyncAttrs, Base):
+    """Граница, до которой (не включительно) источник уже свернут в агрегаты"""
+    __tablename__ = "analytics_rollup_watermarks"
+
+    source: Mapped[str] = mapped_column(String(32), primary_key=True)
+    watermark: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False)
+    # Последний учтенный id источника: строки с большим id и временем до
+    # watermark записаны с опозданием, их часы сворачиваются заново
+    last_id: Mapped[Optional[int]] = mapped_column(BigInteger, nullable=True)
+    # Последнее учтенное время изменения строк источника (для изменяемых строк, например платежей)
+    last_changed_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), nullable=True)
+    updated_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True),
+        default=lambda: datetime.now(timezone.utc),
+        onupdate=lambda: datetime.now(timezone.utc)
+    )
+
+
+class MaterializedViewRefresh(AsyncAttrs, Base):
+    """Состояние обновления материализованного представления.
+
+    source_signature - счетчик изменений исходных таблиц на момент последнего
+    обновления; пока он не меняется, обновление пропускается.
+    """
+    __tablename__ = "materialized_view_refreshes"
+
+    view_name: Mapped[str] = mapped_column(String(63), primary_key=True)
+    source_signature: Mapped[Optional[int]] = mapped_column(BigInteger, nullable=True)
+    refreshed_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), nullable=True)
+    checked_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), nullable=True)
+    last_duration_ms: Mapped[float] = mapped_column(default=0.0)
+    total_duration_ms: Mapped[float] = mapped_column(default=0.0)
+    refresh_count: Mapped[int] = mapped_column(BigInteger, default=0)
+    skip_count: Mapped[int] = mapped_column(BigInteger, default=0)
+    last_error: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
+
+
+class UserActivityBitmap(AsyncAttrs, Base):
+    """Битмап пользователей за день: бит i - пользователь с id = i.
+
+    kind = active - пользователи, активные в этот день (UTC),
+    kind = signup - зарегистрировавшиеся в этот день.
+    """
+    __tablename__ = "user_activity_bitmaps"
+
+    kind: Mapped[str] = mapped_column(String(16), primary_key=True)
+    day: Mapped[date] = mapped_column(Date, primary_key=True)
+    # Сжатый ActivityBitmap, см. services/analytics/bitmaps.py
+    bitmap: Mapped[bytes] = mapped_column(LargeBinary, nullable=False)
+    users_count: Mapped[int] = mapped_column(default=0)
+    updated_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True),
+        default=lambda: datetime.now(timezone.utc),
+        onupdate=lambda: datetime.now(timezone.utc)
+    )
+
+
+class UserActivityBitmapDelta(AsyncAttrs, Base):
+    """Добавка к битмапу дня от одной пачки шины трекинга.
+
+    Пачки только вставляют добавки и не блокируют строку дня в
+    user_activity_bitmaps; досвертка когорт сливает их в битмапы дней.
+    """
+    __tablename__ = "user_activity_bitmap_deltas"
+    __table_args__ = (
+        Index('ix_user_activity_bitmap_deltas_kind_day', 'kind', 'day'),
+    )
+
+    id: Mapped[int] = mapped_column(BigInteger, primary_key=True, autoincrement=True)
+    kind: Mapped[str] = mapped_column(String(16), nullable=False)
+    day: Mapped[date] = mapped_column(Date, nullable=False)
+    # Сжатый ActivityBitmap пользователей пачки за день
+    bitmap: Mapped[bytes] = mapped_column(LargeBinary, nullable=False)
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True),
+        default=lambda: datetime.now(timezone.utc)
+    )
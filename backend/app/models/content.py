@@ -1,6 +1,6 @@
 from sqlalchemy.ext.asyncio import AsyncAttrs
 from sqlalchemy.orm import Mapped, mapped_column, relationship
-from sqlalchemy import ForeignKey, Text, String, Index, Enum, DateTime
+from sqlalchemy import ForeignKey, Text, String, Index, Enum, DateTime, LargeBinary
 from datetime import datetime, timezone
 from typing import Optional
 from ..core.database import Base
@@ -18,7 +18,7 @@ class Generation(AsyncAttrs, Base):
     created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc))
 
     # Отношения
-    user = relationship("User", back_populates="generations", lazy="selectin")
+    user = relationship("User", back_populates="generations", lazy="select")
 
 
 class Image(AsyncAttrs, Base):
@@ -31,7 +31,7 @@ class Image(AsyncAttrs, Base):
     created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc))
 
     # Отношения
-    user = relationship("User", back_populates="images", lazy="selectin")
+    user = relationship("User", back_populates="images", lazy="select")
 
 
 class VideoTranscript(AsyncAttrs, Base):
@@ -39,11 +39,31 @@ class VideoTranscript(AsyncAttrs, Base):
 
     id: Mapped[int] = mapped_column(primary_key=True)
     video_id: Mapped[str] = mapped_column(String(50), index=True)
-    transcript: Mapped[str] = mapped_column(Text)
+    # Несжатый текст остается у старых записей; новые хранятся в transcript_gz
+    transcript: Mapped[str] = mapped_column(Text, default="")
+    # Сегменты "начало\tтекст" построчно, сжатые zlib (services/content/transcript_service.py)
+    transcript_gz: Mapped[Optional[bytes]] = mapped_column(LargeBinary, nullable=True)
     language: Mapped[str] = mapped_column(String(10))
     created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc))
     expires_at: Mapped[datetime] = mapped_column(DateTime(timezone=True))
 
     __table_args__ = (
         Index('idx_video_language', 'video_id', 'language'),
-    )
\ No newline at end of file
+    )
+
+
+class PromptTranslation(AsyncAttrs, Base):
+    """Память переводов промптов (services/content/translation_memory.py)"""
+    __tablename__ = "prompt_translations"
+
+    # SHA-256 нормализованного промпта
+    key: Mapped[str] = mapped_column(String(64), primary_key=True)
+    source_text: Mapped[str] = mapped_column(Text)
+    translation: Mapped[str] = mapped_column(Text)
+    hits: Mapped[int] = mapped_column(default=0)
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc))
+    last_used_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc))
+
+    __table_args__ = (
+        Index('idx_prompt_translations_last_used', 'last_used_at'),
+    )
@@ -62,9 +62,11 @@ class Course(AsyncAttrs, Base):
         cascade="all, delete-orphan",
         lazy="selectin"
     )
+    # Создатель не загружается вместе с курсом: selectin здесь тянул бы
+    # пользователя со всеми его коллекциями на каждую загрузку курса
     creator: Mapped["User"] = relationship(
         back_populates="courses",
-        lazy="selectin"
+        lazy="select"
     )
 
 class Lesson(AsyncAttrs, Base):
@@ -1,20 +1,24 @@
 from sqlalchemy.ext.asyncio import AsyncAttrs
 from sqlalchemy.orm import Mapped, mapped_column, relationship
-from sqlalchemy import String, Enum, JSON, ForeignKey, select, func
+from sqlalchemy import String, Enum, JSON, ForeignKey, DateTime, Identity, select, func
 from datetime import datetime, timezone
 from typing import Optional, Dict, List
 from ..core.database import Base
 from ..core.constants import ContentType, UserRole
+from ..core.utils import day_range
 
 
 class FeatureUsage(AsyncAttrs, Base):
     __tablename__ = "feature_usage"
+    # Помесячное секционирование, см. services/maintenance/partitioning.py
+    __table_args__ = {"postgresql_partition_by": "RANGE (created_at)"}
 
-    id: Mapped[int] = mapped_column(primary_key=True)
+    # id - identity на PostgreSQL: autoincrement в составном ключе SQLite не поддерживает
+    id: Mapped[int] = mapped_column(Identity(), primary_key=True)
     user_id: Mapped[int] = mapped_column(ForeignKey("users.id"))
     feature_type: Mapped[str] = mapped_column(String(50))  # lesson_plan, exercise, game, image, etc.
     content_type: Mapped[Optional[ContentType]] = mapped_column(Enum(ContentType), nullable=True)  # Для генераций
-    created_at: Mapped[datetime] = mapped_column(default=lambda: datetime.now(timezone.utc))
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), primary_key=True, default=lambda: datetime.now(timezone.utc))
     success: Mapped[bool] = mapped_column(default=True)
     usage_data: Mapped[Dict] = mapped_column(JSON, default=dict)  # Дополнительные данные о использовании
     error_type: Mapped[Optional[str]] = mapped_column(String(100), nullable=True)  # Тип ошибки, если success=False
@@ -87,7 +91,8 @@ class FeatureUsageMetrics(AsyncAttrs, Base):
     @classmethod
     async def get_by_date(cls, session, date: datetime) -> Optional["FeatureUsageMetrics"]:
         """Получает метрики за указанную дату"""
-        stmt = select(cls).where(func.date(cls.date) == date.date())
+        day_start, day_end = day_range(date)
+        stmt = select(cls).where(cls.date >= day_start, cls.date < day_end)
         result = await session.execute(stmt)
         return result.scalar_one_or_none()
 
@@ -148,7 +148,8 @@ class OptimizedQueries:
                     SUM(CASE WHEN type = 'image' THEN 1 ELSE 0 END) as today_images
                 FROM generations 
                 WHERE user_id = :user_id 
-                AND DATE(created_at) = CURRENT_DATE
+                AND created_at >= CURRENT_DATE
+                AND created_at < CURRENT_DATE + INTERVAL '1 day'
             )
             SELECT 
                 us.*, ds.today_generations, ds.today_images,
@@ -1,6 +1,7 @@
 from sqlalchemy.ext.asyncio import AsyncAttrs
 from sqlalchemy.orm import Mapped, mapped_column, relationship
-from sqlalchemy import String, Float, DateTime, ForeignKey, Text, JSON
+from sqlalchemy import String, Float, DateTime, ForeignKey, Text, Index, JSON, text
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.sql import func
 from datetime import datetime, timezone
 from typing import Optional, Dict, Any
@@ -8,6 +9,19 @@ from ..core.database import Base
 
 class Payment(AsyncAttrs, Base):
     __tablename__ = "payments"
+    __table_args__ = (
+        # Выборка завершенных платежей за период (финансовая аналитика, агрегаты)
+        Index('idx_payments_status_created_at', 'status', 'created_at'),
+        # Группировка дохода по тарифу из meta_data (services/analytics/financial_queries.py)
+        Index(
+            'idx_payments_completed_tariff_type',
+            text("(meta_data->>'tariff_type')"),
+            'created_at',
+            postgresql_where=text("status = 'completed'")
+        ),
+        # Платежи, изменившиеся после свертки (services/analytics/rollups.py)
+        Index('idx_payments_updated_at', 'updated_at'),
+    )
 
     id: Mapped[int] = mapped_column(primary_key=True, index=True)
     user_id: Mapped[int] = mapped_column(ForeignKey("users.id"), nullable=False)
@@ -17,7 +31,7 @@ class Payment(AsyncAttrs, Base):
     status: Mapped[str] = mapped_column(String(50), default="pending")  # "pending", "completed", "failed", "cancelled"
     payment_method: Mapped[Optional[str]] = mapped_column(String(50))  # "card", "yoomoney", "crypto", etc.
     external_payment_id: Mapped[Optional[str]] = mapped_column(String(255))  # ID платежа в платежной системе
-    meta_data: Mapped[Optional[Dict[str, Any]]] = mapped_column(JSON)  # Дополнительные данные (тип тарифа, количество баллов и т.д.)
+    meta_data: Mapped[Optional[Dict[str, Any]]] = mapped_column(JSON().with_variant(JSONB(), "postgresql"))  # Дополнительные данные (тип тарифа, количество баллов и т.д.)
     description: Mapped[Optional[str]] = mapped_column(Text)
     created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now())
     updated_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
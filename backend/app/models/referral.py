@@ -0,0 +1,33 @@
+from sqlalchemy.ext.asyncio import AsyncAttrs
+from sqlalchemy.orm import Mapped, mapped_column
+from sqlalchemy import ForeignKey, Index
+from ..core.database import Base
+
+
+class ReferralClosure(AsyncAttrs, Base):
+    """Таблица замыкания реферального дерева: все пары (предок, потомок) с глубиной.
+
+    Каждый пользователь связан сам с собой строкой глубины 0,
+    приглашенный напрямую пользователь - строкой глубины 1 и т.д.
+    """
+    __tablename__ = "referral_closure"
+
+    ancestor_id: Mapped[int] = mapped_column(ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    descendant_id: Mapped[int] = mapped_column(ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    depth: Mapped[int] = mapped_column(nullable=False, default=0)
+
+    __table_args__ = (
+        # Цепочка предков пользователя
+        Index('idx_referral_closure_descendant_depth', 'descendant_id', 'depth'),
+        # Поддерево пользователя по уровням
+        Index('idx_referral_closure_ancestor_depth', 'ancestor_id', 'depth'),
+    )
+
+
+class ReferralSubtreeCount(AsyncAttrs, Base):
+    """Предрасчитанное количество рефералов пользователя на каждом уровне дерева"""
+    __tablename__ = "referral_subtree_counts"
+
+    ancestor_id: Mapped[int] = mapped_column(ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    depth: Mapped[int] = mapped_column(primary_key=True)
+    descendants_count: Mapped[int] = mapped_column(nullable=False, default=0)
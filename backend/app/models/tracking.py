@@ -1,6 +1,6 @@
 from sqlalchemy.ext.asyncio import AsyncAttrs
 from sqlalchemy.orm import Mapped, mapped_column, relationship
-from sqlalchemy import ForeignKey, JSON, Enum, String, UniqueConstraint, DateTime, Boolean # <-- Добавлены импорты
+from sqlalchemy import ForeignKey, JSON, Enum, String, UniqueConstraint, DateTime, Boolean, Identity # <-- Добавлены импорты
 from datetime import datetime, timezone
 from typing import Optional, Dict, List
 from ..core.database import Base
@@ -9,8 +9,11 @@ from ..core.constants import ActionType, ContentType
 
 class UsageLog(AsyncAttrs, Base):
     __tablename__ = "usage_logs"
+    # Помесячное секционирование, см. services/maintenance/partitioning.py
+    __table_args__ = {"postgresql_partition_by": "RANGE (created_at)"}
 
-    id: Mapped[int] = mapped_column(primary_key=True)
+    # id - identity на PostgreSQL: autoincrement в составном ключе SQLite не поддерживает
+    id: Mapped[int] = mapped_column(Identity(), primary_key=True)
     user_id: Mapped[int] = mapped_column(ForeignKey("users.id"))
     action_type: Mapped[ActionType] = mapped_column(Enum(ActionType))
     content_type: Mapped[Optional[ContentType]] = mapped_column(Enum(ContentType), nullable=True)
@@ -18,10 +21,11 @@ class UsageLog(AsyncAttrs, Base):
     daily_usage_count: Mapped[int] = mapped_column(default=1)
     extra_data: Mapped[Dict] = mapped_column(JSON)
     skip_limits: Mapped[bool] = mapped_column(Boolean, default=False)  # Флаг для пропуска лимитов (генерация за баллы)
-    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc))
+    # Ключ секционирования входит в первичный ключ
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), primary_key=True, default=lambda: datetime.now(timezone.utc))
 
     # Отношения
-    user = relationship("User", back_populates="usage_logs", lazy="selectin")
+    user = relationship("User", back_populates="usage_logs", lazy="select")
 
 class DailyUsage(AsyncAttrs, Base):
     __tablename__ = "daily_usage"
@@ -46,7 +50,7 @@ class DailyUsage(AsyncAttrs, Base):
     points_spent: Mapped[int] = mapped_column(default=0)
 
     # Отношения
-    user = relationship("User", back_populates="daily_usage", lazy="selectin")
+    user = relationship("User", back_populates="daily_usage", lazy="select")
 
 
 class UsageStatistics(AsyncAttrs, Base):
@@ -77,37 +81,48 @@ class UsageStatistics(AsyncAttrs, Base):
     updated_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), onupdate=lambda: datetime.now(timezone.utc))
 
     # Отношения
-    user = relationship("User", back_populates="usage_statistics", lazy="selectin")
+    user = relationship("User", back_populates="usage_statistics", lazy="select")
 
 
 class GenerationMetrics(AsyncAttrs, Base):
     __tablename__ = "generation_metrics"
+    # Помесячное секционирование, см. services/maintenance/partitioning.py
+    __table_args__ = {"postgresql_partition_by": "RANGE (created_at)"}
 
-    id: Mapped[int] = mapped_column(primary_key=True)
+    # id - identity на PostgreSQL: autoincrement в составном ключе SQLite не поддерживает
+    id: Mapped[int] = mapped_column(Identity(), primary_key=True)
     user_id: Mapped[int] = mapped_column(ForeignKey("users.id"))
     content_type: Mapped[ContentType] = mapped_column(Enum(ContentType))
     prompt: Mapped[str] = mapped_column(String(500))
-    tokens_used: Mapped[int] = mapped_column()
+    tokens_used: Mapped[int] = mapped_column()  # токены ответа
+    # Бюджет токенов (services/content/token_budget.py)
+    prompt_tokens: Mapped[Optional[int]] = mapped_column(nullable=True)
+    predicted_tokens: Mapped[Optional[int]] = mapped_column(nullable=True)
+    max_tokens: Mapped[Optional[int]] = mapped_column(nullable=True)
+    request_kind: Mapped[Optional[str]] = mapped_column(String(50), nullable=True)
     generation_time: Mapped[float] = mapped_column()  # в секундах
     success: Mapped[bool] = mapped_column(default=True)
     error_type: Mapped[Optional[str]] = mapped_column(String(100), nullable=True)
-    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc))
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), primary_key=True, default=lambda: datetime.now(timezone.utc))
 
     # Отношения
-    user = relationship("User", back_populates="generation_metrics", lazy="selectin")
+    user = relationship("User", back_populates="generation_metrics", lazy="select")
 
 
 class UserActivityLog(AsyncAttrs, Base):
     __tablename__ = "user_activity_logs"
+    # Помесячное секционирование, см. services/maintenance/partitioning.py
+    __table_args__ = {"postgresql_partition_by": "RANGE (created_at)"}
 
-    id: Mapped[int] = mapped_column(primary_key=True)
+    # id - identity на PostgreSQL: autoincrement в составном ключе SQLite не поддерживает
+    id: Mapped[int] = mapped_column(Identity(), primary_key=True)
     user_id: Mapped[int] = mapped_column(ForeignKey("users.id"))
     action_type: Mapped[ActionType] = mapped_column(Enum(ActionType))
     content_type: Mapped[Optional[ContentType]] = mapped_column(Enum(ContentType), nullable=True)
     ip_address: Mapped[Optional[str]] = mapped_column(String(45), nullable=True)
     user_agent: Mapped[Optional[str]] = mapped_column(String(200), nullable=True)
     activity_metadata: Mapped[Dict] = mapped_column(JSON, default=dict)
-    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc))
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), primary_key=True, default=lambda: datetime.now(timezone.utc))
 
     # Отношения
-    user = relationship("User", back_populates="activity_logs", lazy="selectin")
+    user = relationship("User", back_populates="activity_logs", lazy="select")
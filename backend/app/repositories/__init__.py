@@ -1,8 +1,15 @@
 # repositories/__init__.py
 from .user import UserRepository
 from .generation import GenerationRepository
+from .course import CourseRepository, LessonRepository
+from .loading import LOADING_PROFILES, apply_profile, loader_options
 
 __all__ = [
     'UserRepository',
-    'GenerationRepository'
-]
\ No newline at end of file
+    'GenerationRepository',
+    'CourseRepository',
+    'LessonRepository',
+    'LOADING_PROFILES',
+    'apply_profile',
+    'loader_options'
+]
@@ -2,26 +2,35 @@
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, update, delete
 from typing import TypeVar, Type, Optional, List, Any, Dict
+from .loading import apply_profile
 
 ModelType = TypeVar("ModelType")
 
 class BaseRepository:
+    # Профиль загрузки связей по умолчанию (см. loading.LOADING_PROFILES);
+    # None - загрузка по lazy=... моделей
+    default_profile: Optional[str] = None
+
     def __init__(self, session: AsyncSession, model: Type[ModelType]):
         self.session = session
         self.model = model
 
-    async def get(self, id: Any) -> Optional[ModelType]:
-        query = select(self.model).where(self.model.id == id)
+    def _select(self, profile: Optional[str] = None):
+        """select(model) с профилем загрузки (явным или по умолчанию репозитория)"""
+        return apply_profile(select(self.model), profile or self.default_profile)
+
+    async def get(self, id: Any, profile: Optional[str] = None) -> Optional[ModelType]:
+        query = self._select(profile).where(self.model.id == id)
         result = await self.session.execute(query)
         return result.scalar_one_or_none()
 
-    async def get_by_field(self, field: str, value: Any) -> Optional[ModelType]:
-        query = select(self.model).where(getattr(self.model, field) == value)
+    async def get_by_field(self, field: str, value: Any, profile: Optional[str] = None) -> Optional[ModelType]:
+        query = self._select(profile).where(getattr(self.model, field) == value)
         result = await self.session.execute(query)
         return result.scalar_one_or_none()
 
-    async def get_all(self, skip: int = 0, limit: int = 100) -> List[ModelType]:
-        query = select(self.model).offset(skip).limit(limit)
+    async def get_all(self, skip: int = 0, limit: int = 100, profile: Optional[str] = None) -> List[ModelType]:
+        query = self._select(profile).offset(skip).limit(limit)
         result = await self.session.execute(query)
         return result.scalars().all()
 
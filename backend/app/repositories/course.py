@@ -0,0 +1,53 @@
+# app/repositories/course.py
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, func, case
+from typing import Optional, List, Dict, Any
+from .base import BaseRepository
+from ..models.course import Course, Lesson
+
+
+class CourseRepository(BaseRepository):
+    # Без явного профиля курс загружается без уроков
+    default_profile = "course_summary"
+
+    def __init__(self, session: AsyncSession):
+        super().__init__(session, Course)
+
+    async def get_full(self, course_id: int) -> Optional[Course]:
+        """Курс с уроками и активностями"""
+        return await self.get(course_id, profile="course_full")
+
+    async def get_template(self, template_id: int, profile: Optional[str] = "course_full") -> Optional[Course]:
+        """Шаблон курса (is_template) с уроками и активностями"""
+        query = self._select(profile).where(self.model.id == template_id, self.model.is_template == True)
+        result = await self.session.execute(query)
+        return result.scalar_one_or_none()
+
+    async def get_progress(self, course_id: int) -> Optional[Dict[str, Any]]:
+        """Прогресс по курсу одним агрегирующим запросом (уроки не загружаются)"""
+        query = (
+            select(
+                func.count(Lesson.id).label("total_lessons"),
+                func.count(case((Lesson.is_completed == True, Lesson.id))).label("completed_lessons"),
+                func.coalesce(func.sum(Lesson.duration), 0).label("total_duration"),
+                func.coalesce(func.sum(case((Lesson.is_completed == True, Lesson.duration), else_=0)), 0)
+                .label("completed_duration"),
+                func.min(case((Lesson.is_completed == False, Lesson.order))).label("next_lesson_order")
+            )
+            .where(Lesson.course_id == course_id)
+        )
+        result = await self.session.execute(query)
+        return dict(result.mappings().one())
+
+
+class LessonRepository(BaseRepository):
+    default_profile = "lesson_with_activities"
+
+    def __init__(self, session: AsyncSession):
+        super().__init__(session, Lesson)
+
+    async def get_by_course(self, course_id: int, profile: Optional[str] = None) -> List[Lesson]:
+        """Уроки курса по порядку"""
+        query = self._select(profile).where(self.model.course_id == course_id).order_by(self.model.order)
+        result = await self.session.execute(query)
+        return result.scalars().all()
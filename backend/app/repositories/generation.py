@@ -5,6 +5,7 @@ from typing import List, Optional, Dict
 from datetime import datetime
 from ..models import Generation
 from ..core.constants import ContentType
+from .loading import apply_profile
 
 # repositories/generation.py
 class GenerationRepository:
@@ -34,7 +35,8 @@ class GenerationRepository:
 
         # Get paginated results
         result = await self.session.execute(
-            query.order_by(desc(Generation.created_at))
+            apply_profile(query, "generation_summary")
+            .order_by(desc(Generation.created_at))
             .offset(skip)
             .limit(limit)
         )
@@ -43,7 +45,7 @@ class GenerationRepository:
         return items, total
 
     async def get_by_id(self, generation_id: int) -> Optional[Generation]:
-        query = select(Generation).where(Generation.id == generation_id)
+        query = apply_profile(select(Generation), "generation_summary").where(Generation.id == generation_id)
         result = await self.session.execute(query)
         return result.scalar_one_or_none()
 
@@ -65,5 +67,5 @@ class GenerationRepository:
         if end_date:
             query = query.where(Generation.created_at <= end_date)
 
-        result = await self.session.execute(query)
+        result = await self.session.execute(apply_profile(query, "generation_summary"))
         return result.scalars().all()
\ No newline at end of file
@@ -0,0 +1,83 @@
+# app/repositories/loading.py
+"""
+Именованные профили загрузки связей для репозиториев.
+
+Профиль перечисляет цепочки связей, которые загружаются selectinload;
+остальные связи сущностей профиля (включая lazy="selectin" моделей)
+не загружаются заранее - lazyload('*'). В тестах (settings.TESTING)
+вместо lazyload ставится raiseload('*', sql_only=True): обращение к связи
+вне профиля, которое потребовало бы запроса к БД, падает сразу, а не
+превращается в N+1.
+"""
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy.orm import defaultload, lazyload, raiseload, selectinload
+
+from ..core.config import settings
+from ..models.content import Generation
+from ..models.course import Course, Lesson
+from ..models.user import User
+
+# Имя профиля -> (модель, цепочки связей для selectinload)
+LOADING_PROFILES: Dict[str, Tuple[type, Tuple[Tuple[Any, ...], ...]]] = {
+    # Поля курса без уроков (списки, проверки существования, обновление счетчиков)
+    "course_summary": (Course, ()),
+    # Курс целиком: уроки и их активности (GET /courses/{id}, клонирование, дерево шаблона)
+    "course_full": (Course, ((Course.lessons, Lesson.activities),)),
+    # Поля урока без активностей (контекст предыдущих уроков)
+    "lesson_summary": (Lesson, ()),
+    # Урок с активностями и курсом (материалы и генерация по уроку)
+    "lesson_with_activities": (Lesson, ((Lesson.activities,), (Lesson.course,))),
+    # Пользователь без коллекций (генерации, логи, тарифы и т.д.)
+    "user_summary": (User, ()),
+    "generation_summary": (Generation, ()),
+}
+
+
+def strict_loading_enabled() -> bool:
+    """raiseload вместо lazyload для связей вне профиля (по умолчанию в тестах)"""
+    return settings.TESTING
+
+
+def _not_loaded(loader=None, strict: bool = False):
+    """Wildcard для связей, не перечисленных в профиле (на корне или в конце цепочки)"""
+    if loader is None:
+        return raiseload("*", sql_only=True) if strict else lazyload("*")
+    return loader.raiseload("*", sql_only=True) if strict else loader.lazyload("*")
+
+
+def loader_options(profile: str, strict: Optional[bool] = None) -> List[Any]:
+    """Опции загрузки для select(...).options(*loader_options(profile))"""
+    if profile not in LOADING_PROFILES:
+        raise ValueError(f"Unknown loading profile: {profile}")
+    if strict is None:
+        strict = strict_loading_enabled()
+
+    _, paths = LOADING_PROFILES[profile]
+    options = [_not_loaded(strict=strict)]
+    seen = set()
+    for path in paths:
+        loader = None
+        for depth, attribute in enumerate(path, start=1):
+            loader = selectinload(attribute) if loader is None else loader.selectinload(attribute)
+            prefix = path[:depth]
+            if prefix in seen:
+                continue
+            seen.add(prefix)
+            # У загруженных по цепочке сущностей остальные связи тоже не загружаются
+            chain = defaultload(prefix[0])
+            for nested in prefix[1:]:
+                chain = chain.defaultload(nested)
+            options.append(_not_loaded(chain, strict))
+        options.append(loader)
+    return options
+
+
+def apply_profile(query, profile: Optional[str], strict: Optional[bool] = None):
+    """Применяет профиль загрузки к запросу; profile=None оставляет загрузку моделей"""
+    if profile is None:
+        return query
+    model, _ = LOADING_PROFILES.get(profile, (None, ()))
+    if model is not None and query.column_descriptions[0].get("entity") is not model:
+        raise ValueError(f"Loading profile {profile} is defined for {model.__name__}")
+    return query.options(*loader_options(profile, strict))
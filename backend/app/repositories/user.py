@@ -8,6 +8,9 @@ from ..models.user import User
 from ..core.constants import UserRole
 
 class UserRepository(BaseRepository):
+    # Коллекции пользователя (генерации, логи, тарифы...) не загружаются
+    default_profile = "user_summary"
+
     def __init__(self, session: AsyncSession):
         super().__init__(session, User)
 
@@ -17,13 +20,13 @@ class UserRepository(BaseRepository):
 
     async def get_active_users(self) -> List[User]:
         """Получить активных пользователей"""
-        query = select(self.model).where(self.model.has_access == True)
+        query = self._select().where(self.model.has_access == True)
         result = await self.session.execute(query)
         return result.scalars().all()
 
     async def get_users_by_role(self, role: UserRole) -> List[User]:
         """Получить пользователей по роли"""
-        query = select(self.model).where(self.model.role == role)
+        query = self._select().where(self.model.role == role)
         result = await self.session.execute(query)
         return result.scalars().all()
 
@@ -33,7 +36,7 @@ class UserRepository(BaseRepository):
 
     async def get_users_with_valid_tariff(self) -> List[User]:
         """Получить пользователей с активным тарифом"""
-        query = select(self.model).where(
+        query = self._select().where(
             and_(
                 self.model.tariff.isnot(None),
                 self.model.tariff_valid_until > datetime.now(timezone.utc)
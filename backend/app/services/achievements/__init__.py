@@ -2,10 +2,12 @@ from .manager import AchievementManager
 from .checker import AchievementChecker
 from .conditions import AchievementConditions
 from .rewards import RewardManager
+from .progress_engine import AchievementProgressEngine
 
 __all__ = [
     'AchievementManager',  # Основной менеджер достижений
     'AchievementChecker',  # Проверка условий достижений
     'AchievementConditions',  # Определение условий достижений
-    'RewardManager'  # Управление наградами за достижения
+    'RewardManager',  # Управление наградами за достижения
+    'AchievementProgressEngine'  # Инкрементальный расчет прогресса по событиям
 ]
\ No newline at end of file
@@ -0,0 +1,454 @@
+import time
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta, timezone
+from typing import Dict, List, Optional, Set, Tuple, Union
+
+from sqlalchemy import select, func
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import lazyload
+
+from ...models import (
+    Achievement,
+    UserAchievement,
+    UserAchievementCounters,
+    UserAction,
+    User,
+    Generation,
+    Image
+)
+from ...core.constants import ActionType, ContentType
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Метрики, которые отслеживаются материализованными счетчиками
+METRIC_GENERATIONS = "generations"
+METRIC_IMAGES = "images"
+METRIC_STREAK = "streak"
+METRIC_INVITES = "invites"
+
+# Действия, которые увеличивают счетчик генераций
+GENERATION_ACTIONS = {
+    ActionType.GENERATION,
+    ActionType.LESSON_PLAN_GENERATION,
+    ActionType.EXERCISE_GENERATION,
+    ActionType.GAME_GENERATION,
+    ActionType.TEXT_ANALYSIS_GENERATION,
+}
+
+# Действия, которые увеличивают счетчик изображений
+IMAGE_ACTIONS = {
+    ActionType.IMAGE,
+    ActionType.IMAGE_GENERATION,
+}
+
+# Действия, после которых нужно синхронизировать счетчик приглашений
+INVITE_ACTIONS = {
+    ActionType.INVITE_USED,
+    ActionType.INVITE_REWARD,
+    ActionType.REFERRAL_REWARD,
+}
+
+# Глубина истории для восстановления серии при первичном заполнении счетчиков
+STREAK_BACKFILL_DAYS = 366
+
+
+@dataclass(frozen=True)
+class IndexedAchievement:
+    """Достижение в индексе: метрика, порог и фильтр по типу контента"""
+    achievement_id: int
+    metric: str
+    required: int
+    content_type: Optional[str] = None
+
+    def progress(self, counters: UserAchievementCounters) -> int:
+        """Вычисляет прогресс (0-100) по текущим счетчикам"""
+        if self.required <= 0:
+            return 0
+
+        if self.metric == METRIC_GENERATIONS:
+            if self.content_type:
+                current = (counters.generations_by_type or {}).get(self.content_type, 0)
+            else:
+                current = counters.generations_total or 0
+        elif self.metric == METRIC_IMAGES:
+            current = counters.images_count or 0
+        elif self.metric == METRIC_STREAK:
+            current = counters.streak_days or 0
+        elif self.metric == METRIC_INVITES:
+            current = counters.invites_count or 0
+        else:
+            return 0
+
+        return int(min(100.0, (current / self.required) * 100))
+
+
+def parse_achievement_conditions(
+        achievement_id: int,
+        conditions: Optional[Dict]
+) -> Optional[IndexedAchievement]:
+    """Преобразует JSON-условия достижения в элемент индекса.
+
+    Поддерживает оба формата условий: из AchievementConditions
+    (generation_count/image_count/consecutive_days/invites_count)
+    и из create_default_achievements (action_type + count).
+    """
+    if not conditions:
+        return None
+
+    content_type = conditions.get('content_type') or None
+
+    if 'generation_count' in conditions:
+        return IndexedAchievement(achievement_id, METRIC_GENERATIONS, int(conditions['generation_count'] or 0), content_type)
+    if 'image_count' in conditions:
+        return IndexedAchievement(achievement_id, METRIC_IMAGES, int(conditions['image_count'] or 0))
+    if 'consecutive_days' in conditions:
+        return IndexedAchievement(achievement_id, METRIC_STREAK, int(conditions['consecutive_days'] or 0))
+    if 'invites_count' in conditions:
+        return IndexedAchievement(achievement_id, METRIC_INVITES, int(conditions['invites_count'] or 0))
+    if 'count' in conditions and conditions.get('action_type') == ActionType.GENERATION.value:
+        return IndexedAchievement(achievement_id, METRIC_GENERATIONS, int(conditions['count'] or 0), content_type)
+
+    return None
+
+
+def advance_streak(
+        last_active_date: Optional[date],
+        streak_days: int,
+        today: date
+) -> Tuple[int, bool]:
+    """Возвращает новую длину серии и флаг ее изменения"""
+    if last_active_date == today:
+        return streak_days, False
+    if last_active_date == today - timedelta(days=1):
+        return streak_days + 1, True
+    return 1, True
+
+
+class AchievementProgressEngine:
+    """Событийный расчет прогресса достижений.
+
+    Вместо пересчета всех достижений по таблицам generations/user_actions
+    на каждое действие движок инкрементально обновляет материализованные
+    счетчики пользователя и пересчитывает только достижения, чья метрика
+    изменилась в этом событии.
+    """
+
+    # Индекс метрика -> достижения, общий для всех экземпляров в процессе
+    _index: Optional[Dict[str, List[IndexedAchievement]]] = None
+    _index_loaded_at: float = 0.0
+    index_ttl: int = 3600  # 1 час, как и кэш доступных достижений
+
+    def __init__(self, session: AsyncSession):
+        self.session = session
+
+    @classmethod
+    def invalidate_index(cls) -> None:
+        """Сбрасывает индекс достижений (после создания/изменения/удаления)"""
+        cls._index = None
+        cls._index_loaded_at = 0.0
+
+    async def _get_index(self) -> Dict[str, List[IndexedAchievement]]:
+        """Возвращает индекс метрика -> достижения, загружая его при необходимости"""
+        cls = type(self)
+        if cls._index is not None and time.monotonic() - cls._index_loaded_at < cls.index_ttl:
+            return cls._index
+
+        # Выбираем только нужные столбцы, чтобы не подгружать user_achievements (lazy="selectin")
+        result = await self.session.execute(select(Achievement.id, Achievement.conditions))
+
+        index: Dict[str, List[IndexedAchievement]] = {}
+        for achievement_id, conditions in result.all():
+            indexed = parse_achievement_conditions(achievement_id, conditions)
+            if indexed is not None:
+                index.setdefault(indexed.metric, []).append(indexed)
+
+        cls._index = index
+        cls._index_loaded_at = time.monotonic()
+        logger.debug(f"Achievement index built: { {k: len(v) for k, v in index.items()} }")
+        return index
+
+    async def process_event(
+            self,
+            user_id: int,
+            action_type: Optional[Union[ActionType, str]],
+            action_data: Optional[dict] = None,
+            today: Optional[date] = None
+    ) -> List[Dict]:
+        """Применяет событие к счетчикам и обновляет затронутые достижения.
+
+        Returns:
+            Список изменившихся записей прогресса
+        """
+        action_data = action_data or {}
+        today = today or datetime.now(timezone.utc).date()
+
+        index = await self._get_index()
+        if not index:
+            return []
+
+        counters, backfilled = await self._get_or_create_counters(user_id)
+
+        if backfilled:
+            # Счетчики только что восстановлены из истории и уже учитывают это событие
+            changed_metrics = set(index.keys())
+            counters.streak_days, _ = advance_streak(counters.last_active_date, counters.streak_days, today)
+            counters.last_active_date = today
+        else:
+            changed_metrics = await self._apply_event(counters, action_type, action_data, today)
+
+        if not changed_metrics:
+            return []
+
+        counters.updated_at = datetime.now(timezone.utc)
+
+        affected = [
+            indexed
+            for metric in changed_metrics
+            for indexed in index.get(metric, ())
+        ]
+
+        return await self._write_progress(user_id, counters, affected)
+
+    async def _apply_event(
+            self,
+            counters: UserAchievementCounters,
+            action_type: Optional[Union[ActionType, str]],
+            action_data: dict,
+            today: date
+    ) -> Set[str]:
+        """Инкрементально обновляет счетчики и возвращает измененные метрики.
+
+        Генерации и изображения не прибавляются за само событие: событие лишь
+        указывает, какие таблицы досчитать после последних учтенных id. Повтор
+        события (декоратор и отдельный вызов проверки) ничего не добавляет.
+        """
+        changed: Set[str] = set()
+
+        try:
+            action_type = ActionType(action_type) if action_type else None
+        except (ValueError, TypeError):
+            action_type = None
+
+        if action_type is None:
+            return changed
+
+        content_type = self._extract_content_type(action_data)
+
+        if action_type in GENERATION_ACTIONS and await self._count_new_generations(counters):
+            changed.add(METRIC_GENERATIONS)
+
+        if (action_type in IMAGE_ACTIONS or content_type == ContentType.IMAGE.value) \
+                and await self._count_new_images(counters):
+            changed.add(METRIC_IMAGES)
+
+        if action_type in INVITE_ACTIONS:
+            # Источник истины - users.invites_count; это чтение по первичному ключу
+            invites = await self.session.scalar(select(User.invites_count).where(User.id == counters.user_id))
+            if (invites or 0) != counters.invites_count:
+                counters.invites_count = invites or 0
+                changed.add(METRIC_INVITES)
+
+        streak, streak_changed = advance_streak(counters.last_active_date, counters.streak_days or 0, today)
+        if streak_changed:
+            counters.streak_days = streak
+            counters.last_active_date = today
+            changed.add(METRIC_STREAK)
+
+        return changed
+
+    async def _count_new_generations(self, counters: UserAchievementCounters) -> bool:
+        """Досчитывает генерации пользователя с id больше последнего учтенного"""
+        result = await self.session.execute(
+            select(Generation.type, func.count(), func.max(Generation.id))
+            .where(
+                Generation.user_id == counters.user_id,
+                Generation.id > (counters.last_generation_id or 0)
+            )
+            .group_by(Generation.type)
+        )
+        rows = result.all()
+        if not rows:
+            return False
+
+        # JSON-столбец не отслеживает мутации, поэтому присваиваем новый словарь
+        by_type = dict(counters.generations_by_type or {})
+        for generation_type, count, last_id in rows:
+            key = self._type_key(generation_type)
+            by_type[key] = by_type.get(key, 0) + count
+            counters.generations_total = (counters.generations_total or 0) + count
+            counters.last_generation_id = max(counters.last_generation_id or 0, last_id)
+        counters.generations_by_type = by_type
+        return True
+
+    async def _count_new_images(self, counters: UserAchievementCounters) -> bool:
+        """Досчитывает изображения пользователя с id больше последнего учтенного"""
+        result = await self.session.execute(
+            select(func.count(), func.max(Image.id))
+            .where(Image.user_id == counters.user_id, Image.id > (counters.last_image_id or 0))
+        )
+        count, last_id = result.one()
+        if not count:
+            return False
+
+        counters.images_count = (counters.images_count or 0) + count
+        counters.last_image_id = last_id
+        return True
+
+    @staticmethod
+    def _type_key(generation_type) -> str:
+        return generation_type.value if isinstance(generation_type, ContentType) else str(generation_type)
+
+    @staticmethod
+    def _extract_content_type(action_data: dict) -> Optional[str]:
+        """Достает тип контента из данных действия в виде строки"""
+        content_type = action_data.get('content_type_enum') or action_data.get('content_type')
+        if isinstance(content_type, ContentType):
+            return content_type.value
+        return content_type or None
+
+    async def _write_progress(
+            self,
+            user_id: int,
+            counters: UserAchievementCounters,
+            affected: List[IndexedAchievement]
+    ) -> List[Dict]:
+        """Записывает только изменившийся прогресс затронутых достижений"""
+        if not affected:
+            await self.session.flush()
+            return []
+
+        affected_ids = [indexed.achievement_id for indexed in affected]
+        # Связи user/achievement (lazy="selectin") здесь не нужны
+        result = await self.session.execute(
+            select(UserAchievement)
+            .options(lazyload("*"))
+            .where(
+                UserAchievement.user_id == user_id,
+                UserAchievement.achievement_id.in_(affected_ids)
+            )
+        )
+        existing = {ua.achievement_id: ua for ua in result.scalars().all()}
+
+        now = datetime.now(timezone.utc)
+        updates = []
+        for indexed in affected:
+            new_progress = indexed.progress(counters)
+            user_achievement = existing.get(indexed.achievement_id)
+            current_progress = user_achievement.progress if user_achievement else 0
+
+            if new_progress <= current_progress:
+                continue
+
+            unlocked = new_progress >= 100
+            if user_achievement:
+                user_achievement.progress = new_progress
+                if unlocked and not user_achievement.unlocked:
+                    user_achievement.unlocked = True
+                    user_achievement.unlocked_at = now
+                user_achievement.last_updated = now
+            else:
+                self.session.add(UserAchievement(
+                    user_id=user_id,
+                    achievement_id=indexed.achievement_id,
+                    progress=new_progress,
+                    unlocked=unlocked,
+                    unlocked_at=now if unlocked else None,
+                    last_updated=now
+                ))
+
+            updates.append({
+                'user_id': user_id,
+                'achievement_id': indexed.achievement_id,
+                'progress': new_progress,
+                'unlocked': unlocked
+            })
+
+        await self.session.flush()
+        return updates
+
+    async def _get_or_create_counters(self, user_id: int) -> Tuple[UserAchievementCounters, bool]:
+        """Получает счетчики пользователя (с блокировкой строки) или создает их из истории"""
+        counters = await self.session.get(UserAchievementCounters, user_id, with_for_update=True)
+        if counters is not None:
+            return counters, False
+
+        counters = await self.build_counters(user_id)
+        try:
+            async with self.session.begin_nested():
+                self.session.add(counters)
+                await self.session.flush()
+        except IntegrityError:
+            # Параллельный запрос уже создал строку - работаем с ней
+            counters = await self.session.get(
+                UserAchievementCounters, user_id, with_for_update=True, populate_existing=True
+            )
+            return counters, False
+
+        return counters, True
+
+    async def build_counters(self, user_id: int) -> UserAchievementCounters:
+        """Однократно восстанавливает счетчики пользователя из исторических таблиц"""
+        by_type_result = await self.session.execute(
+            select(Generation.type, func.count(), func.max(Generation.id))
+            .where(Generation.user_id == user_id)
+            .group_by(Generation.type)
+        )
+        generations_by_type = {}
+        last_generation_id = 0
+        for generation_type, count, last_id in by_type_result.all():
+            generations_by_type[self._type_key(generation_type)] = count
+            last_generation_id = max(last_generation_id, last_id)
+
+        images_count, last_image_id = (await self.session.execute(
+            select(func.count(), func.max(Image.id)).where(Image.user_id == user_id)
+        )).one()
+        invites_count = await self.session.scalar(
+            select(User.invites_count).where(User.id == user_id)
+        )
+
+        activity_day = func.date(UserAction.created_at)
+        days_result = await self.session.execute(
+            select(activity_day)
+            .where(UserAction.user_id == user_id)
+            .group_by(activity_day)
+            .order_by(activity_day.desc())
+            .limit(STREAK_BACKFILL_DAYS)
+        )
+        streak_days, last_active_date = self._streak_from_days(days_result.scalars().all())
+
+        return UserAchievementCounters(
+            user_id=user_id,
+            generations_total=sum(generations_by_type.values()),
+            generations_by_type=generations_by_type,
+            images_count=images_count or 0,
+            invites_count=invites_count or 0,
+            streak_days=streak_days,
+            last_active_date=last_active_date,
+            last_generation_id=last_generation_id,
+            last_image_id=last_image_id or 0,
+            updated_at=datetime.now(timezone.utc)
+        )
+
+    @staticmethod
+    def _streak_from_days(days: List) -> Tuple[int, Optional[date]]:
+        """Считает длину последней серии по датам активности (по убыванию)"""
+        parsed = []
+        for day in days:
+            if isinstance(day, str):
+                day = date.fromisoformat(day[:10])
+            elif isinstance(day, datetime):
+                day = day.date()
+            parsed.append(day)
+
+        if not parsed:
+            return 0, None
+
+        streak = 1
+        for previous, current in zip(parsed, parsed[1:]):
+            if previous - current != timedelta(days=1):
+                break
+            streak += 1
+
+        return streak, parsed[0]
@@ -5,6 +5,15 @@ from .query_optimizer import QueryOptimizer
 from .batch_processor import BatchProcessor
 from .cache_service import CacheService
 from .optimized_analytics import OptimizedAnalyticsService
+from .rollups import AnalyticsRollupService, RollupResult
+from .sketches import HyperLogLog, DDSketch
+from .financial_queries import FinancialAnalyticsQueries
+from .query_fanout import QueryFanOut
+from .matview_refresh import MaterializedViewRefresher, MATERIALIZED_VIEWS
+from .bitmaps import ActivityBitmap
+from .cohorts import CohortRetentionService
+from .snapshot_archive import SnapshotArchive
+from .snapshot_store import AnalyticsSnapshotStore
 
 __all__ = [
     'AnalyticsService', # Сервис аналитики
@@ -13,5 +22,17 @@ __all__ = [
     'QueryOptimizer',
     'BatchProcessor',
     'CacheService',
-    'OptimizedAnalyticsService'
+    'OptimizedAnalyticsService',
+    'AnalyticsRollupService', # Почасовые и дневные агрегаты
+    'RollupResult',
+    'HyperLogLog', # Уникальные значения
+    'DDSketch', # Квантили распределений
+    'FinancialAnalyticsQueries', # Точные агрегаты по платежам и баллам в SQL
+    'QueryFanOut', # Параллельные read-only запросы на отдельных соединениях
+    'MaterializedViewRefresher', # Обновление представлений при изменении данных
+    'MATERIALIZED_VIEWS',
+    'ActivityBitmap', # Множество id пользователей для когорт
+    'CohortRetentionService', # Когортное удержание по дневным битмапам
+    'SnapshotArchive', # Колоночный архив снимков аналитики
+    'AnalyticsSnapshotStore'
 ]
\ No newline at end of file
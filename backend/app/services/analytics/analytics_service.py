@@ -16,6 +16,8 @@ from app.models import (
 )
 from app.core.types import ContentType, TariffType
 from ..optimization import QueryOptimizer
+from .query_fanout import QueryFanOut
+from .snapshot_store import AnalyticsSnapshotStore
 from ...core.cache import CacheService
 
 logger = logging.getLogger(__name__)
@@ -60,32 +62,24 @@ class AnalyticsService:
             end_date = datetime.utcnow()
             start_date = self._get_start_date(end_date, period)
 
-            # Получаем все метрики через оптимизатор
-            user_stats = self.query_optimizer.get_user_statistics(start_date, end_date)
-            gen_metrics = self.query_optimizer.get_generation_metrics()
-            tariff_stats = self.query_optimizer.get_tariff_usage()
-            daily_active = self.query_optimizer.get_daily_active_users()
-            feature_stats = self.query_optimizer.get_feature_usage_stats(days=30)
-            retention_data = self.query_optimizer.get_user_retention()
-            points_metrics = self._get_point_metrics(start_date, end_date)
+            # Независимые запросы выполняются параллельно, каждый на своем соединении
+            # из пула в общем read-only снимке (общая сессия не дает параллелизма)
+            fan_out = QueryFanOut()
+            results = await fan_out.run({
+                "users": lambda s: QueryOptimizer(s).get_user_statistics(start_date, end_date),
+                "generations": lambda s: QueryOptimizer(s).get_generation_metrics(),
+                "tariffs": lambda s: QueryOptimizer(s).get_tariff_usage(),
+                "daily_activity": lambda s: QueryOptimizer(s).get_daily_active_users(),
+                "feature_usage": lambda s: QueryOptimizer(s).get_feature_usage_stats(days=30),
+                "retention": lambda s: QueryOptimizer(s).get_user_retention(),
+                "points": lambda s: self._get_point_metrics(start_date, end_date, session=s)
+            })
 
-            # Ждем выполнения всех запросов
-            results = await asyncio.gather(
-                user_stats,
-                gen_metrics,
-                tariff_stats,
-                daily_active,
-                feature_stats,
-                retention_data,
-                points_metrics,
-                return_exceptions=True  # Не прерываем выполнение при ошибке в одном из запросов
-            )
-            
             # Обрабатываем результаты, заменяя исключения на None
             processed_results = []
-            for result in results:
+            for name, result in results.items():
                 if isinstance(result, Exception):
-                    logger.error(f"Error in analytics query: {str(result)}")
+                    logger.error(f"Error in analytics query {name}: {str(result)}")
                     processed_results.append(None)
                 else:
                     processed_results.append(result)
@@ -124,8 +118,14 @@ class AnalyticsService:
                 }
             }
 
-    async def _get_point_metrics(self, start_date: datetime, end_date: datetime) -> Dict[str, Any]:
+    async def _get_point_metrics(
+            self,
+            start_date: datetime,
+            end_date: datetime,
+            session: Optional[AsyncSession] = None
+    ) -> Dict[str, Any]:
         """Получение метрик по баллам с оптимизированными запросами"""
+        session = session or self.session
         try:
             # Формируем ключ кэша
             cache_key = f"points_metrics:{start_date.strftime('%Y-%m-%d')}:{end_date.strftime('%Y-%m-%d')}"
@@ -147,7 +147,7 @@ class AnalyticsService:
                     created_at BETWEEN :start_date AND :end_date
             """)
 
-            result = await self.session.execute(
+            result = await session.execute(
                 points_query, 
                 {"start_date": start_date, "end_date": end_date}
             )
@@ -170,7 +170,7 @@ class AnalyticsService:
                     date
             """)
             
-            daily_result = await self.session.execute(
+            daily_result = await session.execute(
                 daily_points_query, 
                 {"start_date": start_date, "end_date": end_date}
             )
@@ -300,7 +300,6 @@ class AnalyticsService:
         try:
             # Определяем даты для очистки
             detailed_cutoff = datetime.utcnow() - timedelta(days=self.RETENTION_DAYS['detailed'])
-            aggregated_cutoff = datetime.utcnow() - timedelta(days=self.RETENTION_DAYS['aggregated'])
             
             # Удаляем устаревшие детальные данные
             detailed_query = text("""
@@ -310,18 +309,13 @@ class AnalyticsService:
             
             await self.session.execute(detailed_query, {"cutoff_date": detailed_cutoff})
             
-            # Удаляем устаревшие агрегированные данные
-            aggregated_query = text("""
-                DELETE FROM analytics_data
-                WHERE date < :cutoff_date
-            """)
-            
-            await self.session.execute(aggregated_query, {"cutoff_date": aggregated_cutoff})
-            
             # Коммитим изменения
             await self.session.commit()
+
+            # Старые снимки переносятся в колоночный архив, месяцы архива старше RETENTION_DAYS['aggregated'] удаляются
+            await AnalyticsSnapshotStore(self.session).compact(retention_days=self.RETENTION_DAYS['aggregated'])
             
-            logger.info(f"Cleaned up analytics data older than {detailed_cutoff} (detailed) and {aggregated_cutoff} (aggregated)")
+            logger.info(f"Cleaned up analytics data older than {detailed_cutoff} (detailed), archived old snapshots")
             
             return True
             
@@ -0,0 +1,228 @@
+"""
+Битовые множества пользователей для когортного анализа удержания.
+
+ActivityBitmap - упакованное множество id пользователей: бит i соответствует
+пользователю с id = i. Для каждого дня хранится битмап активных пользователей
+и битмап зарегистрировавшихся в этот день. Так как id выдаются
+последовательно, битмап регистраций одного дня занимает несколько байт, и
+ячейка когортной матрицы (пользователи дня s, активные в день s + k)
+считается как AND соответствующего среза битмапа активности и popcount,
+без обхода таблицы users.
+
+Хранятся только байты от первого до последнего ненулевого (offset - номер
+первого хранимого байта), в БД - со сжатием zlib.
+"""
+import struct
+import zlib
+from datetime import date, timedelta
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+# Формат заголовка: байтовое смещение первого хранимого байта
+_HEADER = struct.Struct("<I")
+
+
+def _popcount(data) -> int:
+    return int.from_bytes(data, "little").bit_count()
+
+
+class ActivityBitmap:
+    """Упакованное множество неотрицательных id пользователей"""
+
+    __slots__ = ("offset", "data")
+
+    def __init__(self, offset: int = 0, data: bytes = b""):
+        self.offset = offset
+        self.data = bytearray(data)
+
+    @classmethod
+    def from_ids(cls, ids: Iterable[int]) -> "ActivityBitmap":
+        return cls().add_many(ids)
+
+    def add_many(self, ids: Iterable[int]) -> "ActivityBitmap":
+        ids = [user_id for user_id in ids if user_id is not None and user_id >= 0]
+        if not ids:
+            return self
+
+        low, high = min(ids) >> 3, max(ids) >> 3
+        if not self.data:
+            self.offset = low
+            self.data = bytearray(high - low + 1)
+        else:
+            if low < self.offset:
+                self.data[0:0] = bytes(self.offset - low)
+                self.offset = low
+            end = self.offset + len(self.data)
+            if high >= end:
+                self.data.extend(bytes(high - end + 1))
+
+        data, offset = self.data, self.offset
+        for user_id in ids:
+            data[(user_id >> 3) - offset] |= 1 << (user_id & 7)
+        return self
+
+    def add(self, user_id: int) -> "ActivityBitmap":
+        return self.add_many((user_id,))
+
+    def __contains__(self, user_id: int) -> bool:
+        index = (user_id >> 3) - self.offset
+        return 0 <= index < len(self.data) and bool(self.data[index] & (1 << (user_id & 7)))
+
+    def __len__(self) -> int:
+        return _popcount(self.data)
+
+    def __iter__(self) -> Iterator[int]:
+        for index, byte in enumerate(self.data):
+            while byte:
+                low_bit = byte & -byte
+                yield ((self.offset + index) << 3) + low_bit.bit_length() - 1
+                byte ^= low_bit
+
+    def is_empty(self) -> bool:
+        return not any(self.data)
+
+    def union(self, other: "ActivityBitmap") -> "ActivityBitmap":
+        """Объединение (OR) в новый битмап"""
+        result = ActivityBitmap(self.offset, self.data)
+        result.update(other)
+        return result
+
+    def update(self, other: "ActivityBitmap") -> "ActivityBitmap":
+        """Объединение (OR) на месте"""
+        if not other.data:
+            return self
+        if not self.data:
+            self.offset, self.data = other.offset, bytearray(other.data)
+            return self
+
+        start = min(self.offset, other.offset)
+        end = max(self.offset + len(self.data), other.offset + len(other.data))
+        merged = (
+            int.from_bytes(self.data, "little") << ((self.offset - start) * 8)
+            | int.from_bytes(other.data, "little") << ((other.offset - start) * 8)
+        )
+        self.offset = start
+        self.data = bytearray(merged.to_bytes(end - start, "little"))
+        return self
+
+    def intersection_count(self, other: "ActivityBitmap") -> int:
+        """Мощность пересечения (AND + popcount) только по перекрывающимся байтам"""
+        start = max(self.offset, other.offset)
+        end = min(self.offset + len(self.data), other.offset + len(other.data))
+        if start >= end:
+            return 0
+        left = int.from_bytes(self.data[start - self.offset:end - self.offset], "little")
+        right = int.from_bytes(other.data[start - other.offset:end - other.offset], "little")
+        return (left & right).bit_count()
+
+    def _trimmed(self) -> Tuple[int, bytes]:
+        data = bytes(self.data)
+        stripped = data.lstrip(b"\x00")
+        if not stripped:
+            return 0, b""
+        return self.offset + len(data) - len(stripped), stripped.rstrip(b"\x00")
+
+    def to_bytes(self) -> bytes:
+        offset, data = self._trimmed()
+        return zlib.compress(_HEADER.pack(offset) + data)
+
+    @classmethod
+    def from_bytes(cls, payload: Optional[bytes]) -> "ActivityBitmap":
+        if not payload:
+            return cls()
+        raw = zlib.decompress(payload)
+        (offset,) = _HEADER.unpack_from(raw)
+        return cls(offset, raw[_HEADER.size:])
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, ActivityBitmap) and self._trimmed() == other._trimmed()
+
+    def __repr__(self) -> str:
+        return f"ActivityBitmap(users={len(self)}, bytes={len(self.data)})"
+
+
+def cohort_start(day: date, period: str) -> date:
+    """Начало когорты (день, неделя с понедельника или месяц), в которую попадает день"""
+    if period == "day":
+        return day
+    if period == "week":
+        return day - timedelta(days=day.weekday())
+    if period == "month":
+        return day.replace(day=1)
+    raise ValueError(f"Unknown cohort period: {period}")
+
+
+def next_cohort_start(start: date, period: str) -> date:
+    if period == "day":
+        return start + timedelta(days=1)
+    if period == "week":
+        return start + timedelta(days=7)
+    if period == "month":
+        return (start + timedelta(days=32)).replace(day=1)
+    raise ValueError(f"Unknown cohort period: {period}")
+
+
+def cohort_ranges(last_day: date, period: str, count: int) -> List[Tuple[date, date]]:
+    """Последние count когорт [start, end) по возрастанию, последняя содержит last_day"""
+    start = cohort_start(last_day, period)
+    ranges = [(start, next_cohort_start(start, period))]
+    for _ in range(count - 1):
+        start = cohort_start(start - timedelta(days=1), period)
+        ranges.append((start, next_cohort_start(start, period)))
+    return ranges[::-1]
+
+
+def retention_matrix(
+        signups: Dict[date, ActivityBitmap],
+        activity: Dict[date, ActivityBitmap],
+        ranges: Sequence[Tuple[date, date]],
+        days: int,
+        last_day: date
+) -> List[Dict]:
+    """
+    N-day retention когорт: доля пользователей, активных ровно через k дней после регистрации
+
+    Ячейка (когорта, k) суммирует по дням регистрации s когорты
+    |signups[s] AND activity[s + k]|. Знаменатель ячейки - только пользователи,
+    для которых день s + k уже наступил (s + k <= last_day), поэтому неполные
+    ячейки молодых когорт не занижают удержание; если таких пользователей
+    нет, ячейка равна None.
+
+    Args:
+        signups: Битмапы регистраций по дням
+        activity: Битмапы активности по дням
+        ranges: Когорты [start, end)
+        days: Количество дней удержания (k = 1..days)
+        last_day: Последний полностью учтенный день активности
+    """
+    empty = ActivityBitmap()
+    rows = []
+    for start, end in ranges:
+        members = [
+            (day, bitmap, len(bitmap))
+            for day, bitmap in sorted(signups.items())
+            if start <= day < end and bitmap.data
+        ]
+        size = sum(count for _, _, count in members)
+
+        retention = []
+        for offset in range(1, days + 1):
+            eligible = retained = 0
+            for day, bitmap, count in members:
+                target = day + timedelta(days=offset)
+                if target > last_day:
+                    continue
+                eligible += count
+                retained += bitmap.intersection_count(activity.get(target, empty))
+            retention.append({
+                "day": offset,
+                "users": retained if eligible else None,
+                "eligible": eligible,
+                "rate": round(retained / eligible * 100, 2) if eligible else None
+            })
+
+        rows.append({
+            "cohort_start": start,
+            "size": size,
+            "retention": retention
+        })
+    return rows
@@ -1,31 +1,199 @@
+"""
+Ограниченный внутрипроцессный кэш аналитики.
+
+Записи вытесняются по политике W-TinyLFU: новые ключи попадают в небольшое
+LRU-окно, а в основную LRU-область переходят, только если по частотному
+скетчу (Count-Min с периодическим старением) обращаются к ним чаще, чем к
+кандидату на вытеснение. Поэтому разовые ключи (сканирование по уникальным
+параметрам) не вытесняют часто используемые отчеты. Кэш ограничен числом
+записей и примерным объемом данных.
+
+Пересчет значения в get_or_set защищен от лавины запросов:
+- блокировки пересчета распределены по фиксированному набору (lock striping),
+  а не создаются на каждый ключ;
+- после истечения TTL значение еще stale_ttl секунд отдается как есть, пока
+  оно пересчитывается в фоне (stale-while-revalidate);
+- незадолго до истечения TTL пересчет запускается с вероятностью, растущей
+  к моменту истечения и пропорциональной времени вычисления (XFetch);
+- при включенном Redis значения видны всем воркерам, а холодный пересчет
+  выполняет только воркер, захвативший блокировку в Redis.
+"""
 import logging
 import json
 import hashlib
-from typing import Dict, Any, Optional, List, Union, Callable
-from datetime import datetime, timedelta, timezone
+import math
+import pickle
+import random
+import sys
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, Any, Optional, List, Callable
+from datetime import datetime, timezone
 import asyncio
 from functools import wraps
 
+from ...core.config import settings
+from ...core.cache import CacheService as RedisCacheService
+
 logger = logging.getLogger(__name__)
 
+# Префиксы ключей кэша аналитики в Redis
+REDIS_KEY_PREFIX = "analytics_cache:"
+REDIS_LOCK_PREFIX = "analytics_cache_lock:"
+
+# Доля записей, отводимая под LRU-окно новых ключей
+WINDOW_RATIO = 0.01
+
+# Интервал опроса Redis, пока значение вычисляет другой воркер
+REMOTE_POLL_INTERVAL = 0.05
+
+
+@dataclass
+class _Entry:
+    """Запись кэша; время - unix timestamp, общий для всех воркеров"""
+    data: Any
+    size: int
+    expires_at: float
+    stale_until: float
+    # Длительность вычисления значения (для вероятностного раннего пересчета)
+    delta: float
+    created_at: float
+
+    def is_fresh(self, now: float) -> bool:
+        return now < self.expires_at
+
+    def is_usable(self, now: float) -> bool:
+        return now < self.stale_until
+
+
+class FrequencySketch:
+    """
+    Count-Min скетч частоты обращений с 4-битными счетчиками
+
+    После sample_size увеличений все счетчики делятся пополам, поэтому
+    оценка отражает недавнюю популярность ключа.
+    """
+
+    DEPTH = 4
+    MAX_COUNT = 15
+
+    def __init__(self, capacity: int):
+        self.width = 1 << max(4, (max(capacity, 1) * 2 - 1).bit_length())
+        self.mask = self.width - 1
+        self.table = [bytearray(self.width) for _ in range(self.DEPTH)]
+        self.sample_size = max(capacity, 1) * 10
+        self.additions = 0
+
+    def _indexes(self, key: str):
+        hashed = hash(key)
+        for row in range(self.DEPTH):
+            hashed = (hashed * 0x9E3779B1 + row) & 0xFFFFFFFFFFFF
+            yield row, (hashed ^ (hashed >> 17)) & self.mask
+
+    def increment(self, key: str) -> None:
+        for row, index in self._indexes(key):
+            if self.table[row][index] < self.MAX_COUNT:
+                self.table[row][index] += 1
+        self.additions += 1
+        if self.additions >= self.sample_size:
+            self._age()
+
+    def frequency(self, key: str) -> int:
+        return min(self.table[row][index] for row, index in self._indexes(key))
+
+    def _age(self) -> None:
+        for row in self.table:
+            for index, value in enumerate(row):
+                if value:
+                    row[index] = value >> 1
+        self.additions //= 2
+
+
+def _estimate_size(data: Any) -> int:
+    """Примерный размер значения в байтах (по pickle, иначе поверхностно)"""
+    try:
+        return len(pickle.dumps(data, protocol=pickle.HIGHEST_PROTOCOL))
+    except Exception:
+        return sys.getsizeof(data)
+
+
 class CacheService:
     """Сервис кэширования для оптимизации аналитики"""
 
-    def __init__(self, default_ttl: int = 3600):
+    def __init__(
+            self,
+            default_ttl: int = 3600,
+            max_entries: Optional[int] = None,
+            max_bytes: Optional[int] = None,
+            stale_ttl: Optional[int] = None,
+            lock_stripes: Optional[int] = None,
+            early_expiration_beta: float = 1.0,
+            use_redis: Optional[bool] = None,
+            redis_cache: Optional[RedisCacheService] = None
+    ):
         """
         Инициализация сервиса кэширования
 
         Args:
             default_ttl: Время жизни кэша по умолчанию в секундах (1 час)
+            max_entries: Максимальное число записей
+            max_bytes: Максимальный примерный объем данных в байтах
+            stale_ttl: Сколько секунд после TTL значение отдается, пока идет пересчет
+            lock_stripes: Количество блокировок пересчета
+            early_expiration_beta: Коэффициент раннего пересчета (0 - отключен)
+            use_redis: Хранить значения также в Redis для всех воркеров
+            redis_cache: Клиент Redis (по умолчанию core.cache.CacheService)
         """
         self.default_ttl = default_ttl
-        self.cache: Dict[str, Dict[str, Any]] = {}
-        self.locks: Dict[str, asyncio.Lock] = {}
+        self.max_entries = max(max_entries or settings.ANALYTICS_CACHE_MAX_ENTRIES, 1)
+        self.max_bytes = max_bytes or settings.ANALYTICS_CACHE_MAX_BYTES
+        self.stale_ttl = stale_ttl if stale_ttl is not None else settings.ANALYTICS_CACHE_STALE_SECONDS
+        self.early_expiration_beta = early_expiration_beta
+
+        use_redis = settings.ANALYTICS_CACHE_REDIS if use_redis is None else use_redis
+        self.redis = (redis_cache or RedisCacheService()) if use_redis or redis_cache else None
+
+        self.window_capacity = max(1, int(self.max_entries * WINDOW_RATIO))
+        self.main_capacity = max(self.max_entries - self.window_capacity, 1)
+        self._window: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._main: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._sketch = FrequencySketch(self.max_entries)
+        self.total_bytes = 0
+
+        self._locks = [asyncio.Lock() for _ in range(max(lock_stripes or settings.ANALYTICS_CACHE_LOCK_STRIPES, 1))]
+        self._refresh_tasks: Dict[str, asyncio.Task] = {}
         self._cleanup_task: Optional[asyncio.Task] = None
 
+        self.stats = {
+            "hits": 0,
+            "misses": 0,
+            "stale_hits": 0,
+            "early_refreshes": 0,
+            "background_refreshes": 0,
+            "computations": 0,
+            "evictions": 0,
+            "size_evictions": 0,
+            "admission_rejections": 0,
+            "expirations": 0,
+            "redis_hits": 0,
+            "redis_errors": 0,
+            "remote_waits": 0,
+        }
+
+    # ---------- Хранилище ----------
+
+    @property
+    def cache(self) -> Dict[str, _Entry]:
+        """Все записи (окно и основная область) - только для чтения"""
+        return {**self._window, **self._main}
+
+    def __len__(self) -> int:
+        return len(self._window) + len(self._main)
+
     def _get_lock(self, key: str) -> asyncio.Lock:
         """
-        Получает блокировку для указанного ключа
+        Получает блокировку пересчета для ключа из фиксированного набора
 
         Args:
             key: Ключ кэша
@@ -33,9 +201,7 @@ class CacheService:
         Returns:
             asyncio.Lock: Объект блокировки
         """
-        if key not in self.locks:
-            self.locks[key] = asyncio.Lock()
-        return self.locks[key]
+        return self._locks[hash(key) % len(self._locks)]
 
     def _generate_key(self, prefix: str, params: Dict[str, Any]) -> str:
         """
@@ -50,13 +216,163 @@ class CacheService:
         """
         # Сортируем параметры для стабильного хэша
         sorted_params = {k: params[k] for k in sorted(params.keys())}
-        params_str = json.dumps(sorted_params, sort_keys=True)
+        params_str = json.dumps(sorted_params, sort_keys=True, default=str)
 
         # Создаем хэш параметров
         params_hash = hashlib.md5(params_str.encode()).hexdigest()
 
         return f"{prefix}:{params_hash}"
 
+    def _lookup(self, key: str) -> Optional[_Entry]:
+        """Находит запись и отмечает обращение (частота и позиция в LRU)"""
+        self._sketch.increment(key)
+        for segment in (self._main, self._window):
+            entry = segment.get(key)
+            if entry is not None:
+                segment.move_to_end(key)
+                return entry
+        return None
+
+    def _peek(self, key: str) -> Optional[_Entry]:
+        """Находит запись, не отмечая обращение"""
+        entry = self._main.get(key)
+        return entry if entry is not None else self._window.get(key)
+
+    def _remove(self, key: str) -> Optional[_Entry]:
+        for segment in (self._window, self._main):
+            entry = segment.pop(key, None)
+            if entry is not None:
+                self.total_bytes -= entry.size
+                return entry
+        return None
+
+    def _store(self, key: str, entry: _Entry) -> None:
+        """Сохраняет запись и вытесняет лишнее по числу записей и объему"""
+        if entry.size > self.max_bytes:
+            # Значение больше всего кэша - не кэшируем, чтобы не вытеснить все остальное
+            self._remove(key)
+            self.stats["size_evictions"] += 1
+            return
+
+        # Обновление ключа из основной области оставляет его там же
+        segment = self._main if key in self._main else self._window
+        self._remove(key)
+        segment[key] = entry
+        self.total_bytes += entry.size
+
+        while len(self._window) > self.window_capacity:
+            candidate_key, candidate = self._window.popitem(last=False)
+            self._admit(candidate_key, candidate)
+
+        while self.total_bytes > self.max_bytes and len(self) > 0:
+            segment = self._main if self._main else self._window
+            _, evicted = segment.popitem(last=False)
+            self.total_bytes -= evicted.size
+            self.stats["size_evictions"] += 1
+
+    def _admit(self, key: str, entry: _Entry) -> None:
+        """TinyLFU: кандидат из окна вытесняет жертву основной области, только если он популярнее"""
+        if len(self._main) < self.main_capacity:
+            self._main[key] = entry
+            return
+
+        victim_key = next(iter(self._main))
+        if self._sketch.frequency(key) > self._sketch.frequency(victim_key):
+            victim = self._main.pop(victim_key)
+            self.total_bytes -= victim.size
+            self._main[key] = entry
+        else:
+            self.total_bytes -= entry.size
+            self.stats["admission_rejections"] += 1
+        self.stats["evictions"] += 1
+
+    def _new_entry(self, data: Any, ttl: Optional[int], delta: float = 0.0, size: Optional[int] = None) -> _Entry:
+        now = time.time()
+        expires_at = now + (self.default_ttl if ttl is None else ttl)
+        return _Entry(
+            data=data,
+            size=size if size is not None else _estimate_size(data),
+            expires_at=expires_at,
+            stale_until=expires_at + self.stale_ttl,
+            delta=delta,
+            created_at=now
+        )
+
+    # ---------- Redis ----------
+
+    async def _remote_get(self, key: str) -> Optional[_Entry]:
+        if self.redis is None:
+            return None
+        try:
+            envelope = await self.redis.get_cached_data(REDIS_KEY_PREFIX + key)
+        except Exception as e:
+            self.stats["redis_errors"] += 1
+            logger.error(f"Analytics cache Redis read error: {str(e)}")
+            return None
+        if not isinstance(envelope, dict) or not time.time() < envelope.get("stale_until", 0):
+            return None
+        self.stats["redis_hits"] += 1
+        return _Entry(
+            data=envelope["data"],
+            size=_estimate_size(envelope["data"]),
+            expires_at=envelope["expires_at"],
+            stale_until=envelope["stale_until"],
+            delta=envelope.get("delta", 0.0),
+            created_at=envelope.get("created_at", time.time())
+        )
+
+    async def _remote_set(self, key: str, entry: _Entry) -> None:
+        if self.redis is None:
+            return
+        envelope = {
+            "data": entry.data,
+            "expires_at": entry.expires_at,
+            "stale_until": entry.stale_until,
+            "delta": entry.delta,
+            "created_at": entry.created_at,
+        }
+        ttl = max(1, math.ceil(entry.stale_until - time.time()))
+        if not await self.redis.cache_data(REDIS_KEY_PREFIX + key, envelope, ttl):
+            self.stats["redis_errors"] += 1
+
+    async def _remote_lock(self, key: str, timeout: int) -> bool:
+        """Захватывает блокировку пересчета в Redis (без Redis - всегда успешно)"""
+        if self.redis is None:
+            return True
+        try:
+            await self.redis.init_redis()
+            return bool(await self.redis.redis.set(REDIS_LOCK_PREFIX + key, b"1", nx=True, ex=timeout))
+        except Exception as e:
+            self.stats["redis_errors"] += 1
+            logger.error(f"Analytics cache Redis lock error: {str(e)}")
+            return True
+
+    async def _remote_unlock(self, key: str) -> None:
+        if self.redis is None:
+            return
+        try:
+            await self.redis.invalidate(REDIS_LOCK_PREFIX + key)
+        except Exception as e:
+            logger.error(f"Analytics cache Redis unlock error: {str(e)}")
+
+    async def _remote_wait(self, key: str, timeout: float) -> Optional[_Entry]:
+        """Ждет значение, которое вычисляет другой воркер, пока держится его блокировка"""
+        self.stats["remote_waits"] += 1
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            await asyncio.sleep(REMOTE_POLL_INTERVAL)
+            entry = await self._remote_get(key)
+            if entry is not None:
+                return entry
+            try:
+                if not await self.redis.redis.exists(REDIS_LOCK_PREFIX + key):
+                    return None
+            except Exception:
+                return None
+        return None
+
+    # ---------- Чтение и запись ----------
+
     async def get(self, key: str) -> Optional[Any]:
         """
         Получает данные из кэша
@@ -67,19 +383,22 @@ class CacheService:
         Returns:
             Optional[Any]: Данные из кэша или None, если кэш отсутствует или устарел
         """
-        async with self._get_lock(key):
-            if key not in self.cache:
-                return None
+        now = time.time()
+        entry = self._lookup(key)
+        if entry is not None and entry.is_fresh(now):
+            self.stats["hits"] += 1
+            logger.debug(f"Получены данные из кэша: {key}")
+            return entry.data
 
-            cache_entry = self.cache[key]
+        remote = await self._remote_get(key)
+        if remote is not None:
+            self._store(key, remote)
+            if remote.is_fresh(now):
+                self.stats["hits"] += 1
+                return remote.data
 
-            # Проверяем, не устарел ли кэш
-            if datetime.now(timezone.utc) > cache_entry["expires_at"]:
-                del self.cache[key]
-                return None
-
-            logger.debug(f"Получены данные из кэша: {key}")
-            return cache_entry["data"]
+        self.stats["misses"] += 1
+        return None
 
     async def set(self, key: str, data: Any, ttl: Optional[int] = None) -> None:
         """
@@ -90,19 +409,10 @@ class CacheService:
             data: Данные для сохранения
             ttl: Время жизни в секундах (если None, используется значение по умолчанию)
         """
-        if ttl is None:
-            ttl = self.default_ttl
-
-        expires_at = datetime.now(timezone.utc) + timedelta(seconds=ttl)
-
-        async with self._get_lock(key):
-            self.cache[key] = {
-                "data": data,
-                "expires_at": expires_at,
-                "created_at": datetime.now(timezone.utc)
-            }
-
-            logger.debug(f"Данные сохранены в кэш: {key} (TTL: {ttl} сек)")
+        entry = self._new_entry(data, ttl)
+        self._store(key, entry)
+        await self._remote_set(key, entry)
+        logger.debug(f"Данные сохранены в кэш: {key} (TTL: {ttl or self.default_ttl} сек)")
 
     async def invalidate(self, key: str) -> bool:
         """
@@ -114,12 +424,12 @@ class CacheService:
         Returns:
             bool: True, если кэш был инвалидирован, False в противном случае
         """
-        async with self._get_lock(key):
-            if key in self.cache:
-                del self.cache[key]
-                logger.debug(f"Кэш инвалидирован: {key}")
-                return True
-            return False
+        removed = self._remove(key) is not None
+        if self.redis is not None:
+            removed = await self.redis.invalidate(REDIS_KEY_PREFIX + key) or removed
+        if removed:
+            logger.debug(f"Кэш инвалидирован: {key}")
+        return removed
 
     async def invalidate_by_prefix(self, prefix: str) -> int:
         """
@@ -131,21 +441,79 @@ class CacheService:
         Returns:
             int: Количество инвалидированных ключей
         """
-        keys_to_invalidate = [k for k in self.cache.keys() if k.startswith(prefix)]
-        count = 0
-
+        keys_to_invalidate = [k for k in self.cache if k.startswith(prefix)]
         for key in keys_to_invalidate:
-            if await self.invalidate(key):
-                count += 1
+            self._remove(key)
+        count = len(keys_to_invalidate)
+
+        if self.redis is not None:
+            count = max(count, await self.redis.invalidate_pattern(f"{REDIS_KEY_PREFIX}{prefix}*"))
 
         logger.debug(f"Инвалидировано {count} ключей с префиксом: {prefix}")
         return count
 
+    # ---------- Пересчет ----------
+
+    def _should_refresh_early(self, entry: _Entry, now: float) -> bool:
+        """XFetch: вероятность пересчета растет к истечению TTL и с длительностью вычисления"""
+        if self.early_expiration_beta <= 0 or entry.delta <= 0:
+            return False
+        return now - entry.delta * self.early_expiration_beta * math.log(1.0 - random.random()) >= entry.expires_at
+
+    async def _compute(self, key: str, data_func: Callable[[], Any], ttl: Optional[int]) -> _Entry:
+        started = time.monotonic()
+        data = await data_func()
+        entry = self._new_entry(data, ttl, delta=time.monotonic() - started)
+        self.stats["computations"] += 1
+        self._store(key, entry)
+        await self._remote_set(key, entry)
+        return entry
+
+    def _schedule_refresh(self, key: str, data_func: Callable[[], Any], ttl: Optional[int]) -> None:
+        """Пересчитывает значение в фоне, если пересчет ключа еще не запущен"""
+        if key in self._refresh_tasks:
+            return
+
+        async def refresh():
+            try:
+                async with self._get_lock(key):
+                    entry = self._peek(key)
+                    if entry is not None and entry.is_fresh(time.time()) and entry.created_at > started:
+                        return
+                    # Другой воркер мог уже обновить значение
+                    remote = await self._remote_get(key)
+                    if remote is not None and remote.is_fresh(time.time()) and remote.created_at > started:
+                        self._store(key, remote)
+                        return
+                    if not await self._remote_lock(key, self._lock_timeout(ttl)):
+                        return
+                    try:
+                        await self._compute(key, data_func, ttl)
+                        self.stats["background_refreshes"] += 1
+                    finally:
+                        await self._remote_unlock(key)
+            except Exception as e:
+                logger.error(f"Ошибка фонового обновления кэша {key}: {str(e)}")
+
+        started = time.time()
+        task = asyncio.create_task(refresh())
+        self._refresh_tasks[key] = task
+        task.add_done_callback(lambda _: self._refresh_tasks.pop(key, None))
+
+    def _lock_timeout(self, ttl: Optional[int]) -> int:
+        return max(5, min(self.default_ttl if ttl is None else ttl, 60))
+
     async def get_or_set(self, key: str, data_func: Callable[[], Any],
                         ttl: Optional[int] = None) -> Any:
         """
         Получает данные из кэша или вызывает функцию для получения данных
 
+        Свежее значение возвращается сразу (иногда с ранним фоновым пересчетом
+        незадолго до истечения TTL), устаревшее в пределах stale_ttl - тоже
+        сразу, с фоновым пересчетом. Без значения функцию для ключа вызывает
+        один запрос (и один воркер при включенном Redis), остальные ждут его
+        результат.
+
         Args:
             key: Ключ кэша
             data_func: Функция для получения данных, если кэш отсутствует
@@ -154,25 +522,42 @@ class CacheService:
         Returns:
             Any: Данные из кэша или результат вызова функции
         """
-        # Пытаемся получить данные из кэша
-        cached_data = await self.get(key)
-        if cached_data is not None:
-            return cached_data
-
-        # Если данных нет в кэше, получаем их с помощью функции
+        now = time.time()
+        entry = self._lookup(key)
+        if entry is None:
+            entry = await self._remote_get(key)
+            if entry is not None:
+                self._store(key, entry)
+
+        if entry is not None and entry.is_fresh(now):
+            self.stats["hits"] += 1
+            if self._should_refresh_early(entry, now):
+                self.stats["early_refreshes"] += 1
+                self._schedule_refresh(key, data_func, ttl)
+            return entry.data
+
+        if entry is not None and entry.is_usable(now):
+            self.stats["stale_hits"] += 1
+            self._schedule_refresh(key, data_func, ttl)
+            return entry.data
+
+        self.stats["misses"] += 1
         async with self._get_lock(key):
-            # Проверяем еще раз, возможно, данные уже были получены другим потоком
-            cached_data = await self.get(key)
-            if cached_data is not None:
-                return cached_data
-
-            # Получаем данные с помощью функции
-            data = await data_func()
-
-            # Сохраняем данные в кэш
-            await self.set(key, data, ttl)
-
-            return data
+            # Проверяем еще раз, возможно, данные уже были получены другим запросом
+            entry = self._peek(key)
+            if entry is not None and entry.is_fresh(time.time()):
+                return entry.data
+
+            timeout = self._lock_timeout(ttl)
+            if not await self._remote_lock(key, timeout):
+                entry = await self._remote_wait(key, timeout)
+                if entry is not None:
+                    self._store(key, entry)
+                    return entry.data
+            try:
+                return (await self._compute(key, data_func, ttl)).data
+            finally:
+                await self._remote_unlock(key)
 
     def cached(self, prefix: str, ttl: Optional[int] = None):
         """
@@ -211,6 +596,8 @@ class CacheService:
 
         return decorator
 
+    # ---------- Обслуживание ----------
+
     async def start_cleanup_task(self, interval: int = 300) -> None:
         """
         Запускает фоновую задачу для очистки устаревших записей кэша
@@ -242,24 +629,18 @@ class CacheService:
 
     async def cleanup_expired(self) -> int:
         """
-        Очищает устаревшие записи кэша
+        Очищает записи, которые нельзя отдать даже как устаревшие
 
         Returns:
             int: Количество очищенных записей
         """
-        now = datetime.now(timezone.utc)
-        keys_to_remove = []
-
-        # Находим устаревшие записи
-        for key, entry in self.cache.items():
-            if now > entry["expires_at"]:
-                keys_to_remove.append(key)
-
-        # Удаляем устаревшие записи
+        now = time.time()
+        keys_to_remove = [key for key, entry in self.cache.items() if not entry.is_usable(now)]
         for key in keys_to_remove:
-            await self.invalidate(key)
+            self._remove(key)
 
         count = len(keys_to_remove)
+        self.stats["expirations"] += count
         if count > 0:
             logger.debug(f"Очищено {count} устаревших записей кэша")
 
@@ -272,10 +653,8 @@ class CacheService:
         Returns:
             Dict[str, Any]: Статистика кэша
         """
-        total_entries = len(self.cache)
-        total_size = 0
+        now = time.time()
         expired_entries = 0
-        now = datetime.now(timezone.utc)
 
         # Группировка по префиксам
         prefix_stats: Dict[str, Dict[str, Any]] = {}
@@ -283,35 +662,27 @@ class CacheService:
         for key, entry in self.cache.items():
             # Определяем префикс (до первого двоеточия)
             prefix = key.split(":")[0] if ":" in key else "other"
-
-            # Инициализируем статистику для префикса, если она еще не существует
-            if prefix not in prefix_stats:
-                prefix_stats[prefix] = {
-                    "count": 0,
-                    "expired": 0,
-                    "size": 0
-                }
-
-            # Увеличиваем счетчики
-            prefix_stats[prefix]["count"] += 1
-
-            # Проверяем, устарела ли запись
-            if now > entry["expires_at"]:
+            stats = prefix_stats.setdefault(prefix, {"count": 0, "expired": 0, "size": 0})
+            stats["count"] += 1
+            stats["size"] += entry.size
+            if not entry.is_fresh(now):
                 expired_entries += 1
-                prefix_stats[prefix]["expired"] += 1
-
-            # Оцениваем размер данных (приблизительно)
-            try:
-                data_size = len(json.dumps(entry["data"]))
-                total_size += data_size
-                prefix_stats[prefix]["size"] += data_size
-            except (TypeError, OverflowError):
-                # Если данные не могут быть сериализованы, пропускаем их
-                pass
+                stats["expired"] += 1
 
+        lookups = self.stats["hits"] + self.stats["stale_hits"] + self.stats["misses"]
         return {
-            "total_entries": total_entries,
+            **self.stats,
+            "hit_ratio": round((self.stats["hits"] + self.stats["stale_hits"]) / lookups, 4) if lookups else 0.0,
+            "total_entries": len(self),
+            "window_entries": len(self._window),
+            "main_entries": len(self._main),
+            "max_entries": self.max_entries,
             "expired_entries": expired_entries,
-            "total_size_bytes": total_size,
-            "prefix_stats": prefix_stats
-        }
\ No newline at end of file
+            "total_size_bytes": self.total_bytes,
+            "max_size_bytes": self.max_bytes,
+            "lock_stripes": len(self._locks),
+            "refreshing": len(self._refresh_tasks),
+            "redis": self.redis is not None,
+            "prefix_stats": prefix_stats,
+            "generated_at": datetime.now(timezone.utc).isoformat()
+        }
@@ -0,0 +1,369 @@
+"""
+Когортное удержание пользователей по дневным битмапам.
+
+Для каждого дня (UTC) хранятся два битмапа id пользователей (см. bitmaps.py):
+активные в этот день и зарегистрировавшиеся в этот день. Шина трекинга при
+записи каждой пачки событий вставляет добавку (битмап пачки за день) без
+блокировки строки дня; периодическая досвертка сливает добавки в битмапы
+дней и по watermark дописывает события, записанные в обход шины, и
+регистрации из users. Установка бита идемпотентна, поэтому повторная
+обработка тех же событий безопасна.
+
+Матрица удержания когорт (D1..DN) считается пересечением битмапов без
+обращения к users и таблицам событий: стоимость зависит от числа дней в
+матрице, а не от количества пользователей и объема истории.
+"""
+import logging
+from collections import defaultdict
+from datetime import date, datetime, timedelta, timezone
+from typing import Dict, Iterable, List, Optional
+
+from sqlalchemy import text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ...core.config import settings
+from ...models import AnalyticsRollupWatermark, UserActivityBitmap, UserActivityBitmapDelta
+from .bitmaps import ActivityBitmap, cohort_ranges, retention_matrix
+from .rollups import AnalyticsRollupService, floor_hour
+
+logger = logging.getLogger(__name__)
+
+KIND_ACTIVE = "active"
+KIND_SIGNUP = "signup"
+
+# Таблицы событий, по которым пользователь считается активным в день события
+ACTIVITY_TABLES = (
+    "feature_usage",
+    "usage_logs",
+    "user_activity_logs",
+    "generation_metrics",
+    "user_actions",
+)
+
+WATERMARK_SOURCE = "cohort_bitmaps"
+
+# Дни удержания в сводке по когортам
+SUMMARY_DAYS = (1, 7, 30)
+
+COHORT_LABELS = {
+    "day": "%Y-%m-%d",
+    "week": "%G-W%V",
+    "month": "%Y-%m",
+}
+
+
+class CohortRetentionService:
+    """Ведение дневных битмапов пользователей и расчет когортного удержания"""
+
+    def __init__(self, session: AsyncSession):
+        self.session = session
+
+    # ---------- Запись битмапов ----------
+
+    async def append(self, kind: str, day_ids: Dict[date, Iterable[int]]) -> int:
+        """
+        Добавляет пользователей в битмапы дней добавками, не фиксируя транзакцию
+
+        Одна вставка на пачку без блокировок: параллельные пачки шины трекинга
+        не ждут друг друга на строке текущего дня. Добавки учитываются при
+        чтении сразу и сливаются в битмапы дней досверткой.
+
+        Returns:
+            Количество добавленных дней
+        """
+        rows = [
+            {"kind": kind, "day": day, "bitmap": ActivityBitmap.from_ids(ids).to_bytes()}
+            for day, ids in sorted(day_ids.items()) if ids
+        ]
+        if rows:
+            await self.session.execute(pg_insert(UserActivityBitmapDelta).values(rows))
+        return len(rows)
+
+    async def mark(self, kind: str, day_ids: Dict[date, Iterable[int]]) -> int:
+        """
+        Добавляет пользователей в битмапы дней, не фиксируя транзакцию
+
+        Returns:
+            Количество измененных дней
+        """
+        return await self._merge(kind, {
+            day: ActivityBitmap.from_ids(ids) for day, ids in day_ids.items() if ids
+        })
+
+    async def _merge(self, kind: str, day_bitmaps: Dict[date, ActivityBitmap]) -> int:
+        """
+        Объединяет битмапы с сохраненными битмапами дней
+
+        Строки дней блокируются FOR UPDATE в порядке дат; пишет в них только
+        досвертка под advisory-блокировкой, поэтому ожиданий на этих строках нет.
+
+        Returns:
+            Количество измененных дней
+        """
+        if not day_bitmaps:
+            return 0
+
+        days = sorted(day_bitmaps)
+        empty = ActivityBitmap().to_bytes()
+        await self.session.execute(
+            pg_insert(UserActivityBitmap)
+            .values([{"kind": kind, "day": day, "bitmap": empty, "users_count": 0} for day in days])
+            .on_conflict_do_nothing(index_elements=[UserActivityBitmap.kind, UserActivityBitmap.day])
+        )
+
+        result = await self.session.execute(
+            text("""
+                SELECT day, bitmap, users_count
+                FROM user_activity_bitmaps
+                WHERE kind = :kind AND day = ANY(CAST(:days AS date[]))
+                ORDER BY day
+                FOR UPDATE
+            """),
+            {"kind": kind, "days": days}
+        )
+
+        updates = []
+        for row in result.fetchall():
+            bitmap = ActivityBitmap.from_bytes(row.bitmap).update(day_bitmaps[row.day])
+            users_count = len(bitmap)
+            if users_count != row.users_count:
+                updates.append({
+                    "kind": kind,
+                    "day": row.day,
+                    "bitmap": bitmap.to_bytes(),
+                    "users_count": users_count
+                })
+
+        if updates:
+            await self.session.execute(
+                text("""
+                    UPDATE user_activity_bitmaps
+                    SET bitmap = :bitmap, users_count = :users_count, updated_at = NOW()
+                    WHERE kind = :kind AND day = :day
+                """),
+                updates
+            )
+        return len(updates)
+
+    async def _merge_deltas(self) -> int:
+        """
+        Сливает добавки шины трекинга в битмапы дней и удаляет их
+
+        Returns:
+            Количество слитых добавок
+        """
+        result = await self.session.execute(
+            text("DELETE FROM user_activity_bitmap_deltas RETURNING kind, day, bitmap")
+        )
+        merged: Dict[str, Dict[date, ActivityBitmap]] = defaultdict(dict)
+        count = 0
+        for row in result.fetchall():
+            bitmap = ActivityBitmap.from_bytes(row.bitmap)
+            if row.day in merged[row.kind]:
+                merged[row.kind][row.day].update(bitmap)
+            else:
+                merged[row.kind][row.day] = bitmap
+            count += 1
+
+        for kind, day_bitmaps in merged.items():
+            await self._merge(kind, day_bitmaps)
+        return count
+
+    async def _set_watermark(self, watermark: datetime) -> None:
+        stmt = pg_insert(AnalyticsRollupWatermark).values(source=WATERMARK_SOURCE, watermark=watermark)
+        await self.session.execute(stmt.on_conflict_do_update(
+            index_elements=[AnalyticsRollupWatermark.source],
+            set_={"watermark": stmt.excluded.watermark, "updated_at": datetime.now(timezone.utc)}
+        ))
+
+    async def _collect(self, query: str, start: datetime, end: datetime) -> Dict[date, List[int]]:
+        result = await self.session.execute(text(query), {"start": start, "end": end})
+        return {row.day: row.user_ids for row in result.fetchall()}
+
+    async def refresh_chunk(self) -> int:
+        """
+        Досворачивает события и регистрации одного окна после watermark
+
+        Returns:
+            Количество обработанных часов (0 - битмапы актуальны или досвертку выполняет другой процесс)
+        """
+        locked = await self.session.execute(
+            text("SELECT pg_try_advisory_xact_lock(hashtext(:key))"),
+            {"key": f"analytics_rollup:{WATERMARK_SOURCE}"}
+        )
+        if not locked.scalar():
+            await self.session.rollback()
+            return 0
+
+        await self._merge_deltas()
+
+        target = floor_hour(datetime.now(timezone.utc) - timedelta(seconds=settings.ROLLUP_LAG_SECONDS))
+        watermark = await AnalyticsRollupService(self.session).get_watermark(WATERMARK_SOURCE)
+        if watermark is None:
+            oldest = (await self.session.execute(text("SELECT MIN(created_at) FROM users"))).scalar()
+            watermark = floor_hour(oldest) if oldest else target
+
+        if watermark >= target:
+            await self._set_watermark(watermark)
+            await self.session.commit()
+            return 0
+
+        end = min(target, watermark + timedelta(hours=settings.ROLLUP_CHUNK_HOURS))
+        events = " UNION ALL ".join(
+            f"SELECT user_id, created_at FROM {table} "
+            f"WHERE created_at >= :start AND created_at < :end AND user_id IS NOT NULL"
+            for table in ACTIVITY_TABLES
+        )
+        activity = await self._collect(f"""
+            SELECT (created_at AT TIME ZONE 'UTC')::date AS day, array_agg(DISTINCT user_id) AS user_ids
+            FROM ({events}) AS events
+            GROUP BY 1
+        """, watermark, end)
+        signups = await self._collect("""
+            SELECT (created_at AT TIME ZONE 'UTC')::date AS day, array_agg(id) AS user_ids
+            FROM users
+            WHERE created_at >= :start AND created_at < :end
+            GROUP BY 1
+        """, watermark, end)
+
+        await self.mark(KIND_SIGNUP, signups)
+        await self.mark(KIND_ACTIVE, activity)
+        await self._set_watermark(end)
+        await self.session.commit()
+
+        hours = int((end - watermark).total_seconds() // 3600)
+        logger.info(f"Cohort bitmaps updated: {hours}h up to {end.isoformat()}, {len(activity)} active days")
+        return hours
+
+    async def refresh(self) -> int:
+        """Досворачивает битмапы до актуального состояния порциями по ROLLUP_CHUNK_HOURS"""
+        total = 0
+        try:
+            while True:
+                hours = await self.refresh_chunk()
+                if hours == 0:
+                    break
+                total += hours
+        except Exception as e:
+            await self.session.rollback()
+            logger.error(f"Error updating cohort bitmaps: {str(e)}")
+        return total
+
+    # ---------- Чтение ----------
+
+    async def last_complete_day(self) -> Optional[date]:
+        """Последний день, события которого полностью учтены в битмапах"""
+        watermark = await AnalyticsRollupService(self.session).get_watermark(WATERMARK_SOURCE)
+        return (watermark - timedelta(days=1)).date() if watermark else None
+
+    async def _load(self, kind: str, start: date, end: date) -> Dict[date, ActivityBitmap]:
+        result = await self.session.execute(
+            text("""
+                SELECT day, bitmap
+                FROM user_activity_bitmaps
+                WHERE kind = :kind AND day >= :start AND day <= :end AND users_count > 0
+            """),
+            {"kind": kind, "start": start, "end": end}
+        )
+        bitmaps = {row.day: ActivityBitmap.from_bytes(row.bitmap) for row in result.fetchall()}
+
+        # Добавки шины трекинга, еще не слитые досверткой
+        deltas = await self.session.execute(
+            text("""
+                SELECT day, bitmap
+                FROM user_activity_bitmap_deltas
+                WHERE kind = :kind AND day >= :start AND day <= :end
+            """),
+            {"kind": kind, "start": start, "end": end}
+        )
+        for row in deltas.fetchall():
+            bitmap = ActivityBitmap.from_bytes(row.bitmap)
+            if row.day in bitmaps:
+                bitmaps[row.day].update(bitmap)
+            else:
+                bitmaps[row.day] = bitmap
+        return bitmaps
+
+    async def retention(self, period: str = "month", cohorts: int = 12, days: int = 30) -> Dict:
+        """
+        Матрица N-day retention для последних когорт
+
+        Args:
+            period: Размер когорты по дате регистрации: day, week, month
+            cohorts: Количество когорт
+            days: Количество дней удержания (столбцы D1..Ddays)
+        """
+        last_day = await self.last_complete_day()
+        if last_day is None:
+            return {"period": period, "days": days, "last_day": None, "cohorts": [], "summary": {}}
+
+        ranges = cohort_ranges(last_day, period, cohorts)
+        first_day = ranges[0][0]
+        signups = await self._load(KIND_SIGNUP, first_day, last_day)
+        activity = await self._load(KIND_ACTIVE, first_day + timedelta(days=1), last_day)
+
+        rows = retention_matrix(signups, activity, ranges, days, last_day)
+
+        summary = {}
+        for offset in SUMMARY_DAYS:
+            if offset > days:
+                continue
+            retained = sum(row["retention"][offset - 1]["users"] or 0 for row in rows)
+            eligible = sum(row["retention"][offset - 1]["eligible"] for row in rows)
+            summary[f"d{offset}"] = round(retained / eligible * 100, 2) if eligible else None
+
+        label = COHORT_LABELS[period]
+        return {
+            "period": period,
+            "days": days,
+            "last_day": last_day.isoformat(),
+            "cohorts": [
+                {
+                    "cohort": row["cohort_start"].strftime(label),
+                    "size": row["size"],
+                    "retention": row["retention"],
+                    **{
+                        f"d{offset}": row["retention"][offset - 1]["rate"]
+                        for offset in SUMMARY_DAYS if offset <= days
+                    }
+                }
+                for row in rows
+            ],
+            "summary": summary
+        }
+
+    async def recent_retention(self, months: int = 12, window_days: int = 30) -> Dict[str, Dict]:
+        """
+        Доля пользователей месячных когорт, активных за последние window_days дней
+
+        Returns:
+            {'YYYY-MM': {'size': ..., 'retained': ..., 'rate': ...}} от новых когорт к старым
+        """
+        last_day = await self.last_complete_day()
+        if last_day is None:
+            return {}
+
+        ranges = cohort_ranges(last_day, "month", months)
+        signups = await self._load(KIND_SIGNUP, ranges[0][0], last_day)
+        recent = ActivityBitmap()
+        for bitmap in (await self._load(KIND_ACTIVE, last_day - timedelta(days=window_days - 1), last_day)).values():
+            recent.update(bitmap)
+
+        cohorts = defaultdict(ActivityBitmap)
+        for day, bitmap in signups.items():
+            cohorts[day.replace(day=1)].update(bitmap)
+
+        retention = {}
+        for start, _ in reversed(ranges):
+            cohort = cohorts.get(start)
+            if cohort is None or cohort.is_empty():
+                continue
+            size = len(cohort)
+            retained = cohort.intersection_count(recent)
+            retention[start.strftime("%Y-%m")] = {
+                "size": size,
+                "retained": retained,
+                "rate": round(retained / size * 100, 2)
+            }
+        return retention
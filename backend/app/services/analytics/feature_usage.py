@@ -1,6 +1,6 @@
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, func, case, text, delete, and_, desc
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 from typing import Dict, List, Any, Optional, AsyncGenerator, Tuple
 import logging
 import asyncio
@@ -15,6 +15,9 @@ from ...core.constants import ContentType, UserRole
 from ...services.optimization import QueryOptimizer, BatchProcessor
 from ...core.cache import CacheService
 from ...core.database import async_session
+from ..tracking.event_bus import tracking_event_bus
+from ..maintenance.partitioning import LogPartitionManager
+from .matview_refresh import MaterializedViewRefresher
 
 logger = logging.getLogger(__name__)
 
@@ -61,8 +64,9 @@ class FeatureUsageService:
                     logger.warning(f"Invalid content_type: {content_type}. Error: {str(e)}")
                     # We'll keep the conversion error but continue with None
 
-            # Create usage record
-            usage_record = {
+            # Запись ставится в очередь шины трекинга и пишется пачкой вместе
+            # с остальными логами; кэш аналитики сбрасывается один раз на пачку
+            await tracking_event_bus.publish_row(FeatureUsage.__tablename__, {
                 'user_id': user_id,
                 'feature_type': feature_type,
                 'content_type': content_type_enum,  # Use converted enum or None
@@ -70,20 +74,8 @@ class FeatureUsageService:
                 'usage_data': usage_data or {},
                 'error_type': error_type,
                 'created_at': datetime.utcnow()
-            }
+            })
 
-            # Создаем асинхронную задачу для обработки записи с новой сессией
-            # Это позволит не блокировать основной поток выполнения и избежать проблем с транзакциями
-            task = asyncio.create_task(
-                self._process_usage_record_with_new_session(usage_record)
-            )
-            
-            # Добавляем задачу в список для отслеживания
-            self.background_tasks.append(task)
-            
-            # Очищаем завершенные задачи
-            self.background_tasks = [t for t in self.background_tasks if not t.done()]
-                
             # If generation metrics provided, track them separately
             if content_type and generation_time and tokens_used is not None:
                 # Создаем асинхронную задачу для сохранения метрик с новой сессией
@@ -315,90 +307,17 @@ class FeatureUsageService:
     async def create_materialized_views(self) -> None:
         """Создание материализованных представлений для оптимизации запросов"""
         try:
-            # Создаем материализованное представление для ежедневной статистики
-            daily_stats_view = text("""
-                CREATE MATERIALIZED VIEW IF NOT EXISTS feature_usage_daily_summary AS
-                SELECT 
-                    DATE_TRUNC('day', created_at) AS day,
-                    feature_type,
-                    content_type,
-                    COUNT(*) AS total_count,
-                    COUNT(DISTINCT user_id) AS unique_users,
-                    AVG(CASE WHEN success THEN 1 ELSE 0 END) AS success_rate
-                FROM 
-                    feature_usage
-                GROUP BY 
-                    DATE_TRUNC('day', created_at),
-                    feature_type,
-                    content_type;
-            """)
-            
-            await self.session.execute(daily_stats_view)
-            
-            # Создаем индекс для материализованного представления отдельным запросом
-            daily_stats_index = text("""
-                CREATE INDEX IF NOT EXISTS idx_feature_usage_daily_summary_day 
-                ON feature_usage_daily_summary(day);
-            """)
-            
-            await self.session.execute(daily_stats_index)
-            
-            # Создаем материализованное представление для статистики пользователей
-            user_stats_view = text("""
-                CREATE MATERIALIZED VIEW IF NOT EXISTS user_activity_summary AS
-                SELECT 
-                    user_id,
-                    COUNT(*) AS total_actions,
-                    MIN(created_at) AS first_action,
-                    MAX(created_at) AS last_action,
-                    COUNT(DISTINCT DATE_TRUNC('day', created_at)) AS active_days
-                FROM 
-                    feature_usage
-                GROUP BY 
-                    user_id;
-            """)
-            
-            await self.session.execute(user_stats_view)
-            
-            # Создаем индекс для материализованного представления отдельным запросом
-            user_stats_index = text("""
-                CREATE INDEX IF NOT EXISTS idx_user_activity_summary_user_id 
-                ON user_activity_summary(user_id);
-            """)
-            
-            await self.session.execute(user_stats_index)
-            
-            # Коммитим изменения
-            await self.session.commit()
-            
+            await MaterializedViewRefresher(self.session).ensure_views()
             logger.info("Created materialized views for analytics")
-            
         except Exception as e:
             await self.session.rollback()
             logger.error(f"Error creating materialized views: {str(e)}")
 
     async def refresh_materialized_views(self) -> None:
-        """Обновление материализованных представлений"""
+        """Обновление материализованных представлений (только при изменении исходных таблиц)"""
         try:
-            # Обновляем материализованное представление для ежедневной статистики
-            refresh_daily_stats = text("""
-                REFRESH MATERIALIZED VIEW feature_usage_daily_summary;
-            """)
-            
-            await self.session.execute(refresh_daily_stats)
-            
-            # Обновляем материализованное представление для статистики пользователей
-            refresh_user_stats = text("""
-                REFRESH MATERIALIZED VIEW user_activity_summary;
-            """)
-            
-            await self.session.execute(refresh_user_stats)
-            
-            # Коммитим изменения
-            await self.session.commit()
-            
-            logger.info("Refreshed materialized views for analytics")
-            
+            outcomes = await MaterializedViewRefresher(self.session).refresh_all()
+            logger.info(f"Materialized views checked: {', '.join(f'{o.view_name}={o.status}' for o in outcomes)}")
         except Exception as e:
             await self.session.rollback()
             logger.error(f"Error refreshing materialized views: {str(e)}")
@@ -407,23 +326,13 @@ class FeatureUsageService:
         """Очистка устаревших данных аналитики"""
         try:
             # Определяем дату для очистки
-            cutoff_date = datetime.utcnow() - timedelta(days=self.DEFAULT_CLEANUP_DAYS)
-            
-            # Удаляем устаревшие данные
-            delete_query = text("""
-                DELETE FROM feature_usage
-                WHERE created_at < :cutoff_date
-            """)
-            
-            await self.session.execute(delete_query, {"cutoff_date": cutoff_date})
-            
-            # Удаляем устаревшие метрики
-            delete_metrics_query = text("""
-                DELETE FROM detailed_generation_metrics
-                WHERE date < :cutoff_date
-            """)
+            cutoff_date = datetime.now(timezone.utc) - timedelta(days=self.DEFAULT_CLEANUP_DAYS)
             
-            await self.session.execute(delete_metrics_query, {"cutoff_date": cutoff_date})
+            # Удаляем устаревшие данные и метрики: старые месяцы - удалением секций,
+            # остаток граничного месяца - DELETE в пределах одной секции
+            partition_manager = LogPartitionManager(self.session)
+            await partition_manager.apply_retention("feature_usage", cutoff_date)
+            await partition_manager.apply_retention("detailed_generation_metrics", cutoff_date)
             
             # Коммитим изменения
             await self.session.commit()
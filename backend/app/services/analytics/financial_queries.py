@@ -0,0 +1,194 @@
+"""
+Агрегирующие запросы финансовой аналитики и аналитики баллов.
+
+Все суммы, группировки и подсчеты уникальных пользователей выполняются в
+PostgreSQL (GROUP BY / FILTER / COUNT(DISTINCT)), в Python возвращаются только
+строки результата. Группировка платежей по тарифу идет по выражению
+meta_data->>'tariff_type', для которого есть частичный индекс
+idx_payments_completed_tariff_type (см. models/payment.py).
+
+В отличие от AnalyticsRollupService значения точные (без HyperLogLog), поэтому
+запросы используются для сверки и как запасной путь, когда агрегаты недоступны.
+"""
+import logging
+from datetime import date, datetime
+from typing import Dict, Optional, Sequence
+
+from sqlalchemy import func, select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ...models.user import User
+
+logger = logging.getLogger(__name__)
+
+# Типы платежей, учитываемые в доходе
+REVENUE_PAYMENT_TYPES = ("tariff", "points")
+
+PAYMENT_SUMMARY_SQL = """
+    SELECT
+        COALESCE(SUM(p.amount), 0) AS total_revenue,
+        COUNT(*) AS payments_count,
+        COALESCE(SUM(p.amount) FILTER (WHERE p.payment_type = 'tariff'), 0) AS tariff_revenue,
+        COUNT(*) FILTER (WHERE p.payment_type = 'tariff') AS tariff_count,
+        COALESCE(SUM(p.amount) FILTER (WHERE p.payment_type = 'points'), 0) AS points_revenue,
+        COUNT(*) FILTER (WHERE p.payment_type = 'points') AS points_count,
+        COUNT(DISTINCT p.user_id) AS paying_users
+    FROM payments p
+    WHERE p.status = 'completed'
+      AND p.payment_type = ANY(:payment_types)
+      AND p.created_at >= :start_date AND p.created_at < :end_date
+"""
+
+TARIFF_REVENUE_SQL = """
+    SELECT
+        p.meta_data->>'tariff_type' AS tariff_type,
+        COUNT(*) AS payments_count,
+        COALESCE(SUM(p.amount), 0) AS revenue
+    FROM payments p
+    WHERE p.status = 'completed'
+      AND p.payment_type = 'tariff'
+      AND p.meta_data->>'tariff_type' IS NOT NULL
+      AND p.created_at >= :start_date AND p.created_at < :end_date
+    GROUP BY p.meta_data->>'tariff_type'
+"""
+
+DAILY_REVENUE_SQL = """
+    SELECT
+        (p.created_at AT TIME ZONE 'UTC')::date AS day,
+        COALESCE(SUM(p.amount), 0) AS revenue
+    FROM payments p
+    WHERE p.status = 'completed'
+      AND p.created_at >= :start_date AND p.created_at < :end_date
+    GROUP BY 1
+"""
+
+POINTS_SUMMARY_SQL = """
+    SELECT
+        COUNT(*) AS total_count,
+        COALESCE(SUM(pt.amount) FILTER (WHERE pt.transaction_type = ANY(:purchase_types)), 0) AS total_purchased,
+        COALESCE(SUM(ABS(pt.amount)) FILTER (WHERE pt.transaction_type = ANY(:usage_types)), 0) AS total_used,
+        COUNT(DISTINCT pt.user_id) AS unique_users
+    FROM point_transactions pt
+    JOIN users u ON u.id = pt.user_id
+    WHERE pt.created_at >= :start_date AND pt.created_at < :end_date
+      AND (CAST(:transaction_types AS text[]) IS NULL OR pt.transaction_type = ANY(:transaction_types))
+      AND (CAST(:tariffs AS text[]) IS NULL OR LOWER(COALESCE(u.tariff::text, 'none')) = ANY(:tariffs))
+"""
+
+POINTS_BY_TARIFF_SQL = """
+    SELECT
+        LOWER(COALESCE(u.tariff::text, 'none')) AS tariff,
+        COALESCE(SUM(pt.amount), 0) AS amount
+    FROM point_transactions pt
+    JOIN users u ON u.id = pt.user_id
+    WHERE pt.created_at >= :start_date AND pt.created_at < :end_date
+      AND pt.transaction_type = ANY(:purchase_types)
+    GROUP BY 1
+"""
+
+
+class FinancialAnalyticsQueries:
+    """Точные агрегаты по платежам и транзакциям баллов, посчитанные в SQL"""
+
+    PURCHASE_TYPES = ["purchase", "admin_add"]
+    USAGE_TYPES = ["generation", "admin_subtract"]
+
+    def __init__(self, session: AsyncSession):
+        self.session = session
+
+    async def payment_summary(self, start_date: datetime, end_date: datetime) -> Dict:
+        """Общий доход, доход по типам платежей и число платящих пользователей"""
+        result = await self.session.execute(
+            text(PAYMENT_SUMMARY_SQL),
+            {
+                "payment_types": list(REVENUE_PAYMENT_TYPES),
+                "start_date": start_date,
+                "end_date": end_date
+            }
+        )
+        row = result.one()
+        return {
+            "total_revenue": float(row.total_revenue),
+            "payments_count": row.payments_count,
+            "tariff_revenue": float(row.tariff_revenue),
+            "tariff_count": row.tariff_count,
+            "points_revenue": float(row.points_revenue),
+            "points_count": row.points_count,
+            "paying_users": row.paying_users
+        }
+
+    async def tariff_revenue(self, start_date: datetime, end_date: datetime) -> Dict[str, Dict]:
+        """Количество и сумма оплат по tariff_type из meta_data"""
+        result = await self.session.execute(
+            text(TARIFF_REVENUE_SQL),
+            {"start_date": start_date, "end_date": end_date}
+        )
+        return {
+            row.tariff_type: {"count": row.payments_count, "revenue": float(row.revenue)}
+            for row in result
+        }
+
+    async def daily_revenue(self, start_date: datetime, end_date: datetime) -> Dict[date, float]:
+        """Доход по дням (UTC), дни без платежей отсутствуют в словаре"""
+        result = await self.session.execute(
+            text(DAILY_REVENUE_SQL),
+            {"start_date": start_date, "end_date": end_date}
+        )
+        return {row.day: float(row.revenue) for row in result}
+
+    async def revenue(self, start_date: datetime, end_date: datetime) -> float:
+        """Сумма всех завершенных платежей за период"""
+        result = await self.session.execute(
+            text("""
+                SELECT COALESCE(SUM(p.amount), 0)
+                FROM payments p
+                WHERE p.status = 'completed'
+                  AND p.created_at >= :start_date AND p.created_at < :end_date
+            """),
+            {"start_date": start_date, "end_date": end_date}
+        )
+        return float(result.scalar() or 0)
+
+    async def active_tariff_counts(self, now: datetime) -> Dict[str, int]:
+        """Количество пользователей с действующим тарифом по каждому тарифу"""
+        result = await self.session.execute(
+            select(User.tariff, func.count(User.id))
+            .where(User.tariff.isnot(None), User.tariff_valid_until >= now)
+            .group_by(User.tariff)
+        )
+        return {tariff.value: count for tariff, count in result}
+
+    async def points_summary(
+            self,
+            start_date: datetime,
+            end_date: datetime,
+            transaction_types: Optional[Sequence[str]] = None,
+            tariffs: Optional[Sequence[str]] = None
+    ) -> Dict:
+        """Счетчики операций с баллами с фильтрами по типу операции и тарифу пользователя"""
+        result = await self.session.execute(
+            text(POINTS_SUMMARY_SQL),
+            {
+                "start_date": start_date,
+                "end_date": end_date,
+                "purchase_types": self.PURCHASE_TYPES,
+                "usage_types": self.USAGE_TYPES,
+                "transaction_types": list(transaction_types) if transaction_types is not None else None,
+                "tariffs": list(tariffs) if tariffs is not None else None
+            }
+        )
+        row = result.one()
+        return {
+            "total_count": row.total_count,
+            "total_purchased": float(row.total_purchased),
+            "total_used": float(row.total_used),
+            "unique_users": row.unique_users
+        }
+
+    async def points_purchases_by_tariff(self, start_date: datetime, end_date: datetime) -> Dict[str, float]:
+        """Сумма покупок баллов по текущему тарифу пользователя"""
+        result = await self.session.execute(
+            text(POINTS_BY_TARIFF_SQL),
+            {"start_date": start_date, "end_date": end_date, "purchase_types": self.PURCHASE_TYPES}
+        )
+        return {row.tariff: float(row.amount) for row in result}
@@ -0,0 +1,248 @@
+"""
+Обновление материализованных представлений аналитики только при изменении данных.
+
+Для каждого представления хранится сигнатура исходных таблиц - сумма
+счетчиков вставок, обновлений и удалений из pg_stat_user_tables (для
+секционированных таблиц - по всем секциям). Если сигнатура не изменилась с
+последнего обновления, REFRESH пропускается. Обновление выполняется
+CONCURRENTLY (по уникальному индексу представления), чтобы чтение не
+блокировалось, под advisory-блокировкой транзакции: при нескольких воркерах
+uvicorn представление обновляет только один из них, остальные пропускают ход.
+
+Счетчики pg_stat обновляются с задержкой до нескольких секунд, поэтому
+изменения, попавшие в статистику после вычисления сигнатуры, будут учтены при
+следующей проверке.
+"""
+import logging
+import time
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ...models import MaterializedViewRefresh
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class MaterializedViewSpec:
+    """Материализованное представление, его исходные таблицы и индексы"""
+    name: str
+    query: str
+    sources: Tuple[str, ...]
+    # Колонки уникального индекса, обязательного для REFRESH CONCURRENTLY
+    unique_columns: Tuple[str, ...]
+    indexes: Tuple[str, ...] = ()
+
+    @property
+    def unique_index(self) -> str:
+        return f"uq_{self.name}"
+
+
+MATERIALIZED_VIEWS: Dict[str, MaterializedViewSpec] = {
+    "feature_usage_daily_summary": MaterializedViewSpec(
+        name="feature_usage_daily_summary",
+        query="""
+            SELECT
+                DATE_TRUNC('day', created_at) AS day,
+                feature_type,
+                content_type,
+                COUNT(*) AS total_count,
+                COUNT(DISTINCT user_id) AS unique_users,
+                AVG(CASE WHEN success THEN 1 ELSE 0 END) AS success_rate
+            FROM feature_usage
+            GROUP BY DATE_TRUNC('day', created_at), feature_type, content_type
+        """,
+        sources=("feature_usage",),
+        unique_columns=("day", "feature_type", "content_type"),
+        indexes=("day",)
+    ),
+    "user_activity_summary": MaterializedViewSpec(
+        name="user_activity_summary",
+        query="""
+            SELECT
+                user_id,
+                COUNT(*) AS total_actions,
+                MIN(created_at) AS first_action,
+                MAX(created_at) AS last_action,
+                COUNT(DISTINCT DATE_TRUNC('day', created_at)) AS active_days
+            FROM feature_usage
+            GROUP BY user_id
+        """,
+        sources=("feature_usage",),
+        unique_columns=("user_id",)
+    ),
+}
+
+
+@dataclass
+class RefreshOutcome:
+    """Результат проверки одного представления"""
+    view_name: str
+    status: str  # refreshed, created, unchanged, locked, failed
+    duration_ms: float = 0.0
+    error: Optional[str] = None
+
+
+class MaterializedViewRefresher:
+    """Создание и обновление материализованных представлений по изменению данных"""
+
+    def __init__(self, session: AsyncSession, views: Optional[Dict[str, MaterializedViewSpec]] = None):
+        self.session = session
+        self.views = views if views is not None else MATERIALIZED_VIEWS
+
+    async def source_signature(self, sources: Sequence[str]) -> int:
+        """Сумма счетчиков изменений исходных таблиц и их секций"""
+        result = await self.session.execute(
+            text("""
+                WITH sources AS (
+                    SELECT to_regclass(name) AS relid FROM unnest(CAST(:tables AS text[])) AS name
+                )
+                SELECT COALESCE(SUM(s.n_tup_ins + s.n_tup_upd + s.n_tup_del), 0)
+                FROM pg_stat_user_tables s
+                WHERE s.relid IN (SELECT relid FROM sources)
+                   OR s.relid IN (
+                       SELECT i.inhrelid FROM pg_inherits i JOIN sources ON i.inhparent = sources.relid
+                   )
+            """),
+            {"tables": list(sources)}
+        )
+        return int(result.scalar() or 0)
+
+    async def _view_state(self, name: str) -> Optional[bool]:
+        """None - представления нет, иначе признак заполненности"""
+        result = await self.session.execute(
+            text("SELECT ispopulated FROM pg_matviews WHERE schemaname = current_schema() AND matviewname = :name"),
+            {"name": name}
+        )
+        row = result.first()
+        return None if row is None else bool(row.ispopulated)
+
+    async def _ensure_indexes(self, spec: MaterializedViewSpec) -> None:
+        await self.session.execute(text(
+            f"CREATE UNIQUE INDEX IF NOT EXISTS {spec.unique_index} "
+            f"ON {spec.name} ({', '.join(spec.unique_columns)})"
+        ))
+        for column in spec.indexes:
+            await self.session.execute(text(
+                f"CREATE INDEX IF NOT EXISTS idx_{spec.name}_{column} ON {spec.name} ({column})"
+            ))
+
+    async def _save_state(self, name: str, values: Dict) -> None:
+        stmt = pg_insert(MaterializedViewRefresh).values(view_name=name, **values)
+        update = {key: stmt.excluded[key] for key in values}
+        if "refresh_count" in values:
+            update["refresh_count"] = MaterializedViewRefresh.refresh_count + 1
+            update["total_duration_ms"] = MaterializedViewRefresh.total_duration_ms + stmt.excluded.last_duration_ms
+        if "skip_count" in values:
+            update["skip_count"] = MaterializedViewRefresh.skip_count + 1
+        await self.session.execute(stmt.on_conflict_do_update(
+            index_elements=[MaterializedViewRefresh.view_name],
+            set_=update
+        ))
+
+    async def _stored_signature(self, name: str) -> Optional[int]:
+        result = await self.session.execute(
+            text("SELECT source_signature FROM materialized_view_refreshes WHERE view_name = :name"),
+            {"name": name}
+        )
+        return result.scalar()
+
+    async def refresh(self, name: str, force: bool = False) -> RefreshOutcome:
+        """
+        Обновляет представление, если исходные данные изменились
+
+        Args:
+            name: Имя представления из MATERIALIZED_VIEWS
+            force: Обновить независимо от сигнатуры
+        """
+        spec = self.views[name]
+        now = datetime.now(timezone.utc)
+        try:
+            # Одно обновление на все воркеры; блокировка снимается при commit/rollback
+            locked = await self.session.execute(
+                text("SELECT pg_try_advisory_xact_lock(hashtext(:key))"),
+                {"key": f"matview_refresh:{name}"}
+            )
+            if not locked.scalar():
+                await self.session.rollback()
+                return RefreshOutcome(name, "locked")
+
+            signature = await self.source_signature(spec.sources)
+            state = await self._view_state(name)
+
+            if state and not force and signature == await self._stored_signature(name):
+                await self._save_state(name, {"checked_at": now, "skip_count": 1})
+                await self.session.commit()
+                return RefreshOutcome(name, "unchanged")
+
+            started = time.perf_counter()
+            if state is None:
+                await self.session.execute(text(f"CREATE MATERIALIZED VIEW {name} AS {spec.query} WITH DATA"))
+                await self._ensure_indexes(spec)
+                status = "created"
+            else:
+                await self._ensure_indexes(spec)
+                # CONCURRENTLY невозможен для незаполненного представления
+                concurrently = "CONCURRENTLY " if state else ""
+                await self.session.execute(text(f"REFRESH MATERIALIZED VIEW {concurrently}{name}"))
+                status = "refreshed"
+            duration_ms = (time.perf_counter() - started) * 1000
+
+            await self._save_state(name, {
+                "source_signature": signature,
+                "refreshed_at": now,
+                "checked_at": now,
+                "last_duration_ms": duration_ms,
+                "total_duration_ms": duration_ms,
+                "last_error": None,
+                "refresh_count": 1
+            })
+            await self.session.commit()
+            logger.info(f"Materialized view {name} {status} in {duration_ms:.0f} ms")
+            return RefreshOutcome(name, status, duration_ms)
+
+        except Exception as e:
+            await self.session.rollback()
+            logger.error(f"Error refreshing materialized view {name}: {str(e)}")
+            try:
+                await self._save_state(name, {"checked_at": now, "last_error": str(e)})
+                await self.session.commit()
+            except Exception:
+                await self.session.rollback()
+            return RefreshOutcome(name, "failed", error=str(e))
+
+    async def refresh_all(self, force: bool = False) -> List[RefreshOutcome]:
+        """Проверяет и при необходимости обновляет все представления"""
+        return [await self.refresh(name, force) for name in self.views]
+
+    async def ensure_views(self) -> List[RefreshOutcome]:
+        """Создает отсутствующие представления и их индексы"""
+        outcomes = []
+        for name, spec in self.views.items():
+            if await self._view_state(name) is None:
+                outcomes.append(await self.refresh(name))
+            else:
+                await self._ensure_indexes(spec)
+                await self.session.commit()
+        return outcomes
+
+    async def status(self) -> List[Dict]:
+        """Метрики обновлений: длительность, количество обновлений и пропусков"""
+        result = await self.session.execute(text("""
+            SELECT view_name, refreshed_at, checked_at, last_duration_ms,
+                   total_duration_ms, refresh_count, skip_count, last_error
+            FROM materialized_view_refreshes
+            ORDER BY view_name
+        """))
+        return [
+            {
+                **row._asdict(),
+                "avg_duration_ms": row.total_duration_ms / row.refresh_count if row.refresh_count else 0.0
+            }
+            for row in result.fetchall()
+        ]
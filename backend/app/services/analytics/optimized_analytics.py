@@ -1,7 +1,7 @@
 import asyncio
 import asyncio
 import logging
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 from typing import Dict, Any, List, Optional, Callable
 
 from sqlalchemy import text, func, select, insert # Добавлен импорт insert
@@ -20,6 +20,10 @@ from ...models import (
 )
 from ..optimization.batch_processor import BatchProcessor
 from ..optimization.query_optimizer import QueryOptimizer
+from ..maintenance.partitioning import LogPartitionManager
+from .query_fanout import QueryFanOut
+from .matview_refresh import MaterializedViewRefresher
+from .snapshot_store import AnalyticsSnapshotStore
 
 logger = logging.getLogger(__name__)
 
@@ -233,28 +237,40 @@ class OptimizedAnalyticsService:
             if cached_data:
                 return cached_data
                 
-            # Получаем базовую статистику
-            total_users = await self.session.scalar(
-                select(func.count()).select_from(User)
-            )
-            
-            # Получаем активных пользователей за сегодня
             today = datetime.utcnow().date()
+            today_start = datetime.combine(today, datetime.min.time(), tzinfo=timezone.utc)
+            today_end = today_start + timedelta(days=1)
+
+            # Общее количество пользователей
+            total_users_query = select(func.count()).select_from(User)
+
+            # Активные пользователи за сегодня.
+            # Диапазон по created_at вместо DATE(created_at) - позволяет отсечь секции
             active_users_query = select(
                 func.count(func.distinct(FeatureUsage.user_id))
             ).where(
-                func.date(FeatureUsage.created_at) == today
+                FeatureUsage.created_at >= today_start,
+                FeatureUsage.created_at < today_end
             )
-            active_users = await self.session.scalar(active_users_query)
-            
-            # Получаем количество генераций за сегодня
+
+            # Количество генераций за сегодня
             generations_query = select(
                 func.count()
             ).select_from(Generation).where(
-                func.date(Generation.created_at) == today
+                Generation.created_at >= today_start,
+                Generation.created_at < today_end
             )
-            generations_today = await self.session.scalar(generations_query)
-            
+
+            # Запросы независимы - выполняем их параллельно на отдельных соединениях пула
+            results = await QueryFanOut().run({
+                "total_users": lambda s: s.scalar(total_users_query),
+                "active_users": lambda s: s.scalar(active_users_query),
+                "generations_today": lambda s: s.scalar(generations_query)
+            }, return_exceptions=False)
+            total_users = results["total_users"]
+            active_users = results["active_users"]
+            generations_today = results["generations_today"]
+
             # Формируем результат
             stats = {
                 'users': {
@@ -289,33 +305,16 @@ class OptimizedAnalyticsService:
         """Очистка устаревших данных аналитики"""
         try:
             # Определяем даты для очистки
-            detailed_cutoff = datetime.utcnow() - timedelta(days=self.RETENTION_DAYS['detailed'])
-            aggregated_cutoff = datetime.utcnow() - timedelta(days=self.RETENTION_DAYS['aggregated'])
+            detailed_cutoff = datetime.now(timezone.utc) - timedelta(days=self.RETENTION_DAYS['detailed'])
             
-            # Удаляем устаревшие детальные данные
-            detailed_query = text("""
-                DELETE FROM feature_usage
-                WHERE created_at < :cutoff_date
-            """)
-            
-            await self.session.execute(
-                detailed_query,
-                {'cutoff_date': detailed_cutoff}
-            )
-            
-            # Удаляем устаревшие агрегированные данные
-            aggregated_query = text("""
-                DELETE FROM analytics_data
-                WHERE created_at < :cutoff_date
-            """)
-            
-            await self.session.execute(
-                aggregated_query,
-                {'cutoff_date': aggregated_cutoff}
-            )
+            # Удаляем устаревшие детальные данные (старые месяцы - удалением секций)
+            await LogPartitionManager(self.session).apply_retention('feature_usage', detailed_cutoff)
             
             # Коммитим изменения
             await self.session.commit()
+
+            # Старые снимки переносятся в колоночный архив, месяцы архива старше RETENTION_DAYS['aggregated'] удаляются
+            await AnalyticsSnapshotStore(self.session).compact(retention_days=self.RETENTION_DAYS['aggregated'])
             
             logger.info(f"Cleaned up analytics data older than {detailed_cutoff}")
             
@@ -339,80 +338,17 @@ class OptimizedAnalyticsService:
     async def create_materialized_views(self) -> None:
         """Создание материализованных представлений для оптимизации запросов"""
         try:
-            # Создаем материализованное представление для ежедневной статистики
-            daily_stats_view = text("""
-                CREATE MATERIALIZED VIEW IF NOT EXISTS feature_usage_daily_summary AS
-                SELECT 
-                    DATE_TRUNC('day', created_at) AS day,
-                    feature_type,
-                    content_type,
-                    COUNT(*) AS total_count,
-                    COUNT(DISTINCT user_id) AS unique_users,
-                    AVG(CASE WHEN success THEN 1 ELSE 0 END) AS success_rate
-                FROM 
-                    feature_usage
-                GROUP BY 
-                    DATE_TRUNC('day', created_at),
-                    feature_type,
-                    content_type;
-                
-                CREATE INDEX IF NOT EXISTS idx_feature_usage_daily_summary_day 
-                ON feature_usage_daily_summary(day);
-            """)
-            
-            await self.session.execute(daily_stats_view)
-            
-            # Создаем материализованное представление для статистики пользователей
-            user_stats_view = text("""
-                CREATE MATERIALIZED VIEW IF NOT EXISTS user_activity_summary AS
-                SELECT 
-                    user_id,
-                    COUNT(*) AS total_actions,
-                    MIN(created_at) AS first_action,
-                    MAX(created_at) AS last_action,
-                    COUNT(DISTINCT DATE_TRUNC('day', created_at)) AS active_days
-                FROM 
-                    feature_usage
-                GROUP BY 
-                    user_id;
-                
-                CREATE INDEX IF NOT EXISTS idx_user_activity_summary_user_id 
-                ON user_activity_summary(user_id);
-            """)
-            
-            await self.session.execute(user_stats_view)
-            
-            # Коммитим изменения
-            await self.session.commit()
-            
+            await MaterializedViewRefresher(self.session).ensure_views()
             logger.info("Created materialized views for analytics")
-            
         except Exception as e:
             await self.session.rollback()
             logger.error(f"Error creating materialized views: {str(e)}")
 
     async def refresh_materialized_views(self) -> None:
-        """Обновление материализованных представлений"""
+        """Обновление материализованных представлений (только при изменении исходных таблиц)"""
         try:
-            # Обновляем материализованное представление для ежедневной статистики
-            refresh_daily_stats = text("""
-                REFRESH MATERIALIZED VIEW feature_usage_daily_summary;
-            """)
-            
-            await self.session.execute(refresh_daily_stats)
-            
-            # Обновляем материализованное представление для статистики пользователей
-            refresh_user_stats = text("""
-                REFRESH MATERIALIZED VIEW user_activity_summary;
-            """)
-            
-            await self.session.execute(refresh_user_stats)
-            
-            # Коммитим изменения
-            await self.session.commit()
-            
-            logger.info("Refreshed materialized views for analytics")
-            
+            outcomes = await MaterializedViewRefresher(self.session).refresh_all()
+            logger.info(f"Materialized views checked: {', '.join(f'{o.view_name}={o.status}' for o in outcomes)}")
         except Exception as e:
             await self.session.rollback()
             logger.error(f"Error refreshing materialized views: {str(e)}")
@@ -0,0 +1,142 @@
+"""
+Параллельное выполнение независимых запросов аналитики.
+
+Одна AsyncSession работает поверх одного соединения, поэтому asyncio.gather над
+корутинами, использующими общую сессию, не дает параллелизма (а для asyncpg
+приводит к ошибке "another operation is in progress"). QueryFanOut берет из пула
+engine до N отдельных соединений и выполняет каждую задачу в своей сессии в
+транзакции READ ONLY с уровнем изоляции REPEATABLE READ.
+
+Чтобы все задачи видели одни и те же данные, ведущее соединение экспортирует
+снимок (pg_export_snapshot), а рабочие транзакции подключаются к нему через
+SET TRANSACTION SNAPSHOT. Время ответа дашборда при этом приближается к времени
+самого медленного запроса.
+"""
+import asyncio
+import logging
+import re
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine, AsyncSession
+
+from ...core.config import settings
+from ...core.database import engine as default_engine
+
+logger = logging.getLogger(__name__)
+
+QueryTask = Callable[[AsyncSession], Awaitable[Any]]
+
+# Формат идентификатора снимка PostgreSQL, например 00000003-0000001B-1
+_SNAPSHOT_ID = re.compile(r"^[0-9A-Fa-f]+-[0-9A-Fa-f]+(-[0-9]+)?$")
+
+
+class QueryFanOut:
+    """Выполняет read-only задачи аналитики параллельно на отдельных соединениях пула"""
+
+    def __init__(
+            self,
+            bind: Optional[AsyncEngine] = None,
+            max_connections: Optional[int] = None,
+            consistent_snapshot: bool = True,
+            statement_timeout_ms: Optional[int] = None
+    ):
+        self.engine = bind or default_engine
+        limit = max_connections or settings.ANALYTICS_FANOUT_CONNECTIONS
+        # Одно соединение занимает ведущая транзакция со снимком
+        pool_capacity = settings.DB_POOL_SIZE + settings.DB_MAX_OVERFLOW - 1
+        self.max_connections = max(1, min(limit, pool_capacity))
+        self.consistent_snapshot = consistent_snapshot
+        self.statement_timeout_ms = (
+            settings.ANALYTICS_FANOUT_STATEMENT_TIMEOUT_MS
+            if statement_timeout_ms is None else statement_timeout_ms
+        )
+        # Длительность каждой задачи и всего прогона последнего вызова run()
+        self.timings: Dict[str, float] = {}
+        self.elapsed: float = 0.0
+
+    async def _read_only(self, conn: AsyncConnection) -> AsyncConnection:
+        """Транзакция соединения начнется как REPEATABLE READ READ ONLY"""
+        return await conn.execution_options(
+            isolation_level="REPEATABLE READ",
+            postgresql_readonly=True
+        )
+
+    async def _export_snapshot(self) -> tuple:
+        """Открывает ведущую транзакцию и экспортирует ее снимок"""
+        leader = await self.engine.connect()
+        try:
+            leader = await self._read_only(leader)
+            snapshot_id = (await leader.execute(text("SELECT pg_export_snapshot()"))).scalar()
+            if not snapshot_id or not _SNAPSHOT_ID.match(snapshot_id):
+                raise ValueError(f"Unexpected snapshot id: {snapshot_id!r}")
+            return leader, snapshot_id
+        except Exception:
+            await leader.close()
+            raise
+
+    async def _run_task(
+            self,
+            name: str,
+            task: QueryTask,
+            semaphore: asyncio.Semaphore,
+            snapshot_id: Optional[str]
+    ) -> Any:
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                async with self.engine.connect() as conn:
+                    conn = await self._read_only(conn)
+                    if snapshot_id:
+                        # Должно быть первым оператором транзакции; параметры здесь не поддерживаются
+                        await conn.execute(text(f"SET TRANSACTION SNAPSHOT '{snapshot_id}'"))
+                    if self.statement_timeout_ms:
+                        await conn.execute(text(f"SET LOCAL statement_timeout = {int(self.statement_timeout_ms)}"))
+
+                    session = AsyncSession(bind=conn, expire_on_commit=False, autoflush=False)
+                    try:
+                        return await task(session)
+                    finally:
+                        await session.close()
+            finally:
+                self.timings[name] = time.perf_counter() - started
+
+    async def run(self, tasks: Dict[str, QueryTask], return_exceptions: bool = True) -> Dict[str, Any]:
+        """
+        Выполняет задачи параллельно и возвращает результаты по именам задач
+
+        Args:
+            tasks: Имя задачи -> корутинная функция, получающая собственную сессию
+            return_exceptions: Возвращать исключение вместо результата упавшей задачи
+        """
+        if not tasks:
+            return {}
+
+        started = time.perf_counter()
+        self.timings = {}
+        leader, snapshot_id = None, None
+        if self.consistent_snapshot and len(tasks) > 1:
+            try:
+                leader, snapshot_id = await self._export_snapshot()
+            except Exception as e:
+                # Например, на реплике без поддержки экспорта - каждая задача со своим снимком
+                logger.warning(f"Snapshot export failed, running without shared snapshot: {str(e)}")
+
+        semaphore = asyncio.Semaphore(self.max_connections)
+        try:
+            results = await asyncio.gather(
+                *(self._run_task(name, task, semaphore, snapshot_id) for name, task in tasks.items()),
+                return_exceptions=return_exceptions
+            )
+        finally:
+            if leader is not None:
+                await leader.close()
+
+        self.elapsed = time.perf_counter() - started
+        slowest = max(self.timings.items(), key=lambda item: item[1], default=(None, 0.0))
+        logger.debug(
+            f"Query fan-out: {len(tasks)} tasks on {self.max_connections} connections "
+            f"in {self.elapsed:.3f}s (slowest {slowest[0]}: {slowest[1]:.3f}s)"
+        )
+        return dict(zip(tasks.keys(), results))
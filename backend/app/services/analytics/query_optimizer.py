@@ -4,6 +4,8 @@ from sqlalchemy import text, Table, Column, MetaData
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.exc import SQLAlchemyError
 
+from .matview_refresh import MATERIALIZED_VIEWS, MaterializedViewRefresher
+
 logger = logging.getLogger(__name__)
 
 class QueryOptimizer:
@@ -193,6 +195,11 @@ class QueryOptimizer:
         Returns:
             bool: Успешно ли обновлено представление
         """
+        if view_name in MATERIALIZED_VIEWS:
+            # Известные представления обновляются только при изменении данных и одним воркером
+            outcome = await MaterializedViewRefresher(self.session).refresh(view_name)
+            return outcome.status != "failed"
+
         try:
             concurrently_str = "CONCURRENTLY" if concurrently else ""
             
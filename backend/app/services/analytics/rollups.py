@@ -0,0 +1,884 @@
+"""
+Почасовые и дневные агрегаты (rollups) для админской аналитики.
+
+Сырые события (платежи, транзакции баллов, генерации, метрики генераций,
+использование функций) сворачиваются инкрементально по watermark: каждый
+запуск обрабатывает только завершившиеся часы после watermark и сдвигает его.
+События, записанные с опозданием (сброс буфера трекинга после простоя,
+повтор событий с диска), находятся по второму watermark - последнему
+учтенному id источника: часы, в которые попали строки с большим id и временем
+до watermark, сворачиваются заново целиком. Для изменяемых строк (платеж
+создается в статусе pending и завершается позже) так же пересворачиваются
+часы строк, измененных после последней свертки (changed_column).
+Запросы за период собираются из дневных агрегатов, почасовых агрегатов на
+краях периода и небольшого хвоста сырых данных после watermark, поэтому их
+стоимость не зависит от объема истории.
+
+Вместе с суммами хранятся скетчи, объединяемые слиянием: HyperLogLog
+уникальных пользователей (DAU/WAU/MAU за любое окно) и DDSketch значения
+источника (p50/p95/p99 длительности генерации).
+"""
+import asyncio
+import logging
+from collections import defaultdict
+from dataclasses import dataclass, field
+from datetime import date, datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ...core.config import settings
+from ...core.database import async_session
+from ...models import AnalyticsRollupHourly, AnalyticsRollupDaily, AnalyticsRollupWatermark
+from .sketches import DDSKETCH_MIN_VALUE, DDSketch, HyperLogLog
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class RollupSource:
+    """Источник сырых событий и выражения для его свертки"""
+    table: str
+    time_column: str
+    # Возрастающий id строки - порядок записи, а не время события
+    id_column: str
+    user_column: str
+    category: str
+    tariff: str
+    amount: str = "0"
+    success: str = "TRUE"
+    where: str = "TRUE"
+    # Дополнительная задержка свертки (платеж может завершиться позже создания)
+    lag_seconds: int = 0
+    # Значение, распределение которого хранится в DDSketch (None - без скетча)
+    value: Optional[str] = None
+    # Время последнего изменения строки (None - строки источника не изменяются)
+    changed_column: Optional[str] = None
+
+    @property
+    def base_table(self) -> str:
+        """Таблица событий без присоединенных таблиц (для MAX(id) по индексу)"""
+        return self.table.split(" JOIN ")[0]
+
+
+# Текущий тариф пользователя на момент свертки
+_USER_TARIFF = "LOWER(COALESCE(u.tariff::text, 'none'))"
+
+ROLLUP_SOURCES: Dict[str, RollupSource] = {
+    "payments": RollupSource(
+        table="payments p",
+        time_column="p.created_at",
+        id_column="p.id",
+        user_column="p.user_id",
+        category="p.payment_type",
+        tariff="LOWER(COALESCE(p.meta_data->>'tariff_type', 'none'))",
+        amount="p.amount",
+        where="p.status = 'completed'",
+        lag_seconds=3600,
+        changed_column="p.updated_at"
+    ),
+    "point_transactions": RollupSource(
+        table="point_transactions pt JOIN users u ON u.id = pt.user_id",
+        time_column="pt.created_at",
+        id_column="pt.id",
+        user_column="pt.user_id",
+        category="pt.transaction_type",
+        tariff=_USER_TARIFF,
+        amount="pt.amount"
+    ),
+    "generations": RollupSource(
+        table="generations g JOIN users u ON u.id = g.user_id",
+        time_column="g.created_at",
+        id_column="g.id",
+        user_column="g.user_id",
+        category="LOWER(g.type::text)",
+        tariff=_USER_TARIFF
+    ),
+    "generation_metrics": RollupSource(
+        table="generation_metrics gm JOIN users u ON u.id = gm.user_id",
+        time_column="gm.created_at",
+        id_column="gm.id",
+        user_column="gm.user_id",
+        category="LOWER(gm.content_type::text)",
+        tariff=_USER_TARIFF,
+        amount="gm.generation_time",
+        success="gm.success",
+        value="gm.generation_time"
+    ),
+    "feature_usage": RollupSource(
+        table="feature_usage fu JOIN users u ON u.id = fu.user_id",
+        time_column="fu.created_at",
+        id_column="fu.id",
+        user_column="fu.user_id",
+        category="fu.feature_type",
+        tariff=_USER_TARIFF,
+        success="fu.success"
+    ),
+}
+
+# Строк в одном INSERT ... ON CONFLICT (ограничение asyncpg на число параметров)
+_UPSERT_CHUNK = 1000
+
+
+def _utc(value: datetime) -> datetime:
+    return value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value.astimezone(timezone.utc)
+
+
+def floor_hour(value: datetime) -> datetime:
+    return _utc(value).replace(minute=0, second=0, microsecond=0)
+
+
+def ceil_hour(value: datetime) -> datetime:
+    floored = floor_hour(value)
+    return floored if floored == _utc(value) else floored + timedelta(hours=1)
+
+
+def floor_day(value: datetime) -> datetime:
+    return floor_hour(value).replace(hour=0)
+
+
+def ceil_day(value: datetime) -> datetime:
+    floored = floor_day(value)
+    return floored if floored == _utc(value) else floored + timedelta(days=1)
+
+
+def pg_weekday(day: date) -> int:
+    """День недели в нумерации PostgreSQL EXTRACT(dow): 0 - воскресенье"""
+    return day.isoweekday() % 7
+
+
+@dataclass
+class RollupTotals:
+    """Суммарные показатели группы событий"""
+    count: int = 0
+    success: int = 0
+    amount: float = 0.0
+    amount_abs: float = 0.0
+
+    def add(self, count: int, success: int, amount: float, amount_abs: float) -> None:
+        self.count += count
+        self.success += success
+        self.amount += amount
+        self.amount_abs += amount_abs
+
+    @property
+    def success_rate(self) -> float:
+        return self.success / self.count * 100 if self.count else 0.0
+
+    @property
+    def avg_amount(self) -> float:
+        return self.amount / self.count if self.count else 0.0
+
+
+@dataclass
+class RollupGroup(RollupTotals):
+    """Показатели по категории и тарифу вместе с данными об уникальных пользователях"""
+    sketches: List[HyperLogLog] = field(default_factory=list)
+    user_ids: Set[int] = field(default_factory=set)
+    value_sketches: List[DDSketch] = field(default_factory=list)
+
+
+def _distinct(sketches: Sequence[HyperLogLog], user_ids: Set[int]) -> int:
+    """Уникальные пользователи: точно, если скетчей нет, иначе оценка HyperLogLog"""
+    if not sketches:
+        return len(user_ids)
+    merged = HyperLogLog.merge_all(sketches)
+    merged.update(user_ids)
+    return merged.count()
+
+
+class RollupResult:
+    """Агрегаты источника за период, собранные из rollup-таблиц и сырого хвоста"""
+
+    def __init__(self, source: str):
+        self.source = source
+        self.groups: Dict[Tuple[str, str], RollupGroup] = {}
+        self.daily: Dict[date, Dict[str, RollupTotals]] = defaultdict(dict)
+        self.hourly_counts = [0] * 24
+        self.weekday_counts = [0] * 7
+        self.weekday_hour_counts = [[0] * 24 for _ in range(7)]
+        self._weekday_sketches: Dict[int, List[HyperLogLog]] = defaultdict(list)
+        self._weekday_users: Dict[int, Set[int]] = defaultdict(set)
+
+    def add(
+            self,
+            day: date,
+            category: str,
+            tariff: str,
+            totals: Tuple[int, int, float, float],
+            hour_counts: Sequence[int],
+            sketch: Optional[HyperLogLog] = None,
+            user_ids: Iterable[int] = (),
+            value_sketch: Optional[DDSketch] = None
+    ) -> None:
+        group = self.groups.get((category, tariff))
+        if group is None:
+            group = self.groups[(category, tariff)] = RollupGroup()
+        group.add(*totals)
+
+        day_totals = self.daily[day].get(category)
+        if day_totals is None:
+            day_totals = self.daily[day][category] = RollupTotals()
+        day_totals.add(*totals)
+
+        weekday = pg_weekday(day)
+        self.weekday_counts[weekday] += totals[0]
+        for hour, count in enumerate(hour_counts):
+            if count:
+                self.hourly_counts[hour] += count
+                self.weekday_hour_counts[weekday][hour] += count
+
+        if sketch is not None:
+            group.sketches.append(sketch)
+            self._weekday_sketches[weekday].append(sketch)
+        if user_ids:
+            group.user_ids.update(user_ids)
+            self._weekday_users[weekday].update(user_ids)
+        if value_sketch is not None:
+            group.value_sketches.append(value_sketch)
+
+    def _select(self, categories: Optional[Iterable[str]] = None, tariffs: Optional[Iterable[str]] = None):
+        categories = set(categories) if categories is not None else None
+        tariffs = set(tariffs) if tariffs is not None else None
+        for (category, tariff), group in self.groups.items():
+            if categories is not None and category not in categories:
+                continue
+            if tariffs is not None and tariff not in tariffs:
+                continue
+            yield category, tariff, group
+
+    def totals(self, categories: Optional[Iterable[str]] = None, tariffs: Optional[Iterable[str]] = None) -> RollupTotals:
+        result = RollupTotals()
+        for _, _, group in self._select(categories, tariffs):
+            result.add(group.count, group.success, group.amount, group.amount_abs)
+        return result
+
+    def by_category(self, tariffs: Optional[Iterable[str]] = None) -> Dict[str, RollupTotals]:
+        result: Dict[str, RollupTotals] = defaultdict(RollupTotals)
+        for category, _, group in self._select(tariffs=tariffs):
+            result[category].add(group.count, group.success, group.amount, group.amount_abs)
+        return dict(result)
+
+    def by_tariff(self, categories: Optional[Iterable[str]] = None) -> Dict[str, RollupTotals]:
+        result: Dict[str, RollupTotals] = defaultdict(RollupTotals)
+        for _, tariff, group in self._select(categories=categories):
+            result[tariff].add(group.count, group.success, group.amount, group.amount_abs)
+        return dict(result)
+
+    def distinct_users(self, categories: Optional[Iterable[str]] = None, tariffs: Optional[Iterable[str]] = None) -> int:
+        sketches, user_ids = [], set()
+        for _, _, group in self._select(categories, tariffs):
+            sketches.extend(group.sketches)
+            user_ids.update(group.user_ids)
+        return _distinct(sketches, user_ids)
+
+    def value_sketch(self, categories: Optional[Iterable[str]] = None, tariffs: Optional[Iterable[str]] = None) -> DDSketch:
+        """Объединенный DDSketch значения источника (пустой, если у источника нет скетча)"""
+        return DDSketch.merge_all(
+            (sketch for _, _, group in self._select(categories, tariffs) for sketch in group.value_sketches),
+            settings.ROLLUP_QUANTILE_ACCURACY
+        )
+
+    def quantiles(
+            self,
+            qs: Sequence[float] = (0.5, 0.95, 0.99),
+            categories: Optional[Iterable[str]] = None,
+            tariffs: Optional[Iterable[str]] = None
+    ) -> Dict[float, Optional[float]]:
+        """Оценки квантилей значения источника (None, если данных нет)"""
+        sketch = self.value_sketch(categories, tariffs)
+        return dict(zip(qs, sketch.quantiles(qs)))
+
+    def distinct_users_by_category(self) -> Dict[str, int]:
+        return {category: self.distinct_users(categories=[category]) for category in self.by_category()}
+
+    def weekday_distinct_users(self, weekday: int) -> int:
+        return _distinct(self._weekday_sketches.get(weekday, []), self._weekday_users.get(weekday, set()))
+
+    def daily_series(self, categories: Optional[Iterable[str]] = None) -> Dict[date, RollupTotals]:
+        categories = set(categories) if categories is not None else None
+        series = {}
+        for day, per_category in sorted(self.daily.items()):
+            totals = RollupTotals()
+            for category, day_totals in per_category.items():
+                if categories is None or category in categories:
+                    totals.add(day_totals.count, day_totals.success, day_totals.amount, day_totals.amount_abs)
+            series[day] = totals
+        return series
+
+
+class AnalyticsRollupService:
+    """Свертка сырых событий в агрегаты и чтение агрегатов за период"""
+
+    # Фоновая догоняющая свертка, запущенная из запроса (одна на процесс)
+    _catch_up_task: Optional[asyncio.Task] = None
+
+    def __init__(self, session: AsyncSession):
+        self.session = session
+
+    # ---------- Свертка ----------
+
+    async def get_watermark(self, source: str) -> Optional[datetime]:
+        result = await self.session.execute(
+            text("SELECT watermark FROM analytics_rollup_watermarks WHERE source = :source"),
+            {"source": source}
+        )
+        watermark = result.scalar()
+        return _utc(watermark) if watermark else None
+
+    async def _set_watermark(
+            self,
+            source: str,
+            watermark: datetime,
+            last_id: Optional[int],
+            last_changed_at: Optional[datetime] = None
+    ) -> None:
+        stmt = pg_insert(AnalyticsRollupWatermark).values(
+            source=source, watermark=watermark, last_id=last_id, last_changed_at=last_changed_at
+        )
+        await self.session.execute(stmt.on_conflict_do_update(
+            index_elements=[AnalyticsRollupWatermark.source],
+            set_={
+                "watermark": stmt.excluded.watermark,
+                "last_id": stmt.excluded.last_id,
+                "last_changed_at": stmt.excluded.last_changed_at,
+                "updated_at": datetime.now(timezone.utc)
+            }
+        ))
+
+    async def _aggregate_raw(
+            self,
+            source_name: str,
+            start: datetime,
+            end: datetime,
+            categories: Optional[Sequence[str]] = None,
+            tariffs: Optional[Sequence[str]] = None
+    ) -> List[Any]:
+        """Агрегирует сырые события [start, end) по часам, категориям и тарифам"""
+        source = ROLLUP_SOURCES[source_name]
+        category = f"COALESCE({source.category}, 'unknown')"
+        params: Dict[str, Any] = {"start": start, "end": end}
+        filters = ""
+        if categories is not None:
+            filters += f" AND {category} = ANY(:categories)"
+            params["categories"] = list(categories)
+        if tariffs is not None:
+            filters += f" AND {source.tariff} = ANY(:tariffs)"
+            params["tariffs"] = list(tariffs)
+
+        result = await self.session.execute(
+            text(f"""
+                SELECT
+                    date_trunc('hour', {source.time_column} AT TIME ZONE 'UTC') AS bucket,
+                    {category} AS category,
+                    {source.tariff} AS tariff,
+                    COUNT(*) AS events_count,
+                    COUNT(*) FILTER (WHERE {source.success}) AS success_count,
+                    COALESCE(SUM({source.amount}), 0) AS amount_sum,
+                    COALESCE(SUM(ABS({source.amount})), 0) AS amount_abs_sum,
+                    array_agg(DISTINCT {source.user_column}) FILTER (WHERE {source.user_column} IS NOT NULL) AS user_ids
+                FROM {source.table}
+                WHERE {source.time_column} >= :start
+                  AND {source.time_column} < :end
+                  AND {source.where}{filters}
+                GROUP BY 1, 2, 3
+            """),
+            params
+        )
+        return result.fetchall()
+
+    async def _aggregate_values(
+            self,
+            source_name: str,
+            start: datetime,
+            end: datetime,
+            categories: Optional[Sequence[str]] = None,
+            tariffs: Optional[Sequence[str]] = None
+    ) -> Dict[Tuple[datetime, str, str], DDSketch]:
+        """
+        DDSketch значения источника по часам, категориям и тарифам за [start, end)
+
+        Номера корзин считаются в SQL, поэтому из БД приходит не больше строк,
+        чем корзин в скетчах, а не все значения.
+        """
+        source = ROLLUP_SOURCES[source_name]
+        sketches: Dict[Tuple[datetime, str, str], DDSketch] = {}
+        if source.value is None:
+            return sketches
+
+        accuracy = settings.ROLLUP_QUANTILE_ACCURACY
+        category = f"COALESCE({source.category}, 'unknown')"
+        params: Dict[str, Any] = {
+            "start": start,
+            "end": end,
+            "log_gamma": DDSketch(accuracy).log_gamma,
+            "min_value": DDSKETCH_MIN_VALUE
+        }
+        filters = ""
+        if categories is not None:
+            filters += f" AND {category} = ANY(:categories)"
+            params["categories"] = list(categories)
+        if tariffs is not None:
+            filters += f" AND {source.tariff} = ANY(:tariffs)"
+            params["tariffs"] = list(tariffs)
+
+        result = await self.session.execute(
+            text(f"""
+                SELECT
+                    date_trunc('hour', {source.time_column} AT TIME ZONE 'UTC') AS bucket,
+                    {category} AS category,
+                    {source.tariff} AS tariff,
+                    CASE WHEN {source.value} > :min_value
+                         THEN CEIL(LN({source.value}) / :log_gamma)::int END AS bin,
+                    COUNT(*) AS bin_count,
+                    SUM({source.value}) AS bin_sum,
+                    MIN({source.value}) AS bin_min,
+                    MAX({source.value}) AS bin_max
+                FROM {source.table}
+                WHERE {source.time_column} >= :start
+                  AND {source.time_column} < :end
+                  AND {source.value} IS NOT NULL
+                  AND {source.where}{filters}
+                GROUP BY 1, 2, 3, 4
+            """),
+            params
+        )
+        for row in result.fetchall():
+            key = (_utc(row.bucket), row.category, row.tariff)
+            sketch = sketches.get(key)
+            if sketch is None:
+                sketch = sketches[key] = DDSketch(accuracy)
+            sketch.add_bucket(row.bin, row.bin_count, float(row.bin_sum), float(row.bin_min), float(row.bin_max))
+        return sketches
+
+    async def _upsert(self, model, index_elements: List[str], rows: List[Dict[str, Any]]) -> None:
+        for offset in range(0, len(rows), _UPSERT_CHUNK):
+            stmt = pg_insert(model).values(rows[offset:offset + _UPSERT_CHUNK])
+            update_columns = {
+                column.name: stmt.excluded[column.name]
+                for column in model.__table__.columns
+                if column.name not in index_elements
+            }
+            await self.session.execute(stmt.on_conflict_do_update(index_elements=index_elements, set_=update_columns))
+
+    async def _rebuild_daily(self, source_name: str, first_day: datetime, last_day: datetime) -> int:
+        """Пересобирает дневные агрегаты [first_day, last_day] из почасовых"""
+        await self.session.execute(
+            text("""
+                DELETE FROM analytics_rollup_daily
+                WHERE source = :source AND day >= :start AND day <= :end
+            """),
+            {"source": source_name, "start": first_day.date(), "end": last_day.date()}
+        )
+        result = await self.session.execute(
+            text("""
+                SELECT bucket_start, category, tariff, events_count, success_count,
+                       amount_sum, amount_abs_sum, users_sketch, value_sketch
+                FROM analytics_rollup_hourly
+                WHERE source = :source AND bucket_start >= :start AND bucket_start < :end
+            """),
+            {"source": source_name, "start": first_day, "end": last_day + timedelta(days=1)}
+        )
+
+        days: Dict[Tuple[date, str, str], Dict[str, Any]] = {}
+        for row in result.fetchall():
+            bucket = _utc(row.bucket_start)
+            key = (bucket.date(), row.category, row.tariff)
+            day = days.get(key)
+            if day is None:
+                day = days[key] = {
+                    "totals": RollupTotals(),
+                    "hourly_counts": [0] * 24,
+                    "sketches": [],
+                    "value_sketches": []
+                }
+            day["totals"].add(row.events_count, row.success_count, row.amount_sum, row.amount_abs_sum)
+            day["hourly_counts"][bucket.hour] += row.events_count
+            if row.users_sketch:
+                day["sketches"].append(HyperLogLog.from_bytes(row.users_sketch))
+            if row.value_sketch:
+                day["value_sketches"].append(DDSketch.from_bytes(row.value_sketch))
+
+        rows = []
+        for (day, category, tariff), data in days.items():
+            totals = data["totals"]
+            rows.append({
+                "source": source_name,
+                "day": day,
+                "category": category,
+                "tariff": tariff,
+                "events_count": totals.count,
+                "success_count": totals.success,
+                "amount_sum": totals.amount,
+                "amount_abs_sum": totals.amount_abs,
+                "users_sketch": HyperLogLog.merge_all(data["sketches"]).to_bytes() if data["sketches"] else None,
+                "value_sketch": DDSketch.merge_all(data["value_sketches"]).to_bytes() if data["value_sketches"] else None,
+                "hourly_counts": data["hourly_counts"],
+            })
+        await self._upsert(AnalyticsRollupDaily, ["source", "day", "category", "tariff"], rows)
+        return len(rows)
+
+    async def _rollup_hours(self, source_name: str, start: datetime, end: datetime) -> int:
+        """Сворачивает часы [start, end) из сырых событий, заменяя их агрегаты целиком.
+
+        Returns:
+            Количество записанных почасовых строк
+        """
+        # Группы, из которых ушли все строки (возврат платежа), не должны остаться в агрегатах
+        await self.session.execute(
+            text("""
+                DELETE FROM analytics_rollup_hourly
+                WHERE source = :source AND bucket_start >= :start AND bucket_start < :end
+            """),
+            {"source": source_name, "start": start, "end": end}
+        )
+        raw_rows = await self._aggregate_raw(source_name, start, end)
+        value_sketches = await self._aggregate_values(source_name, start, end)
+
+        hourly_rows = []
+        for row in raw_rows:
+            sketch = HyperLogLog(settings.ROLLUP_SKETCH_PRECISION).update(row.user_ids or ())
+            value_sketch = value_sketches.get((_utc(row.bucket), row.category, row.tariff))
+            hourly_rows.append({
+                "source": source_name,
+                "bucket_start": _utc(row.bucket),
+                "category": row.category,
+                "tariff": row.tariff,
+                "events_count": row.events_count,
+                "success_count": row.success_count,
+                "amount_sum": float(row.amount_sum),
+                "amount_abs_sum": float(row.amount_abs_sum),
+                "users_sketch": sketch.to_bytes(),
+                "value_sketch": value_sketch.to_bytes() if value_sketch is not None else None,
+            })
+        await self._upsert(AnalyticsRollupHourly, ["source", "bucket_start", "category", "tariff"], hourly_rows)
+        await self._rebuild_daily(source_name, floor_day(start), floor_day(end - timedelta(microseconds=1)))
+        return len(hourly_rows)
+
+    async def _hours_where(self, source_name: str, condition: str, params: Dict[str, Any]) -> Set[datetime]:
+        """Часы (UTC), в которые попадают строки источника, удовлетворяющие условию"""
+        source = ROLLUP_SOURCES[source_name]
+        result = await self.session.execute(
+            text(f"""
+                SELECT DISTINCT date_trunc('hour', {source.time_column} AT TIME ZONE 'UTC') AS bucket
+                FROM {source.table}
+                WHERE {condition}
+            """),
+            params
+        )
+        return {_utc(row.bucket) for row in result.fetchall()}
+
+    async def _restate_hours(self, source_name: str, hours: Iterable[datetime]) -> int:
+        """Пересворачивает уже свернутые часы целиком.
+
+        Returns:
+            Количество пересвернутых часов
+        """
+        hours = sorted(hours)
+
+        # Соседние часы сворачиваются одним диапазоном
+        ranges: List[List[datetime]] = []
+        for hour in hours:
+            if ranges and ranges[-1][1] == hour:
+                ranges[-1][1] = hour + timedelta(hours=1)
+            else:
+                ranges.append([hour, hour + timedelta(hours=1)])
+        for start, end in ranges:
+            await self._rollup_hours(source_name, start, end)
+
+        if hours:
+            logger.info(f"Restated {source_name}: {len(hours)}h with late or changed rows, from {hours[0].isoformat()}")
+        return len(hours)
+
+    async def refresh_source(self, source_name: str) -> int:
+        """Сворачивает часы с опоздавшими строками и очередную порцию завершившихся часов источника.
+
+        Returns:
+            Количество обработанных новых часов (0 - агрегаты актуальны или свертку выполняет другой процесс)
+        """
+        source = ROLLUP_SOURCES[source_name]
+
+        # Только один процесс сворачивает источник; блокировка снимается при commit
+        locked = await self.session.execute(
+            text("SELECT pg_try_advisory_xact_lock(hashtext(:key))"),
+            {"key": f"analytics_rollup:{source_name}"}
+        )
+        if not locked.scalar():
+            await self.session.rollback()
+            return 0
+
+        now = datetime.now(timezone.utc)
+        target = floor_hour(now - timedelta(seconds=settings.ROLLUP_LAG_SECONDS + source.lag_seconds))
+
+        state = (await self.session.execute(
+            text("""
+                SELECT watermark, last_id, last_changed_at
+                FROM analytics_rollup_watermarks
+                WHERE source = :source
+            """),
+            {"source": source_name}
+        )).first()
+        watermark = _utc(state.watermark) if state else None
+        last_id = state.last_id if state else None
+        last_changed_at = _utc(state.last_changed_at) if state and state.last_changed_at else None
+
+        # Снимок id и времени изменения до свертки: более поздние строки найдутся при следующем запуске
+        max_id = (await self.session.execute(
+            text(f"SELECT MAX({source.id_column}) FROM {source.base_table}")
+        )).scalar()
+        max_changed_at = None
+        if source.changed_column:
+            max_changed_at = (await self.session.execute(
+                text(f"SELECT MAX({source.changed_column}) FROM {source.base_table}")
+            )).scalar()
+
+        if watermark is None:
+            oldest = await self.session.execute(text(
+                f"SELECT MIN({source.time_column}) FROM {source.table} WHERE {source.where}"
+            ))
+            oldest = oldest.scalar()
+            watermark = floor_hour(oldest) if oldest else target
+        else:
+            restate: Set[datetime] = set()
+            if last_id is not None and max_id is not None and max_id > last_id:
+                restate |= await self._hours_where(
+                    source_name,
+                    f"{source.id_column} > :last_id AND {source.id_column} <= :max_id"
+                    f" AND {source.time_column} < :watermark AND {source.where}",
+                    {"last_id": last_id, "max_id": max_id, "watermark": watermark}
+                )
+            if last_changed_at is not None and max_changed_at is not None:
+                # Без фильтра where: строка могла и войти в выборку, и выйти из нее (возврат платежа).
+                # Время изменения - начало транзакции, поэтому окно перекрывается на ROLLUP_LAG_SECONDS
+                restate |= await self._hours_where(
+                    source_name,
+                    f"{source.changed_column} > :since AND {source.changed_column} <= :max_changed_at"
+                    f" AND {source.time_column} < :watermark",
+                    {
+                        "since": last_changed_at - timedelta(seconds=settings.ROLLUP_LAG_SECONDS),
+                        "max_changed_at": max_changed_at,
+                        "watermark": watermark
+                    }
+                )
+            await self._restate_hours(source_name, restate)
+        if max_id is not None:
+            last_id = max_id
+        if max_changed_at is not None:
+            last_changed_at = _utc(max_changed_at)
+
+        if watermark >= target:
+            await self._set_watermark(source_name, watermark, last_id, last_changed_at)
+            await self.session.commit()
+            return 0
+
+        end = min(target, watermark + timedelta(hours=settings.ROLLUP_CHUNK_HOURS))
+        hourly_count = await self._rollup_hours(source_name, watermark, end)
+        await self._set_watermark(source_name, end, last_id, last_changed_at)
+        await self.session.commit()
+
+        hours = int((end - watermark).total_seconds() // 3600)
+        logger.info(f"Rolled up {source_name}: {hours}h up to {end.isoformat()}, {hourly_count} hourly rows")
+        return hours
+
+    async def refresh(self, sources: Optional[Iterable[str]] = None) -> Dict[str, int]:
+        """Сворачивает все источники до актуального состояния порциями по ROLLUP_CHUNK_HOURS"""
+        processed = {}
+        for source_name in sources or ROLLUP_SOURCES:
+            total = 0
+            try:
+                while True:
+                    hours = await self.refresh_source(source_name)
+                    if hours == 0:
+                        break
+                    total += hours
+            except Exception as e:
+                await self.session.rollback()
+                logger.error(f"Error rolling up {source_name}: {str(e)}")
+            processed[source_name] = total
+        return processed
+
+    @classmethod
+    def _schedule_catch_up(cls, watermark: Optional[datetime]) -> None:
+        """Запускает фоновую свертку, если агрегаты заметно отстали"""
+        now = datetime.now(timezone.utc)
+        if watermark is not None and (now - watermark).total_seconds() < settings.ROLLUP_STALE_SECONDS:
+            return
+        if cls._catch_up_task is not None and not cls._catch_up_task.done():
+            return
+
+        async def _catch_up():
+            async with async_session() as session:
+                await AnalyticsRollupService(session).refresh()
+
+        cls._catch_up_task = asyncio.create_task(_catch_up())
+
+    # ---------- Чтение ----------
+
+    async def _add_rollup_rows(
+            self,
+            result: RollupResult,
+            table: str,
+            time_column: str,
+            start,
+            end,
+            categories: Optional[Sequence[str]],
+            tariffs: Optional[Sequence[str]]
+    ) -> None:
+        params: Dict[str, Any] = {"source": result.source, "start": start, "end": end}
+        filters = ""
+        if categories is not None:
+            filters += " AND category = ANY(:categories)"
+            params["categories"] = list(categories)
+        if tariffs is not None:
+            filters += " AND tariff = ANY(:tariffs)"
+            params["tariffs"] = list(tariffs)
+
+        daily = table == "analytics_rollup_daily"
+        rows = await self.session.execute(
+            text(f"""
+                SELECT {time_column} AS bucket, category, tariff, events_count, success_count,
+                       amount_sum, amount_abs_sum, users_sketch, value_sketch
+                       {', hourly_counts' if daily else ''}
+                FROM {table}
+                WHERE source = :source AND {time_column} >= :start AND {time_column} < :end{filters}
+            """),
+            params
+        )
+        for row in rows.fetchall():
+            if daily:
+                day, hour_counts = row.bucket, row.hourly_counts or []
+            else:
+                bucket = _utc(row.bucket)
+                day, hour_counts = bucket.date(), [0] * 24
+                hour_counts[bucket.hour] = row.events_count
+            result.add(
+                day,
+                row.category,
+                row.tariff,
+                (row.events_count, row.success_count, row.amount_sum, row.amount_abs_sum),
+                hour_counts,
+                sketch=HyperLogLog.from_bytes(row.users_sketch) if row.users_sketch else None,
+                value_sketch=DDSketch.from_bytes(row.value_sketch) if row.value_sketch else None
+            )
+
+    async def _add_raw_rows(
+            self,
+            result: RollupResult,
+            start: datetime,
+            end: datetime,
+            categories: Optional[Sequence[str]],
+            tariffs: Optional[Sequence[str]]
+    ) -> None:
+        value_sketches = await self._aggregate_values(result.source, start, end, categories, tariffs)
+        for row in await self._aggregate_raw(result.source, start, end, categories, tariffs):
+            bucket = _utc(row.bucket)
+            hour_counts = [0] * 24
+            hour_counts[bucket.hour] = row.events_count
+            result.add(
+                bucket.date(),
+                row.category,
+                row.tariff,
+                (row.events_count, row.success_count, float(row.amount_sum), float(row.amount_abs_sum)),
+                hour_counts,
+                user_ids=row.user_ids or (),
+                value_sketch=value_sketches.get((bucket, row.category, row.tariff))
+            )
+
+    async def aggregate(
+            self,
+            source_name: str,
+            start: datetime,
+            end: Optional[datetime] = None,
+            categories: Optional[Sequence[str]] = None,
+            tariffs: Optional[Sequence[str]] = None
+    ) -> RollupResult:
+        """Агрегаты источника за [start, end).
+
+        Полные дни читаются из дневных агрегатов, неполные дни до watermark -
+        из почасовых, неполный первый час и все после watermark - из сырых таблиц.
+        """
+        start = _utc(start)
+        end = _utc(end) if end else datetime.now(timezone.utc)
+        result = RollupResult(source_name)
+        if end <= start:
+            return result
+
+        watermark = await self.get_watermark(source_name)
+        self._schedule_catch_up(watermark)
+
+        covered_start = ceil_hour(start)
+        covered_end = min(floor_hour(end), watermark) if watermark else covered_start
+
+        if covered_start >= covered_end:
+            await self._add_raw_rows(result, start, end, categories, tariffs)
+            return result
+
+        if start < covered_start:
+            await self._add_raw_rows(result, start, covered_start, categories, tariffs)
+
+        days_start, days_end = ceil_day(covered_start), floor_day(covered_end)
+        if days_start < days_end:
+            await self._add_rollup_rows(
+                result, "analytics_rollup_daily", "day",
+                days_start.date(), days_end.date(), categories, tariffs
+            )
+            hourly_ranges = [(covered_start, days_start), (days_end, covered_end)]
+        else:
+            hourly_ranges = [(covered_start, covered_end)]
+
+        for hourly_start, hourly_end in hourly_ranges:
+            if hourly_start < hourly_end:
+                await self._add_rollup_rows(
+                    result, "analytics_rollup_hourly", "bucket_start",
+                    hourly_start, hourly_end, categories, tariffs
+                )
+
+        if covered_end < end:
+            await self._add_raw_rows(result, covered_end, end, categories, tariffs)
+
+        return result
+
+    async def active_users(
+            self,
+            end: Optional[datetime] = None,
+            source_name: str = "feature_usage"
+    ) -> Dict[str, int]:
+        """
+        DAU/WAU/MAU - уникальные пользователи за последние 1, 7 и 30 дней
+
+        Каждое окно собирается слиянием почасовых и дневных скетчей, поэтому
+        стоимость не зависит от количества событий в окне.
+        """
+        end = _utc(end) if end else datetime.now(timezone.utc)
+        windows = {"dau": 1, "wau": 7, "mau": 30}
+        active = {}
+        for name, days in windows.items():
+            result = await self.aggregate(source_name, end - timedelta(days=days), end)
+            active[name] = result.distinct_users()
+        return active
+
+    async def generation_latency(
+            self,
+            start: datetime,
+            end: Optional[datetime] = None,
+            qs: Sequence[float] = (0.5, 0.95, 0.99)
+    ) -> Dict[str, Any]:
+        """Квантили времени генерации (секунды) в целом и по типам контента"""
+        result = await self.aggregate("generation_metrics", start, end)
+        overall = result.value_sketch()
+        by_type = {}
+        for content_type in result.by_category():
+            sketch = result.value_sketch(categories=[content_type])
+            by_type[content_type] = {
+                "count": sketch.count,
+                "mean": sketch.mean,
+                "quantiles": dict(zip(qs, sketch.quantiles(qs)))
+            }
+        return {
+            "count": overall.count,
+            "mean": overall.mean,
+            "quantiles": dict(zip(qs, overall.quantiles(qs))),
+            "by_type": by_type
+        }
@@ -7,8 +7,13 @@ from typing import Dict, Any, List, Optional, Callable
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from ...core.cache import CacheService
+from ...core.config import settings
+from ..content.cache_primer import get_cache_primer
 from .analytics_service import AnalyticsService
 from .feature_usage import FeatureUsageService
+from .rollups import AnalyticsRollupService
+from .matview_refresh import MaterializedViewRefresher
+from .cohorts import CohortRetentionService
 
 logger = logging.getLogger(__name__)
 
@@ -18,10 +23,12 @@ class AnalyticsScheduler:
     
     # Константы для настройки планировщика
     DEFAULT_INTERVALS = {
-        'refresh_materialized_views': 3600,  # 1 час
+        'refresh_materialized_views': 600,   # 10 минут (обновляются только при изменении данных)
         'cleanup_old_data': 86400,           # 1 день
         'save_analytics_snapshot': 43200,    # 12 часов
-        'refresh_cache': 1800                # 30 минут
+        'refresh_cache': 1800,               # 30 минут
+        'refresh_rollups': 300,              # 5 минут
+        'prime_caches': settings.CACHE_PRIMING_INTERVAL  # 30 минут (меньше времени жизни кэша генераций)
     }
     
     def __init__(self, session_factory, config: Optional[Dict] = None):
@@ -45,7 +52,11 @@ class AnalyticsScheduler:
             'save_analytics_snapshot': self.config.get('save_analytics_snapshot', 
                                                       self.DEFAULT_INTERVALS['save_analytics_snapshot']),
             'refresh_cache': self.config.get('refresh_cache', 
-                                            self.DEFAULT_INTERVALS['refresh_cache'])
+                                            self.DEFAULT_INTERVALS['refresh_cache']),
+            'refresh_rollups': self.config.get('refresh_rollups',
+                                              self.DEFAULT_INTERVALS['refresh_rollups']),
+            'prime_caches': self.config.get('prime_caches',
+                                           self.DEFAULT_INTERVALS['prime_caches'])
         }
         
     async def start(self):
@@ -86,6 +97,22 @@ class AnalyticsScheduler:
             )
         ))
         
+        self.tasks.append(asyncio.create_task(
+            self._run_periodic(
+                self._refresh_rollups,
+                self.intervals['refresh_rollups']
+            )
+        ))
+
+        # Первый запуск загрузки кэша - сразу после старта (со случайной задержкой)
+        if settings.CACHE_PRIMING_ENABLED:
+            self.tasks.append(asyncio.create_task(
+                self._run_periodic(
+                    self._prime_caches,
+                    self.intervals['prime_caches']
+                )
+            ))
+        
         logger.info(f"Analytics scheduler started with {len(self.tasks)} tasks")
         
     async def stop(self):
@@ -148,15 +175,28 @@ class AnalyticsScheduler:
                 await asyncio.sleep(interval)
     
     async def _refresh_materialized_views(self):
-        """Обновление материализованных представлений"""
+        """Обновление материализованных представлений, исходные таблицы которых изменились"""
         async with self.session_factory() as session:
             try:
-                feature_usage_service = FeatureUsageService(session)
-                await feature_usage_service.refresh_materialized_views()
-                logger.info("Materialized views refreshed successfully")
+                outcomes = await MaterializedViewRefresher(session).refresh_all()
+                for outcome in outcomes:
+                    if outcome.status in ("refreshed", "created"):
+                        logger.info(f"Materialized view {outcome.view_name} {outcome.status} in {outcome.duration_ms:.0f} ms")
+                    elif outcome.status == "failed":
+                        logger.warning(f"Materialized view {outcome.view_name} refresh failed: {outcome.error}")
             except Exception as e:
                 logger.error(f"Error refreshing materialized views: {str(e)}")
     
+    async def _refresh_rollups(self):
+        """Инкрементальная свертка новых событий в почасовые и дневные агрегаты и битмапы когорт"""
+        async with self.session_factory() as session:
+            try:
+                processed = await AnalyticsRollupService(session).refresh()
+                processed["cohort_bitmaps"] = await CohortRetentionService(session).refresh()
+                logger.info(f"Analytics rollups refreshed: {processed}")
+            except Exception as e:
+                logger.error(f"Error refreshing analytics rollups: {str(e)}")
+    
     async def _cleanup_old_data(self):
         """Очистка устаревших данных аналитики"""
         async with self.session_factory() as session:
@@ -206,4 +246,11 @@ class AnalyticsScheduler:
                 
                 logger.info("Analytics cache refreshed successfully")
             except Exception as e:
-                logger.error(f"Error refreshing analytics cache: {str(e)}") 
\ No newline at end of file
+                logger.error(f"Error refreshing analytics cache: {str(e)}") 
+
+    async def _prime_caches(self):
+        """Загрузка популярных шаблонов и генераций в кэш"""
+        try:
+            await get_cache_primer().prime()
+        except Exception as e:
+            logger.error(f"Error priming caches: {str(e)}")
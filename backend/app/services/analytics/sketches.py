@@ -0,0 +1,318 @@
+"""
+Вероятностные скетчи для аналитики.
+
+HyperLogLog оценивает количество уникальных значений (например, пользователей)
+с относительной ошибкой около 1.04 / sqrt(2^precision). Скетчи сливаются
+поэлементным максимумом регистров, поэтому почасовые и дневные скетчи
+можно объединить в любое окно без обращения к исходным строкам.
+
+DDSketch оценивает квантили (p50/p95/p99 длительности генерации, размера
+ответа) с гарантированной относительной ошибкой значения. Значения попадают в
+логарифмические корзины, скетчи сливаются сложением счетчиков корзин.
+"""
+import hashlib
+import math
+import struct
+import zlib
+from array import array
+from typing import Dict, Iterable, List, Optional, Sequence
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - numpy ставится вместе с pandas
+    np = None
+
+DEFAULT_PRECISION = 11
+
+DEFAULT_RELATIVE_ACCURACY = 0.01
+DEFAULT_MAX_BINS = 2048
+# Значения не больше этого порога (в том числе нулевые) учитываются в отдельной корзине
+DDSKETCH_MIN_VALUE = 1e-9
+
+
+def _hash64(value) -> int:
+    """Стабильный 64-битный хеш значения (одинаковый во всех процессах)"""
+    return int.from_bytes(hashlib.blake2b(str(value).encode(), digest_size=8).digest(), "big")
+
+
+class HyperLogLog:
+    """Скетч HyperLogLog с 2^precision однобайтовыми регистрами"""
+
+    __slots__ = ("precision", "registers")
+
+    def __init__(self, precision: int = DEFAULT_PRECISION, registers: Optional[bytes] = None):
+        if not 4 <= precision <= 16:
+            raise ValueError(f"HyperLogLog precision must be between 4 and 16, got {precision}")
+        self.precision = precision
+        size = 1 << precision
+        self.registers = bytearray(registers) if registers is not None else bytearray(size)
+        if len(self.registers) != size:
+            raise ValueError(f"Expected {size} registers, got {len(self.registers)}")
+
+    def add(self, value) -> None:
+        """Добавляет значение в скетч"""
+        hashed = _hash64(value)
+        index = hashed >> (64 - self.precision)
+        remainder_bits = 64 - self.precision
+        remainder = hashed & ((1 << remainder_bits) - 1)
+        rank = remainder_bits - remainder.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def update(self, values: Iterable) -> "HyperLogLog":
+        """Добавляет все значения и возвращает сам скетч"""
+        for value in values:
+            self.add(value)
+        return self
+
+    def merge(self, other: "HyperLogLog") -> "HyperLogLog":
+        """Объединяет другой скетч с текущим (на месте)"""
+        if other.precision != self.precision:
+            raise ValueError("Cannot merge HyperLogLog sketches with different precision")
+        if np is not None:
+            merged = np.maximum(
+                np.frombuffer(self.registers, dtype=np.uint8),
+                np.frombuffer(other.registers, dtype=np.uint8)
+            )
+            self.registers = bytearray(merged.tobytes())
+        else:
+            self.registers = bytearray(map(max, self.registers, other.registers))
+        return self
+
+    @classmethod
+    def merge_all(cls, sketches: Iterable["HyperLogLog"], precision: int = DEFAULT_PRECISION) -> "HyperLogLog":
+        """Объединяет набор скетчей в новый скетч"""
+        sketches = list(sketches)
+        if not sketches:
+            return cls(precision)
+        precision = sketches[0].precision
+        if np is not None:
+            stacked = np.frombuffer(b"".join(bytes(s.registers) for s in sketches), dtype=np.uint8)
+            merged = stacked.reshape(len(sketches), 1 << precision).max(axis=0)
+            return cls(precision, merged.tobytes())
+        result = cls(precision)
+        for sketch in sketches:
+            result.merge(sketch)
+        return result
+
+    def count(self) -> int:
+        """Оценка количества уникальных значений"""
+        size = len(self.registers)
+        if size >= 128:
+            alpha = 0.7213 / (1 + 1.079 / size)
+        else:
+            alpha = {16: 0.673, 32: 0.697, 64: 0.709}[size]
+
+        if np is not None:
+            registers = np.frombuffer(self.registers, dtype=np.uint8)
+            harmonic = float(np.power(2.0, -registers.astype(np.float64)).sum())
+            zeros = int((registers == 0).sum())
+        else:
+            harmonic = sum(2.0 ** -r for r in self.registers)
+            zeros = self.registers.count(0)
+
+        estimate = alpha * size * size / harmonic
+        # Для малых множеств точнее линейный подсчет по пустым регистрам
+        if estimate <= 2.5 * size and zeros:
+            estimate = size * math.log(size / zeros)
+        return int(round(estimate))
+
+    def is_empty(self) -> bool:
+        return not any(self.registers)
+
+    def to_bytes(self) -> bytes:
+        """Компактное представление для хранения в БД (пустые регистры хорошо сжимаются)"""
+        return zlib.compress(bytes([self.precision]) + bytes(self.registers))
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "HyperLogLog":
+        raw = zlib.decompress(data)
+        return cls(raw[0], raw[1:])
+
+    def __len__(self) -> int:
+        return self.count()
+
+
+def ddsketch_gamma(relative_accuracy: float) -> float:
+    """Основание логарифмических корзин DDSketch для заданной относительной точности"""
+    return (1 + relative_accuracy) / (1 - relative_accuracy)
+
+
+class DDSketch:
+    """
+    Скетч квантилей DDSketch
+
+    Значение v > 0 попадает в корзину ceil(log_gamma(v)), где
+    gamma = (1 + a) / (1 - a); любая оценка квантиля отличается от точного
+    значения не более чем в (1 ± a) раз. При превышении max_bins младшие
+    корзины объединяются - точность верхних квантилей сохраняется.
+    """
+
+    __slots__ = ("relative_accuracy", "gamma", "_log_gamma", "max_bins", "bins", "zero_count", "sum", "min", "max")
+
+    _HEADER = struct.Struct("<dQdddI")
+
+    def __init__(self, relative_accuracy: float = DEFAULT_RELATIVE_ACCURACY, max_bins: int = DEFAULT_MAX_BINS):
+        if not 0 < relative_accuracy < 1:
+            raise ValueError(f"DDSketch relative accuracy must be between 0 and 1, got {relative_accuracy}")
+        self.relative_accuracy = relative_accuracy
+        self.gamma = ddsketch_gamma(relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.max_bins = max_bins
+        self.bins: Dict[int, int] = {}
+        self.zero_count = 0
+        self.sum = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    @property
+    def log_gamma(self) -> float:
+        return self._log_gamma
+
+    @property
+    def count(self) -> int:
+        return self.zero_count + sum(self.bins.values())
+
+    @property
+    def mean(self) -> Optional[float]:
+        count = self.count
+        return self.sum / count if count else None
+
+    def key(self, value: float) -> int:
+        return math.ceil(math.log(value) / self._log_gamma)
+
+    def add(self, value: float, weight: int = 1) -> None:
+        """Добавляет значение (отрицательные значения учитываются как нулевые)"""
+        value = float(value)
+        if value > DDSKETCH_MIN_VALUE:
+            key = self.key(value)
+            self.bins[key] = self.bins.get(key, 0) + weight
+        else:
+            self.zero_count += weight
+        self.sum += value * weight
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+        if len(self.bins) > self.max_bins:
+            self._collapse()
+
+    def update(self, values: Iterable[float]) -> "DDSketch":
+        """Добавляет все значения и возвращает сам скетч"""
+        for value in values:
+            self.add(value)
+        return self
+
+    def add_bucket(
+            self,
+            key: Optional[int],
+            count: int,
+            total: float = 0.0,
+            minimum: Optional[float] = None,
+            maximum: Optional[float] = None
+    ) -> None:
+        """
+        Добавляет готовую корзину, например посчитанную в SQL выражением
+        CEIL(LN(v) / log_gamma); key=None - корзина нулевых значений
+        """
+        if key is None:
+            self.zero_count += count
+        else:
+            self.bins[key] = self.bins.get(key, 0) + count
+        self.sum += total
+        if minimum is not None:
+            self.min = min(self.min, minimum)
+        if maximum is not None:
+            self.max = max(self.max, maximum)
+        if len(self.bins) > self.max_bins:
+            self._collapse()
+
+    def _collapse(self) -> None:
+        """Объединяет младшие корзины, пока их не станет max_bins"""
+        keys = sorted(self.bins)
+        extra = len(keys) - self.max_bins
+        target = keys[extra]
+        for key in keys[:extra]:
+            self.bins[target] += self.bins.pop(key)
+
+    def merge(self, other: "DDSketch") -> "DDSketch":
+        """Объединяет другой скетч с текущим (на месте)"""
+        if not math.isclose(other.relative_accuracy, self.relative_accuracy):
+            raise ValueError("Cannot merge DDSketch sketches with different relative accuracy")
+        for key, count in other.bins.items():
+            self.bins[key] = self.bins.get(key, 0) + count
+        self.zero_count += other.zero_count
+        self.sum += other.sum
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        if len(self.bins) > self.max_bins:
+            self._collapse()
+        return self
+
+    @classmethod
+    def merge_all(
+            cls,
+            sketches: Iterable["DDSketch"],
+            relative_accuracy: float = DEFAULT_RELATIVE_ACCURACY
+    ) -> "DDSketch":
+        """Объединяет набор скетчей в новый скетч"""
+        sketches = list(sketches)
+        result = cls(sketches[0].relative_accuracy if sketches else relative_accuracy)
+        for sketch in sketches:
+            result.merge(sketch)
+        return result
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Оценка квантиля q (0..1); None для пустого скетча"""
+        if not 0 <= q <= 1:
+            raise ValueError(f"Quantile must be between 0 and 1, got {q}")
+        count = self.count
+        if not count:
+            return None
+
+        rank = q * (count - 1)
+        if rank < self.zero_count:
+            return max(self.min, 0.0)
+
+        cumulative = self.zero_count
+        for key in sorted(self.bins):
+            cumulative += self.bins[key]
+            if cumulative > rank:
+                value = 2 * self.gamma ** key / (self.gamma + 1)
+                return min(max(value, self.min), self.max)
+        return self.max
+
+    def quantiles(self, qs: Sequence[float]) -> List[Optional[float]]:
+        return [self.quantile(q) for q in qs]
+
+    def is_empty(self) -> bool:
+        return not self.zero_count and not self.bins
+
+    def to_bytes(self) -> bytes:
+        """Компактное представление для хранения в БД"""
+        keys = sorted(self.bins)
+        header = self._HEADER.pack(
+            self.relative_accuracy, self.zero_count, self.sum, self.min, self.max, len(keys)
+        )
+        return zlib.compress(
+            header + array("i", keys).tobytes() + array("Q", (self.bins[key] for key in keys)).tobytes()
+        )
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "DDSketch":
+        raw = zlib.decompress(data)
+        relative_accuracy, zero_count, total, minimum, maximum, size = cls._HEADER.unpack_from(raw)
+        offset = cls._HEADER.size
+        keys = array("i")
+        keys.frombytes(raw[offset:offset + 4 * size])
+        counts = array("Q")
+        counts.frombytes(raw[offset + 4 * size:offset + 12 * size])
+
+        sketch = cls(relative_accuracy)
+        sketch.bins = dict(zip(keys, counts))
+        sketch.zero_count = zero_count
+        sketch.sum = total
+        sketch.min = minimum
+        sketch.max = maximum
+        return sketch
+
+    def __len__(self) -> int:
+        return self.count
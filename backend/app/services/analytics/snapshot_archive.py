@@ -0,0 +1,280 @@
+"""
+Колоночный архив снимков аналитики на локальном диске.
+
+Снимки analytics_data хранятся по месяцам (каталог month=YYYY-MM): каждая
+колонка - отдельный файл с плотным массивом int64 или float64 в порядке
+байтов платформы (как буферы фиксированной ширины в Arrow), а manifest.json
+описывает колонки, количество строк и диапазон времени. JSON-поля
+(tariff_distribution, generations_by_type) разворачиваются в отдельные
+колонки вида generations_by_type.game.
+
+Чтение временного ряда открывает через mmap только нужные колонки нужных
+месяцев, а границы периода ищутся бинарным поиском по колонке времени, поэтому
+запрос за год не зависит от количества остальных колонок и не
+десериализует JSON.
+"""
+import bisect
+import json
+import mmap
+import os
+import shutil
+import sys
+from array import array
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Sequence
+
+# Колонка времени снимка (unix timestamp, секунды)
+TIME_COLUMN = "ts"
+
+# Скалярные поля analytics_data и тип колонки: q - int64, d - float64
+SCALAR_COLUMNS = {
+    "total_users": "q",
+    "active_users": "q",
+    "new_users": "q",
+    "users_with_tariffs": "q",
+    "total_generations": "q",
+    "average_generations_per_user": "d",
+    "total_points_spent": "q",
+    "total_points_earned": "q",
+    "average_user_balance": "d",
+}
+
+# JSON-поля, которые разворачиваются в колонки "<поле>.<ключ>"
+MAP_COLUMNS = ("tariff_distribution", "generations_by_type")
+
+MANIFEST = "manifest.json"
+FORMAT_VERSION = 1
+
+
+def month_key(value: datetime) -> str:
+    return value.astimezone(timezone.utc).strftime("%Y-%m")
+
+
+def _timestamp(value: datetime) -> int:
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return int(value.timestamp())
+
+
+def flatten_snapshot(snapshot: Mapping[str, Any]) -> Dict[str, float]:
+    """Разворачивает строку analytics_data в плоский набор колонок архива"""
+    row: Dict[str, float] = {TIME_COLUMN: _timestamp(snapshot["date"])}
+    for column, typecode in SCALAR_COLUMNS.items():
+        value = snapshot.get(column) or 0
+        row[column] = int(value) if typecode == "q" else float(value)
+    for field in MAP_COLUMNS:
+        for key, value in (snapshot.get(field) or {}).items():
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                row[f"{field}.{key}"] = float(value)
+    return row
+
+
+def column_type(column: str) -> str:
+    return "q" if column == TIME_COLUMN else SCALAR_COLUMNS.get(column, "d")
+
+
+class SnapshotArchive:
+    """Запись и чтение помесячных колоночных партиций снимков"""
+
+    def __init__(self, root: str):
+        self.root = Path(root)
+
+    def _partition_dir(self, month: str) -> Path:
+        return self.root / f"month={month}"
+
+    def months(self) -> List[str]:
+        if not self.root.exists():
+            return []
+        return sorted(
+            path.name.split("=", 1)[1]
+            for path in self.root.iterdir()
+            if path.is_dir() and path.name.startswith("month=") and (path / MANIFEST).exists()
+        )
+
+    def manifest(self, month: str) -> Optional[Dict[str, Any]]:
+        path = self._partition_dir(month) / MANIFEST
+        if not path.exists():
+            return None
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+
+    def columns(self) -> List[str]:
+        """Все колонки, встречающиеся в архиве"""
+        names = set()
+        for month in self.months():
+            names.update(self.manifest(month)["columns"])
+        return sorted(names)
+
+    def size_bytes(self) -> int:
+        return sum(path.stat().st_size for path in self.root.rglob("*") if path.is_file()) if self.root.exists() else 0
+
+    # ---------- Запись ----------
+
+    def write_month(self, month: str, rows: Iterable[Mapping[str, float]]) -> int:
+        """
+        Перезаписывает партицию месяца строками, упорядоченными по времени
+
+        Партиция пишется во временный каталог и подменяется переименованием,
+        поэтому частично записанную партицию читатели не видят. Каталог
+        непустой партиции нельзя заменить одним rename, поэтому между
+        переносом старой версии и установкой новой есть короткое окно, в
+        котором месяца в архиве нет и чтение вернет его пустым.
+        Отсутствующие в строке колонки записываются нулями.
+
+        Returns:
+            Количество строк в партиции
+        """
+        rows = sorted(rows, key=lambda row: row[TIME_COLUMN])
+        names = sorted({name for row in rows for name in row} | {TIME_COLUMN})
+
+        self.root.mkdir(parents=True, exist_ok=True)
+        target = self._partition_dir(month)
+        tmp = self.root / f".month={month}.tmp-{os.getpid()}"
+        shutil.rmtree(tmp, ignore_errors=True)
+        tmp.mkdir()
+
+        columns = {}
+        for index, name in enumerate(names):
+            typecode = column_type(name)
+            values = array(typecode, (row.get(name, 0) for row in rows))
+            filename = f"c{index}.bin"
+            with open(tmp / filename, "wb") as f:
+                values.tofile(f)
+            columns[name] = {"file": filename, "type": typecode}
+
+        manifest = {
+            "version": FORMAT_VERSION,
+            "month": month,
+            "rows": len(rows),
+            "byteorder": sys.byteorder,
+            "min_ts": rows[0][TIME_COLUMN] if rows else None,
+            "max_ts": rows[-1][TIME_COLUMN] if rows else None,
+            "columns": columns,
+        }
+        with open(tmp / MANIFEST, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False)
+
+        old = self.root / f".month={month}.old-{os.getpid()}"
+        if target.exists():
+            os.replace(target, old)
+        os.replace(tmp, target)
+        shutil.rmtree(old, ignore_errors=True)
+        return len(rows)
+
+    def merge_month(self, month: str, rows: Iterable[Mapping[str, float]]) -> int:
+        """Дописывает строки в партицию; строка с тем же временем заменяется новой"""
+        merged = {row[TIME_COLUMN]: row for row in self.read_month(month)}
+        for row in rows:
+            merged[row[TIME_COLUMN]] = row
+        return self.write_month(month, merged.values())
+
+    def drop_months_before(self, month: str) -> List[str]:
+        """
+        Удаляет партиции месяцев раньше month (срок хранения истек)
+
+        Returns:
+            Удаленные месяцы
+        """
+        dropped = []
+        for existing in self.months():
+            if existing >= month:
+                break
+            trash = self.root / f".month={existing}.drop-{os.getpid()}"
+            try:
+                os.replace(self._partition_dir(existing), trash)
+            except FileNotFoundError:
+                # Уже удалена другим воркером
+                continue
+            shutil.rmtree(trash, ignore_errors=True)
+            dropped.append(existing)
+        return dropped
+
+    # ---------- Чтение ----------
+
+    def _read_column(
+            self,
+            directory: Path,
+            manifest: Dict[str, Any],
+            column: str,
+            start: int,
+            end: int
+    ) -> List[float]:
+        meta = manifest["columns"].get(column)
+        if meta is None:
+            return [0] * (end - start)
+        if end <= start:
+            return []
+
+        with open(directory / meta["file"], "rb") as f, \
+                mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            view = memoryview(mapped).cast(meta["type"])
+            part = view[start:end]
+            try:
+                if manifest["byteorder"] == sys.byteorder:
+                    return part.tolist()
+                values = array(meta["type"], part.tobytes())
+                values.byteswap()
+                return values.tolist()
+            finally:
+                part.release()
+                view.release()
+
+    def _row_range(self, directory: Path, manifest: Dict[str, Any], start_ts: int, end_ts: int):
+        rows = manifest["rows"]
+        if not rows or manifest["min_ts"] >= end_ts or manifest["max_ts"] < start_ts:
+            return 0, 0
+        if manifest["min_ts"] >= start_ts and manifest["max_ts"] < end_ts:
+            return 0, rows
+
+        meta = manifest["columns"][TIME_COLUMN]
+        with open(directory / meta["file"], "rb") as f, \
+                mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            view = memoryview(mapped).cast("q")
+            try:
+                if manifest["byteorder"] != sys.byteorder:
+                    times = array("q", view.tobytes())
+                    times.byteswap()
+                    return bisect.bisect_left(times, start_ts), bisect.bisect_left(times, end_ts)
+                return bisect.bisect_left(view, start_ts), bisect.bisect_left(view, end_ts)
+            finally:
+                view.release()
+
+    def read(self, columns: Sequence[str], start: datetime, end: datetime) -> Dict[str, List]:
+        """
+        Читает колонки за период [start, end)
+
+        Returns:
+            {'ts': [datetime, ...], '<колонка>': [значения, ...]} в порядке времени
+        """
+        start_ts, end_ts = _timestamp(start), _timestamp(end)
+        first_month, last_month = month_key(start), month_key(end)
+        result: Dict[str, List] = {TIME_COLUMN: [], **{column: [] for column in columns}}
+
+        for month in self.months():
+            if month < first_month or month > last_month:
+                continue
+            manifest = self.manifest(month)
+            if manifest is None:
+                # Партиция подменяется или удалена после чтения списка месяцев
+                continue
+            directory = self._partition_dir(month)
+            low, high = self._row_range(directory, manifest, start_ts, end_ts)
+            if low >= high:
+                continue
+            result[TIME_COLUMN].extend(self._read_column(directory, manifest, TIME_COLUMN, low, high))
+            for column in columns:
+                result[column].extend(self._read_column(directory, manifest, column, low, high))
+
+        result[TIME_COLUMN] = [datetime.fromtimestamp(ts, timezone.utc) for ts in result[TIME_COLUMN]]
+        return result
+
+    def read_month(self, month: str) -> List[Dict[str, float]]:
+        """Все строки партиции (для слияния при компактизации)"""
+        manifest = self.manifest(month)
+        if manifest is None:
+            return []
+        directory = self._partition_dir(month)
+        rows = manifest["rows"]
+        data = {column: self._read_column(directory, manifest, column, 0, rows) for column in manifest["columns"]}
+        return [{column: values[i] for column, values in data.items()} for i in range(rows)]
@@ -0,0 +1,168 @@
+"""
+Снимки аналитики: компактизация analytics_data в колоночный архив и тренды.
+
+В analytics_data остаются только снимки за последние
+ANALYTICS_ARCHIVE_HOT_DAYS дней. Более старые месяцы переносятся в
+SnapshotArchive (см. snapshot_archive.py) и удаляются из таблицы. Перенос
+идемпотентен: партиция месяца сливается по времени снимка, поэтому повтор
+после сбоя между записью файла и удалением строк не дублирует данные.
+Месяцы архива старше срока хранения удаляются при той же компактизации.
+"""
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Sequence
+
+from sqlalchemy import select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ...core.config import settings
+from ...models import AnalyticsData
+from .snapshot_archive import (
+    MAP_COLUMNS,
+    SCALAR_COLUMNS,
+    TIME_COLUMN,
+    SnapshotArchive,
+    flatten_snapshot,
+    month_key
+)
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_FIELDS = ("id", "date", *SCALAR_COLUMNS, *MAP_COLUMNS)
+
+TREND_BUCKETS = {
+    "day": "%Y-%m-%d",
+    "week": "%G-W%V",
+    "month": "%Y-%m",
+}
+
+
+class AnalyticsSnapshotStore:
+    """Горячие снимки в analytics_data и архив старых месяцев на диске"""
+
+    def __init__(self, session: AsyncSession, archive: Optional[SnapshotArchive] = None):
+        self.session = session
+        self.archive = archive or SnapshotArchive(settings.ANALYTICS_ARCHIVE_DIR)
+
+    def _snapshot_query(self):
+        table = AnalyticsData.__table__
+        return select(*(table.c[field] for field in SNAPSHOT_FIELDS))
+
+    async def compact(self, hot_days: Optional[int] = None, retention_days: Optional[int] = None) -> Dict[str, int]:
+        """
+        Переносит завершившиеся месяцы старше hot_days дней в архив
+
+        Args:
+            hot_days: Сколько дней снимки остаются в analytics_data
+            retention_days: Срок хранения архива; месяцы, целиком старше него,
+                удаляются. None - архив не очищается
+
+        Returns:
+            Количество перенесенных снимков по месяцам
+        """
+        hot_days = settings.ANALYTICS_ARCHIVE_HOT_DAYS if hot_days is None else hot_days
+        now = datetime.now(timezone.utc)
+        # Переносятся только целые месяцы, чтобы партиция не переписывалась многократно
+        cutoff = (now - timedelta(days=hot_days)).replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+        months = await self.session.execute(
+            text("""
+                SELECT DISTINCT DATE_TRUNC('month', date AT TIME ZONE 'UTC') AS month
+                FROM analytics_data
+                WHERE date < :cutoff
+                ORDER BY month
+            """),
+            {"cutoff": cutoff}
+        )
+
+        compacted = {}
+        for (month_start,) in months.fetchall():
+            month_start = month_start.replace(tzinfo=timezone.utc)
+            month_end = (month_start + timedelta(days=32)).replace(day=1)
+            try:
+                locked = await self.session.execute(
+                    text("SELECT pg_try_advisory_xact_lock(hashtext(:key))"),
+                    {"key": f"analytics_snapshot_compaction:{month_key(month_start)}"}
+                )
+                if not locked.scalar():
+                    await self.session.rollback()
+                    continue
+
+                table = AnalyticsData.__table__
+                result = await self.session.execute(
+                    self._snapshot_query()
+                    .where(table.c.date >= month_start, table.c.date < min(month_end, cutoff))
+                    .order_by(table.c.date)
+                )
+                snapshots = [row._asdict() for row in result]
+                if not snapshots:
+                    await self.session.rollback()
+                    continue
+
+                month = month_key(month_start)
+                self.archive.merge_month(month, (flatten_snapshot(snapshot) for snapshot in snapshots))
+                await self.session.execute(
+                    text("DELETE FROM analytics_data WHERE id = ANY(CAST(:ids AS integer[]))"),
+                    {"ids": [snapshot["id"] for snapshot in snapshots]}
+                )
+                await self.session.commit()
+                compacted[month] = len(snapshots)
+                logger.info(f"Compacted {len(snapshots)} analytics snapshots into archive month {month}")
+            except Exception as e:
+                await self.session.rollback()
+                logger.error(f"Error compacting analytics snapshots for {month_start:%Y-%m}: {str(e)}")
+
+        if retention_days is not None:
+            try:
+                dropped = self.archive.drop_months_before(month_key(now - timedelta(days=retention_days)))
+                if dropped:
+                    logger.info(f"Dropped expired analytics archive months: {', '.join(dropped)}")
+            except Exception as e:
+                logger.error(f"Error dropping expired analytics archive months: {str(e)}")
+        return compacted
+
+    async def series(self, columns: Sequence[str], start: datetime, end: datetime) -> Dict[str, List]:
+        """
+        Временной ряд колонок за [start, end) из архива и горячих снимков
+
+        Колонки - поля analytics_data или развернутые ключи JSON-полей
+        (например, generations_by_type.game).
+        """
+        result = self.archive.read(columns, start, end)
+
+        table = AnalyticsData.__table__
+        rows = await self.session.execute(
+            self._snapshot_query()
+            .where(table.c.date >= start, table.c.date < end)
+            .order_by(table.c.date)
+        )
+        archived = set(result[TIME_COLUMN])
+        for row in rows:
+            flat = flatten_snapshot(row._asdict())
+            moment = datetime.fromtimestamp(flat[TIME_COLUMN], timezone.utc)
+            # Снимок мог остаться в таблице после сбоя компактизации
+            if moment in archived:
+                continue
+            result[TIME_COLUMN].append(moment)
+            for column in columns:
+                result[column].append(flat.get(column, 0))
+        return result
+
+    async def trend(
+            self,
+            columns: Sequence[str],
+            start: datetime,
+            end: datetime,
+            bucket: str = "day"
+    ) -> List[Dict]:
+        """Последнее значение колонок в каждом дне, неделе или месяце периода"""
+        series = await self.series(columns, start, end)
+        label = TREND_BUCKETS[bucket]
+
+        points: Dict[str, Dict] = {}
+        for index, moment in sorted(enumerate(series[TIME_COLUMN]), key=lambda item: item[1]):
+            points[moment.strftime(label)] = {
+                "period": moment.strftime(label),
+                **{column: series[column][index] for column in columns}
+            }
+        return list(points.values())
@@ -88,8 +88,13 @@ class ProviderConfig:
             return 0.0
         return (self.successful_requests / self.total_requests) * 100
     
-    def get_available_models(self) -> List[ModelConfig]:
-        """Получить доступные модели (не в cooldown и не с ошибками)"""
+    def get_available_models(self, min_output_tokens: int = 0) -> List[ModelConfig]:
+        """
+        Получить доступные модели (не в cooldown и не с ошибками)
+
+        min_output_tokens - ожидаемый размер ответа: модели с меньшим max_tokens
+        обрезали бы ответ и пропускаются, если есть подходящие.
+        """
         now = datetime.utcnow()
         available = []
         
@@ -107,6 +112,11 @@ class ProviderConfig:
             
             available.append(model)
         
+        if min_output_tokens:
+            fitting = [model for model in available if model.max_tokens >= min_output_tokens]
+            if fitting:
+                available = fitting
+        
         # Сортируем по приоритету
         return sorted(available, key=lambda m: m.priority)
 
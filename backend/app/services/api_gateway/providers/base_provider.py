@@ -67,7 +67,9 @@ class BaseProvider(ABC):
         Основной метод вызова API с fallback на модели
         """
         start_time = time.time()
-        available_models = self.config.get_available_models()
+        available_models = self.config.get_available_models(
+            min_output_tokens=int(request.data.get('maxTokens') or 0)
+        )
         
         if not available_models:
             return APIResponse(
@@ -9,6 +9,10 @@ from collections import defaultdict, deque
 import logging
 
 from ..models import APIResponse, ProviderStats
+from ...analytics.sketches import DDSketch
+
+# Квантили времени ответа в статистике
+RESPONSE_TIME_QUANTILES = (0.5, 0.95, 0.99)
 
 
 class MetricsCollector:
@@ -35,6 +39,8 @@ class MetricsCollector:
             'successful_requests': 0,
             'failed_requests': 0,
             'total_response_time': 0.0,
+            # Распределение времени ответа (p50/p95/p99) при постоянной памяти
+            'response_time_sketch': DDSketch(),
             'total_tokens': 0,
             'model_usage': defaultdict(int),
             'error_types': defaultdict(int),
@@ -50,6 +56,7 @@ class MetricsCollector:
             'total_requests': 0,
             'successful_requests': 0,
             'avg_response_time': 0.0,
+            'response_time_sketch': DDSketch(),
             'provider_usage': defaultdict(int)
         })
         
@@ -110,6 +117,7 @@ class MetricsCollector:
                 metrics['error_types'][response.error] += 1
         
         metrics['total_response_time'] += response.response_time
+        metrics['response_time_sketch'].add(response.response_time)
         metrics['total_tokens'] += response.tokens_used
         
         # Использование моделей
@@ -139,6 +147,7 @@ class MetricsCollector:
         metrics['total_requests'] += 1
         if response.success:
             metrics['successful_requests'] += 1
+        metrics['response_time_sketch'].add(response.response_time)
         
         # Обновляем среднее время ответа
         if metrics['total_requests'] == 1:
@@ -188,12 +197,21 @@ class MetricsCollector:
             'failed_requests': metrics['failed_requests'],
             'success_rate': success_rate,
             'avg_response_time': avg_response_time,
+            'response_time_percentiles': self._percentiles(metrics['response_time_sketch']),
             'total_tokens_used': metrics['total_tokens'],
             'most_used_model': max(metrics['model_usage'].items(), key=lambda x: x[1])[0] if metrics['model_usage'] else None,
             'model_usage': dict(metrics['model_usage']),
             'common_errors': dict(sorted(metrics['error_types'].items(), key=lambda x: x[1], reverse=True)[:5])
         }
     
+    @staticmethod
+    def _percentiles(sketch: DDSketch) -> Dict[str, Optional[float]]:
+        """p50/p95/p99 времени ответа из скетча"""
+        return {
+            f"p{int(q * 100)}": value
+            for q, value in zip(RESPONSE_TIME_QUANTILES, sketch.quantiles(RESPONSE_TIME_QUANTILES))
+        }
+    
     def get_endpoint_stats(self, endpoint: str) -> Dict[str, Any]:
         """Получить статистику эндпоинта"""
         if endpoint not in self.endpoint_metrics:
@@ -207,6 +225,7 @@ class MetricsCollector:
             'successful_requests': metrics['successful_requests'],
             'success_rate': success_rate,
             'avg_response_time': metrics['avg_response_time'],
+            'response_time_percentiles': self._percentiles(metrics['response_time_sketch']),
             'most_used_provider': max(metrics['provider_usage'].items(), key=lambda x: x[1])[0] if metrics['provider_usage'] else None,
             'provider_usage': dict(metrics['provider_usage'])
         }
@@ -0,0 +1,449 @@
+"""
+Заблаговременная загрузка кэша (cache priming).
+
+Шаблоны курсов и уроков читались из БД при каждом обращении после
+истечения кэша, а популярные генерации по одинаковым промптам
+генерировались заново для каждого пользователя. CachePrimer при старте и
+по расписанию (AnalyticsScheduler, CACHE_PRIMING_INTERVAL) загружает в
+кэш:
+  - списки шаблонов уроков и курсов и деревья (уроки с активностями)
+    CACHE_PRIMING_TOP_TEMPLATES самых используемых шаблонов курсов;
+  - результаты CACHE_PRIMING_TOP_PROMPTS популярных промптов из generations;
+    места делятся между типами контента по долям feature_usage. Результат
+    берется из последней удачной генерации; если ее нет, промпт
+    генерируется заново.
+
+Ключ кэша генерации зависит от extra_params, которых нет в generations,
+поэтому ContentGenerator при записи в кэш запоминает параметры промпта
+(remember_prompt). Промпт без запомненных параметров ни разу не
+запрашивался через кэш генераций (например, формы API вызывают
+generate_content с use_cache=False) - он загружается только с пустыми
+параметрами и не генерируется.
+
+Генерация идет с низким приоритетом: по одной, с паузой
+CACHE_PRIMING_GENERATION_DELAY, не больше CACHE_PRIMING_MAX_GENERATIONS за
+запуск и только пока у провайдера свободно не меньше
+CACHE_PRIMING_MIN_SPARE_CAPACITY квоты (gemini_limiter.spare_capacity).
+
+Загруженные записи помечаются ожидаемым временем генерации (среднее
+generation_time типа) или загрузки из БД; первое попадание в такую запись
+добавляет это время в счетчик сэкономленного времени (stats()). Следующие
+попадания не учитываются: без загрузки запись появилась бы после первого
+промаха.
+"""
+import asyncio
+import hashlib
+import logging
+import math
+import time
+from collections import defaultdict
+from dataclasses import dataclass, replace
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, List, Optional, Union
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ...core.cache import CacheService
+from ...core.config import settings
+from ...core.constants import ContentType
+from ...core.database import async_session
+from .prompt_cache import NearDuplicateIndex, VOLATILE_PARAMS, canonical_prompt, generation_cache_key
+from .token_budget import _content_type
+
+logger = logging.getLogger(__name__)
+
+PRIMED_PREFIX = "cache_priming:primed:"
+MANIFEST_PREFIX = "cache_priming:prompt:"
+STATS_KEY = "cache_priming:stats"
+STATS_TTL = 30 * 24 * 3600
+
+# Время жизни кэша генераций (как в ContentGenerator._cache_generation) и шаблонов
+GENERATION_CACHE_TTL = 3600
+# Кандидатов из generations на одно место (часть промптов совпадет после канонизации)
+CANDIDATE_FACTOR = 4
+# Время генерации, если для типа нет истории generation_metrics, сек
+DEFAULT_GENERATION_SECONDS = 20.0
+
+# Так начинаются сообщения об ошибке, которые generate_content возвращает вместо контента
+FAILED_CONTENT_PREFIXES = ("Не удалось сгенерировать", "Произошла ошибка", "Ошибка")
+
+POPULAR_PROMPTS_SQL = """
+    SELECT type AS content_type,
+           count(*) AS requests,
+           (array_agg(id ORDER BY created_at DESC))[1] AS latest_id
+    FROM generations
+    WHERE created_at >= :since
+      AND prompt IS NOT NULL
+      AND prompt <> ''
+    GROUP BY type, md5(prompt)
+    HAVING count(*) >= :min_requests
+    ORDER BY requests DESC
+    LIMIT :limit
+"""
+
+LATEST_GENERATIONS_SQL = """
+    SELECT id, user_id, prompt, content
+    FROM generations
+    WHERE id = ANY(:ids)
+"""
+
+FEATURE_SHARES_SQL = """
+    SELECT content_type, count(*) AS uses
+    FROM feature_usage
+    WHERE created_at >= :since
+      AND content_type IS NOT NULL
+      AND success
+    GROUP BY content_type
+"""
+
+GENERATION_SECONDS_SQL = """
+    SELECT content_type, avg(generation_time) AS seconds
+    FROM generation_metrics
+    WHERE success
+      AND created_at >= :since
+    GROUP BY content_type
+"""
+
+POPULAR_TEMPLATES_SQL = """
+    SELECT id
+    FROM courses
+    WHERE is_template
+    ORDER BY usage_count DESC, last_used DESC NULLS LAST, id
+    LIMIT :limit
+"""
+
+
+@dataclass
+class PopularPrompt:
+    content_type: ContentType
+    prompt: str
+    requests: int
+    # Последняя генерация по промпту: ее автор и результат
+    user_id: Optional[int] = None
+    content: Optional[str] = None
+
+
+def usable_content(content: Any) -> bool:
+    """Результат генерации, который можно отдавать из кэша"""
+    return isinstance(content, str) and bool(content.strip()) and not content.startswith(FAILED_CONTENT_PREFIXES)
+
+
+def _type_name(content_type: Union[str, ContentType]) -> str:
+    return content_type.value if hasattr(content_type, "value") else str(content_type)
+
+
+def prompt_manifest_key(content_type: Union[str, ContentType], prompt: str) -> str:
+    digest = hashlib.md5(canonical_prompt(prompt).encode()).hexdigest()
+    return f"{MANIFEST_PREFIX}{_type_name(content_type)}:{digest}"
+
+
+async def remember_prompt(
+        cache: CacheService,
+        content_type: Union[str, ContentType],
+        prompt: str,
+        extra_params: Optional[Dict[str, Any]]
+) -> None:
+    """Запоминает параметры промпта, результат которого записан в кэш генераций"""
+    params = {key: value for key, value in (extra_params or {}).items() if key not in VOLATILE_PARAMS}
+    await cache.cache_data(
+        prompt_manifest_key(content_type, prompt),
+        {"params": params},
+        ttl=settings.CACHE_PRIMING_LOOKBACK_DAYS * 86400
+    )
+
+
+async def mark_primed(cache: CacheService, key: str, kind: str, seconds: float, ttl: int = GENERATION_CACHE_TTL) -> None:
+    """Помечает загруженную заранее запись временем, которое экономит попадание в нее"""
+    await cache.cache_data(f"{PRIMED_PREFIX}{key}", {"kind": kind, "seconds": round(seconds, 3)}, ttl=ttl)
+
+
+async def record_primed_hit(cache: CacheService, key: str) -> None:
+    """Учитывает первое попадание в запись, загруженную заранее"""
+    try:
+        marker = await cache.get_cached_data(f"{PRIMED_PREFIX}{key}")
+        if not marker:
+            return
+        await cache.invalidate(f"{PRIMED_PREFIX}{key}")
+        # Чтение и запись счетчиков не атомарны: при гонке теряется одно попадание
+        stats = await cache.get_cached_data(STATS_KEY) or {"hits": 0, "saved_seconds": 0.0, "by_kind": {}}
+        stats["hits"] += 1
+        stats["saved_seconds"] += marker["seconds"]
+        kind = stats["by_kind"].setdefault(marker["kind"], {"hits": 0, "saved_seconds": 0.0})
+        kind["hits"] += 1
+        kind["saved_seconds"] += marker["seconds"]
+        await cache.cache_data(STATS_KEY, stats, ttl=STATS_TTL)
+    except Exception as e:
+        logger.error(f"Error recording primed cache hit: {str(e)}")
+
+
+def select_popular(candidates: List[PopularPrompt], shares: Dict[ContentType, float], top_n: int) -> List[PopularPrompt]:
+    """
+    Популярные промпты для загрузки.
+
+    Промпты, совпадающие после канонизации, объединяются. Места делятся
+    между типами контента пропорционально shares (доли feature_usage; без
+    них - числу запросов), каждому типу хотя бы одно; свободные места
+    достаются самым запрашиваемым из оставшихся.
+    """
+    merged: Dict[tuple, PopularPrompt] = {}
+    for candidate in candidates:
+        key = (candidate.content_type, canonical_prompt(candidate.prompt))
+        if key in merged:
+            current = merged[key]
+            # Остается результат промпта с большим числом запросов
+            best = current if current.requests >= candidate.requests else candidate
+            merged[key] = replace(best, requests=current.requests + candidate.requests)
+        else:
+            merged[key] = candidate
+
+    by_type: Dict[ContentType, List[PopularPrompt]] = defaultdict(list)
+    for prompt in sorted(merged.values(), key=lambda p: p.requests, reverse=True):
+        by_type[prompt.content_type].append(prompt)
+    if not by_type or top_n <= 0:
+        return []
+
+    weights = {content_type: shares.get(content_type, 0.0) for content_type in by_type}
+    if not sum(weights.values()):
+        weights = {content_type: sum(p.requests for p in prompts) for content_type, prompts in by_type.items()}
+    total = sum(weights.values())
+
+    quotas = {content_type: max(1, math.floor(top_n * weight / total)) for content_type, weight in weights.items()}
+    # Минимум в одно место не должен вытеснять типы с меньшей долей
+    while sum(quotas.values()) > top_n and max(quotas.values()) > 1:
+        quotas[max(quotas, key=quotas.get)] -= 1
+
+    selected = []
+    for content_type, prompts in by_type.items():
+        selected.extend(prompts[:quotas[content_type]])
+    chosen = {id(prompt) for prompt in selected}
+    rest = sorted((p for prompts in by_type.values() for p in prompts if id(p) not in chosen),
+                  key=lambda p: p.requests, reverse=True)
+    selected.extend(rest[:max(0, top_n - len(selected))])
+
+    return sorted(selected, key=lambda p: p.requests, reverse=True)[:top_n]
+
+
+def _course_manager(session: AsyncSession):
+    # Импорт здесь, чтобы избежать циклического импорта (CourseManager использует ContentGenerator)
+    from ..course.manager import CourseManager
+    return CourseManager(session)
+
+
+def _content_generator(session: AsyncSession):
+    from .generator import ContentGenerator
+    return ContentGenerator(session)
+
+
+def _provider_spare_capacity() -> float:
+    from ...utils.gemini_rate_limiter import gemini_limiter
+    return gemini_limiter.spare_capacity()
+
+
+class CachePrimer:
+    """Загрузка популярных шаблонов и генераций в кэш с низким приоритетом"""
+
+    def __init__(
+            self,
+            session_factory: Callable[[], AsyncSession] = async_session,
+            cache: Optional[CacheService] = None,
+            top_prompts: Optional[int] = None,
+            top_templates: Optional[int] = None,
+            lookback_days: Optional[int] = None,
+            min_requests: Optional[int] = None,
+            max_generations: Optional[int] = None,
+            generation_delay: Optional[float] = None,
+            min_spare_capacity: Optional[float] = None,
+            manager_factory: Callable[[AsyncSession], Any] = _course_manager,
+            generator_factory: Callable[[AsyncSession], Any] = _content_generator,
+            spare_capacity: Callable[[], float] = _provider_spare_capacity,
+            sleep: Callable[[float], Any] = asyncio.sleep
+    ):
+        self.session_factory = session_factory
+        self.cache = cache or CacheService()
+        self.top_prompts = top_prompts if top_prompts is not None else settings.CACHE_PRIMING_TOP_PROMPTS
+        self.top_templates = top_templates if top_templates is not None else settings.CACHE_PRIMING_TOP_TEMPLATES
+        self.lookback_days = lookback_days or settings.CACHE_PRIMING_LOOKBACK_DAYS
+        self.min_requests = min_requests or settings.CACHE_PRIMING_MIN_REQUESTS
+        self.max_generations = (max_generations if max_generations is not None
+                                else settings.CACHE_PRIMING_MAX_GENERATIONS)
+        self.generation_delay = (generation_delay if generation_delay is not None
+                                 else settings.CACHE_PRIMING_GENERATION_DELAY)
+        self.min_spare_capacity = (min_spare_capacity if min_spare_capacity is not None
+                                   else settings.CACHE_PRIMING_MIN_SPARE_CAPACITY)
+        self.near_duplicates = NearDuplicateIndex(self.cache)
+        self._manager_factory = manager_factory
+        self._generator_factory = generator_factory
+        self._spare_capacity = spare_capacity
+        self._sleep = sleep
+        self._lock = asyncio.Lock()
+        self.last_run: Dict[str, Any] = {}
+
+    async def prime(self) -> Dict[str, Any]:
+        """Один запуск загрузки; итоги сохраняются в last_run"""
+        if self._lock.locked():
+            logger.info("Cache priming is already running, skipping")
+            return self.last_run
+
+        async with self._lock:
+            started = time.perf_counter()
+            summary: Dict[str, Any] = {}
+            async with self.session_factory() as session:
+                try:
+                    summary.update(await self.prime_templates(session))
+                except Exception as e:
+                    logger.error(f"Error priming template caches: {str(e)}")
+                try:
+                    summary.update(await self.prime_prompts(session))
+                except Exception as e:
+                    logger.error(f"Error priming generation cache: {str(e)}")
+
+            summary["duration_seconds"] = round(time.perf_counter() - started, 2)
+            summary["finished_at"] = datetime.now(timezone.utc).isoformat()
+            self.last_run = summary
+            logger.info(f"Cache priming finished: {summary}")
+            return summary
+
+    async def prime_templates(self, session: AsyncSession) -> Dict[str, int]:
+        """Списки шаблонов уроков и курсов и деревья популярных шаблонов курсов"""
+        manager = self._manager_factory(session)
+
+        lesson_templates = await manager.get_lesson_templates(refresh=True)
+        for template_type in sorted({template.type for template in lesson_templates}):
+            await manager.get_lesson_templates(template_type, refresh=True)
+        await manager.get_course_templates(refresh=True)
+
+        result = await session.execute(text(POPULAR_TEMPLATES_SQL), {"limit": self.top_templates})
+        template_ids = [row[0] for row in result.all()]
+        trees = 0
+        for template_id in template_ids:
+            started = time.perf_counter()
+            tree = await manager.get_course_template_tree(template_id, refresh=True)
+            if tree is None:
+                continue
+            await mark_primed(self.cache, f"course_template_tree:{template_id}", "template_tree",
+                              time.perf_counter() - started)
+            trees += 1
+
+        return {"lesson_templates": len(lesson_templates), "template_trees": trees}
+
+    async def popular_prompts(self, session: AsyncSession) -> List[PopularPrompt]:
+        """Популярные промпты из generations с квотами типов по feature_usage"""
+        since = datetime.now(timezone.utc) - timedelta(days=self.lookback_days)
+        result = await session.execute(text(POPULAR_PROMPTS_SQL), {
+            "since": since,
+            "min_requests": self.min_requests,
+            "limit": self.top_prompts * CANDIDATE_FACTOR
+        })
+        rows = result.mappings().all()
+        if not rows:
+            return []
+
+        result = await session.execute(text(LATEST_GENERATIONS_SQL), {"ids": [row["latest_id"] for row in rows]})
+        latest = {row["id"]: row for row in result.mappings().all()}
+
+        result = await session.execute(text(FEATURE_SHARES_SQL), {"since": since})
+        shares = {}
+        for row in result.mappings().all():
+            content_type = _content_type(row["content_type"])
+            if content_type:
+                shares[content_type] = float(row["uses"])
+
+        candidates = []
+        for row in rows:
+            content_type = _content_type(row["content_type"])
+            generation = latest.get(row["latest_id"])
+            if not content_type or not generation or content_type == ContentType.IMAGE:
+                continue
+            candidates.append(PopularPrompt(
+                content_type=content_type,
+                prompt=generation["prompt"],
+                requests=int(row["requests"]),
+                user_id=generation["user_id"],
+                content=generation["content"]
+            ))
+        return select_popular(candidates, shares, self.top_prompts)
+
+    async def _generation_seconds(self, session: AsyncSession) -> Dict[ContentType, float]:
+        since = datetime.now(timezone.utc) - timedelta(days=self.lookback_days)
+        result = await session.execute(text(GENERATION_SECONDS_SQL), {"since": since})
+        seconds = {}
+        for row in result.mappings().all():
+            content_type = _content_type(row["content_type"])
+            if content_type and row["seconds"]:
+                seconds[content_type] = float(row["seconds"])
+        return seconds
+
+    async def prime_prompts(self, session: AsyncSession) -> Dict[str, int]:
+        """Загружает результаты популярных промптов, недостающие генерирует с низким приоритетом"""
+        popular = await self.popular_prompts(session)
+        if not popular:
+            return {"popular_prompts": 0, "preloaded": 0, "already_cached": 0, "generated": 0, "deferred": 0}
+        generation_seconds = await self._generation_seconds(session)
+
+        preloaded = already_cached = 0
+        pending = []
+        for item in popular:
+            manifest = await self.cache.get_cached_data(prompt_manifest_key(item.content_type, item.prompt))
+            params = manifest["params"] if manifest else None
+            key = generation_cache_key(item.prompt, item.content_type, params)
+            if await self.cache.get_cached_data(key) is not None:
+                already_cached += 1
+                continue
+            seconds = generation_seconds.get(item.content_type, DEFAULT_GENERATION_SECONDS)
+            if usable_content(item.content):
+                await self.cache.cache_data(key, item.content, ttl=GENERATION_CACHE_TTL)
+                await self.near_duplicates.add(item.content_type, item.prompt, params, key)
+                await mark_primed(self.cache, key, "generation", seconds)
+                preloaded += 1
+            elif manifest is not None:
+                pending.append((item, params, key, seconds))
+
+        generated = 0
+        deferred = max(0, len(pending) - self.max_generations)
+        for index, (item, params, key, seconds) in enumerate(pending[:self.max_generations]):
+            # Пауза перед каждой генерацией и проверка квоты: запросы пользователей важнее
+            await self._sleep(self.generation_delay)
+            if self._spare_capacity() < self.min_spare_capacity:
+                logger.info("Provider quota is busy, deferring cache priming generations")
+                deferred += len(pending[:self.max_generations]) - index
+                break
+            try:
+                generator = self._generator_factory(session)
+                await generator.generate_content(
+                    user_id=item.user_id,
+                    prompt=item.prompt,
+                    content_type=item.content_type,
+                    use_cache=True,
+                    extra_params=params
+                )
+            except Exception as e:
+                logger.error(f"Error pre-generating popular prompt: {str(e)}")
+                continue
+            # generate_content кэширует только удачный результат
+            if await self.cache.get_cached_data(key) is not None:
+                await mark_primed(self.cache, key, "generation", seconds)
+                generated += 1
+
+        return {
+            "popular_prompts": len(popular),
+            "preloaded": preloaded,
+            "already_cached": already_cached,
+            "generated": generated,
+            "deferred": deferred
+        }
+
+    async def stats(self) -> Dict[str, Any]:
+        """Итоги последнего запуска и сэкономленное время по попаданиям в загруженные записи"""
+        saved = await self.cache.get_cached_data(STATS_KEY) or {"hits": 0, "saved_seconds": 0.0, "by_kind": {}}
+        return {"last_run": self.last_run, **saved}
+
+
+_primer: Optional[CachePrimer] = None
+
+
+def get_cache_primer() -> CachePrimer:
+    global _primer
+    if _primer is None:
+        _primer = CachePrimer()
+    return _primer
@@ -4,7 +4,7 @@
 """
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
-from typing import Optional, Dict, Any, List, Union
+from typing import Optional, Dict, Any, List, Tuple, Union
 import logging
 from datetime import datetime, timedelta, timezone
 import asyncio
@@ -20,6 +20,7 @@ from ...core.constants import ContentType
 from ...services.optimization.query_optimizer import QueryOptimizer
 from ...services.optimization.batch_processor import BatchProcessor
 from ...core.cache import CacheService
+from ...core.config import settings
 from ...core.memory import memory_optimized
 
 # Импорты для компонентов
@@ -29,6 +30,9 @@ from .content_generator_lesson import ContentGeneratorLesson
 from .content_generator_text import ContentGeneratorText
 from .content_generator_course import ContentGeneratorCourse
 from .content_generator_game import ContentGeneratorGame
+from .prompt_cache import NearDuplicateIndex, generation_cache_key
+from .token_budget import TokenPlan, get_token_budget
+from .cache_primer import record_primed_hit, remember_prompt
 
 # Импорты для API Gateway
 from ..api_gateway import APIGateway
@@ -53,6 +57,7 @@ class ContentGenerator(
         self.session = session
         self.query_optimizer = QueryOptimizer(session)
         self.cache_service = CacheService()
+        self.near_duplicates = NearDuplicateIndex(self.cache_service)
         self.batch_processor = BatchProcessor(session)
         # Initialize queue to None - we'll create it when needed
         self._generation_queue = None
@@ -173,11 +178,15 @@ class ContentGenerator(
             gateway_content_type = self._map_content_type(content_type)
             endpoint = self._get_endpoint_for_content_type(content_type)
 
+            # Лимит ответа из бюджета токенов: по нему API Gateway пропускает модели с меньшим max_tokens
+            with_points = extra_params.get('with_points', False) if extra_params else False
+            plan = await self._plan_tokens(content_type, prompt, with_points)
+
             # Подготавливаем данные для запроса
             request_data = {
                 'prompt': prompt,
                 'temperature': 0.7,
-                'maxTokens': 4000
+                'maxTokens': plan.max_tokens or 4000
             }
 
             # Добавляем дополнительные параметры
@@ -212,7 +221,13 @@ class ContentGenerator(
             logger.error(f"Критическая ошибка в generate_content_via_gateway: {e}")
             return f"Критическая ошибка генерации: {str(e)}"
 
-    async def _generate_with_g4f(self, prompt: str, content_type: ContentType, with_points: bool = False) -> Optional[str]:
+    async def _generate_with_g4f(
+        self,
+        prompt: str,
+        content_type: ContentType,
+        with_points: bool = False,
+        max_tokens: Optional[int] = None
+    ) -> Optional[str]:
         """
         Генерирует контент с использованием доступных провайдеров
         в порядке приоритета: LLM7 -> Gemini -> OpenRouter -> Groq -> Together -> Cerebras -> Chutes -> Mistral -> G4F
@@ -221,6 +236,7 @@ class ContentGenerator(
             prompt: Текст промпта для генерации
             content_type: Тип контента
             with_points: Флаг использования баллов (влияет на определение токенов)
+            max_tokens: Лимит ответа из бюджета токенов; без него - эвристика _get_smart_token_count
 
         Returns:
             Optional[str]: Сгенерированный текст или None в случае ошибки
@@ -230,7 +246,8 @@ class ContentGenerator(
             temperature = 0.8 if content_type in [ContentType.LESSON_PLAN, ContentType.EXERCISE, ContentType.GAME] else 0.7
 
             # Умное определение токенов в зависимости от типа запроса
-            max_tokens = self._get_smart_token_count(content_type, prompt, with_points)
+            if max_tokens is None:
+                max_tokens = self._get_smart_token_count(content_type, prompt, with_points)
 
             logger.info(f"Параметры генерации: temperature={temperature}, max_tokens={max_tokens}, content_type={content_type}, with_points={with_points}")
 
@@ -437,6 +454,28 @@ class ContentGenerator(
         Returns:
             int: Количество токенов для генерации
         """
+        max_tokens, _ = self._classify_token_request(content_type, prompt, with_points)
+        return max_tokens
+
+    async def _plan_tokens(self, content_type: ContentType, prompt: str, with_points: bool = False) -> TokenPlan:
+        """
+        Бюджет токенов запроса: эвристика _classify_token_request как верхняя
+        граница, уточненная по истории фактических ответов (TokenBudget)
+        """
+        ceiling, request_kind = self._classify_token_request(content_type, prompt, with_points)
+        plan = await get_token_budget().plan(content_type, prompt, request_kind, ceiling)
+        if plan.max_tokens != ceiling:
+            logger.info(f"max_tokens по истории: {plan.max_tokens} вместо {ceiling} "
+                        f"(p{int(settings.TOKEN_BUDGET_PERCENTILE * 100)}={plan.predicted_tokens}, {request_kind})")
+        return plan
+
+    def _classify_token_request(self, content_type: ContentType, prompt: str, with_points: bool = False) -> Tuple[int, str]:
+        """
+        Вид запроса и количество токенов для него по типу контента и ключевым словам промпта
+
+        Returns:
+            Tuple[int, str]: (max_tokens, вид запроса)
+        """
         # Анализируем промпт для определения специфики запроса
         prompt_lower = prompt.lower()
 
@@ -556,7 +595,7 @@ class ContentGenerator(
             request_type = "свободный запрос"
 
         logger.info(f"Определены токены: {max_tokens} для content_type={content_type}, тип запроса: {request_type}")
-        return max_tokens
+        return max_tokens, request_type
 
     async def get_generation_queue(self):
         """Lazy initialization of generation queue"""
@@ -595,8 +634,8 @@ class ContentGenerator(
             logger.info(f"Генерация контента типа: {content_type.value if hasattr(content_type, 'value') else content_type}")
             logger.info(f"Параметры: user_id={user_id}, use_cache={use_cache}, force_queue={force_queue}")
 
-            # Сохраняем параметры для использования в других методах
-            self._current_extra_params = extra_params or {}
+            # Сохраняем параметры для использования в других методах (копия, чтобы не менять словарь вызывающего)
+            self._current_extra_params = dict(extra_params or {})
             # Добавляем параметр use_cache в extra_params для передачи в другие методы
             self._current_extra_params['use_cache'] = use_cache
 
@@ -608,7 +647,7 @@ class ContentGenerator(
 
             # Проверяем кэш, если use_cache=True
             if use_cache:
-                cached_content = await self.cache_service.get_cached_data(cache_key)
+                cached_content = await self._get_cached_generation(cache_key, prompt, content_type, extra_params)
                 if cached_content:
                     logger.info(f"Найден кэшированный контент, длина: {len(cached_content) if isinstance(cached_content, str) else 'не строка'}")
                     return cached_content
@@ -637,11 +676,18 @@ class ContentGenerator(
                     logger.info("Генерация контента через G4FHandler")
                     # Извлекаем with_points из extra_params
                     with_points = extra_params.get('with_points', False) if extra_params else False
-                    content = await self._generate_with_g4f(prompt, content_type, with_points)
+                    plan = await self._plan_tokens(content_type, prompt, with_points)
+                    started = time.perf_counter()
+                    content = await self._generate_with_g4f(prompt, content_type, with_points, max_tokens=plan.max_tokens)
+                    if content_type != ContentType.IMAGE:
+                        get_token_budget().record_later(
+                            user_id, plan, prompt, content, time.perf_counter() - started,
+                            success=bool(content), error_type=None if content else "all_providers_failed"
+                        )
                     if content:
                         # Кэшируем результат, если use_cache=True
                         if use_cache:
-                            await self.cache_service.cache_data(cache_key, content, ttl=3600)
+                            await self._cache_generation(cache_key, prompt, content_type, extra_params, content)
 
                         # Для структурированных данных, проверяем формат
                         if content_type == ContentType.STRUCTURED_DATA:
@@ -687,7 +733,7 @@ class ContentGenerator(
             if content:
                 # Кэшируем результат, если use_cache=True
                 if use_cache:
-                    await self.cache_service.cache_data(cache_key, content, ttl=3600)
+                    await self._cache_generation(cache_key, prompt, content_type, extra_params, content)
                 return content
             else:
                 logger.error("Оба метода генерации (G4FHandler и очередь) не смогли сгенерировать контент")
@@ -728,17 +774,45 @@ class ContentGenerator(
             raise ValidationError(f"Prompt too long for {ct_value}")
 
     def _create_cache_key(self, prompt: str, content_type: Union[str, ContentType], extra_params: Optional[Dict[str, Any]] = None) -> str:
-        """Create cache key for content"""
-        # Создаем базовый ключ из промпта и типа контента
-        base_key = f"{content_type}:{hashlib.md5(prompt.encode()).hexdigest()}"
-        
-        # Добавляем параметры если есть
-        if extra_params:
-            params_str = json.dumps(extra_params, sort_keys=True, ensure_ascii=False)
-            params_hash = hashlib.md5(params_str.encode()).hexdigest()
-            base_key += f":{params_hash}"
-            
-        return base_key
+        """Create cache key for content (канонические промпт и параметры, см. prompt_cache)"""
+        return generation_cache_key(prompt, content_type, extra_params)
+
+    async def _get_cached_generation(
+        self,
+        cache_key: str,
+        prompt: str,
+        content_type: ContentType,
+        extra_params: Optional[Dict[str, Any]]
+    ) -> Optional[str]:
+        """Генерация из кэша по точному ключу или по почти совпадающему промпту"""
+        cached_content = await self.cache_service.get_cached_data(cache_key)
+        if cached_content:
+            await record_primed_hit(self.cache_service, cache_key)
+            return cached_content
+
+        near_key = await self.near_duplicates.find(content_type, prompt, extra_params)
+        if near_key and near_key != cache_key:
+            cached_content = await self.cache_service.get_cached_data(near_key)
+            if cached_content:
+                await record_primed_hit(self.cache_service, near_key)
+            return cached_content
+        return None
+
+    async def _cache_generation(
+        self,
+        cache_key: str,
+        prompt: str,
+        content_type: ContentType,
+        extra_params: Optional[Dict[str, Any]],
+        content: str
+    ) -> None:
+        await self.cache_service.cache_data(cache_key, content, ttl=3600)
+        try:
+            await self.near_duplicates.add(content_type, prompt, extra_params, cache_key)
+            # Параметры нужны cache_primer, чтобы построить этот же ключ для популярного промпта
+            await remember_prompt(self.cache_service, content_type, prompt, extra_params)
+        except Exception as e:
+            logger.error(f"Ошибка индексации промпта: {str(e)}")
 
     async def _save_generation(self, batch: List[Dict[str, Any]]) -> None:
         """Batch save generations (улучшенная версия с детальным логированием)"""
@@ -34,11 +34,11 @@ class ContentGeneratorImage:
             
             # Попытка использовать новый ImageGenerationService
             try:
-                from .image_generator import ImageGenerationService
-                
-                # Создаем экземпляр сервиса
-                image_service = ImageGenerationService()
-                
+                # Общий экземпляр сервиса: провайдеры и хранилище изображений создаются один раз
+                from .image_generator import image_service
+                if image_service is None:
+                    raise ImportError("ImageGenerationService failed to initialize")
+
                 # Извлекаем параметры
                 with_points = params.get('with_points', False) if params else False
                 
@@ -3,16 +3,16 @@
 Модуль для анализа текста и генерации текстового контента
 """
 import logging
-from typing import Optional, Dict, Any, List
-from youtube_transcript_api import YouTubeTranscriptApi
-from sqlalchemy import select
+from typing import Optional, Dict, Any, List, Tuple
 import re
 
-from ...models import VideoTranscript
+from ...core.config import settings
 from ...core.memory import memory_optimized
 from ...core.constants import ContentType
 from ...core.exceptions import ValidationError
 from ...schemas.content import TextLevelAnalysis, TitlesAnalysis, QuestionsAnalysis
+from .text_pipeline import TextChunk, TextPipeline
+from .transcript_service import extract_video_id, get_transcript_service
 
 logger = logging.getLogger(__name__)
 
@@ -56,16 +56,29 @@ class ContentGeneratorText:
                 logger.warning(f"Unknown difficulty level: {difficulty}, using 'medium' as default")
                 difficulty = "medium"
 
-            # Создаем промпт для теста на понимание
-            prompt = self._create_comprehension_test_prompt(text, language, question_count, difficulty)
+            extra_params = {"difficulty": difficulty, "question_count": question_count}
+            pipeline = self._text_pipeline(user_id, extra_params)
+            if pipeline.is_long(text):
+                # Длинный текст: вопросы по кускам, затем отбор question_count лучших
+                chunks = pipeline.split(text)
+                per_chunk = self._questions_per_chunk(question_count, len(chunks))
+                content = await pipeline.reduce(
+                    await pipeline.map(chunks, lambda chunk: self._create_comprehension_test_prompt(
+                        chunk.with_context, language, per_chunk, difficulty
+                    )),
+                    lambda candidates: self._create_merge_questions_prompt(candidates, question_count)
+                )
+            else:
+                # Создаем промпт для теста на понимание
+                prompt = self._create_comprehension_test_prompt(text, language, question_count, difficulty)
 
-            # Генерируем контент
-            content = await self.generate_content(
-                content_type=ContentType.TEXT_ANALYSIS,
-                prompt=prompt,
-                user_id=user_id,
-                extra_params={"difficulty": difficulty, "question_count": question_count}
-            )
+                # Генерируем контент
+                content = await self.generate_content(
+                    content_type=ContentType.TEXT_ANALYSIS,
+                    prompt=prompt,
+                    user_id=user_id,
+                    extra_params=extra_params
+                )
 
             # Заменяем заголовок "Тест на понимание текста" на "Вопросы по тексту"
             is_russian = language.lower() in ["russian", "русский", "ru"]
@@ -393,56 +406,11 @@ Now generate {count} unique and engaging titles for this text.
             "recommended_index": recommended_index
         }
 
-    async def process_video_transcript(self, video_id: str, subtitle_language: str = "ru") -> str:
+    async def process_video_transcript(self, video_id: str, subtitle_language: str = "ru", **kwargs) -> str:
         """Process video transcript for language learning"""
-        from youtube_transcript_api import YouTubeTranscriptApi, NoTranscriptFound
-        from datetime import datetime
-
         logger.info(f"Обработка транскрипта для видео {video_id}")
-
-        # Extract YouTube ID from URL if a full URL was provided
-        video_id = self._extract_video_id(video_id)
-        if not video_id:
-            logger.error("Invalid YouTube video ID")
-            raise ValueError("Invalid YouTube video ID format")
-
-        # Check cache first without starting a new transaction
-        stmt = select(VideoTranscript).where(
-            VideoTranscript.video_id == video_id,
-            VideoTranscript.language == subtitle_language
-        )
-
-        result = await self.session.execute(stmt)
-        cached_transcript = result.scalar_one_or_none()
-
-        if cached_transcript:
-            logger.info(f"Found cached transcript for video {video_id} in {subtitle_language}")
-            return cached_transcript.content
-
-        # If not cached, fetch from YouTube
-        try:
-            logger.info(f"Fetching transcript for video {video_id} in {subtitle_language}")
-            transcript_list = YouTubeTranscriptApi.get_transcript(video_id, languages=[subtitle_language])
-            
-            # Combine transcript entries into a single text
-            transcript_text = ' '.join([entry['text'] for entry in transcript_list])
-            
-            # Save to database
-            video_transcript = VideoTranscript(
-                video_id=video_id,
-                language=subtitle_language,
-                content=transcript_text,
-                created_at=datetime.utcnow()
-            )
-            self.session.add(video_transcript)
-            await self.session.flush()
-            
-            logger.info(f"Successfully fetched and cached transcript for video {video_id}")
-            return transcript_text
-            
-        except Exception as e:
-            logger.error(f"Error fetching YouTube transcript: {str(e)}")
-            raise ValidationError(f"Could not fetch transcript for video {video_id}: {str(e)}")
+        # Загрузка в пуле потоков, общая для одновременных запросов (transcript_service.py)
+        return await get_transcript_service().get_transcript(video_id, subtitle_language)
 
     @memory_optimized()
     async def generate_questions(
@@ -470,20 +438,33 @@ Now generate {count} unique and engaging titles for this text.
             user_id = kwargs.get('user_id', 1)
             logger.info(f"Generating {question_count} {question_type} questions with {difficulty} difficulty")
 
-            # Создаем промпт для генерации вопросов
-            prompt = self._create_questions_prompt(text, question_count, question_type, difficulty)
+            extra_params = {
+                "question_count": question_count,
+                "question_type": question_type,
+                "difficulty": difficulty
+            }
+            pipeline = self._text_pipeline(user_id, extra_params)
+            if pipeline.is_long(text):
+                # Длинный текст: вопросы по кускам, затем отбор question_count лучших
+                chunks = pipeline.split(text)
+                per_chunk = self._questions_per_chunk(question_count, len(chunks))
+                content = await pipeline.reduce(
+                    await pipeline.map(chunks, lambda chunk: self._create_questions_prompt(
+                        chunk.with_context, per_chunk, question_type, difficulty
+                    )),
+                    lambda candidates: self._create_merge_questions_prompt(candidates, question_count)
+                )
+            else:
+                # Создаем промпт для генерации вопросов
+                prompt = self._create_questions_prompt(text, question_count, question_type, difficulty)
 
-            # Генерируем контент
-            content = await self.generate_content(
-                content_type=ContentType.TEXT_ANALYSIS,
-                prompt=prompt,
-                user_id=user_id,
-                extra_params={
-                    "question_count": question_count,
-                    "question_type": question_type,
-                    "difficulty": difficulty
-                }
-            )
+                # Генерируем контент
+                content = await self.generate_content(
+                    content_type=ContentType.TEXT_ANALYSIS,
+                    prompt=prompt,
+                    user_id=user_id,
+                    extra_params=extra_params
+                )
 
             return QuestionsAnalysis(
                 original_text=text[:200] + "..." if len(text) > 200 else text,
@@ -688,32 +669,46 @@ Now generate {count} unique and engaging titles for this text.
             logger.error(f"Error structuring questions: {str(e)}")
             return []
 
+    def _text_pipeline(self, user_id: int, extra_params: Dict[str, Any]) -> TextPipeline:
+        """Map-reduce по кускам длинного текста (text_pipeline.py); кэш ведется по кускам"""
+        async def generate(prompt: str) -> str:
+            return await self.generate_content(
+                content_type=ContentType.TEXT_ANALYSIS,
+                prompt=prompt,
+                user_id=user_id,
+                use_cache=False,
+                extra_params=extra_params
+            )
+
+        return TextPipeline(generate, cache=getattr(self, "cache_service", None))
+
+    @staticmethod
+    def _questions_per_chunk(question_count: int, chunk_count: int) -> int:
+        """Вопросов-кандидатов с куска: с запасом для отбора, но не больше question_count"""
+        return min(question_count, -(-question_count // chunk_count) + 1)
+
+    def _create_merge_questions_prompt(self, candidates: str, question_count: int) -> str:
+        """Промпт reduce: отбор вопросов из кандидатов по частям длинного текста"""
+        return f"""
+Below are candidate questions generated from consecutive parts of one long text.
+
+Instructions:
+- Select the {question_count} best questions so that together they cover the whole text evenly
+- Remove duplicates and questions that depend on each other
+- Renumber the selected questions from 1 to {question_count}
+- Keep the language, formatting, options and correct answers of the candidates exactly as they are
+- If the candidates start with a main heading, keep a single main heading at the top
+- Do not add any comments before or after the questions
+
+Candidate questions:
+{candidates}
+
+Return the {question_count} selected questions now:
+"""
+
     def _extract_video_id(self, video_id_or_url: str) -> str:
         """Extract YouTube video ID from URL or return as is if already an ID"""
-        if not video_id_or_url:
-            return None
-
-        # If it's already a video ID (11 characters, alphanumeric + _ -)
-        if re.match(r'^[a-zA-Z0-9_-]{11}$', video_id_or_url):
-            return video_id_or_url
-
-        # Extract from various YouTube URL formats
-        patterns = [
-            r'(?:youtube\.com/watch\?v=|youtu\.be/|youtube\.com/embed/)([a-zA-Z0-9_-]{11})',
-            r'youtube\.com/watch\?.*v=([a-zA-Z0-9_-]{11})',
-            r'youtu\.be/([a-zA-Z0-9_-]{11})',
-            r'youtube\.com/embed/([a-zA-Z0-9_-]{11})',
-            r'youtube\.com/v/([a-zA-Z0-9_-]{11})',
-            r'youtube\.com/watch/([a-zA-Z0-9_-]{11})',
-            r'youtube\.com/shorts/([a-zA-Z0-9_-]{11})',
-        ]
-
-        for pattern in patterns:
-            match = re.search(pattern, video_id_or_url)
-            if match:
-                return match.group(1)
-
-        return None
+        return extract_video_id(video_id_or_url)
 
     def _create_questions_prompt(self, text: str, question_count: int, question_type: str, difficulty: str) -> str:
         """Создает промпт для генерации вопросов"""
@@ -844,6 +839,16 @@ Generate {question_count} questions now:
 
             logger.info(f"Generating summary with max length {actual_max_length} for text of length {len(text)}")
 
+            extra_params = {"max_length": actual_max_length, "level": level}
+            pipeline = self._text_pipeline(user_id, extra_params)
+            if pipeline.is_long(text):
+                # Длинный текст: саммари кусков, затем саммари их объединения
+                return await pipeline.map_reduce(
+                    text,
+                    lambda chunk: self._create_summary_prompt(chunk.with_context, language, actual_max_length, level),
+                    lambda partial: self._create_summary_prompt(partial, language, actual_max_length, level)
+                )
+
             # Создаем промпт для генерации саммари
             prompt = self._create_summary_prompt(text, language, actual_max_length, level)
 
@@ -852,7 +857,7 @@ Generate {question_count} questions now:
                 content_type=ContentType.TEXT_ANALYSIS,
                 prompt=prompt,
                 user_id=user_id,
-                extra_params={"max_length": actual_max_length, "level": level}
+                extra_params=extra_params
             )
 
             return content
@@ -1107,6 +1112,15 @@ Now create three well-structured summaries at different levels of detail for thi
 
             logger.info(f"Changing text level from {source_level or 'auto-detected'} to {target_level}")
 
+            extra_params = {"target_level": target_level, "source_level": source_level}
+            pipeline = self._text_pipeline(user_id, extra_params)
+            if pipeline.is_long(text):
+                # Длинный текст адаптируется по кускам; reduce - склейка по порядку
+                parts = await pipeline.map(pipeline.split(text), lambda chunk: self._create_text_level_prompt(
+                    chunk.text, language, target_level, source_level
+                ))
+                return "\n\n".join(part.strip() for part in parts)
+
             # Создаем промпт для изменения уровня
             prompt = self._create_text_level_prompt(text, language, target_level, source_level)
 
@@ -1115,7 +1129,7 @@ Now create three well-structured summaries at different levels of detail for thi
                 content_type=ContentType.TEXT_ANALYSIS,
                 prompt=prompt,
                 user_id=user_id,
-                extra_params={"target_level": target_level, "source_level": source_level}
+                extra_params=extra_params
             )
 
             return content
@@ -1161,7 +1175,7 @@ Adapted text for {target_level.upper()} level:
 
         return prompt
 
-    def _create_text_level_prompt(self, text: str, language: str, level_system: str) -> str:
+    def _create_level_scale_prompt(self, text: str, language: str, level_system: str) -> str:
         """Создает промпт для определения уровня текста"""
 
         # Определяем языковые параметры на основе указанного языка
@@ -1419,19 +1433,26 @@ Regenerated text with {vocabulary_type} vocabulary:
             user_id = kwargs.get('user_id', 1)
             logger.info(f"Detecting text level for text in {language}")
 
-            # Создаем промпт для определения уровня
-            prompt = self._create_level_detection_prompt(text, language)
+            pipeline = self._text_pipeline(user_id, {"language": language})
+            if pipeline.is_long(text):
+                # Длинный текст: уровень по равномерной выборке кусков, итог - голосование по объему
+                chunks = self._sample_chunks(pipeline.split(text), settings.TEXT_PIPELINE_LEVEL_SAMPLES)
+                analyses = await pipeline.map(chunks, lambda chunk: self._create_level_detection_prompt(chunk.text, language))
+                content, level_info = self._merge_level_analyses(chunks, analyses)
+            else:
+                # Создаем промпт для определения уровня
+                prompt = self._create_level_detection_prompt(text, language)
 
-            # Генерируем контент
-            content = await self.generate_content(
-                content_type=ContentType.TEXT_ANALYSIS,
-                prompt=prompt,
-                user_id=user_id,
-                extra_params={"language": language}
-            )
+                # Генерируем контент
+                content = await self.generate_content(
+                    content_type=ContentType.TEXT_ANALYSIS,
+                    prompt=prompt,
+                    user_id=user_id,
+                    extra_params={"language": language}
+                )
 
-            # Парсим результат
-            level_info = self._parse_level_analysis(content)
+                # Парсим результат
+                level_info = self._parse_level_analysis(content)
 
             return TextLevelAnalysis(
                 original_text=text[:200] + "..." if len(text) > 200 else text,
@@ -1445,6 +1466,29 @@ Regenerated text with {vocabulary_type} vocabulary:
             logger.error(f"Error detecting text level: {str(e)}")
             raise
 
+    @staticmethod
+    def _sample_chunks(chunks: List[TextChunk], samples: int) -> List[TextChunk]:
+        """Равномерная выборка кусков от начала до конца текста"""
+        if len(chunks) <= samples:
+            return chunks
+        step = (len(chunks) - 1) / (samples - 1) if samples > 1 else 0
+        return [chunks[round(i * step)] for i in range(samples)]
+
+    def _merge_level_analyses(self, chunks: List[TextChunk], analyses: List[str]) -> Tuple[str, Dict[str, Any]]:
+        """Уровень с наибольшим объемом текста среди кусков и анализ самого уверенного из них"""
+        weights: Dict[str, int] = {}
+        parsed = [self._parse_level_analysis(content) for content in analyses]
+        for chunk, info in zip(chunks, parsed):
+            level = info.get("level", "intermediate")
+            weights[level] = weights.get(level, 0) + chunk.tokens
+        level = max(weights, key=weights.get)
+        matching = [(info, content) for info, content in zip(parsed, analyses) if info.get("level", "intermediate") == level]
+        _, content = max(matching, key=lambda item: item[0].get("confidence", 0.0))
+        return content, {
+            "level": level,
+            "confidence": sum(item[0].get("confidence", 0.0) for item in matching) / len(matching)
+        }
+
     def _create_level_detection_prompt(self, text: str, language: str) -> str:
         """Создает промпт для определения уровня текста"""
 
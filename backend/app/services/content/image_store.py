@@ -0,0 +1,287 @@
+"""
+Хранилище сгенерированных изображений с адресацией по содержимому.
+
+Файл называется SHA-256 своего содержимого ({hash}.png), поэтому одинаковые
+изображения хранятся один раз, а имя никогда не указывает на другие данные -
+его можно отдавать с сильным ETag и Cache-Control: immutable
+(см. api/generated_images.py).
+
+Ответ провайдера или декодированный base64 пишется во временный файл
+частями в потоке, а хеш считается по ходу записи, так что цикл событий не
+блокируется ни диском, ни хешированием. Варианты WebP и миниатюра
+({hash}.webp, {hash}.thumb.webp) создаются в пуле процессов через Pillow;
+если Pillow не установлен, отдается только оригинал.
+"""
+import asyncio
+import base64
+import binascii
+import hashlib
+import logging
+import multiprocessing
+import os
+import re
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import AsyncIterator, Dict, Optional, Set
+
+import httpx
+
+from ...core.config import settings
+
+logger = logging.getLogger(__name__)
+
+URL_PREFIX = "/static/generated_images"
+
+# Имена файлов хранилища: хеш содержимого и необязательный вариант
+STORED_NAME = re.compile(r"^(?P<digest>[0-9a-f]{64})(?P<variant>\.thumb)?\.(?P<ext>png|jpg|gif|webp)$")
+
+# Размер части при декодировании base64 (кратен 4) и записи на диск
+CHUNK_SIZE = 256 * 1024
+
+_SIGNATURES = (
+    (b"\x89PNG\r\n\x1a\n", "png"),
+    (b"\xff\xd8\xff", "jpg"),
+    (b"GIF87a", "gif"),
+    (b"GIF89a", "gif"),
+)
+
+
+class ImageStoreError(Exception):
+    """Изображение не удалось сохранить"""
+    pass
+
+
+def detect_extension(head: bytes) -> str:
+    """Расширение по сигнатуре файла; неизвестные форматы сохраняются как png"""
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "webp"
+    for signature, ext in _SIGNATURES:
+        if head.startswith(signature):
+            return ext
+    return "png"
+
+
+def make_variants(path: str, thumbnail_size: int, quality: int) -> Dict[str, str]:
+    """
+    Создает WebP и миниатюру рядом с оригиналом (выполняется в процессе пула)
+
+    Returns:
+        {'webp': путь, 'thumb': путь} для созданных вариантов
+    """
+    try:
+        from PIL import Image
+    except ImportError:
+        return {}
+
+    source = Path(path)
+    digest = source.name.split(".", 1)[0]
+    targets = {
+        "webp": source.with_name(f"{digest}.webp"),
+        "thumb": source.with_name(f"{digest}.thumb.webp"),
+    }
+    created = {}
+    with Image.open(source) as image:
+        image.load()
+        if image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGBA" if "transparency" in image.info else "RGB")
+        for name, target in targets.items():
+            if target.exists():
+                created[name] = str(target)
+                continue
+            variant = image
+            if name == "thumb":
+                variant = image.copy()
+                variant.thumbnail((thumbnail_size, thumbnail_size))
+            tmp = target.with_name(f".{target.name}.{uuid.uuid4().hex}.tmp")
+            variant.save(tmp, "WEBP", quality=quality, method=4)
+            os.replace(tmp, target)
+            created[name] = str(target)
+    return created
+
+
+@dataclass
+class StoredImage:
+    """Сохраненное изображение"""
+    digest: str
+    filename: str
+    size: int
+    created: bool  # False, если такой файл уже был в хранилище
+    variants: Dict[str, str] = field(default_factory=dict)
+
+
+class ImageStore:
+    """Запись изображений по хешу содержимого и создание вариантов"""
+
+    def __init__(
+            self,
+            root: Optional[str] = None,
+            base_url: Optional[str] = None,
+            variant_workers: Optional[int] = None
+    ):
+        self.root = Path(root or settings.IMAGE_STORE_DIR)
+        self.base_url = base_url if base_url is not None else os.getenv('BASE_URL', 'http://localhost:8000')
+        self.variant_workers = settings.IMAGE_VARIANT_WORKERS if variant_workers is None else variant_workers
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._variant_tasks: Set[asyncio.Task] = set()
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    def url(self, filename: str) -> str:
+        return f"{self.base_url}{URL_PREFIX}/{filename}"
+
+    def path(self, filename: str) -> Path:
+        return self.root / filename
+
+    # ---------- Запись ----------
+
+    async def save_chunks(self, chunks: AsyncIterator[bytes], with_variants: bool = True) -> StoredImage:
+        """Сохраняет поток байтов; файл появляется под именем хеша только целиком"""
+        tmp = self.root / f".upload-{uuid.uuid4().hex}.tmp"
+        hasher = hashlib.sha256()
+        size = 0
+        head = b""
+        file = await asyncio.to_thread(open, tmp, "wb")
+        try:
+            async for chunk in chunks:
+                if not chunk:
+                    continue
+                if len(head) < 16:
+                    head = (head + chunk)[:16]
+                size += len(chunk)
+                await asyncio.to_thread(self._write_chunk, file, hasher, chunk)
+        except BaseException:
+            await asyncio.to_thread(file.close)
+            await asyncio.to_thread(self._discard, tmp)
+            raise
+        await asyncio.to_thread(file.close)
+
+        if not size:
+            await asyncio.to_thread(self._discard, tmp)
+            raise ImageStoreError("Пустое изображение")
+
+        digest = hasher.hexdigest()
+        filename = f"{digest}.{detect_extension(head)}"
+        created = await asyncio.to_thread(self._commit, tmp, self.path(filename))
+        stored = StoredImage(digest=digest, filename=filename, size=size, created=created)
+        if with_variants:
+            self._schedule_variants(stored)
+        return stored
+
+    async def save_bytes(self, data: bytes, with_variants: bool = True) -> StoredImage:
+        async def chunks():
+            for start in range(0, len(data), CHUNK_SIZE):
+                yield data[start:start + CHUNK_SIZE]
+
+        return await self.save_chunks(chunks(), with_variants)
+
+    async def save_base64(self, data: str, with_variants: bool = True) -> StoredImage:
+        """Декодирует base64 частями в потоке, не держа в памяти второй полной копии"""
+        if data.startswith("data:"):
+            data = data.split(",", 1)[-1]
+        if "\n" in data or "\r" in data or " " in data:
+            data = "".join(data.split())
+
+        async def chunks():
+            for start in range(0, len(data), CHUNK_SIZE):
+                try:
+                    yield await asyncio.to_thread(base64.b64decode, data[start:start + CHUNK_SIZE])
+                except binascii.Error as e:
+                    raise ImageStoreError(f"Некорректный base64: {e}")
+
+        return await self.save_chunks(chunks(), with_variants)
+
+    async def save_url(
+            self,
+            url: str,
+            client: Optional[httpx.AsyncClient] = None,
+            with_variants: bool = True
+    ) -> StoredImage:
+        """Скачивает изображение провайдера потоком прямо в хранилище"""
+        async def fetch(http: httpx.AsyncClient) -> StoredImage:
+            async with http.stream("GET", url) as response:
+                if response.status_code != 200:
+                    raise ImageStoreError(f"Image download failed: HTTP {response.status_code}")
+                return await self.save_chunks(response.aiter_bytes(CHUNK_SIZE), with_variants)
+
+        if client is not None:
+            return await fetch(client)
+        async with httpx.AsyncClient(timeout=settings.IMAGE_DOWNLOAD_TIMEOUT, follow_redirects=True) as http:
+            return await fetch(http)
+
+    @staticmethod
+    def _write_chunk(file, hasher, chunk: bytes) -> None:
+        hasher.update(chunk)
+        file.write(chunk)
+
+    @staticmethod
+    def _discard(path: Path) -> None:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    @staticmethod
+    def _commit(tmp: Path, target: Path) -> bool:
+        """Переносит файл под постоянное имя; дубликат просто удаляется"""
+        if target.exists():
+            os.remove(tmp)
+            return False
+        os.replace(tmp, target)
+        return True
+
+    # ---------- Варианты ----------
+
+    def _executor(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.variant_workers,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return self._pool
+
+    def variant_filenames(self, digest: str) -> Dict[str, str]:
+        return {"webp": f"{digest}.webp", "thumb": f"{digest}.thumb.webp"}
+
+    async def create_variants(self, stored: StoredImage) -> Dict[str, str]:
+        """Создает варианты и возвращает их имена файлов"""
+        args = (str(self.path(stored.filename)), settings.IMAGE_THUMBNAIL_SIZE, settings.IMAGE_WEBP_QUALITY)
+        try:
+            if self.variant_workers <= 0:
+                paths = await asyncio.to_thread(make_variants, *args)
+            else:
+                paths = await asyncio.get_running_loop().run_in_executor(self._executor(), make_variants, *args)
+        except Exception as e:
+            logger.error(f"Ошибка создания вариантов изображения {stored.filename}: {str(e)}")
+            return {}
+        stored.variants = {name: Path(path).name for name, path in paths.items()}
+        return stored.variants
+
+    def _schedule_variants(self, stored: StoredImage) -> None:
+        if stored.filename.endswith(".webp") or not stored.created:
+            return
+        task = asyncio.create_task(self.create_variants(stored))
+        # Ссылка на задачу хранится до завершения, иначе ее может собрать GC
+        self._variant_tasks.add(task)
+        task.add_done_callback(self._variant_tasks.discard)
+
+    async def wait_variants(self) -> None:
+        """Дожидается запущенных задач создания вариантов"""
+        if self._variant_tasks:
+            await asyncio.gather(*list(self._variant_tasks), return_exceptions=True)
+
+    def shutdown(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=True, cancel_futures=True)
+            self._pool = None
+
+
+_store: Optional[ImageStore] = None
+
+
+def get_image_store() -> ImageStore:
+    """Общее на процесс хранилище изображений"""
+    global _store
+    if _store is None:
+        _store = ImageStore()
+    return _store
@@ -0,0 +1,282 @@
+"""
+Канонические ключи кэша генераций и индекс почти совпадающих промптов.
+
+Ключ кэша раньше строился из сырого промпта и json.dumps(extra_params),
+поэтому запрос с другим регистром, лишними пробелами или служебными
+параметрами (use_cache, batch_index) не находил готовую генерацию.
+Теперь промпт приводится к канонической форме (NFKC, casefold, пробелы),
+служебные параметры отбрасываются, строковые значения параметров
+нормализуются так же, как промпт.
+
+Индекс почти совпадающих промптов (только для типов из
+PROMPT_CACHE_SIMILARITY, по умолчанию выключен) находит генерацию для
+промпта с теми же предложениями в другом порядке, с другой пунктуацией или
+со словами-паразитами ("пожалуйста", "please"): MinHash-подпись по
+биграммам слов, кандидаты - через LSH-корзины в Redis. Кандидат подходит,
+если оценка сходства Жаккара не ниже порога типа, слова промптов (без
+слов-паразитов) различаются не более чем на PROMPT_CACHE_MAX_CHANGED_WORDS,
+причем без чисел, и порядок слов внутри каждого предложения совпадает:
+шаблонные промпты уроков почти целиком совпадают, и одно сходство
+пропустило бы смену темы или уровня, а совпадение набора слов - перевод
+"с русского на английский" вместо "с английского на русский".
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import re
+import unicodedata
+from collections import Counter
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
+
+from ...core.cache import CacheService
+from ...core.config import settings
+from ...core.constants import ContentType
+
+logger = logging.getLogger(__name__)
+
+# Параметры, не влияющие на результат генерации
+VOLATILE_PARAMS = frozenset({"use_cache", "batch_index"})
+
+# Слова, которые не меняют запрос
+FILLER_WORDS = frozenset({
+    "please", "pls", "kindly", "the", "a", "an", "just",
+    "пожалуйста", "плиз", "ну", "же", "бы", "вот", "просто", "мне",
+})
+
+_WHITESPACE = re.compile(r"\s+")
+_WORD = re.compile(r"\w+")
+_DIGIT = re.compile(r"\d")
+# Границы предложений: порядок предложений не важен, порядок слов в них - важен
+_SENTENCE_BREAK = re.compile(r"[.!?;\n]+")
+
+# MinHash: NUM_PERM = BANDS * ROWS; кандидатом считается совпадение хотя бы одной корзины
+NUM_PERM = 64
+BANDS = 16
+ROWS = 4
+SHINGLE_SIZE = 2
+# Ключей в одной LSH-корзине
+MAX_BUCKET_SIZE = 32
+# Кандидатов, проверяемых при поиске
+MAX_CANDIDATES = 8
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_PERMUTATIONS = [
+    (
+        int.from_bytes(hashlib.blake2b(f"a{i}".encode(), digest_size=8).digest(), "big") % (_MERSENNE_PRIME - 1) + 1,
+        int.from_bytes(hashlib.blake2b(f"b{i}".encode(), digest_size=8).digest(), "big") % _MERSENNE_PRIME
+    )
+    for i in range(NUM_PERM)
+]
+
+
+def _type_name(content_type: Union[str, ContentType]) -> str:
+    return content_type.value if hasattr(content_type, "value") else str(content_type)
+
+
+def canonical_prompt(prompt: str) -> str:
+    """Каноническая форма промпта: NFKC, casefold, одиночные пробелы"""
+    normalized = unicodedata.normalize("NFKC", prompt).casefold()
+    return _WHITESPACE.sub(" ", normalized).strip()
+
+
+def _canonical_value(value: Any) -> Any:
+    if isinstance(value, str):
+        return canonical_prompt(value)
+    if isinstance(value, dict):
+        return {str(k): _canonical_value(v) for k, v in value.items() if v is not None}
+    if isinstance(value, (list, tuple)):
+        return [_canonical_value(v) for v in value]
+    if hasattr(value, "value"):
+        return value.value
+    return value
+
+
+def canonical_params(extra_params: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """Параметры без служебных ключей и None, строки в канонической форме"""
+    if not extra_params:
+        return {}
+    return {
+        str(key): _canonical_value(value)
+        for key, value in extra_params.items()
+        if key not in VOLATILE_PARAMS and value is not None
+    }
+
+
+def params_hash(extra_params: Optional[Dict[str, Any]]) -> Optional[str]:
+    params = canonical_params(extra_params)
+    if not params:
+        return None
+    params_str = json.dumps(params, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.md5(params_str.encode()).hexdigest()
+
+
+def generation_cache_key(prompt: str, content_type: Union[str, ContentType], extra_params: Optional[Dict[str, Any]] = None) -> str:
+    """Ключ кэша генерации по канонической форме промпта и параметров"""
+    key = f"{_type_name(content_type)}:{hashlib.md5(canonical_prompt(prompt).encode()).hexdigest()}"
+    params = params_hash(extra_params)
+    if params:
+        key += f":{params}"
+    return key
+
+
+def content_words(prompt: str) -> List[str]:
+    """Слова канонической формы промпта без слов-паразитов"""
+    return [word for word in _WORD.findall(canonical_prompt(prompt)) if word not in FILLER_WORDS]
+
+
+def content_sentences(prompt: str) -> List[List[str]]:
+    """Слова промпта без слов-паразитов по предложениям и строкам"""
+    return [words for words in map(content_words, _SENTENCE_BREAK.split(prompt)) if words]
+
+
+def _shingle_hashes(words: Sequence[str]) -> List[int]:
+    if len(words) < SHINGLE_SIZE:
+        shingles = {" ".join(words)}
+    else:
+        shingles = {" ".join(words[i:i + SHINGLE_SIZE]) for i in range(len(words) - SHINGLE_SIZE + 1)}
+    return [int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=8).digest(), "big") for s in shingles]
+
+
+def minhash(words: Sequence[str]) -> Tuple[int, ...]:
+    """MinHash-подпись множества биграмм слов"""
+    hashes = _shingle_hashes(words)
+    return tuple(min((a * h + b) % _MERSENNE_PRIME for h in hashes) for a, b in _PERMUTATIONS)
+
+
+def estimated_similarity(left: Sequence[int], right: Sequence[int]) -> float:
+    """Оценка сходства Жаккара по MinHash-подписям"""
+    return sum(1 for x, y in zip(left, right) if x == y) / NUM_PERM
+
+
+def changed_words(left: Sequence[str], right: Sequence[str]) -> List[str]:
+    """Слова, которые есть только в одном из промптов (с учетом повторов)"""
+    left_counts = Counter(left)
+    right_counts = Counter(right)
+    return list(((left_counts - right_counts) + (right_counts - left_counts)).elements())
+
+
+def same_word_order(
+        left: Sequence[Sequence[str]],
+        right: Sequence[Sequence[str]],
+        changed: Sequence[str] = ()
+) -> bool:
+    """Совпадают ли предложения промптов с точностью до их порядка и слов changed"""
+    ignored = set(changed)
+
+    def ordered(sentences: Sequence[Sequence[str]]) -> List[Tuple[str, ...]]:
+        kept = (tuple(word for word in sentence if word not in ignored) for sentence in sentences)
+        return sorted(sentence for sentence in kept if sentence)
+
+    return ordered(left) == ordered(right)
+
+
+def _bands(signature: Sequence[int]) -> List[str]:
+    return [
+        hashlib.md5(",".join(map(str, signature[band * ROWS:(band + 1) * ROWS])).encode()).hexdigest()[:16]
+        for band in range(BANDS)
+    ]
+
+
+class NearDuplicateIndex:
+    """LSH-индекс MinHash-подписей промптов в Redis"""
+
+    def __init__(
+            self,
+            cache: CacheService,
+            thresholds: Optional[Dict[str, float]] = None,
+            max_changed_words: Optional[int] = None,
+            ttl: Optional[int] = None
+    ):
+        self.cache = cache
+        self.thresholds = thresholds if thresholds is not None else settings.PROMPT_CACHE_SIMILARITY
+        self.max_changed_words = (max_changed_words if max_changed_words is not None
+                                  else settings.PROMPT_CACHE_MAX_CHANGED_WORDS)
+        self.ttl = ttl or settings.PROMPT_CACHE_INDEX_TTL
+        self.stats = {"lookups": 0, "candidates": 0, "hits": 0, "rejected": 0}
+
+    def threshold(self, content_type: Union[str, ContentType]) -> Optional[float]:
+        """Порог сходства для типа или None, если поиск почти совпадающих промптов выключен"""
+        return self.thresholds.get(_type_name(content_type))
+
+    def _namespace(self, content_type: Union[str, ContentType], extra_params: Optional[Dict[str, Any]]) -> str:
+        # Кандидаты ищутся только среди генераций того же типа с теми же параметрами
+        return f"near_dup:{_type_name(content_type)}:{params_hash(extra_params) or '-'}"
+
+    async def find(
+            self,
+            content_type: Union[str, ContentType],
+            prompt: str,
+            extra_params: Optional[Dict[str, Any]] = None
+    ) -> Optional[str]:
+        """Ключ кэша генерации почти совпадающего промпта"""
+        threshold = self.threshold(content_type)
+        if threshold is None:
+            return None
+        self.stats["lookups"] += 1
+        words = content_words(prompt)
+        if not words:
+            return None
+        signature = minhash(words)
+        namespace = self._namespace(content_type, extra_params)
+
+        buckets = await asyncio.gather(*(
+            self.cache.get_cached_data(f"{namespace}:{band}:{value}") for band, value in enumerate(_bands(signature))
+        ))
+        # Проверяются кандидаты с наибольшим числом совпавших корзин
+        matches = Counter(key for bucket in buckets if bucket for key in bucket)
+        candidates = [key for key, _ in matches.most_common(MAX_CANDIDATES)]
+        if not candidates:
+            return None
+        self.stats["candidates"] += len(candidates)
+
+        entries = await asyncio.gather(*(self.cache.get_cached_data(f"near_dup:entry:{key}") for key in candidates))
+        best_key = None
+        best_similarity = threshold
+        for key, entry in zip(candidates, entries):
+            if not entry:
+                continue
+            similarity = estimated_similarity(signature, entry["signature"])
+            if similarity < best_similarity:
+                continue
+            changed = changed_words(words, entry["words"])
+            if (len(changed) > self.max_changed_words
+                    or any(_DIGIT.search(word) for word in changed)
+                    or not same_word_order(content_sentences(prompt), entry.get("sentences") or [], changed)):
+                self.stats["rejected"] += 1
+                continue
+            best_key, best_similarity = key, similarity
+
+        if best_key:
+            self.stats["hits"] += 1
+            logger.info(f"Near-duplicate prompt for {_type_name(content_type)} (similarity {best_similarity:.2f})")
+        return best_key
+
+    async def add(
+            self,
+            content_type: Union[str, ContentType],
+            prompt: str,
+            extra_params: Optional[Dict[str, Any]],
+            key: str
+    ) -> None:
+        """Добавляет в индекс промпт, генерация которого сохранена в кэше под key"""
+        if self.threshold(content_type) is None:
+            return
+        words = content_words(prompt)
+        if not words:
+            return
+        signature = minhash(words)
+        namespace = self._namespace(content_type, extra_params)
+        entry = {"words": words, "sentences": content_sentences(prompt), "signature": list(signature)}
+        await self.cache.cache_data(f"near_dup:entry:{key}", entry, ttl=self.ttl)
+
+        async def add_to_bucket(bucket_key: str):
+            # Чтение и запись корзины не атомарны: при гонке теряется ключ, а не генерация
+            bucket = await self.cache.get_cached_data(bucket_key) or []
+            if key not in bucket:
+                bucket = [key] + bucket[:MAX_BUCKET_SIZE - 1]
+                await self.cache.cache_data(bucket_key, bucket, ttl=self.ttl)
+
+        await asyncio.gather(*(
+            add_to_bucket(f"{namespace}:{band}:{value}") for band, value in enumerate(_bands(signature))
+        ))
@@ -1,37 +1,78 @@
 """
 Сервис для перевода промптов генерации изображений на английский язык
 Использует LLM7 ChatGPT 4.1 для качественного перевода
+
+Переводы хранятся в памяти переводов (translation_memory.py) - локальном LRU
+и таблице prompt_translations. Промпты без букв нелатинских алфавитов не
+переводятся. Промпты, пришедшие в течение TRANSLATION_BATCH_WINDOW_MS,
+переводятся одним запросом к LLM, а частота запросов ограничивается
+token bucket вместо фиксированной паузы.
 """
 
 import asyncio
+import json
 import logging
-import re
-from typing import Optional, Dict, Any
-from datetime import datetime, timedelta
+from typing import Optional, Dict, Any, List
 
+from ...core.config import settings
+from ...core.database import async_session
 from ...utils.llm7_api import LLM7Handler, LLM7_AVAILABLE, LLM7ConnectionException, LLM7RateLimitException
+from .translation_memory import TokenBucket, TranslationMemory, needs_translation, non_latin_ratio, prompt_key
 
 logger = logging.getLogger(__name__)
 
+TRANSLATION_MODEL = "gpt-4.1-2025-04-14"  # ChatGPT 4.1
+
+TRANSLATION_RULES = """IMPORTANT RULES:
+1. Translate ONLY the user input, preserve any existing English parts
+2. Keep artistic terms, style descriptions, and technical parameters intact
+3. Maintain the creative intent and visual description quality
+4. If the text is already in English, return it unchanged
+5. For mixed language text, translate only non-English parts
+6. Preserve formatting, commas, and structure
+7. Focus on accuracy for visual/artistic descriptions"""
+
+# Перевод с такой долей нелатинских букв считается неудачным (например, текст ошибки)
+MAX_NON_LATIN_RATIO = 0.5
+
 class PromptTranslationService:
     """
     Сервис для перевода промптов генерации изображений на английский язык
     """
     
-    def __init__(self):
+    def __init__(self, memory: Optional[TranslationMemory] = None, llm_handler=None):
         """Инициализация сервиса перевода"""
-        self.llm7_handler = None
-        self._last_request_time = None
-        self._request_delay = 1.0  # Минимальная задержка между запросами в секундах
+        self.llm7_handler = llm_handler
         self._max_retries = 3
         self._retry_delay = 2.0  # Задержка между повторными попытками
-        
+
         # Инициализируем LLM7 handler
-        self._initialize_llm7()
-        
-        # Кэш переводов для избежания повторных запросов
-        self._translation_cache = {}
-        self._cache_ttl = timedelta(hours=24)  # TTL кэша - 24 часа
+        if self.llm7_handler is None:
+            self._initialize_llm7()
+
+        # Память переводов вместо словаря экземпляра
+        self.memory = memory or TranslationMemory(session_factory=async_session)
+        self.rate_limiter = TokenBucket(settings.TRANSLATION_RATE_PER_SECOND, settings.TRANSLATION_RATE_BURST)
+        self.batch_window = settings.TRANSLATION_BATCH_WINDOW_MS / 1000
+        self.batch_size = settings.TRANSLATION_BATCH_SIZE
+
+        # Результаты по ключу промпта: одинаковые промпты ждут один перевод
+        self._waiting: Dict[str, asyncio.Future] = {}
+        # Промпты, ожидающие проверки памяти переводов: ключ -> промпт
+        self._pending: Dict[str, str] = {}
+        # Промпты, ожидающие запроса к LLM (в порядке поступления)
+        self._queue: Dict[str, str] = {}
+        self._flush_timer: Optional[asyncio.Task] = None
+        self._dispatcher: Optional[asyncio.Task] = None
+        self._tasks = set()
+        self.stats = {
+            "requests": 0,
+            "skipped": 0,
+            "shared": 0,
+            "llm_calls": 0,
+            "translated": 0,
+            "failed": 0,
+        }
         
     def _initialize_llm7(self):
         """Инициализация LLM7 handler"""
@@ -54,75 +95,9 @@ class PromptTranslationService:
         return self.llm7_handler is not None and self.llm7_handler.is_available()
     
     def _is_english(self, text: str) -> bool:
-        """
-        Простая проверка, является ли текст уже на английском языке
-        
-        Args:
-            text: Текст для проверки
-            
-        Returns:
-            True если текст уже на английском, False если нужен перевод
-        """
-        # Удаляем знаки препинания и цифры для анализа
-        clean_text = re.sub(r'[^\w\s]', '', text.lower())
-        words = clean_text.split()
-        
-        if not words:
-            return True  # Пустой текст считаем английским
-        
-        # Проверяем наличие кириллических символов
-        cyrillic_pattern = re.compile(r'[а-яё]', re.IGNORECASE)
-        if cyrillic_pattern.search(text):
-            return False
-        
-        # Если нет кириллицы и есть латинские буквы, считаем английским
-        latin_pattern = re.compile(r'[a-z]', re.IGNORECASE)
-        if latin_pattern.search(text):
-            return True
-        
-        # Если только цифры и знаки, считаем английским
-        return True
-    
-    def _get_cache_key(self, text: str) -> str:
-        """Генерирует ключ кэша для текста"""
-        import hashlib
-        return hashlib.md5(text.encode('utf-8')).hexdigest()
-    
-    def _get_cached_translation(self, text: str) -> Optional[str]:
-        """Получает перевод из кэша если он актуален"""
-        cache_key = self._get_cache_key(text)
-        
-        if cache_key in self._translation_cache:
-            cached_data = self._translation_cache[cache_key]
-            if datetime.now() - cached_data['timestamp'] < self._cache_ttl:
-                logger.debug(f"Using cached translation for: {text[:50]}...")
-                return cached_data['translation']
-            else:
-                # Удаляем устаревший кэш
-                del self._translation_cache[cache_key]
-        
-        return None
-    
-    def _cache_translation(self, original: str, translation: str):
-        """Сохраняет перевод в кэш"""
-        cache_key = self._get_cache_key(original)
-        self._translation_cache[cache_key] = {
-            'translation': translation,
-            'timestamp': datetime.now()
-        }
-        logger.debug(f"Cached translation: {original[:50]}... -> {translation[:50]}...")
-    
-    async def _wait_for_rate_limit(self):
-        """Ожидание для соблюдения rate limit"""
-        if self._last_request_time:
-            elapsed = datetime.now() - self._last_request_time
-            if elapsed.total_seconds() < self._request_delay:
-                wait_time = self._request_delay - elapsed.total_seconds()
-                logger.debug(f"Rate limiting: waiting {wait_time:.2f} seconds")
-                await asyncio.sleep(wait_time)
-        
-        self._last_request_time = datetime.now()
-    
+        """Текст без букв нелатинских алфавитов не требует перевода"""
+        return not needs_translation(text)
+
     def _create_translation_prompt(self, text: str) -> str:
         """
         Создает промпт для перевода текста на английский
@@ -137,150 +112,240 @@ class PromptTranslationService:
 
 Your task is to translate the following text to English while preserving the artistic and descriptive intent for image generation.
 
-IMPORTANT RULES:
-1. Translate ONLY the user input, preserve any existing English parts
-2. Keep artistic terms, style descriptions, and technical parameters intact
-3. Maintain the creative intent and visual description quality
-4. If the text is already in English, return it unchanged
-5. For mixed language text, translate only non-English parts
-6. Preserve formatting, commas, and structure
-7. Focus on accuracy for visual/artistic descriptions
+{TRANSLATION_RULES}
 
 Text to translate:
 {text}
 
 Provide ONLY the translated text, no explanations or additional text."""
 
-    async def translate_prompt(self, prompt: str) -> str:
-        """
-        Переводит промпт на английский язык
-        
-        Args:
-            prompt: Исходный промпт для перевода
-            
-        Returns:
-            Переведенный промпт на английском языке
-            
-        Raises:
-            Exception: При ошибке перевода
-        """
-        if not prompt or not prompt.strip():
-            return prompt
-        
-        # Проверяем, нужен ли перевод
-        if self._is_english(prompt):
-            logger.debug(f"Prompt already in English: {prompt[:50]}...")
-            return prompt
-        
-        # Проверяем кэш
-        cached_translation = self._get_cached_translation(prompt)
-        if cached_translation:
-            return cached_translation
-        
-        # Проверяем доступность сервиса
-        if not self.is_available():
-            logger.warning("Translation service not available, returning original prompt")
-            return prompt
-        
-        logger.info(f"🔄 Translating prompt: {prompt[:100]}...")
-        
-        # Выполняем перевод с повторными попытками
+    def _create_batch_prompt(self, texts: List[str]) -> str:
+        """Промпт для перевода нескольких текстов одним запросом"""
+        return f"""You are a professional translator specializing in image generation prompts. 
+
+Your task is to translate every item of the JSON array below to English while preserving the artistic and descriptive intent for image generation. Items are independent prompts.
+
+{TRANSLATION_RULES}
+
+Input JSON array ({len(texts)} items):
+{json.dumps(texts, ensure_ascii=False)}
+
+Provide ONLY a JSON array of exactly {len(texts)} translated strings in the same order, no explanations or additional text."""
+
+    @staticmethod
+    def _extract_content(translated: str) -> str:
+        """Достает текст, если LLM вернул полный JSON ответа API"""
+        translated = translated.strip()
+        if translated.startswith('{"id":') and '"content":"' in translated:
+            try:
+                json_response = json.loads(translated)
+                if 'choices' in json_response and len(json_response['choices']) > 0:
+                    choice = json_response['choices'][0]
+                    if 'message' in choice and 'content' in choice['message']:
+                        translated = choice['message']['content'].strip()
+                        logger.info(f"✅ Extracted content from JSON response: {translated[:50]}...")
+            except (json.JSONDecodeError, KeyError) as e:
+                logger.warning(f"Failed to parse JSON response, using as-is: {e}")
+        return translated
+
+    @staticmethod
+    def _is_valid_translation(translated: Optional[str]) -> bool:
+        return bool(translated and translated.strip()) and non_latin_ratio(translated) <= MAX_NON_LATIN_RATIO
+
+    async def _call_llm(self, prompt: str, max_tokens: int, token_acquired: bool = False) -> Optional[str]:
+        """Запрос к LLM с ограничением частоты и повторными попытками; None при неудаче"""
         for attempt in range(self._max_retries):
             try:
-                # Соблюдаем rate limit
-                await self._wait_for_rate_limit()
-                
-                # Создаем промпт для перевода
-                translation_prompt = self._create_translation_prompt(prompt)
-                
-                # Выполняем перевод с использованием ChatGPT 4.1
+                if attempt or not token_acquired:
+                    await self.rate_limiter.acquire()
+                self.stats["llm_calls"] += 1
                 translated = await self.llm7_handler.generate_content(
-                    prompt=translation_prompt,
-                    model="gpt-4.1-2025-04-14",  # Используем ChatGPT 4.1
+                    prompt=prompt,
+                    model=TRANSLATION_MODEL,
                     temperature=0.3,  # Низкая температура для точного перевода
-                    max_tokens=500
+                    max_tokens=max_tokens
                 )
-                
                 if not translated or not translated.strip():
                     raise Exception("Empty translation received")
-                
-                # Очищаем результат от лишних символов
-                translated = translated.strip()
-
-                # Проверяем, не вернулся ли полный JSON ответ вместо содержимого
-                if translated.startswith('{"id":') and '"content":"' in translated:
-                    try:
-                        import json
-                        json_response = json.loads(translated)
-                        if 'choices' in json_response and len(json_response['choices']) > 0:
-                            choice = json_response['choices'][0]
-                            if 'message' in choice and 'content' in choice['message']:
-                                translated = choice['message']['content'].strip()
-                                logger.info(f"✅ Extracted content from JSON response: {translated[:50]}...")
-                    except (json.JSONDecodeError, KeyError) as e:
-                        logger.warning(f"Failed to parse JSON response, using as-is: {e}")
-
-                # Кэшируем результат
-                self._cache_translation(prompt, translated)
-                
-                logger.info(f"✅ Successfully translated prompt: {prompt[:50]}... -> {translated[:50]}...")
-                return translated
-                
+                return self._extract_content(translated)
+
             except LLM7RateLimitException as e:
                 logger.warning(f"⚠️ Rate limit hit on attempt {attempt + 1}: {e}")
                 if attempt < self._max_retries - 1:
                     wait_time = self._retry_delay * (2 ** attempt)  # Exponential backoff
                     logger.info(f"Waiting {wait_time} seconds before retry...")
                     await asyncio.sleep(wait_time)
-                else:
-                    logger.error("Max retries reached for rate limit, returning original prompt")
-                    return prompt
-                    
+
             except LLM7ConnectionException as e:
                 logger.error(f"❌ Connection error on attempt {attempt + 1}: {e}")
                 if attempt < self._max_retries - 1:
-                    wait_time = self._retry_delay * (attempt + 1)
-                    logger.info(f"Waiting {wait_time} seconds before retry...")
-                    await asyncio.sleep(wait_time)
-                else:
-                    logger.error("Max retries reached for connection error, returning original prompt")
-                    return prompt
-                    
+                    await asyncio.sleep(self._retry_delay * (attempt + 1))
+
             except Exception as e:
                 logger.error(f"❌ Translation error on attempt {attempt + 1}: {e}")
                 if attempt < self._max_retries - 1:
-                    wait_time = self._retry_delay * (attempt + 1)
-                    logger.info(f"Waiting {wait_time} seconds before retry...")
-                    await asyncio.sleep(wait_time)
-                else:
-                    logger.error("Max retries reached, returning original prompt")
-                    return prompt
+                    await asyncio.sleep(self._retry_delay * (attempt + 1))
+
+        logger.error("Max retries reached, returning original prompt")
+        return None
+
+    async def _translate_one(self, prompt: str, token_acquired: bool = False) -> Optional[str]:
+        translated = await self._call_llm(self._create_translation_prompt(prompt), 500, token_acquired)
+        return translated if self._is_valid_translation(translated) else None
+
+    async def _translate_batch(self, prompts: List[str], token_acquired: bool = False) -> List[Optional[str]]:
+        """Переводит промпты одним запросом; при неразборчивом ответе - по одному"""
+        if len(prompts) == 1:
+            return [await self._translate_one(prompts[0], token_acquired)]
+
+        response = await self._call_llm(
+            self._create_batch_prompt(prompts), min(4000, 500 * len(prompts)), token_acquired
+        )
+        if response:
+            try:
+                items = json.loads(response[response.index("["):response.rindex("]") + 1])
+                if (isinstance(items, list) and len(items) == len(prompts)
+                        and all(isinstance(item, str) for item in items)):
+                    return [item.strip() if self._is_valid_translation(item) else None for item in items]
+            except ValueError:
+                pass
+            logger.warning(f"Unparseable batch translation for {len(prompts)} prompts, translating one by one")
+        return list(await asyncio.gather(*(self._translate_one(prompt) for prompt in prompts)))
+
+    # ---------- Пакетирование ----------
+
+    def _spawn(self, coro) -> asyncio.Task:
+        task = asyncio.create_task(coro)
+        # Ссылка на задачу хранится до завершения, иначе ее может собрать GC
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    def _resolve(self, key: str, value: str) -> None:
+        future = self._waiting.pop(key, None)
+        if future is not None and not future.done():
+            future.set_result(value)
+
+    def _take_pending(self) -> Dict[str, str]:
+        pending, self._pending = self._pending, {}
+        return pending
+
+    async def _flush_later(self):
+        await asyncio.sleep(self.batch_window)
+        self._flush_timer = None
+        await self._lookup(self._take_pending())
+
+    async def _lookup(self, batch: Dict[str, str]):
+        """Проверяет память переводов одним запросом и ставит промахи в очередь к LLM"""
+        if not batch:
+            return
+        try:
+            found = await self.memory.get_many(batch.keys())
+        except Exception as e:
+            logger.error(f"❌ Translation memory error: {e}")
+            found = {}
+        for key, prompt in batch.items():
+            if key in found:
+                self._resolve(key, found[key])
+            elif self.is_available():
+                self._queue[key] = prompt
+            else:
+                logger.warning("Translation service not available, returning original prompt")
+                self._resolve(key, prompt)
+        if self._queue and self._dispatcher is None:
+            self._dispatcher = self._spawn(self._dispatch())
+
+    async def _dispatch(self):
+        """
+        Отправляет очередь в LLM пакетами по мере появления токенов
+
+        Пока ограничитель не выдал токен, новые промпты накапливаются в
+        очереди и уходят следующим общим запросом.
+        """
+        try:
+            while self._queue:
+                await self.rate_limiter.acquire()
+                keys = list(self._queue)[:self.batch_size]
+                batch = {key: self._queue.pop(key) for key in keys}
+                self._spawn(self._translate_and_resolve(batch))
+        finally:
+            self._dispatcher = None
+
+    async def _translate_and_resolve(self, batch: Dict[str, str]):
+        results: Dict[str, str] = {}
+        try:
+            translated = await self._translate_batch(list(batch.values()), token_acquired=True)
+            learned = {}
+            for key, value in zip(batch, translated):
+                if value is None:
+                    self.stats["failed"] += 1
+                    continue
+                results[key] = value
+                learned[key] = (batch[key], value)
+            self.stats["translated"] += len(learned)
+            await self.memory.put_many(learned)
+        except Exception as e:
+            logger.error(f"❌ Translation batch error: {e}")
+        finally:
+            # Без перевода возвращается исходный промпт, как и раньше
+            for key, prompt in batch.items():
+                self._resolve(key, results.get(key, prompt))
+
+    async def translate_prompt(self, prompt: str) -> str:
+        """
+        Переводит промпт на английский язык
         
-        # Если все попытки неудачны, возвращаем оригинальный промпт
-        return prompt
+        Args:
+            prompt: Исходный промпт для перевода
+            
+        Returns:
+            Переведенный промпт на английском языке (исходный, если перевести не удалось)
+        """
+        if not prompt or not prompt.strip():
+            return prompt
+        self.stats["requests"] += 1
+
+        # Проверяем, нужен ли перевод
+        if not needs_translation(prompt):
+            self.stats["skipped"] += 1
+            logger.debug(f"Prompt already in English: {prompt[:50]}...")
+            return prompt
+
+        key = prompt_key(prompt)
+        cached_translation = self.memory.get_local(key)
+        if cached_translation:
+            return cached_translation
+
+        future = self._waiting.get(key)
+        if future is not None:
+            self.stats["shared"] += 1
+            return await asyncio.shield(future)
+
+        future = asyncio.get_running_loop().create_future()
+        self._waiting[key] = future
+        self._pending[key] = prompt
+        if len(self._pending) >= self.batch_size:
+            self._spawn(self._lookup(self._take_pending()))
+        elif self._flush_timer is None:
+            self._flush_timer = self._spawn(self._flush_later())
+        return await asyncio.shield(future)
+
+    async def translate_prompts(self, prompts: List[str]) -> List[str]:
+        """Переводит несколько промптов, объединяя их в общие запросы"""
+        return list(await asyncio.gather(*(self.translate_prompt(prompt) for prompt in prompts)))
 
     def clear_cache(self):
-        """Очищает кэш переводов"""
-        self._translation_cache.clear()
+        """Очищает локальный кэш переводов (таблица prompt_translations не затрагивается)"""
+        self.memory.clear_local()
         logger.info("Translation cache cleared")
 
     def get_cache_stats(self) -> Dict[str, Any]:
         """Возвращает статистику кэша"""
-        active_entries = 0
-        expired_entries = 0
-
-        now = datetime.now()
-        for cached_data in self._translation_cache.values():
-            if now - cached_data['timestamp'] < self._cache_ttl:
-                active_entries += 1
-            else:
-                expired_entries += 1
-
         return {
-            'total_entries': len(self._translation_cache),
-            'active_entries': active_entries,
-            'expired_entries': expired_entries,
-            'cache_ttl_hours': self._cache_ttl.total_seconds() / 3600
+            'total_entries': self.memory.local_size(),
+            'cache_ttl_hours': self.memory.ttl.total_seconds() / 3600,
+            **self.memory.stats,
+            **self.stats
         }
 
 # Глобальный экземпляр сервиса
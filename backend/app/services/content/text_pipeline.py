@@ -0,0 +1,225 @@
+"""
+Map-reduce для длинных текстов.
+
+Текст делится на куски по границам предложений с оценкой числа токенов
+(без токенизатора: латиница ~4 символа на токен, другие алфавиты ~2.5,
+иероглифы - символ на токен). Граница куска выбирается по содержимому:
+после набора половины лимита кусок заканчивается на предложении, хеш
+которого делится на BOUNDARY_DIVISOR. Поэтому правка текста меняет только
+кусок с правкой (и, из-за перекрытия, следующий), а остальные куски и их
+результаты в кэше остаются прежними.
+
+Map - запросы к LLM по кускам параллельно с ограничением одновременных
+запросов, reduce - объединение частичных результатов одним запросом
+(группами в несколько уровней, если они не помещаются в один). Результат
+каждого запроса кэшируется по хешу промпта.
+"""
+import asyncio
+import hashlib
+import logging
+import re
+import zlib
+from dataclasses import dataclass
+from typing import Awaitable, Callable, List, Optional
+
+from ...core.cache import CacheService
+from ...core.config import settings
+from ...core.exceptions import GenerationError
+from ...utils.tokenizer import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+# Конец предложения или абзаца; разделитель остается в конце предложения
+_BOUNDARY = re.compile(r'(?<=[.!?…。！？])\s+|\n\s*\n')
+_WORD = re.compile(r'\S+\s*')
+
+# Делитель хеша предложения для границы куска (в среднем 1 граница на 16 предложений)
+BOUNDARY_DIVISOR = 16
+# Уровней reduce, после которых части объединяются одним запросом как есть
+MAX_REDUCE_LEVELS = 3
+
+# Ответы generate_content при неудачной генерации
+FAILED_GENERATION_PREFIXES = (
+    "Не удалось сгенерировать контент",
+    "Произошла ошибка при генерации контента",
+    "Ошибка генерации",
+    "Критическая ошибка генерации",
+)
+
+
+def split_sentences(text: str) -> List[str]:
+    """Предложения вместе с последующими пробелами: "".join() дает исходный текст"""
+    sentences = []
+    start = 0
+    for match in _BOUNDARY.finditer(text):
+        sentences.append(text[start:match.end()])
+        start = match.end()
+    if start < len(text):
+        sentences.append(text[start:])
+    return sentences
+
+
+def _split_long(sentence: str, max_tokens: int) -> List[str]:
+    """Режет предложение длиннее лимита по словам (слово длиннее лимита - по символам)"""
+    pieces = []
+    current = ""
+    for word in _WORD.findall(sentence) or [sentence]:
+        while estimate_tokens(word) > max_tokens:
+            if current:
+                pieces.append(current)
+                current = ""
+            pieces.append(word[:max_tokens])
+            word = word[max_tokens:]
+        if current and estimate_tokens(current + word) > max_tokens:
+            pieces.append(current)
+            current = ""
+        current += word
+    if current:
+        pieces.append(current)
+    return pieces
+
+
+def _is_boundary(sentence: str) -> bool:
+    return zlib.crc32(sentence.strip().encode("utf-8")) % BOUNDARY_DIVISOR == 0
+
+
+@dataclass
+class TextChunk:
+    index: int
+    text: str
+    # Конец предыдущего куска для связности (перекрытие)
+    context: str
+    tokens: int
+
+    @property
+    def with_context(self) -> str:
+        return f"{self.context}{self.text}" if self.context else self.text
+
+
+def split_text(text: str, max_tokens: int, overlap_tokens: int = 0) -> List[TextChunk]:
+    """Куски не длиннее max_tokens с границами по содержимому и перекрытием overlap_tokens"""
+    min_tokens = max_tokens // 2
+    groups: List[List[str]] = []
+    current: List[str] = []
+    size = 0
+    for sentence in split_sentences(text):
+        for piece in _split_long(sentence, max_tokens) if estimate_tokens(sentence) > max_tokens else [sentence]:
+            tokens = estimate_tokens(piece)
+            if current and size + tokens > max_tokens:
+                groups.append(current)
+                current, size = [], 0
+            current.append(piece)
+            size += tokens
+            if size >= min_tokens and _is_boundary(piece):
+                groups.append(current)
+                current, size = [], 0
+    if current:
+        groups.append(current)
+
+    chunks = []
+    previous: List[str] = []
+    for index, group in enumerate(groups):
+        context: List[str] = []
+        budget = overlap_tokens
+        for sentence in reversed(previous):
+            budget -= estimate_tokens(sentence)
+            if budget < 0:
+                break
+            context.insert(0, sentence)
+        chunk_text = "".join(group)
+        if chunk_text.strip():
+            chunks.append(TextChunk(len(chunks), chunk_text, "".join(context), estimate_tokens(chunk_text)))
+        previous = group
+    return chunks
+
+
+def is_failed_generation(content: Optional[str]) -> bool:
+    return not content or not content.strip() or content.startswith(FAILED_GENERATION_PREFIXES)
+
+
+class TextPipeline:
+    """Map-reduce запросов к LLM по кускам длинного текста"""
+
+    def __init__(
+            self,
+            generate: Callable[[str], Awaitable[str]],
+            cache: Optional[CacheService] = None,
+            max_chunk_tokens: Optional[int] = None,
+            overlap_tokens: Optional[int] = None,
+            concurrency: Optional[int] = None,
+            cache_ttl: Optional[int] = None
+    ):
+        self.generate = generate
+        self.cache = cache
+        self.max_chunk_tokens = max_chunk_tokens or settings.TEXT_PIPELINE_CHUNK_TOKENS
+        self.overlap_tokens = overlap_tokens if overlap_tokens is not None else settings.TEXT_PIPELINE_OVERLAP_TOKENS
+        self.cache_ttl = cache_ttl or settings.TEXT_PIPELINE_CACHE_TTL
+        self._semaphore = asyncio.Semaphore(concurrency or settings.TEXT_PIPELINE_CONCURRENCY)
+        self.stats = {"chunks": 0, "llm_calls": 0, "cached": 0}
+
+    def is_long(self, text: str) -> bool:
+        """Нужно ли делить текст (не помещается в один кусок)"""
+        return estimate_tokens(text) > self.max_chunk_tokens
+
+    def split(self, text: str) -> List[TextChunk]:
+        chunks = split_text(text, self.max_chunk_tokens, self.overlap_tokens)
+        self.stats["chunks"] += len(chunks)
+        return chunks
+
+    async def run(self, prompt: str) -> str:
+        """Один запрос к LLM с кэшем по хешу промпта"""
+        key = f"text_pipeline:{hashlib.sha256(prompt.encode('utf-8')).hexdigest()}"
+        if self.cache is not None:
+            cached = await self.cache.get_cached_data(key)
+            if cached:
+                self.stats["cached"] += 1
+                return cached
+
+        async with self._semaphore:
+            self.stats["llm_calls"] += 1
+            content = await self.generate(prompt)
+        if is_failed_generation(content):
+            raise GenerationError(f"Chunk generation failed: {(content or '')[:200]}")
+
+        if self.cache is not None:
+            await self.cache.cache_data(key, content, ttl=self.cache_ttl)
+        return content
+
+    async def map(self, chunks: List[TextChunk], build_prompt: Callable[[TextChunk], str]) -> List[str]:
+        return list(await asyncio.gather(*(self.run(build_prompt(chunk)) for chunk in chunks)))
+
+    def _group(self, parts: List[str]) -> List[List[str]]:
+        groups: List[List[str]] = []
+        size = 0
+        for part in parts:
+            tokens = estimate_tokens(part)
+            if not groups or size + tokens > self.max_chunk_tokens:
+                groups.append([])
+                size = 0
+            groups[-1].append(part)
+            size += tokens
+        return groups
+
+    async def reduce(self, parts: List[str], build_prompt: Callable[[str], str]) -> str:
+        """
+        Объединяет частичные результаты
+
+        Если они не помещаются в один запрос, сначала объединяются группами
+        (до MAX_REDUCE_LEVELS уровней).
+        """
+        for _ in range(MAX_REDUCE_LEVELS):
+            groups = self._group(parts)
+            if len(groups) == 1:
+                break
+            parts = await asyncio.gather(*(self.run(build_prompt("\n\n".join(group))) for group in groups))
+        return await self.run(build_prompt("\n\n".join(parts)))
+
+    async def map_reduce(
+            self,
+            text: str,
+            map_prompt: Callable[[TextChunk], str],
+            reduce_prompt: Callable[[str], str]
+    ) -> str:
+        chunks = self.split(text)
+        logger.info(f"Map-reduce over {len(chunks)} chunks ({estimate_tokens(text)} tokens)")
+        return await self.reduce(await self.map(chunks, map_prompt), reduce_prompt)
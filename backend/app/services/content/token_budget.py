@@ -0,0 +1,308 @@
+"""
+Бюджет токенов генерации.
+
+max_tokens для запроса раньше брался только из _get_smart_token_count
+(фиксированные значения по типу контента и ключевым словам промпта, с
+запасом: 17000 для плана урока при фактических ответах в несколько тысяч
+токенов). Завышенный max_tokens резервирует лишнюю квоту токенов в минуту
+у провайдера и отсекает модели с меньшим лимитом ответа.
+
+Теперь размер ответа предсказывается по истории generation_metrics: для
+каждой пары (тип контента, вид запроса) берется перцентиль
+TOKEN_BUDGET_PERCENTILE фактических токенов ответа за
+TOKEN_BUDGET_LOOKBACK_DAYS дней, умноженный на TOKEN_BUDGET_HEADROOM.
+Эвристика остается верхней границей и используется, пока истории мало или
+если заметная доля ответов уперлась в лимит (история обрезанных ответов
+занижает перцентиль). Токены промпта считаются локальным токенизатором
+(utils/tokenizer.py).
+
+Каждая генерация записывается с предсказанием и фактом, prediction_error()
+показывает ошибку предсказания по типам.
+"""
+import asyncio
+import logging
+import math
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ...core.config import settings
+from ...core.constants import ContentType
+from ...core.database import async_session
+from ...models.tracking import GenerationMetrics
+from ...utils.tokenizer import count_tokens
+
+logger = logging.getLogger(__name__)
+
+# Ответ считается обрезанным, если занял эту долю max_tokens
+TRUNCATION_RATIO = 0.95
+# Доля обрезанных ответов, при которой предсказание не используется
+MAX_TRUNCATED_SHARE = 0.05
+# Меньше этого max_tokens не опускается
+MIN_OUTPUT_TOKENS = 512
+
+PROFILES_SQL = """
+    SELECT content_type,
+           request_kind,
+           count(*) AS samples,
+           percentile_cont(:percentile) WITHIN GROUP (ORDER BY tokens_used) AS predicted,
+           avg(CASE WHEN max_tokens > 0 AND tokens_used >= :truncation * max_tokens THEN 1.0 ELSE 0.0 END) AS truncated
+    FROM generation_metrics
+    WHERE success
+      AND request_kind IS NOT NULL
+      AND created_at >= :since
+    GROUP BY content_type, request_kind
+"""
+
+PREDICTION_ERROR_SQL = """
+    SELECT content_type,
+           request_kind,
+           count(*) AS samples,
+           avg(tokens_used) AS avg_actual,
+           avg(predicted_tokens) AS avg_predicted,
+           avg(abs(tokens_used - predicted_tokens)) AS mean_abs_error,
+           avg(abs(tokens_used - predicted_tokens)::float / greatest(tokens_used, 1)) AS mean_pct_error,
+           avg(CASE WHEN tokens_used > predicted_tokens THEN 1.0 ELSE 0.0 END) AS under_predicted,
+           avg(CASE WHEN max_tokens > 0 AND tokens_used >= :truncation * max_tokens THEN 1.0 ELSE 0.0 END) AS truncated,
+           avg(max_tokens) AS avg_max_tokens
+    FROM generation_metrics
+    WHERE success
+      AND predicted_tokens IS NOT NULL
+      AND created_at >= :since
+    GROUP BY content_type, request_kind
+    ORDER BY samples DESC
+"""
+
+
+@dataclass
+class TokenPlan:
+    content_type: ContentType
+    # Вид запроса из _classify_token_request ("основной план", "одно упражнение", ...)
+    request_kind: str
+    prompt_tokens: int
+    max_tokens: int
+    # Перцентиль по истории; None, пока истории мало
+    predicted_tokens: Optional[int]
+
+    @property
+    def total_tokens(self) -> int:
+        """Верхняя оценка токенов запроса для лимита токенов в минуту"""
+        return self.prompt_tokens + self.max_tokens
+
+
+@dataclass
+class _Profile:
+    samples: int
+    predicted: float
+    truncated: float
+
+
+def _content_type(value: Any) -> Optional[ContentType]:
+    # Enum(ContentType) хранит в БД имя члена перечисления
+    if isinstance(value, ContentType):
+        return value
+    try:
+        return ContentType[value]
+    except KeyError:
+        try:
+            return ContentType(value)
+        except ValueError:
+            return None
+
+
+class TokenBudget:
+    """Предсказание размера ответа по истории и запись фактических токенов"""
+
+    def __init__(
+            self,
+            session_factory: Optional[Callable[[], AsyncSession]] = async_session,
+            percentile: Optional[float] = None,
+            headroom: Optional[float] = None,
+            lookback_days: Optional[int] = None,
+            min_samples: Optional[int] = None,
+            refresh_seconds: Optional[float] = None,
+            clock: Callable[[], float] = time.monotonic
+    ):
+        self.session_factory = session_factory
+        self.percentile = percentile or settings.TOKEN_BUDGET_PERCENTILE
+        self.headroom = headroom or settings.TOKEN_BUDGET_HEADROOM
+        self.lookback_days = lookback_days or settings.TOKEN_BUDGET_LOOKBACK_DAYS
+        self.min_samples = min_samples or settings.TOKEN_BUDGET_MIN_SAMPLES
+        self.refresh_seconds = refresh_seconds if refresh_seconds is not None else settings.TOKEN_BUDGET_REFRESH_SECONDS
+        self._clock = clock
+        self._profiles: Dict[Tuple[ContentType, str], _Profile] = {}
+        self._refreshed_at: Optional[float] = None
+        self._refresh_lock = asyncio.Lock()
+        self._tasks = set()
+
+    # ---------- Профили ----------
+
+    async def refresh(self) -> None:
+        """Перечитывает перцентили из generation_metrics"""
+        if self.session_factory is None:
+            return
+        since = datetime.now(timezone.utc) - timedelta(days=self.lookback_days)
+        try:
+            async with self.session_factory() as session:
+                result = await session.execute(text(PROFILES_SQL), {
+                    "percentile": self.percentile,
+                    "truncation": TRUNCATION_RATIO,
+                    "since": since
+                })
+                rows = result.mappings().all()
+        except Exception as e:
+            # Прежние профили остаются; повтор - через refresh_seconds
+            logger.error(f"Error loading token profiles: {str(e)}")
+            return
+
+        profiles = {}
+        for row in rows:
+            content_type = _content_type(row["content_type"])
+            if content_type is None or row["predicted"] is None:
+                continue
+            profiles[(content_type, row["request_kind"])] = _Profile(
+                samples=int(row["samples"]),
+                predicted=float(row["predicted"]),
+                truncated=float(row["truncated"] or 0)
+            )
+        self._profiles = profiles
+        logger.info(f"Loaded {len(profiles)} token profiles")
+
+    async def _ensure_fresh(self) -> None:
+        now = self._clock()
+        if self._refreshed_at is not None and now - self._refreshed_at < self.refresh_seconds:
+            return
+        async with self._refresh_lock:
+            if self._refreshed_at is not None and self._clock() - self._refreshed_at < self.refresh_seconds:
+                return
+            await self.refresh()
+            self._refreshed_at = self._clock()
+
+    def predict(self, content_type: ContentType, request_kind: str) -> Optional[int]:
+        """Перцентиль токенов ответа или None, если истории мало или ответы обрезаются"""
+        profile = self._profiles.get((content_type, request_kind))
+        if profile is None or profile.samples < self.min_samples or profile.truncated > MAX_TRUNCATED_SHARE:
+            return None
+        return math.ceil(profile.predicted)
+
+    async def plan(
+            self,
+            content_type: ContentType,
+            prompt: str,
+            request_kind: str,
+            ceiling: int,
+            model: Optional[str] = None
+    ) -> TokenPlan:
+        """
+        Бюджет запроса
+
+        ceiling - max_tokens эвристики (_get_smart_token_count): верхняя граница
+        и значение по умолчанию без истории.
+        """
+        await self._ensure_fresh()
+        predicted = self.predict(content_type, request_kind)
+        max_tokens = ceiling
+        if predicted is not None and ceiling > 0:
+            max_tokens = min(ceiling, max(MIN_OUTPUT_TOKENS, math.ceil(predicted * self.headroom)))
+        return TokenPlan(
+            content_type=content_type,
+            request_kind=request_kind,
+            prompt_tokens=count_tokens(prompt, model),
+            max_tokens=max_tokens,
+            predicted_tokens=predicted
+        )
+
+    # ---------- Метрики ----------
+
+    async def record(
+            self,
+            user_id: int,
+            plan: TokenPlan,
+            prompt: str,
+            content: Optional[str],
+            generation_time: float,
+            success: bool = True,
+            error_type: Optional[str] = None,
+            model: Optional[str] = None
+    ) -> None:
+        """Записывает фактические токены ответа рядом с предсказанием"""
+        if self.session_factory is None or not user_id:
+            return
+        completion_tokens = count_tokens(content, model) if success else 0
+        try:
+            async with self.session_factory() as session:
+                session.add(GenerationMetrics(
+                    user_id=user_id,
+                    content_type=plan.content_type,
+                    prompt=prompt[:500],
+                    tokens_used=completion_tokens,
+                    prompt_tokens=plan.prompt_tokens,
+                    predicted_tokens=plan.predicted_tokens,
+                    max_tokens=plan.max_tokens,
+                    request_kind=plan.request_kind,
+                    generation_time=generation_time,
+                    success=success,
+                    error_type=error_type
+                ))
+                await session.commit()
+        except Exception as e:
+            logger.error(f"Error recording generation tokens: {str(e)}")
+            return
+
+        if success and plan.max_tokens and completion_tokens >= TRUNCATION_RATIO * plan.max_tokens:
+            logger.warning(
+                f"Response hit max_tokens: {completion_tokens}/{plan.max_tokens} tokens "
+                f"({plan.content_type.value}, {plan.request_kind})"
+            )
+
+    def record_later(self, *args, **kwargs) -> asyncio.Task:
+        """record() в фоне, чтобы запись метрик не задерживала ответ"""
+        task = asyncio.create_task(self.record(*args, **kwargs))
+        # Ссылка на задачу хранится до завершения, иначе ее может собрать GC
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    async def prediction_error(self, days: int = 7) -> List[Dict[str, Any]]:
+        """Ошибка предсказания токенов ответа по (тип контента, вид запроса) за days дней"""
+        if self.session_factory is None:
+            return []
+        since = datetime.now(timezone.utc) - timedelta(days=days)
+        async with self.session_factory() as session:
+            result = await session.execute(text(PREDICTION_ERROR_SQL), {
+                "truncation": TRUNCATION_RATIO,
+                "since": since
+            })
+            rows = result.mappings().all()
+
+        report = []
+        for row in rows:
+            content_type = _content_type(row["content_type"])
+            report.append({
+                "content_type": content_type.value if content_type else str(row["content_type"]),
+                "request_kind": row["request_kind"],
+                "samples": int(row["samples"]),
+                "avg_actual_tokens": round(float(row["avg_actual"] or 0), 1),
+                "avg_predicted_tokens": round(float(row["avg_predicted"] or 0), 1),
+                "avg_max_tokens": round(float(row["avg_max_tokens"] or 0), 1),
+                "mean_abs_error": round(float(row["mean_abs_error"] or 0), 1),
+                "mean_pct_error": round(float(row["mean_pct_error"] or 0) * 100, 1),
+                "under_predicted_share": round(float(row["under_predicted"] or 0), 3),
+                "truncated_share": round(float(row["truncated"] or 0), 3)
+            })
+        return report
+
+
+_budget: Optional[TokenBudget] = None
+
+
+def get_token_budget() -> TokenBudget:
+    """Общий на процесс бюджет токенов"""
+    global _budget
+    if _budget is None:
+        _budget = TokenBudget()
+    return _budget
@@ -0,0 +1,323 @@
+"""
+Получение транскриптов видео YouTube.
+
+youtube_transcript_api синхронный, поэтому загрузка выполняется в
+ограниченном пуле потоков (TRANSCRIPT_FETCH_WORKERS), а не в цикле событий.
+Одновременные запросы одного (video_id, язык) ждут одну загрузку, а ошибки
+(нет субтитров, видео удалено) запоминаются на TRANSCRIPT_FAILURE_TTL_SECONDS,
+чтобы сломанное видео не запрашивалось при каждом обращении.
+
+Транскрипт хранится в video_transcripts.transcript_gz: сегменты построчно
+("начало\\tтекст"), сжатые zlib. iter_chunks распаковывает запись потоково и
+отдает куски не длиннее заданного числа символов по границам сегментов,
+поэтому для длинного видео не нужно собирать весь текст в одну строку.
+"""
+import asyncio
+import logging
+import re
+import time
+import zlib
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import AsyncIterator, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from sqlalchemy import delete, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ...core.config import settings
+from ...core.database import async_session
+from ...core.exceptions import ValidationError
+from ...models import VideoTranscript
+
+logger = logging.getLogger(__name__)
+
+# Размер порции при потоковой распаковке
+READ_SIZE = 64 * 1024
+# Порог, после которого из кэша ошибок удаляются истекшие записи
+MAX_REMEMBERED_FAILURES = 1000
+
+VIDEO_ID = re.compile(r'^[a-zA-Z0-9_-]{11}$')
+VIDEO_URL_PATTERNS = [
+    re.compile(r'(?:youtube\.com/watch\?v=|youtu\.be/|youtube\.com/embed/)([a-zA-Z0-9_-]{11})'),
+    re.compile(r'youtube\.com/watch\?.*v=([a-zA-Z0-9_-]{11})'),
+    re.compile(r'youtube\.com/v/([a-zA-Z0-9_-]{11})'),
+    re.compile(r'youtube\.com/watch/([a-zA-Z0-9_-]{11})'),
+    re.compile(r'youtube\.com/shorts/([a-zA-Z0-9_-]{11})'),
+]
+
+
+def extract_video_id(video_id_or_url: str) -> Optional[str]:
+    """ID видео YouTube из ссылки или сам ID; None, если формат не распознан"""
+    if not video_id_or_url:
+        return None
+    if VIDEO_ID.match(video_id_or_url):
+        return video_id_or_url
+    for pattern in VIDEO_URL_PATTERNS:
+        match = pattern.search(video_id_or_url)
+        if match:
+            return match.group(1)
+    return None
+
+
+class TranscriptUnavailableError(ValidationError):
+    """Транскрипт не удалось получить (в том числе по запомненной ошибке)"""
+
+
+class TranscriptSource(ABC):
+    """Синхронный источник транскриптов: список {"text", "start", ...}"""
+
+    @abstractmethod
+    def fetch(self, video_id: str, language: str) -> List[dict]:
+        pass
+
+
+class YouTubeTranscriptSource(TranscriptSource):
+
+    def fetch(self, video_id: str, language: str) -> List[dict]:
+        from youtube_transcript_api import YouTubeTranscriptApi
+        return YouTubeTranscriptApi.get_transcript(video_id, languages=[language])
+
+
+@dataclass
+class TranscriptChunk:
+    index: int
+    start: float  # Начало первого сегмента, сек
+    end: float  # Начало последнего сегмента, сек
+    text: str
+
+
+def encode_segments(entries: Iterable[dict]) -> bytes:
+    """Сжимает сегменты транскрипта в формат transcript_gz"""
+    compressor = zlib.compressobj(6)
+    parts = []
+    for entry in entries:
+        text = " ".join(str(entry.get("text", "")).split())
+        if text:
+            line = f"{float(entry.get('start', 0.0)):.2f}\t{text}\n"
+            parts.append(compressor.compress(line.encode("utf-8")))
+    parts.append(compressor.flush())
+    return b"".join(parts)
+
+
+def iter_segments(blob: bytes) -> Iterator[Tuple[float, str]]:
+    """Потоково распаковывает transcript_gz в пары (начало, текст)"""
+    decompressor = zlib.decompressobj()
+    tail = b""
+    for offset in range(0, len(blob), READ_SIZE):
+        data = tail + decompressor.decompress(blob[offset:offset + READ_SIZE])
+        *lines, tail = data.split(b"\n")
+        for line in lines:
+            start, _, text = line.decode("utf-8").partition("\t")
+            yield float(start), text
+    tail += decompressor.flush()
+    if tail:
+        start, _, text = tail.decode("utf-8").partition("\t")
+        yield float(start), text
+
+
+def chunk_segments(segments: Iterable[Tuple[float, str]], max_chars: int) -> Iterator[TranscriptChunk]:
+    """Группирует сегменты в куски не длиннее max_chars (сегмент длиннее лимита режется)"""
+    index = 0
+    parts: List[str] = []
+    size = 0
+    start = end = 0.0
+    for segment_start, text in segments:
+        while len(text) > max_chars:
+            if parts:
+                yield TranscriptChunk(index, start, end, " ".join(parts))
+                index, parts, size = index + 1, [], 0
+            yield TranscriptChunk(index, segment_start, segment_start, text[:max_chars])
+            index += 1
+            text = text[max_chars:]
+        if not text:
+            continue
+        if parts and size + 1 + len(text) > max_chars:
+            yield TranscriptChunk(index, start, end, " ".join(parts))
+            index, parts, size = index + 1, [], 0
+        if not parts:
+            start = segment_start
+            size = len(text)
+        else:
+            size += 1 + len(text)
+        parts.append(text)
+        end = segment_start
+    if parts:
+        yield TranscriptChunk(index, start, end, " ".join(parts))
+
+
+class TranscriptService:
+    """Загрузка транскриптов в пуле потоков с общими загрузками и кэшем ошибок"""
+
+    def __init__(
+            self,
+            session_factory: Optional[Callable[[], AsyncSession]] = async_session,
+            source: Optional[TranscriptSource] = None,
+            workers: Optional[int] = None,
+            ttl_hours: Optional[int] = None,
+            failure_ttl: Optional[float] = None,
+            fetch_timeout: Optional[float] = None,
+            clock: Callable[[], float] = time.monotonic
+    ):
+        self.session_factory = session_factory
+        self.source = source or YouTubeTranscriptSource()
+        self.ttl = timedelta(hours=ttl_hours or settings.TRANSCRIPT_CACHE_HOURS)
+        self.failure_ttl = failure_ttl if failure_ttl is not None else settings.TRANSCRIPT_FAILURE_TTL_SECONDS
+        self.fetch_timeout = fetch_timeout or settings.TRANSCRIPT_FETCH_TIMEOUT
+        self._clock = clock
+        self._executor = ThreadPoolExecutor(
+            max_workers=workers or settings.TRANSCRIPT_FETCH_WORKERS,
+            thread_name_prefix="transcript-fetch"
+        )
+        # Загрузки в процессе: (video_id, язык) -> задача
+        self._inflight: Dict[Tuple[str, str], asyncio.Task] = {}
+        # Запомненные ошибки: (video_id, язык) -> (сообщение, срок)
+        self._failures: Dict[Tuple[str, str], Tuple[str, float]] = {}
+        self.stats = {"stored_hits": 0, "fetches": 0, "shared": 0, "failures": 0, "failure_hits": 0}
+
+    # ---------- Получение ----------
+
+    async def get_blob(self, video_id: str, language: str) -> bytes:
+        """Сжатый транскрипт: из video_transcripts или загрузкой из источника"""
+        parsed_id = extract_video_id(video_id)
+        if not parsed_id:
+            raise ValidationError("Invalid YouTube video ID format")
+        key = (parsed_id, language)
+
+        failure = self._failures.get(key)
+        if failure is not None:
+            message, expires_at = failure
+            if expires_at > self._clock():
+                self.stats["failure_hits"] += 1
+                raise TranscriptUnavailableError(message)
+            del self._failures[key]
+
+        task = self._inflight.get(key)
+        if task is not None:
+            self.stats["shared"] += 1
+        else:
+            # Загрузка идет отдельной задачей: отмена одного запроса не прерывает ее для остальных
+            task = asyncio.create_task(self._load_or_fetch(key))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        return await asyncio.shield(task)
+
+    async def get_transcript(self, video_id: str, language: str) -> str:
+        """Полный текст транскрипта"""
+        blob = await self.get_blob(video_id, language)
+        return " ".join(text for _, text in iter_segments(blob))
+
+    async def iter_chunks(
+            self,
+            video_id: str,
+            language: str,
+            max_chars: Optional[int] = None
+    ) -> AsyncIterator[TranscriptChunk]:
+        """Куски транскрипта не длиннее max_chars по границам сегментов"""
+        blob = await self.get_blob(video_id, language)
+        for chunk in chunk_segments(iter_segments(blob), max_chars or settings.TRANSCRIPT_PROMPT_CHARS):
+            yield chunk
+
+    async def _load_or_fetch(self, key: Tuple[str, str]) -> bytes:
+        blob = await self._load(key)
+        if blob is not None:
+            self.stats["stored_hits"] += 1
+            return blob
+
+        video_id, language = key
+        self.stats["fetches"] += 1
+        logger.info(f"Fetching transcript for video {video_id} in {language}")
+        loop = asyncio.get_running_loop()
+        try:
+            entries = await asyncio.wait_for(
+                loop.run_in_executor(self._executor, self.source.fetch, video_id, language),
+                timeout=self.fetch_timeout
+            )
+            if not entries:
+                raise ValueError("Transcript is empty")
+        except Exception as e:
+            message = f"Could not fetch transcript for video {video_id}: {str(e) or type(e).__name__}"
+            logger.error(message)
+            self.stats["failures"] += 1
+            self._remember_failure(key, message)
+            raise TranscriptUnavailableError(message)
+
+        blob = encode_segments(entries)
+        await self._store(key, blob)
+        return blob
+
+    def _remember_failure(self, key: Tuple[str, str], message: str) -> None:
+        now = self._clock()
+        if len(self._failures) >= MAX_REMEMBERED_FAILURES:
+            self._failures = {k: v for k, v in self._failures.items() if v[1] > now}
+        self._failures[key] = (message, now + self.failure_ttl)
+
+    # ---------- Хранение ----------
+
+    async def _load(self, key: Tuple[str, str]) -> Optional[bytes]:
+        if self.session_factory is None:
+            return None
+        video_id, language = key
+        try:
+            async with self.session_factory() as session:
+                result = await session.execute(
+                    select(VideoTranscript.transcript_gz, VideoTranscript.transcript)
+                    .where(
+                        VideoTranscript.video_id == video_id,
+                        VideoTranscript.language == language,
+                        VideoTranscript.expires_at > datetime.now(timezone.utc)
+                    )
+                    .order_by(VideoTranscript.created_at.desc())
+                    .limit(1)
+                )
+                row = result.first()
+        except Exception as e:
+            logger.error(f"Error reading stored transcript: {str(e)}")
+            return None
+        if row is None:
+            return None
+        blob, legacy_text = row
+        if blob is not None:
+            return blob
+        # Записи до сжатия: весь текст одним сегментом
+        return encode_segments([{"text": legacy_text, "start": 0.0}]) if legacy_text else None
+
+    async def _store(self, key: Tuple[str, str], blob: bytes) -> None:
+        if self.session_factory is None:
+            return
+        video_id, language = key
+        now = datetime.now(timezone.utc)
+        try:
+            async with self.session_factory() as session:
+                await session.execute(
+                    delete(VideoTranscript).where(
+                        VideoTranscript.video_id == video_id,
+                        VideoTranscript.language == language
+                    )
+                )
+                session.add(VideoTranscript(
+                    video_id=video_id,
+                    language=language,
+                    transcript="",
+                    transcript_gz=blob,
+                    created_at=now,
+                    expires_at=now + self.ttl
+                ))
+                await session.commit()
+        except Exception as e:
+            logger.error(f"Error saving transcript: {str(e)}")
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+_service: Optional[TranscriptService] = None
+
+
+def get_transcript_service() -> TranscriptService:
+    """Общий на процесс сервис транскриптов"""
+    global _service
+    if _service is None:
+        _service = TranscriptService()
+    return _service
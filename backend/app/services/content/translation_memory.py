@@ -0,0 +1,254 @@
+"""
+Память переводов промптов изображений.
+
+Переводы хранятся по ключу нормализованного промпта (NFKC, регистр, пробелы,
+завершающая пунктуация) в двух уровнях:
+  - локальный LRU процесса с TTL (TRANSLATION_MEMORY_LOCAL_ENTRIES);
+  - таблица prompt_translations, общая для всех воркеров и переживающая
+    перезапуск. Чтение продлевает last_used_at, а prune удаляет записи старше
+    TTL и самые давно использованные сверх TRANSLATION_MEMORY_MAX_ENTRIES.
+
+Здесь же быстрый локальный детектор (нужен ли перевод вообще) и
+token bucket для ограничения частоты запросов к LLM.
+"""
+import asyncio
+import hashlib
+import logging
+import re
+import time
+import unicodedata
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, Iterable, Optional, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ...core.config import settings
+from ...models import PromptTranslation
+
+logger = logging.getLogger(__name__)
+
+_WHITESPACE = re.compile(r"\s+")
+_TRAILING_PUNCTUATION = ".!?;,:… "
+
+
+def normalize_prompt(prompt: str) -> str:
+    """Нормализованная форма промпта для ключа памяти переводов"""
+    normalized = unicodedata.normalize("NFKC", prompt).casefold()
+    normalized = _WHITESPACE.sub(" ", normalized).strip()
+    return normalized.rstrip(_TRAILING_PUNCTUATION)
+
+
+def prompt_key(prompt: str) -> str:
+    return hashlib.sha256(normalize_prompt(prompt).encode("utf-8")).hexdigest()
+
+
+def _is_latin(char: str) -> bool:
+    code = ord(char)
+    # Basic Latin, Latin-1, Latin Extended-A/B и Latin Extended Additional
+    return code < 0x250 or 0x1E00 <= code <= 0x1EFF
+
+
+def non_latin_ratio(value: str) -> float:
+    """Доля букв не латинского алфавита среди всех букв текста"""
+    letters = 0
+    foreign = 0
+    for char in value:
+        if char.isalpha():
+            letters += 1
+            if not _is_latin(char):
+                foreign += 1
+    return foreign / letters if letters else 0.0
+
+
+def needs_translation(prompt: str) -> bool:
+    """
+    Нужен ли перевод на английский
+
+    Текст только из латиницы, цифр и знаков не переводится; любая буква
+    другого алфавита (кириллица, греческий, CJK...) требует перевода.
+    """
+    if prompt.isascii():
+        return False
+    return any(char.isalpha() and not _is_latin(char) for char in prompt)
+
+
+class TokenBucket:
+    """
+    Ограничитель частоты: rate запросов в секунду с запасом capacity
+
+    В отличие от фиксированной паузы между запросами, простаивавший
+    ограничитель пропускает пачку запросов сразу, а очередь ожидающих
+    обслуживается по порядку.
+    """
+
+    def __init__(self, rate: float, capacity: float, clock: Callable[[], float] = time.monotonic):
+        self.rate = rate
+        self.capacity = capacity
+        self._clock = clock
+        self._tokens = capacity
+        self._updated = clock()
+        self._lock = asyncio.Lock()
+
+    def _refill(self) -> None:
+        now = self._clock()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self, tokens: float = 1.0) -> float:
+        """Ждет и забирает токены; возвращает время ожидания в секундах"""
+        waited = 0.0
+        async with self._lock:
+            while True:
+                self._refill()
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return waited
+                delay = (tokens - self._tokens) / self.rate
+                waited += delay
+                await asyncio.sleep(delay)
+
+
+class TranslationMemory:
+    """Локальный LRU и таблица prompt_translations"""
+
+    def __init__(
+            self,
+            session_factory: Optional[Callable[[], AsyncSession]] = None,
+            local_entries: Optional[int] = None,
+            max_entries: Optional[int] = None,
+            ttl_hours: Optional[int] = None
+    ):
+        self.session_factory = session_factory
+        self.local_entries = local_entries or settings.TRANSLATION_MEMORY_LOCAL_ENTRIES
+        self.max_entries = max_entries or settings.TRANSLATION_MEMORY_MAX_ENTRIES
+        self.ttl = timedelta(hours=ttl_hours or settings.TRANSLATION_MEMORY_TTL_HOURS)
+        self._local: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+        self._last_prune = 0.0
+        self.stats = {"local_hits": 0, "persistent_hits": 0, "misses": 0}
+
+    # ---------- Локальный уровень ----------
+
+    def get_local(self, key: str) -> Optional[str]:
+        entry = self._local.get(key)
+        if entry is None:
+            return None
+        translation, expires_at = entry
+        if expires_at < time.monotonic():
+            del self._local[key]
+            return None
+        self._local.move_to_end(key)
+        self.stats["local_hits"] += 1
+        return translation
+
+    def put_local(self, key: str, translation: str) -> None:
+        self._local[key] = (translation, time.monotonic() + self.ttl.total_seconds())
+        self._local.move_to_end(key)
+        while len(self._local) > self.local_entries:
+            self._local.popitem(last=False)
+
+    def clear_local(self) -> None:
+        self._local.clear()
+
+    def local_size(self) -> int:
+        return len(self._local)
+
+    # ---------- Таблица ----------
+
+    async def get_many(self, keys: Iterable[str]) -> Dict[str, str]:
+        """Переводы из локального LRU, затем из таблицы одним запросом"""
+        found: Dict[str, str] = {}
+        missing = []
+        for key in dict.fromkeys(keys):
+            translation = self.get_local(key)
+            if translation is None:
+                missing.append(key)
+            else:
+                found[key] = translation
+
+        if missing and self.session_factory is not None:
+            try:
+                async with self.session_factory() as session:
+                    # Чтение и продление срока одной командой
+                    result = await session.execute(
+                        text("""
+                            UPDATE prompt_translations
+                            SET last_used_at = now(), hits = hits + 1
+                            WHERE key = ANY(CAST(:keys AS varchar[])) AND last_used_at >= :cutoff
+                            RETURNING key, translation
+                        """),
+                        {"keys": missing, "cutoff": datetime.now(timezone.utc) - self.ttl}
+                    )
+                    rows = result.fetchall()
+                    await session.commit()
+                for key, translation in rows:
+                    found[key] = translation
+                    self.put_local(key, translation)
+                self.stats["persistent_hits"] += len(rows)
+            except Exception as e:
+                logger.error(f"Error reading translation memory: {str(e)}")
+
+        self.stats["misses"] += len([key for key in missing if key not in found])
+        return found
+
+    async def put_many(self, items: Dict[str, Tuple[str, str]]) -> None:
+        """
+        Сохраняет переводы
+
+        Args:
+            items: {ключ: (исходный промпт, перевод)}
+        """
+        for key, (_, translation) in items.items():
+            self.put_local(key, translation)
+        if not items or self.session_factory is None:
+            return
+
+        now = datetime.now(timezone.utc)
+        try:
+            async with self.session_factory() as session:
+                stmt = pg_insert(PromptTranslation).values([
+                    {"key": key, "source_text": source, "translation": translation,
+                     "hits": 0, "created_at": now, "last_used_at": now}
+                    for key, (source, translation) in items.items()
+                ])
+                stmt = stmt.on_conflict_do_update(
+                    index_elements=["key"],
+                    set_={"translation": stmt.excluded.translation, "last_used_at": stmt.excluded.last_used_at}
+                )
+                await session.execute(stmt)
+                await session.commit()
+        except Exception as e:
+            logger.error(f"Error saving translation memory: {str(e)}")
+            return
+
+        if time.monotonic() - self._last_prune > settings.TRANSLATION_MEMORY_PRUNE_SECONDS:
+            await self.prune()
+
+    async def prune(self) -> int:
+        """Удаляет устаревшие записи и самые давно использованные сверх max_entries"""
+        self._last_prune = time.monotonic()
+        if self.session_factory is None:
+            return 0
+        try:
+            async with self.session_factory() as session:
+                result = await session.execute(
+                    text("""
+                        DELETE FROM prompt_translations
+                        WHERE last_used_at < :cutoff
+                           OR key IN (
+                               SELECT key FROM prompt_translations
+                               ORDER BY last_used_at DESC
+                               OFFSET :max_entries
+                           )
+                    """),
+                    {"cutoff": datetime.now(timezone.utc) - self.ttl, "max_entries": self.max_entries}
+                )
+                await session.commit()
+                if result.rowcount:
+                    logger.info(f"Pruned {result.rowcount} prompt translations")
+                return result.rowcount or 0
+        except Exception as e:
+            logger.error(f"Error pruning translation memory: {str(e)}")
+            return 0
@@ -1,5 +1,6 @@
 # app/services/generator/__init__.py
 from .manager import CourseManager
+from .export_renderer import CourseExportRenderer, get_course_export_renderer
 from typing import Dict, Any
 
 # Common constants
@@ -31,6 +32,8 @@ def validate_course_structure(course_data: Dict[str, Any]) -> bool:
 
 __all__ = [
     'CourseManager',
+    'CourseExportRenderer',  # Рендеринг экспорта в пуле процессов
+    'get_course_export_renderer',
     'DEFAULT_RETENTION_DAYS',
     'MAX_COURSE_SIZE',
     'MIN_LESSON_DURATION',
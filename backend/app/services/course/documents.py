@@ -0,0 +1,302 @@
+"""
+Рендеринг курса в PDF и DOCX.
+
+Функции модуля выполняются в процессах пула рендеринга (см. export_renderer.py).
+init_worker вызывается один раз на процесс: импортирует reportlab и
+python-docx, регистрирует шрифты DejaVuSans и собирает стили абзацев.
+render_course получает курс простыми словарями (без ORM-объектов, чтобы их
+можно было передать в другой процесс) и добавляет содержимое урок за уроком.
+
+Модуль не обращается к БД и настройкам приложения.
+"""
+import io
+import logging
+import os
+from typing import Any, Dict, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+FONTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'static', 'fonts')
+
+# Версия разметки документов: входит в ключ кэша готовых файлов,
+# поэтому изменение оформления не отдает старые файлы из кэша
+LAYOUT_VERSION = 1
+
+FORMATS = ("pdf", "docx")
+
+
+class ExportUnavailableError(RuntimeError):
+    """Библиотека для формата экспорта не установлена"""
+
+    def __init__(self, format: str):
+        self.format = format
+        super().__init__(f"Export to {format} is unavailable")
+
+
+# Состояние процесса рендеринга: инструменты PDF и признак наличия python-docx
+_worker: Dict[str, Any] = {}
+
+
+def _init_pdf(fonts_dir: str) -> Optional[Dict[str, Any]]:
+    """Регистрирует шрифты и собирает стили PDF"""
+    try:
+        from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, PageBreak
+        from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+        from reportlab.lib.enums import TA_LEFT, TA_CENTER
+        from reportlab.lib.units import inch
+        from reportlab.lib import colors
+        from reportlab.pdfbase import pdfmetrics
+        from reportlab.pdfbase.pdfmetrics import registerFontFamily
+        from reportlab.pdfbase.ttfonts import TTFont
+    except ImportError:
+        logger.error("Библиотека reportlab не установлена. Экспорт в PDF недоступен.")
+        return None
+
+    # Используем DejaVuSans, который поддерживает кириллицу
+    fonts_registered = False
+    for font_name, file_name in (('DejaVuSans', 'DejaVuSans.ttf'), ('DejaVuSans-Bold', 'DejaVuSans-Bold.ttf')):
+        path = os.path.join(fonts_dir, file_name)
+        if os.path.exists(path):
+            pdfmetrics.registerFont(TTFont(font_name, path))
+            fonts_registered = True
+    if fonts_registered:
+        registerFontFamily('DejaVuSans', normal='DejaVuSans', bold='DejaVuSans-Bold')
+    else:
+        logger.warning(f"Шрифты DejaVuSans не найдены в {fonts_dir}, используем стандартные шрифты")
+
+    styles = getSampleStyleSheet()
+    if fonts_registered:
+        for name, font, size, leading, alignment, space_after in (
+                ('CustomTitle', 'DejaVuSans-Bold', 18, 22, TA_CENTER, 12),
+                ('CustomHeading1', 'DejaVuSans-Bold', 16, 20, TA_LEFT, 10),
+                ('CustomHeading2', 'DejaVuSans-Bold', 14, 18, TA_LEFT, 8),
+                ('CustomHeading3', 'DejaVuSans-Bold', 12, 16, TA_LEFT, 6),
+                ('CustomNormal', 'DejaVuSans', 10, 14, TA_LEFT, 6),
+        ):
+            styles.add(ParagraphStyle(
+                name=name,
+                fontName=font,
+                fontSize=size,
+                leading=leading,
+                alignment=alignment,
+                spaceAfter=space_after,
+                textColor=colors.black
+            ))
+
+        # Применяем шрифты к стандартным стилям
+        registered = pdfmetrics.getRegisteredFontNames()
+        for style_name in styles.byName:
+            style = styles[style_name]
+            if not hasattr(style, 'fontName'):
+                continue
+            if style_name in ['h1', 'h2', 'h3', 'h4', 'Heading1', 'Heading2', 'Heading3', 'Heading4', 'Title']:
+                if 'DejaVuSans-Bold' in registered:
+                    style.fontName = 'DejaVuSans-Bold'
+            elif 'DejaVuSans' in registered:
+                style.fontName = 'DejaVuSans'
+
+    def pick(custom: str, fallback: str):
+        return styles[custom] if fonts_registered else styles[fallback]
+
+    return {
+        "SimpleDocTemplate": SimpleDocTemplate,
+        "Paragraph": Paragraph,
+        "Spacer": Spacer,
+        "PageBreak": PageBreak,
+        "inch": inch,
+        "page_font": 'DejaVuSans' if fonts_registered else 'Helvetica',
+        "styles": {
+            "title": pick('CustomTitle', 'h1'),
+            "lesson": pick('CustomHeading1', 'h2'),
+            "section": pick('CustomHeading3', 'h3'),
+            "activity": pick('CustomHeading3', 'h4'),
+            "normal": pick('CustomNormal', 'Normal'),
+            "duration": pick('CustomNormal', 'Italic'),
+        },
+    }
+
+
+def _init_docx() -> bool:
+    try:
+        import docx  # noqa: F401
+    except ImportError:
+        logger.error("Библиотека python-docx не установлена. Экспорт в DOCX недоступен.")
+        return False
+    return True
+
+
+def init_worker(fonts_dir: str = FONTS_DIR) -> None:
+    """Инициализатор процесса рендеринга: шрифты и стили загружаются один раз"""
+    _worker["pdf"] = _init_pdf(fonts_dir)
+    _worker["docx"] = _init_docx()
+
+
+# ---------- PDF ----------
+
+def _pdf_lesson(pdf: Dict[str, Any], index: int, lesson: Dict[str, Any]) -> Iterable:
+    Paragraph, Spacer, inch, styles = pdf["Paragraph"], pdf["Spacer"], pdf["inch"], pdf["styles"]
+
+    yield Paragraph(f"Урок {index + 1}: {lesson['title']}", styles["lesson"])
+    yield Spacer(1, 0.1 * inch)
+    yield Paragraph(f"Продолжительность: {lesson['duration']} минут", styles["duration"])
+    yield Spacer(1, 0.1 * inch)
+
+    for title, items in (("Цели:", lesson["objectives"]),
+                         ("Грамматика:", lesson["grammar"]),
+                         ("Лексика:", lesson["vocabulary"])):
+        yield Paragraph(title, styles["section"])
+        for item in items:
+            yield Paragraph(f"- {item}", styles["normal"])
+        yield Spacer(1, 0.1 * inch)
+
+    yield Paragraph("Активности:", styles["section"])
+    for activity in lesson["activities"]:
+        yield Paragraph(f"- {activity['name']} ({activity['type']}, {activity['duration']} мин)", styles["activity"])
+        if activity["description"]:
+            yield Paragraph(activity["description"], styles["normal"])
+        yield Spacer(1, 0.05 * inch)
+    yield Spacer(1, 0.1 * inch)
+
+    homework = lesson["homework"]
+    if homework:
+        yield Paragraph("Домашнее задание:", styles["section"])
+        if isinstance(homework, dict):
+            if homework.get('description'):
+                yield Paragraph(homework['description'], styles["normal"])
+            for task in homework.get('tasks') or []:
+                yield Paragraph(f"- {task}", styles["normal"])
+        else:
+            yield Paragraph(str(homework), styles["normal"])
+        yield Spacer(1, 0.1 * inch)
+
+
+def render_pdf(course: Dict[str, Any], lessons: List[Dict[str, Any]]) -> bytes:
+    pdf = _worker.get("pdf")
+    if pdf is None:
+        raise ExportUnavailableError("pdf")
+    Paragraph, Spacer, PageBreak, inch, styles = (
+        pdf["Paragraph"], pdf["Spacer"], pdf["PageBreak"], pdf["inch"], pdf["styles"]
+    )
+
+    buffer = io.BytesIO()
+    doc = pdf["SimpleDocTemplate"](
+        buffer,
+        pagesize=(8.5 * inch, 11 * inch),
+        leftMargin=0.75 * inch,
+        rightMargin=0.75 * inch,
+        topMargin=1 * inch,
+        bottomMargin=1 * inch,
+        encoding='utf-8',
+        title=course["name"],
+        author='Course Generator',
+        subject=f'Course: {course["name"]}'
+    )
+
+    # Титульная страница
+    story = [
+        Paragraph(course["name"], styles["title"]),
+        Spacer(1, 0.2 * inch),
+        Paragraph(f"Язык: {course['language']}, Уровень: {course['level']}", styles["section"]),
+        Paragraph(f"Аудитория: {course['target_audience']}, Формат: {course['format']}", styles["section"]),
+    ]
+    if course["description"]:
+        story.append(Spacer(1, 0.1 * inch))
+        story.append(Paragraph(f"Описание: {course['description']}", styles["normal"]))
+    story.append(PageBreak())
+
+    # Уроки
+    for i, lesson in enumerate(lessons):
+        story.extend(_pdf_lesson(pdf, i, lesson))
+        if i < len(lessons) - 1:
+            story.append(PageBreak())
+
+    def first_page(canvas, doc):
+        canvas.saveState()
+        canvas.setTitle(course["name"])
+        canvas.setAuthor('Course Generator')
+        canvas.setSubject(f'Course: {course["name"]}')
+        canvas.setCreator('ReportLab PDF Library')
+        canvas.setPageCompression(1)
+        canvas.restoreState()
+
+    def later_pages(canvas, doc):
+        canvas.saveState()
+        canvas.setFont(pdf["page_font"], 9)
+        canvas.drawString(inch, 0.75 * inch, f"Страница {doc.page}")
+        canvas.restoreState()
+
+    doc.build(story, onFirstPage=first_page, onLaterPages=later_pages)
+    return buffer.getvalue()
+
+
+# ---------- DOCX ----------
+
+def _docx_lesson(document, index: int, lesson: Dict[str, Any]) -> None:
+    document.add_heading(f"Урок {index + 1}: {lesson['title']}", level=2)
+    document.add_paragraph(f"Продолжительность: {lesson['duration']} минут").italic = True
+
+    for title, items in (("Цели:", lesson["objectives"]),
+                         ("Грамматика:", lesson["grammar"]),
+                         ("Лексика:", lesson["vocabulary"])):
+        document.add_heading(title, level=3)
+        for item in items:
+            document.add_paragraph(item, style='List Bullet')
+
+    document.add_heading("Активности:", level=3)
+    for activity in lesson["activities"]:
+        paragraph = document.add_paragraph()
+        paragraph.add_run(f"{activity['name']} ({activity['type']}, {activity['duration']} мин)").bold = True
+        if activity["description"]:
+            document.add_paragraph(activity["description"])
+
+    homework = lesson["homework"]
+    if homework:
+        document.add_heading("Домашнее задание:", level=3)
+        if isinstance(homework, dict):
+            if homework.get('description'):
+                document.add_paragraph(homework['description'])
+            for task in homework.get('tasks') or []:
+                document.add_paragraph(task, style='List Bullet')
+        else:
+            document.add_paragraph(str(homework))
+
+
+def render_docx(course: Dict[str, Any], lessons: List[Dict[str, Any]]) -> bytes:
+    if not _worker.get("docx"):
+        raise ExportUnavailableError("docx")
+    from docx import Document
+
+    document = Document()
+    # Титульная страница
+    document.add_heading(course["name"], level=1)
+    document.add_paragraph(f"Язык: {course['language']}, Уровень: {course['level']}")
+    document.add_paragraph(f"Аудитория: {course['target_audience']}, Формат: {course['format']}")
+    if course["description"]:
+        document.add_paragraph(f"Описание: {course['description']}")
+    document.add_page_break()
+
+    # Уроки
+    for i, lesson in enumerate(lessons):
+        _docx_lesson(document, i, lesson)
+        if i < len(lessons) - 1:
+            document.add_page_break()
+
+    stream = io.BytesIO()
+    document.save(stream)
+    return stream.getvalue()
+
+
+def render_course(format: str, course: Dict[str, Any], lessons: List[Dict[str, Any]]) -> bytes:
+    """
+    Рендерит курс в PDF или DOCX
+
+    Вне пула (например, при COURSE_EXPORT_WORKERS=0) инициализирует процесс
+    при первом вызове.
+    """
+    if not _worker:
+        init_worker()
+    if format == "pdf":
+        return render_pdf(course, lessons)
+    if format == "docx":
+        return render_docx(course, lessons)
+    raise ValueError(f"Unsupported export format: {format}")
@@ -0,0 +1,255 @@
+"""
+Экспорт курсов в PDF и DOCX вне цикла событий.
+
+Документ рендерится в пуле процессов (COURSE_EXPORT_WORKERS), каждый процесс
+один раз загружает шрифты и стили (documents.init_worker). Уроки с
+активностями читаются одним потоковым запросом и сразу превращаются в простые
+словари; по ходу чтения считается SHA-256 содержимого курса. Готовый файл
+хранится в COURSE_EXPORT_CACHE_DIR под этим хешем, поэтому повторное
+скачивание неизмененного курса не требует рендеринга, а одновременные запросы
+одного файла ждут один общий рендеринг.
+"""
+import asyncio
+import glob
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ...core.config import settings
+from ...core.exceptions import NotFoundException, ValidationError
+from ...models.course import Activity, Course, Lesson
+from .documents import FORMATS, LAYOUT_VERSION, ExportUnavailableError, init_worker, render_course
+
+logger = logging.getLogger(__name__)
+
+UNAVAILABLE_MESSAGES = {
+    "pdf": "Экспорт в PDF недоступен. Установите reportlab.",
+    "docx": "Экспорт в DOCX недоступен. Установите python-docx.",
+}
+
+COURSE_FIELDS = ("name", "language", "level", "target_audience", "format", "description")
+LESSON_FIELDS = ("id", "title", "duration", "objectives", "grammar", "vocabulary", "homework")
+ACTIVITY_FIELDS = ("id", "name", "type", "duration", "description")
+
+# Строк уроков с активностями в одной пачке серверного курсора
+STREAM_BATCH_SIZE = 200
+
+
+def _canonical(value: Any) -> bytes:
+    return json.dumps(value, sort_keys=True, ensure_ascii=False, default=str, separators=(",", ":")).encode("utf-8")
+
+
+class CourseExportRenderer:
+    """Пул процессов рендеринга и дисковый кэш готовых файлов курсов"""
+
+    def __init__(
+            self,
+            workers: Optional[int] = None,
+            cache_dir: Optional[str] = None,
+            ttl_hours: Optional[int] = None
+    ):
+        self.workers = settings.COURSE_EXPORT_WORKERS if workers is None else workers
+        self.cache_dir = cache_dir or settings.COURSE_EXPORT_CACHE_DIR
+        self.ttl_hours = settings.COURSE_EXPORT_CACHE_TTL_HOURS if ttl_hours is None else ttl_hours
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self.stats = {"renders": 0, "cache_hits": 0, "shared_renders": 0}
+
+    def _executor(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            # spawn: процессы не наследуют цикл событий и соединения родителя
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=init_worker
+            )
+        return self._pool
+
+    def shutdown(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=True, cancel_futures=True)
+            self._pool = None
+
+    # ---------- Чтение курса ----------
+
+    async def load_course(
+            self,
+            session: AsyncSession,
+            course_id: int,
+            format: str
+    ) -> Tuple[Dict[str, Any], List[Dict[str, Any]], str]:
+        """
+        Читает курс для экспорта
+
+        Returns:
+            (заголовок курса, уроки с активностями в порядке order, хеш содержимого)
+        """
+        row = (await session.execute(
+            select(*(getattr(Course, field) for field in COURSE_FIELDS)).where(Course.id == course_id)
+        )).first()
+        if row is None:
+            raise NotFoundException(f"Курс с ID {course_id} не найден")
+        if format not in FORMATS:
+            raise ValidationError(f"Неподдерживаемый формат экспорта: {format}")
+
+        # Перечисления выводятся так же, как в f-строках шаблона документа
+        course = {
+            "name": row.name,
+            "language": row.language,
+            "level": f"{row.level}",
+            "target_audience": f"{row.target_audience}",
+            "format": f"{row.format}",
+            "description": row.description,
+        }
+
+        digest = hashlib.sha256()
+        digest.update(_canonical({"layout": LAYOUT_VERSION, "format": format, "course": course}))
+
+        statement = (
+            select(
+                *(getattr(Lesson, field) for field in LESSON_FIELDS),
+                *(getattr(Activity, field).label(f"activity_{field}") for field in ACTIVITY_FIELDS)
+            )
+            .outerjoin(Activity, Activity.lesson_id == Lesson.id)
+            .where(Lesson.course_id == course_id)
+            .order_by(Lesson.order, Lesson.id, Activity.id)
+            .execution_options(yield_per=STREAM_BATCH_SIZE)
+        )
+
+        lessons: List[Dict[str, Any]] = []
+        lesson: Optional[Dict[str, Any]] = None
+        result = await session.stream(statement)
+        async for item in result:
+            if lesson is None or lesson["id"] != item.id:
+                if lesson is not None:
+                    digest.update(_canonical(lesson))
+                lesson = {field: getattr(item, field) for field in LESSON_FIELDS}
+                for field in ("objectives", "grammar", "vocabulary"):
+                    lesson[field] = lesson[field] or []
+                lesson["activities"] = []
+                lessons.append(lesson)
+            if item.activity_id is not None:
+                lesson["activities"].append({field: getattr(item, f"activity_{field}") for field in ACTIVITY_FIELDS})
+        if lesson is not None:
+            digest.update(_canonical(lesson))
+
+        return course, lessons, digest.hexdigest()
+
+    # ---------- Кэш файлов ----------
+
+    def _cache_path(self, course_id: int, format: str, digest: str) -> str:
+        return os.path.join(self.cache_dir, f"course_{course_id}_{digest}.{format}")
+
+    def _read_cached(self, path: str) -> Optional[bytes]:
+        try:
+            with open(path, "rb") as file:
+                content = file.read()
+        except OSError:
+            return None
+        # Время изменения продлевает срок хранения используемых файлов
+        os.utime(path)
+        return content
+
+    def _write_cached(self, course_id: int, format: str, path: str, content: bytes) -> None:
+        os.makedirs(self.cache_dir, exist_ok=True)
+        tmp_path = f"{path}.tmp-{os.getpid()}"
+        with open(tmp_path, "wb") as file:
+            file.write(content)
+        os.replace(tmp_path, path)
+
+        # Предыдущие версии этого курса больше не понадобятся
+        for old_path in glob.glob(os.path.join(self.cache_dir, f"course_{course_id}_*.{format}")):
+            if old_path != path:
+                self._remove(old_path)
+        self.cleanup_expired()
+
+    def _remove(self, path: str) -> None:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def cleanup_expired(self) -> int:
+        """Удаляет файлы, к которым не обращались дольше ttl_hours"""
+        if not os.path.isdir(self.cache_dir):
+            return 0
+        deadline = time.time() - self.ttl_hours * 3600
+        removed = 0
+        for entry in os.scandir(self.cache_dir):
+            try:
+                if entry.is_file() and entry.stat().st_mtime < deadline:
+                    os.remove(entry.path)
+                    removed += 1
+            except OSError:
+                continue
+        return removed
+
+    # ---------- Экспорт ----------
+
+    async def _render(self, format: str, course: Dict[str, Any], lessons: List[Dict[str, Any]]) -> bytes:
+        if self.workers <= 0:
+            return await asyncio.to_thread(render_course, format, course, lessons)
+        loop = asyncio.get_running_loop()
+        try:
+            return await loop.run_in_executor(self._executor(), render_course, format, course, lessons)
+        except BrokenProcessPool:
+            # Процесс рендеринга аварийно завершился: следующий экспорт создаст новый пул
+            self._pool = None
+            raise
+
+    async def export(self, session: AsyncSession, course_id: int, format: str) -> bytes:
+        """Возвращает файл курса из кэша или рендерит его в пуле процессов"""
+        course, lessons, digest = await self.load_course(session, course_id, format)
+        path = self._cache_path(course_id, format, digest)
+
+        content = await asyncio.to_thread(self._read_cached, path)
+        if content is not None:
+            self.stats["cache_hits"] += 1
+            return content
+
+        pending = self._inflight.get(path)
+        if pending is not None:
+            self.stats["shared_renders"] += 1
+            return await asyncio.shield(pending)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[path] = future
+        try:
+            try:
+                content = await self._render(format, course, lessons)
+            except ExportUnavailableError as e:
+                raise ValidationError(UNAVAILABLE_MESSAGES[e.format])
+            self.stats["renders"] += 1
+            await asyncio.to_thread(self._write_cached, course_id, format, path, content)
+            future.set_result(content)
+            return content
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Исключение уже передано вызывающему; ожидающие получат его из future
+            future.exception()
+            raise
+        finally:
+            del self._inflight[path]
+
+
+_renderer: Optional[CourseExportRenderer] = None
+
+
+def get_course_export_renderer() -> CourseExportRenderer:
+    """Общий на процесс приложения экземпляр с пулом рендеринга"""
+    global _renderer
+    if _renderer is None:
+        _renderer = CourseExportRenderer()
+    return _renderer
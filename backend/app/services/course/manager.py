@@ -1,19 +1,23 @@
 # services/course/manager.py
 import asyncio
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, and_, func, case
+from sqlalchemy import select, update, and_, func, case
 from typing import List, Optional, Dict, Any, Tuple
 import logging
 from datetime import datetime, timedelta, timezone
 
 from ...models.course import Course, Lesson, Activity, LessonTemplate
 from ...schemas.course import CourseCreate, CourseUpdate, LessonCreate
-from ...core.exceptions import NotFoundException, ValidationError
+from ...core.exceptions import AccessDeniedError, NotFoundException, ValidationError
 from ...services.content import ContentGenerator as AIService
 from ...services.optimization.query_optimizer import QueryOptimizer
 from ...services.optimization.batch_processor import BatchProcessor
+from ...repositories.course import CourseRepository, LessonRepository
+from ...repositories.loading import apply_profile
 from ...core.memory import memory_optimized
 from ...core.cache import CacheService
+from ..content.cache_primer import record_primed_hit
+from .export_renderer import get_course_export_renderer
 
 logger = logging.getLogger(__name__)
 
@@ -24,17 +28,15 @@ class CourseManager:
         self.ai_service = AIService(session)
         self.batch_processor = BatchProcessor(session)
         self.query_optimizer = QueryOptimizer(session)
+        self.courses = CourseRepository(session)
+        self.lessons = LessonRepository(session)
         self.cache_service = CacheService()
 
     @memory_optimized()
     async def track_course_usage(self, user_id: int, course_id: int, interaction_type: str = "view", section: Optional[str] = None, metadata: Optional[Dict[str, Any]] = None) -> bool:
         """Отмечает использование курса с оптимизацией запросов и отслеживанием в аналитике"""
         try:
-            query = await self.query_optimizer.optimize_query(
-                select(Course).where(Course.id == course_id)
-            )
-            result = await self.session.execute(query)
-            course = result.scalar_one_or_none()
+            course = await self.courses.get(course_id)
 
             if course:
                 course.is_used = True
@@ -73,12 +75,8 @@ class CourseManager:
     async def update_course(self, course_id: int, course_data: CourseUpdate) -> Optional[Course]:
         """Обновляет существующий курс"""
         try:
-            # Получаем существующий курс
-            query = await self.query_optimizer.optimize_query(
-                select(Course).where(Course.id == course_id)
-            )
-            result = await self.session.execute(query)
-            course = result.scalar_one_or_none()
+            # Получаем существующий курс (ответ включает уроки и активности)
+            course = await self.courses.get_full(course_id)
 
             if not course:
                 logger.warning(f"Course with ID {course_id} not found for update")
@@ -106,11 +104,16 @@ class CourseManager:
 
             # Сохраняем изменения
             await self.session.commit()
-            await self.session.refresh(course)  # Обновляем объект из базы данных
+            # Обновляем из базы только колонки: связи уже загружены профилем course_full
+            await self.session.refresh(course, attribute_names=Course.__table__.columns.keys())
 
             # Логируем успешное обновление
             logger.info(f"Course with ID {course_id} successfully updated")
 
+            if course.is_template:
+                await self.cache_service.invalidate(f"course_template_tree:{course_id}")
+                await self.cache_service.invalidate_pattern("course_templates:*")
+
             # Возвращаем обновленный курс
             return course
         except Exception as e:
@@ -118,6 +121,53 @@ class CourseManager:
             await self.session.rollback()
             raise
 
+    async def get_course(self, course_id: int) -> Optional[Course]:
+        """Курс с уроками и активностями (профиль course_full)"""
+        return await self.courses.get_full(course_id)
+
+    async def get_course_progress(self, course_id: int) -> Dict[str, Any]:
+        """Прогресс по курсу: курс без уроков и агрегат по урокам - два запроса"""
+        course = await self.courses.get(course_id)
+        if not course:
+            raise NotFoundException("Course not found")
+
+        progress = await self.courses.get_progress(course_id)
+        total_lessons = progress["total_lessons"]
+        return {
+            "course_id": course.id,
+            "name": course.name,
+            "total_lessons": total_lessons,
+            "completed_lessons": progress["completed_lessons"],
+            "progress_percent": round(progress["completed_lessons"] / total_lessons * 100, 1) if total_lessons else 0.0,
+            "total_duration": progress["total_duration"],
+            "completed_duration": progress["completed_duration"],
+            "next_lesson_order": progress["next_lesson_order"]
+        }
+
+    async def delete_course(self, course_id: int, user_id: int, is_admin: bool = False) -> bool:
+        """Удаляет курс вместе с уроками и активностями; удалить курс может его автор или администратор"""
+        try:
+            # Каскадное удаление ORM требует загруженных уроков и активностей
+            course = await self.courses.get_full(course_id)
+            if not course:
+                return False
+            if course.creator_id != user_id and not is_admin:
+                raise AccessDeniedError(f"User {user_id} is not allowed to delete course {course_id}")
+
+            is_template = course.is_template
+            await self.session.delete(course)
+            await self.session.commit()
+
+            await self.cache_service.invalidate(f"course:{course_id}")
+            if is_template:
+                await self.cache_service.invalidate(f"course_template_tree:{course_id}")
+                await self.cache_service.invalidate_pattern("course_templates:*")
+            return True
+        except Exception as e:
+            logger.error(f"Error deleting course: {str(e)}")
+            await self.session.rollback()
+            raise
+
     @memory_optimized()
     async def create_course(self, course_data: CourseCreate, user_id: int) -> Course:
         """Создает новый курс с оптимизированной обработкой уроков и активностей"""
@@ -136,17 +186,7 @@ class CourseManager:
                 total_duration += lesson_duration
 
             # Create course with total_duration set
-            try:
-                # Пробуем использовать model_dump (Pydantic v2)
-                course_dict = course_data.model_dump(exclude={'lessons'})
-            except AttributeError:
-                try:
-                    # Пробуем использовать dict (Pydantic v1)
-                    course_dict = course_data.dict(exclude={'lessons'})
-                except AttributeError:
-                    # Если ни один метод не работает, преобразуем объект в словарь вручную
-                    course_dict = {k: v for k, v in course_data.__dict__.items()
-                                  if not k.startswith('_') and k != 'lessons'}
+            course_dict = self._schema_dict(course_data, {'lessons'})
 
             course = Course(
                 **course_dict,
@@ -158,37 +198,16 @@ class CourseManager:
             self.session.add(course)
             await self.session.flush()
 
-            # Используем BatchProcessor для создания уроков
-            lessons_data = []
-            recalculated_total_duration = 0
-
-            for lesson_data in course_data.lessons:
-                lesson = await self._create_lesson_with_batch(lesson_data, course.id)
-                lessons_data.append(lesson)
-                recalculated_total_duration += lesson.duration
-
-            await self.batch_processor.bulk_insert(lessons_data)
+            # Уроки и активности собираются в памяти и пишутся многострочными INSERT
+            lessons = [self._lesson_from_schema(lesson_data) for lesson_data in course_data.lessons]
+            await self._persist_lessons(course.id, lessons)
 
             # Update total_duration with the actual calculated value
-            course.total_duration = recalculated_total_duration
+            course.total_duration = sum(lesson["duration"] for lesson in lessons)
             await self.session.commit()
 
-            # Reload the course with all relationships to avoid DetachedInstanceError
-            from sqlalchemy import select
-            from sqlalchemy.orm import selectinload
-
-            # Create a query with explicit loading of all relationships
-            query = (
-                select(Course)
-                .where(Course.id == course.id)
-                .options(
-                    selectinload(Course.lessons).selectinload(Lesson.activities)
-                )
-            )
-
-            # Execute the query
-            result = await self.session.execute(query)
-            refreshed_course = result.scalar_one()
+            # Reload the course with lessons and activities to avoid DetachedInstanceError
+            refreshed_course = await self.courses.get_full(course.id)
 
             # Кэшируем созданный курс
             cache_key = f"course:{refreshed_course.id}"
@@ -201,77 +220,89 @@ class CourseManager:
             await self.session.rollback()
             raise
 
-    async def _create_lesson_with_batch(self, lesson_data: LessonCreate, course_id: int) -> Lesson:
-        """Создает урок и активности с использованием батч-процессинга"""
-        # Calculate lesson duration from activities if they exist
-        lesson_duration = lesson_data.duration
-        if lesson_data.activities:
-            activities_duration = sum(activity.duration for activity in lesson_data.activities)
-            if activities_duration > 0:
-                lesson_duration = activities_duration
-
-        # Create lesson with proper duration - exclude both activities and duration from dict
+    @staticmethod
+    def _schema_dict(data: Any, exclude: Optional[set] = None) -> Dict[str, Any]:
+        """Поля схемы в виде словаря (Pydantic v2, v1 или атрибуты объекта)"""
+        exclude = exclude or set()
         try:
             # Пробуем использовать model_dump (Pydantic v2)
-            lesson_dict = lesson_data.model_dump(exclude={'activities', 'duration'})
+            return data.model_dump(exclude=exclude)
         except AttributeError:
             try:
                 # Пробуем использовать dict (Pydantic v1)
-                lesson_dict = lesson_data.dict(exclude={'activities', 'duration'})
+                return data.dict(exclude=exclude)
             except AttributeError:
                 # Если ни один метод не работает, преобразуем объект в словарь вручную
-                lesson_dict = {k: v for k, v in lesson_data.__dict__.items()
-                              if not k.startswith('_') and k not in ['activities', 'duration']}
+                return {k: v for k, v in data.__dict__.items()
+                        if not k.startswith('_') and k not in exclude}
 
-        lesson = Lesson(
-            **lesson_dict,
-            course_id=course_id,
-            duration=lesson_duration  # Set duration explicitly
-        )
-        self.session.add(lesson)
-        await self.session.flush()
+    def _lesson_from_schema(self, lesson_data: LessonCreate) -> Dict[str, Any]:
+        """Урок со списком активностей из схемы создания (для _persist_lessons)"""
+        # Calculate lesson duration from activities if they exist
+        lesson_duration = lesson_data.duration
+        if lesson_data.activities:
+            activities_duration = sum(activity.duration for activity in lesson_data.activities)
+            if activities_duration > 0:
+                lesson_duration = activities_duration
 
-        # Подготавливаем активности для батч-вставки
-        activities = []
+        lesson = self._schema_dict(lesson_data, {'activities', 'duration'})
+        lesson["duration"] = lesson_duration
+        lesson["activities"] = [self._schema_dict(activity) for activity in lesson_data.activities]
+        return lesson
 
-        for activity_data in lesson_data.activities:
-            # Create activity with proper parameters
-            try:
-                # Пробуем использовать model_dump (Pydantic v2)
-                activity_dict = activity_data.model_dump()
-            except AttributeError:
-                try:
-                    # Пробуем использовать dict (Pydantic v1)
-                    activity_dict = activity_data.dict()
-                except AttributeError:
-                    # Если ни один метод не работает, преобразуем объект в словарь вручную
-                    activity_dict = {k: v for k, v in activity_data.__dict__.items()
-                                    if not k.startswith('_')}
+    @staticmethod
+    def _lesson_from_structure(lesson_structure: Dict[str, Any], order: int) -> Dict[str, Any]:
+        """Урок со списком активностей из структуры, сгенерированной AI"""
+        return {
+            "title": lesson_structure.get('title', f'Урок {order}'),
+            "order": order,
+            "objectives": lesson_structure.get('objectives', []),
+            "grammar": lesson_structure.get('grammar', []),
+            "vocabulary": lesson_structure.get('vocabulary', []),
+            "materials": lesson_structure.get('materials', []),
+            "homework": lesson_structure.get('homework', {}),
+            "duration": lesson_structure.get('duration', 60),
+            "is_completed": False,
+            "activities": [
+                {
+                    "name": activity_data.get('name', f'Активность {activity_index+1}'),
+                    "type": activity_data.get('type', 'practice'),
+                    "duration": activity_data.get('duration', 15),
+                    "description": activity_data.get('description', ''),
+                    "materials": activity_data.get('materials', []),
+                    "objectives": activity_data.get('objectives', [])
+                }
+                for activity_index, activity_data in enumerate(lesson_structure.get('activities', []))
+            ]
+        }
 
-            activity = Activity(
-                **activity_dict,
-                lesson_id=lesson.id
-            )
-            activities.append(activity)
+    async def _persist_lessons(self, course_id: int, lessons: List[Dict[str, Any]]) -> List[int]:
+        """
+        Сохраняет уроки с активностями двумя многострочными INSERT без коммита.
 
-        # Only insert activities if there are any
-        if activities:
-            await self.batch_processor.bulk_insert(activities)
+        lessons - словари полей урока с ключом "activities" (список словарей
+        полей активности). Уроки вставляются одним INSERT ... RETURNING id,
+        идентификаторы в порядке lessons проставляются активностям, и те
+        вставляются одним INSERT ... VALUES. Фиксирует транзакцию вызывающий.
+        """
+        if not lessons:
+            return []
 
-        # Reload the lesson with activities to avoid DetachedInstanceError
-        from sqlalchemy import select
-        from sqlalchemy.orm import selectinload
+        lesson_rows = [
+            {**{key: value for key, value in lesson.items() if key != "activities"}, "course_id": course_id}
+            for lesson in lessons
+        ]
+        lesson_ids = await self.batch_processor.insert_returning_ids(Lesson.__table__, lesson_rows)
 
-        query = (
-            select(Lesson)
-            .where(Lesson.id == lesson.id)
-            .options(selectinload(Lesson.activities))
-        )
+        activity_rows = [
+            {**activity, "lesson_id": lesson_id}
+            for lesson, lesson_id in zip(lessons, lesson_ids)
+            for activity in lesson.get("activities", [])
+        ]
+        if activity_rows:
+            await self.batch_processor.insert_rows(Activity.__table__, activity_rows)
 
-        result = await self.session.execute(query)
-        refreshed_lesson = result.scalar_one()
-
-        return refreshed_lesson
+        return lesson_ids
 
     def _validate_course_data(self, course_data: CourseCreate):
         """Проверяет данные курса на корректность"""
@@ -349,107 +380,36 @@ class CourseManager:
 
             # Если уже заданы уроки, то создаем их
             if course_data.lessons:
-                lessons_data = []
-                total_duration = 0
-                for lesson_data in course_data.lessons:
-                    lesson = await self._create_lesson_with_batch(lesson_data, course.id)
-                    lessons_data.append(lesson)
-                    total_duration += lesson.duration
+                lessons = [self._lesson_from_schema(lesson_data) for lesson_data in course_data.lessons]
+                await self._persist_lessons(course.id, lessons)
 
-                course.total_duration = total_duration
+                course.total_duration = sum(lesson["duration"] for lesson in lessons)
                 await self.session.commit()
 
-                # Решение проблемы DetachedInstanceError
-                from sqlalchemy import select
-                from sqlalchemy.orm import selectinload
-
-                # Создаем запрос с явной загрузкой всех отношений
-                query = (
-                    select(Course)
-                    .where(Course.id == course.id)
-                    .options(
-                        selectinload(Course.lessons).selectinload(Lesson.activities)
-                    )
-                )
-
-                # Выполняем запрос
-                result = await self.session.execute(query)
-                return result.scalar_one()
+                # Решение проблемы DetachedInstanceError: курс с уроками и активностями
+                return await self.courses.get_full(course.id)
             else:
                 # Генерируем структуру через AI
                 generated_structure = await self._generate_with_ai(course_data)
 
-                # Создаем уроки и активности
-                lessons_data = []
-                total_duration = 0
-
-                for lesson_index, lesson_structure in enumerate(generated_structure['lessons']):
-                    # Готовим данные для урока
-                    lesson = Lesson(
-                        course_id=course.id,
-                        title=lesson_structure.get('title', f'Урок {lesson_index+1}'),
-                        order=lesson_index+1,
-                        objectives=lesson_structure.get('objectives', []),
-                        grammar=lesson_structure.get('grammar', []),
-                        vocabulary=lesson_structure.get('vocabulary', []),
-                        materials=lesson_structure.get('materials', []),
-                        homework=lesson_structure.get('homework', {}),
-                        duration=lesson_structure.get('duration', 60),
-                        is_completed=False
-                    )
+                # Создаем уроки и активности многострочными INSERT
+                lessons = [
+                    self._lesson_from_structure(lesson_structure, lesson_index+1)
+                    for lesson_index, lesson_structure in enumerate(generated_structure['lessons'])
+                ]
+                await self._persist_lessons(course.id, lessons)
 
-                    self.session.add(lesson)
-                    await self.session.flush()
-
-                    # Создаем активности для урока
-                    lesson_duration = 0
-                    activities = []
-
-                    for activity_index, activity_data in enumerate(lesson_structure.get('activities', [])):
-                        activity = Activity(
-                            lesson_id=lesson.id,
-                            name=activity_data.get('name', f'Активность {activity_index+1}'),
-                            type=activity_data.get('type', 'practice'),
-                            duration=activity_data.get('duration', 15),
-                            description=activity_data.get('description', ''),
-                            materials=activity_data.get('materials', []),
-                            objectives=activity_data.get('objectives', [])
-                        )
-                        activities.append(activity)
-                        lesson_duration += activity.duration
-
-                    # Используем batch-processor для вставки активностей
-                    await self.batch_processor.bulk_insert(activities)
-
-                    # Обновляем продолжительность урока - УДАЛЕНО, используем значение из lesson_structure.get('duration', 60)
-                    # lesson.duration = lesson_duration
-                    lessons_data.append(lesson)
-                    # Используем исходную длительность урока для общей длительности курса
-                    total_duration += lesson.duration # Используем lesson.duration, установленное при создании Lesson
+                # Для длительности курса используется исходная длительность уроков
+                # (lesson_structure.get('duration', 60)), а не сумма активностей
+                total_duration = sum(lesson["duration"] for lesson in lessons)
 
                 # Обновляем продолжительность курса
                 course.total_duration = total_duration
                 await self.session.commit()
 
                 # Решение проблемы DetachedInstanceError: делаем повторный запрос для получения полной структуры курса
-                # с предварительно загруженными отношениями
-                from sqlalchemy import select
-                from sqlalchemy.orm import selectinload
-
-                # Создаем запрос с явной загрузкой всех отношений
-                query = (
-                    select(Course)
-                    .where(Course.id == course.id)
-                    .options(
-                        selectinload(Course.lessons).selectinload(Lesson.activities)
-                    )
-                )
-
-                # Выполняем запрос
-                result = await self.session.execute(query)
-                refreshed_course = result.scalar_one()
-
-                return refreshed_course
+                # с предварительно загруженными отношениями (профиль course_full)
+                return await self.courses.get_full(course.id)
 
         except Exception as e:
             logger.error(f"Error generating course structure: {str(e)}")
@@ -734,15 +694,8 @@ class CourseManager:
             #     logger.info(f"Возвращаем кэшированные материалы для урока {lesson_id}, типы: {types}")
             #     return cached_materials
 
-            # Импортируем selectinload здесь, если он нужен
-            from sqlalchemy.orm import selectinload
-            query = await self.query_optimizer.optimize_query(
-                select(Lesson)
-                .where(Lesson.id == lesson_id)
-                .options(selectinload(Lesson.course))  # Загружаем курс для контекста
-            )
-            result = await self.session.execute(query)
-            lesson = result.scalar_one_or_none()
+            # Урок с активностями и курсом для контекста (профиль lesson_with_activities)
+            lesson = await self.lessons.get(lesson_id)
 
             if not lesson:
                 raise NotFoundException(f"Урок с ID {lesson_id} не найден")
@@ -1078,24 +1031,27 @@ class CourseManager:
 
     @memory_optimized()
     async def clone_course(self, course_id: int, new_name: str, user_id: int) -> Course:
-        """Клонирует существующий курс с оптимизацией"""
+        """Клонирует существующий курс: уроки и активности копируются многострочными INSERT"""
         try:
-            # Получаем исходный курс
-            source_course = await self.get_course(course_id)
+            # Получаем исходный курс с уроками и активностями
+            source_course = await self.courses.get_full(course_id)
             if not source_course:
                 raise NotFoundException("Course not found")
 
+            source = self._course_tree(source_course)
+
             # Создаем новый курс
             new_course = Course(
                 name=new_name,
-                language=source_course.language,
-                level=source_course.level,
-                target_audience=source_course.target_audience,
-                format=source_course.format,
-                description=source_course.description,
-                exam_prep=source_course.exam_prep,
-                prerequisites=source_course.prerequisites.copy(),
-                learning_outcomes=source_course.learning_outcomes.copy(),
+                language=source["language"],
+                level=source["level"],
+                target_audience=source["target_audience"],
+                format=source["format"],
+                description=source["description"],
+                exam_prep=source["exam_prep"],
+                prerequisites=source["prerequisites"],
+                learning_outcomes=source["learning_outcomes"],
+                total_duration=source["total_duration"],
                 creator_id=user_id,
                 is_used=False,
                 usage_count=0
@@ -1103,59 +1059,11 @@ class CourseManager:
             self.session.add(new_course)
             await self.session.flush()
 
-            # Получаем все уроки исходного курса оптимизированным запросом
-            query = await self.query_optimizer.optimize_query(
-                select(Lesson).where(Lesson.course_id == course_id)
-            )
-            result = await self.session.execute(query)
-            source_lessons = result.scalars().all()
-
-            # Подготавливаем данные для батч-вставки
-            new_lessons = []
-            activities_data = []
-
-            for lesson in source_lessons:
-                new_lesson = Lesson(
-                    course_id=new_course.id,
-                    title=lesson.title,
-                    duration=lesson.duration,
-                    order=lesson.order,
-                    objectives=lesson.objectives.copy(),
-                    grammar=lesson.grammar.copy(),
-                    vocabulary=lesson.vocabulary.copy(),
-                    materials=lesson.materials.copy(),
-                    homework=lesson.homework.copy()
-                )
-                self.session.add(new_lesson)
-                await self.session.flush()
-                new_lessons.append(new_lesson)
-
-                # Клонируем активности
-                activity_query = await self.query_optimizer.optimize_query(
-                    select(Activity).where(Activity.lesson_id == lesson.id)
-                )
-                activity_result = await self.session.execute(activity_query)
-                activities = activity_result.scalars().all()
-
-                for activity in activities:
-                    new_activity = Activity(
-                        lesson_id=new_lesson.id,
-                        name=activity.name,
-                        type=activity.type,
-                        duration=activity.duration,
-                        description=activity.description,
-                        materials=activity.materials.copy(),
-                        objectives=activity.objectives.copy()
-                    )
-                    activities_data.append(new_activity)
-
-            # Батч-вставка всех активностей
-            await self.batch_processor.bulk_insert(activities_data)
+            await self._persist_lessons(new_course.id, source["lessons"])
 
             await self.session.commit()
-            await self.session.refresh(new_course)
 
-            return new_course
+            return await self.courses.get_full(new_course.id)
 
         except Exception as e:
             logger.error(f"Error cloning course: {str(e)}")
@@ -1166,351 +1074,17 @@ class CourseManager:
     async def export_course(self, course_id: int, format: str) -> Tuple[bytes, str]:
         """
         Экспортирует курс в выбранном формате (PDF или DOCX) и возвращает байты файла и имя.
+
+        Документ рендерится в пуле процессов вне цикла событий, а готовый файл
+        кэшируется по хешу содержимого курса (см. export_renderer.py).
         """
         logger.info(f"Начало экспорта курса {course_id} в формат {format}")
         try:
-            # Импортируем selectinload здесь
-            from sqlalchemy.orm import selectinload
-            # Получаем курс с полной структурой уроков и активностей
-            query = await self.query_optimizer.optimize_query(
-                select(Course)
-                .where(Course.id == course_id)
-                .options(
-                    selectinload(Course.lessons)
-                    .selectinload(Lesson.activities)  # Загружаем активности сразу
-                )
-            )
-            result = await self.session.execute(query)
-            course = result.scalar_one_or_none()
-
-            if not course:
-                raise NotFoundException(f"Курс с ID {course_id} не найден")
-
-            # Сортируем уроки по order на всякий случай
-            course.lessons.sort(key=lambda l: l.order)
+            file_content_bytes = await get_course_export_renderer().export(self.session, course_id, format)
 
             # Используем только ID курса в имени файла, чтобы избежать проблем с кодировкой
             filename = f"course_{course_id}.{format}"
-            file_content_bytes: bytes
-
-            if format == 'pdf':
-                # --- Логика генерации PDF ---
-                # Убедитесь, что reportlab установлен: pip install reportlab
-                try:
-                    from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, PageBreak
-                    from reportlab.lib.styles import getSampleStyleSheet
-                    from reportlab.lib.units import inch
-                    from reportlab.pdfbase import pdfmetrics
-                    from reportlab.pdfbase.ttfonts import TTFont
-                    import io
-                    import os
-
-                    # Регистрируем шрифты с поддержкой кириллицы
-                    # Используем DejaVuSans, который поддерживает кириллицу
-                    font_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'static', 'fonts')
-
-                    # Проверяем наличие шрифтов в папке static/fonts
-                    dejavu_path = os.path.join(font_path, 'DejaVuSans.ttf')
-                    dejavu_bold_path = os.path.join(font_path, 'DejaVuSans-Bold.ttf')
-
-                    fonts_registered = False
-
-                    if os.path.exists(dejavu_path):
-                        pdfmetrics.registerFont(TTFont('DejaVuSans', dejavu_path))
-                        logger.info(f"Зарегистрирован шрифт DejaVuSans из {dejavu_path}")
-                        fonts_registered = True
-
-                    if os.path.exists(dejavu_bold_path):
-                        pdfmetrics.registerFont(TTFont('DejaVuSans-Bold', dejavu_bold_path))
-                        logger.info(f"Зарегистрирован шрифт DejaVuSans-Bold из {dejavu_bold_path}")
-                        fonts_registered = True
-
-                    # Регистрируем шрифтовые пары для поддержки кириллицы
-                    if fonts_registered:
-                        from reportlab.pdfbase.pdfmetrics import registerFontFamily
-                        registerFontFamily('DejaVuSans', normal='DejaVuSans', bold='DejaVuSans-Bold')
-                        logger.info("Зарегистрировано семейство шрифтов DejaVuSans")
-
-                    if not fonts_registered:
-                        # Если шрифтов нет в папке, используем стандартный Helvetica
-                        logger.warning(f"Шрифты DejaVuSans не найдены в {font_path}, используем стандартные шрифты")
-
-                    # Создаем буфер для PDF
-                    buffer = io.BytesIO()
-
-                    # Создаем документ с указанием кодировки
-                    doc = SimpleDocTemplate(
-                        buffer,
-                        pagesize=(8.5 * inch, 11 * inch),
-                        leftMargin=0.75 * inch,
-                        rightMargin=0.75 * inch,
-                        topMargin=1 * inch,
-                        bottomMargin=1 * inch,
-                        encoding='utf-8',  # Явно указываем кодировку UTF-8
-                        title=course.name,  # Устанавливаем заголовок документа
-                        author='Course Generator',  # Устанавливаем автора
-                        subject=f'Course: {course.name}'  # Устанавливаем тему
-                    )
-                    styles = getSampleStyleSheet()
-
-                    # Создаем копии стилей с поддержкой кириллицы
-                    if fonts_registered:
-                        # Импортируем необходимые классы для создания стилей
-                        from reportlab.lib.styles import ParagraphStyle
-                        from reportlab.lib.enums import TA_LEFT, TA_CENTER, TA_RIGHT
-                        from reportlab.lib import colors
-
-                        # Создаем собственные стили с поддержкой кириллицы
-                        styles.add(ParagraphStyle(
-                            name='CustomTitle',
-                            fontName='DejaVuSans-Bold',
-                            fontSize=18,
-                            leading=22,
-                            alignment=TA_CENTER,
-                            spaceAfter=12,
-                            textColor=colors.black
-                        ))
-
-                        styles.add(ParagraphStyle(
-                            name='CustomHeading1',
-                            fontName='DejaVuSans-Bold',
-                            fontSize=16,
-                            leading=20,
-                            alignment=TA_LEFT,
-                            spaceAfter=10,
-                            textColor=colors.black
-                        ))
-
-                        styles.add(ParagraphStyle(
-                            name='CustomHeading2',
-                            fontName='DejaVuSans-Bold',
-                            fontSize=14,
-                            leading=18,
-                            alignment=TA_LEFT,
-                            spaceAfter=8,
-                            textColor=colors.black
-                        ))
-
-                        styles.add(ParagraphStyle(
-                            name='CustomHeading3',
-                            fontName='DejaVuSans-Bold',
-                            fontSize=12,
-                            leading=16,
-                            alignment=TA_LEFT,
-                            spaceAfter=6,
-                            textColor=colors.black
-                        ))
-
-                        styles.add(ParagraphStyle(
-                            name='CustomNormal',
-                            fontName='DejaVuSans',
-                            fontSize=10,
-                            leading=14,
-                            alignment=TA_LEFT,
-                            spaceAfter=6,
-                            textColor=colors.black
-                        ))
-
-                        # Применяем шрифты к стандартным стилям
-                        for style_name in styles.byName:
-                            style = styles[style_name]
-                            if hasattr(style, 'fontName'):
-                                if style_name in ['h1', 'h2', 'h3', 'h4', 'Heading1', 'Heading2', 'Heading3', 'Heading4', 'Title']:
-                                    # Для заголовков используем жирный шрифт
-                                    if 'DejaVuSans-Bold' in pdfmetrics.getRegisteredFontNames():
-                                        style.fontName = 'DejaVuSans-Bold'
-                                else:
-                                    # Для обычного текста используем обычный шрифт
-                                    if 'DejaVuSans' in pdfmetrics.getRegisteredFontNames():
-                                        style.fontName = 'DejaVuSans'
-
-                    story = []
-
-                    # Титульная страница
-                    story.append(Paragraph(course.name, styles['CustomTitle'] if fonts_registered else styles['h1']))
-                    story.append(Spacer(1, 0.2 * inch))
-                    story.append(Paragraph(f"Язык: {course.language}, Уровень: {course.level}",
-                                          styles['CustomHeading3'] if fonts_registered else styles['h3']))
-                    story.append(
-                        Paragraph(f"Аудитория: {course.target_audience}, Формат: {course.format}",
-                                 styles['CustomHeading3'] if fonts_registered else styles['h3']))
-                    if course.description:
-                        story.append(Spacer(1, 0.1 * inch))
-                        story.append(Paragraph(f"Описание: {course.description}",
-                                             styles['CustomNormal'] if fonts_registered else styles['Normal']))
-                    story.append(PageBreak())
-
-                    # Уроки
-                    for i, lesson in enumerate(course.lessons):
-                        story.append(Paragraph(f"Урок {i + 1}: {lesson.title}",
-                                             styles['CustomHeading1'] if fonts_registered else styles['h2']))
-                        story.append(Spacer(1, 0.1 * inch))
-                        story.append(Paragraph(f"Продолжительность: {lesson.duration} минут",
-                                             styles['CustomNormal'] if fonts_registered else styles['Italic']))
-                        story.append(Spacer(1, 0.1 * inch))
-
-                        story.append(Paragraph("Цели:",
-                                             styles['CustomHeading3'] if fonts_registered else styles['h3']))
-                        for obj in lesson.objectives:
-                            story.append(Paragraph(f"- {obj}",
-                                                 styles['CustomNormal'] if fonts_registered else styles['Normal']))
-                        story.append(Spacer(1, 0.1 * inch))
-
-                        story.append(Paragraph("Грамматика:",
-                                             styles['CustomHeading3'] if fonts_registered else styles['h3']))
-                        for gram in lesson.grammar:
-                            story.append(Paragraph(f"- {gram}",
-                                                 styles['CustomNormal'] if fonts_registered else styles['Normal']))
-                        story.append(Spacer(1, 0.1 * inch))
-
-                        story.append(Paragraph("Лексика:",
-                                             styles['CustomHeading3'] if fonts_registered else styles['h3']))
-                        for vocab in lesson.vocabulary:
-                            story.append(Paragraph(f"- {vocab}",
-                                                 styles['CustomNormal'] if fonts_registered else styles['Normal']))
-                        story.append(Spacer(1, 0.1 * inch))
-
-                        story.append(Paragraph("Активности:",
-                                             styles['CustomHeading3'] if fonts_registered else styles['h3']))
-                        for act in lesson.activities:
-                            story.append(Paragraph(f"- {act.name} ({act.type}, {act.duration} мин)",
-                                                 styles['CustomHeading3'] if fonts_registered else styles['h4']))
-                            if act.description:
-                                story.append(Paragraph(act.description,
-                                                     styles['CustomNormal'] if fonts_registered else styles['Normal']))
-                            story.append(Spacer(1, 0.05 * inch))
-                        story.append(Spacer(1, 0.1 * inch))
-
-                        if lesson.homework:
-                            story.append(Paragraph("Домашнее задание:",
-                                                 styles['CustomHeading3'] if fonts_registered else styles['h3']))
-                            if isinstance(lesson.homework, dict):
-                                if lesson.homework.get('description'):
-                                    story.append(Paragraph(lesson.homework['description'],
-                                                         styles['CustomNormal'] if fonts_registered else styles['Normal']))
-                                if lesson.homework.get('tasks'):
-                                    for task in lesson.homework['tasks']:
-                                        story.append(Paragraph(f"- {task}",
-                                                             styles['CustomNormal'] if fonts_registered else styles['Normal']))
-                            else:  # Если homework - строка
-                                story.append(Paragraph(str(lesson.homework),
-                                                     styles['CustomNormal'] if fonts_registered else styles['Normal']))
-                            story.append(Spacer(1, 0.1 * inch))
-
-                        if i < len(course.lessons) - 1:
-                            story.append(PageBreak())
-
-                    # Создаем PDF с указанием кодировки и дополнительными метаданными
-                    from reportlab.lib.pagesizes import letter
-
-                    # Добавляем метаданные документа
-                    doc_info = {
-                        'Title': course.name,
-                        'Author': 'Course Generator',
-                        'Subject': f'Course: {course.name}',
-                        'Creator': 'ReportLab PDF Library',
-                        'Producer': 'Course Generator System'
-                    }
-
-                    # Создаем функцию для первой страницы
-                    def first_page(canvas, doc):
-                        canvas.saveState()
-                        # Устанавливаем метаданные документа
-                        canvas.setTitle(doc_info.get('Title', ''))
-                        canvas.setAuthor(doc_info.get('Author', ''))
-                        canvas.setSubject(doc_info.get('Subject', ''))
-                        canvas.setCreator(doc_info.get('Creator', ''))
-                        # Устанавливаем кодировку
-                        canvas.setPageCompression(1)
-                        canvas.restoreState()
-
-                    # Создаем функцию для остальных страниц
-                    def later_pages(canvas, doc):
-                        canvas.saveState()
-                        # Добавляем номер страницы
-                        canvas.setFont('DejaVuSans' if fonts_registered else 'Helvetica', 9)
-                        canvas.drawString(inch, 0.75 * inch, f"Страница {doc.page}")
-                        canvas.restoreState()
-
-                    # Строим документ с указанием функций для страниц
-                    doc.build(story, onFirstPage=first_page, onLaterPages=later_pages)
-
-                    file_content_bytes = buffer.getvalue()
-                    logger.info(f"PDF для курса {course_id} успешно сгенерирован.")
-
-                except ImportError:
-                    logger.error("Библиотека reportlab не установлена. Невозможно экспортировать в PDF.")
-                    raise ValidationError("Экспорт в PDF недоступен. Установите reportlab.")
-                except Exception as pdf_err:
-                    logger.error(f"Ошибка при генерации PDF для курса {course_id}: {pdf_err}")
-                    raise
-
-            elif format == 'docx':
-                # --- Логика генерации DOCX ---
-                # Убедитесь, что python-docx установлен: pip install python-docx
-                try:
-                    from docx import Document
-                    from docx.shared import Inches, Pt
-                    import io
-
-                    document = Document()
-                    # Титульная страница
-                    document.add_heading(course.name, level=1)
-                    document.add_paragraph(f"Язык: {course.language}, Уровень: {course.level}")
-                    document.add_paragraph(f"Аудитория: {course.target_audience}, Формат: {course.format}")
-                    if course.description: document.add_paragraph(f"Описание: {course.description}")
-                    document.add_page_break()
-
-                    # Уроки
-                    for i, lesson in enumerate(course.lessons):
-                        document.add_heading(f"Урок {i + 1}: {lesson.title}", level=2)
-                        document.add_paragraph(f"Продолжительность: {lesson.duration} минут").italic = True
-
-                        document.add_heading("Цели:", level=3)
-                        for obj in lesson.objectives: document.add_paragraph(obj, style='List Bullet')
-
-                        document.add_heading("Грамматика:", level=3)
-                        for gram in lesson.grammar: document.add_paragraph(gram, style='List Bullet')
-
-                        document.add_heading("Лексика:", level=3)
-                        for vocab in lesson.vocabulary: document.add_paragraph(vocab, style='List Bullet')
-
-                        document.add_heading("Активности:", level=3)
-                        for act in lesson.activities:
-                            p = document.add_paragraph()
-                            p.add_run(f"{act.name} ({act.type}, {act.duration} мин)").bold = True
-                            if act.description: document.add_paragraph(act.description)
-
-                        if lesson.homework:
-                            document.add_heading("Домашнее задание:", level=3)
-                            if isinstance(lesson.homework, dict):
-                                if lesson.homework.get('description'): document.add_paragraph(
-                                    lesson.homework['description'])
-                                if lesson.homework.get('tasks'):
-                                    for task in lesson.homework['tasks']: document.add_paragraph(task,
-                                                                                                 style='List Bullet')
-                            else:
-                                document.add_paragraph(str(lesson.homework))
-
-                        if i < len(course.lessons) - 1:
-                            document.add_page_break()
-
-                    # Сохраняем в байтовый поток
-                    file_stream = io.BytesIO()
-                    document.save(file_stream)
-                    file_stream.seek(0)
-                    file_content_bytes = file_stream.read()
-                    logger.info(f"DOCX для курса {course_id} успешно сгенерирован.")
-
-                except ImportError:
-                    logger.error("Библиотека python-docx не установлена. Невозможно экспортировать в DOCX.")
-                    raise ValidationError("Экспорт в DOCX недоступен. Установите python-docx.")
-                except Exception as docx_err:
-                    logger.error(f"Ошибка при генерации DOCX для курса {course_id}: {docx_err}")
-                    raise
-            else:
-                raise ValidationError(f"Неподдерживаемый формат экспорта: {format}")
-
+            logger.info(f"{format.upper()} для курса {course_id} успешно сгенерирован.")
             return file_content_bytes, filename
 
         except NotFoundException:
@@ -1524,13 +1098,14 @@ class CourseManager:
 
     # Методы работы с шаблонами уроков
     @memory_optimized()
-    async def get_lesson_templates(self, type: Optional[str] = None) -> List[LessonTemplate]:
-        """Получает шаблоны уроков с оптимизацией запросов"""
+    async def get_lesson_templates(self, type: Optional[str] = None, refresh: bool = False) -> List[LessonTemplate]:
+        """Получает шаблоны уроков с оптимизацией запросов (refresh=True - мимо кэша)"""
         try:
             # Проверяем кэш
             cache_key = f"lesson_templates:{type or 'all'}"
-            cached_templates = await self.cache_service.get_cached_data(cache_key)
-            if cached_templates:
+            cached_templates = None if refresh else await self.cache_service.get_cached_data(cache_key)
+            # Пустой список тоже закэширован (кэш заполняется заранее, см. cache_primer)
+            if cached_templates is not None:
                 return cached_templates
 
             # Формируем оптимизированный запрос
@@ -1632,14 +1207,15 @@ class CourseManager:
     async def get_course_templates(
             self,
             level: Optional[str] = None,
-            target_audience: Optional[str] = None
+            target_audience: Optional[str] = None,
+            refresh: bool = False
     ) -> List[Dict[str, Any]]:
-        """Получает шаблоны курсов с фильтрацией и оптимизацией"""
+        """Получает шаблоны курсов с фильтрацией и оптимизацией (refresh=True - мимо кэша)"""
         try:
             # Проверяем кэш
             cache_key = f"course_templates:{level or 'all'}:{target_audience or 'all'}"
-            cached_templates = await self.cache_service.get_cached_data(cache_key)
-            if cached_templates:
+            cached_templates = None if refresh else await self.cache_service.get_cached_data(cache_key)
+            if cached_templates is not None:
                 return cached_templates
 
             # Формируем оптимизированный запрос
@@ -1650,7 +1226,8 @@ class CourseManager:
             if target_audience:
                 query = query.where(Course.target_audience == target_audience)
 
-            query = await self.query_optimizer.optimize_query(query)
+            # В список попадают только поля курса - уроки не загружаются
+            query = apply_profile(query, "course_summary")
             result = await self.session.execute(query)
             templates = result.scalars().all()
 
@@ -1679,11 +1256,7 @@ class CourseManager:
     async def mark_as_template(self, course_id: int) -> bool:
         """Помечает курс как шаблон"""
         try:
-            query = await self.query_optimizer.optimize_query(
-                select(Course).where(Course.id == course_id)
-            )
-            result = await self.session.execute(query)
-            course = result.scalar_one_or_none()
+            course = await self.courses.get(course_id)
 
             if not course:
                 return False
@@ -1693,6 +1266,7 @@ class CourseManager:
 
             # Инвалидируем кэш шаблонов
             await self.cache_service.invalidate_pattern("course_templates:*")
+            await self.cache_service.invalidate(f"course_template_tree:{course_id}")
 
             return True
         except Exception as e:
@@ -1700,6 +1274,70 @@ class CourseManager:
             await self.session.rollback()
             raise
 
+    @staticmethod
+    def _course_tree(course: Course) -> Dict[str, Any]:
+        """Курс с уроками (по порядку) и активностями в виде словарей"""
+        return {
+            "id": course.id,
+            "name": course.name,
+            "language": course.language,
+            "level": course.level,
+            "target_audience": course.target_audience,
+            "format": course.format,
+            "description": course.description,
+            "exam_prep": course.exam_prep,
+            "prerequisites": list(course.prerequisites or []),
+            "learning_outcomes": list(course.learning_outcomes or []),
+            "total_duration": course.total_duration,
+            "lessons": [
+                {
+                    "title": lesson.title,
+                    "duration": lesson.duration,
+                    "order": lesson.order,
+                    "objectives": list(lesson.objectives or []),
+                    "grammar": list(lesson.grammar or []),
+                    "vocabulary": list(lesson.vocabulary or []),
+                    "materials": list(lesson.materials or []),
+                    "homework": dict(lesson.homework or {}),
+                    "activities": [
+                        {
+                            "name": activity.name,
+                            "type": activity.type,
+                            "duration": activity.duration,
+                            "description": activity.description,
+                            "materials": list(activity.materials or []),
+                            "objectives": list(activity.objectives or [])
+                        }
+                        for activity in sorted(lesson.activities, key=lambda a: a.id)
+                    ]
+                }
+                for lesson in sorted(course.lessons, key=lambda l: l.order)
+            ]
+        }
+
+    async def get_course_template_tree(self, template_id: int, refresh: bool = False) -> Optional[Dict[str, Any]]:
+        """
+        Шаблон курса с уроками и активностями в виде словарей.
+
+        Дерево кэшируется под course_template_tree:{id}; популярные шаблоны
+        загружаются в кэш заранее (services/content/cache_primer.py).
+        refresh=True перечитывает шаблон из БД.
+        """
+        cache_key = f"course_template_tree:{template_id}"
+        if not refresh:
+            cached_tree = await self.cache_service.get_cached_data(cache_key)
+            if cached_tree:
+                await record_primed_hit(self.cache_service, cache_key)
+                return cached_tree
+
+        template = await self.courses.get_template(template_id)
+        if not template:
+            return None
+
+        tree = self._course_tree(template)
+        await self.cache_service.cache_data(cache_key, tree, ttl=3600)
+        return tree
+
     @memory_optimized()
     async def generate_course_from_template(
             self,
@@ -1708,23 +1346,23 @@ class CourseManager:
             user_id: int,
             customization: Dict[str, Any] = None
     ) -> Course:
-        """Генерирует новый курс на основе шаблона с оптимизацией"""
+        """Генерирует новый курс на основе шаблона (дерево шаблона из кэша)"""
         try:
-            template = await self.get_course(template_id)
-            if not template or not template.is_template:
+            template = await self.get_course_template_tree(template_id)
+            if not template:
                 raise NotFoundException("Template not found")
 
             # Создаём новый курс на основе шаблона с учётом кастомизации
             course_data = {
                 "name": new_name,
-                "language": template.language,
-                "level": template.level,
-                "target_audience": template.target_audience,
-                "format": template.format,
-                "description": template.description,
-                "exam_prep": template.exam_prep,
-                "prerequisites": template.prerequisites.copy(),
-                "learning_outcomes": template.learning_outcomes.copy(),
+                "language": template["language"],
+                "level": template["level"],
+                "target_audience": template["target_audience"],
+                "format": template["format"],
+                "description": template["description"],
+                "exam_prep": template["exam_prep"],
+                "prerequisites": list(template["prerequisites"]),
+                "learning_outcomes": list(template["learning_outcomes"]),
                 "creator_id": user_id,
                 "is_template": False,
                 "is_used": False,
@@ -1735,97 +1373,33 @@ class CourseManager:
             if customization:
                 course_data.update(customization)
 
-            # Set initial total_duration from template
-            initial_total_duration = template.total_duration
-
-            # Создаём курс
+            # total_duration - сумма длительностей скопированных уроков
             new_course = Course(
                 **course_data,
-                total_duration=initial_total_duration  # Set initial total_duration
+                total_duration=sum(lesson["duration"] for lesson in template["lessons"]) or template["total_duration"]
             )
             self.session.add(new_course)
             await self.session.flush()
 
-            # Копируем структуру из шаблона
-            await self._copy_course_structure(template, new_course)
+            # Копируем уроки и активности шаблона многострочными INSERT
+            await self._persist_lessons(new_course.id, template["lessons"])
 
-            # Recalculate total_duration after copying structure
-            query = await self.query_optimizer.optimize_query(
-                select(Lesson).where(Lesson.course_id == new_course.id)
+            # Популярность шаблона для заблаговременной загрузки в кэш
+            await self.session.execute(
+                update(Course)
+                .where(Course.id == template_id)
+                .values(usage_count=Course.usage_count + 1, last_used=datetime.now(timezone.utc))
             )
-            result = await self.session.execute(query)
-            lessons = result.scalars().all()
-
-            # Update total_duration based on actual lesson durations
-            recalculated_total_duration = sum(lesson.duration for lesson in lessons)
-            new_course.total_duration = recalculated_total_duration
 
             await self.session.commit()
-            await self.session.refresh(new_course)
 
-            return new_course
+            return await self.courses.get_full(new_course.id)
 
         except Exception as e:
             logger.error(f"Error generating course from template: {str(e)}")
             await self.session.rollback()
             raise
 
-    async def _copy_course_structure(self, source: Course, target: Course):
-        """Копирует структуру курса из шаблона с батч-процессингом"""
-        try:
-            # Получаем все уроки шаблона оптимизированным запросом
-            query = await self.query_optimizer.optimize_query(
-                select(Lesson).where(Lesson.course_id == source.id)
-            )
-            result = await self.session.execute(query)
-            source_lessons = result.scalars().all()
-
-            # Подготавливаем данные для батч-вставки
-            lessons_data = []
-            activities_data = []
-
-            for lesson in source_lessons:
-                new_lesson = Lesson(
-                    course_id=target.id,
-                    title=lesson.title,
-                    duration=lesson.duration,
-                    order=lesson.order,
-                    objectives=lesson.objectives.copy(),
-                    grammar=lesson.grammar.copy(),
-                    vocabulary=lesson.vocabulary.copy(),
-                    materials=lesson.materials.copy(),
-                    homework=lesson.homework.copy()
-                )
-                self.session.add(new_lesson)
-                await self.session.flush()
-                lessons_data.append(new_lesson)
-
-                # Копируем активности
-                activity_query = await self.query_optimizer.optimize_query(
-                    select(Activity).where(Activity.lesson_id == lesson.id)
-                )
-                activity_result = await self.session.execute(activity_query)
-                activities = activity_result.scalars().all()
-
-                for activity in activities:
-                    new_activity = Activity(
-                        lesson_id=new_lesson.id,
-                        name=activity.name,
-                        type=activity.type,
-                        duration=activity.duration,
-                        description=activity.description,
-                        materials=activity.materials.copy(),
-                        objectives=activity.objectives.copy()
-                    )
-                    activities_data.append(new_activity)
-
-            # Батч-вставка всех активностей
-            await self.batch_processor.bulk_insert(activities_data)
-
-        except Exception as e:
-            logger.error(f"Error copying course structure: {str(e)}")
-            raise
-
     @memory_optimized()
     async def generate_next_batch(
         self,
@@ -1840,12 +1414,8 @@ class CourseManager:
         import traceback # Добавим импорт traceback здесь
 
         try:
-            # 1. Получаем курс и проверяем существование
-            query = await self.query_optimizer.optimize_query(
-                select(Course).where(Course.id == course_id)
-            )
-            result = await self.session.execute(query)
-            course = result.scalar_one_or_none()
+            # 1. Получаем курс (без уроков) и проверяем существование
+            course = await self.courses.get(course_id)
 
             if not course:
                 raise NotFoundException(f"Курс с ID {course_id} не найден.")
@@ -1866,14 +1436,12 @@ class CourseManager:
             previous_lessons_context = []
             if current_lesson_count > 0:
                 context_limit = 3
-                # Импортируем selectinload здесь, если он нужен
-                from sqlalchemy.orm import selectinload
-                context_query = await self.query_optimizer.optimize_query(
-                    select(Lesson)
+                # Для контекста нужны только поля уроков (профиль lesson_summary)
+                context_query = (
+                    apply_profile(select(Lesson), "lesson_summary")
                     .where(Lesson.course_id == course_id)
                     .order_by(Lesson.order.desc())
                     .limit(context_limit)
-                    # .options(selectinload(Lesson.activities)) # Можно раскомментировать для большего контекста
                 )
                 context_result = await self.session.execute(context_query)
                 previous_lessons_context = [
@@ -1959,54 +1527,29 @@ class CourseManager:
 
             logger.info(f"AI вернул {len(new_lessons_data)} уроков.")
 
-            # 7. Сохранение новых уроков и активностей в БД
-            created_lessons: List[Lesson] = []
-            total_new_duration = 0
-
+            # 7. Сохранение новых уроков и активностей в БД многострочными INSERT
+            lessons = []
             for lesson_index, lesson_structure in enumerate(new_lessons_data):
-                lesson_order = start_lesson_num + lesson_index
-                lesson = Lesson(
-                    course_id=course.id,
-                    title=lesson_structure.get('title', f'Урок {lesson_order}'),
-                    order=lesson_order,
-                    objectives=lesson_structure.get('objectives', []),
-                    grammar=lesson_structure.get('grammar', []),
-                    vocabulary=lesson_structure.get('vocabulary', []),
-                    materials=lesson_structure.get('materials', []),
-                    homework=lesson_structure.get('homework', {}),
-                    duration=lesson_structure.get('duration', 60),
-                    is_completed=False
-                )
-                self.session.add(lesson)
-                await self.session.flush()
-
-                lesson_duration = 0
-                activities_to_insert = []
-                for activity_index, activity_data in enumerate(lesson_structure.get('activities', [])):
-                    activity = Activity(
-                        lesson_id=lesson.id,
-                        name=activity_data.get('name', f'Активность {activity_index+1}'),
-                        type=activity_data.get('type', 'practice'),
-                        duration=activity_data.get('duration', 15),
-                        description=activity_data.get('description', ''),
-                        materials=activity_data.get('materials', []),
-                        objectives=activity_data.get('objectives', [])
-                    )
-                    activities_to_insert.append(activity)
-                    lesson_duration += activity.duration
-
-                await self.batch_processor.bulk_insert(activities_to_insert)
-                lesson.duration = lesson_duration
-                created_lessons.append(lesson)
-                total_new_duration += lesson_duration
+                lesson = self._lesson_from_structure(lesson_structure, start_lesson_num + lesson_index)
+                lesson["duration"] = sum(activity["duration"] for activity in lesson["activities"])
+                lessons.append(lesson)
+            lesson_ids = await self._persist_lessons(course.id, lessons)
 
+            total_new_duration = sum(lesson["duration"] for lesson in lessons)
             course.total_duration = (course.total_duration or 0) + total_new_duration
             await self.session.commit()
 
+            # Созданные уроки с активностями одним запросом (профиль lesson_with_activities)
+            created_result = await self.session.execute(
+                apply_profile(select(Lesson), "lesson_with_activities")
+                .where(Lesson.id.in_(lesson_ids))
+                .order_by(Lesson.order)
+            )
+            created_lessons = list(created_result.scalars().all())
+
             logger.info(f"Успешно создано и сохранено {len(created_lessons)} новых уроков.")
 
             # Возвращаем только что созданные уроки
-            # Можно сделать refresh или отдельный запрос для получения полных данных
             return created_lessons
 
         except NotFoundException:
@@ -0,0 +1,28 @@
+from .streaming import (
+    ExportColumn,
+    stream_rows,
+    stream_csv,
+    stream_json,
+    stream_xlsx,
+    write_xlsx,
+    streaming_response
+)
+from .jobs import ExportJobManager
+from .generations import GENERATION_EXPORT_COLUMNS, generation_export_query, generation_batches
+
+__all__ = [
+    # Потоковая сериализация
+    'ExportColumn',
+    'stream_rows',
+    'stream_csv',
+    'stream_json',
+    'stream_xlsx',
+    'write_xlsx',
+    'streaming_response',
+    # Фоновые экспорты
+    'ExportJobManager',
+    # Генерации
+    'GENERATION_EXPORT_COLUMNS',
+    'generation_export_query',
+    'generation_batches'
+]
@@ -0,0 +1,103 @@
+"""
+Экспорт генераций: запрос, колонки и преобразование строк.
+
+Запрос выбирает только нужные колонки генерации и имя пользователя через
+LEFT JOIN, без загрузки ORM-объектов и отдельного запроса пользователей,
+поэтому результат можно читать серверным курсором.
+"""
+import logging
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import select
+
+from ...core.constants import ContentType
+from ...models import Generation, User
+from .streaming import ExportColumn, RowBatches, stream_rows
+
+logger = logging.getLogger(__name__)
+
+GENERATION_EXPORT_COLUMNS: List[ExportColumn] = [
+    ExportColumn("id", "ID", 10),
+    ExportColumn("user_id", "ID пользователя", 15),
+    ExportColumn("user_name", "Имя пользователя", 25),
+    ExportColumn("type", "Тип генерации", 20),
+    ExportColumn("type_formatted", "Тип (форматированный)", 25),
+    ExportColumn("content", "Содержимое", 50),
+    ExportColumn("prompt", "Запрос", 50),
+    ExportColumn("created_at", "Дата создания", 22)
+]
+
+GENERATION_SORT_COLUMNS = ("id", "user_id", "type", "created_at")
+
+
+def generation_export_query(
+        start_date: Optional[datetime] = None,
+        end_date: Optional[datetime] = None,
+        type: Optional[str] = None,
+        user_id: Optional[int] = None,
+        sort_by: str = "created_at",
+        sort_order: str = "desc"
+):
+    """Запрос генераций для экспорта с фильтрами и сортировкой"""
+    query = (
+        select(
+            Generation.id,
+            Generation.user_id,
+            Generation.type,
+            Generation.content,
+            Generation.prompt,
+            Generation.created_at,
+            User.first_name,
+            User.last_name,
+            User.username
+        )
+        .select_from(Generation)
+        .outerjoin(User, User.id == Generation.user_id)
+    )
+
+    if start_date:
+        query = query.where(Generation.created_at >= start_date)
+    if end_date:
+        query = query.where(Generation.created_at <= end_date)
+
+    if type:
+        try:
+            query = query.where(Generation.type == ContentType(type))
+        except ValueError:
+            # Если тип не соответствует enum, игнорируем фильтр
+            logger.warning(f"Invalid content type filter: {type}")
+
+    if user_id:
+        query = query.where(Generation.user_id == user_id)
+
+    if sort_by not in GENERATION_SORT_COLUMNS:
+        sort_by = "created_at"
+    sort_column = getattr(Generation, sort_by)
+    query = query.order_by(sort_column.desc() if sort_order == "desc" else sort_column.asc())
+    if sort_by != "id":
+        # Стабильный порядок при одинаковых значениях
+        query = query.order_by(Generation.id.desc() if sort_order == "desc" else Generation.id.asc())
+    return query
+
+
+def generation_export_row(row: Any) -> Dict[str, Any]:
+    """Строка результата запроса -> словарь для экспорта"""
+    user_name = f"{row['first_name'] or ''} {row['last_name'] or ''}".strip()
+    user_name = user_name or row["username"] or f"ID: {row['user_id']}"
+    type_value = row["type"].value if row["type"] is not None else ""
+    return {
+        "id": row["id"],
+        "user_id": row["user_id"],
+        "user_name": user_name,
+        "type": type_value,
+        "type_formatted": type_value.replace("_", " ").title(),
+        "content": row["content"],
+        "prompt": row["prompt"],
+        "created_at": row["created_at"]
+    }
+
+
+def generation_batches(batch_size: Optional[int] = None, **filters) -> RowBatches:
+    """Пачки строк экспорта генераций (фильтры - как у generation_export_query)"""
+    return stream_rows(generation_export_query(**filters), generation_export_row, batch_size)
@@ -0,0 +1,144 @@
+"""
+Фоновые экспорты в файл.
+
+Задача экспорта пишет файл в EXPORT_DIR, а состояние - в JSON рядом с ним,
+поэтому статус и ссылка на скачивание доступны из любого воркера с общим
+диском. Файл пишется под временным именем и переименовывается только после
+успешного завершения. Файлы старше EXPORT_TTL_HOURS удаляются при создании
+новых задач.
+"""
+import asyncio
+import json
+import logging
+import os
+import re
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional, Sequence
+
+from ...core.config import settings
+from .streaming import ExportColumn, RowBatches, stream_csv, stream_json, write_xlsx
+
+logger = logging.getLogger(__name__)
+
+_JOB_ID = re.compile(r"^[0-9a-f]{32}$")
+
+
+class ExportJobManager:
+    """Создание, выполнение и поиск фоновых экспортов"""
+
+    def __init__(self, export_dir: Optional[str] = None, ttl_hours: Optional[int] = None):
+        self.export_dir = export_dir or settings.EXPORT_DIR
+        self.ttl_hours = ttl_hours if ttl_hours is not None else settings.EXPORT_TTL_HOURS
+        os.makedirs(self.export_dir, exist_ok=True)
+
+    def _meta_path(self, job_id: str) -> str:
+        return os.path.join(self.export_dir, f"{job_id}.json")
+
+    def _data_path(self, job_id: str, format: str) -> str:
+        return os.path.join(self.export_dir, f"{job_id}.{format}")
+
+    def _save_meta(self, meta: Dict[str, Any]) -> None:
+        path = self._meta_path(meta["job_id"])
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as file:
+            json.dump(meta, file, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    def create(self, kind: str, format: str, filename: str) -> Dict[str, Any]:
+        """Регистрирует новую задачу экспорта в статусе pending"""
+        self.cleanup_expired()
+        meta = {
+            "job_id": uuid.uuid4().hex,
+            "kind": kind,
+            "format": format,
+            "filename": f"{filename}.{format}",
+            "status": "pending",
+            "rows": 0,
+            "size": 0,
+            "error": None,
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "finished_at": None
+        }
+        self._save_meta(meta)
+        return meta
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        if not _JOB_ID.match(job_id or ""):
+            return None
+        try:
+            with open(self._meta_path(job_id), encoding="utf-8") as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return None
+
+    def file_path(self, job_id: str) -> Optional[str]:
+        """Путь к готовому файлу или None, если экспорт не завершен"""
+        meta = self.get(job_id)
+        if not meta or meta["status"] != "done":
+            return None
+        path = self._data_path(job_id, meta["format"])
+        return path if os.path.exists(path) else None
+
+    async def run(
+            self,
+            job_id: str,
+            batches: RowBatches,
+            columns: Sequence[ExportColumn],
+            sheet_name: str = "Data"
+    ) -> None:
+        """Выполняет экспорт в файл и обновляет состояние задачи"""
+        meta = self.get(job_id)
+        if meta is None:
+            logger.error(f"Export job {job_id} not found")
+            return
+
+        meta["status"] = "running"
+        self._save_meta(meta)
+        path = self._data_path(job_id, meta["format"])
+        tmp_path = f"{path}.part"
+        rows = 0
+
+        async def counted():
+            nonlocal rows
+            async for batch in batches:
+                rows += len(batch)
+                yield batch
+
+        try:
+            if meta["format"] == "xlsx":
+                await write_xlsx(counted(), columns, tmp_path, sheet_name)
+            else:
+                encoder = stream_csv if meta["format"] == "csv" else stream_json
+                with open(tmp_path, "wb") as file:
+                    async for chunk in encoder(counted(), columns):
+                        await asyncio.to_thread(file.write, chunk)
+            os.replace(tmp_path, path)
+
+            meta.update(status="done", rows=rows, size=os.path.getsize(path))
+            logger.info(f"Export job {job_id} finished: {rows} rows, {meta['size']} bytes")
+        except Exception as e:
+            logger.error(f"Export job {job_id} failed: {str(e)}")
+            meta.update(status="failed", rows=rows, error=str(e))
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+        finally:
+            meta["finished_at"] = datetime.now(timezone.utc).isoformat()
+            self._save_meta(meta)
+
+    def cleanup_expired(self) -> int:
+        """Удаляет файлы экспорта старше TTL"""
+        cutoff = time.time() - self.ttl_hours * 3600
+        removed = 0
+        for name in os.listdir(self.export_dir):
+            path = os.path.join(self.export_dir, name)
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    os.unlink(path)
+                    removed += 1
+            except OSError:
+                continue
+        return removed
@@ -0,0 +1,256 @@
+"""
+Потоковый экспорт больших выборок в CSV, JSON и XLSX.
+
+Строки читаются из БД серверным курсором пачками (yield_per) в отдельной
+сессии, каждая пачка сразу сериализуется и отдается клиенту, поэтому
+потребление памяти не зависит от количества строк. XLSX пишется openpyxl в
+режиме write-only (строки сразу уходят во временный XML-файл), ширина колонок
+задается заранее без обхода ячеек. Готовый XLSX - zip-архив, поэтому он
+собирается во временный файл и отдается кусками.
+"""
+import asyncio
+import csv
+import io
+import json
+import logging
+import os
+import tempfile
+from dataclasses import dataclass
+from datetime import date, datetime
+from enum import Enum
+from typing import Any, AsyncIterator, Callable, Dict, Iterable, List, Optional, Sequence
+
+from fastapi.responses import StreamingResponse
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Alignment, Font, PatternFill
+from openpyxl.utils import get_column_letter
+
+from ...core.config import settings
+from ...core.database import async_session
+from ...utils.excel_export import excel_cell_value
+
+logger = logging.getLogger(__name__)
+
+# Ограничение формата XLSX на число строк листа
+XLSX_MAX_ROWS = 1_048_576
+
+FILE_CHUNK_SIZE = 64 * 1024
+
+MEDIA_TYPES = {
+    "csv": "text/csv; charset=utf-8",
+    "json": "application/json",
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+}
+
+RowBatches = AsyncIterator[List[Dict[str, Any]]]
+
+
+@dataclass(frozen=True)
+class ExportColumn:
+    """Колонка экспорта: ключ в строке, заголовок и ширина в XLSX (в символах)"""
+    key: str
+    title: str
+    width: int = 15
+
+
+def _plain(value: Any) -> Any:
+    """Значение для CSV/JSON"""
+    if value is None:
+        return ""
+    if isinstance(value, Enum):
+        return value.value
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, ensure_ascii=False, default=str)
+    return value
+
+
+async def stream_rows(
+        statement,
+        row_mapper: Optional[Callable[[Any], Dict[str, Any]]] = None,
+        batch_size: Optional[int] = None,
+        session_factory=async_session
+) -> RowBatches:
+    """
+    Читает результат запроса серверным курсором и отдает пачки словарей
+
+    Сессия открывается здесь же: тело StreamingResponse выполняется уже после
+    выхода из обработчика, когда сессия запроса может быть закрыта.
+    """
+    batch_size = batch_size or settings.EXPORT_BATCH_SIZE
+    async with session_factory() as session:
+        result = await session.stream(statement.execution_options(yield_per=batch_size))
+        async for partition in result.mappings().partitions(batch_size):
+            yield [row_mapper(row) if row_mapper else dict(row) for row in partition]
+
+
+class CsvRowWriter:
+    """Построчная запись CSV в небольшой буфер, который очищается после каждой пачки"""
+
+    def __init__(self, columns: Sequence[ExportColumn], bom: bool = True):
+        self.columns = columns
+        self.bom = bom
+        self._buffer = io.StringIO()
+        self._writer = csv.writer(self._buffer)
+
+    def _drain(self) -> bytes:
+        data = self._buffer.getvalue().encode("utf-8")
+        self._buffer.seek(0)
+        self._buffer.truncate()
+        return data
+
+    def header(self) -> bytes:
+        self._writer.writerow([column.title for column in self.columns])
+        # BOM нужен Excel, чтобы открыть UTF-8 CSV с кириллицей
+        return ("\ufeff".encode("utf-8") if self.bom else b"") + self._drain()
+
+    def rows(self, rows: Iterable[Dict[str, Any]]) -> bytes:
+        for row in rows:
+            self._writer.writerow([_plain(row.get(column.key)) for column in self.columns])
+        return self._drain()
+
+
+async def stream_csv(batches: RowBatches, columns: Sequence[ExportColumn], bom: bool = True) -> AsyncIterator[bytes]:
+    writer = CsvRowWriter(columns, bom=bom)
+    yield writer.header()
+    async for batch in batches:
+        yield writer.rows(batch)
+
+
+async def stream_json(batches: RowBatches, columns: Sequence[ExportColumn]) -> AsyncIterator[bytes]:
+    """JSON-массив объектов, сериализуемый по одной пачке"""
+    yield b"["
+    first = True
+    async for batch in batches:
+        parts = []
+        for row in batch:
+            item = {
+                column.key: None if row.get(column.key) is None else _plain(row.get(column.key))
+                for column in columns
+            }
+            parts.append(("" if first else ",") + json.dumps(item, ensure_ascii=False, default=str))
+            first = False
+        yield "".join(parts).encode("utf-8")
+    yield b"]"
+
+
+class XlsxStreamWriter:
+    """XLSX в режиме write-only; при превышении лимита строк Excel начинается новый лист"""
+
+    def __init__(
+            self,
+            columns: Sequence[ExportColumn],
+            sheet_name: str = "Data",
+            max_rows_per_sheet: int = XLSX_MAX_ROWS
+    ):
+        self.columns = columns
+        self.sheet_name = sheet_name
+        self.max_rows_per_sheet = max_rows_per_sheet
+        self.workbook = Workbook(write_only=True)
+        self.rows_written = 0
+        self._sheet = None
+        self._sheet_rows = 0
+        self._sheet_count = 0
+        self._new_sheet()
+
+    def _new_sheet(self) -> None:
+        self._sheet_count += 1
+        title = self.sheet_name if self._sheet_count == 1 else f"{self.sheet_name} ({self._sheet_count})"
+        sheet = self.workbook.create_sheet(title[:31])
+
+        # В write-only режиме ширину колонок нужно задать до первой строки
+        for index, column in enumerate(self.columns, start=1):
+            sheet.column_dimensions[get_column_letter(index)].width = column.width
+
+        header = []
+        for column in self.columns:
+            cell = WriteOnlyCell(sheet, value=column.title)
+            cell.font = Font(bold=True, color="FFFFFF")
+            cell.fill = PatternFill(start_color="366092", end_color="366092", fill_type="solid")
+            cell.alignment = Alignment(horizontal="center", vertical="center")
+            header.append(cell)
+        sheet.append(header)
+
+        self._sheet = sheet
+        self._sheet_rows = 1
+
+    def append_rows(self, rows: Iterable[Dict[str, Any]]) -> None:
+        for row in rows:
+            if self._sheet_rows >= self.max_rows_per_sheet:
+                self._new_sheet()
+            self._sheet.append([excel_cell_value(row.get(column.key)) for column in self.columns])
+            self._sheet_rows += 1
+            self.rows_written += 1
+
+    def save(self, target) -> None:
+        self.workbook.save(target)
+
+
+async def write_xlsx(batches: RowBatches, columns: Sequence[ExportColumn], path: str, sheet_name: str = "Data") -> int:
+    """Пишет XLSX в файл; сериализация выполняется вне event loop. Возвращает число строк"""
+    writer = XlsxStreamWriter(columns, sheet_name)
+    async for batch in batches:
+        await asyncio.to_thread(writer.append_rows, batch)
+    await asyncio.to_thread(writer.save, path)
+    return writer.rows_written
+
+
+async def iter_file(path: str, chunk_size: int = FILE_CHUNK_SIZE) -> AsyncIterator[bytes]:
+    with open(path, "rb") as file:
+        while True:
+            chunk = await asyncio.to_thread(file.read, chunk_size)
+            if not chunk:
+                break
+            yield chunk
+
+
+async def stream_xlsx(batches: RowBatches, columns: Sequence[ExportColumn], sheet_name: str = "Data") -> AsyncIterator[bytes]:
+    fd, path = tempfile.mkstemp(suffix=".xlsx")
+    os.close(fd)
+    try:
+        await write_xlsx(batches, columns, path, sheet_name)
+        async for chunk in iter_file(path):
+            yield chunk
+    finally:
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+
+
+def encode_stream(
+        batches: RowBatches,
+        columns: Sequence[ExportColumn],
+        format: str,
+        sheet_name: str = "Data"
+) -> AsyncIterator[bytes]:
+    """Поток байтов экспорта в указанном формате (csv, json, xlsx)"""
+    if format == "csv":
+        return stream_csv(batches, columns)
+    if format == "json":
+        return stream_json(batches, columns)
+    if format == "xlsx":
+        return stream_xlsx(batches, columns, sheet_name)
+    raise ValueError(f"Unsupported export format: {format}")
+
+
+def streaming_response(
+        batches: RowBatches,
+        columns: Sequence[ExportColumn],
+        format: str,
+        filename: str,
+        sheet_name: str = "Data"
+) -> StreamingResponse:
+    """StreamingResponse с экспортом, отдаваемым по частям"""
+    return StreamingResponse(
+        encode_stream(batches, columns, format, sheet_name),
+        media_type=MEDIA_TYPES[format],
+        headers={
+            "Content-Disposition": f"attachment; filename={filename}.{format}",
+            "Cache-Control": "no-cache",
+            # Не буферизовать ответ на прокси (nginx)
+            "X-Accel-Buffering": "no"
+        }
+    )
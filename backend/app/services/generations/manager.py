@@ -1,18 +1,24 @@
 # services/generations/manager.py
-from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import datetime
-import pandas as pd
-import io
 import logging
-from typing import Optional, Dict, Any
+from typing import AsyncIterator, Optional, Dict, Any
 from ...repositories import GenerationRepository
 from ...schemas.generations import GenerationFilter
 from ...services.optimization.batch_processor import BatchProcessor
+from ...services.export.streaming import ExportColumn, stream_rows, stream_csv, stream_json
+from ...services.export.generations import generation_export_query, generation_export_row
 from ...core.memory import memory_optimized
 
 logger = logging.getLogger(__name__)
 
+# Колонки CSV/JSON экспорта генераций (заголовки CSV совпадают с ключами)
+EXPORT_COLUMNS = [
+    ExportColumn(key, key)
+    for key in ("id", "user_id", "type", "content", "prompt", "created_at")
+]
+
+
 class GenerationService:
     def __init__(self, session: AsyncSession):
         self.session = session
@@ -51,50 +57,34 @@ class GenerationService:
             logger.error(f"Error getting generation {generation_id}: {str(e)}")
             raise
 
-    @memory_optimized()
     async def export_generations(
         self,
         format: str,
         filter: Optional[GenerationFilter] = None
-    ) -> StreamingResponse:
-        """Экспорт генераций в CSV или другой формат"""
+    ) -> AsyncIterator[bytes]:
+        """
+        Экспорт генераций в CSV или JSON
+
+        Возвращает асинхронный поток байтов для StreamingResponse. Строки
+        читаются пачками в отдельной сессии, так как поток выполняется уже
+        после закрытия сессии сервиса.
+        """
         try:
-            generations = await self.repository.get_filtered(
-                type=filter.type if filter else None,
-                user_id=filter.user_id if filter else None,
-                start_date=filter.start_date if filter else None,
-                end_date=filter.end_date if filter else None
+            batches = stream_rows(
+                generation_export_query(
+                    start_date=filter.start_date if filter else None,
+                    end_date=filter.end_date if filter else None,
+                    type=filter.type if filter else None,
+                    user_id=filter.user_id if filter else None,
+                    sort_order="asc"
+                ),
+                generation_export_row
             )
-
             if format == "csv":
-                # Обрабатываем данные батчами для оптимизации памяти
-                data = []
-                async def process_batch(batch):
-                    for g in batch:
-                        data.append({
-                            'id': g.id,
-                            'user_id': g.user_id,
-                            'type': g.type.value,
-                            'content': g.content,
-                            'prompt': g.prompt,
-                            'created_at': g.created_at
-                        })
-
-                await self.batch_processor.process_in_batches(generations, process_batch)
-
-                df = pd.DataFrame(data)
-                output = io.StringIO()
-                df.to_csv(output, index=False)
-
-                response = StreamingResponse(
-                    iter([output.getvalue()]),
-                    media_type="text/csv"
-                )
-                response.headers["Content-Disposition"] = \
-                    f"attachment; filename=generations_{datetime.utcnow().date()}.csv"
-                return response
-
-            return [g.__dict__ for g in generations]
+                return stream_csv(batches, EXPORT_COLUMNS)
+            if format == "json":
+                return stream_json(batches, EXPORT_COLUMNS)
+            raise ValueError(f"Unsupported export format: {format}")
 
         except Exception as e:
             logger.error(f"Error exporting generations: {str(e)}")
@@ -3,96 +3,191 @@
 """
 import asyncio
 import logging
+import time
 from datetime import datetime, timedelta, timezone
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, delete, and_, or_, func, exc
+from sqlalchemy import text
 from typing import List, Dict, Any, Optional
 
-from ...models import DailyUsage, UsageLog, UserTariff, User
 from ...core.database import async_session
 from ...core.config import settings
+from .partitioning import LogPartitionManager, PARTITIONED_TABLES, add_months, month_start
 
 logger = logging.getLogger(__name__)
 
 class DailyMaintenanceService:
     """
     Сервис для выполнения ежедневных задач обслуживания системы.
+
+    Все задачи выполняются множественными SQL-операциями без построчных
+    обращений к БД: вставки - через INSERT ... SELECT по диапазонам id,
+    удаления - порциями по первичному ключу, чтобы не держать длинные
+    блокировки (ctid не годится: в секционированной таблице он уникален
+    только внутри секции).
+    В режиме dry_run задачи только считают затрагиваемые строки.
     """
 
-    def __init__(self, session: Optional[AsyncSession] = None):
+    def __init__(
+            self,
+            session: Optional[AsyncSession] = None,
+            dry_run: bool = False,
+            batch_size: Optional[int] = None
+    ):
         self.session = session or async_session()
-
-    async def reset_daily_usage(self) -> int:
+        self.dry_run = dry_run
+        self.batch_size = batch_size or settings.MAINTENANCE_BATCH_SIZE
+        # Метрики выполнения задач: {task: {...}}
+        self.metrics: Dict[str, Dict[str, Any]] = {}
+
+    def _start_metrics(self, task: str) -> Dict[str, Any]:
+        metrics = {
+            "task": task,
+            "dry_run": self.dry_run,
+            "affected": 0,
+            "batches": 0,
+            "started_at": datetime.now(timezone.utc).isoformat(),
+            "duration_seconds": 0.0,
+        }
+        self.metrics[task] = metrics
+        metrics["_started"] = time.perf_counter()
+        return metrics
+
+    def _finish_metrics(self, metrics: Dict[str, Any]) -> Dict[str, Any]:
+        metrics["duration_seconds"] = round(time.perf_counter() - metrics.pop("_started"), 3)
+        logger.info(
+            f"Обслуживание {metrics['task']}{' (dry run)' if self.dry_run else ''}: "
+            f"затронуто {metrics['affected']} строк за {metrics['batches']} шагов, "
+            f"{metrics['duration_seconds']} с"
+        )
+        return metrics
+
+    async def _chunked_delete(
+            self,
+            table: str,
+            condition: str,
+            params: Dict[str, Any],
+            metrics: Dict[str, Any],
+            key: str = "id"
+    ) -> int:
         """
-        Сбрасывает счетчики дневного использования для всех пользователей.
+        Удаляет строки по условию порциями по batch_size, выбирая порцию
+        по первичному ключу key. Для секционированных таблиц key должен
+        включать ключ секционирования, например "id, created_at".
+        Каждая порция фиксируется отдельно, поэтому блокировки короткие.
         """
-        try:
-            today = datetime.now(timezone.utc).date()
-            yesterday = today - timedelta(days=1)
-
-            # Удаляем записи дневного использования старше определенного срока (кроме вчерашнего дня)
-            delete_stmt = delete(DailyUsage).where(
-                and_(
-                    DailyUsage.date < yesterday,
-                    DailyUsage.date < today - timedelta(days=settings.USAGE_HISTORY_DAYS)
-                )
+        if self.dry_run:
+            result = await self.session.execute(
+                text(f"SELECT COUNT(*) FROM {table} WHERE {condition}"),
+                params
             )
+            count = result.scalar() or 0
+            metrics["affected"] += count
+            return count
 
-            result = await self.session.execute(delete_stmt)
-            deleted_count = result.rowcount
-
-            # Создаем новые записи для активных пользователей
-            # Получаем активных пользователей (заходивших за последние 7 дней)
-            active_date = datetime.now(timezone.utc) - timedelta(days=7)
-            active_users_query = select(User.id).where(
-                or_(
-                    User.last_active >= active_date,
-                    User.tariff_valid_until >= datetime.now(timezone.utc)
-                )
+        delete_query = text(f"""
+            DELETE FROM {table}
+            WHERE ({key}) IN (
+                SELECT {key} FROM {table}
+                WHERE {condition}
+                LIMIT :batch_size
             )
+        """)
 
-            result = await self.session.execute(active_users_query)
-            active_user_ids = [row[0] for row in result.fetchall()]
+        total = 0
+        while True:
+            result = await self.session.execute(delete_query, {**params, "batch_size": self.batch_size})
+            await self.session.commit()
 
-            # Проверяем, у каких пользователей нет записи на сегодня
-            existing_query = select(DailyUsage.user_id).where(
-                DailyUsage.date == today
-            )
-            result = await self.session.execute(existing_query)
-            existing_user_ids = [row[0] for row in result.fetchall()]
+            deleted = result.rowcount or 0
+            total += deleted
+            metrics["affected"] += deleted
+            metrics["batches"] += 1
+            logger.debug(f"{table}: удалено {total} строк ({metrics['batches']} порций)")
 
-            # Создаем записи для пользователей, у которых их нет
-            users_to_create = set(active_user_ids) - set(existing_user_ids)
-            created_count = 0
+            if deleted < self.batch_size:
+                break
+            # Отдаем управление циклу событий между порциями
+            await asyncio.sleep(0)
 
-            if users_to_create:
-                # Используем INSERT ... ON CONFLICT для атомарного создания записей
-                from sqlalchemy import text
+        return total
 
-                # Создаем запрос для массового добавления записей
-                query = text("""
-                INSERT INTO daily_usage (user_id, date, generations_count, lesson_plans_count, exercises_count, games_count, images_count, transcripts_count, points_earned, points_spent)
-                VALUES (:user_id, :date, 0, 0, 0, 0, 0, 0, 0, 0)
+    async def reset_daily_usage(self) -> int:
+        """
+        Сбрасывает счетчики дневного использования для всех пользователей:
+        удаляет устаревшие записи и создает пустые записи на сегодня
+        для активных пользователей одним INSERT ... SELECT на диапазон id.
+        """
+        metrics = self._start_metrics("reset_daily_usage")
+        try:
+            now = datetime.now(timezone.utc)
+            today = now.date()
+            history_cutoff = today - timedelta(days=max(1, settings.USAGE_HISTORY_DAYS))
+
+            # Удаляем записи дневного использования старше срока хранения (вчерашний день сохраняется всегда)
+            deleted_count = await self._chunked_delete(
+                "daily_usage",
+                "date < :cutoff",
+                {"cutoff": history_cutoff},
+                metrics
+            )
+            metrics["deleted"] = deleted_count
+            metrics["affected"] = 0
+
+            # Активные пользователи - заходившие за последние 7 дней или с действующим тарифом
+            params = {
+                "today": today,
+                "active_date": now - timedelta(days=7),
+                "now": now,
+            }
+            active_condition = "(u.last_active >= :active_date OR u.tariff_valid_until >= :now)"
+
+            if self.dry_run:
+                result = await self.session.execute(text(f"""
+                    SELECT COUNT(*) FROM users u
+                    WHERE {active_condition}
+                      AND NOT EXISTS (
+                          SELECT 1 FROM daily_usage d
+                          WHERE d.user_id = u.id AND d.date = :today
+                      )
+                """), params)
+                created_count = result.scalar() or 0
+                metrics["affected"] = created_count
+                metrics["created"] = created_count
+                return created_count
+
+            bounds = (await self.session.execute(text("SELECT MIN(id), MAX(id) FROM users"))).first()
+            min_id, max_id = (bounds[0], bounds[1]) if bounds else (None, None)
+
+            insert_query = text(f"""
+                INSERT INTO daily_usage (
+                    user_id, date, generations_count, lesson_plans_count, exercises_count,
+                    games_count, images_count, transcripts_count, points_earned, points_spent
+                )
+                SELECT u.id, :today, 0, 0, 0, 0, 0, 0, 0, 0
+                FROM users u
+                WHERE u.id >= :from_id AND u.id < :to_id
+                  AND {active_condition}
                 ON CONFLICT (user_id, date) DO NOTHING
-                """)
-
-                try:
-                    # Выполняем запрос для каждого пользователя
-                    for user_id in users_to_create:
-                        try:
-                            await self.session.execute(query, {"user_id": user_id, "date": today})
-                            created_count += 1
-                        except Exception as e:
-                            logger.error(f"Ошибка при создании записи DailyUsage для пользователя {user_id}: {e}")
-
-                    # Финальный коммит для сохранения всех успешно созданных записей
+            """)
+
+            created_count = 0
+            if min_id is not None:
+                for from_id in range(min_id, max_id + 1, self.batch_size):
+                    result = await self.session.execute(
+                        insert_query,
+                        {**params, "from_id": from_id, "to_id": from_id + self.batch_size}
+                    )
                     await self.session.commit()
-                except Exception as e:
-                    logger.error(f"Ошибка при массовом создании записей DailyUsage: {e}")
-                    await self.session.rollback()
+
+                    created_count += result.rowcount or 0
+                    metrics["batches"] += 1
+                    await asyncio.sleep(0)
+
+            metrics["affected"] = created_count
+            metrics["created"] = created_count
 
             logger.info(f"Удалено {deleted_count} устаревших записей DailyUsage")
-            logger.info(f"Создано {created_count} из {len(users_to_create)} новых записей DailyUsage для активных пользователей")
+            logger.info(f"Создано {created_count} новых записей DailyUsage для активных пользователей")
 
             return created_count
 
@@ -100,24 +195,33 @@ class DailyMaintenanceService:
             logger.error(f"Ошибка при сбросе дневного использования: {e}")
             await self.session.rollback()
             raise
+        finally:
+            self._finish_metrics(metrics)
 
     async def cleanup_usage_logs(self, days_to_keep: int = 30) -> int:
         """
-        Удаляет старые записи из логов использования.
+        Удаляет старые записи из логов использования: целые месяцы -
+        удалением секций, остаток граничного месяца - порциями по
+        первичному ключу (id, created_at).
         """
+        metrics = self._start_metrics("cleanup_usage_logs")
         try:
             cutoff_date = datetime.now(timezone.utc) - timedelta(days=days_to_keep)
 
-            # Удаляем записи старше указанного срока
-            delete_stmt = delete(UsageLog).where(
-                UsageLog.created_at < cutoff_date
+            if not self.dry_run:
+                metrics["partitions"] = await LogPartitionManager(self.session).drop_partitions_before(
+                    "usage_logs", cutoff_date
+                )
+                await self.session.commit()
+
+            deleted_count = await self._chunked_delete(
+                "usage_logs",
+                "created_at < :cutoff",
+                {"cutoff": cutoff_date},
+                metrics,
+                key="id, created_at"
             )
 
-            result = await self.session.execute(delete_stmt)
-            deleted_count = result.rowcount
-
-            await self.session.commit()
-
             logger.info(f"Удалено {deleted_count} устаревших записей UsageLog")
 
             return deleted_count
@@ -126,43 +230,99 @@ class DailyMaintenanceService:
             logger.error(f"Ошибка при очистке логов использования: {e}")
             await self.session.rollback()
             raise
+        finally:
+            self._finish_metrics(metrics)
 
-    async def check_expired_tariffs(self) -> int:
+    async def maintain_log_partitions(self) -> Dict[str, Any]:
         """
-        Проверяет истекшие тарифы и обновляет статус пользователей.
+        Создает будущие помесячные секции журналов и удаляет секции
+        старше сроков хранения из settings.LOG_RETENTION_DAYS.
         """
+        metrics = self._start_metrics("maintain_log_partitions")
         try:
+            manager = LogPartitionManager(self.session)
             now = datetime.now(timezone.utc)
+            created, removed = {}, {}
 
-            # Находим пользователей с истекшими тарифами
-            expired_query = select(User).where(
-                and_(
-                    User.tariff_valid_until < now,
-                    User.tariff != None
-                )
-            )
+            for table in PARTITIONED_TABLES:
+                if not await manager.is_partitioned(table):
+                    continue
 
-            result = await self.session.execute(expired_query)
-            expired_users = result.scalars().all()
+                cutoff = now - timedelta(days=settings.LOG_RETENTION_DAYS[table])
+                if self.dry_run:
+                    partitions = await manager.list_partitions(table)
+                    removed[table] = [
+                        name for month, name in sorted(partitions.items())
+                        if add_months(month, 1) <= month_start(cutoff)
+                    ]
+                    continue
 
-            count = 0
-            for user in expired_users:
-                # Помечаем тарифные записи как неактивные
-                tariff_query = select(UserTariff).where(
-                    and_(
-                        UserTariff.user_id == user.id,
-                        UserTariff.is_active == True
-                    )
-                )
-                tariff_result = await self.session.execute(tariff_query)
-                tariffs = tariff_result.scalars().all()
+                created[table] = await manager.ensure_partitions(table)
+                removed[table] = await manager.drop_partitions_before(table, cutoff)
+                await self.session.commit()
+                metrics["batches"] += 1
 
-                for tariff in tariffs:
-                    tariff.is_active = False
+            metrics["affected"] = sum(len(names) for names in removed.values())
+            metrics["created"] = created
+            metrics["removed"] = removed
 
-                count += 1
+            return {"created": created, "removed": removed}
 
-            await self.session.commit()
+        except Exception as e:
+            logger.error(f"Ошибка при обслуживании секций журналов: {e}")
+            await self.session.rollback()
+            raise
+        finally:
+            self._finish_metrics(metrics)
+
+    async def check_expired_tariffs(self) -> int:
+        """
+        Проверяет истекшие тарифы и деактивирует тарифные записи
+        одним UPDATE ... FROM. Возвращает количество пользователей
+        с истекшим тарифом, число деактивированных записей - в метриках.
+        """
+        metrics = self._start_metrics("check_expired_tariffs")
+        try:
+            params = {"now": datetime.now(timezone.utc)}
+            expired_users = """
+                SELECT COUNT(*) FROM users u
+                WHERE u.tariff IS NOT NULL AND u.tariff_valid_until < :now
+            """
+            expired_condition = """
+                ut.user_id = u.id
+                AND ut.is_active = TRUE
+                AND u.tariff IS NOT NULL
+                AND u.tariff_valid_until < :now
+            """
+
+            if self.dry_run:
+                result = await self.session.execute(text(f"""
+                    SELECT
+                        ({expired_users}) AS expired_users,
+                        (SELECT COUNT(*) FROM user_tariffs ut, users u WHERE {expired_condition}) AS deactivated
+                """), params)
+            else:
+                result = await self.session.execute(text(f"""
+                    WITH updated AS (
+                        UPDATE user_tariffs ut
+                        SET is_active = FALSE
+                        FROM users u
+                        WHERE {expired_condition}
+                        RETURNING ut.id
+                    )
+                    SELECT
+                        ({expired_users}) AS expired_users,
+                        (SELECT COUNT(*) FROM updated) AS deactivated
+                """), params)
+                metrics["batches"] = 1
+
+            row = result.first()
+            count = row.expired_users or 0
+            metrics["affected"] = row.deactivated or 0
+            metrics["expired_users"] = count
+
+            if not self.dry_run:
+                await self.session.commit()
 
             logger.info(f"Обработано {count} пользователей с истекшими тарифами")
 
@@ -172,6 +332,8 @@ class DailyMaintenanceService:
             logger.error(f"Ошибка при проверке истекших тарифов: {e}")
             await self.session.rollback()
             raise
+        finally:
+            self._finish_metrics(metrics)
 
     async def run_all_maintenance_tasks(self) -> Dict[str, Any]:
         """
@@ -190,11 +352,17 @@ class DailyMaintenanceService:
             # Проверка истекших тарифов
             expired_count = await self.check_expired_tariffs()
 
+            # Будущие секции журналов и удаление секций старше срока хранения
+            partitions = await self.maintain_log_partitions()
+
             return {
                 "success": True,
+                "dry_run": self.dry_run,
                 "reset_daily_usage": reset_count,
                 "cleanup_usage_logs": cleanup_count,
                 "expired_tariffs": expired_count,
+                "log_partitions": partitions,
+                "metrics": self.metrics,
                 "timestamp": datetime.now(timezone.utc).isoformat()
             }
 
@@ -217,11 +385,11 @@ class DailyMaintenanceService:
 
 
 # Функция для запуска обслуживания из скрипта или планировщика
-async def run_maintenance():
+async def run_maintenance(dry_run: bool = False):
     """
     Запускает все задачи обслуживания.
     """
-    async with DailyMaintenanceService() as service:
+    async with DailyMaintenanceService(dry_run=dry_run) as service:
         return await service.run_all_maintenance_tasks()
 
 
@@ -232,8 +400,9 @@ if __name__ == "__main__":
         format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
     )
 
-    # Запуск обслуживания
-    results = asyncio.run(run_maintenance())
+    # Запуск обслуживания (--dry-run - только подсчет затрагиваемых строк)
+    import sys
+    results = asyncio.run(run_maintenance(dry_run="--dry-run" in sys.argv))
 
     # Вывод результатов
     logger.info(f"Результаты обслуживания: {results}")
\ No newline at end of file
@@ -0,0 +1,336 @@
+"""
+Помесячное секционирование (range partitioning) журналов с большим объемом записей.
+
+Таблицы из PARTITIONED_TABLES создаются из метаданных моделей как
+секционированные по RANGE (колонка времени). Секции именуются
+<таблица>_pYYYYMM, строки вне созданных секций попадают в <таблица>_default.
+Хранение ограничивается отсоединением/удалением целых секций вместо
+построчного DELETE, а запросы по диапазону времени отсекают лишние секции.
+"""
+import logging
+import re
+import time
+from datetime import date, datetime, timezone
+from typing import Dict, List, Optional, Union
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession, AsyncConnection
+
+from ...core.config import settings
+from ...core.database import Base
+
+logger = logging.getLogger(__name__)
+
+# Таблица -> колонка, по которой выполняется секционирование
+PARTITIONED_TABLES: Dict[str, str] = {
+    "usage_logs": "created_at",
+    "user_activity_logs": "created_at",
+    "feature_usage": "created_at",
+    "generation_metrics": "created_at",
+    "detailed_generation_metrics": "date",
+}
+
+_PARTITION_NAME_RE = re.compile(r"_p(\d{4})(\d{2})$")
+
+
+def month_start(value: Union[date, datetime]) -> date:
+    """Первый день месяца для даты или момента времени (в UTC)"""
+    if isinstance(value, datetime):
+        if value.tzinfo is not None:
+            value = value.astimezone(timezone.utc)
+        value = value.date()
+    return value.replace(day=1)
+
+
+def add_months(month: date, months: int) -> date:
+    """Сдвигает первый день месяца на указанное количество месяцев"""
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(table: str, month: date) -> str:
+    """Имя секции таблицы за месяц"""
+    return f"{table}_p{month:%Y%m}"
+
+
+def partition_month(table: str, name: str) -> Optional[date]:
+    """Месяц секции по ее имени или None для секции по умолчанию и чужих таблиц"""
+    if not name.startswith(f"{table}_p"):
+        return None
+    match = _PARTITION_NAME_RE.search(name)
+    if not match:
+        return None
+    return date(int(match.group(1)), int(match.group(2)), 1)
+
+
+def month_bound(month: date) -> datetime:
+    """Граница секции - полночь первого дня месяца в UTC"""
+    return datetime(month.year, month.month, 1, tzinfo=timezone.utc)
+
+
+class LogPartitionManager:
+    """Создание, перевод и обслуживание помесячных секций журналов.
+
+    Принимает AsyncSession или AsyncConnection; транзакцией управляет вызывающий код.
+    """
+
+    def __init__(self, db: Union[AsyncSession, AsyncConnection]):
+        self.db = db
+
+    async def is_partitioned(self, table: str) -> bool:
+        """Проверяет, что таблица уже секционирована"""
+        result = await self.db.execute(
+            text("""
+                SELECT EXISTS (
+                    SELECT 1
+                    FROM pg_partitioned_table pt
+                    JOIN pg_class c ON c.oid = pt.partrelid
+                    WHERE c.relname = :table
+                      AND c.relnamespace = current_schema()::regnamespace
+                )
+            """),
+            {"table": table}
+        )
+        return bool(result.scalar())
+
+    async def _table_exists(self, table: str) -> bool:
+        result = await self.db.execute(text("SELECT to_regclass(:table) IS NOT NULL"), {"table": table})
+        return bool(result.scalar())
+
+    async def list_partitions(self, table: str) -> Dict[date, str]:
+        """Возвращает помесячные секции таблицы {месяц: имя секции}"""
+        result = await self.db.execute(
+            text("""
+                SELECT child.relname
+                FROM pg_inherits i
+                JOIN pg_class parent ON parent.oid = i.inhparent
+                JOIN pg_class child ON child.oid = i.inhrelid
+                WHERE parent.relname = :table
+                  AND parent.relnamespace = current_schema()::regnamespace
+            """),
+            {"table": table}
+        )
+        partitions = {}
+        for (name,) in result.fetchall():
+            month = partition_month(table, name)
+            if month is not None:
+                partitions[month] = name
+        return partitions
+
+    async def ensure_default_partition(self, table: str) -> None:
+        """Создает секцию по умолчанию для строк вне помесячных секций"""
+        await self.db.execute(text(f"CREATE TABLE IF NOT EXISTS {table}_default PARTITION OF {table} DEFAULT"))
+
+    async def ensure_default_partitions(self) -> List[str]:
+        """Создает секции по умолчанию у всех уже секционированных журналов
+
+        Returns:
+            Таблицы, для которых проверена секция по умолчанию
+        """
+        tables = []
+        for table in PARTITIONED_TABLES:
+            if await self._table_exists(table) and await self.is_partitioned(table):
+                await self.ensure_default_partition(table)
+                tables.append(table)
+        return tables
+
+    async def create_partition(self, table: str, month: date) -> bool:
+        """Создает секцию за месяц.
+
+        Если в секции по умолчанию уже есть строки этого месяца, они переносятся
+        в новую секцию перед ее присоединением.
+
+        Returns:
+            True, если секция была создана
+        """
+        month = month_start(month)
+        name = partition_name(table, month)
+        if await self._table_exists(name):
+            return False
+
+        column = PARTITIONED_TABLES[table]
+        start, end = month_bound(month), month_bound(add_months(month, 1))
+        bounds = f"FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+        default = f"{table}_default"
+
+        has_default_rows = False
+        if await self._table_exists(default):
+            result = await self.db.execute(
+                text(f"SELECT EXISTS (SELECT 1 FROM {default} WHERE {column} >= :start AND {column} < :end)"),
+                {"start": start, "end": end}
+            )
+            has_default_rows = bool(result.scalar())
+
+        if not has_default_rows:
+            await self.db.execute(text(
+                f"CREATE TABLE {name} PARTITION OF {table} FOR VALUES {bounds}"
+            ))
+        else:
+            await self.db.execute(text(
+                f"CREATE TABLE {name} (LIKE {table} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)"
+            ))
+            result = await self.db.execute(
+                text(f"""
+                    WITH moved AS (
+                        DELETE FROM {default}
+                        WHERE {column} >= :start AND {column} < :end
+                        RETURNING *
+                    )
+                    INSERT INTO {name} SELECT * FROM moved
+                """),
+                {"start": start, "end": end}
+            )
+            await self.db.execute(text(
+                f"ALTER TABLE {table} ATTACH PARTITION {name} FOR VALUES {bounds}"
+            ))
+            logger.info(f"Moved {result.rowcount} rows from {default} into {name}")
+
+        logger.info(f"Created partition {name}")
+        return True
+
+    async def ensure_partitions(
+            self,
+            table: str,
+            months_ahead: Optional[int] = None,
+            from_month: Optional[date] = None
+    ) -> List[str]:
+        """Создает недостающие секции от from_month (по умолчанию текущий месяц)
+        до текущего месяца плюс months_ahead.
+
+        Returns:
+            Имена созданных секций
+        """
+        if months_ahead is None:
+            months_ahead = settings.LOG_PARTITION_MONTHS_AHEAD
+
+        await self.ensure_default_partition(table)
+
+        current = month_start(datetime.now(timezone.utc))
+        month = month_start(from_month) if from_month else current
+        last = add_months(current, months_ahead)
+
+        created = []
+        while month <= last:
+            if await self.create_partition(table, month):
+                created.append(partition_name(table, month))
+            month = add_months(month, 1)
+        return created
+
+    async def drop_partitions_before(
+            self,
+            table: str,
+            cutoff: datetime,
+            detach_only: Optional[bool] = None
+    ) -> List[str]:
+        """Отсоединяет и удаляет секции, целиком лежащие раньше cutoff.
+
+        При detach_only секции только отсоединяются и остаются отдельными
+        таблицами (например, для архивации).
+
+        Returns:
+            Имена обработанных секций
+        """
+        if detach_only is None:
+            detach_only = settings.LOG_PARTITION_DETACH_ONLY
+
+        boundary = month_start(cutoff)
+        removed = []
+        for month, name in sorted((await self.list_partitions(table)).items()):
+            if add_months(month, 1) > boundary:
+                continue
+            await self.db.execute(text(f"ALTER TABLE {table} DETACH PARTITION {name}"))
+            if not detach_only:
+                await self.db.execute(text(f"DROP TABLE {name}"))
+            removed.append(name)
+
+        if removed:
+            logger.info(f"{'Detached' if detach_only else 'Dropped'} partitions of {table}: {', '.join(removed)}")
+        return removed
+
+    async def apply_retention(self, table: str, cutoff: datetime) -> Dict[str, Union[int, List[str]]]:
+        """Удаляет данные старше cutoff: целые секции - через DROP/DETACH,
+        остаток граничного месяца - DELETE, который затрагивает одну секцию.
+        """
+        removed = await self.drop_partitions_before(table, cutoff)
+        column = PARTITIONED_TABLES[table]
+        result = await self.db.execute(
+            text(f"DELETE FROM {table} WHERE {column} < :cutoff"),
+            {"cutoff": cutoff}
+        )
+        return {"partitions": removed, "deleted_rows": result.rowcount or 0}
+
+    async def convert_table(self, table: str) -> Dict[str, Union[int, float]]:
+        """Переводит обычную таблицу в секционированную.
+
+        Старая таблица переименовывается, новая создается из метаданных модели,
+        данные копируются в помесячные секции, после чего старая таблица удаляется.
+        Зависимые материализованные представления удаляются вместе с ней и
+        создаются заново сервисами аналитики при следующем обращении.
+        """
+        started = time.perf_counter()
+        column = PARTITIONED_TABLES[table]
+        legacy = f"{table}_legacy"
+
+        await self.db.execute(text(f"ALTER TABLE {table} RENAME TO {legacy}"))
+
+        # Освобождаем имена индексов, ограничений и последовательности для новой таблицы
+        indexes = await self.db.execute(
+            text("SELECT indexname FROM pg_indexes WHERE schemaname = current_schema() AND tablename = :table"),
+            {"table": legacy}
+        )
+        for (index_name,) in indexes.fetchall():
+            await self.db.execute(text(f'ALTER INDEX "{index_name}" RENAME TO "{index_name[:55]}_legacy"'))
+        await self.db.execute(text(f"ALTER SEQUENCE IF EXISTS {table}_id_seq RENAME TO {legacy}_id_seq"))
+
+        connection = self.db if isinstance(self.db, AsyncConnection) else await self.db.connection()
+        await connection.run_sync(lambda sync_conn: Base.metadata.tables[table].create(sync_conn, checkfirst=True))
+
+        await self.db.execute(text(f"""
+            SELECT setval(
+                pg_get_serial_sequence('{table}', 'id'),
+                COALESCE((SELECT MAX(id) FROM {legacy}), 0) + 1,
+                false
+            )
+        """))
+
+        result = await self.db.execute(text(f"SELECT MIN({column}) FROM {legacy}"))
+        oldest = result.scalar()
+        await self.ensure_partitions(table, from_month=month_start(oldest) if oldest else None)
+
+        # Копируем только колонки, существующие в обеих таблицах
+        result = await self.db.execute(
+            text("""
+                SELECT column_name FROM information_schema.columns
+                WHERE table_schema = current_schema() AND table_name = :table
+            """),
+            {"table": legacy}
+        )
+        legacy_columns = {row[0] for row in result.fetchall()}
+        columns = [c.name for c in Base.metadata.tables[table].columns if c.name in legacy_columns]
+        select_list = ", ".join(
+            f"COALESCE({name}, NOW())" if name == column else name
+            for name in columns
+        )
+        result = await self.db.execute(text(
+            f"INSERT INTO {table} ({', '.join(columns)}) SELECT {select_list} FROM {legacy}"
+        ))
+        copied = result.rowcount or 0
+
+        await self.db.execute(text(f"DROP TABLE {legacy} CASCADE"))
+
+        elapsed = time.perf_counter() - started
+        logger.info(f"Converted {table} to monthly partitions: {copied} rows, {elapsed:.2f}s")
+        return {"rows": copied, "duration_seconds": elapsed}
+
+    async def ensure_all(self, months_ahead: Optional[int] = None) -> Dict[str, List[str]]:
+        """Переводит журналы в секционированный вид (при необходимости)
+        и создает недостающие будущие секции для всех таблиц.
+        """
+        created = {}
+        for table in PARTITIONED_TABLES:
+            if not await self._table_exists(table):
+                continue
+            if not await self.is_partitioned(table):
+                await self.convert_table(table)
+            created[table] = await self.ensure_partitions(table, months_ahead)
+        return created
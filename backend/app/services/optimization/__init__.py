@@ -1,4 +1,5 @@
 from .query_optimizer import QueryOptimizer
 from .batch_processor import BatchProcessor
+from .index_advisor import IndexAdvisor, IndexSpec, REQUIRED_INDEXES
 
-__all__ = ['QueryOptimizer', 'BatchProcessor']
\ No newline at end of file
+__all__ = ['QueryOptimizer', 'BatchProcessor', 'IndexAdvisor', 'IndexSpec', 'REQUIRED_INDEXES']
\ No newline at end of file
@@ -1,7 +1,7 @@
 # app/services/optimization/batch_processor.py
-from typing import List, Any, Callable, AsyncGenerator, Optional
+from typing import List, Any, Callable, AsyncGenerator, Optional, Dict
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
+from sqlalchemy import select, insert, Table
 import logging
 import traceback
 
@@ -157,6 +157,36 @@ class BatchProcessor:
             await self.session.rollback()
             raise
 
+    async def insert_returning_ids(
+            self,
+            table: Table,
+            rows: List[Dict[str, Any]],
+            chunk_size: int = 1000
+    ) -> List[int]:
+        """
+        Многострочный INSERT ... RETURNING id без коммита (в транзакции вызывающего).
+
+        Идентификаторы возвращаются в порядке rows (sort_by_parameter_order),
+        поэтому их можно сопоставить дочерним записям за один проход.
+        Строки должны иметь одинаковый набор ключей.
+        """
+        ids: List[int] = []
+        statement = insert(table).returning(table.c.id, sort_by_parameter_order=True)
+        for chunk in self.chunk_list(rows, chunk_size):
+            result = await self.session.execute(statement, chunk)
+            ids.extend(result.scalars().all())
+        return ids
+
+    async def insert_rows(
+            self,
+            table: Table,
+            rows: List[Dict[str, Any]],
+            chunk_size: int = 1000
+    ) -> None:
+        """Многострочный INSERT ... VALUES по чанкам без коммита (в транзакции вызывающего)"""
+        for chunk in self.chunk_list(rows, chunk_size):
+            await self.session.execute(insert(table).values(chunk))
+
     async def __aenter__(self):
         return self
 
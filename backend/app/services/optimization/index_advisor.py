@@ -0,0 +1,316 @@
+"""
+Обязательные индексы для горячих запросов аналитики и их создание.
+
+REQUIRED_INDEXES - единый список составных, покрывающих (INCLUDE) и BRIN
+индексов для generations, usage_logs, feature_usage, point_transactions,
+payments и связанных таблиц. IndexAdvisor создает недостающие индексы
+(CONCURRENTLY для обычных таблиц), пересоздает невалидные после прерванной
+сборки и проверяет через EXPLAIN, что горячие запросы (HOT_QUERIES) не
+используют последовательное сканирование.
+
+Условия по времени в горячих запросах записаны полуоткрытыми интервалами
+(created_at >= :start AND created_at < :end): DATE(created_at) = ... не
+использует индекс по created_at и не отсекает секции.
+"""
+import json
+import logging
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import text
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class IndexSpec:
+    """Описание индекса, который должен существовать в БД"""
+    name: str
+    table: str
+    columns: str  # Список колонок или выражений в синтаксисе CREATE INDEX
+    method: str = "btree"
+    include: Tuple[str, ...] = ()
+    where: Optional[str] = None
+    reason: str = ""
+
+    def create_sql(self, concurrently: bool = False) -> str:
+        parts = ["CREATE INDEX"]
+        if concurrently:
+            parts.append("CONCURRENTLY")
+        parts.append(f"IF NOT EXISTS {self.name} ON {self.table}")
+        if self.method != "btree":
+            parts.append(f"USING {self.method}")
+        parts.append(f"({self.columns})")
+        if self.include:
+            parts.append(f"INCLUDE ({', '.join(self.include)})")
+        if self.where:
+            parts.append(f"WHERE {self.where}")
+        return " ".join(parts)
+
+    def drop_sql(self, concurrently: bool = False) -> str:
+        return f"DROP INDEX {'CONCURRENTLY ' if concurrently else ''}IF EXISTS {self.name}"
+
+
+REQUIRED_INDEXES: List[IndexSpec] = [
+    # generations
+    IndexSpec(
+        "idx_generations_user_type_created", "generations", "user_id, type, created_at",
+        reason="Счетчики генераций пользователя по типу (достижения), история пользователя"
+    ),
+    IndexSpec(
+        "idx_generations_created_covering", "generations", "created_at",
+        include=("type", "user_id"),
+        reason="Метрики генераций за день и окна агрегатов без обращения к таблице"
+    ),
+    # usage_logs (секционирована по created_at)
+    IndexSpec(
+        "idx_usage_logs_user_created", "usage_logs", "user_id, created_at",
+        reason="Дневные лимиты и история действий пользователя"
+    ),
+    IndexSpec(
+        "idx_usage_logs_created_brin", "usage_logs", "created_at", method="brin",
+        reason="Диапазонные выборки по времени в журнале, заполняемом по порядку"
+    ),
+    # feature_usage (секционирована по created_at; первичный ключ начинается с id)
+    IndexSpec(
+        "idx_feature_usage_created_covering", "feature_usage", "created_at",
+        include=("user_id", "feature_type", "success"),
+        reason="Активные пользователи и статистика функций за период"
+    ),
+    IndexSpec(
+        "idx_feature_usage_user_created", "feature_usage", "user_id, created_at",
+        reason="Использование функций пользователем"
+    ),
+    # point_transactions
+    IndexSpec(
+        "idx_point_transactions_user_created", "point_transactions", "user_id, created_at",
+        reason="История транзакций пользователя с сортировкой по времени"
+    ),
+    IndexSpec(
+        "idx_point_transactions_created_covering", "point_transactions", "created_at",
+        include=("transaction_type", "amount", "user_id"),
+        reason="Аналитика баллов за период"
+    ),
+    # payments
+    IndexSpec(
+        "idx_payments_status_created_at", "payments", "status, created_at",
+        reason="Завершенные платежи за период"
+    ),
+    IndexSpec(
+        "idx_payments_completed_tariff_type", "payments", "(meta_data->>'tariff_type'), created_at",
+        where="status = 'completed'",
+        reason="Доход по тарифам из meta_data"
+    ),
+    IndexSpec(
+        "idx_payments_user_created", "payments", "user_id, created_at",
+        reason="Платежи пользователя"
+    ),
+    IndexSpec(
+        "idx_payments_updated_at", "payments", "updated_at",
+        reason="Платежи, изменившиеся после свертки агрегатов"
+    ),
+    # Связанные таблицы горячих запросов
+    IndexSpec(
+        "idx_users_last_active", "users", "last_active",
+        reason="Активность и входы пользователей за период"
+    ),
+    IndexSpec(
+        "idx_users_created_at", "users", "created_at",
+        reason="Новые пользователи за период"
+    ),
+    IndexSpec(
+        "idx_images_user_id", "images", "user_id",
+        reason="Количество изображений пользователя (достижения)"
+    ),
+    IndexSpec(
+        "idx_user_actions_user_created", "user_actions", "user_id, created_at",
+        reason="Дни активности пользователя (серии достижений)"
+    ),
+]
+
+
+# Горячие запросы для проверки планов. Параметры: :start_date, :end_date, :user_id
+HOT_QUERIES: Dict[str, str] = {
+    # QueryOptimizer.get_generation_metrics
+    "generation_metrics_today": """
+        SELECT type, COUNT(*) AS count, COUNT(DISTINCT user_id) AS unique_users
+        FROM generations
+        WHERE created_at >= :start_date AND created_at < :end_date
+        GROUP BY type
+    """,
+    # QueryOptimizer.get_daily_active_users
+    "daily_active_users": """
+        SELECT COUNT(DISTINCT user_id) AS active_users, COUNT(*) AS total_actions
+        FROM feature_usage
+        WHERE created_at >= :start_date AND created_at < :end_date
+    """,
+    # AchievementChecker._check_generation_count / AchievementProgressEngine
+    "user_generations_by_type": """
+        SELECT type, COUNT(*) FROM generations WHERE user_id = :user_id GROUP BY type
+    """,
+    "user_images_count": """
+        SELECT COUNT(*) FROM images WHERE user_id = :user_id
+    """,
+    "user_activity_days": """
+        SELECT DISTINCT (created_at AT TIME ZONE 'UTC')::date AS day
+        FROM user_actions
+        WHERE user_id = :user_id
+    """,
+    # Дневные лимиты пользователя
+    "user_usage_today": """
+        SELECT COUNT(*) FROM usage_logs
+        WHERE user_id = :user_id AND created_at >= :start_date AND created_at < :end_date
+    """,
+    # PointsManager.get_transactions
+    "user_point_history": """
+        SELECT id, amount, transaction_type, created_at
+        FROM point_transactions
+        WHERE user_id = :user_id
+        ORDER BY created_at DESC
+        LIMIT 10
+    """,
+    # /analytics/points, агрегаты point_transactions
+    "points_window": """
+        SELECT transaction_type, SUM(amount), COUNT(DISTINCT user_id)
+        FROM point_transactions
+        WHERE created_at >= :start_date AND created_at < :end_date
+        GROUP BY transaction_type
+    """,
+    # FinancialAnalyticsQueries.payment_summary / tariff_revenue
+    "payments_window": """
+        SELECT COALESCE(SUM(amount), 0), COUNT(DISTINCT user_id)
+        FROM payments
+        WHERE status = 'completed' AND created_at >= :start_date AND created_at < :end_date
+    """,
+    "payments_by_tariff": """
+        SELECT meta_data->>'tariff_type', COUNT(*), SUM(amount)
+        FROM payments
+        WHERE status = 'completed' AND meta_data->>'tariff_type' IS NOT NULL
+          AND created_at >= :start_date AND created_at < :end_date
+        GROUP BY 1
+    """,
+    # /analytics/time-activity (входы по last_active)
+    "logins_by_hour": """
+        SELECT EXTRACT(hour FROM last_active) AS hour, COUNT(*)
+        FROM users
+        WHERE last_active >= :start_date AND last_active < :end_date
+        GROUP BY 1
+    """,
+}
+
+
+def sequential_scans(plan: Any) -> List[str]:
+    """Имена таблиц, которые план EXPLAIN (FORMAT JSON) читает последовательным сканированием"""
+    if isinstance(plan, list):
+        return [name for item in plan for name in sequential_scans(item)]
+    if not isinstance(plan, dict):
+        return []
+    if "Plan" in plan:
+        return sequential_scans(plan["Plan"])
+
+    found = []
+    if plan.get("Node Type") == "Seq Scan":
+        found.append(plan.get("Relation Name", "?"))
+    for child in plan.get("Plans", []):
+        found.extend(sequential_scans(child))
+    return found
+
+
+class IndexAdvisor:
+    """Создает обязательные индексы и проверяет планы горячих запросов"""
+
+    def __init__(self, conn, specs: Optional[List[IndexSpec]] = None):
+        """
+        Args:
+            conn: AsyncConnection или AsyncSession; для CONCURRENTLY соединение
+                должно быть в режиме AUTOCOMMIT
+            specs: Список индексов (по умолчанию REQUIRED_INDEXES)
+        """
+        self.conn = conn
+        self.specs = specs if specs is not None else REQUIRED_INDEXES
+
+    async def _tables(self) -> Dict[str, str]:
+        """Таблицы текущей схемы и их relkind ('r' - обычная, 'p' - секционированная)"""
+        result = await self.conn.execute(text("""
+            SELECT c.relname, c.relkind
+            FROM pg_class c
+            JOIN pg_namespace n ON n.oid = c.relnamespace
+            WHERE n.nspname = current_schema() AND c.relkind IN ('r', 'p')
+        """))
+        return {row.relname: row.relkind for row in result}
+
+    async def _indexes(self) -> Dict[str, bool]:
+        """Индексы текущей схемы и признак валидности"""
+        result = await self.conn.execute(text("""
+            SELECT c.relname, i.indisvalid
+            FROM pg_index i
+            JOIN pg_class c ON c.oid = i.indexrelid
+            JOIN pg_namespace n ON n.oid = c.relnamespace
+            WHERE n.nspname = current_schema()
+        """))
+        return {row.relname: row.indisvalid for row in result}
+
+    async def missing(self) -> List[IndexSpec]:
+        """Индексы, которых нет (или которые невалидны) для существующих таблиц"""
+        tables = await self._tables()
+        indexes = await self._indexes()
+        return [
+            spec for spec in self.specs
+            if spec.table in tables and not indexes.get(spec.name, False)
+        ]
+
+    async def apply(self, concurrently: bool = True) -> List[str]:
+        """
+        Создает недостающие индексы
+
+        Для секционированных таблиц CONCURRENTLY не поддерживается - индекс
+        создается на родительской таблице и наследуется всеми секциями.
+
+        Returns:
+            Имена созданных индексов
+        """
+        tables = await self._tables()
+        indexes = await self._indexes()
+        created = []
+        for spec in self.specs:
+            if spec.table not in tables or indexes.get(spec.name, False):
+                continue
+            use_concurrently = concurrently and tables[spec.table] != "p"
+            try:
+                if spec.name in indexes:
+                    # Невалидный индекс после прерванной CONCURRENTLY-сборки
+                    await self.conn.execute(text(spec.drop_sql(use_concurrently)))
+                await self.conn.execute(text(spec.create_sql(use_concurrently)))
+                created.append(spec.name)
+                logger.info(f"Created index {spec.name} on {spec.table}: {spec.reason}")
+            except Exception as e:
+                logger.error(f"Error creating index {spec.name}: {str(e)}")
+        return created
+
+    async def explain(self, query: str, params: Optional[Dict[str, Any]] = None) -> Any:
+        """План запроса в формате JSON (без выполнения)"""
+        result = await self.conn.execute(text(f"EXPLAIN (FORMAT JSON) {query}"), params or {})
+        plan = result.scalar()
+        return json.loads(plan) if isinstance(plan, str) else plan
+
+    async def audit(
+            self,
+            queries: Optional[Dict[str, str]] = None,
+            user_id: int = 1,
+            now: Optional[datetime] = None
+    ) -> Dict[str, List[str]]:
+        """
+        Проверяет планы горячих запросов
+
+        Returns:
+            Имя запроса -> таблицы с последовательным сканированием (пустой список - ок)
+        """
+        now = now or datetime.now(timezone.utc)
+        params = {"start_date": now - timedelta(days=1), "end_date": now, "user_id": user_id}
+        report = {}
+        for name, query in (queries or HOT_QUERIES).items():
+            report[name] = sequential_scans(await self.explain(query, params))
+            if report[name]:
+                logger.warning(f"Hot query {name} uses sequential scan on {', '.join(report[name])}")
+        return report
@@ -92,7 +92,8 @@ class QueryOptimizer:
                         COUNT(*) as count,
                         COUNT(DISTINCT user_id) as unique_users
                     FROM generations
-                    WHERE DATE(created_at) = CURRENT_DATE
+                    WHERE created_at >= CURRENT_DATE
+                      AND created_at < CURRENT_DATE + INTERVAL '1 day'
                     GROUP BY type
                 )
                 SELECT
@@ -199,36 +200,16 @@ class QueryOptimizer:
             }
 
     async def get_user_retention(self) -> Dict[str, Any]:
-        """Получение данных по удержанию пользователей"""
-        try:
-            query = text("""
-                WITH user_cohorts AS (
-                    SELECT
-                        DATE_TRUNC('month', created_at) as cohort_month,
-                        COUNT(DISTINCT id) as cohort_size,
-                        COUNT(DISTINCT CASE
-                            WHEN last_active >= NOW() - INTERVAL '30 days'
-                            THEN id
-                        END) as retained_users
-                    FROM users
-                    GROUP BY DATE_TRUNC('month', created_at)
-                )
-                SELECT
-                    TO_CHAR(cohort_month, 'YYYY-MM') as cohort,
-                    cohort_size,
-                    retained_users,
-                    ROUND((retained_users::float / NULLIF(cohort_size, 0)::float * 100)::numeric, 2) as retention_rate
-                FROM user_cohorts
-                ORDER BY cohort_month DESC
-                LIMIT 12
-            """)
+        """Получение данных по удержанию пользователей
 
-            result = await self.session.execute(query)
-            return {row.cohort: {
-                'size': row.cohort_size,
-                'retained': row.retained_users,
-                'rate': row.retention_rate
-            } for row in result}
+        Доля пользователей месячных когорт, активных за последние 30 дней,
+        считается по дневным битмапам активности, а не по users.last_active.
+        """
+        # Локальный импорт: пакет аналитики сам импортирует QueryOptimizer
+        from ..analytics.cohorts import CohortRetentionService
+
+        try:
+            return await CohortRetentionService(self.session).recent_retention(months=12, window_days=30)
         except Exception as e:
             logger.error(f"Error getting user retention: {str(e)}")
             return {}
@@ -246,7 +227,8 @@ class QueryOptimizer:
                         ELSE 0
                     END as actions_per_user
                 FROM feature_usage
-                WHERE DATE(created_at) = CURRENT_DATE
+                WHERE created_at >= CURRENT_DATE
+                  AND created_at < CURRENT_DATE + INTERVAL '1 day'
             """)
 
             result = await self.session.execute(query)
@@ -1,2 +1,3 @@
 # app/services/referral/__init__.py
-from .manager import ReferralManager
\ No newline at end of file
+from .manager import ReferralManager
+from .closure import ReferralClosureService
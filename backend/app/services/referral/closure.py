@@ -0,0 +1,207 @@
+from sqlalchemy.ext.asyncio import AsyncSession, AsyncConnection
+from sqlalchemy import text
+from typing import Dict, List, Optional, Union
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+# Ограничение глубины при полном перестроении - защита от циклов в invited_by_code
+MAX_REBUILD_DEPTH = 1000
+
+
+class ReferralClosureService:
+    """Поддержка таблицы замыкания реферального дерева.
+
+    Таблица referral_closure хранит все пары (предок, потомок, глубина),
+    а referral_subtree_counts - количество потомков пользователя на каждом уровне.
+    Цепочки и статистика рефералов читаются по индексам, без рекурсивных запросов.
+    """
+
+    def __init__(self, db: Union[AsyncSession, AsyncConnection]):
+        self.db = db
+
+    async def ensure_node(self, user_id: int) -> None:
+        """Создает собственную строку пользователя (глубина 0), если ее нет"""
+        await self.db.execute(
+            text("""
+                INSERT INTO referral_closure (ancestor_id, descendant_id, depth)
+                VALUES (:user_id, :user_id, 0)
+                ON CONFLICT DO NOTHING
+            """),
+            {"user_id": user_id}
+        )
+
+    async def is_descendant(self, ancestor_id: int, descendant_id: int) -> bool:
+        """Проверяет, находится ли пользователь в поддереве другого пользователя"""
+        result = await self.db.execute(
+            text("""
+                SELECT 1 FROM referral_closure
+                WHERE ancestor_id = :ancestor_id AND descendant_id = :descendant_id
+            """),
+            {"ancestor_id": ancestor_id, "descendant_id": descendant_id}
+        )
+        return result.first() is not None
+
+    async def link(self, inviter_id: int, invited_id: int) -> bool:
+        """Подвешивает поддерево приглашенного пользователя под пригласившего.
+
+        Вызывается после успешной обработки инвайт-кода в той же транзакции.
+
+        Returns:
+            False, если связь создала бы цикл и не была добавлена
+        """
+        await self.ensure_node(inviter_id)
+        await self.ensure_node(invited_id)
+
+        if await self.is_descendant(invited_id, inviter_id):
+            logger.warning(f"Referral link {inviter_id} -> {invited_id} would create a cycle, skipping")
+            return False
+
+        params = {"inviter_id": inviter_id, "invited_id": invited_id}
+
+        # Каждый предок пригласившего становится предком каждого потомка приглашенного.
+        # Счетчики поддеревьев растут только на действительно вставленные пары:
+        # повторная связь (или повтор обработки инвайта) их не увеличивает
+        await self.db.execute(
+            text("""
+                WITH inserted AS (
+                    INSERT INTO referral_closure (ancestor_id, descendant_id, depth)
+                    SELECT a.ancestor_id, d.descendant_id, a.depth + d.depth + 1
+                    FROM referral_closure a
+                    CROSS JOIN referral_closure d
+                    WHERE a.descendant_id = :inviter_id
+                      AND d.ancestor_id = :invited_id
+                    ON CONFLICT DO NOTHING
+                    RETURNING ancestor_id, depth
+                )
+                INSERT INTO referral_subtree_counts (ancestor_id, depth, descendants_count)
+                SELECT ancestor_id, depth, COUNT(*)
+                FROM inserted
+                GROUP BY ancestor_id, depth
+                ON CONFLICT (ancestor_id, depth) DO UPDATE SET
+                    descendants_count = referral_subtree_counts.descendants_count
+                                        + EXCLUDED.descendants_count
+            """),
+            params
+        )
+        return True
+
+    async def has_node(self, user_id: int) -> bool:
+        """Проверяет, что пользователь уже есть в таблице замыкания"""
+        result = await self.db.execute(
+            text("""
+                SELECT 1 FROM referral_closure
+                WHERE ancestor_id = :user_id AND descendant_id = :user_id
+            """),
+            {"user_id": user_id}
+        )
+        return result.first() is not None
+
+    async def get_ancestors(self, user_id: int, max_depth: int) -> List:
+        """Возвращает пользователя и его предков до max_depth уровней (уровень 1 - сам пользователь)"""
+        result = await self.db.execute(
+            text("""
+                SELECT
+                    u.id,
+                    u.invite_code,
+                    u.invited_by_code,
+                    u.invites_count,
+                    c.depth + 1 AS level
+                FROM referral_closure c
+                JOIN users u ON u.id = c.ancestor_id
+                WHERE c.descendant_id = :user_id
+                  AND c.depth < :max_depth
+                ORDER BY level, u.id
+            """),
+            {"user_id": user_id, "max_depth": max_depth}
+        )
+        return result.fetchall()
+
+    async def get_subtree_counts(self, user_id: int, max_depth: Optional[int] = None) -> Dict[int, int]:
+        """Возвращает количество рефералов пользователя по уровням {глубина: количество}"""
+        query = """
+            SELECT depth, descendants_count
+            FROM referral_subtree_counts
+            WHERE ancestor_id = :user_id
+        """
+        params = {"user_id": user_id}
+        if max_depth is not None:
+            query += " AND depth <= :max_depth"
+            params["max_depth"] = max_depth
+
+        result = await self.db.execute(text(query + " ORDER BY depth"), params)
+        return {row.depth: row.descendants_count for row in result.fetchall()}
+
+    async def count_active_direct_invites(self, user_id: int) -> int:
+        """Количество приглашенных напрямую пользователей с доступом"""
+        result = await self.db.execute(
+            text("""
+                SELECT COUNT(*)
+                FROM referral_closure c
+                JOIN users u ON u.id = c.descendant_id
+                WHERE c.ancestor_id = :user_id
+                  AND c.depth = 1
+                  AND u.has_access = TRUE
+            """),
+            {"user_id": user_id}
+        )
+        return result.scalar() or 0
+
+    async def rebuild(self) -> Dict[str, float]:
+        """Полностью перестраивает таблицы замыкания по users.invited_by_code.
+
+        Используется для первичного заполнения (бэкфилла) и восстановления после
+        ручных правок. Работает множествами по уровням: один INSERT ... SELECT на уровень.
+        """
+        started = time.perf_counter()
+
+        await self.db.execute(text("TRUNCATE referral_closure, referral_subtree_counts"))
+
+        # Ребра родитель -> ребенок во временной таблице с индексом по родителю
+        await self.db.execute(text("DROP TABLE IF EXISTS tmp_referral_edges"))
+        await self.db.execute(text("""
+            CREATE TEMP TABLE tmp_referral_edges ON COMMIT DROP AS
+            SELECT parent.id AS parent_id, child.id AS child_id
+            FROM users child
+            JOIN users parent ON parent.invite_code = child.invited_by_code
+            WHERE child.id <> parent.id
+        """))
+        await self.db.execute(text("CREATE INDEX ON tmp_referral_edges (parent_id)"))
+
+        result = await self.db.execute(text("""
+            INSERT INTO referral_closure (ancestor_id, descendant_id, depth)
+            SELECT id, id, 0 FROM users
+        """))
+        total_rows = result.rowcount or 0
+
+        depth = 0
+        while depth < MAX_REBUILD_DEPTH:
+            result = await self.db.execute(
+                text("""
+                    INSERT INTO referral_closure (ancestor_id, descendant_id, depth)
+                    SELECT c.ancestor_id, e.child_id, c.depth + 1
+                    FROM referral_closure c
+                    JOIN tmp_referral_edges e ON e.parent_id = c.descendant_id
+                    WHERE c.depth = :depth
+                    ON CONFLICT DO NOTHING
+                """),
+                {"depth": depth}
+            )
+            inserted = result.rowcount or 0
+            if inserted == 0:
+                break
+            total_rows += inserted
+            depth += 1
+
+        await self.db.execute(text("""
+            INSERT INTO referral_subtree_counts (ancestor_id, depth, descendants_count)
+            SELECT ancestor_id, depth, COUNT(*)
+            FROM referral_closure
+            WHERE depth > 0
+            GROUP BY ancestor_id, depth
+        """))
+
+        elapsed = time.perf_counter() - started
+        logger.info(f"Referral closure rebuilt: {total_rows} rows, max depth {depth}, {elapsed:.2f}s")
+        return {"rows": total_rows, "max_depth": depth, "duration_seconds": elapsed}
@@ -9,6 +9,7 @@ from ...core.constants import ActionType
 from ...services.optimization.query_optimizer import QueryOptimizer
 from ...services.optimization.batch_processor import BatchProcessor
 from ...core.cache import CacheService
+from .closure import ReferralClosureService
 
 logger = logging.getLogger(__name__)
 
@@ -19,6 +20,7 @@ class ReferralManager:
         self.cache = cache
         self.batch_processor = BatchProcessor(session)
         self.query_optimizer = QueryOptimizer(session)
+        self.closure = ReferralClosureService(session)
         self.invite_points_reward = 100  # Настраиваемая награда за приглашение
         self.max_chain_depth = 3  # Максимальная глубина цепочки рефералов
         self.cache_ttl = 3600  # Время жизни кэша в секундах
@@ -42,23 +44,17 @@ class ReferralManager:
             if not user:
                 return None
 
-            # Получаем количество активных приглашений через оптимизатор
-            active_invites_query = await self.query_optimizer.optimize_query(
-                select(func.count(User.id)).where(
-                    and_(
-                        User.invited_by_code == user.invite_code,
-                        User.has_access == True
-                    )
-                )
-            )
-            result = await self.session.execute(active_invites_query)
-            active_invites = result.scalar_one()
+            # Активные приглашения и поддерево по уровням - индексные чтения из таблиц замыкания
+            active_invites = await self.closure.count_active_direct_invites(user_id)
+            referrals_by_level = await self.closure.get_subtree_counts(user_id, self.max_chain_depth)
 
             # Собираем статистику
             stats = {
                 "invite_code": user.invite_code,
                 "total_invites": user.invites_count,
                 "active_invites": active_invites,
+                "referrals_by_level": referrals_by_level,
+                "total_referrals": sum(referrals_by_level.values()),
                 "total_points_earned": await self._calculate_referral_points(user_id),
                 "effective_discount": user.effective_discount,
                 "can_invite": await self._check_invite_availability(user_id)
@@ -132,9 +128,14 @@ class ReferralManager:
             # Выполняем batch-операции
             await self.batch_processor.bulk_insert(batch_operations)
 
-            # Инвалидируем кэш
-            await self.cache.invalidate_pattern(f"invite_stats:{inviter.id}*")
+            # Обновляем таблицу замыкания реферального дерева
+            await self.closure.link(inviter.id, new_user_id)
+
+            # Инвалидируем кэш статистики у всех предков, чье поддерево изменилось
+            for ancestor in await self.closure.get_ancestors(inviter.id, self.max_chain_depth):
+                await self.cache.invalidate_pattern(f"invite_stats:{ancestor.id}*")
             await self.cache.invalidate_pattern(f"referral_chain:{inviter.id}*")
+            await self.cache.invalidate_pattern(f"referral_chain:{new_user_id}*")
 
             return True
 
@@ -154,48 +155,12 @@ class ReferralManager:
             if cached_chain:
                 return cached_chain
 
-            # Оптимизированный рекурсивный запрос через CTE
-            with_recursive = """
-                WITH RECURSIVE referral_chain AS (
-                    -- Базовый случай
-                    SELECT 
-                        u.id,
-                        u.invite_code,
-                        u.invited_by_code,
-                        u.invites_count,
-                        1 as level
-                    FROM users u
-                    WHERE u.id = :user_id
-
-                    UNION ALL
-
-                    -- Рекурсивная часть
-                    SELECT
-                        u.id,
-                        u.invite_code,
-                        u.invited_by_code,
-                        u.invites_count,
-                        rc.level + 1
-                    FROM users u
-                    INNER JOIN referral_chain rc ON u.invite_code = rc.invited_by_code
-                    WHERE rc.level < :max_depth
-                )
-                SELECT 
-                    id,
-                    invite_code,
-                    invited_by_code,
-                    invites_count,
-                    level
-                FROM referral_chain
-                ORDER BY level, id
-            """
-
-            # Выполняем оптимизированный запрос
-            result = await self.session.execute(
-                text(with_recursive),
-                {"user_id": user_id, "max_depth": depth}
-            )
-            chain_data = result.fetchall()
+            if await self.closure.has_node(user_id):
+                # Индексное чтение предков из таблицы замыкания
+                chain_data = await self.closure.get_ancestors(user_id, depth)
+            else:
+                # Пользователь еще не попал в таблицу замыкания (до бэкфилла)
+                chain_data = await self._get_referral_chain_recursive(user_id, depth)
 
             # Обрабатываем результаты
             chain = []
@@ -231,6 +196,49 @@ class ReferralManager:
             logger.error(f"Error getting referral chain: {str(e)}")
             raise
 
+    async def _get_referral_chain_recursive(self, user_id: int, max_depth: int) -> List:
+        """Рекурсивный обход цепочки по invited_by_code (запасной путь без таблицы замыкания)"""
+        with_recursive = """
+            WITH RECURSIVE referral_chain AS (
+                -- Базовый случай
+                SELECT 
+                    u.id,
+                    u.invite_code,
+                    u.invited_by_code,
+                    u.invites_count,
+                    1 as level
+                FROM users u
+                WHERE u.id = :user_id
+
+                UNION ALL
+
+                -- Рекурсивная часть
+                SELECT
+                    u.id,
+                    u.invite_code,
+                    u.invited_by_code,
+                    u.invites_count,
+                    rc.level + 1
+                FROM users u
+                INNER JOIN referral_chain rc ON u.invite_code = rc.invited_by_code
+                WHERE rc.level < :max_depth
+            )
+            SELECT 
+                id,
+                invite_code,
+                invited_by_code,
+                invites_count,
+                level
+            FROM referral_chain
+            ORDER BY level, id
+        """
+
+        result = await self.session.execute(
+            text(with_recursive),
+            {"user_id": user_id, "max_depth": max_depth}
+        )
+        return result.fetchall()
+
     async def generate_invite_code(self) -> str:
         """Генерирует уникальный пригласительный код"""
         max_attempts = 5
@@ -15,6 +15,7 @@ from ...models import (
 from ...core.constants import StatisticsPeriod, StatisticsMetric
 from ...services.optimization.query_optimizer import QueryOptimizer
 from ...services.optimization.batch_processor import BatchProcessor
+from ...services.analytics.query_fanout import QueryFanOut
 import logging
 import psutil
 import asyncio
@@ -169,13 +170,17 @@ class StatisticsCollector:
     async def get_dashboard_statistics(self) -> Dict[str, Any]:
         """Получает общую статистику для дашборда"""
         try:
-            yesterday = datetime.utcnow() - timedelta(days=1)
-
-            new_users_24h, generations_24h, active_users_24h = await asyncio.gather(
-                self.query_optimizer.get_new_users(yesterday, datetime.utcnow()),
-                self.query_optimizer.get_total_generations(yesterday, datetime.utcnow()),
-                self.query_optimizer.get_active_users(yesterday, datetime.utcnow())
-            )
+            now = datetime.utcnow()
+            yesterday = now - timedelta(days=1)
+
+            # Запросы независимы - выполняем их параллельно на отдельных соединениях пула
+            results = await QueryFanOut().run({
+                "users": lambda s: QueryOptimizer(s).get_user_statistics(yesterday, now),
+                "generations": lambda s: QueryOptimizer(s).get_total_generations(yesterday, now)
+            }, return_exceptions=False)
+            new_users_24h = results["users"]["new"]
+            generations_24h = results["generations"]
+            active_users_24h = results["users"]["active"]
 
             return {
                 "last_24h": {
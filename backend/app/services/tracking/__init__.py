@@ -1,4 +1,5 @@
 from .tracking_service import TrackingService
 from .usage import UsageTracker
+from .event_bus import TrackingEventBus, tracking_event_bus
 
-__all__ = ['TrackingService', 'UsageTracker']
\ No newline at end of file
+__all__ = ['TrackingService', 'UsageTracker', 'TrackingEventBus', 'tracking_event_bus']
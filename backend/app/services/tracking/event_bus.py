@@ -0,0 +1,521 @@
+# app/services/tracking/event_bus.py
+"""
+Внутрипроцессная шина событий трекинга.
+
+Запросы только ставят события в очередь, а фоновый сборщик пачками
+записывает логи многострочными INSERT и агрегирует приращения daily_usage
+по (user_id, date) в один upsert на пачку. Если очередь переполнена,
+публикация кратко ждет места (backpressure), а затем сбрасывает событие на диск;
+если БД недоступна, вся пачка сохраняется в spill-файл и дозаписывается позже
+понемногу между живыми сбросами. Пачка, упавшая не из-за недоступности БД,
+делится пополам до отдельных событий; событие, которое не записывается само
+по себе, уходит в dead-letter файл и не блокирует остальные.
+"""
+import asyncio
+import json
+import os
+import time
+from datetime import date, datetime, time as dt_time, timezone
+from enum import Enum
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import insert, Enum as SAEnum, DateTime
+from sqlalchemy.exc import DBAPIError, DisconnectionError, InterfaceError, OperationalError, TimeoutError as PoolTimeoutError
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+from ...core.config import settings
+from ...core.database import async_session
+from ...core.cache import CacheService
+from ...models import (
+    UsageLog,
+    UserActivityLog,
+    FeatureUsage,
+    GenerationMetrics,
+    DailyUsage
+)
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Таблицы, которые пишутся через шину
+TRACKED_TABLES = {
+    UsageLog.__tablename__: UsageLog,
+    UserActivityLog.__tablename__: UserActivityLog,
+    FeatureUsage.__tablename__: FeatureUsage,
+    GenerationMetrics.__tablename__: GenerationMetrics,
+}
+
+# Счетчики daily_usage, которые агрегируются приращениями
+DAILY_USAGE_COUNTERS = (
+    "generations_count",
+    "lesson_plans_count",
+    "exercises_count",
+    "games_count",
+    "images_count",
+    "transcripts_count",
+    "points_earned",
+    "points_spent",
+)
+
+# Кэш, который нужно сбросить после записи пачки в таблицу
+TABLE_CACHE_PATTERNS = {
+    FeatureUsage.__tablename__: "feature_usage:*",
+}
+
+# Интервал повторной попытки дозаписи spill-файлов
+SPILL_REPLAY_INTERVAL = 30.0
+
+# Подкаталог spill_dir для событий, которые не удалось записать по причине в самих данных
+DEAD_LETTER_DIR = "dead"
+
+# Сколько ждать текущую пачку сборщика при остановке, сверх flush_interval
+STOP_GRACE_SECONDS = 10.0
+
+# Ошибки недоступности БД: пачка откладывается целиком, а не делится
+TRANSIENT_ERRORS = (
+    OperationalError,
+    InterfaceError,
+    DisconnectionError,
+    PoolTimeoutError,
+    OSError,
+    asyncio.TimeoutError,
+)
+
+EVENT_ROW = "row"
+EVENT_DAILY_USAGE = "daily_usage"
+
+
+def _encode_value(value: Any) -> Any:
+    """Приводит значение к JSON-совместимому виду (для очереди и spill-файлов)"""
+    if isinstance(value, Enum):
+        return value.value
+    if isinstance(value, datetime):
+        return {"__datetime__": value.isoformat()}
+    if isinstance(value, date):
+        return {"__date__": value.isoformat()}
+    return value
+
+
+def _decode_value(value: Any) -> Any:
+    if isinstance(value, dict):
+        if "__datetime__" in value:
+            return datetime.fromisoformat(value["__datetime__"])
+        if "__date__" in value:
+            return date.fromisoformat(value["__date__"])
+    return value
+
+
+def _is_transient(error: Exception) -> bool:
+    """Ошибка недоступности БД (повтор поможет), а не ошибка в данных события"""
+    if isinstance(error, DBAPIError) and error.connection_invalidated:
+        return True
+    return isinstance(error, TRANSIENT_ERRORS)
+
+
+def _decode_row(model, row: Dict[str, Any]) -> Dict[str, Any]:
+    """Восстанавливает типы значений строки по колонкам модели"""
+    columns = model.__table__.columns
+    decoded = {}
+    for key, value in row.items():
+        value = _decode_value(value)
+        column = columns.get(key)
+        if column is not None and isinstance(value, str):
+            column_type = column.type
+            enum_class = getattr(column_type, "enum_class", None)
+            if isinstance(column_type, SAEnum) and enum_class is not None:
+                try:
+                    value = enum_class(value)
+                except ValueError:
+                    pass
+            elif isinstance(column_type, DateTime):
+                value = datetime.fromisoformat(value)
+        decoded[key] = value
+    return decoded
+
+
+class TrackingEventBus:
+    """Очередь событий трекинга с фоновым пакетным сбросом в БД"""
+
+    def __init__(
+            self,
+            session_factory=None,
+            maxsize: Optional[int] = None,
+            batch_size: Optional[int] = None,
+            flush_interval: Optional[float] = None,
+            enqueue_timeout: Optional[float] = None,
+            spill_dir: Optional[str] = None
+    ):
+        self.session_factory = session_factory or async_session
+        self.maxsize = maxsize or settings.TRACKING_QUEUE_MAXSIZE
+        self.batch_size = batch_size or settings.TRACKING_BATCH_SIZE
+        self.flush_interval = flush_interval or settings.TRACKING_FLUSH_INTERVAL
+        self.enqueue_timeout = enqueue_timeout if enqueue_timeout is not None else settings.TRACKING_ENQUEUE_TIMEOUT
+        self.spill_dir = Path(spill_dir or settings.TRACKING_SPILL_DIR)
+
+        self._queue: Optional[asyncio.Queue] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._flusher: Optional[asyncio.Task] = None
+        self._flush_lock: Optional[asyncio.Lock] = None
+        self._last_replay = 0.0
+        self._spill_pending = False
+        self._running = False
+
+        self.stats = {
+            "published": 0,
+            "flushed": 0,
+            "batches": 0,
+            "backpressure_waits": 0,
+            "spilled": 0,
+            "replayed": 0,
+            "flush_errors": 0,
+            "dead_lettered": 0,
+        }
+
+    # ------------------------------------------------------------------
+    # Публикация
+    # ------------------------------------------------------------------
+
+    async def publish_row(self, table: str, row: Dict[str, Any]) -> None:
+        """Ставит в очередь вставку строки в одну из TRACKED_TABLES"""
+        if table not in TRACKED_TABLES:
+            raise ValueError(f"Table {table} is not tracked by the event bus")
+        await self.publish({
+            "kind": EVENT_ROW,
+            "table": table,
+            "row": {key: _encode_value(value) for key, value in row.items()}
+        })
+
+    async def publish_daily_usage(self, user_id: int, day: date, deltas: Dict[str, int]) -> None:
+        """Ставит в очередь приращения счетчиков daily_usage"""
+        deltas = {key: value for key, value in deltas.items() if key in DAILY_USAGE_COUNTERS and value}
+        if not deltas:
+            return
+        await self.publish({
+            "kind": EVENT_DAILY_USAGE,
+            "user_id": user_id,
+            "date": day.isoformat(),
+            "deltas": deltas
+        })
+
+    async def publish(self, event: Dict[str, Any]) -> None:
+        """Ставит событие в очередь; при переполнении ждет, затем сбрасывает на диск"""
+        self._ensure_started()
+        self.stats["published"] += 1
+
+        try:
+            self._queue.put_nowait(event)
+            return
+        except asyncio.QueueFull:
+            self.stats["backpressure_waits"] += 1
+
+        try:
+            await asyncio.wait_for(self._queue.put(event), timeout=self.enqueue_timeout)
+        except asyncio.TimeoutError:
+            logger.warning("Tracking queue is full, spilling event to disk")
+            await self._spill([event])
+
+    # ------------------------------------------------------------------
+    # Жизненный цикл
+    # ------------------------------------------------------------------
+
+    def _ensure_started(self) -> None:
+        loop = asyncio.get_running_loop()
+        if self._queue is None or self._loop is not loop:
+            self._loop = loop
+            self._queue = asyncio.Queue(maxsize=self.maxsize)
+            self._flush_lock = asyncio.Lock()
+            self._flusher = None
+        if self._flusher is None or self._flusher.done():
+            self._running = True
+            self._flusher = loop.create_task(self._run())
+
+    async def start(self) -> None:
+        """Явный запуск сборщика (иначе он стартует при первой публикации)"""
+        self._ensure_started()
+
+    async def stop(self) -> None:
+        """Останавливает сборщик, дописав все события из очереди.
+
+        Пачку, которую сборщик уже пишет, он дописывает сам (отменяется только
+        зависшая запись); остаток очереди записывается здесь же, а то, что не
+        удалось записать, уходит в spill-файл и дозапишется после рестарта.
+        """
+        self._running = False
+        if self._flusher is not None:
+            try:
+                await asyncio.wait_for(
+                    asyncio.shield(self._flusher),
+                    timeout=self.flush_interval + STOP_GRACE_SECONDS
+                )
+            except asyncio.TimeoutError:
+                logger.warning("Tracking event bus flusher did not stop in time, cancelling")
+                self._flusher.cancel()
+            await asyncio.gather(self._flusher, return_exceptions=True)
+            self._flusher = None
+        await self.flush()
+        logger.info(f"Tracking event bus stopped: {self.get_stats()}")
+
+    async def flush(self) -> None:
+        """Немедленно записывает все события, накопленные в очереди"""
+        if self._queue is None:
+            return
+        while not self._queue.empty():
+            batch = []
+            while not self._queue.empty() and len(batch) < self.batch_size:
+                batch.append(self._queue.get_nowait())
+            await self._flush_batch(batch)
+
+    async def _run(self) -> None:
+        logger.info("Tracking event bus flusher started")
+        while self._running:
+            try:
+                batch = await self._collect_batch()
+                if batch:
+                    await self._flush_batch(batch)
+                # Дозапись spill-файлов по одной пачке между живыми сбросами,
+                # чтобы они расходовались и под постоянной нагрузкой
+                if self._spill_pending or time.monotonic() - self._last_replay > SPILL_REPLAY_INTERVAL:
+                    await self.replay_spill(max_events=self.batch_size)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Tracking event bus flusher error: {str(e)}", exc_info=True)
+
+    async def _collect_batch(self) -> List[Dict[str, Any]]:
+        """Ждет первое событие не дольше flush_interval и добирает пачку без ожидания"""
+        try:
+            first = await asyncio.wait_for(self._queue.get(), timeout=self.flush_interval)
+        except asyncio.TimeoutError:
+            return []
+
+        batch = [first]
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+            except asyncio.QueueEmpty:
+                break
+        return batch
+
+    # ------------------------------------------------------------------
+    # Запись в БД
+    # ------------------------------------------------------------------
+
+    async def _flush_batch(self, batch: List[Dict[str, Any]]) -> bool:
+        async with self._flush_lock:
+            try:
+                touched_tables = await self._write_isolating_failures(batch)
+            except Exception as e:
+                self.stats["flush_errors"] += 1
+                logger.error(f"Error flushing {len(batch)} tracking events, spilling to disk: {str(e)}")
+                await self._spill(batch)
+                return False
+
+        self.stats["flushed"] += len(batch)
+        self.stats["batches"] += 1
+
+        patterns = {TABLE_CACHE_PATTERNS[table] for table in touched_tables if table in TABLE_CACHE_PATTERNS}
+        if patterns:
+            cache = CacheService()
+            for pattern in patterns:
+                await cache.invalidate_pattern(pattern)
+        return True
+
+    async def _write_isolating_failures(self, batch: List[Dict[str, Any]]) -> set:
+        """Записывает пачку; при ошибке в данных делит ее пополам до отдельных событий.
+
+        Ошибки недоступности БД пробрасываются (пачка откладывается целиком),
+        событие, которое не записывается само по себе, уходит в dead-letter файл.
+        """
+        try:
+            return await self._write_batch(batch)
+        except Exception as e:
+            if _is_transient(e):
+                raise
+            if len(batch) == 1:
+                logger.error(f"Tracking event rejected, moving to dead letters: {str(e)}")
+                await self._dead_letter(batch[0], e)
+                return set()
+
+        middle = len(batch) // 2
+        touched = await self._write_isolating_failures(batch[:middle])
+        return touched | await self._write_isolating_failures(batch[middle:])
+
+    async def _write_batch(self, batch: List[Dict[str, Any]]) -> set:
+        """Записывает пачку событий в одной транзакции и возвращает затронутые таблицы"""
+        rows_by_table: Dict[Tuple[str, frozenset], List[Dict[str, Any]]] = {}
+        daily: Dict[Tuple[int, str], Dict[str, int]] = {}
+        active: Dict[date, set] = {}
+
+        for event in batch:
+            if event["kind"] == EVENT_ROW:
+                model = TRACKED_TABLES[event["table"]]
+                row = _decode_row(model, event["row"])
+                # executemany требует одинаковый набор ключей в строках
+                rows_by_table.setdefault((event["table"], frozenset(row)), []).append(row)
+                if row.get("user_id") is not None:
+                    created_at = row.get("created_at") or datetime.now(timezone.utc)
+                    # Наивное время (datetime.utcnow()) - уже UTC, а не локальное время сервера
+                    if created_at.tzinfo is None:
+                        created_at = created_at.replace(tzinfo=timezone.utc)
+                    active.setdefault(created_at.astimezone(timezone.utc).date(), set()).add(row["user_id"])
+            elif event["kind"] == EVENT_DAILY_USAGE:
+                totals = daily.setdefault((event["user_id"], event["date"]), {})
+                for counter, value in event["deltas"].items():
+                    totals[counter] = totals.get(counter, 0) + value
+
+        async with self.session_factory() as session:
+            for (table, _), rows in rows_by_table.items():
+                # Многострочный INSERT (insertmanyvalues) вместо построчного add/flush
+                await session.execute(insert(TRACKED_TABLES[table]), rows)
+
+            if daily:
+                await session.execute(self._daily_usage_upsert(daily))
+
+            if active:
+                await self._mark_active_users(session, active)
+
+            await session.commit()
+
+        touched = {table for table, _ in rows_by_table}
+        if daily:
+            touched.add(DailyUsage.__tablename__)
+        return touched
+
+    @staticmethod
+    async def _mark_active_users(session, active: Dict[date, set]) -> None:
+        """Добавляет пользователей в дневные битмапы активности в той же транзакции"""
+        # Локальный импорт: пакет аналитики сам импортирует шину трекинга
+        from ..analytics.cohorts import CohortRetentionService, KIND_ACTIVE
+
+        try:
+            # Ошибка битмапов не должна отправлять пачку событий на диск:
+            # пропущенные дни дополнит досвертка по watermark
+            async with session.begin_nested():
+                await CohortRetentionService(session).append(KIND_ACTIVE, active)
+        except Exception as e:
+            logger.warning(f"Failed to update activity bitmaps: {str(e)}")
+
+    @staticmethod
+    def _daily_usage_upsert(daily: Dict[Tuple[int, str], Dict[str, int]]):
+        """Один upsert daily_usage на пачку с суммированными приращениями"""
+        values = []
+        for (user_id, day), totals in daily.items():
+            row = {
+                "user_id": user_id,
+                "date": datetime.combine(date.fromisoformat(day), dt_time.min, tzinfo=timezone.utc),
+            }
+            for counter in DAILY_USAGE_COUNTERS:
+                row[counter] = totals.get(counter, 0)
+            values.append(row)
+
+        stmt = pg_insert(DailyUsage).values(values)
+        table = DailyUsage.__table__
+        return stmt.on_conflict_do_update(
+            index_elements=[table.c.user_id, table.c.date],
+            set_={counter: table.c[counter] + stmt.excluded[counter] for counter in DAILY_USAGE_COUNTERS}
+        )
+
+    # ------------------------------------------------------------------
+    # Сброс на диск
+    # ------------------------------------------------------------------
+
+    async def _spill(self, events: List[Dict[str, Any]]) -> None:
+        """Сохраняет события в JSONL-файл для последующей дозаписи"""
+        try:
+            await asyncio.to_thread(self._write_spill_file, events)
+            self.stats["spilled"] += len(events)
+            self._spill_pending = True
+        except Exception as e:
+            logger.error(f"Failed to spill {len(events)} tracking events, events lost: {str(e)}")
+
+    async def _dead_letter(self, event: Dict[str, Any], error: Exception) -> None:
+        """Откладывает событие с ошибкой в данных для ручного разбора"""
+        try:
+            await asyncio.to_thread(
+                self._write_spill_file, [{**event, "error": str(error)[:1000]}], self.spill_dir / DEAD_LETTER_DIR
+            )
+            self.stats["dead_lettered"] += 1
+        except Exception as e:
+            logger.error(f"Failed to dead-letter tracking event, event lost: {str(e)}")
+
+    def _write_spill_file(self, events: List[Dict[str, Any]], directory: Optional[Path] = None) -> None:
+        directory = directory or self.spill_dir
+        directory.mkdir(parents=True, exist_ok=True)
+        path = directory / f"tracking-{os.getpid()}-{time.time_ns()}.jsonl"
+        tmp_path = path.with_suffix(".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for event in events:
+                f.write(json.dumps(event, ensure_ascii=False, default=str))
+                f.write("\n")
+        # Атомарно публикуем файл, чтобы дозапись не увидела его частично записанным
+        os.replace(tmp_path, path)
+
+    async def replay_spill(self, max_events: Optional[int] = None) -> int:
+        """Дозаписывает события из spill-файлов; возвращает количество обработанных событий.
+
+        max_events ограничивает объем одного вызова (сборщик дозаписывает по
+        пачке между живыми сбросами); недописанный остаток файла возвращается на диск.
+        """
+        self._last_replay = time.monotonic()
+        self._spill_pending = False
+        if not self.spill_dir.exists():
+            return 0
+
+        replayed = 0
+        for path in sorted(self.spill_dir.glob("tracking-*.jsonl")):
+            if max_events is not None and replayed >= max_events:
+                # Файлы остались - продолжим на следующей итерации сборщика
+                self._spill_pending = True
+                break
+
+            # Переименование захватывает файл, чтобы другой воркер не дозаписал его повторно
+            claimed = path.with_suffix(f".{os.getpid()}.replaying")
+            try:
+                os.replace(path, claimed)
+            except OSError:
+                continue
+
+            events = await asyncio.to_thread(self._read_spill_file, claimed)
+            written = 0
+            postponed = False
+            try:
+                while written < len(events) and (max_events is None or replayed < max_events):
+                    chunk = events[written:written + self.batch_size]
+                    await self._write_isolating_failures(chunk)
+                    written += len(chunk)
+                    replayed += len(chunk)
+            except Exception as e:
+                # БД все еще недоступна - повторим по интервалу
+                postponed = True
+                logger.warning(f"Tracking spill replay postponed: {str(e)}")
+
+            if written < len(events):
+                # Возвращаем на диск только незаписанный остаток
+                await asyncio.to_thread(self._write_spill_file, events[written:])
+            claimed.unlink(missing_ok=True)
+            if postponed:
+                break
+            if written < len(events):
+                self._spill_pending = True
+
+        if replayed:
+            self.stats["replayed"] += replayed
+            logger.info(f"Replayed {replayed} spilled tracking events")
+        return replayed
+
+    @staticmethod
+    def _read_spill_file(path: Path) -> List[Dict[str, Any]]:
+        with open(path, encoding="utf-8") as f:
+            return [json.loads(line) for line in f if line.strip()]
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            **self.stats,
+            "queue_size": self._queue.qsize() if self._queue is not None else 0,
+            "queue_maxsize": self.maxsize,
+        }
+
+
+# Общая шина процесса
+tracking_event_bus = TrackingEventBus()
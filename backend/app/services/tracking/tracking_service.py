@@ -9,6 +9,7 @@ from ...models import (
     UserActivityLog
 )
 from ...core.constants import ActionType, ContentType
+from .event_bus import tracking_event_bus
 import logging
 from sqlalchemy import select, func, text
 
@@ -29,7 +30,7 @@ class TrackingService:
             ip_address: Optional[str] = None,
             user_agent: Optional[str] = None
     ):
-        """Записывает действие пользователя"""
+        """Записывает действие пользователя через шину событий трекинга"""
         try:
             # Convert string values to Enum instances
             action_type_enum = None
@@ -48,42 +49,61 @@ class TrackingService:
                     logger.warning(f"Invalid content_type: {content_type}. Error: {str(e)}")
                     # Fallback to a default value or continue with None
 
-            # Создаем запись в логе использования
-            usage_log = UsageLog(
-                user_id=user_id,
-                action_type=action_type_enum,
-                content_type=content_type_enum,
-                points_change=points_change,
-                extra_data=extra_data or {}
-            )
-            self.session.add(usage_log)
+            now = datetime.now(timezone.utc)
 
-            # Обновляем дневное использование
-            await self._update_daily_usage(
+            # Запрос только ставит события в очередь; запись в БД - пачками в фоне
+            await tracking_event_bus.publish_row(UsageLog.__tablename__, {
+                "user_id": user_id,
+                "action_type": action_type_enum,
+                "content_type": content_type_enum,
+                "points_change": points_change,
+                "daily_usage_count": 1,
+                "skip_limits": False,
+                "extra_data": extra_data or {},
+                "created_at": now
+            })
+
+            # Приращения дневного использования агрегируются по (user_id, date) при сбросе
+            await tracking_event_bus.publish_daily_usage(
                 user_id,
-                action_type_enum,
-                content_type_enum,
-                points_change
+                now.date(),
+                self._daily_usage_deltas(action_type_enum, content_type_enum, points_change)
             )
 
             # Логируем активность пользователя
-            activity_log = UserActivityLog(
-                user_id=user_id,
-                action_type=action_type_enum,
-                content_type=content_type_enum,
-                ip_address=ip_address,
-                user_agent=user_agent,
-                activity_metadata=extra_data or {}
-            )
-            self.session.add(activity_log)
-
-            await self.session.commit()
+            await tracking_event_bus.publish_row(UserActivityLog.__tablename__, {
+                "user_id": user_id,
+                "action_type": action_type_enum,
+                "content_type": content_type_enum,
+                "ip_address": ip_address,
+                "user_agent": user_agent,
+                "activity_metadata": extra_data or {},
+                "created_at": now
+            })
 
         except Exception as e:
             logger.error(f"Error tracking action: {str(e)}")
-            await self.session.rollback()
             raise
 
+    @staticmethod
+    def _daily_usage_deltas(
+            action_type: Optional[ActionType],
+            content_type: Optional[ContentType],
+            points_change: int
+    ) -> Dict[str, int]:
+        """Приращения счетчиков daily_usage для одного действия"""
+        is_generation = action_type == ActionType.GENERATION
+        return {
+            "generations_count": 1 if is_generation else 0,
+            "lesson_plans_count": 1 if is_generation and content_type in (ContentType.LESSON_PLAN, ContentType.COURSE_LESSON_PLAN) else 0,
+            "exercises_count": 1 if is_generation and content_type in (ContentType.EXERCISE, ContentType.COURSE_EXERCISE) else 0,
+            "games_count": 1 if is_generation and content_type in (ContentType.GAME, ContentType.COURSE_GAME) else 0,
+            "images_count": 1 if is_generation and content_type == ContentType.IMAGE else 0,
+            "transcripts_count": 1 if is_generation and content_type == ContentType.TRANSCRIPT else 0,
+            "points_earned": points_change if points_change > 0 else 0,
+            "points_spent": abs(points_change) if points_change < 0 else 0
+        }
+
     async def _update_daily_usage(
             self,
             user_id: int,
@@ -100,17 +120,7 @@ class TrackingService:
         today = datetime.now(timezone.utc).date()
 
         try:
-            # Определяем инкременты для разных типов контента
-            generations_increment = 1 if action_type == ActionType.GENERATION else 0
-            lesson_plans_increment = 1 if action_type == ActionType.GENERATION and (content_type == ContentType.LESSON_PLAN or content_type == ContentType.COURSE_LESSON_PLAN) else 0
-            exercises_increment = 1 if action_type == ActionType.GENERATION and (content_type == ContentType.EXERCISE or content_type == ContentType.COURSE_EXERCISE) else 0
-            games_increment = 1 if action_type == ActionType.GENERATION and (content_type == ContentType.GAME or content_type == ContentType.COURSE_GAME) else 0
-            images_increment = 1 if action_type == ActionType.GENERATION and content_type == ContentType.IMAGE else 0
-            transcripts_increment = 1 if action_type == ActionType.GENERATION and content_type == ContentType.TRANSCRIPT else 0
-
-            # Определяем изменения баллов
-            points_earned_increment = points_change if points_change > 0 else 0
-            points_spent_increment = abs(points_change) if points_change < 0 else 0
+            deltas = self._daily_usage_deltas(action_type, content_type, points_change)
 
             # Используем INSERT ... ON CONFLICT для атомарного обновления
             query = text("""
@@ -133,14 +143,14 @@ class TrackingService:
             result = await self.session.execute(query, {
                 "user_id": user_id,
                 "date": today,
-                "generations_increment": generations_increment,
-                "lesson_plans_increment": lesson_plans_increment,
-                "exercises_increment": exercises_increment,
-                "games_increment": games_increment,
-                "images_increment": images_increment,
-                "transcripts_increment": transcripts_increment,
-                "points_earned_increment": points_earned_increment,
-                "points_spent_increment": points_spent_increment
+                "generations_increment": deltas["generations_count"],
+                "lesson_plans_increment": deltas["lesson_plans_count"],
+                "exercises_increment": deltas["exercises_count"],
+                "games_increment": deltas["games_count"],
+                "images_increment": deltas["images_count"],
+                "transcripts_increment": deltas["transcripts_count"],
+                "points_earned_increment": deltas["points_earned"],
+                "points_spent_increment": deltas["points_spent"]
             })
 
             # Если транзакция не была начата извне, фиксируем изменения
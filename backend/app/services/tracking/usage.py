@@ -3,7 +3,9 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from ...models import UsageLog
 from ...schemas.tracking import UsageLogCreate
 from ...core.constants import ActionType, ContentType
-from datetime import datetime, timezone
+from .event_bus import tracking_event_bus
+from datetime import datetime, timedelta, timezone
+from typing import Optional
 import logging
 from sqlalchemy import select, func, and_, exc
 
@@ -17,8 +19,13 @@ class UsageTracker:
         from ...services.optimization.query_optimizer import QueryOptimizer
         self.query_optimizer = QueryOptimizer(session)
 
-    async def log_usage(self, usage_data: UsageLogCreate) -> UsageLog:
-        """Log usage action and update daily counters"""
+    async def log_usage(self, usage_data: UsageLogCreate, deferred: bool = True) -> UsageLog:
+        """Log usage action and update daily counters.
+
+        daily_usage обновляется сразу (по нему проверяются лимиты), а сама запись
+        usage_logs при deferred=True ставится в очередь шины трекинга и пишется пачкой.
+        В этом режиме возвращается несохраненный объект без id.
+        """
         try:
             log = UsageLog(
                 user_id=usage_data.user_id,
@@ -66,6 +73,29 @@ class UsageTracker:
                         # В крайнем случае - не устанавливаем content_type
                         pass
 
+            if deferred:
+                # Update daily usage statistics only if skip_limits is False
+                if not usage_data.skip_limits:
+                    counter_value = await self._update_daily_usage(usage_data.user_id, log)
+                    if counter_value:
+                        log.daily_usage_count = counter_value
+                else:
+                    logger.info(f"Skipping daily usage update for user {usage_data.user_id} (skip_limits=True)")
+
+                log.skip_limits = usage_data.skip_limits
+                log.created_at = datetime.now(timezone.utc)
+                await tracking_event_bus.publish_row(UsageLog.__tablename__, {
+                    "user_id": log.user_id,
+                    "action_type": log.action_type,
+                    "content_type": log.content_type,
+                    "points_change": log.points_change,
+                    "daily_usage_count": log.daily_usage_count,
+                    "skip_limits": log.skip_limits,
+                    "extra_data": log.extra_data,
+                    "created_at": log.created_at
+                })
+                return log
+
             # Get current daily usage count for this type
             count_query = await self.query_optimizer.optimize_query(
                 select(func.count())
@@ -75,7 +105,8 @@ class UsageTracker:
                         UsageLog.user_id == usage_data.user_id,
                         UsageLog.action_type == usage_data.action_type,
                         UsageLog.content_type == log.content_type,
-                        func.date(UsageLog.created_at) == func.date(func.now())
+                        UsageLog.created_at >= func.date_trunc('day', func.now()),
+                        UsageLog.created_at < func.date_trunc('day', func.now()) + timedelta(days=1)
                     )
                 )
             )
@@ -101,9 +132,10 @@ class UsageTracker:
             logger.error(f"Error logging usage: {e}", exc_info=True)
             raise
 
-    async def _update_daily_usage(self, user_id: int, log: UsageLog) -> None:
+    async def _update_daily_usage(self, user_id: int, log: UsageLog) -> Optional[int]:
         """
         Обновляет статистику ежедневного использования.
+        Возвращает новое значение счетчика, соответствующего типу контента.
         Использует INSERT ... ON CONFLICT для предотвращения дублирующихся записей.
         Работает независимо от наличия активной транзакции.
         """
@@ -121,6 +153,7 @@ class UsageTracker:
             games_increment = 0
             images_increment = 0
             transcripts_increment = 0
+            counter_column = "generations_count"
 
             # Обновляем специфичные счетчики И общий счетчик в зависимости от типа контента
             if log.content_type:
@@ -130,18 +163,23 @@ class UsageTracker:
 
                     if content_type_enum == ContentType.LESSON_PLAN or content_type_enum == ContentType.COURSE_LESSON_PLAN:
                         lesson_plans_increment = 1
+                        counter_column = "lesson_plans_count"
                         generations_increment = 1
                     elif content_type_enum == ContentType.EXERCISE or content_type_enum == ContentType.COURSE_EXERCISE:
                         exercises_increment = 1
+                        counter_column = "exercises_count"
                         generations_increment = 1
                     elif content_type_enum == ContentType.GAME or content_type_enum == ContentType.COURSE_GAME:
                         games_increment = 1
+                        counter_column = "games_count"
                         generations_increment = 1
                     elif content_type_enum == ContentType.IMAGE:
                         images_increment = 1
+                        counter_column = "images_count"
                         # Не увеличиваем generations_count для картинок, если они считаются отдельно
                     elif content_type_enum == ContentType.TRANSCRIPT:
                         transcripts_increment = 1
+                        counter_column = "transcripts_count"
                         generations_increment = 1
                     elif content_type_enum == ContentType.COURSE:
                         # Генерация самого курса - увеличиваем только общий счетчик
@@ -192,10 +230,12 @@ class UsageTracker:
                 points_earned = daily_usage.points_earned + :points_earned_increment,
                 points_spent = daily_usage.points_spent + :points_spent_increment
             WHERE daily_usage.user_id = :user_id AND daily_usage.date = :date
+            RETURNING generations_count, lesson_plans_count, exercises_count,
+                      games_count, images_count, transcripts_count
             """)
 
             # Выполняем запрос без начала новой транзакции
-            await self.session.execute(query, {
+            result = await self.session.execute(query, {
                 "user_id": user_id,
                 "date": today,
                 "generations_increment": generations_increment,
@@ -208,16 +248,21 @@ class UsageTracker:
                 "points_spent_increment": points_spent_increment
             })
 
+            row = result.fetchone()
+
             # Если транзакция не была начата извне, фиксируем изменения
             if not self.session.in_transaction():
                 await self.session.commit()
 
+            return row._mapping[counter_column] if row else None
+
         except Exception as e:
             logger.error(f"Error updating daily usage: {e}", exc_info=True)
             # Если транзакция не была начата извне, откатываем изменения
             if not self.session.in_transaction():
                 await self.session.rollback()
             # Не вызываем исключение, чтобы не прерывать основной поток
+            return None
 
     async def get_user_logs(self, user_id: int, limit: int = 100):
         """Получает логи использования для пользователя"""
@@ -16,6 +16,7 @@ from ...services.optimization.query_optimizer import QueryOptimizer
 from ...services.optimization.batch_processor import BatchProcessor
 from ...core.cache import cache_service
 from ...core.memory import memory_optimized
+from ..referral.closure import ReferralClosureService
 
 logger = logging.getLogger(__name__)
 
@@ -163,6 +164,9 @@ class UserManager(BaseService):
                     inviter.invites_count += 1
                     inviter.total_earned_discount += 2  # Бонус для пригласившего
 
+                    # Обновляем таблицу замыкания реферального дерева в той же транзакции
+                    await ReferralClosureService(self.session).link(inviter.id, user.id)
+
                     # Обновляем обоих пользователей одной транзакцией
                     await self.session.commit()
 
@@ -1,107 +1,145 @@
 """
 Утилиты для экспорта данных в Excel
+
+Книги создаются в режиме write-only: строки сразу сериализуются и не
+хранятся в памяти как объекты ячеек. Ширина колонок вычисляется по
+заголовкам и ограниченной выборке строк до записи данных.
 """
 import io
+import json
 import logging
-from typing import List, Dict, Any, Optional
-from datetime import datetime
-import pandas as pd
+from datetime import datetime, timezone
+from enum import Enum
+from itertools import islice
+from typing import List, Dict, Any, Optional, Sequence
+
 from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.cell.cell import ILLEGAL_CHARACTERS_RE
 from openpyxl.styles import Font, PatternFill, Alignment
-from openpyxl.utils.dataframe import dataframe_to_rows
+from openpyxl.utils import get_column_letter
 
 logger = logging.getLogger(__name__)
 
+# Сколько строк просматривать для расчета ширины колонок
+WIDTH_SAMPLE_ROWS = 200
+MAX_COLUMN_WIDTH = 50
+# Максимальная длина текста в ячейке Excel
+MAX_CELL_LENGTH = 32_767
+
+
+def excel_cell_value(value: Any) -> Any:
+    """Значение для ячейки XLSX с учетом ограничений Excel"""
+    if value is None:
+        return None
+    if isinstance(value, Enum):
+        value = value.value
+    if isinstance(value, datetime):
+        # Excel не хранит часовой пояс - пишем UTC без tzinfo
+        if value.tzinfo is not None:
+            value = value.astimezone(timezone.utc).replace(tzinfo=None)
+        return value
+    if isinstance(value, (dict, list)):
+        value = json.dumps(value, ensure_ascii=False, default=str)
+    if isinstance(value, str):
+        return ILLEGAL_CHARACTERS_RE.sub("", value)[:MAX_CELL_LENGTH]
+    return value
+
+
+def _error_workbook(error: Exception) -> bytes:
+    """Простой файл с текстом ошибки"""
+    wb = Workbook()
+    ws = wb.active
+    ws.title = "Error"
+    ws.append([f"Ошибка при создании файла: {str(error)}"])
+
+    buffer = io.BytesIO()
+    wb.save(buffer)
+    return buffer.getvalue()
+
+
+def _column_widths(keys: Sequence[str], titles: Sequence[str], rows: Sequence[Dict[str, Any]]) -> List[int]:
+    """Ширина колонок по заголовкам и первым WIDTH_SAMPLE_ROWS строкам"""
+    widths = [len(str(title)) for title in titles]
+    for row in islice(rows, WIDTH_SAMPLE_ROWS):
+        for index, key in enumerate(keys):
+            value = row.get(key)
+            if value is not None:
+                widths[index] = max(widths[index], len(str(value)))
+    return [min(width + 2, MAX_COLUMN_WIDTH) for width in widths]
+
+
+def _append_sheet(
+    wb: Workbook,
+    title: str,
+    rows: Sequence[Dict[str, Any]],
+    keys: Sequence[str],
+    titles: Optional[Sequence[str]] = None,
+    styled: bool = True
+) -> None:
+    """Добавляет лист с заголовком и строками в книгу write-only"""
+    titles = list(titles or keys)
+    ws = wb.create_sheet(title[:31])
+
+    # В write-only режиме ширину нужно задать до первой строки
+    for index, width in enumerate(_column_widths(keys, titles, rows), start=1):
+        ws.column_dimensions[get_column_letter(index)].width = width
+
+    header = []
+    for value in titles:
+        cell = WriteOnlyCell(ws, value=value)
+        if styled:
+            cell.font = Font(bold=True, color="FFFFFF")
+            cell.fill = PatternFill(start_color="366092", end_color="366092", fill_type="solid")
+            cell.alignment = Alignment(horizontal="center", vertical="center")
+        header.append(cell)
+    ws.append(header)
+
+    for row in rows:
+        ws.append([excel_cell_value(row.get(key)) for key in keys])
+
+
 def export_to_excel(
-    data: List[Dict[str, Any]], 
+    data: List[Dict[str, Any]],
     filename: str = "export.xlsx",
     sheet_name: str = "Data",
     headers: Optional[Dict[str, str]] = None
 ) -> bytes:
     """
     Экспортирует данные в Excel файл
-    
+
     Args:
         data: Список словарей с данными
         filename: Имя файла
         sheet_name: Имя листа
         headers: Словарь для переименования колонок {old_name: new_name}
-    
+
     Returns:
         bytes: Содержимое Excel файла
     """
     try:
+        wb = Workbook(write_only=True)
+
         if not data:
             # Создаем пустой файл если нет данных
-            wb = Workbook()
-            ws = wb.active
-            ws.title = sheet_name
+            ws = wb.create_sheet(sheet_name[:31])
             ws.append(["Нет данных для экспорта"])
-            
-            buffer = io.BytesIO()
-            wb.save(buffer)
-            buffer.seek(0)
-            return buffer.getvalue()
-        
-        # Создаем DataFrame из данных
-        df = pd.DataFrame(data)
-        
-        # Переименовываем колонки если указаны headers
-        if headers:
-            df = df.rename(columns=headers)
-        
-        # Создаем Excel файл
-        wb = Workbook()
-        ws = wb.active
-        ws.title = sheet_name
-        
-        # Добавляем данные
-        for r in dataframe_to_rows(df, index=False, header=True):
-            ws.append(r)
-        
-        # Стилизация заголовков
-        header_font = Font(bold=True, color="FFFFFF")
-        header_fill = PatternFill(start_color="366092", end_color="366092", fill_type="solid")
-        header_alignment = Alignment(horizontal="center", vertical="center")
-        
-        for cell in ws[1]:
-            cell.font = header_font
-            cell.fill = header_fill
-            cell.alignment = header_alignment
-        
-        # Автоширина колонок
-        for column in ws.columns:
-            max_length = 0
-            column_letter = column[0].column_letter
-            for cell in column:
-                try:
-                    if len(str(cell.value)) > max_length:
-                        max_length = len(str(cell.value))
-                except:
-                    pass
-            adjusted_width = min(max_length + 2, 50)
-            ws.column_dimensions[column_letter].width = adjusted_width
-        
-        # Сохраняем в буфер
+        else:
+            # Колонки в порядке первого появления ключа
+            keys = list(dict.fromkeys(key for row in data for key in row))
+            titles = [(headers or {}).get(key, key) for key in keys]
+            _append_sheet(wb, sheet_name, data, keys, titles)
+
         buffer = io.BytesIO()
         wb.save(buffer)
-        buffer.seek(0)
-        
+
         logger.info(f"Excel file created successfully: {filename}, rows: {len(data)}")
         return buffer.getvalue()
-        
+
     except Exception as e:
         logger.error(f"Error creating Excel file: {str(e)}")
-        # Возвращаем простой файл с ошибкой
-        wb = Workbook()
-        ws = wb.active
-        ws.title = "Error"
-        ws.append([f"Ошибка при создании файла: {str(e)}"])
-        
-        buffer = io.BytesIO()
-        wb.save(buffer)
-        buffer.seek(0)
-        return buffer.getvalue()
+        return _error_workbook(e)
+
 
 def export_analytics_to_excel(
     analytics_data: Dict[str, Any],
@@ -109,93 +147,48 @@ def export_analytics_to_excel(
 ) -> bytes:
     """
     Экспортирует аналитические данные в Excel с несколькими листами
-    
+
     Args:
         analytics_data: Словарь с аналитическими данными
         filename: Имя файла
-    
+
     Returns:
         bytes: Содержимое Excel файла
     """
     try:
-        wb = Workbook()
-        
-        # Удаляем стандартный лист
-        wb.remove(wb.active)
-        
-        # Создаем листы для разных типов данных
+        wb = Workbook(write_only=True)
         sheets_created = False
-        
+
         # Лист с общей статистикой
         if 'summary' in analytics_data:
-            ws_summary = wb.create_sheet("Общая статистика")
-            summary_data = analytics_data['summary']
-            
-            # Добавляем заголовки
-            ws_summary.append(["Метрика", "Значение"])
-            
-            # Добавляем данные
-            for key, value in summary_data.items():
-                ws_summary.append([key, value])
-            
+            summary_rows = [
+                {"metric": key, "value": value}
+                for key, value in analytics_data['summary'].items()
+            ]
+            _append_sheet(
+                wb, "Общая статистика", summary_rows,
+                ["metric", "value"], ["Метрика", "Значение"], styled=False
+            )
             sheets_created = True
-        
-        # Лист с пользователями
-        if 'users' in analytics_data and analytics_data['users']:
-            ws_users = wb.create_sheet("Пользователи")
-            users_data = analytics_data['users']
-            
-            if isinstance(users_data, list) and users_data:
-                # Добавляем заголовки
-                headers = list(users_data[0].keys())
-                ws_users.append(headers)
-                
-                # Добавляем данные
-                for user in users_data:
-                    row = [user.get(header, '') for header in headers]
-                    ws_users.append(row)
-                
-                sheets_created = True
-        
-        # Лист с генерациями
-        if 'generations' in analytics_data and analytics_data['generations']:
-            ws_generations = wb.create_sheet("Генерации")
-            generations_data = analytics_data['generations']
-            
-            if isinstance(generations_data, list) and generations_data:
-                # Добавляем заголовки
-                headers = list(generations_data[0].keys())
-                ws_generations.append(headers)
-                
-                # Добавляем данные
-                for generation in generations_data:
-                    row = [generation.get(header, '') for header in headers]
-                    ws_generations.append(row)
-                
+
+        # Листы с пользователями и генерациями
+        for key, title in (('users', "Пользователи"), ('generations', "Генерации")):
+            rows = analytics_data.get(key)
+            if isinstance(rows, list) and rows:
+                _append_sheet(wb, title, rows, list(rows[0].keys()), styled=False)
                 sheets_created = True
-        
+
         # Если не создали ни одного листа, создаем пустой
         if not sheets_created:
             ws_empty = wb.create_sheet("Нет данных")
             ws_empty.append(["Нет данных для экспорта"])
-        
-        # Сохраняем в буфер
+
         buffer = io.BytesIO()
         wb.save(buffer)
-        buffer.seek(0)
-        
+
         logger.info(f"Analytics Excel file created successfully: {filename}")
         return buffer.getvalue()
-        
+
     except Exception as e:
         logger.error(f"Error creating analytics Excel file: {str(e)}")
-        # Возвращаем простой файл с ошибкой
-        wb = Workbook()
-        ws = wb.active
-        ws.title = "Error"
-        ws.append([f"Ошибка при создании файла: {str(e)}"])
-        
-        buffer = io.BytesIO()
-        wb.save(buffer)
-        buffer.seek(0)
-        return buffer.getvalue()
+        return _error_workbook(e)
@@ -23,6 +23,8 @@ try:
 except ImportError:
     GEMINI_AVAILABLE = False
 
+from .tokenizer import count_tokens
+
 # Настраиваем логгер
 logger = logging.getLogger(__name__)
 
@@ -468,11 +470,15 @@ class GeminiHandler:
 
         api_key_to_use = None
         model_to_use = model
+        prompt_tokens = count_tokens(prompt, model)
 
         # Если включен rate limiter, получаем доступный ключ и модель
         if self.use_rate_limiter and RATE_LIMITER_AVAILABLE:
             try:
-                api_key_to_use, model_to_use = gemini_limiter.get_available_key_and_model()
+                # Ключ и модель выбираются с учетом лимита токенов в минуту
+                api_key_to_use, model_to_use = gemini_limiter.get_available_key_and_model(
+                    tokens=prompt_tokens + max_tokens
+                )
                 logger.info(f"Модель выбрана rate limiter: {model_to_use}")
                 logger.info(f"Используем API ключ из rate limiter: {api_key_to_use[:5]}...")
             except Exception as e:
@@ -509,7 +515,10 @@ class GeminiHandler:
 
             # Записываем использование в rate limiter (если используется)
             if self.use_rate_limiter and RATE_LIMITER_AVAILABLE:
-                gemini_limiter.record_usage(api_key_to_use, model_to_use)
+                gemini_limiter.record_usage(
+                    api_key_to_use, model_to_use,
+                    tokens=prompt_tokens + count_tokens(result if isinstance(result, str) else None, model_to_use)
+                )
 
             return result
         except GeminiAPIException as e:
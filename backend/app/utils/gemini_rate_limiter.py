@@ -105,7 +105,7 @@ class GeminiRateLimiter:
         self.key_manager = APIKeyManager()
         
         # Отслеживание использования API
-        # Формат: {ключ: {модель: {"minute_count": 0, "day_count": 0, "minute_start": timestamp, "day_start": timestamp, "errors": 0}}}
+        # Формат: {ключ: {модель: {"minute_count": 0, "minute_tokens": 0, "day_count": 0, "minute_start": timestamp, "day_start": timestamp, "errors": 0}}}
         self.usage = {}
         
         # Инициализируем отслеживание использования для всех ключей и моделей
@@ -130,6 +130,7 @@ class GeminiRateLimiter:
                 if model not in self.usage[key]:
                     self.usage[key][model] = {
                         "minute_count": 0,
+                        "minute_tokens": 0,
                         "day_count": 0,
                         "errors": 0,
                         "minute_start": now,
@@ -166,15 +167,17 @@ class GeminiRateLimiter:
                 # Также проверяем, не прошла ли минута с момента последнего запроса
                 if now - self.usage[key][model]["minute_start"] >= 60:
                     self.usage[key][model]["minute_count"] = 0
+                    self.usage[key][model]["minute_tokens"] = 0
                     self.usage[key][model]["minute_start"] = now
     
-    def record_usage(self, api_key: str, model: str):
+    def record_usage(self, api_key: str, model: str, tokens: int = 0):
         """
         Записывает использование API
         
         Args:
             api_key: Ключ API
             model: Название модели
+            tokens: Токены запроса (промпт + ответ)
         """
         if not self.enabled or api_key not in self.usage:
             return
@@ -183,6 +186,7 @@ class GeminiRateLimiter:
             # Инициализируем отслеживание для новой модели
             self.usage[api_key][model] = {
                 "minute_count": 0,
+                "minute_tokens": 0,
                 "day_count": 0,
                 "errors": 0,
                 "minute_start": time.time(),
@@ -194,24 +198,31 @@ class GeminiRateLimiter:
         # Проверяем, не прошла ли минута с момента последнего запроса
         if now - self.usage[api_key][model]["minute_start"] >= 60:
             self.usage[api_key][model]["minute_count"] = 0
+            self.usage[api_key][model]["minute_tokens"] = 0
             self.usage[api_key][model]["minute_start"] = now
         
         # Увеличиваем счетчики использования
         self.usage[api_key][model]["minute_count"] += 1
+        self.usage[api_key][model]["minute_tokens"] += tokens
         self.usage[api_key][model]["day_count"] += 1
         
         # Проверяем, не превышены ли лимиты
         rpm_limit = self.model_limits[model]["rpm"]
         rpd_limit = self.model_limits[model]["rpd"]
+        tpm_limit = self.model_limits[model]["tpm"]
         
         minute_usage = self.usage[api_key][model]["minute_count"]
         day_usage = self.usage[api_key][model]["day_count"]
+        minute_tokens = self.usage[api_key][model]["minute_tokens"]
         
         if minute_usage >= rpm_limit:
             logger.warning(f"Достигнут лимит запросов в минуту ({rpm_limit}) для модели {model} и ключа {api_key[:5]}...")
             
         if day_usage >= rpd_limit:
             logger.warning(f"Достигнут лимит запросов в день ({rpd_limit}) для модели {model} и ключа {api_key[:5]}...")
+            
+        if minute_tokens >= tpm_limit:
+            logger.warning(f"Достигнут лимит токенов в минуту ({tpm_limit}) для модели {model} и ключа {api_key[:5]}...")
     
     def record_error(self, api_key: str, model: str, error_details: str = ""):
         """
@@ -229,6 +240,7 @@ class GeminiRateLimiter:
             # Инициализируем отслеживание для новой модели
             self.usage[api_key][model] = {
                 "minute_count": 0,
+                "minute_tokens": 0,
                 "day_count": 0,
                 "errors": 0,
                 "minute_start": time.time(),
@@ -240,13 +252,14 @@ class GeminiRateLimiter:
         
         logger.error(f"Ошибка при использовании модели {model} с ключом {api_key[:5]}...: {error_details}")
     
-    def is_key_available(self, api_key: str, model: str) -> bool:
+    def is_key_available(self, api_key: str, model: str, tokens: int = 0) -> bool:
         """
         Проверяет, доступен ли указанный ключ API для использования с указанной моделью
         
         Args:
             api_key: Ключ API
             model: Название модели
+            tokens: Ожидаемые токены запроса (промпт + max_tokens)
             
         Returns:
             True, если ключ доступен, иначе False
@@ -262,24 +275,29 @@ class GeminiRateLimiter:
         # Проверяем, не прошла ли минута с момента последнего запроса
         if now - self.usage[api_key][model]["minute_start"] >= 60:
             self.usage[api_key][model]["minute_count"] = 0
+            self.usage[api_key][model]["minute_tokens"] = 0
             self.usage[api_key][model]["minute_start"] = now
-            return True
         
         # Проверяем лимиты
         rpm_limit = self.model_limits[model]["rpm"]
         rpd_limit = self.model_limits[model]["rpd"]
+        tpm_limit = self.model_limits[model]["tpm"]
         
         minute_usage = self.usage[api_key][model]["minute_count"]
         day_usage = self.usage[api_key][model]["day_count"]
+        # Запрос больше всего лимита не отклоняется, если минута еще пуста
+        minute_tokens = self.usage[api_key][model]["minute_tokens"]
+        tokens_fit = minute_tokens == 0 or minute_tokens + tokens <= tpm_limit
         
-        return minute_usage < rpm_limit and day_usage < rpd_limit
+        return minute_usage < rpm_limit and day_usage < rpd_limit and tokens_fit
     
-    def get_available_model(self, api_key: str) -> Optional[str]:
+    def get_available_model(self, api_key: str, tokens: int = 0) -> Optional[str]:
         """
         Возвращает доступную модель для указанного ключа API
         
         Args:
             api_key: Ключ API
+            tokens: Ожидаемые токены запроса (промпт + max_tokens)
             
         Returns:
             Название доступной модели или None, если все модели недоступны
@@ -296,16 +314,19 @@ class GeminiRateLimiter:
         
         # Проверяем каждую модель, начиная с самой приоритетной
         for model, _ in sorted_models:
-            if self.is_key_available(api_key, model):
+            if self.is_key_available(api_key, model, tokens):
                 return model
         
         # Если все модели недоступны, возвращаем None
         return None
     
-    def get_available_key_and_model(self) -> Tuple[str, str]:
+    def get_available_key_and_model(self, tokens: int = 0) -> Tuple[str, str]:
         """
         Возвращает доступные ключ API и модель
         
+        Args:
+            tokens: Ожидаемые токены запроса (промпт + max_tokens)
+        
         Returns:
             Кортеж (ключ API, название модели)
         """
@@ -329,7 +350,7 @@ class GeminiRateLimiter:
             used_keys.append(api_key)
             
             # Получаем доступную модель для этого ключа
-            model = self.get_available_model(api_key)
+            model = self.get_available_model(api_key, tokens)
             
             if model:
                 return api_key, model
@@ -346,7 +367,35 @@ class GeminiRateLimiter:
             Словарь со статистикой использования для всех ключей и моделей
         """
         return self.usage
-    
+
+    def spare_capacity(self) -> float:
+        """
+        Свободная доля квоты у наименее загруженной пары (ключ, модель)
+
+        Returns:
+            Число от 0 до 1: минимум из свободных долей RPM, RPD и TPM
+        """
+        if not self.enabled or not self.usage:
+            return 1.0
+
+        now = time.time()
+        best = 0.0
+        for api_key, models in self.usage.items():
+            for model, usage in models.items():
+                limits = self.model_limits.get(model)
+                if not limits:
+                    continue
+                minute_expired = now - usage["minute_start"] >= 60
+                minute_count = 0 if minute_expired else usage["minute_count"]
+                minute_tokens = 0 if minute_expired else usage["minute_tokens"]
+                spare = min(
+                    1 - minute_count / limits["rpm"],
+                    1 - usage["day_count"] / limits["rpd"],
+                    1 - minute_tokens / limits["tpm"]
+                )
+                best = max(best, spare)
+        return max(0.0, min(1.0, best))
+
     def increment_usage(self, api_key: str, model: str, count: int = 1):
         """
         Увеличивает счетчик использования API на указанное количество
@@ -363,6 +412,7 @@ class GeminiRateLimiter:
             # Инициализируем отслеживание для новой модели
             self.usage[api_key][model] = {
                 "minute_count": 0,
+                "minute_tokens": 0,
                 "day_count": 0,
                 "errors": 0,
                 "minute_start": time.time(),
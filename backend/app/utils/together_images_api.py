@@ -7,11 +7,9 @@ import os
 import asyncio
 import json
 import logging
-import base64
 from typing import Dict, Any, Optional, List
 import httpx
 from datetime import datetime, timedelta
-from pathlib import Path
 
 logger = logging.getLogger(__name__)
 
@@ -72,9 +70,10 @@ class TogetherImagesHandler:
         self.key_cooldowns = {}  # Кулдауны для ключей
         self.current_key_index = 0
         
-        # Директория для сохранения изображений
-        self.images_dir = Path("static/generated_images")
-        self.images_dir.mkdir(parents=True, exist_ok=True)
+        # Хранилище изображений по хешу содержимого
+        from ..services.content.image_store import get_image_store
+        self.image_store = get_image_store()
+        self.images_dir = self.image_store.root
         
         logger.info(f"Инициализация TogetherImagesHandler (доступно ключей: {len(self.api_keys)})")
 
@@ -248,6 +247,8 @@ class TogetherImagesHandler:
                             # Используем прямую ссылку от Together AI (приоритет)
                             image_url = image_data["url"]
                             logger.info(f"Получен прямой URL от Together AI: {image_url[:100]}...")
+                            if save_locally:
+                                image_url = await self._mirror_remote_image(image_url)
                         elif save_locally and "b64_json" in image_data:
                             # Fallback: сохраняем изображение локально
                             image_url = await self._save_image_locally(image_data["b64_json"], prompt)
@@ -313,32 +314,34 @@ class TogetherImagesHandler:
         raise TogetherImagesAPIException("Все API ключи Together AI Images недоступны")
 
     async def _save_image_locally(self, base64_data: str, prompt: str) -> str:
-        """Сохраняет изображение локально и возвращает URL"""
+        """Сохраняет изображение в хранилище по хешу содержимого и возвращает URL"""
         try:
-            # Декодируем base64
-            image_bytes = base64.b64decode(base64_data)
-            
-            # Генерируем имя файла
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            safe_prompt = "".join(c for c in prompt[:30] if c.isalnum() or c in (' ', '-', '_')).rstrip()
-            safe_prompt = safe_prompt.replace(' ', '_')
-            filename = f"flux_{timestamp}_{safe_prompt}.png"
-            
-            # Сохраняем файл
-            file_path = self.images_dir / filename
-            with open(file_path, 'wb') as f:
-                f.write(image_bytes)
-            
-            # Возвращаем полный URL для совместимости с фронтендом
-            # Получаем базовый URL из переменных окружения или используем дефолтный
-            import os
-            base_url = os.getenv('BASE_URL', 'http://localhost:8000')
-            return f"{base_url}/static/generated_images/{filename}"
-            
+            stored = await self.image_store.save_base64(base64_data)
+            if not stored.created:
+                logger.info(f"Изображение уже есть в хранилище: {stored.filename}")
+            return self.image_store.url(stored.filename)
+
         except Exception as e:
             logger.error(f"Ошибка сохранения изображения: {e}")
             raise TogetherImagesAPIException(f"Ошибка сохранения изображения: {e}")
 
+    async def _mirror_remote_image(self, image_url: str) -> str:
+        """
+        Скачивает изображение по временной ссылке провайдера в хранилище
+
+        Включается IMAGE_STORE_MIRROR_REMOTE; при ошибке возвращается исходная ссылка.
+        """
+        from ..core.config import settings
+
+        if not settings.IMAGE_STORE_MIRROR_REMOTE:
+            return image_url
+        try:
+            stored = await self.image_store.save_url(image_url)
+            return self.image_store.url(stored.filename)
+        except Exception as e:
+            logger.warning(f"Не удалось сохранить изображение локально, используем ссылку провайдера: {e}")
+            return image_url
+
     async def _generate_image_via_worker(
         self,
         prompt: str,
@@ -408,6 +411,12 @@ class TogetherImagesHandler:
                 response_time = (datetime.now() - start_time).total_seconds()
 
                 logger.info(f"Получен прямой URL от Together AI через Worker: {image_url[:100]}...")
+                if save_locally:
+                    local_url = await self._mirror_remote_image(image_url)
+                    saved_locally = local_url != image_url
+                    image_url = local_url
+                else:
+                    saved_locally = False
 
                 # Логгируем успешное использование
                 log_key_usage(
@@ -427,7 +436,7 @@ class TogetherImagesHandler:
                     "height": height,
                     "steps": steps,
                     "seed": image_data.get("seed"),
-                    "saved_locally": False,  # Не сохраняем локально, используем прямой URL
+                    "saved_locally": saved_locally,
                     "worker_version": result.get("worker_version", "1.0.0")
                 }
 
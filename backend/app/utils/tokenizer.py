@@ -0,0 +1,71 @@
+"""
+Подсчет токенов промпта и ответа.
+
+Если установлен tiktoken, токены считаются локальным BPE-токенизатором
+(кодировка выбирается по семейству модели и загружается один раз на
+процесс). Для моделей не OpenAI (Gemini, Llama, Mistral) это приближение,
+но заметно точнее оценки по символам. Без tiktoken используется
+estimate_tokens: латиница ~4 символа на токен, другие алфавиты ~2.5,
+иероглифы - символ на токен.
+"""
+import logging
+from functools import lru_cache
+from typing import Optional
+
+try:
+    import tiktoken
+    TIKTOKEN_AVAILABLE = True
+except ImportError:
+    TIKTOKEN_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+# Модели с кодировкой o200k_base; у остальных - cl100k_base
+O200K_MODEL_PREFIXES = ("gpt-4o", "gpt-4.1", "gpt-5", "o1", "o3", "o4", "chatgpt-4o")
+DEFAULT_ENCODING = "cl100k_base"
+
+
+def estimate_tokens(text: str) -> int:
+    """Оценка числа токенов без токенизатора"""
+    latin = 0
+    wide = 0
+    other = 0
+    for char in text:
+        code = ord(char)
+        if code < 0x250:
+            latin += 1
+        elif 0x2E80 <= code <= 0x9FFF or 0xAC00 <= code <= 0xD7AF or 0xF900 <= code <= 0xFAFF:
+            wide += 1
+        else:
+            other += 1
+    return int(latin / 4 + other / 2.5 + wide) + 1
+
+
+def model_family(model: Optional[str]) -> str:
+    """Кодировка tiktoken для модели (провайдерский префикс вида openai/ отбрасывается)"""
+    name = (model or "").lower().rsplit("/", 1)[-1]
+    if name.startswith(O200K_MODEL_PREFIXES):
+        return "o200k_base"
+    return DEFAULT_ENCODING
+
+
+@lru_cache(maxsize=None)
+def _encoding(family: str):
+    if not TIKTOKEN_AVAILABLE:
+        return None
+    try:
+        return tiktoken.get_encoding(family)
+    except Exception as e:
+        # Файл кодировки не скачан и сети нет - остаемся на оценке
+        logger.warning(f"Кодировка {family} недоступна, токены оцениваются по символам: {str(e)}")
+        return None
+
+
+def count_tokens(text: Optional[str], model: Optional[str] = None) -> int:
+    """Число токенов текста для модели"""
+    if not text:
+        return 0
+    encoding = _encoding(model_family(model))
+    if encoding is None:
+        return estimate_tokens(text)
+    return len(encoding.encode(text, disallowed_special=()))
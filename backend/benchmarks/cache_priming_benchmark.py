@@ -0,0 +1,199 @@
+"""
+Бенчмарк заблаговременной загрузки кэша генераций.
+
+Сутки запросов к генерации: --prompts промптов с популярностью по закону
+Ципфа, --rate запросов в час, кэш генераций живет час. Часть сохраненных
+генераций неудачна (--failed) - такие промпты CachePrimer генерирует
+заново, если у провайдера свободна квота (--rpm запросов в минуту).
+История generations за прошлые сутки дает популярность. Сравниваются:
+  - cold: только кэш генераций (запись при промахе);
+  - primed: плюс CachePrimer каждые --interval секунд.
+Выводятся доля попаданий, генерации на пути пользователя, генерации
+загрузчика и сэкономленное время по счетчику cache_priming:stats. БД и
+Redis не нужны (история и кэш в памяти, время модельное).
+
+Запуск из каталога backend:
+    python -m benchmarks.cache_priming_benchmark --prompts 400 --rate 300 --top 50
+"""
+import argparse
+import asyncio
+import random
+from collections import Counter, deque
+
+from app.core.constants import ContentType
+from app.services.content.cache_primer import STATS_KEY, CachePrimer, record_primed_hit, remember_prompt
+from app.services.content.prompt_cache import generation_cache_key
+
+GENERATION_SECONDS = 20.0
+CACHE_TTL = 3600
+FAILED_CONTENT = "Не удалось сгенерировать контент. Пожалуйста, попробуйте позже."
+
+
+class ClockCache:
+    """Кэш в памяти со временем жизни по модельным часам"""
+
+    def __init__(self):
+        self.now = 0.0
+        self.data = {}
+
+    async def get_cached_data(self, key):
+        item = self.data.get(key)
+        if item is None or item[1] <= self.now:
+            return None
+        return item[0]
+
+    async def cache_data(self, key, data, ttl=None):
+        self.data[key] = (data, self.now + (ttl or CACHE_TTL))
+        return True
+
+    async def invalidate(self, key):
+        return self.data.pop(key, None) is not None
+
+
+class FakeResult:
+
+    def __init__(self, rows):
+        self.rows = rows
+
+    def mappings(self):
+        return self
+
+    def all(self):
+        return self.rows
+
+
+class HistorySession:
+    """Отвечает на запросы CachePrimer по истории generations в памяти"""
+
+    def __init__(self, history):
+        self.history = history
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        return False
+
+    async def execute(self, statement, params=None):
+        sql = str(statement)
+        if "GROUP BY type, md5(prompt)" in sql:
+            counts = Counter(prompt for prompt, _ in self.history)
+            latest = {prompt: index for index, (prompt, _) in enumerate(self.history)}
+            rows = [{"content_type": "LESSON_PLAN", "requests": count, "latest_id": latest[prompt]}
+                    for prompt, count in counts.most_common(params["limit"]) if count >= params["min_requests"]]
+            return FakeResult(rows)
+        if "id = ANY(:ids)" in sql:
+            return FakeResult([{"id": i, "user_id": 1, "prompt": self.history[i][0], "content": self.history[i][1]}
+                               for i in params["ids"]])
+        if "FROM generation_metrics" in sql:
+            return FakeResult([{"content_type": "LESSON_PLAN", "seconds": GENERATION_SECONDS}])
+        return FakeResult([])
+
+
+class Provider:
+    """Квота провайдера: запросы за последнюю минуту модельного времени"""
+
+    def __init__(self, cache, rpm):
+        self.cache = cache
+        self.rpm = rpm
+        self.calls = deque()
+
+    def call(self):
+        self.calls.append(self.cache.now)
+
+    def spare_capacity(self):
+        while self.calls and self.calls[0] <= self.cache.now - 60:
+            self.calls.popleft()
+        return max(0.0, 1 - len(self.calls) / self.rpm)
+
+
+class PrimerGenerator:
+
+    def __init__(self, cache, provider, counter):
+        self.cache = cache
+        self.provider = provider
+        self.counter = counter
+
+    async def generate_content(self, user_id, prompt, content_type, use_cache=True, extra_params=None):
+        self.provider.call()
+        self.counter["primer_generations"] += 1
+        content = f"content of {prompt}"
+        await self.cache.cache_data(generation_cache_key(prompt, content_type, extra_params), content, ttl=CACHE_TTL)
+        return content
+
+
+def make_prompt(index):
+    return f"Составь план урока английского языка. Тема номер {index}. Уровень: B1"
+
+
+async def simulate(args, primed):
+    rng = random.Random(5)
+    prompts = [make_prompt(i) for i in range(args.prompts)]
+    weights = [1 / (rank + 1) ** args.zipf for rank in range(args.prompts)]
+
+    def stored_content(prompt):
+        return FAILED_CONTENT if rng.random() < args.failed else f"content of {prompt}"
+
+    history = [(prompt, stored_content(prompt)) for prompt in rng.choices(prompts, weights, k=args.rate * 24)]
+    cache = ClockCache()
+    provider = Provider(cache, args.rpm)
+    counter = Counter()
+    # Промпты прошлых суток уже запрашивались через кэш генераций
+    for prompt in set(prompt for prompt, _ in history):
+        await remember_prompt(cache, ContentType.LESSON_PLAN, prompt, {"level": "B1"})
+
+    async def no_sleep(seconds):
+        return None
+
+    primer = CachePrimer(
+        session_factory=lambda: HistorySession(history), cache=cache, top_prompts=args.top, top_templates=0,
+        lookback_days=7, min_requests=2, max_generations=args.max_generations, generation_delay=0,
+        min_spare_capacity=0.5, generator_factory=lambda session: PrimerGenerator(cache, provider, counter),
+        spare_capacity=provider.spare_capacity, sleep=no_sleep
+    )
+
+    times = sorted(rng.uniform(0, 24 * 3600) for _ in range(args.rate * 24))
+    next_priming = 0.0
+    for now in times:
+        cache.now = now
+        if primed and now >= next_priming:
+            await primer.prime_prompts(HistorySession(history))
+            next_priming = now + args.interval
+
+        prompt = rng.choices(prompts, weights)[0]
+        key = generation_cache_key(prompt, ContentType.LESSON_PLAN, {"level": "B1"})
+        if await cache.get_cached_data(key) is not None:
+            counter["hits"] += 1
+            await record_primed_hit(cache, key)
+            continue
+        provider.call()
+        counter["user_generations"] += 1
+        await cache.cache_data(key, f"content of {prompt}", ttl=CACHE_TTL)
+
+    total = len(times)
+    stats = await cache.get_cached_data(STATS_KEY) or {"hits": 0, "saved_seconds": 0.0}
+    print(f"{'primed' if primed else 'cold':<7} hit rate {counter['hits'] / total * 100:5.1f}%, "
+          f"user-path generations {counter['user_generations']}, "
+          f"primer generations {counter['primer_generations']}, "
+          f"hits on primed entries {stats['hits']}, saved {stats['saved_seconds'] / 3600:.1f} h of generation time")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cache priming benchmark")
+    parser.add_argument("--prompts", type=int, default=400, help="Различных промптов")
+    parser.add_argument("--rate", type=int, default=300, help="Запросов генерации в час")
+    parser.add_argument("--zipf", type=float, default=1.1, help="Показатель закона Ципфа для популярности")
+    parser.add_argument("--top", type=int, default=50, help="Популярных промптов за запуск загрузчика")
+    parser.add_argument("--interval", type=int, default=1800, help="Период загрузки, сек")
+    parser.add_argument("--failed", type=float, default=0.05, help="Доля неудачных генераций в истории")
+    parser.add_argument("--max-generations", type=int, default=5)
+    parser.add_argument("--rpm", type=int, default=15, help="Лимит провайдера, запросов в минуту")
+    args = parser.parse_args()
+
+    print(f"{args.rate * 24} requests over 24 h, {args.prompts} prompts, generation cache TTL {CACHE_TTL} s")
+    asyncio.run(simulate(args, primed=False))
+    asyncio.run(simulate(args, primed=True))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+"""
+Бенчмарк сохранения уроков и активностей курса.
+
+Курс из --lessons уроков по --activities активностей (по умолчанию 50 x 10,
+как при клонировании большого курса) сохраняется в отдельной схеме
+PostgreSQL двумя способами:
+  - per-lesson: прежний путь - add + flush каждого урока, затем add_all +
+    flush его активностей;
+  - bulk: CourseManager._persist_lessons - один INSERT ... RETURNING id для
+    уроков и один многострочный INSERT для активностей.
+Выводятся число обращений к БД (выполненных SQL-запросов) и время; каждый
+прогон выполняется в транзакции, которая откатывается.
+
+Запуск из каталога backend:
+    python -m benchmarks.course_bulk_persistence_benchmark --lessons 50 --activities 10
+"""
+import argparse
+import asyncio
+import time
+
+from sqlalchemy import event, text
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+
+from app.core.database import get_async_db_url
+from app.models.course import Activity, Lesson
+from app.services.course.manager import CourseManager
+
+BENCH_SCHEMA = "course_persistence_bench"
+
+
+def make_lessons(lessons: int, activities: int):
+    return [
+        {
+            "title": f"Урок {i + 1}",
+            "order": i + 1,
+            "duration": activities * 6,
+            "objectives": ["Цель 1", "Цель 2"],
+            "grammar": ["Present Perfect"],
+            "vocabulary": ["word", "phrase"],
+            "materials": ["Учебник, стр. 10"],
+            "homework": {"description": "Упражнения 1-3"},
+            "activities": [
+                {
+                    "name": f"Активность {j + 1}",
+                    "type": "practice",
+                    "duration": 6,
+                    "description": "Работа в парах",
+                    "materials": ["Карточки"],
+                    "objectives": ["Закрепить грамматику"]
+                }
+                for j in range(activities)
+            ]
+        }
+        for i in range(lessons)
+    ]
+
+
+async def per_lesson(session: AsyncSession, course_id: int, lessons):
+    """Прежний путь: flush на каждый урок и его активности"""
+    for lesson_data in lessons:
+        lesson = Lesson(course_id=course_id, **{k: v for k, v in lesson_data.items() if k != "activities"})
+        session.add(lesson)
+        await session.flush()
+        session.add_all([Activity(lesson_id=lesson.id, **activity) for activity in lesson_data["activities"]])
+        await session.flush()
+
+
+async def bulk(session: AsyncSession, course_id: int, lessons):
+    await CourseManager(session)._persist_lessons(course_id, lessons)
+
+
+async def _setup(conn):
+    """Схема с минимальной таблицей courses и таблицами уроков и активностей"""
+    await conn.execute(text(f"DROP SCHEMA IF EXISTS {BENCH_SCHEMA} CASCADE"))
+    await conn.execute(text(f"CREATE SCHEMA {BENCH_SCHEMA}"))
+    await conn.execute(text(f"SET search_path TO {BENCH_SCHEMA}"))
+    await conn.execute(text("CREATE TABLE courses (id INTEGER PRIMARY KEY)"))
+    await conn.execute(text("INSERT INTO courses (id) VALUES (1)"))
+    await conn.run_sync(
+        lambda sync_conn: Lesson.metadata.create_all(sync_conn, tables=[Lesson.__table__, Activity.__table__])
+    )
+
+
+async def _measure(engine, implementation, lessons):
+    """Число SQL-запросов и время одного прогона в откатываемой транзакции"""
+    statements = []
+
+    def count(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    async with engine.connect() as conn:
+        await conn.execute(text(f"SET search_path TO {BENCH_SCHEMA}"))
+        event.listen(engine.sync_engine, "before_cursor_execute", count)
+        try:
+            async with AsyncSession(bind=conn) as session:
+                started = time.perf_counter()
+                await implementation(session, 1, lessons)
+                elapsed = time.perf_counter() - started
+                await session.rollback()
+        finally:
+            event.remove(engine.sync_engine, "before_cursor_execute", count)
+    return len(statements), elapsed
+
+
+async def run(database_url: str, lessons: int, activities: int, repeats: int, keep: bool):
+    engine = create_async_engine(database_url)
+    try:
+        async with engine.begin() as conn:
+            await _setup(conn)
+
+        tree = make_lessons(lessons, activities)
+        print(f"Course of {lessons} lessons x {activities} activities ({lessons * activities} activities)")
+        for name, implementation in (("per-lesson", per_lesson), ("bulk", bulk)):
+            timings = []
+            for _ in range(repeats):
+                statements, elapsed = await _measure(engine, implementation, tree)
+                timings.append(elapsed)
+            print(
+                f"{name:<11} {statements} statements, best {min(timings) * 1000:.1f} ms, "
+                f"avg {sum(timings) / len(timings) * 1000:.1f} ms"
+            )
+
+        if not keep:
+            async with engine.begin() as conn:
+                await conn.execute(text(f"DROP SCHEMA {BENCH_SCHEMA} CASCADE"))
+    finally:
+        await engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Lesson and activity persistence benchmark")
+    parser.add_argument("--database-url", default=get_async_db_url())
+    parser.add_argument("--lessons", type=int, default=50)
+    parser.add_argument("--activities", type=int, default=10, help="Активностей в уроке")
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--keep", action="store_true", help="Не удалять схему после прогона")
+    args = parser.parse_args()
+
+    asyncio.run(run(args.database_url, args.lessons, args.activities, args.repeats, args.keep))
+
+
+if __name__ == "__main__":
+    main()
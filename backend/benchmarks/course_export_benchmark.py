@@ -0,0 +1,195 @@
+"""
+Бенчмарк экспорта курса: рендеринг в цикле событий против пула процессов с кэшем.
+
+Создает в отдельной схеме PostgreSQL курс из 50 уроков (по умолчанию 6
+активностей в уроке) и экспортирует его одновременно от 10 клиентов:
+  - inline: как прежний CourseManager.export_course - каждый запрос заново
+    регистрирует шрифты и стили и рендерит документ прямо в цикле событий;
+  - pool, cold: CourseExportRenderer с пустым кэшем - один общий рендеринг
+    в пуле процессов на все одновременные запросы;
+  - pool, warm: повторные скачивания неизмененного курса из кэша.
+
+Для каждого режима выводится общее время, среднее время ответа клиента и
+максимальная задержка цикла событий (насколько опоздал тикер с периодом 10 мс).
+
+Требуется reportlab (для --format pdf) или python-docx (для --format docx).
+
+Запуск из каталога backend:
+    python -m benchmarks.course_export_benchmark --lessons 50 --clients 10 --format pdf
+"""
+import argparse
+import asyncio
+import tempfile
+import time
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+
+from app.core.database import get_async_db_url
+from app.services.course.documents import init_worker, render_course
+from app.services.course.export_renderer import CourseExportRenderer
+
+BENCH_SCHEMA = "course_export_bench"
+
+COURSE_ID = 1
+
+
+async def _setup(conn, lessons: int, activities: int):
+    """Создает таблицы курса с колонками, которые читает экспорт"""
+    await conn.execute(text(f"DROP SCHEMA IF EXISTS {BENCH_SCHEMA} CASCADE"))
+    await conn.execute(text(f"CREATE SCHEMA {BENCH_SCHEMA}"))
+    await conn.execute(text(f"SET search_path TO {BENCH_SCHEMA}"))
+
+    await conn.execute(text("""
+        CREATE TABLE courses (
+            id INTEGER PRIMARY KEY,
+            name VARCHAR(255) NOT NULL,
+            language VARCHAR(50) NOT NULL,
+            level VARCHAR(32) NOT NULL,
+            target_audience VARCHAR(32) NOT NULL,
+            format VARCHAR(32) NOT NULL,
+            description TEXT
+        )
+    """))
+    await conn.execute(text("""
+        CREATE TABLE lessons (
+            id SERIAL PRIMARY KEY,
+            course_id INTEGER NOT NULL REFERENCES courses (id),
+            title VARCHAR(255) NOT NULL,
+            duration INTEGER NOT NULL,
+            "order" INTEGER NOT NULL,
+            objectives JSON,
+            grammar JSON,
+            vocabulary JSON,
+            homework JSON
+        )
+    """))
+    await conn.execute(text("""
+        CREATE TABLE activities (
+            id SERIAL PRIMARY KEY,
+            lesson_id INTEGER NOT NULL REFERENCES lessons (id),
+            name VARCHAR(255) NOT NULL,
+            type VARCHAR(50) NOT NULL,
+            duration INTEGER NOT NULL,
+            description TEXT
+        )
+    """))
+
+    await conn.execute(
+        text("""
+            INSERT INTO courses (id, name, language, level, target_audience, format, description)
+            VALUES (:id, 'Английский для путешествий', 'English', 'INTERMEDIATE', 'ADULTS', 'GROUP',
+                    repeat('Курс для самостоятельной подготовки к поездкам. ', 10))
+        """),
+        {"id": COURSE_ID}
+    )
+    await conn.execute(
+        text("""
+            INSERT INTO lessons (course_id, title, duration, "order", objectives, grammar, vocabulary, homework)
+            SELECT :course_id, 'Тема урока ' || n, 90, n,
+                   json_build_array('Научиться описывать ситуацию ' || n, 'Отработать диалог', 'Расширить словарь'),
+                   json_build_array('Present Perfect', 'Модальные глаголы'),
+                   (SELECT json_agg('слово ' || w) FROM generate_series(1, 20) AS w),
+                   json_build_object('description', 'Подготовить рассказ по теме ' || n,
+                                     'tasks', json_build_array('Упражнение 1', 'Упражнение 2', 'Эссе'))
+            FROM generate_series(1, :lessons) AS n
+        """),
+        {"course_id": COURSE_ID, "lessons": lessons}
+    )
+    await conn.execute(
+        text("""
+            INSERT INTO activities (lesson_id, name, type, duration, description)
+            SELECT l.id, 'Активность ' || a, 'speaking', 15,
+                   repeat('Ученики работают в парах и обсуждают вопросы по теме. ', 6)
+            FROM lessons l CROSS JOIN generate_series(1, :activities) AS a
+        """),
+        {"activities": activities}
+    )
+
+
+async def _loop_lag(stop: asyncio.Event, period: float = 0.01) -> float:
+    """Максимальное опоздание тикера: время, на которое блокировался цикл событий"""
+    worst = 0.0
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(period)
+        worst = max(worst, time.perf_counter() - started - period)
+    return worst
+
+
+async def _client(engine, export) -> float:
+    async with engine.connect() as conn:
+        await conn.execute(text(f"SET search_path TO {BENCH_SCHEMA}"))
+        async with AsyncSession(bind=conn) as session:
+            started = time.perf_counter()
+            content = await export(session)
+            assert content
+            return time.perf_counter() - started
+
+
+async def _measure(engine, export, clients: int):
+    """Общее время, среднее время ответа и задержка цикла для clients одновременных запросов"""
+    stop = asyncio.Event()
+    ticker = asyncio.create_task(_loop_lag(stop))
+    started = time.perf_counter()
+    latencies = await asyncio.gather(*(_client(engine, export) for _ in range(clients)))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    return elapsed, sum(latencies) / len(latencies), await ticker
+
+
+async def run(database_url: str, lessons: int, activities: int, clients: int, format: str, workers: int, keep: bool):
+    engine = create_async_engine(database_url, pool_size=clients)
+    try:
+        async with engine.begin() as conn:
+            await _setup(conn, lessons, activities)
+        print(f"Course with {lessons} lessons x {activities} activities, {clients} clients, format {format}")
+
+        with tempfile.TemporaryDirectory() as cache_dir:
+            renderer = CourseExportRenderer(workers=workers, cache_dir=cache_dir)
+
+            async def inline_export(session):
+                # Прежнее поведение: инициализация шрифтов и стилей и рендеринг в цикле событий
+                course, course_lessons, _ = await renderer.load_course(session, COURSE_ID, format)
+                init_worker()
+                return render_course(format, course, course_lessons)
+
+            async def pool_export(session):
+                return await renderer.export(session, COURSE_ID, format)
+
+            # Процессы пула запускаются заранее, как у работающего приложения
+            await asyncio.get_running_loop().run_in_executor(renderer._executor(), init_worker)
+
+            try:
+                for name, export in (("inline", inline_export), ("pool, cold", pool_export), ("pool, warm", pool_export)):
+                    elapsed, latency, lag = await _measure(engine, export, clients)
+                    print(f"{name:<11} total {elapsed * 1000:.0f} ms, avg response {latency * 1000:.0f} ms, "
+                          f"max event loop stall {lag * 1000:.0f} ms")
+                print(f"Renderer stats: {renderer.stats}")
+            finally:
+                renderer.shutdown()
+
+        if not keep:
+            async with engine.begin() as conn:
+                await conn.execute(text(f"DROP SCHEMA {BENCH_SCHEMA} CASCADE"))
+    finally:
+        await engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Course export benchmark")
+    parser.add_argument("--database-url", default=get_async_db_url())
+    parser.add_argument("--lessons", type=int, default=50)
+    parser.add_argument("--activities", type=int, default=6, help="Активностей в каждом уроке")
+    parser.add_argument("--clients", type=int, default=10, help="Одновременных запросов экспорта")
+    parser.add_argument("--format", choices=("pdf", "docx"), default="pdf")
+    parser.add_argument("--workers", type=int, default=2, help="Процессов рендеринга")
+    parser.add_argument("--keep", action="store_true", help="Не удалять схему после прогона")
+    args = parser.parse_args()
+
+    asyncio.run(run(args.database_url, args.lessons, args.activities, args.clients, args.format,
+                    args.workers, args.keep))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,253 @@
+"""
+Бенчмарк финансовой аналитики: загрузка платежей в Python против агрегатов в SQL.
+
+Создает в отдельной схеме PostgreSQL таблицу payments с синтетическими платежами
+(по умолчанию 1 000 000) и сравнивает время и пиковую память Python (tracemalloc):
+  - прежнюю реализацию /analytics/financial, которая загружает все завершенные
+    платежи как ORM-объекты, суммирует их, группирует по meta_data["tariff_type"]
+    и считает платящих пользователей через set, плюс по запросу на каждый день
+    истории и на предыдущий период;
+  - FinancialAnalyticsQueries, где все считается через GROUP BY / FILTER /
+    COUNT(DISTINCT) и возвращаются только строки результата.
+
+Запуск из каталога backend:
+    python -m benchmarks.financial_analytics_benchmark --payments 1000000 --period-days 365
+"""
+import argparse
+import asyncio
+import gc
+import time
+import tracemalloc
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import select, text
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+
+from app.core.database import get_async_db_url
+from app.models import Payment
+from app.services.analytics.financial_queries import FinancialAnalyticsQueries
+
+BENCH_SCHEMA = "financial_bench"
+
+
+async def _setup(conn, payments: int, users: int, days: int):
+    """Создает схему с таблицей payments той же структуры и индексами, что и в приложении"""
+    await conn.execute(text(f"DROP SCHEMA IF EXISTS {BENCH_SCHEMA} CASCADE"))
+    await conn.execute(text(f"CREATE SCHEMA {BENCH_SCHEMA}"))
+    await conn.execute(text(f"SET search_path TO {BENCH_SCHEMA}"))
+
+    await conn.execute(text("""
+        CREATE TABLE payments (
+            id SERIAL PRIMARY KEY,
+            user_id INTEGER NOT NULL,
+            amount DOUBLE PRECISION NOT NULL,
+            currency VARCHAR(3) DEFAULT 'RUB',
+            payment_type VARCHAR(50) NOT NULL,
+            status VARCHAR(50) DEFAULT 'pending',
+            payment_method VARCHAR(50),
+            external_payment_id VARCHAR(255),
+            meta_data JSONB,
+            description TEXT,
+            created_at TIMESTAMPTZ DEFAULT now(),
+            updated_at TIMESTAMPTZ DEFAULT now(),
+            completed_at TIMESTAMPTZ
+        )
+    """))
+
+    # 70% оплат тарифов, 30% покупок баллов; 90% платежей завершены
+    await conn.execute(
+        text("""
+            INSERT INTO payments (user_id, amount, payment_type, status, payment_method,
+                                  external_payment_id, meta_data, description, created_at, completed_at)
+            SELECT
+                s.user_id,
+                CASE WHEN s.is_tariff THEN (ARRAY[299, 599, 999])[s.tariff_idx] ELSE 100 * (1 + s.tariff_idx) END,
+                CASE WHEN s.is_tariff THEN 'tariff' ELSE 'points' END,
+                CASE WHEN random() < 0.9 THEN 'completed' ELSE 'failed' END,
+                'card',
+                md5(g::text),
+                CASE WHEN s.is_tariff
+                     THEN jsonb_build_object('tariff_type', (ARRAY['tariff_2', 'tariff_4', 'tariff_6'])[s.tariff_idx])
+                     ELSE jsonb_build_object('points', 100 * (1 + s.tariff_idx)) END,
+                'Synthetic payment',
+                s.created_at,
+                s.created_at
+            FROM generate_series(1, :payments) AS g
+            CROSS JOIN LATERAL (
+                SELECT
+                    1 + floor(random() * :users)::int AS user_id,
+                    random() < 0.7 AS is_tariff,
+                    1 + floor(random() * 3)::int AS tariff_idx,
+                    now() - random() * make_interval(days => :days) AS created_at,
+                    g AS seq  -- ссылка на g: random() вычисляется для каждой строки
+            ) s
+        """),
+        {"payments": payments, "users": users, "days": days}
+    )
+    await conn.execute(text("CREATE INDEX idx_payments_status_created_at ON payments (status, created_at)"))
+    await conn.execute(text("""
+        CREATE INDEX idx_payments_completed_tariff_type
+            ON payments ((meta_data->>'tariff_type'), created_at)
+            WHERE status = 'completed'
+    """))
+    await conn.execute(text("ANALYZE payments"))
+
+
+async def legacy_financial(session: AsyncSession, start_date: datetime, now: datetime) -> dict:
+    """Прежняя реализация: ORM-объекты платежей и агрегация в Python"""
+    tariff_payments = (await session.execute(
+        select(Payment).where(
+            Payment.created_at >= start_date,
+            Payment.status == "completed",
+            Payment.payment_type == "tariff"
+        )
+    )).scalars().all()
+    points_payments = (await session.execute(
+        select(Payment).where(
+            Payment.created_at >= start_date,
+            Payment.status == "completed",
+            Payment.payment_type == "points"
+        )
+    )).scalars().all()
+
+    total_revenue = sum(p.amount for p in tariff_payments + points_payments)
+    tariff_revenue = {}
+    for payment in tariff_payments:
+        tariff_type = payment.meta_data.get("tariff_type") if payment.meta_data else None
+        if tariff_type:
+            if tariff_type not in tariff_revenue:
+                tariff_revenue[tariff_type] = {"count": 0, "revenue": 0}
+            tariff_revenue[tariff_type]["count"] += 1
+            tariff_revenue[tariff_type]["revenue"] += payment.amount
+    points_revenue = sum(p.amount for p in points_payments)
+    paying_users = len(set(p.user_id for p in tariff_payments + points_payments))
+
+    daily_revenue = []
+    for i in range(min((now - start_date).days, 30)):
+        day_start = start_date + timedelta(days=i)
+        day_payments = (await session.execute(
+            select(Payment).where(
+                Payment.created_at >= day_start,
+                Payment.created_at < day_start + timedelta(days=1),
+                Payment.status == "completed"
+            )
+        )).scalars().all()
+        daily_revenue.append(sum(p.amount for p in day_payments))
+
+    prev_payments = (await session.execute(
+        select(Payment).where(
+            Payment.created_at >= start_date - (now - start_date),
+            Payment.created_at < start_date,
+            Payment.status == "completed"
+        )
+    )).scalars().all()
+    prev_revenue = sum(p.amount for p in prev_payments)
+
+    return {
+        "total_revenue": total_revenue,
+        "points_revenue": points_revenue,
+        "paying_users": paying_users,
+        "tariff_revenue": tariff_revenue,
+        "daily_revenue": daily_revenue,
+        "prev_revenue": prev_revenue
+    }
+
+
+async def sql_financial(session: AsyncSession, start_date: datetime, now: datetime) -> dict:
+    """Новая реализация: агрегаты считаются в PostgreSQL"""
+    queries = FinancialAnalyticsQueries(session)
+    summary = await queries.payment_summary(start_date, now)
+    tariff_revenue = await queries.tariff_revenue(start_date, now)
+    by_day = await queries.daily_revenue(start_date, now)
+    daily_revenue = [
+        by_day.get((start_date + timedelta(days=i)).date(), 0)
+        for i in range(min((now - start_date).days, 30))
+    ]
+    prev_revenue = await queries.revenue(start_date - (now - start_date), start_date)
+
+    return {
+        "total_revenue": summary["total_revenue"],
+        "points_revenue": summary["points_revenue"],
+        "paying_users": summary["paying_users"],
+        "tariff_revenue": tariff_revenue,
+        "daily_revenue": daily_revenue,
+        "prev_revenue": prev_revenue
+    }
+
+
+async def _measure(engine, implementation, start_date: datetime, now: datetime):
+    """Время и пиковая память одного прогона в новой сессии"""
+    async with engine.connect() as conn:
+        await conn.execute(text(f"SET search_path TO {BENCH_SCHEMA}"))
+        async with AsyncSession(bind=conn) as session:
+            gc.collect()
+            tracemalloc.start()
+            started = time.perf_counter()
+            result = await implementation(session, start_date, now)
+            elapsed = time.perf_counter() - started
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+    return result, elapsed, peak
+
+
+def _assert_same(legacy: dict, current: dict):
+    assert legacy["paying_users"] == current["paying_users"]
+    for key in ("total_revenue", "points_revenue", "prev_revenue"):
+        assert abs(legacy[key] - current[key]) < 1e-6 * max(1.0, legacy[key]), key
+    assert legacy["tariff_revenue"].keys() == current["tariff_revenue"].keys()
+    for tariff_type, data in legacy["tariff_revenue"].items():
+        assert data["count"] == current["tariff_revenue"][tariff_type]["count"], tariff_type
+
+
+async def run(database_url: str, payments: int, users: int, days: int, period_days: int, repeats: int, keep: bool):
+    engine = create_async_engine(database_url)
+    try:
+        async with engine.begin() as conn:
+            started = time.perf_counter()
+            await _setup(conn, payments, users, days)
+            print(f"Generated {payments} payments in {time.perf_counter() - started:.1f}s")
+
+        now = datetime.now(timezone.utc)
+        start_date = now - timedelta(days=period_days)
+
+        for name, implementation in (("ORM + Python", legacy_financial), ("SQL aggregates", sql_financial)):
+            timings, peaks = [], []
+            for _ in range(repeats):
+                result, elapsed, peak = await _measure(engine, implementation, start_date, now)
+                timings.append(elapsed)
+                peaks.append(peak)
+            if name == "ORM + Python":
+                legacy_result = result
+            else:
+                _assert_same(legacy_result, result)
+            print(
+                f"{name:<16} best {min(timings):.3f}s, avg {sum(timings) / len(timings):.3f}s, "
+                f"peak Python memory {max(peaks) / 1024 / 1024:.1f} MiB"
+            )
+
+        if not keep:
+            async with engine.begin() as conn:
+                await conn.execute(text(f"DROP SCHEMA {BENCH_SCHEMA} CASCADE"))
+    finally:
+        await engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Financial analytics aggregation benchmark")
+    parser.add_argument("--database-url", default=get_async_db_url())
+    parser.add_argument("--payments", type=int, default=1_000_000)
+    parser.add_argument("--users", type=int, default=100_000)
+    parser.add_argument("--days", type=int, default=730, help="Глубина истории синтетических платежей")
+    parser.add_argument("--period-days", type=int, default=365, help="Период отчета")
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--keep", action="store_true", help="Не удалять схему после прогона")
+    args = parser.parse_args()
+
+    asyncio.run(run(
+        args.database_url, args.payments, args.users, args.days,
+        args.period_days, args.repeats, args.keep
+    ))
+
+
+if __name__ == "__main__":
+    main()
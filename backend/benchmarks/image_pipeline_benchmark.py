@@ -0,0 +1,164 @@
+"""
+Бенчмарк сохранения и раздачи сгенерированных изображений.
+
+Сохранение: N одновременных ответов провайдера в base64 (PNG 512x512, по
+умолчанию половина - повторы уже сгенерированных изображений):
+  - legacy: как прежний TogetherImagesHandler._save_image_locally - декодирование
+    и open().write() прямо в цикле событий, имя по времени и промпту;
+  - store: ImageStore - декодирование, хеширование и запись частями в потоке,
+    имя по хешу содержимого, повторы не пишутся.
+Выводятся общее время, максимальная задержка цикла событий (тикер с периодом
+10 мс), количество файлов и объем на диске.
+
+Раздача: клиенты R раз открывают галерею из сохраненных изображений через
+роутер /static/generated_images (httpx + ASGI, без сети). Без кэширующих
+заголовков каждый просмотр скачивает файлы целиком; с сильным ETag повторный
+просмотр получает 304 без тела (а с immutable браузер не запрашивает файл вовсе).
+
+БД не требуется; нужен только Pillow, если проверять создание WebP-вариантов.
+
+Запуск из каталога backend:
+    python -m benchmarks.image_pipeline_benchmark --images 200 --duplicates 0.5 --views 5
+"""
+import argparse
+import asyncio
+import base64
+import os
+import random
+import struct
+import tempfile
+import time
+import zlib
+from datetime import datetime
+from pathlib import Path
+
+import httpx
+from fastapi import FastAPI
+
+from app.api.generated_images import router as generated_images_router
+from app.services.content import image_store as image_store_module
+from app.services.content.image_store import ImageStore
+
+
+def _png(width: int, height: int, seed: int) -> bytes:
+    """PNG с шумом: плохо сжимается, как реальные сгенерированные изображения"""
+    rng = random.Random(seed)
+    raw = b"".join(b"\x00" + rng.randbytes(width * 3) for _ in range(height))
+
+    def chunk(kind: bytes, data: bytes) -> bytes:
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+
+    header = struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)
+    return b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", header) + chunk(b"IDAT", zlib.compress(raw, 6)) + chunk(b"IEND", b"")
+
+
+async def legacy_save(images_dir: Path, base64_data: str, prompt: str) -> str:
+    """Прежнее сохранение: все в цикле событий, имя по времени и промпту"""
+    image_bytes = base64.b64decode(base64_data)
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+    safe_prompt = "".join(c for c in prompt[:30] if c.isalnum() or c in (' ', '-', '_')).rstrip().replace(' ', '_')
+    filename = f"flux_{timestamp}_{safe_prompt}.png"
+    with open(images_dir / filename, 'wb') as f:
+        f.write(image_bytes)
+    return filename
+
+
+async def _loop_lag(stop: asyncio.Event, period: float = 0.01) -> float:
+    worst = 0.0
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(period)
+        worst = max(worst, time.perf_counter() - started - period)
+    return worst
+
+
+async def _measure(save, payloads):
+    stop = asyncio.Event()
+    ticker = asyncio.create_task(_loop_lag(stop))
+    started = time.perf_counter()
+    names = await asyncio.gather(*(save(data, prompt) for data, prompt in payloads))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    return names, elapsed, await ticker
+
+
+def _disk_usage(directory: Path):
+    files = [path for path in directory.iterdir() if path.is_file()]
+    return len(files), sum(path.stat().st_size for path in files)
+
+
+async def _serve(store: ImageStore, names, clients: int, views: int, conditional: bool) -> int:
+    """Байты тел ответов за views просмотров галереи clients клиентами"""
+    app = FastAPI()
+    app.include_router(generated_images_router)
+    image_store_module._store = store
+
+    transferred = 0
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as http:
+        async def client():
+            nonlocal transferred
+            etags = {}
+            for _ in range(views):
+                for name in names:
+                    headers = {"If-None-Match": etags[name]} if conditional and name in etags else {}
+                    response = await http.get(f"/static/generated_images/{name}", headers=headers)
+                    assert response.status_code in (200, 304)
+                    etags[name] = response.headers["etag"]
+                    transferred += len(response.content)
+
+        await asyncio.gather(*(client() for _ in range(clients)))
+    return transferred
+
+
+async def run(images: int, duplicates: float, size: int, clients: int, views: int, variants: bool):
+    unique = max(1, int(images * (1 - duplicates)))
+    pngs = [_png(size, size, seed) for seed in range(unique)]
+    payloads = []
+    for i in range(images):
+        index = i if i < unique else random.randrange(unique)
+        payloads.append((base64.b64encode(pngs[index]).decode(), f"prompt number {index}"))
+    print(f"{images} images ({unique} unique), {len(pngs[0]) / 1024:.0f} KiB each")
+
+    with tempfile.TemporaryDirectory() as legacy_dir, tempfile.TemporaryDirectory() as store_dir:
+        legacy_path = Path(legacy_dir)
+        store = ImageStore(root=store_dir, base_url="", variant_workers=os.cpu_count() if variants else 0)
+        try:
+            async def store_save(data, prompt):
+                return (await store.save_base64(data, with_variants=variants)).filename
+
+            async def old_save(data, prompt):
+                return await legacy_save(legacy_path, data, prompt)
+
+            for name, save, directory in (("legacy", old_save, legacy_path), ("store", store_save, Path(store_dir))):
+                names, elapsed, lag = await _measure(save, payloads)
+                if name == "store" and variants:
+                    await store.wait_variants()
+                count, size_bytes = _disk_usage(directory)
+                print(f"{name:<7} save {elapsed * 1000:.0f} ms, max event loop stall {lag * 1000:.0f} ms, "
+                      f"{count} files, {size_bytes / 1024 / 1024:.1f} MiB on disk")
+
+            gallery = sorted(set(names))[:20]
+            for name, conditional in (("no validators", False), ("ETag / 304", True)):
+                started = time.perf_counter()
+                transferred = await _serve(store, gallery, clients, views, conditional)
+                print(f"{name:<14} {clients} clients x {views} views of {len(gallery)} images: "
+                      f"{transferred / 1024 / 1024:.1f} MiB of bodies in {time.perf_counter() - started:.1f}s")
+        finally:
+            store.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generated image pipeline benchmark")
+    parser.add_argument("--images", type=int, default=200, help="Одновременных сохранений")
+    parser.add_argument("--duplicates", type=float, default=0.5, help="Доля повторных изображений")
+    parser.add_argument("--size", type=int, default=512, help="Сторона изображения, px")
+    parser.add_argument("--clients", type=int, default=10)
+    parser.add_argument("--views", type=int, default=5, help="Просмотров галереи каждым клиентом")
+    parser.add_argument("--variants", action="store_true", help="Создавать WebP и миниатюры (нужен Pillow)")
+    args = parser.parse_args()
+
+    asyncio.run(run(args.images, args.duplicates, args.size, args.clients, args.views, args.variants))
+
+
+if __name__ == "__main__":
+    main()
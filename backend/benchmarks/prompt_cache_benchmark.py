@@ -0,0 +1,154 @@
+"""
+Офлайн-оценка кэша генераций на синтетическом корпусе промптов.
+
+Корпус: запросы планов уроков из шаблона (тема, уровень, длительность,
+цели) с популярностью по закону Ципфа. Каждый повторный запрос получает
+случайное тривиальное отличие: регистр и пробелы, порядок и служебные
+ключи extra_params (use_cache, batch_index), порядок полей формы,
+слова-паразиты и пунктуация. Сравниваются:
+  - raw: прежний _create_cache_key (сырой промпт и json.dumps параметров);
+  - canonical: канонический ключ (generation_cache_key);
+  - canonical + near-duplicate: плюс NearDuplicateIndex.
+Выводятся доля попаданий, попадания в чужую генерацию (другая тема,
+уровень или длительность - должно быть 0) и время поиска. Redis не нужен
+(кэш - словарь в памяти).
+
+Запуск из каталога backend:
+    python -m benchmarks.prompt_cache_benchmark --requests 5000 --threshold 0.6
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import random
+import time
+
+from app.core.constants import ContentType
+from app.services.content.prompt_cache import NearDuplicateIndex, generation_cache_key
+
+TOPICS = ["Present Perfect", "Past Simple", "Past Continuous", "Future Simple", "Conditionals", "Passive Voice",
+          "Modal Verbs", "Reported Speech", "Travel vocabulary", "Food and drinks", "Job interview", "Phrasal verbs"]
+LEVELS = ["A1", "A2", "B1", "B2", "C1"]
+DURATIONS = [45, 60, 90]
+FILLERS = ["Пожалуйста, ", "Please ", "Ну ", ""]
+
+
+class DictCache:
+
+    def __init__(self):
+        self.data = {}
+
+    async def get_cached_data(self, key):
+        return self.data.get(key)
+
+    async def cache_data(self, key, data, ttl=None):
+        self.data[key] = data
+        return True
+
+
+def raw_key(prompt, content_type, extra_params):
+    """Прежний _create_cache_key"""
+    key = f"{content_type.value}:{hashlib.md5(prompt.encode()).hexdigest()}"
+    if extra_params:
+        key += ":" + hashlib.md5(json.dumps(extra_params, sort_keys=True, ensure_ascii=False).encode()).hexdigest()
+    return key
+
+
+def base_fields(request_id):
+    topic, level, duration = request_id
+    return [
+        f"Тема: {topic}",
+        f"Уровень: {level}",
+        f"Длительность: {duration} минут",
+        f"Цели: научить студентов уверенно использовать {topic} в устной и письменной речи",
+        "Формат: разминка, объяснение, практика, домашнее задание",
+    ]
+
+
+def make_request(request_id, rng: random.Random, variant: bool):
+    fields = base_fields(request_id)
+    params = {"level": request_id[1], "language": "en"}
+    if not variant:
+        return "Составь план урока английского языка.\n" + "\n".join(fields), params
+
+    transform = rng.randrange(5)
+    header = "Составь план урока английского языка."
+    if transform == 0:
+        prompt = f"  {header}\n\n" + "\n".join(field.upper() if rng.random() < 0.5 else field for field in fields) + "\n"
+    elif transform == 1:
+        prompt = f"{header}\n" + "\n".join(fields)
+        params = {"language": "en", "level": request_id[1].lower(), "use_cache": True, "batch_index": rng.randrange(5)}
+    elif transform == 2:
+        rng.shuffle(fields)
+        prompt = f"{header}\n" + "\n".join(fields)
+    elif transform == 3:
+        prompt = rng.choice(FILLERS) + header.lower() + "\n" + "\n".join(fields) + " !"
+    else:
+        rng.shuffle(fields)
+        prompt = rng.choice(FILLERS) + f"{header}\n" + "\n".join(field + "." for field in fields)
+    return prompt, params
+
+
+async def evaluate(name, requests, key_fn, threshold=None):
+    cache = DictCache()
+    index = None
+    if threshold is not None:
+        index = NearDuplicateIndex(cache, thresholds={"lesson_plan": threshold}, max_changed_words=0, ttl=3600)
+    hits = wrong = 0
+    lookup_time = 0.0
+    for request_id, prompt, params in requests:
+        key = key_fn(prompt, ContentType.LESSON_PLAN, params)
+        started = time.perf_counter()
+        served = await cache.get_cached_data(key)
+        if served is None and index is not None:
+            near_key = await index.find(ContentType.LESSON_PLAN, prompt, params)
+            if near_key:
+                served = await cache.get_cached_data(near_key)
+        lookup_time += time.perf_counter() - started
+
+        if served is not None:
+            hits += 1
+            wrong += served != request_id
+            continue
+        await cache.cache_data(key, request_id)
+        if index is not None:
+            await index.add(ContentType.LESSON_PLAN, prompt, params, key)
+
+    print(f"{name:<28} hit rate {hits / len(requests) * 100:5.1f}%, wrong content served {wrong}, "
+          f"lookup {lookup_time / len(requests) * 1e6:.0f} us/request")
+    if index is not None:
+        print(f"near-duplicate index: {index.stats}")
+
+
+async def run(args):
+    rng = random.Random(3)
+    ids = [(topic, level, duration) for topic in TOPICS for level in LEVELS for duration in DURATIONS]
+    rng.shuffle(ids)
+    weights = [1 / (rank + 1) ** args.zipf for rank in range(len(ids))]
+    seen = set()
+    requests = []
+    for _ in range(args.requests):
+        request_id = rng.choices(ids, weights)[0]
+        prompt, params = make_request(request_id, rng, variant=request_id in seen)
+        seen.add(request_id)
+        requests.append((request_id, prompt, params))
+    print(f"{args.requests} requests, {len(seen)} distinct lesson plans "
+          f"(upper bound of hit rate {(1 - len(seen) / args.requests) * 100:.1f}%)")
+
+    await evaluate("raw", requests, raw_key)
+    await evaluate("canonical", requests, generation_cache_key)
+    await evaluate("canonical + near-duplicate", requests, generation_cache_key, args.threshold)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generation cache hit rate on a synthetic prompt corpus")
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--zipf", type=float, default=1.1, help="Показатель закона Ципфа для популярности")
+    parser.add_argument("--threshold", type=float, default=0.6, help="Порог сходства для lesson_plan")
+    args = parser.parse_args()
+
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
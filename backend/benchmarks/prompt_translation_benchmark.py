@@ -0,0 +1,214 @@
+"""
+Бенчмарк перевода промптов изображений на воспроизведенном журнале промптов.
+
+Журнал - файл с одним промптом в строке (--log) или синтетический: русские
+промпты с распределением Ципфа (частые повторы с разным регистром и
+пунктуацией) и доля английских. Промпты поступают с заданной частотой
+(пуассоновский поток) и переводятся двумя способами с имитацией LLM
+(фиксированная задержка ответа):
+  - legacy: как прежний PromptTranslationService - словарь экземпляра по
+    точному тексту, пауза 1 с от предыдущего запроса, один промпт на запрос;
+  - memory: память переводов (нормализованные ключи), детектор латиницы,
+    пакетный перевод и token bucket.
+
+Выводятся медиана и p95 задержки перевода, количество запросов к LLM и
+доля сэкономленных запросов. С --persistent память переводов использует
+таблицу prompt_translations в отдельной схеме PostgreSQL, и второй прогон
+того же журнала (как после перезапуска) обслуживается из нее.
+
+Запуск из каталога backend:
+    python -m benchmarks.prompt_translation_benchmark --prompts 2000 --rate 20 --llm-latency 0.8
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import random
+import time
+from datetime import datetime
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+from app.core.database import get_async_db_url
+from app.services.content.prompt_translator import PromptTranslationService
+from app.services.content.translation_memory import TranslationMemory
+
+BENCH_SCHEMA = "prompt_translation_bench"
+
+SUBJECTS = ["кот", "собака", "дракон", "замок", "робот", "девочка", "лес", "город", "корабль", "сова"]
+STYLES = ["в стиле аниме", "акварель", "реалистично", "пиксель-арт", "мультяшный стиль", "масляная живопись"]
+SCENES = ["на крыше", "под дождем", "в космосе", "на закате", "в библиотеке", "на берегу моря"]
+ENGLISH = ["a red fox in the snow, 4k", "watercolor lighthouse at dawn", "cyberpunk street, neon lights"]
+
+
+def synthetic_log(count: int, unique: int, english_share: float, seed: int = 7):
+    rng = random.Random(seed)
+    phrases = [f"{rng.choice(SUBJECTS)} {rng.choice(SCENES)}, {rng.choice(STYLES)}" for _ in range(unique)]
+    weights = [1 / (rank + 1) for rank in range(unique)]
+    log = []
+    for _ in range(count):
+        if rng.random() < english_share:
+            log.append(rng.choice(ENGLISH))
+            continue
+        phrase = rng.choices(phrases, weights)[0]
+        # Те же промпты с другим регистром и пунктуацией, как их вводят пользователи
+        variant = rng.random()
+        if variant < 0.2:
+            phrase = phrase.capitalize()
+        elif variant < 0.3:
+            phrase = f"{phrase}."
+        log.append(phrase)
+    return log
+
+
+class FakeLLM:
+    """Имитация LLM: задержка ответа и счетчик запросов"""
+
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.calls = 0
+
+    def is_available(self):
+        return True
+
+    @staticmethod
+    def _translate(value: str) -> str:
+        return f"translated {hashlib.md5(value.encode()).hexdigest()[:8]}"
+
+    async def generate_content(self, prompt, **kwargs):
+        self.calls += 1
+        await asyncio.sleep(self.latency)
+        if "Input JSON array" in prompt:
+            items = json.loads(prompt.split("items):\n", 1)[1].split("\n\n", 1)[0])
+            return json.dumps([self._translate(item) for item in items])
+        return self._translate(prompt.split("Text to translate:\n", 1)[1].split("\n\n", 1)[0])
+
+
+class LegacyTranslator:
+    """Прежняя логика: словарь по точному тексту и пауза 1 с между запросами"""
+
+    def __init__(self, llm: FakeLLM):
+        self.llm = llm
+        self._cache = {}
+        self._last_request_time = None
+
+    async def _wait_for_rate_limit(self):
+        if self._last_request_time:
+            elapsed = (datetime.now() - self._last_request_time).total_seconds()
+            if elapsed < 1.0:
+                await asyncio.sleep(1.0 - elapsed)
+        self._last_request_time = datetime.now()
+
+    async def translate_prompt(self, prompt: str) -> str:
+        if not any("а" <= char.lower() <= "я" or char.lower() == "ё" for char in prompt):
+            return prompt
+        key = hashlib.md5(prompt.encode("utf-8")).hexdigest()
+        if key in self._cache:
+            return self._cache[key]
+        await self._wait_for_rate_limit()
+        translated = await self.llm.generate_content(f"Text to translate:\n{prompt}\n\nProvide ONLY")
+        self._cache[key] = translated
+        return translated
+
+
+async def replay(translator, log, rate: float, seed: int = 11):
+    """Промпты журнала поступают пуассоновским потоком; возвращает задержки"""
+    rng = random.Random(seed)
+    latencies = []
+
+    async def one(prompt):
+        started = time.perf_counter()
+        await translator.translate_prompt(prompt)
+        latencies.append(time.perf_counter() - started)
+
+    tasks = []
+    for prompt in log:
+        tasks.append(asyncio.create_task(one(prompt)))
+        await asyncio.sleep(rng.expovariate(rate))
+    await asyncio.gather(*tasks)
+    return sorted(latencies)
+
+
+def _report(name: str, latencies, calls: int, total: int, elapsed: float):
+    p50 = latencies[len(latencies) // 2]
+    p95 = latencies[int(len(latencies) * 0.95)]
+    print(f"{name:<18} p50 {p50 * 1000:.0f} ms, p95 {p95 * 1000:.0f} ms, LLM calls {calls} "
+          f"({(1 - calls / total) * 100:.1f}% of {total} prompts saved), replay {elapsed:.1f}s")
+
+
+async def _setup(conn):
+    await conn.execute(text(f"DROP SCHEMA IF EXISTS {BENCH_SCHEMA} CASCADE"))
+    await conn.execute(text(f"CREATE SCHEMA {BENCH_SCHEMA}"))
+    await conn.execute(text(f"""
+        CREATE TABLE {BENCH_SCHEMA}.prompt_translations (
+            key VARCHAR(64) PRIMARY KEY,
+            source_text TEXT NOT NULL,
+            translation TEXT NOT NULL,
+            hits INTEGER NOT NULL DEFAULT 0,
+            created_at TIMESTAMPTZ NOT NULL,
+            last_used_at TIMESTAMPTZ NOT NULL
+        )
+    """))
+
+
+async def run(args):
+    if args.log:
+        with open(args.log, encoding="utf-8") as file:
+            log = [line.strip() for line in file if line.strip()][:args.prompts]
+    else:
+        log = synthetic_log(args.prompts, args.unique, args.english_share)
+    print(f"Replaying {len(log)} prompts ({len(set(log))} distinct strings) at {args.rate}/s, "
+          f"LLM latency {args.llm_latency * 1000:.0f} ms")
+
+    llm = FakeLLM(args.llm_latency)
+    started = time.perf_counter()
+    latencies = await replay(LegacyTranslator(llm), log, args.rate)
+    _report("legacy", latencies, llm.calls, len(log), time.perf_counter() - started)
+
+    engine = None
+    session_factory = None
+    if args.persistent:
+        engine = create_async_engine(
+            args.database_url, connect_args={"server_settings": {"search_path": BENCH_SCHEMA}}
+        )
+        async with engine.begin() as conn:
+            await _setup(conn)
+        session_factory = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+
+    try:
+        runs = ("memory", "memory, restarted") if args.persistent else ("memory",)
+        for name in runs:
+            llm = FakeLLM(args.llm_latency)
+            memory = TranslationMemory(session_factory=session_factory)
+            service = PromptTranslationService(memory=memory, llm_handler=llm)
+            started = time.perf_counter()
+            latencies = await replay(service, log, args.rate)
+            _report(name, latencies, llm.calls, len(log), time.perf_counter() - started)
+            print(f"{'':<18} {service.get_cache_stats()}")
+    finally:
+        if engine is not None:
+            if not args.keep:
+                async with engine.begin() as conn:
+                    await conn.execute(text(f"DROP SCHEMA {BENCH_SCHEMA} CASCADE"))
+            await engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prompt translation memory benchmark")
+    parser.add_argument("--database-url", default=get_async_db_url())
+    parser.add_argument("--log", help="Файл журнала: один промпт в строке")
+    parser.add_argument("--prompts", type=int, default=2000)
+    parser.add_argument("--unique", type=int, default=300, help="Различных промптов в синтетическом журнале")
+    parser.add_argument("--english-share", type=float, default=0.2)
+    parser.add_argument("--rate", type=float, default=20.0, help="Промптов в секунду")
+    parser.add_argument("--llm-latency", type=float, default=0.8, help="Задержка ответа LLM, сек")
+    parser.add_argument("--persistent", action="store_true", help="Использовать таблицу prompt_translations")
+    parser.add_argument("--keep", action="store_true", help="Не удалять схему после прогона")
+    args = parser.parse_args()
+
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
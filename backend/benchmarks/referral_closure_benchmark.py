@@ -0,0 +1,197 @@
+"""
+Бенчмарк таблицы замыкания реферального дерева.
+
+Создает синтетический реферальный лес (по умолчанию 1 000 000 пользователей)
+в отдельной схеме PostgreSQL, строит таблицу замыкания и сравнивает:
+  - рекурсивный CTE по invited_by_code против индексного чтения предков;
+  - подсчет прямых приглашений по users против предрасчитанных счетчиков;
+  - стоимость инкрементального обновления при обработке инвайта.
+
+Запуск из каталога backend:
+    python -m benchmarks.referral_closure_benchmark --users 1000000 --samples 1000
+"""
+import argparse
+import asyncio
+import random
+import statistics
+import time
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from app.core.database import get_async_db_url
+from app.models.referral import ReferralClosure, ReferralSubtreeCount
+from app.services.referral.closure import ReferralClosureService
+
+BENCH_SCHEMA = "referral_bench"
+
+RECURSIVE_CHAIN_SQL = """
+    WITH RECURSIVE referral_chain AS (
+        SELECT u.id, u.invite_code, u.invited_by_code, u.invites_count, 1 AS level
+        FROM users u
+        WHERE u.id = :user_id
+        UNION ALL
+        SELECT u.id, u.invite_code, u.invited_by_code, u.invites_count, rc.level + 1
+        FROM users u
+        INNER JOIN referral_chain rc ON u.invite_code = rc.invited_by_code
+        WHERE rc.level < :max_depth
+    )
+    SELECT id, invite_code, invited_by_code, invites_count, level
+    FROM referral_chain
+    ORDER BY level, id
+"""
+
+DIRECT_INVITES_SQL = """
+    SELECT COUNT(*) FROM users
+    WHERE invited_by_code = :invite_code AND has_access = TRUE
+"""
+
+
+def _summary(samples):
+    samples = sorted(samples)
+    p95 = samples[int(len(samples) * 0.95) - 1] if len(samples) >= 20 else samples[-1]
+    return f"avg {statistics.mean(samples) * 1000:.3f} ms, p95 {p95 * 1000:.3f} ms"
+
+
+async def _setup(conn, users: int, root_ratio: float):
+    """Создает схему с минимальной таблицей users и таблицами замыкания"""
+    await conn.execute(text(f"DROP SCHEMA IF EXISTS {BENCH_SCHEMA} CASCADE"))
+    await conn.execute(text(f"CREATE SCHEMA {BENCH_SCHEMA}"))
+    await conn.execute(text(f"SET search_path TO {BENCH_SCHEMA}"))
+
+    await conn.execute(text("""
+        CREATE TABLE users (
+            id INTEGER PRIMARY KEY,
+            invite_code VARCHAR(36) UNIQUE,
+            invited_by_code VARCHAR(36),
+            invites_count INTEGER NOT NULL DEFAULT 0,
+            has_access BOOLEAN NOT NULL DEFAULT TRUE
+        )
+    """))
+
+    # Каждый пользователь приглашен случайным более ранним пользователем
+    # либо является корнем дерева с вероятностью root_ratio
+    await conn.execute(
+        text("""
+            INSERT INTO users (id, invite_code, invited_by_code, has_access)
+            SELECT
+                g,
+                'c' || g,
+                CASE WHEN g = 1 OR random() < :root_ratio THEN NULL
+                     ELSE 'c' || (floor(random() * (g - 1)) + 1)::int END,
+                random() < 0.8
+            FROM generate_series(1, :users) AS g
+        """),
+        {"users": users, "root_ratio": root_ratio}
+    )
+    await conn.execute(text("""
+        UPDATE users u SET invites_count = s.cnt
+        FROM (
+            SELECT invited_by_code, COUNT(*) AS cnt
+            FROM users WHERE invited_by_code IS NOT NULL
+            GROUP BY invited_by_code
+        ) s
+        WHERE u.invite_code = s.invited_by_code
+    """))
+    await conn.execute(text("ANALYZE users"))
+
+    await conn.run_sync(lambda sync_conn: ReferralClosure.__table__.create(sync_conn))
+    await conn.run_sync(lambda sync_conn: ReferralSubtreeCount.__table__.create(sync_conn))
+
+
+async def run(database_url: str, users: int, samples: int, max_depth: int, root_ratio: float, keep: bool):
+    engine = create_async_engine(database_url)
+    try:
+        async with engine.begin() as conn:
+            started = time.perf_counter()
+            await _setup(conn, users, root_ratio)
+            print(f"Generated {users} users in {time.perf_counter() - started:.1f}s")
+
+            rebuild_stats = await ReferralClosureService(conn).rebuild()
+            await conn.execute(text("ANALYZE referral_closure"))
+            await conn.execute(text("ANALYZE referral_subtree_counts"))
+            print(
+                f"Backfill: {rebuild_stats['rows']} closure rows, "
+                f"max depth {rebuild_stats['max_depth']}, {rebuild_stats['duration_seconds']:.1f}s"
+            )
+
+        sample_ids = random.sample(range(1, users + 1), min(samples, users))
+
+        async with engine.connect() as conn:
+            await conn.execute(text(f"SET search_path TO {BENCH_SCHEMA}"))
+            closure = ReferralClosureService(conn)
+
+            recursive_times, closure_times = [], []
+            for user_id in sample_ids:
+                started = time.perf_counter()
+                expected = (await conn.execute(
+                    text(RECURSIVE_CHAIN_SQL), {"user_id": user_id, "max_depth": max_depth}
+                )).fetchall()
+                recursive_times.append(time.perf_counter() - started)
+
+                started = time.perf_counter()
+                actual = await closure.get_ancestors(user_id, max_depth)
+                closure_times.append(time.perf_counter() - started)
+
+                assert [row.id for row in expected] == [row.id for row in actual], user_id
+
+            print(f"Chain (recursive CTE):   {_summary(recursive_times)}")
+            print(f"Chain (closure lookup):  {_summary(closure_times)}")
+
+            codes = {
+                row.id: row.invite_code
+                for row in (await conn.execute(
+                    text("SELECT id, invite_code FROM users WHERE id = ANY(:ids)"), {"ids": sample_ids}
+                )).fetchall()
+            }
+            scan_times, counter_times = [], []
+            for user_id in sample_ids:
+                started = time.perf_counter()
+                await conn.execute(text(DIRECT_INVITES_SQL), {"invite_code": codes[user_id]})
+                scan_times.append(time.perf_counter() - started)
+
+                started = time.perf_counter()
+                await closure.get_subtree_counts(user_id, max_depth)
+                counter_times.append(time.perf_counter() - started)
+
+            print(f"Stats (users scan):      {_summary(scan_times)}")
+            print(f"Stats (subtree counts):  {_summary(counter_times)}")
+
+        async with engine.begin() as conn:
+            await conn.execute(text(f"SET search_path TO {BENCH_SCHEMA}"))
+            closure = ReferralClosureService(conn)
+            link_times = []
+            for offset in range(1, min(samples, 1000) + 1):
+                new_id = users + offset
+                inviter_id = random.randint(1, users)
+                await conn.execute(
+                    text("INSERT INTO users (id, invite_code, invited_by_code) VALUES (:id, :code, :by)"),
+                    {"id": new_id, "code": f"c{new_id}", "by": f"c{inviter_id}"}
+                )
+                started = time.perf_counter()
+                await closure.link(inviter_id, new_id)
+                link_times.append(time.perf_counter() - started)
+            print(f"Incremental link:        {_summary(link_times)}")
+
+        if not keep:
+            async with engine.begin() as conn:
+                await conn.execute(text(f"DROP SCHEMA {BENCH_SCHEMA} CASCADE"))
+    finally:
+        await engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Referral closure table benchmark")
+    parser.add_argument("--database-url", default=get_async_db_url())
+    parser.add_argument("--users", type=int, default=1_000_000)
+    parser.add_argument("--samples", type=int, default=1000)
+    parser.add_argument("--max-depth", type=int, default=3)
+    parser.add_argument("--root-ratio", type=float, default=0.05)
+    parser.add_argument("--keep", action="store_true", help="Не удалять схему после прогона")
+    args = parser.parse_args()
+
+    asyncio.run(run(args.database_url, args.users, args.samples, args.max_depth, args.root_ratio, args.keep))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,210 @@
+"""
+Бенчмарк трендов по снимкам аналитики: JSON-строки analytics_data против колоночного архива.
+
+Создает в отдельной схеме PostgreSQL таблицу analytics_data с синтетическими
+снимками за год (по умолчанию каждые 10 минут, ~52 000 строк) и сравнивает
+время и пиковую память Python (tracemalloc) годового тренда двух метрик
+(total_users и generations_by_type.game):
+  - чтение строк analytics_data ORM-объектами с разбором JSON-полей;
+  - SnapshotArchive: mmap только двух нужных колонок помесячных партиций.
+
+Также выводится объем таблицы с индексами и объем архива на диске.
+
+Запуск из каталога backend:
+    python -m benchmarks.snapshot_archive_benchmark --interval-minutes 10 --repeats 5
+"""
+import argparse
+import asyncio
+import gc
+import tempfile
+import time
+import tracemalloc
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import select, text
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+
+from app.core.database import get_async_db_url
+from app.models import AnalyticsData
+from app.services.analytics.snapshot_archive import SnapshotArchive, flatten_snapshot, month_key
+
+BENCH_SCHEMA = "snapshot_archive_bench"
+
+TREND_COLUMNS = ("total_users", "generations_by_type.game")
+
+
+async def _setup(conn, interval_minutes: int, days: int):
+    """Создает схему с таблицей analytics_data той же структуры, что и в приложении"""
+    await conn.execute(text(f"DROP SCHEMA IF EXISTS {BENCH_SCHEMA} CASCADE"))
+    await conn.execute(text(f"CREATE SCHEMA {BENCH_SCHEMA}"))
+    await conn.execute(text(f"SET search_path TO {BENCH_SCHEMA}"))
+
+    await conn.execute(text("""
+        CREATE TABLE analytics_data (
+            id SERIAL PRIMARY KEY,
+            date TIMESTAMPTZ NOT NULL,
+            total_users INTEGER NOT NULL,
+            active_users INTEGER NOT NULL,
+            new_users INTEGER NOT NULL,
+            users_with_tariffs INTEGER NOT NULL,
+            tariff_distribution JSON,
+            total_generations INTEGER NOT NULL,
+            generations_by_type JSON,
+            average_generations_per_user DOUBLE PRECISION NOT NULL,
+            total_points_spent INTEGER NOT NULL,
+            total_points_earned INTEGER NOT NULL,
+            average_user_balance DOUBLE PRECISION NOT NULL
+        )
+    """))
+
+    # Монотонно растущие счетчики с шумом, как у реальных снимков
+    await conn.execute(
+        text("""
+            INSERT INTO analytics_data (
+                date, total_users, active_users, new_users, users_with_tariffs, tariff_distribution,
+                total_generations, generations_by_type, average_generations_per_user,
+                total_points_spent, total_points_earned, average_user_balance
+            )
+            SELECT
+                s.moment,
+                10000 + s.n * 3,
+                1000 + floor(random() * 500)::int,
+                floor(random() * 20)::int,
+                2000 + s.n,
+                json_build_object('free', 8000 + s.n, 'tariff_2', 900 + s.n / 3,
+                                  'tariff_4', 600 + s.n / 5, 'tariff_6', 300 + s.n / 7),
+                50000 + s.n * 12,
+                json_build_object('lesson_plan', 20000 + s.n * 4, 'exercise', 15000 + s.n * 3,
+                                  'game', 8000 + s.n * 2, 'image', 4000 + s.n,
+                                  'text_analysis', 1000 + s.n, 'concept_explanation', 800 + s.n,
+                                  'course', 100 + s.n / 10, 'ai_assistant', 1100 + s.n),
+                random() * 10,
+                100000 + s.n * 20,
+                120000 + s.n * 25,
+                random() * 300
+            FROM (
+                SELECT n, now() - make_interval(days => :days) + make_interval(mins => n * :interval) AS moment
+                FROM generate_series(0, (:days * 24 * 60) / :interval - 1) AS n
+            ) s
+        """),
+        {"days": days, "interval": interval_minutes}
+    )
+    await conn.execute(text("CREATE INDEX ix_analytics_data_date ON analytics_data (date)"))
+    await conn.execute(text("ANALYZE analytics_data"))
+
+
+async def _build_archive(session: AsyncSession, archive: SnapshotArchive) -> int:
+    """Раскладывает все снимки по помесячным партициям (как компактизация, без удаления строк)"""
+    rows = (await session.execute(select(AnalyticsData).order_by(AnalyticsData.date))).scalars().all()
+    by_month = defaultdict(list)
+    for row in rows:
+        snapshot = {column.name: getattr(row, column.key) for column in AnalyticsData.__table__.columns}
+        by_month[month_key(row.date)].append(flatten_snapshot(snapshot))
+    for month, month_rows in by_month.items():
+        archive.write_month(month, month_rows)
+    return len(rows)
+
+
+async def json_trend(session: AsyncSession, archive: SnapshotArchive, start: datetime, end: datetime) -> dict:
+    """Прежний путь: строки analytics_data целиком и значения из JSON-полей"""
+    rows = (await session.execute(
+        select(AnalyticsData)
+        .where(AnalyticsData.date >= start, AnalyticsData.date < end)
+        .order_by(AnalyticsData.date)
+    )).scalars().all()
+    return {
+        "ts": [row.date for row in rows],
+        "total_users": [row.total_users for row in rows],
+        "generations_by_type.game": [float((row.generations_by_type or {}).get("game", 0)) for row in rows],
+    }
+
+
+async def archive_trend(session: AsyncSession, archive: SnapshotArchive, start: datetime, end: datetime) -> dict:
+    """Новый путь: mmap двух колонок архива"""
+    return archive.read(TREND_COLUMNS, start, end)
+
+
+async def _measure(engine, implementation, archive: SnapshotArchive, start: datetime, end: datetime):
+    """Время и пиковая память одного прогона в новой сессии"""
+    async with engine.connect() as conn:
+        await conn.execute(text(f"SET search_path TO {BENCH_SCHEMA}"))
+        async with AsyncSession(bind=conn) as session:
+            gc.collect()
+            tracemalloc.start()
+            started = time.perf_counter()
+            result = await implementation(session, archive, start, end)
+            elapsed = time.perf_counter() - started
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+    return result, elapsed, peak
+
+
+def _assert_same(legacy: dict, current: dict):
+    assert len(legacy["ts"]) == len(current["ts"])
+    assert [int(moment.timestamp()) for moment in legacy["ts"]] == [int(moment.timestamp()) for moment in current["ts"]]
+    for column in TREND_COLUMNS:
+        assert legacy[column] == current[column], column
+
+
+async def run(database_url: str, interval_minutes: int, days: int, repeats: int, keep: bool):
+    engine = create_async_engine(database_url)
+    try:
+        async with engine.begin() as conn:
+            started = time.perf_counter()
+            await _setup(conn, interval_minutes, days)
+            print(f"Generated snapshots for {days} days in {time.perf_counter() - started:.1f}s")
+
+        with tempfile.TemporaryDirectory() as archive_dir:
+            archive = SnapshotArchive(archive_dir)
+            async with engine.connect() as conn:
+                await conn.execute(text(f"SET search_path TO {BENCH_SCHEMA}"))
+                async with AsyncSession(bind=conn) as session:
+                    started = time.perf_counter()
+                    rows = await _build_archive(session, archive)
+                    print(f"Archived {rows} snapshots into {len(archive.months())} months "
+                          f"in {time.perf_counter() - started:.1f}s")
+                    table_size = (await session.execute(
+                        text("SELECT pg_total_relation_size('analytics_data')")
+                    )).scalar()
+            print(f"analytics_data with indexes: {table_size / 1024 / 1024:.1f} MiB, "
+                  f"archive on disk: {archive.size_bytes() / 1024 / 1024:.1f} MiB")
+
+            end = datetime.now(timezone.utc)
+            start = end - timedelta(days=365)
+            for name, implementation in (("JSON rows", json_trend), ("Columnar mmap", archive_trend)):
+                timings, peaks = [], []
+                for _ in range(repeats):
+                    result, elapsed, peak = await _measure(engine, implementation, archive, start, end)
+                    timings.append(elapsed)
+                    peaks.append(peak)
+                if name == "JSON rows":
+                    legacy_result = result
+                else:
+                    _assert_same(legacy_result, result)
+                print(
+                    f"{name:<14} best {min(timings) * 1000:.1f} ms, avg {sum(timings) / len(timings) * 1000:.1f} ms, "
+                    f"peak Python memory {max(peaks) / 1024 / 1024:.1f} MiB, {len(result['ts'])} points"
+                )
+
+        if not keep:
+            async with engine.begin() as conn:
+                await conn.execute(text(f"DROP SCHEMA {BENCH_SCHEMA} CASCADE"))
+    finally:
+        await engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Analytics snapshot archive benchmark")
+    parser.add_argument("--database-url", default=get_async_db_url())
+    parser.add_argument("--interval-minutes", type=int, default=10, help="Интервал между синтетическими снимками")
+    parser.add_argument("--days", type=int, default=365, help="Глубина истории снимков")
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--keep", action="store_true", help="Не удалять схему после прогона")
+    args = parser.parse_args()
+
+    asyncio.run(run(args.database_url, args.interval_minutes, args.days, args.repeats, args.keep))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""
+Бенчмарк map-reduce для длинных текстов.
+
+Имитация LLM: задержка ответа растет с длиной промпта (base + per-token), как
+у реальных провайдеров. Саммари текста длиной --tokens токенов:
+  - single: весь текст одним запросом (как прежде; при длине промпта сверх
+    лимита _validate_prompt для text_analysis запрос бы отклонялся);
+  - pipeline: TextPipeline - куски по TEXT_PIPELINE_CHUNK_TOKENS, параллельные
+    запросы и reduce;
+  - pipeline after edit: тот же текст с правкой в середине и кэшем первого
+    прогона - повторно выполняются только измененные куски и reduce.
+Выводятся время, количество запросов и попаданий в кэш. БД и Redis не нужны
+(кэш - словарь в памяти).
+
+Запуск из каталога backend:
+    python -m benchmarks.text_pipeline_benchmark --tokens 40000 --concurrency 4
+"""
+import argparse
+import asyncio
+import random
+import time
+
+from app.services.content.text_pipeline import TextPipeline, estimate_tokens
+
+PROMPT_LIMIT_CHARS = 15000  # _validate_prompt для ContentType.TEXT_ANALYSIS
+WORDS = ["the", "teacher", "reads", "a", "long", "story", "about", "river", "city", "students", "learn",
+         "new", "words", "every", "morning", "before", "class", "starts", "quietly", "together"]
+
+
+def make_text(tokens: int, seed: int = 1) -> str:
+    rng = random.Random(seed)
+    paragraphs = []
+    while estimate_tokens("\n\n".join(paragraphs)) < tokens:
+        paragraphs.append(" ".join(
+            " ".join(rng.choices(WORDS, k=rng.randint(6, 18))).capitalize() + "." for _ in range(6)
+        ))
+    return "\n\n".join(paragraphs)
+
+
+class FakeLLM:
+    """Задержка: base + per_token * токены промпта"""
+
+    def __init__(self, base: float, per_token: float):
+        self.base = base
+        self.per_token = per_token
+        self.calls = 0
+
+    async def __call__(self, prompt: str) -> str:
+        self.calls += 1
+        await asyncio.sleep(self.base + self.per_token * estimate_tokens(prompt))
+        return f"Summary of a part with {estimate_tokens(prompt)} tokens. " * 10
+
+
+class DictCache:
+
+    def __init__(self):
+        self.data = {}
+
+    async def get_cached_data(self, key):
+        return self.data.get(key)
+
+    async def cache_data(self, key, data, ttl=None):
+        self.data[key] = data
+        return True
+
+
+def _map_prompt(chunk):
+    return f"Summarize this part of a long text in 150 words.\n\n{chunk.with_context}"
+
+
+def _reduce_prompt(parts):
+    return f"Combine these partial summaries into one summary of 150 words.\n\n{parts}"
+
+
+async def run(args):
+    text = make_text(args.tokens)
+    print(f"Text: {len(text)} chars, ~{estimate_tokens(text)} tokens; "
+          f"single prompt {'exceeds' if len(text) > PROMPT_LIMIT_CHARS else 'fits'} the {PROMPT_LIMIT_CHARS} char limit")
+
+    llm = FakeLLM(args.base_latency, args.per_token)
+    started = time.perf_counter()
+    await llm(f"Summarize this text in 150 words.\n\n{text}")
+    print(f"{'single':<20} {time.perf_counter() - started:.2f}s, {llm.calls} LLM calls")
+
+    cache = DictCache()
+    edited = text.replace("students", "pupils", 1) if args.edit_at_start else \
+        text[:len(text) // 2] + text[len(text) // 2:].replace("students", "pupils", 1)
+    for name, source in (("pipeline", text), ("pipeline after edit", edited)):
+        llm = FakeLLM(args.base_latency, args.per_token)
+        pipeline = TextPipeline(llm, cache=cache, max_chunk_tokens=args.chunk_tokens, concurrency=args.concurrency)
+        started = time.perf_counter()
+        await pipeline.map_reduce(source, _map_prompt, _reduce_prompt)
+        print(f"{name:<20} {time.perf_counter() - started:.2f}s, {llm.calls} LLM calls, "
+              f"{pipeline.stats['chunks']} chunks, {pipeline.stats['cached']} cached")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Long text map-reduce benchmark")
+    parser.add_argument("--tokens", type=int, default=40000, help="Длина текста в токенах")
+    parser.add_argument("--chunk-tokens", type=int, default=2500)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--base-latency", type=float, default=1.0, help="Задержка ответа без учета промпта, сек")
+    parser.add_argument("--per-token", type=float, default=0.0002, help="Задержка на токен промпта, сек")
+    parser.add_argument("--edit-at-start", action="store_true", help="Правка в начале текста вместо середины")
+    args = parser.parse_args()
+
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
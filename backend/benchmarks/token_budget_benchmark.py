@@ -0,0 +1,171 @@
+"""
+Бенчмарк бюджета токенов.
+
+История генераций: для каждого вида запроса фактический размер ответа
+распределен логнормально вокруг типичного значения. Провайдер, как Groq и
+OpenAI, резервирует промпт + max_tokens в лимите токенов в минуту (--tpm).
+Сравниваются:
+  - heuristic: max_tokens из _get_smart_token_count (фиксированные значения);
+  - budget: TokenBudget - перцентиль истории с запасом, эвристика как
+    верхняя граница.
+Выводятся запросы, принятые за минуту в пределах лимита, доля обрезанных
+ответов и ошибка предсказания. Также - скорость подсчета токенов
+(tiktoken, если установлен, иначе оценка по символам). БД не нужна
+(история передается через поддельную сессию).
+
+Запуск из каталога backend:
+    python -m benchmarks.token_budget_benchmark --history 2000 --requests 500 --tpm 60000
+"""
+import argparse
+import asyncio
+import math
+import random
+import statistics
+import time
+
+from app.core.constants import ContentType
+from app.services.content.token_budget import TokenBudget, TRUNCATION_RATIO
+from app.utils.tokenizer import TIKTOKEN_AVAILABLE, count_tokens, estimate_tokens
+
+# (тип контента, вид запроса, max_tokens эвристики, типичный ответ, доля запросов)
+KINDS = [
+    (ContentType.LESSON_PLAN, "основной план", 17000, 4200, 0.25),
+    (ContentType.LESSON_PLAN, "детализация плана", 6000, 1500, 0.10),
+    (ContentType.EXERCISE, "основные упражнения", 12000, 3500, 0.25),
+    (ContentType.GAME, "основная игра", 10000, 2200, 0.15),
+    (ContentType.TEXT_ANALYSIS, "генерация вопросов", 4000, 900, 0.15),
+    (ContentType.FREE_QUERY, "свободный запрос", 6000, 600, 0.10),
+]
+PROMPT_TOKENS = 800
+
+
+def _actual(rng: random.Random, typical: int) -> int:
+    return max(50, int(rng.lognormvariate(math.log(typical), 0.3)))
+
+
+def _percentile(values, p):
+    values = sorted(values)
+    position = (len(values) - 1) * p
+    low = math.floor(position)
+    high = min(low + 1, len(values) - 1)
+    return values[low] + (values[high] - values[low]) * (position - low)
+
+
+class FakeResult:
+
+    def __init__(self, rows):
+        self.rows = rows
+
+    def mappings(self):
+        return self
+
+    def all(self):
+        return self.rows
+
+
+class HistorySession:
+    """Отдает профили, посчитанные по истории как в PROFILES_SQL"""
+
+    def __init__(self, rows):
+        self.rows = rows
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        return False
+
+    async def execute(self, statement, params=None):
+        return FakeResult(self.rows)
+
+
+def _profiles(history, percentile):
+    rows = []
+    for content_type, kind, ceiling, _, _ in KINDS:
+        values = history[kind]
+        rows.append({
+            "content_type": content_type.name,
+            "request_kind": kind,
+            "samples": len(values),
+            "predicted": _percentile(values, percentile),
+            "truncated": sum(value >= TRUNCATION_RATIO * ceiling for value in values) / len(values)
+        })
+    return rows
+
+
+def _simulate(requests, max_tokens_for, tpm):
+    """Запросы за минуту: провайдер резервирует промпт + max_tokens"""
+    reserved = 0
+    admitted = 0
+    truncated = 0
+    for kind, ceiling, actual, predicted in requests:
+        max_tokens = max_tokens_for(kind, ceiling)
+        if reserved + PROMPT_TOKENS + max_tokens > tpm:
+            continue
+        reserved += PROMPT_TOKENS + max_tokens
+        admitted += 1
+        truncated += actual > max_tokens
+    return admitted, truncated
+
+
+async def run(args):
+    rng = random.Random(11)
+    weights = [kind[4] for kind in KINDS]
+    history = {kind[1]: [] for kind in KINDS}
+    for _ in range(args.history):
+        _, kind, ceiling, typical, _ = rng.choices(KINDS, weights)[0]
+        history[kind].append(min(ceiling, _actual(rng, typical)))
+
+    rows = _profiles(history, args.percentile)
+    budget = TokenBudget(session_factory=lambda: HistorySession(rows), percentile=args.percentile,
+                         headroom=args.headroom, min_samples=30, refresh_seconds=3600)
+    plans = {}
+    for content_type, kind, ceiling, _, _ in KINDS:
+        plans[kind] = await budget.plan(content_type, "x", kind, ceiling)
+
+    requests = []
+    for _ in range(args.requests):
+        _, kind, ceiling, typical, _ = rng.choices(KINDS, weights)[0]
+        requests.append((kind, ceiling, _actual(rng, typical), plans[kind].predicted_tokens))
+
+    print(f"{args.requests} requests, provider limit {args.tpm} tokens/min (prompt + max_tokens reserved)")
+    for name, max_tokens_for in (
+            ("heuristic", lambda kind, ceiling: ceiling),
+            ("budget", lambda kind, ceiling: plans[kind].max_tokens),
+    ):
+        admitted, truncated = _simulate(requests, max_tokens_for, args.tpm)
+        print(f"{name:<10} {admitted} requests/min admitted, {truncated} truncated responses")
+
+    errors = [abs(actual - predicted) / actual for _, _, actual, predicted in requests if predicted]
+    under = sum(actual > predicted for _, _, actual, predicted in requests if predicted) / len(errors)
+    print(f"prediction error: mean {statistics.mean(errors) * 100:.1f}%, "
+          f"actual above p{int(args.percentile * 100)} in {under * 100:.1f}% of requests")
+    for kind, plan in plans.items():
+        print(f"  {kind:<22} predicted {plan.predicted_tokens}, max_tokens {plan.max_tokens}")
+
+    sample = ("Составь подробный план урока английского языка по теме Present Perfect для уровня B1. "
+              "Include warm-up, vocabulary, grammar practice and homework. ") * 40
+    started = time.perf_counter()
+    for _ in range(args.count_iterations):
+        count_tokens(sample)
+    elapsed = time.perf_counter() - started
+    print(f"count_tokens ({'tiktoken' if TIKTOKEN_AVAILABLE else 'estimate'}): "
+          f"{elapsed / args.count_iterations * 1e6:.0f} us per {len(sample)} char prompt, "
+          f"{count_tokens(sample)} tokens (char estimate {estimate_tokens(sample)})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Token budget benchmark")
+    parser.add_argument("--history", type=int, default=2000, help="Генераций в истории")
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--tpm", type=int, default=60000, help="Лимит токенов в минуту у провайдера")
+    parser.add_argument("--percentile", type=float, default=0.9)
+    parser.add_argument("--headroom", type=float, default=1.3)
+    parser.add_argument("--count-iterations", type=int, default=200)
+    args = parser.parse_args()
+
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
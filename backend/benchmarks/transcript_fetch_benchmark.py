@@ -0,0 +1,132 @@
+"""
+Бенчмарк получения транскриптов видео.
+
+Клиенты одновременно запрашивают транскрипты V видео (часть видео без
+субтитров) с имитацией YouTube: блокирующая загрузка с фиксированной
+задержкой. Два способа:
+  - legacy: как прежний process_video_transcript - синхронный вызов прямо в
+    цикле событий, каждый запрос загружает сам, ошибки не запоминаются;
+  - service: TranscriptService - пул потоков, общая загрузка на
+    (video_id, язык) и кэш ошибок.
+Выводятся общее время, максимальная задержка цикла событий (тикер с периодом
+10 мс), количество загрузок и размер сжатого транскрипта против исходного
+текста. БД не требуется (сохранение в video_transcripts отключено).
+
+Запуск из каталога backend:
+    python -m benchmarks.transcript_fetch_benchmark --videos 20 --requests 200 --latency 0.3
+"""
+import argparse
+import asyncio
+import random
+import string
+import time
+
+from app.services.content.transcript_service import (
+    TranscriptService,
+    TranscriptSource,
+    TranscriptUnavailableError,
+    encode_segments
+)
+
+
+class FakeYouTube(TranscriptSource):
+    """Имитация YouTube: блокирующая загрузка и видео без субтитров"""
+
+    def __init__(self, transcripts, latency: float):
+        self.transcripts = transcripts
+        self.latency = latency
+        self.calls = 0
+
+    def fetch(self, video_id, language):
+        self.calls += 1
+        time.sleep(self.latency)
+        if video_id not in self.transcripts:
+            raise LookupError("No transcripts were found")
+        return self.transcripts[video_id]
+
+
+def _video_id(rng: random.Random) -> str:
+    return "".join(rng.choice(string.ascii_letters + string.digits) for _ in range(11))
+
+
+def _transcript(rng: random.Random, segments: int):
+    words = ["hello", "today", "we", "will", "talk", "about", "grammar", "present", "perfect", "tense", "and", "vocabulary"]
+    return [{"text": " ".join(rng.choices(words, k=8)), "start": i * 3.0, "duration": 3.0} for i in range(segments)]
+
+
+async def _loop_lag(stop: asyncio.Event, period: float = 0.01) -> float:
+    worst = 0.0
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(period)
+        worst = max(worst, time.perf_counter() - started - period)
+    return worst
+
+
+async def _measure(get, requests):
+    async def one(video_id):
+        try:
+            await get(video_id)
+        except (LookupError, TranscriptUnavailableError):
+            pass
+
+    stop = asyncio.Event()
+    ticker = asyncio.create_task(_loop_lag(stop))
+    started = time.perf_counter()
+    await asyncio.gather(*(one(video_id) for video_id in requests))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    return elapsed, await ticker
+
+
+async def run(args):
+    rng = random.Random(5)
+    videos = [_video_id(rng) for _ in range(args.videos)]
+    broken = set(videos[:int(args.videos * args.broken)])
+    transcripts = {video_id: _transcript(rng, args.segments) for video_id in videos if video_id not in broken}
+    requests = [rng.choice(videos) for _ in range(args.requests)]
+    print(f"{args.requests} requests for {args.videos} videos ({len(broken)} without subtitles), "
+          f"fetch latency {args.latency * 1000:.0f} ms")
+
+    source = FakeYouTube(transcripts, args.latency)
+
+    async def legacy_get(video_id):
+        entries = source.fetch(video_id, "en")
+        return " ".join(entry["text"] for entry in entries)
+
+    elapsed, lag = await _measure(legacy_get, requests)
+    print(f"legacy   {elapsed:.2f}s, max event loop stall {lag * 1000:.0f} ms, {source.calls} fetches")
+
+    source = FakeYouTube(transcripts, args.latency)
+    service = TranscriptService(session_factory=None, source=source, workers=args.workers)
+    try:
+        async def service_get(video_id):
+            return await service.get_transcript(video_id, "en")
+
+        elapsed, lag = await _measure(service_get, requests)
+        print(f"service  {elapsed:.2f}s, max event loop stall {lag * 1000:.0f} ms, {source.calls} fetches, "
+              f"{service.stats}")
+    finally:
+        service.shutdown()
+
+    sample = next(iter(transcripts.values()))
+    raw = len(" ".join(entry["text"] for entry in sample).encode("utf-8"))
+    print(f"stored transcript: {raw / 1024:.0f} KiB of text -> {len(encode_segments(sample)) / 1024:.0f} KiB compressed "
+          f"(with segment start times)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Transcript fetch benchmark")
+    parser.add_argument("--videos", type=int, default=20)
+    parser.add_argument("--requests", type=int, default=200, help="Одновременных запросов")
+    parser.add_argument("--broken", type=float, default=0.2, help="Доля видео без субтитров")
+    parser.add_argument("--segments", type=int, default=1200, help="Сегментов в транскрипте (~1 час)")
+    parser.add_argument("--latency", type=float, default=0.3, help="Задержка загрузки, сек")
+    parser.add_argument("--workers", type=int, default=4)
+    args = parser.parse_args()
+
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -13,7 +13,11 @@ import os
 # Add backend to path
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend'))
 
+# Тестовый режим: raiseload для связей вне профиля загрузки и строгие бюджеты запросов
+os.environ.setdefault("TESTING", "true")
+
 from app.core.database import Base
+from app.core.query_counter import count_queries, install_query_counter
 from app.main import app
 from app.models import User
 from app.core.constants import TariffType
@@ -35,6 +39,8 @@ test_engine = create_async_engine(
     echo=False
 )
 
+install_query_counter(test_engine)
+
 # Create test session maker
 TestSessionLocal = async_sessionmaker(
     test_engine,
@@ -72,6 +78,13 @@ async def client(db_session: AsyncSession) -> AsyncGenerator[AsyncClient, None]:
         yield ac
 
 
+@pytest.fixture
+def query_counter():
+    """Count SQL queries of the test engine; use counter.assert_max(n) for a budget"""
+    with count_queries() as counter:
+        yield counter
+
+
 @pytest.fixture
 async def test_user(db_session: AsyncSession) -> User:
     """Create a test user"""
@@ -0,0 +1,153 @@
+"""
+Unit tests for the incremental achievement progress engine
+"""
+import pytest
+import sys
+import os
+from datetime import date
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'backend'))
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.pool import StaticPool
+
+from app.core.constants import ActionType, ContentType
+from app.models import (
+    Achievement,
+    Generation,
+    Image,
+    User,
+    UserAchievement,
+    UserAchievementCounters,
+    UserAction
+)
+from app.services.achievements.progress_engine import (
+    AchievementProgressEngine,
+    METRIC_GENERATIONS,
+    METRIC_STREAK,
+    advance_streak,
+    parse_achievement_conditions
+)
+
+
+class TestConditionParsing:
+    """Tests for mapping achievement conditions to index entries"""
+
+    def test_generation_count_with_content_type(self):
+        indexed = parse_achievement_conditions(1, {"generation_count": 5, "content_type": "game"})
+        assert indexed.metric == METRIC_GENERATIONS
+        assert indexed.required == 5
+        assert indexed.content_type == "game"
+
+    def test_default_achievement_format(self):
+        indexed = parse_achievement_conditions(2, {"action_type": "generation", "count": 10})
+        assert indexed.metric == METRIC_GENERATIONS
+        assert indexed.required == 10
+        assert indexed.content_type is None
+
+    def test_streak_conditions(self):
+        indexed = parse_achievement_conditions(3, {"consecutive_days": 7})
+        assert indexed.metric == METRIC_STREAK
+
+    def test_unknown_conditions_are_skipped(self):
+        assert parse_achievement_conditions(4, {"points_required": 100}) is None
+        assert parse_achievement_conditions(5, None) is None
+
+
+class TestStreak:
+    """Tests for streak bookkeeping"""
+
+    def test_same_day_does_not_change_streak(self):
+        assert advance_streak(date(2024, 5, 2), 3, date(2024, 5, 2)) == (3, False)
+
+    def test_next_day_extends_streak(self):
+        assert advance_streak(date(2024, 5, 1), 3, date(2024, 5, 2)) == (4, True)
+
+    def test_gap_resets_streak(self):
+        assert advance_streak(date(2024, 4, 28), 3, date(2024, 5, 2)) == (1, True)
+        assert advance_streak(None, 0, date(2024, 5, 2)) == (1, True)
+
+    def test_streak_from_history(self):
+        days = [date(2024, 5, 3), date(2024, 5, 2), date(2024, 5, 1), date(2024, 4, 28)]
+        assert AchievementProgressEngine._streak_from_days(days) == (3, date(2024, 5, 3))
+        assert AchievementProgressEngine._streak_from_days(["2024-05-03"]) == (1, date(2024, 5, 3))
+        assert AchievementProgressEngine._streak_from_days([]) == (0, None)
+
+
+class TestProgress:
+    """Tests for progress calculation from counters"""
+
+    def test_progress_by_content_type(self):
+        counters = UserAchievementCounters(
+            user_id=1,
+            generations_total=8,
+            generations_by_type={"game": 2},
+            images_count=0,
+            invites_count=0,
+            streak_days=0
+        )
+        assert parse_achievement_conditions(1, {"generation_count": 4, "content_type": "game"}).progress(counters) == 50
+        assert parse_achievement_conditions(2, {"generation_count": 4}).progress(counters) == 100
+
+
+class TestRepeatedEvents:
+    """Tests that counters follow saved rows, not the number of checks"""
+
+    @pytest.fixture
+    async def session(self):
+        engine = create_async_engine("sqlite+aiosqlite://", poolclass=StaticPool)
+        tables = [User.__table__, Achievement.__table__, UserAchievement.__table__, UserAction.__table__,
+                  UserAchievementCounters.__table__, Generation.__table__, Image.__table__]
+        async with engine.begin() as conn:
+            await conn.run_sync(lambda sync_conn: User.metadata.create_all(sync_conn, tables=tables))
+        async with AsyncSession(engine, expire_on_commit=False) as session:
+            session.add_all([
+                User(id=1, telegram_id=1, first_name="Test"),
+                Achievement(id=1, code="gen_3", name="Gen", description="", conditions={"generation_count": 3}),
+                Achievement(id=2, code="img_2", name="Img", description="", conditions={"image_count": 2}),
+            ])
+            await session.commit()
+            yield session
+        await engine.dispose()
+
+    @staticmethod
+    async def progress(session):
+        result = await session.execute(select(UserAchievement.achievement_id, UserAchievement.progress))
+        return dict(result.all())
+
+    @pytest.mark.asyncio
+    async def test_repeated_checks_do_not_inflate_counters(self, session):
+        engine = AchievementProgressEngine(session)
+        AchievementProgressEngine.invalidate_index()
+        session.add(Generation(user_id=1, type=ContentType.GAME, content="c", prompt="p"))
+        await session.flush()
+
+        for _ in range(3):
+            await engine.process_event(1, ActionType.GENERATION, {"content_type": "game"})
+        counters = await session.get(UserAchievementCounters, 1)
+        assert counters.generations_total == 1
+        assert await self.progress(session) == {1: 33}
+
+        session.add(Generation(user_id=1, type=ContentType.GAME, content="c", prompt="p"))
+        await session.flush()
+        await engine.process_event(1, ActionType.GENERATION, {"content_type": "game"})
+        await engine.process_event(1, ActionType.GENERATION, {"content_type": "game"})
+
+        assert (counters.generations_total, counters.generations_by_type) == (2, {"game": 2})
+        assert await self.progress(session) == {1: 66}
+
+    @pytest.mark.asyncio
+    async def test_image_generation_counts_saved_images_once(self, session):
+        engine = AchievementProgressEngine(session)
+        AchievementProgressEngine.invalidate_index()
+        await engine.process_event(1, ActionType.GENERATION, {"content_type": "image"})
+
+        session.add(Image(user_id=1, prompt="p", url="/img/1.png"))
+        await session.flush()
+        await engine.process_event(1, ActionType.GENERATION, {"content_type": "image"})
+        await engine.process_event(1, ActionType.IMAGE_GENERATION, {"content_type": "image"})
+
+        counters = await session.get(UserAchievementCounters, 1)
+        assert counters.images_count == 1
+        assert await self.progress(session) == {2: 50}
@@ -0,0 +1,107 @@
+"""
+Unit tests for the bounded analytics cache (TinyLFU eviction, stampede protection)
+"""
+import pytest
+import sys
+import os
+import asyncio
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'backend'))
+
+from app.services.analytics.cache_service import CacheService
+
+
+def make_cache(**kwargs):
+    params = {"max_entries": 100, "max_bytes": 1 << 20, "stale_ttl": 60, "lock_stripes": 8, "use_redis": False}
+    params.update(kwargs)
+    return CacheService(**params)
+
+
+class TestBounds:
+    """Tests for entry count and byte limits"""
+
+    @pytest.mark.asyncio
+    async def test_entry_limit(self):
+        cache = make_cache()
+        for i in range(1_000):
+            await cache.set(f"report:{i}", i)
+        stats = await cache.get_stats()
+        assert stats["total_entries"] <= 100
+        assert stats["evictions"] >= 900
+
+    @pytest.mark.asyncio
+    async def test_byte_limit(self):
+        cache = make_cache(max_bytes=50_000)
+        for i in range(100):
+            await cache.set(f"report:{i}", "x" * 2_000)
+        assert cache.total_bytes <= 50_000
+        assert (await cache.get_stats())["size_evictions"] > 0
+
+    @pytest.mark.asyncio
+    async def test_hot_keys_survive_scan(self):
+        """Разовые ключи не вытесняют часто читаемые"""
+        cache = make_cache()
+        for i in range(50):
+            await cache.set(f"hot:{i}", i)
+        for _ in range(5):
+            for i in range(50):
+                assert await cache.get(f"hot:{i}") == i
+
+        for i in range(5_000):
+            await cache.set(f"scan:{i}", i)
+
+        assert sum([await cache.get(f"hot:{i}") is not None for i in range(50)]) >= 45
+        assert (await cache.get_stats())["admission_rejections"] > 0
+
+    def test_locks_are_striped(self):
+        cache = make_cache(lock_stripes=8)
+        assert len({id(cache._get_lock(f"key:{i}")) for i in range(10_000)}) <= 8
+
+
+class TestStampedeProtection:
+    """Tests for get_or_set recomputation"""
+
+    @pytest.mark.asyncio
+    async def test_concurrent_miss_computes_once(self):
+        cache = make_cache()
+        calls = 0
+
+        async def compute():
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.01)
+            return "value"
+
+        results = await asyncio.gather(*(cache.get_or_set("dashboard:1", compute) for _ in range(20)))
+        assert results == ["value"] * 20
+        assert calls == 1
+
+    @pytest.mark.asyncio
+    async def test_stale_while_revalidate(self):
+        cache = make_cache(early_expiration_beta=0)
+        versions = iter(["v1", "v2"])
+
+        async def compute():
+            return next(versions)
+
+        assert await cache.get_or_set("dashboard:2", compute, ttl=0) == "v1"
+        # TTL истек, но значение отдается сразу, а пересчет идет в фоне
+        assert await cache.get_or_set("dashboard:2", compute, ttl=60) == "v1"
+        await asyncio.sleep(0)
+        await asyncio.gather(*cache._refresh_tasks.values())
+        assert await cache.get("dashboard:2") == "v2"
+
+        stats = await cache.get_stats()
+        assert stats["stale_hits"] == 1
+        assert stats["background_refreshes"] == 1
+
+    @pytest.mark.asyncio
+    async def test_hit_ratio(self):
+        cache = make_cache()
+
+        async def compute():
+            return 1
+
+        for _ in range(4):
+            await cache.get_or_set("dashboard:3", compute)
+        assert (await cache.get_stats())["hit_ratio"] == 0.75
@@ -0,0 +1,71 @@
+"""
+Unit tests for analytics rollup result assembly
+"""
+import pytest
+import sys
+import os
+from datetime import date, datetime, timezone
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'backend'))
+
+from app.services.analytics.rollups import (
+    RollupResult,
+    ceil_day,
+    ceil_hour,
+    floor_day,
+    floor_hour,
+    pg_weekday
+)
+from app.services.analytics.sketches import HyperLogLog
+
+
+class TestBoundaries:
+    """Tests for hour/day alignment of rollup segments"""
+
+    def test_hour_alignment(self):
+        moment = datetime(2024, 5, 2, 13, 45, tzinfo=timezone.utc)
+        assert floor_hour(moment) == datetime(2024, 5, 2, 13, tzinfo=timezone.utc)
+        assert ceil_hour(moment) == datetime(2024, 5, 2, 14, tzinfo=timezone.utc)
+        assert ceil_hour(floor_hour(moment)) == floor_hour(moment)
+
+    def test_day_alignment(self):
+        moment = datetime(2024, 5, 2, 13, 45, tzinfo=timezone.utc)
+        assert floor_day(moment) == datetime(2024, 5, 2, tzinfo=timezone.utc)
+        assert ceil_day(moment) == datetime(2024, 5, 3, tzinfo=timezone.utc)
+
+    def test_postgres_weekday_numbering(self):
+        assert pg_weekday(date(2024, 5, 5)) == 0  # воскресенье
+        assert pg_weekday(date(2024, 5, 6)) == 1
+
+
+class TestRollupResult:
+    """Tests for merging rollup rows and raw tail rows"""
+
+    def test_totals_and_filters(self):
+        result = RollupResult("payments")
+        day = date(2024, 5, 6)
+        hours = [0] * 24
+        hours[10] = 2
+        result.add(day, "tariff", "tariff_2", (2, 2, 598.0, 598.0), hours)
+        result.add(day, "points", "none", (1, 1, 100.0, 100.0), hours, user_ids=[7])
+
+        assert result.totals().amount == 698.0
+        assert result.totals(categories=["tariff"]).count == 2
+        assert result.by_tariff(categories=["tariff"])["tariff_2"].avg_amount == 299.0
+        assert result.hourly_counts[10] == 4
+        assert result.weekday_counts[1] == 3
+        assert result.daily_series()[day].count == 3
+
+    def test_distinct_users_merges_sketches_and_raw_ids(self):
+        result = RollupResult("generations")
+        day = date(2024, 5, 6)
+        sketch = HyperLogLog().update(range(100))
+        result.add(day, "game", "none", (100, 100, 0.0, 0.0), [0] * 24, sketch=sketch)
+        result.add(day, "game", "none", (2, 2, 0.0, 0.0), [0] * 24, user_ids=[1, 1000])
+
+        assert result.distinct_users() == pytest.approx(101, rel=0.05)
+
+    def test_distinct_users_exact_without_sketches(self):
+        result = RollupResult("generations")
+        result.add(date(2024, 5, 6), "game", "none", (3, 3, 0.0, 0.0), [0] * 24, user_ids=[1, 2, 3])
+        assert result.distinct_users() == 3
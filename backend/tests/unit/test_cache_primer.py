@@ -0,0 +1,266 @@
+"""
+Unit tests for warm-start cache priming of templates and popular generations
+"""
+import pytest
+import sys
+import os
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'backend'))
+
+from app.core.constants import ContentType
+from app.services.content.cache_primer import (
+    STATS_KEY,
+    CachePrimer,
+    PopularPrompt,
+    mark_primed,
+    prompt_manifest_key,
+    record_primed_hit,
+    remember_prompt,
+    select_popular
+)
+from app.services.content.prompt_cache import generation_cache_key
+
+PLAN_PROMPT = "Составь план урока английского языка. Тема: Present Perfect. Уровень: B1"
+GAME_PROMPT = "Придумай игру на запоминание неправильных глаголов"
+
+
+class FakeCache:
+    """Словарь вместо Redis"""
+
+    def __init__(self):
+        self.data = {}
+
+    async def get_cached_data(self, key):
+        return self.data.get(key)
+
+    async def cache_data(self, key, data, ttl=None):
+        self.data[key] = data
+        return True
+
+    async def invalidate(self, key):
+        return self.data.pop(key, None) is not None
+
+
+class FakeResult:
+
+    def __init__(self, rows):
+        self.rows = rows
+
+    def mappings(self):
+        return self
+
+    def all(self):
+        return self.rows
+
+
+class FakeSession:
+    """Отвечает на запросы cache_primer заранее заданными строками"""
+
+    def __init__(self, tables):
+        self.tables = tables
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        return False
+
+    async def execute(self, statement, params=None):
+        sql = str(statement)
+        if "FROM courses" in sql:
+            return FakeResult([(template_id,) for template_id in self.tables.get("templates", [])])
+        if "GROUP BY type, md5(prompt)" in sql:
+            return FakeResult(self.tables.get("popular", []))
+        if "id = ANY(:ids)" in sql:
+            return FakeResult(self.tables.get("generations", []))
+        if "FROM feature_usage" in sql:
+            return FakeResult(self.tables.get("feature_usage", []))
+        return FakeResult(self.tables.get("generation_metrics", []))
+
+
+class FakeGenerator:
+
+    def __init__(self, cache, calls):
+        self.cache = cache
+        self.calls = calls
+
+    async def generate_content(self, user_id, prompt, content_type, use_cache=True, extra_params=None):
+        self.calls.append((user_id, prompt, content_type, extra_params))
+        await self.cache.cache_data(generation_cache_key(prompt, content_type, extra_params), "new content")
+        return "new content"
+
+
+def make_primer(tables, spare=1.0, **kwargs):
+    cache = FakeCache()
+    calls = []
+    primer = CachePrimer(
+        session_factory=lambda: FakeSession(tables),
+        cache=cache,
+        top_prompts=10, top_templates=5, lookback_days=7, min_requests=2,
+        max_generations=2, generation_delay=0, min_spare_capacity=0.5,
+        generator_factory=lambda session: FakeGenerator(cache, calls),
+        spare_capacity=lambda: spare,
+        **kwargs
+    )
+    return primer, cache, calls
+
+
+def generation_rows(*items):
+    popular = []
+    generations = []
+    for index, (content_type, prompt, requests, content) in enumerate(items, start=1):
+        popular.append({"content_type": content_type, "requests": requests, "latest_id": index})
+        generations.append({"id": index, "user_id": 7, "prompt": prompt, "content": content})
+    return {"popular": popular, "generations": generations}
+
+
+class TestSelectPopular:
+    """Tests for choosing popular prompts across content types"""
+
+    def test_merges_canonical_duplicates(self):
+        selected = select_popular([
+            PopularPrompt(ContentType.LESSON_PLAN, PLAN_PROMPT, 5, content="a"),
+            PopularPrompt(ContentType.LESSON_PLAN, f"  {PLAN_PROMPT.upper()} ", 3, content="b"),
+        ], {}, 10)
+
+        assert len(selected) == 1
+        assert (selected[0].requests, selected[0].content) == (8, "a")
+
+    def test_quotas_follow_feature_usage(self):
+        candidates = [PopularPrompt(ContentType.LESSON_PLAN, f"plan {i}", 100 - i) for i in range(10)]
+        candidates += [PopularPrompt(ContentType.GAME, f"game {i}", 10 - i) for i in range(5)]
+
+        selected = select_popular(candidates, {ContentType.LESSON_PLAN: 1.0, ContentType.GAME: 1.0}, 6)
+
+        assert len(selected) == 6
+        assert sum(p.content_type == ContentType.GAME for p in selected) == 3
+        assert select_popular(candidates, {ContentType.LESSON_PLAN: 1.0}, 4)[-1].content_type == ContentType.GAME
+
+
+class TestPrimePrompts:
+    """Tests for pre-loading and pre-generating popular prompts"""
+
+    @pytest.mark.asyncio
+    async def test_preloads_latest_content_under_remembered_params(self):
+        tables = generation_rows(
+            ("LESSON_PLAN", PLAN_PROMPT, 12, "lesson plan"),
+            ("GAME", GAME_PROMPT, 4, "game"),
+        )
+        tables["generation_metrics"] = [{"content_type": "LESSON_PLAN", "seconds": 42.0}]
+        primer, cache, calls = make_primer(tables)
+        await remember_prompt(cache, ContentType.LESSON_PLAN, PLAN_PROMPT, {"level": "B1", "use_cache": True})
+
+        summary = await primer.prime_prompts(FakeSession(tables))
+
+        plan_key = generation_cache_key(PLAN_PROMPT, ContentType.LESSON_PLAN, {"level": "B1"})
+        assert cache.data[plan_key] == "lesson plan"
+        assert cache.data[generation_cache_key(GAME_PROMPT, ContentType.GAME)] == "game"
+        assert summary["preloaded"] == 2 and calls == []
+
+        again = await primer.prime_prompts(FakeSession(tables))
+        assert again["already_cached"] == 2
+
+        await record_primed_hit(cache, plan_key)
+        assert cache.data[STATS_KEY]["hits"] == 1
+        assert cache.data[STATS_KEY]["saved_seconds"] == 42.0
+
+    @pytest.mark.asyncio
+    async def test_generates_failed_prompts_only_with_spare_quota(self):
+        tables = generation_rows(
+            ("LESSON_PLAN", PLAN_PROMPT, 12, "Не удалось сгенерировать контент."),
+            ("GAME", GAME_PROMPT, 4, ""),
+        )
+        primer, cache, calls = make_primer(tables)
+        await remember_prompt(cache, ContentType.LESSON_PLAN, PLAN_PROMPT, {"level": "B1"})
+
+        summary = await primer.prime_prompts(FakeSession(tables))
+
+        # Промпт игры ни разу не запрашивался через кэш генераций - не генерируется
+        assert summary["generated"] == 1
+        assert calls == [(7, PLAN_PROMPT, ContentType.LESSON_PLAN, {"level": "B1"})]
+
+        busy, busy_cache, busy_calls = make_primer(tables, spare=0.2)
+        await remember_prompt(busy_cache, ContentType.LESSON_PLAN, PLAN_PROMPT, {"level": "B1"})
+        summary = await busy.prime_prompts(FakeSession(tables))
+
+        assert (summary["generated"], summary["deferred"]) == (0, 1)
+        assert busy_calls == []
+
+
+class FakeTemplate:
+
+    def __init__(self, type):
+        self.type = type
+
+
+class FakeCourseManager:
+
+    def __init__(self, cache, calls):
+        self.cache = cache
+        self.calls = calls
+
+    async def get_lesson_templates(self, type=None, refresh=False):
+        self.calls.append(("lesson_templates", type, refresh))
+        return [FakeTemplate("grammar"), FakeTemplate("speaking"), FakeTemplate("grammar")]
+
+    async def get_course_templates(self, level=None, target_audience=None, refresh=False):
+        self.calls.append(("course_templates", level, refresh))
+        return []
+
+    async def get_course_template_tree(self, template_id, refresh=False):
+        self.calls.append(("tree", template_id, refresh))
+        if template_id == 3:
+            return None
+        tree = {"id": template_id, "lessons": []}
+        await self.cache.cache_data(f"course_template_tree:{template_id}", tree)
+        return tree
+
+
+class TestPrimeTemplates:
+    """Tests for template list and template tree priming"""
+
+    @pytest.mark.asyncio
+    async def test_primes_lists_and_popular_trees(self):
+        calls = []
+        tables = {"templates": [1, 3, 2]}
+        primer, cache, _ = make_primer(tables, manager_factory=lambda session: FakeCourseManager(primer.cache, calls))
+
+        summary = await primer.prime()
+
+        assert summary["template_trees"] == 2
+        assert ("lesson_templates", "grammar", True) in calls and ("lesson_templates", "speaking", True) in calls
+        assert ("tree", 3, True) in calls
+        assert "cache_priming:primed:course_template_tree:1" in cache.data
+        assert "cache_priming:primed:course_template_tree:3" not in cache.data
+
+        await mark_primed(cache, "other", "generation", 1.5)
+        await record_primed_hit(cache, "course_template_tree:1")
+        await record_primed_hit(cache, "not-primed")
+        stats = await primer.stats()
+        assert stats["hits"] == 1
+        assert stats["by_kind"]["template_tree"]["hits"] == 1
+        assert stats["last_run"]["template_trees"] == 2
+
+    def test_manifest_key_is_canonical(self):
+        assert prompt_manifest_key(ContentType.GAME, GAME_PROMPT) == \
+               prompt_manifest_key("game", f"  {GAME_PROMPT.upper()}\n")
+
+
+class TestProviderSpareCapacity:
+    """Tests for the quota headroom that gates pre-generation"""
+
+    def test_spare_capacity_of_least_loaded_model(self, monkeypatch):
+        monkeypatch.setenv("GEMINI_API_KEY", "key-one")
+        monkeypatch.setenv("GEMINI_EXTRA_API_KEYS", "")
+        monkeypatch.setenv("USE_RATE_LIMITER", "false")
+        from app.utils.gemini_rate_limiter import GeminiRateLimiter
+        limiter = GeminiRateLimiter()
+        limiter.enabled = True
+
+        assert limiter.spare_capacity() == 1.0
+
+        limiter.record_usage("key-one", "gemini-2.0-flash", tokens=45000)
+        limiter.record_usage("key-one", "gemini-1.5-flash", tokens=30000)
+        limiter.record_usage("key-one", "gemini-1.5-pro", tokens=15000)
+
+        assert limiter.spare_capacity() == pytest.approx(0.5)
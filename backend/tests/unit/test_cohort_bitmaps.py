@@ -0,0 +1,97 @@
+"""
+Unit tests for activity bitmaps and cohort retention matrices against exact sets
+"""
+import pytest
+import sys
+import os
+import random
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'backend'))
+
+from app.services.analytics.bitmaps import ActivityBitmap, cohort_ranges, retention_matrix
+
+
+class TestActivityBitmap:
+    """Tests for set operations and serialization"""
+
+    def test_set_operations_match_python_sets(self):
+        rng = random.Random(5)
+        left = {rng.randrange(10_000, 50_000) for _ in range(3_000)}
+        right = {rng.randrange(30_000, 90_000) for _ in range(3_000)}
+        a, b = ActivityBitmap.from_ids(left), ActivityBitmap.from_ids(right)
+
+        assert len(a) == len(left)
+        assert set(a) == left
+        assert a.intersection_count(b) == len(left & right)
+        assert set(a.union(b)) == left | right
+        assert 12_345 in a.add(12_345)
+
+    def test_add_extends_both_sides(self):
+        bitmap = ActivityBitmap.from_ids([800, 801])
+        bitmap.add_many([3, 5_000])
+        assert set(bitmap) == {3, 800, 801, 5_000}
+
+    def test_serialization_trims_and_round_trips(self):
+        bitmap = ActivityBitmap.from_ids([1_000_000, 1_000_007])
+        restored = ActivityBitmap.from_bytes(bitmap.to_bytes())
+        assert restored == bitmap
+        assert restored.offset == 125_000
+        assert len(restored.data) == 1
+        assert ActivityBitmap.from_bytes(ActivityBitmap().to_bytes()).is_empty()
+
+
+class TestRetentionMatrix:
+    """Tests for cohort retention computed by bitmap intersections"""
+
+    def test_cohort_ranges(self):
+        assert cohort_ranges(date(2024, 3, 15), "month", 3) == [
+            (date(2024, 1, 1), date(2024, 2, 1)),
+            (date(2024, 2, 1), date(2024, 3, 1)),
+            (date(2024, 3, 1), date(2024, 4, 1)),
+        ]
+        assert cohort_ranges(date(2024, 5, 8), "week", 1) == [(date(2024, 5, 6), date(2024, 5, 13))]
+
+    def test_matches_exact_retention(self):
+        rng = random.Random(9)
+        first_day, last_day = date(2024, 1, 1), date(2024, 4, 30)
+        days = (last_day - first_day).days + 1
+
+        signup_day, active_days = {}, {}
+        user_id = 0
+        for offset in range(days):
+            day = first_day + timedelta(days=offset)
+            for _ in range(rng.randrange(5, 40)):
+                user_id += 1
+                signup_day[user_id] = day
+                active_days[user_id] = {
+                    day + timedelta(days=k) for k in range(1, 40) if rng.random() < 0.3
+                }
+
+        signups, activity = {}, {}
+        for user, day in signup_day.items():
+            signups.setdefault(day, ActivityBitmap()).add(user)
+            for active in active_days[user]:
+                activity.setdefault(active, ActivityBitmap()).add(user)
+
+        ranges = cohort_ranges(last_day, "month", 4)
+        rows = retention_matrix(signups, activity, ranges, 30, last_day)
+
+        for (start, end), row in zip(ranges, rows):
+            members = [user for user, day in signup_day.items() if start <= day < end]
+            assert row["size"] == len(members)
+            for cell in row["retention"]:
+                eligible = [
+                    user for user in members
+                    if signup_day[user] + timedelta(days=cell["day"]) <= last_day
+                ]
+                retained = [
+                    user for user in eligible
+                    if signup_day[user] + timedelta(days=cell["day"]) in active_days[user]
+                ]
+                assert cell["eligible"] == len(eligible)
+                if eligible:
+                    assert cell["users"] == len(retained)
+                    assert cell["rate"] == round(len(retained) / len(eligible) * 100, 2)
+                else:
+                    assert cell["rate"] is None
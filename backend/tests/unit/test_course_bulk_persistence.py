@@ -0,0 +1,129 @@
+"""
+Unit tests for multi-row persistence of lessons and activities
+"""
+import pytest
+import sys
+import os
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'backend'))
+
+from app.models.course import Activity, Lesson
+from app.services.course.manager import CourseManager
+from app.services.optimization.batch_processor import BatchProcessor
+
+
+class FakeResult:
+
+    def __init__(self, ids):
+        self.ids = ids
+
+    def scalars(self):
+        return self
+
+    def all(self):
+        return self.ids
+
+
+class FakeSession:
+    """Считает выполненные INSERT и выдает последовательные id для RETURNING"""
+
+    def __init__(self, first_id=100):
+        self.next_id = first_id
+        self.statements = []
+        self.commits = 0
+
+    async def execute(self, statement, params=None):
+        compiled = statement.compile()
+        self.statements.append((statement.table.name, str(compiled), params, compiled.params))
+        if params is None:
+            return FakeResult([])
+        ids = list(range(self.next_id, self.next_id + len(params)))
+        self.next_id += len(params)
+        return FakeResult(ids)
+
+    async def commit(self):
+        self.commits += 1
+
+
+def make_manager(session):
+    manager = CourseManager.__new__(CourseManager)
+    manager.session = session
+    manager.batch_processor = BatchProcessor(session)
+    return manager
+
+
+def make_lessons(lessons, activities):
+    return [
+        {
+            "title": f"Урок {i + 1}", "order": i + 1, "duration": 60, "objectives": [], "grammar": [],
+            "vocabulary": [], "materials": [], "homework": {},
+            "activities": [
+                {"name": f"Активность {i + 1}.{j + 1}", "type": "practice", "duration": 6,
+                 "description": "", "materials": [], "objectives": []}
+                for j in range(activities)
+            ]
+        }
+        for i in range(lessons)
+    ]
+
+
+class TestBatchInserts:
+    """Tests for INSERT helpers that run inside the caller's transaction"""
+
+    @pytest.mark.asyncio
+    async def test_returning_ids_in_row_order_by_chunks(self):
+        session = FakeSession()
+        rows = [{"course_id": 1, "title": f"t{i}", "duration": 60, "order": i} for i in range(5)]
+
+        ids = await BatchProcessor(session).insert_returning_ids(Lesson.__table__, rows, chunk_size=2)
+
+        assert ids == [100, 101, 102, 103, 104]
+        assert [len(params) for _, _, params, _ in session.statements] == [2, 2, 1]
+        assert all("RETURNING" in sql for _, sql, _, _ in session.statements)
+        assert session.commits == 0
+
+    @pytest.mark.asyncio
+    async def test_rows_are_inserted_as_multi_row_values(self):
+        session = FakeSession()
+        rows = [{"lesson_id": 1, "name": f"a{i}", "type": "practice", "duration": 5} for i in range(3)]
+
+        await BatchProcessor(session).insert_rows(Activity.__table__, rows)
+
+        assert len(session.statements) == 1
+        table, sql, _, params = session.statements[0]
+        assert table == "activities"
+        assert [params[f"name_m{i}"] for i in range(3)] == ["a0", "a1", "a2"]
+        assert session.commits == 0
+
+
+class TestPersistLessons:
+    """Tests for writing a lesson tree with a handful of statements"""
+
+    @pytest.mark.asyncio
+    async def test_course_of_50_lessons_in_two_statements(self):
+        session = FakeSession()
+        lessons = make_lessons(50, 10)
+
+        lesson_ids = await make_manager(session)._persist_lessons(7, lessons)
+
+        assert lesson_ids == list(range(100, 150))
+        assert [table for table, *_ in session.statements] == ["lessons", "activities"]
+        lesson_params = session.statements[0][2]
+        assert all(row["course_id"] == 7 and "activities" not in row for row in lesson_params)
+
+        # Активность j урока i получает id урока i
+        activity_params = session.statements[1][3]
+        assert activity_params["lesson_id_m0"] == 100
+        assert activity_params["lesson_id_m9"] == 100
+        assert activity_params["lesson_id_m10"] == 101
+        assert activity_params["name_m499"] == "Активность 50.10"
+        assert activity_params["lesson_id_m499"] == 149
+        assert session.commits == 0
+
+    @pytest.mark.asyncio
+    async def test_lessons_without_activities(self):
+        session = FakeSession()
+
+        assert await make_manager(session)._persist_lessons(7, []) == []
+        assert await make_manager(session)._persist_lessons(7, make_lessons(2, 0)) == [100, 101]
+        assert [table for table, *_ in session.statements] == ["lessons"]
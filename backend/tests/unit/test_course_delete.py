@@ -0,0 +1,101 @@
+"""
+Unit tests for course deletion permissions
+"""
+import pytest
+import sys
+import os
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'backend'))
+
+from app.core.exceptions import AccessDeniedError
+from app.services.course.manager import CourseManager
+
+CREATOR_ID = 1
+
+
+class FakeSession:
+
+    def __init__(self):
+        self.deleted = []
+        self.commits = 0
+
+    async def delete(self, obj):
+        self.deleted.append(obj)
+
+    async def commit(self):
+        self.commits += 1
+
+    async def rollback(self):
+        pass
+
+
+class FakeCourses:
+
+    def __init__(self, course):
+        self.course = course
+
+    async def get_full(self, course_id):
+        return self.course
+
+
+class FakeCache:
+
+    def __init__(self):
+        self.invalidated = []
+
+    async def invalidate(self, key):
+        self.invalidated.append(key)
+
+    async def invalidate_pattern(self, pattern):
+        self.invalidated.append(pattern)
+
+
+def make_manager(course):
+    manager = CourseManager.__new__(CourseManager)
+    manager.session = FakeSession()
+    manager.courses = FakeCourses(course)
+    manager.cache_service = FakeCache()
+    return manager
+
+
+def make_course():
+    return SimpleNamespace(id=10, creator_id=CREATOR_ID, is_template=False)
+
+
+class TestDeleteCourse:
+    """Tests for restricting course deletion to its creator and administrators"""
+
+    @pytest.mark.asyncio
+    async def test_creator_can_delete(self):
+        course = make_course()
+        manager = make_manager(course)
+
+        assert await manager.delete_course(course.id, CREATOR_ID) is True
+        assert manager.session.deleted == [course]
+        assert manager.session.commits == 1
+        assert manager.cache_service.invalidated == ["course:10"]
+
+    @pytest.mark.asyncio
+    async def test_admin_can_delete_any_course(self):
+        course = make_course()
+        manager = make_manager(course)
+
+        assert await manager.delete_course(course.id, 2, is_admin=True) is True
+        assert manager.session.deleted == [course]
+
+    @pytest.mark.asyncio
+    async def test_other_user_cannot_delete(self):
+        course = make_course()
+        manager = make_manager(course)
+
+        with pytest.raises(AccessDeniedError):
+            await manager.delete_course(course.id, 2)
+        assert manager.session.deleted == []
+        assert manager.session.commits == 0
+        assert manager.cache_service.invalidated == []
+
+    @pytest.mark.asyncio
+    async def test_missing_course(self):
+        manager = make_manager(None)
+        assert await manager.delete_course(10, CREATOR_ID) is False
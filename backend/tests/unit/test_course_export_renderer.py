@@ -0,0 +1,70 @@
+"""
+Unit tests for the course export renderer cache
+"""
+import pytest
+import sys
+import os
+import asyncio
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'backend'))
+
+from app.core.exceptions import ValidationError
+from app.services.course.documents import ExportUnavailableError
+from app.services.course.export_renderer import CourseExportRenderer
+
+COURSE = {"name": "Курс", "language": "English", "level": "A1",
+          "target_audience": "adults", "format": "group", "description": None}
+
+
+def make_renderer(tmp_path, versions):
+    renderer = CourseExportRenderer(workers=0, cache_dir=str(tmp_path), ttl_hours=1)
+    renders = []
+
+    async def load_course(session, course_id, format):
+        return COURSE, [], versions[-1]
+
+    async def render(format, course, lessons):
+        renders.append(format)
+        await asyncio.sleep(0.01)
+        return f"{format}:{versions[-1]}".encode()
+
+    renderer.load_course = load_course
+    renderer._render = render
+    return renderer, renders
+
+
+class TestCourseExportCache:
+    """Tests for content-hash artifact caching"""
+
+    @pytest.mark.asyncio
+    async def test_concurrent_exports_render_once(self, tmp_path):
+        renderer, renders = make_renderer(tmp_path, ["a" * 64])
+        results = await asyncio.gather(*(renderer.export(None, 1, "pdf") for _ in range(10)))
+        assert set(results) == {b"pdf:" + b"a" * 64}
+        assert renders == ["pdf"]
+
+        assert await renderer.export(None, 1, "pdf") == results[0]
+        assert renderer.stats["cache_hits"] == 1
+        assert renders == ["pdf"]
+
+    @pytest.mark.asyncio
+    async def test_changed_content_replaces_file(self, tmp_path):
+        versions = ["a" * 64]
+        renderer, renders = make_renderer(tmp_path, versions)
+        await renderer.export(None, 1, "docx")
+        versions.append("b" * 64)
+        assert await renderer.export(None, 1, "docx") == b"docx:" + b"b" * 64
+        assert renders == ["docx", "docx"]
+        assert os.listdir(tmp_path) == [f"course_1_{'b' * 64}.docx"]
+
+    @pytest.mark.asyncio
+    async def test_missing_library_is_validation_error(self, tmp_path):
+        renderer, _ = make_renderer(tmp_path, ["a" * 64])
+
+        async def render(format, course, lessons):
+            raise ExportUnavailableError(format)
+
+        renderer._render = render
+        with pytest.raises(ValidationError, match="reportlab"):
+            await renderer.export(None, 1, "pdf")
+        assert os.listdir(tmp_path) == []
@@ -0,0 +1,54 @@
+"""
+Unit tests for the content-addressed image store
+"""
+import pytest
+import sys
+import os
+import base64
+import hashlib
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'backend'))
+
+from app.services.content.image_store import ImageStore, ImageStoreError, STORED_NAME, detect_extension
+
+PNG = b"\x89PNG\r\n\x1a\n" + os.urandom(600_000)
+
+
+def make_store(tmp_path):
+    return ImageStore(root=str(tmp_path), base_url="http://test", variant_workers=0)
+
+
+class TestImageStore:
+    """Tests for hash-named storage and deduplication"""
+
+    @pytest.mark.asyncio
+    async def test_base64_is_stored_by_content_hash(self, tmp_path):
+        store = make_store(tmp_path)
+        stored = await store.save_base64(base64.b64encode(PNG).decode(), with_variants=False)
+
+        assert stored.filename == f"{hashlib.sha256(PNG).hexdigest()}.png"
+        assert STORED_NAME.match(stored.filename)
+        assert (tmp_path / stored.filename).read_bytes() == PNG
+        assert store.url(stored.filename) == f"http://test/static/generated_images/{stored.filename}"
+
+    @pytest.mark.asyncio
+    async def test_duplicates_are_stored_once(self, tmp_path):
+        store = make_store(tmp_path)
+        first = await store.save_bytes(PNG, with_variants=False)
+        second = await store.save_base64(base64.encodebytes(PNG).decode(), with_variants=False)
+
+        assert first.created and not second.created
+        assert second.filename == first.filename
+        assert os.listdir(tmp_path) == [first.filename]
+
+    @pytest.mark.asyncio
+    async def test_invalid_base64_leaves_no_files(self, tmp_path):
+        store = make_store(tmp_path)
+        with pytest.raises(ImageStoreError):
+            await store.save_base64("not base64!", with_variants=False)
+        assert os.listdir(tmp_path) == []
+
+    def test_detect_extension(self):
+        assert detect_extension(b"\xff\xd8\xff\xe0") == "jpg"
+        assert detect_extension(b"RIFF\x00\x00\x00\x00WEBPVP8 ") == "webp"
+        assert detect_extension(PNG[:16]) == "png"
@@ -0,0 +1,147 @@
+"""
+Unit tests for the index advisor and hot query plans
+"""
+import pytest
+import sys
+import os
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'backend'))
+
+from app.core.utils import day_range
+from app.services.optimization.index_advisor import (
+    HOT_QUERIES,
+    REQUIRED_INDEXES,
+    IndexAdvisor,
+    IndexSpec,
+    sequential_scans
+)
+
+TEST_DATABASE_URL = os.getenv("TEST_DATABASE_URL", "")
+EXPLAIN_SCHEMA = "index_advisor_test"
+
+
+class TestIndexSpec:
+    """Tests for CREATE INDEX statement generation"""
+
+    def test_covering_index(self):
+        spec = IndexSpec("idx_t", "t", "created_at", include=("a", "b"))
+        assert spec.create_sql() == "CREATE INDEX IF NOT EXISTS idx_t ON t (created_at) INCLUDE (a, b)"
+
+    def test_brin_concurrently(self):
+        spec = IndexSpec("idx_t", "t", "created_at", method="brin")
+        assert spec.create_sql(concurrently=True) == "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_t ON t USING brin (created_at)"
+
+    def test_partial_index(self):
+        spec = IndexSpec("idx_t", "t", "status", where="status = 'completed'")
+        assert spec.create_sql().endswith("(status) WHERE status = 'completed'")
+
+    def test_names_are_unique(self):
+        names = [spec.name for spec in REQUIRED_INDEXES]
+        assert len(names) == len(set(names))
+
+
+class TestSequentialScans:
+    """Tests for EXPLAIN (FORMAT JSON) plan walking"""
+
+    def test_nested_plan(self):
+        plan = [{"Plan": {
+            "Node Type": "Hash Join",
+            "Plans": [
+                {"Node Type": "Seq Scan", "Relation Name": "users"},
+                {"Node Type": "Index Only Scan", "Relation Name": "generations"}
+            ]
+        }}]
+        assert sequential_scans(plan) == ["users"]
+
+    def test_index_plan(self):
+        plan = [{"Plan": {"Node Type": "Bitmap Heap Scan", "Relation Name": "usage_logs", "Plans": [
+            {"Node Type": "Bitmap Index Scan", "Index Name": "idx_usage_logs_created_brin"}
+        ]}}]
+        assert sequential_scans(plan) == []
+
+
+class TestDayRange:
+    """Tests for half-open day ranges"""
+
+    def test_day_range_from_datetime(self):
+        start, end = day_range(datetime(2024, 5, 2, 13, 45, tzinfo=timezone.utc))
+        assert start == datetime(2024, 5, 2, tzinfo=timezone.utc)
+        assert end == datetime(2024, 5, 3, tzinfo=timezone.utc)
+
+
+SEED_SQL = [
+    "CREATE TABLE users (id SERIAL PRIMARY KEY, created_at TIMESTAMPTZ, last_active TIMESTAMPTZ)",
+    "CREATE TABLE generations (id SERIAL PRIMARY KEY, user_id INTEGER, type VARCHAR(50), content TEXT, prompt TEXT, created_at TIMESTAMPTZ)",
+    "CREATE TABLE images (id SERIAL PRIMARY KEY, user_id INTEGER, prompt TEXT, url VARCHAR(500), created_at TIMESTAMPTZ)",
+    "CREATE TABLE user_actions (id SERIAL PRIMARY KEY, user_id INTEGER, action_type VARCHAR(50), created_at TIMESTAMPTZ)",
+    "CREATE TABLE usage_logs (id SERIAL PRIMARY KEY, user_id INTEGER, action_type VARCHAR(50), created_at TIMESTAMPTZ)",
+    "CREATE TABLE feature_usage (id SERIAL PRIMARY KEY, user_id INTEGER, feature_type VARCHAR(50), success BOOLEAN, created_at TIMESTAMPTZ)",
+    "CREATE TABLE point_transactions (id SERIAL PRIMARY KEY, user_id INTEGER, amount INTEGER, transaction_type VARCHAR(50), created_at TIMESTAMPTZ)",
+    "CREATE TABLE payments (id SERIAL PRIMARY KEY, user_id INTEGER, amount DOUBLE PRECISION, payment_type VARCHAR(50), status VARCHAR(50), meta_data JSONB, created_at TIMESTAMPTZ)",
+    """INSERT INTO users (created_at, last_active)
+       SELECT now() - random() * interval '365 days', now() - random() * interval '90 days'
+       FROM generate_series(1, 5000)""",
+    """INSERT INTO generations (user_id, type, content, prompt, created_at)
+       SELECT 1 + floor(random() * 5000)::int, (ARRAY['lesson_plan', 'exercise', 'game'])[1 + floor(random() * 3)::int],
+              'content', 'prompt', now() - random() * interval '365 days'
+       FROM generate_series(1, 50000)""",
+    """INSERT INTO images (user_id, prompt, url, created_at)
+       SELECT 1 + floor(random() * 5000)::int, 'prompt', 'url', now() - random() * interval '365 days'
+       FROM generate_series(1, 20000)""",
+    """INSERT INTO user_actions (user_id, action_type, created_at)
+       SELECT 1 + floor(random() * 5000)::int, 'generation', now() - random() * interval '365 days'
+       FROM generate_series(1, 50000)""",
+    """INSERT INTO usage_logs (user_id, action_type, created_at)
+       SELECT 1 + floor(random() * 5000)::int, 'generation', now() - interval '365 days' + g * interval '10 minutes'
+       FROM generate_series(1, 50000) AS g""",
+    """INSERT INTO feature_usage (user_id, feature_type, success, created_at)
+       SELECT 1 + floor(random() * 5000)::int, 'lesson_plan', random() < 0.9, now() - random() * interval '365 days'
+       FROM generate_series(1, 50000)""",
+    """INSERT INTO point_transactions (user_id, amount, transaction_type, created_at)
+       SELECT 1 + floor(random() * 5000)::int, 10 - floor(random() * 20)::int, 'generation', now() - random() * interval '365 days'
+       FROM generate_series(1, 50000)""",
+    """INSERT INTO payments (user_id, amount, payment_type, status, meta_data, created_at)
+       SELECT 1 + floor(random() * 5000)::int, 299, 'tariff',
+              CASE WHEN random() < 0.9 THEN 'completed' ELSE 'failed' END,
+              jsonb_build_object('tariff_type', 'tariff_2'), now() - random() * interval '365 days'
+       FROM generate_series(1, 20000)""",
+]
+
+
+@pytest.mark.asyncio
+@pytest.mark.skipif(
+    not TEST_DATABASE_URL.startswith("postgresql"),
+    reason="EXPLAIN checks require PostgreSQL (TEST_DATABASE_URL)"
+)
+async def test_hot_queries_do_not_use_sequential_scans():
+    """После создания обязательных индексов горячие запросы не сканируют таблицы целиком"""
+    from sqlalchemy import text
+    from sqlalchemy.ext.asyncio import create_async_engine
+
+    engine = create_async_engine(TEST_DATABASE_URL)
+    try:
+        async with engine.begin() as conn:
+            await conn.execute(text(f"DROP SCHEMA IF EXISTS {EXPLAIN_SCHEMA} CASCADE"))
+            await conn.execute(text(f"CREATE SCHEMA {EXPLAIN_SCHEMA}"))
+            await conn.execute(text(f"SET LOCAL search_path TO {EXPLAIN_SCHEMA}"))
+            for statement in SEED_SQL:
+                await conn.execute(text(statement))
+
+            advisor = IndexAdvisor(conn)
+            await advisor.apply(concurrently=False)
+            assert await advisor.missing() == []
+            for table in {spec.table for spec in REQUIRED_INDEXES}:
+                await conn.execute(text(f"ANALYZE {table}"))
+
+            # Запрещаем seq scan: если условие не использует индекс, планировщик
+            # все равно будет вынужден выбрать последовательное сканирование
+            await conn.execute(text("SET LOCAL enable_seqscan = off"))
+            report = await advisor.audit(HOT_QUERIES)
+
+            assert {name: tables for name, tables in report.items() if tables} == {}
+
+        async with engine.begin() as conn:
+            await conn.execute(text(f"DROP SCHEMA {EXPLAIN_SCHEMA} CASCADE"))
+    finally:
+        await engine.dispose()
@@ -0,0 +1,142 @@
+"""
+Unit tests for eager-loading profiles and per-endpoint query budgets
+"""
+import pytest
+import sys
+import os
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'backend'))
+
+from fastapi import FastAPI
+from httpx import ASGITransport, AsyncClient
+from sqlalchemy import select, text
+from sqlalchemy.exc import InvalidRequestError
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.pool import StaticPool
+
+from app.core.constants import CourseFormat, CourseLevel, TargetAudience
+from app.core.exceptions import QueryBudgetExceededError
+from app.core.query_counter import QueryBudgetMiddleware, count_queries, install_query_counter, query_budget
+from app.models.course import Activity, Course, Lesson
+from app.repositories.course import CourseRepository, LessonRepository
+from app.repositories.loading import apply_profile, loader_options
+
+
+@pytest.fixture
+async def engine():
+    engine = create_async_engine("sqlite+aiosqlite://", poolclass=StaticPool)
+    install_query_counter(engine)
+    async with engine.begin() as conn:
+        await conn.run_sync(
+            lambda sync_conn: Course.metadata.create_all(
+                sync_conn, tables=[Course.__table__, Lesson.__table__, Activity.__table__]
+            )
+        )
+    yield engine
+    await engine.dispose()
+
+
+@pytest.fixture
+async def course_id(engine):
+    async with AsyncSession(engine, expire_on_commit=False) as session:
+        course = Course(name="Grammar", language="en", level=CourseLevel.INTERMEDIATE,
+                        target_audience=TargetAudience.ADULTS, format=CourseFormat.ONLINE,
+                        total_duration=240, creator_id=1)
+        course.lessons = [
+            Lesson(title=f"Lesson {i}", duration=60, order=i, is_completed=i == 1,
+                   activities=[Activity(name=f"Activity {i}.{j}", type="practice", duration=10) for j in range(3)])
+            for i in range(1, 5)
+        ]
+        session.add(course)
+        await session.commit()
+        return course.id
+
+
+class TestLoaderOptions:
+    """Tests for resolving named loading profiles"""
+
+    def test_unknown_profile(self):
+        with pytest.raises(ValueError):
+            loader_options("course_everything")
+
+    def test_profile_must_match_query_entity(self):
+        with pytest.raises(ValueError):
+            apply_profile(select(Lesson), "course_full")
+
+    def test_none_keeps_model_loading(self):
+        query = select(Course)
+        assert apply_profile(query, None) is query
+
+
+class TestRepositoryProfiles:
+    """Tests for query counts and strict loading of repository profiles"""
+
+    @pytest.mark.asyncio
+    async def test_course_full_in_three_queries(self, engine, course_id):
+        async with AsyncSession(engine) as session:
+            with count_queries() as counter:
+                course = await CourseRepository(session).get_full(course_id)
+
+            assert counter.count == 3
+            assert [len(lesson.activities) for lesson in course.lessons] == [3, 3, 3, 3]
+
+    @pytest.mark.asyncio
+    async def test_relationship_outside_profile_raises_in_strict_mode(self, engine, course_id):
+        async with AsyncSession(engine) as session:
+            course = await CourseRepository(session).get(course_id)
+
+            with pytest.raises(InvalidRequestError):
+                course.lessons
+
+            lesson = (await LessonRepository(session).get_by_course(course_id))[0]
+            # Курс урока уже в сессии - обращение без запроса разрешено
+            assert lesson.course is course
+            assert len(lesson.activities) == 3
+
+    @pytest.mark.asyncio
+    async def test_progress_in_one_query(self, engine, course_id):
+        async with AsyncSession(engine) as session:
+            with count_queries() as counter:
+                progress = await CourseRepository(session).get_progress(course_id)
+
+            assert counter.count == 1
+            assert progress["total_lessons"] == 4
+            assert progress["completed_lessons"] == 1
+            assert (progress["total_duration"], progress["completed_duration"]) == (240, 60)
+            assert progress["next_lesson_order"] == 2
+
+
+def make_app(engine, strict):
+    app = FastAPI()
+    app.add_middleware(QueryBudgetMiddleware, strict=strict)
+
+    @app.get("/items")
+    @query_budget(1)
+    async def items():
+        async with engine.connect() as conn:
+            await conn.execute(text("SELECT 1"))
+            await conn.execute(text("SELECT 2"))
+        return {"ok": True}
+
+    return app
+
+
+class TestQueryBudgetMiddleware:
+    """Tests for counting queries per request and enforcing endpoint budgets"""
+
+    @pytest.mark.asyncio
+    async def test_reports_query_count_and_logs_overrun(self, engine, caplog):
+        transport = ASGITransport(app=make_app(engine, strict=False))
+        async with AsyncClient(transport=transport, base_url="http://test") as client:
+            response = await client.get("/items")
+
+        assert response.status_code == 200
+        assert response.headers["x-db-queries"] == "2"
+        assert "budget is 1" in caplog.text
+
+    @pytest.mark.asyncio
+    async def test_strict_mode_fails_over_budget(self, engine):
+        transport = ASGITransport(app=make_app(engine, strict=True))
+        async with AsyncClient(transport=transport, base_url="http://test") as client:
+            with pytest.raises(QueryBudgetExceededError):
+                await client.get("/items")
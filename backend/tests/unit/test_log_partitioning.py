@@ -0,0 +1,46 @@
+"""
+Unit tests for monthly log partition helpers
+"""
+import pytest
+import sys
+import os
+from datetime import date, datetime, timezone, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'backend'))
+
+from app.services.maintenance.partitioning import (
+    add_months,
+    month_bound,
+    month_start,
+    partition_month,
+    partition_name
+)
+
+
+class TestMonthArithmetic:
+    """Tests for partition month boundaries"""
+
+    def test_month_start_uses_utc(self):
+        moscow = timezone(timedelta(hours=3))
+        assert month_start(datetime(2024, 6, 1, 1, 0, tzinfo=moscow)) == date(2024, 5, 1)
+        assert month_start(date(2024, 6, 17)) == date(2024, 6, 1)
+
+    def test_add_months_crosses_year(self):
+        assert add_months(date(2024, 11, 1), 3) == date(2025, 2, 1)
+        assert add_months(date(2024, 1, 1), -1) == date(2023, 12, 1)
+
+    def test_month_bound(self):
+        assert month_bound(date(2024, 2, 1)) == datetime(2024, 2, 1, tzinfo=timezone.utc)
+
+
+class TestPartitionNames:
+    """Tests for partition naming convention"""
+
+    def test_round_trip(self):
+        name = partition_name("usage_logs", date(2024, 3, 1))
+        assert name == "usage_logs_p202403"
+        assert partition_month("usage_logs", name) == date(2024, 3, 1)
+
+    def test_default_and_foreign_partitions_are_ignored(self):
+        assert partition_month("usage_logs", "usage_logs_default") is None
+        assert partition_month("feature_usage", "usage_logs_p202403") is None
@@ -0,0 +1,128 @@
+"""
+Unit tests for change-driven materialized view refreshes
+"""
+import pytest
+import sys
+import os
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'backend'))
+
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.sql.elements import TextClause
+
+from app.services.analytics.matview_refresh import MATERIALIZED_VIEWS, MaterializedViewRefresher
+
+VIEW = "user_activity_summary"
+
+
+class FakeResult:
+    def __init__(self, value=None, row=None):
+        self.value = value
+        self.row = row
+
+    def scalar(self):
+        return self.value
+
+    def first(self):
+        return self.row
+
+
+class FakeSession:
+    """Отвечает на запросы обновления по тексту SQL"""
+
+    def __init__(self, signature, stored_signature, populated=True, locked=True):
+        self.signature = signature
+        self.stored_signature = stored_signature
+        self.populated = populated
+        self.locked = locked
+        self.statements = []
+        self.saved = []
+        self.commits = 0
+        self.rollbacks = 0
+
+    async def execute(self, statement, params=None):
+        if not isinstance(statement, TextClause):
+            # Upsert состояния в materialized_view_refreshes
+            self.saved.append(statement.compile(dialect=postgresql.dialect()).params)
+            return FakeResult()
+        sql = statement.text
+        self.statements.append(sql)
+        if "pg_try_advisory_xact_lock" in sql:
+            return FakeResult(self.locked)
+        if "pg_stat_user_tables" in sql:
+            return FakeResult(self.signature)
+        if "pg_matviews" in sql:
+            return FakeResult(row=SimpleNamespace(ispopulated=self.populated))
+        if "FROM materialized_view_refreshes" in sql:
+            return FakeResult(self.stored_signature)
+        return FakeResult()
+
+    async def commit(self):
+        self.commits += 1
+
+    async def rollback(self):
+        self.rollbacks += 1
+
+    def refreshes(self):
+        return [sql for sql in self.statements if sql.startswith("REFRESH MATERIALIZED VIEW")]
+
+
+def refresher(session):
+    return MaterializedViewRefresher(session, views={VIEW: MATERIALIZED_VIEWS[VIEW]})
+
+
+class TestMaterializedViewRefresher:
+    """Tests for skipping and running refreshes by source table signature"""
+
+    @pytest.mark.asyncio
+    async def test_skips_when_signature_unchanged(self):
+        session = FakeSession(signature=42, stored_signature=42)
+
+        outcome = await refresher(session).refresh(VIEW)
+
+        assert outcome.status == "unchanged"
+        assert session.refreshes() == []
+        assert "skip_count" in session.saved[0]
+        assert session.commits == 1
+
+    @pytest.mark.asyncio
+    async def test_refreshes_concurrently_when_signature_changes(self):
+        session = FakeSession(signature=43, stored_signature=42)
+
+        outcome = await refresher(session).refresh(VIEW)
+
+        assert outcome.status == "refreshed"
+        assert session.refreshes() == [f"REFRESH MATERIALIZED VIEW CONCURRENTLY {VIEW}"]
+        assert session.saved[0]["source_signature"] == 43
+        assert "refresh_count" in session.saved[0]
+        assert session.commits == 1
+
+    @pytest.mark.asyncio
+    async def test_force_refreshes_unchanged_view(self):
+        session = FakeSession(signature=42, stored_signature=42)
+
+        outcome = await refresher(session).refresh(VIEW, force=True)
+
+        assert outcome.status == "refreshed"
+        assert len(session.refreshes()) == 1
+
+    @pytest.mark.asyncio
+    async def test_unpopulated_view_is_refreshed_without_concurrently(self):
+        session = FakeSession(signature=42, stored_signature=42, populated=False)
+
+        outcome = await refresher(session).refresh(VIEW)
+
+        assert outcome.status == "refreshed"
+        assert session.refreshes() == [f"REFRESH MATERIALIZED VIEW {VIEW}"]
+
+    @pytest.mark.asyncio
+    async def test_skips_when_another_worker_holds_lock(self):
+        session = FakeSession(signature=43, stored_signature=42, locked=False)
+
+        outcome = await refresher(session).refresh(VIEW)
+
+        assert outcome.status == "locked"
+        assert session.refreshes() == []
+        assert session.saved == []
+        assert session.rollbacks == 1
@@ -0,0 +1,123 @@
+"""
+Unit tests for canonical generation cache keys and the near-duplicate prompt index
+"""
+import pytest
+import sys
+import os
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'backend'))
+
+from app.core.constants import ContentType
+from app.services.content.prompt_cache import (
+    NearDuplicateIndex,
+    canonical_params,
+    content_words,
+    estimated_similarity,
+    generation_cache_key,
+    minhash
+)
+
+PROMPT = """Составь план урока английского языка.
+Тема: Present Perfect
+Уровень: B1
+Длительность: 60 минут
+Цели: научить студентов использовать Present Perfect в разговоре о жизненном опыте"""
+
+
+class FakeCache:
+    """Словарь вместо Redis"""
+
+    def __init__(self):
+        self.data = {}
+
+    async def get_cached_data(self, key):
+        return self.data.get(key)
+
+    async def cache_data(self, key, data, ttl=None):
+        self.data[key] = data
+        return True
+
+
+def make_index(**kwargs):
+    kwargs.setdefault("thresholds", {"lesson_plan": 0.5})
+    return NearDuplicateIndex(FakeCache(), max_changed_words=0, ttl=60, **kwargs)
+
+
+class TestCanonicalKey:
+    """Tests for prompt and parameter canonicalization"""
+
+    def test_trivial_differences_share_key(self):
+        key = generation_cache_key(PROMPT, ContentType.LESSON_PLAN, {"level": "B1", "language": "en"})
+
+        assert generation_cache_key(f"  {PROMPT.upper()}\n\n", ContentType.LESSON_PLAN,
+                                    {"language": "EN ", "level": "b1", "use_cache": True, "batch_index": 3}) == key
+        assert generation_cache_key(PROMPT.replace(" ", "\u00a0"), "lesson_plan", {"level": "B1", "language": "en"}) == key
+
+    def test_meaningful_differences_change_key(self):
+        key = generation_cache_key(PROMPT, ContentType.LESSON_PLAN, {"level": "B1"})
+
+        assert generation_cache_key(PROMPT.replace("B1", "B2"), ContentType.LESSON_PLAN, {"level": "B1"}) != key
+        assert generation_cache_key(PROMPT, ContentType.LESSON_PLAN, {"level": "B2"}) != key
+        assert generation_cache_key(PROMPT, ContentType.EXERCISE, {"level": "B1"}) != key
+
+    def test_canonical_params(self):
+        assert canonical_params({"use_cache": False, "style": None, "Level": " B1  ", "tags": ["Grammar"]}) == \
+               {"Level": "b1", "tags": ["grammar"]}
+        assert canonical_params(None) == {}
+
+
+class TestMinHash:
+    """Tests for MinHash similarity estimates"""
+
+    def test_similarity_estimate(self):
+        words = content_words(PROMPT)
+        reordered = content_words("\n".join(reversed(PROMPT.splitlines())))
+        other = content_words("Придумай игру на запоминание неправильных глаголов для детей")
+
+        assert estimated_similarity(minhash(words), minhash(words)) == 1.0
+        assert estimated_similarity(minhash(words), minhash(reordered)) > 0.6
+        assert estimated_similarity(minhash(words), minhash(other)) < 0.2
+
+
+class TestNearDuplicateIndex:
+    """Tests for near-duplicate lookup and its safety checks"""
+
+    @pytest.mark.asyncio
+    async def test_reordered_prompt_with_fillers_is_found(self):
+        index = make_index()
+        key = generation_cache_key(PROMPT, ContentType.LESSON_PLAN)
+        await index.add(ContentType.LESSON_PLAN, PROMPT, None, key)
+
+        variant = "Пожалуйста, " + "\n".join(reversed(PROMPT.splitlines())) + "!"
+
+        assert await index.find(ContentType.LESSON_PLAN, variant) == key
+        assert index.stats["hits"] == 1
+
+    @pytest.mark.asyncio
+    async def test_changed_topic_level_or_params_are_not_served(self):
+        index = make_index()
+        await index.add(ContentType.LESSON_PLAN, PROMPT, {"level": "B1"}, "cached-key")
+
+        assert await index.find(ContentType.LESSON_PLAN, PROMPT.replace("Perfect", "Simple"), {"level": "B1"}) is None
+        assert await index.find(ContentType.LESSON_PLAN, PROMPT.replace("60", "45"), {"level": "B1"}) is None
+        assert await index.find(ContentType.LESSON_PLAN, PROMPT, {"level": "B2"}) is None
+        assert index.stats["rejected"] >= 2
+
+    @pytest.mark.asyncio
+    async def test_swapped_word_order_is_not_served(self):
+        index = make_index(thresholds={"lesson_plan": 0.5, "text_analysis": 0.5})
+        prompt = ("Translate the text from Russian to English and explain the grammar. "
+                  "Text: my favourite day of the week is Saturday because I can sleep late")
+        await index.add(ContentType.TEXT_ANALYSIS, prompt, None, "ru-en")
+
+        swapped = prompt.replace("from Russian to English", "from English to Russian")
+        assert await index.find(ContentType.TEXT_ANALYSIS, swapped) is None
+        assert index.stats["rejected"] == 1
+
+    @pytest.mark.asyncio
+    async def test_disabled_content_type(self):
+        index = make_index()
+        await index.add(ContentType.IMAGE, PROMPT, None, "image-key")
+
+        assert await index.find(ContentType.IMAGE, PROMPT) is None
+        assert index.cache.data == {}
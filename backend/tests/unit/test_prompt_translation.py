@@ -0,0 +1,97 @@
+"""
+Unit tests for image-prompt translation memory and batching
+"""
+import pytest
+import sys
+import os
+import asyncio
+import json
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'backend'))
+
+from app.services.content.translation_memory import (
+    TokenBucket,
+    TranslationMemory,
+    needs_translation,
+    normalize_prompt,
+    prompt_key
+)
+from app.services.content.prompt_translator import PromptTranslationService
+
+
+class FakeLLM:
+    """Переводит промпты из словаря и считает вызовы"""
+
+    def __init__(self, translations):
+        self.translations = translations
+        self.calls = 0
+
+    def is_available(self):
+        return True
+
+    async def generate_content(self, prompt, **kwargs):
+        self.calls += 1
+        await asyncio.sleep(0.01)
+        if "Input JSON array" in prompt:
+            items = json.loads(prompt.split("items):\n", 1)[1].split("\n\n", 1)[0])
+            return json.dumps([self.translations[item] for item in items])
+        return self.translations[prompt.split("Text to translate:\n", 1)[1].split("\n\n", 1)[0]]
+
+
+def make_service(translations):
+    llm = FakeLLM(translations)
+    memory = TranslationMemory(session_factory=None, local_entries=100, max_entries=1000, ttl_hours=1)
+    return PromptTranslationService(memory=memory, llm_handler=llm), llm
+
+
+class TestDetection:
+    """Tests for the local language detector and key normalization"""
+
+    def test_needs_translation(self):
+        assert needs_translation("красный кот на крыше")
+        assert needs_translation("cat, стиль аниме")
+        assert not needs_translation("a red cat, 4k, --ar 16:9")
+        assert not needs_translation("café crème à Paris")
+        assert not needs_translation("12345 !!!")
+
+    def test_normalized_keys(self):
+        assert normalize_prompt("  Красный   КОТ. ") == "красный кот"
+        assert prompt_key("Красный кот") == prompt_key("красный  кот!")
+        assert prompt_key("красный кот") != prompt_key("синий кот")
+
+
+class TestTokenBucket:
+    """Tests for burst and refill of the rate limiter"""
+
+    @pytest.mark.asyncio
+    async def test_burst_then_rate(self):
+        now = [0.0]
+        bucket = TokenBucket(rate=2.0, capacity=2, clock=lambda: now[0])
+        assert await bucket.acquire() == 0
+        assert await bucket.acquire() == 0
+        now[0] = 0.5
+        assert await bucket.acquire() == 0
+        assert bucket._tokens == pytest.approx(0)
+
+
+class TestBatchTranslation:
+    """Tests for batching and translation memory hits"""
+
+    @pytest.mark.asyncio
+    async def test_concurrent_prompts_share_one_call(self):
+        service, llm = make_service({"красный кот": "red cat", "синий дом": "blue house", "зеленый лес": "green forest"})
+        results = await service.translate_prompts(["красный кот", "синий дом", "Красный кот.", "зеленый лес", "blue sky"])
+
+        assert results == ["red cat", "blue house", "red cat", "green forest", "blue sky"]
+        assert llm.calls == 1
+        assert service.stats["skipped"] == 1
+        assert service.stats["shared"] == 1
+
+        assert await service.translate_prompt("синий  дом") == "blue house"
+        assert llm.calls == 1
+
+    @pytest.mark.asyncio
+    async def test_failed_translation_returns_original(self):
+        service, llm = make_service({"красный кот": "Извините, генерация заняла слишком много времени."})
+        assert await service.translate_prompt("красный кот") == "красный кот"
+        assert service.memory.local_size() == 0
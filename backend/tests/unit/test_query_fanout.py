@@ -0,0 +1,175 @@
+"""
+Unit tests for running analytics queries on separate pooled connections
+"""
+import asyncio
+import pytest
+import sys
+import os
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'backend'))
+
+from app.services.analytics import query_fanout
+from app.services.analytics.query_fanout import QueryFanOut
+
+SNAPSHOT_ID = "00000003-0000001B-1"
+
+
+class FakeResult:
+    def __init__(self, value):
+        self.value = value
+
+    def scalar(self):
+        return self.value
+
+
+class FakeConnection:
+    """Соединение пула: поддерживает и await engine.connect(), и async with"""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.statements = []
+        self.options = {}
+        self.closed = False
+
+    def __await__(self):
+        async def connected():
+            return self
+        return connected().__await__()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+        return False
+
+    async def execution_options(self, **options):
+        self.options = options
+        return self
+
+    async def execute(self, statement):
+        sql = str(statement)
+        self.statements.append(sql)
+        if "pg_export_snapshot" in sql:
+            if self.engine.export_error:
+                raise self.engine.export_error
+            return FakeResult(SNAPSHOT_ID)
+        return FakeResult(None)
+
+    async def close(self):
+        self.closed = True
+
+
+class FakeEngine:
+    def __init__(self, export_error=None):
+        self.export_error = export_error
+        self.connections = []
+
+    def connect(self):
+        connection = FakeConnection(self)
+        self.connections.append(connection)
+        return connection
+
+
+class FakeSession:
+    sessions = []
+
+    def __init__(self, bind, **kwargs):
+        self.bind = bind
+        self.closed = False
+        FakeSession.sessions.append(self)
+
+    async def close(self):
+        self.closed = True
+
+
+@pytest.fixture(autouse=True)
+def fake_session(monkeypatch):
+    FakeSession.sessions = []
+    monkeypatch.setattr(query_fanout, "AsyncSession", FakeSession)
+
+
+def workers(engine):
+    return [c for c in engine.connections if not any("pg_export_snapshot" in s for s in c.statements)]
+
+
+class TestQueryFanOut:
+    """Tests for task isolation, snapshot sharing and connection cleanup"""
+
+    @pytest.mark.asyncio
+    async def test_failed_task_does_not_affect_others(self):
+        engine = FakeEngine()
+
+        async def ok(session):
+            return session.bind
+
+        async def bad(session):
+            raise ValueError("boom")
+
+        results = await QueryFanOut(bind=engine, max_connections=4).run({"ok": ok, "bad": bad})
+
+        assert isinstance(results["ok"], FakeConnection)
+        assert isinstance(results["bad"], ValueError)
+        assert set(results) == {"ok", "bad"}
+
+    @pytest.mark.asyncio
+    async def test_sessions_and_connections_are_closed(self):
+        engine = FakeEngine()
+
+        async def bad(session):
+            raise ValueError("boom")
+
+        async def ok(session):
+            return 1
+
+        await QueryFanOut(bind=engine, max_connections=4).run({"bad": bad, "ok": ok})
+
+        assert len(FakeSession.sessions) == 2
+        assert all(session.closed for session in FakeSession.sessions)
+        # Две рабочие и одна ведущая транзакция со снимком
+        assert len(engine.connections) == 3
+        assert all(connection.closed for connection in engine.connections)
+
+    @pytest.mark.asyncio
+    async def test_each_task_gets_own_connection_in_shared_snapshot(self):
+        engine = FakeEngine()
+
+        async def task(session):
+            return session.bind
+
+        results = await QueryFanOut(bind=engine, max_connections=4).run({"a": task, "b": task})
+
+        assert results["a"] is not results["b"]
+        for connection in workers(engine):
+            assert connection.statements[0] == f"SET TRANSACTION SNAPSHOT '{SNAPSHOT_ID}'"
+            assert connection.options == {"isolation_level": "REPEATABLE READ", "postgresql_readonly": True}
+
+    @pytest.mark.asyncio
+    async def test_runs_without_snapshot_when_export_fails(self):
+        engine = FakeEngine(export_error=RuntimeError("not supported on replica"))
+
+        async def task(session):
+            return 1
+
+        results = await QueryFanOut(bind=engine, max_connections=4).run({"a": task, "b": task})
+
+        assert results == {"a": 1, "b": 1}
+        assert all(connection.closed for connection in engine.connections)
+        for connection in workers(engine):
+            assert not any("SNAPSHOT" in statement for statement in connection.statements)
+
+    @pytest.mark.asyncio
+    async def test_concurrency_is_bounded(self):
+        engine = FakeEngine()
+        active, peak = 0, 0
+
+        async def task(session):
+            nonlocal active, peak
+            active += 1
+            peak = max(peak, active)
+            await asyncio.sleep(0.01)
+            active -= 1
+
+        await QueryFanOut(bind=engine, max_connections=2).run({str(i): task for i in range(6)})
+
+        assert peak == 2
@@ -0,0 +1,101 @@
+"""
+Unit tests for redeeming invite codes through the referral API
+"""
+import pytest
+import sys
+import os
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'backend'))
+
+from fastapi import HTTPException
+
+from app.api.v1 import referral
+
+
+class FakeResult:
+    def __init__(self, value):
+        self.value = value
+
+    def scalar_one_or_none(self):
+        return self.value
+
+
+class FakeSession:
+    """Сессия, возвращающая пригласившего на любой SELECT"""
+
+    def __init__(self, inviter):
+        self.inviter = inviter
+        self.commits = 0
+
+    async def execute(self, query):
+        return FakeResult(self.inviter)
+
+    async def commit(self):
+        self.commits += 1
+
+
+class FakeClosure:
+    links = []
+    result = True
+
+    def __init__(self, session):
+        self.session = session
+
+    async def link(self, inviter_id, invited_id):
+        FakeClosure.links.append((self.session, inviter_id, invited_id))
+        return FakeClosure.result
+
+
+class FakePointsManager:
+    def __init__(self, session):
+        pass
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def add_points(self, **kwargs):
+        return None
+
+
+@pytest.fixture
+def fakes(monkeypatch):
+    FakeClosure.links = []
+    FakeClosure.result = True
+    monkeypatch.setattr(referral, "ReferralClosureService", FakeClosure)
+    monkeypatch.setattr(referral, "PointsManager", FakePointsManager)
+    inviter = SimpleNamespace(id=1, invites_count=0)
+    user = SimpleNamespace(id=2, invited_by_code=None)
+    return FakeSession(inviter), inviter, user
+
+
+class TestUseInviteCode:
+    """Tests for keeping the referral closure in sync with redeemed codes"""
+
+    @pytest.mark.asyncio
+    async def test_links_user_under_inviter_in_same_transaction(self, fakes):
+        session, inviter, user = fakes
+
+        response = await referral.use_invite_code("CODE", session=session, current_user=user)
+
+        assert response["status"] == "success"
+        assert FakeClosure.links == [(session, 1, 2)]
+        assert user.invited_by_code == "CODE"
+        assert inviter.invites_count == 1
+        assert session.commits == 1
+
+    @pytest.mark.asyncio
+    async def test_cycle_is_rejected(self, fakes):
+        session, inviter, user = fakes
+        FakeClosure.result = False
+
+        with pytest.raises(HTTPException) as error:
+            await referral.use_invite_code("CODE", session=session, current_user=user)
+
+        assert error.value.status_code == 400
+        assert user.invited_by_code is None
+        assert inviter.invites_count == 0
+        assert session.commits == 0
@@ -0,0 +1,134 @@
+"""
+Accuracy tests for analytics sketches against exact counts and quantiles
+"""
+import pytest
+import sys
+import os
+import random
+from datetime import date
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import OperationalError
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'backend'))
+
+from app.services.analytics.rollups import RollupResult
+from app.services.analytics.sketches import DDSketch, HyperLogLog
+
+QUANTILES = (0.5, 0.9, 0.95, 0.99)
+
+
+def exact_quantile(sorted_values, q):
+    return sorted_values[int(q * (len(sorted_values) - 1))]
+
+
+class TestHyperLogLogAccuracy:
+    """Distinct counts vs exact set sizes"""
+
+    @pytest.mark.parametrize("size", [10, 1_000, 50_000])
+    def test_single_sketch(self, size):
+        # Стандартная ошибка при precision=11 около 2.3%, допускаем 3 сигмы
+        assert HyperLogLog().update(range(size)).count() == pytest.approx(size, rel=0.07)
+
+    def test_rolling_windows_from_hourly_sketches(self):
+        """DAU/WAU/MAU из почасовых скетчей совпадают с точными значениями"""
+        rng = random.Random(7)
+        hours = [
+            {rng.randrange(20_000) for _ in range(rng.randrange(50, 400))}
+            for _ in range(30 * 24)
+        ]
+        sketches = [HyperLogLog().update(users) for users in hours]
+
+        for days in (1, 7, 30):
+            window = slice(len(hours) - days * 24, None)
+            exact = len(set().union(*hours[window]))
+            estimate = HyperLogLog.merge_all(sketches[window]).count()
+            assert estimate == pytest.approx(exact, rel=0.07)
+
+    def test_serialization_round_trip(self):
+        sketch = HyperLogLog().update(range(5_000))
+        assert HyperLogLog.from_bytes(sketch.to_bytes()).count() == sketch.count()
+
+
+class TestDDSketchAccuracy:
+    """Quantiles vs exact sorted values"""
+
+    @pytest.mark.parametrize("distribution", ["lognormal", "uniform", "exponential"])
+    def test_relative_error_bound(self, distribution):
+        rng = random.Random(11)
+        generators = {
+            "lognormal": lambda: rng.lognormvariate(1.0, 1.0),
+            "uniform": lambda: rng.uniform(0.5, 60.0),
+            "exponential": lambda: rng.expovariate(0.2),
+        }
+        values = [generators[distribution]() for _ in range(50_000)]
+        sketch = DDSketch(relative_accuracy=0.01).update(values)
+        ordered = sorted(values)
+
+        for q in QUANTILES:
+            exact = exact_quantile(ordered, q)
+            assert sketch.quantile(q) == pytest.approx(exact, rel=0.011)
+        assert sketch.count == len(values)
+        assert sketch.mean == pytest.approx(sum(values) / len(values))
+
+    def test_merged_hourly_sketches_match_whole(self):
+        rng = random.Random(3)
+        hours = [[rng.lognormvariate(0.5, 0.8) for _ in range(500)] for _ in range(48)]
+        merged = DDSketch.merge_all(
+            DDSketch.from_bytes(DDSketch().update(values).to_bytes()) for values in hours
+        )
+        whole = DDSketch().update(value for values in hours for value in values)
+
+        assert merged.bins == whole.bins
+        assert merged.quantiles(QUANTILES) == whole.quantiles(QUANTILES)
+
+    def test_zero_values_and_empty(self):
+        assert DDSketch().quantile(0.5) is None
+        sketch = DDSketch().update([0.0] * 90 + [10.0] * 10)
+        assert sketch.quantile(0.5) == 0.0
+        assert sketch.quantile(0.99) == pytest.approx(10.0, rel=0.01)
+
+    def test_collapse_keeps_upper_quantiles(self):
+        values = [10 ** (i / 1000) for i in range(-6000, 3000)]
+        sketch = DDSketch(max_bins=256).update(values)
+        assert len(sketch.bins) <= 256
+        assert sketch.quantile(0.99) == pytest.approx(exact_quantile(sorted(values), 0.99), rel=0.011)
+
+    def test_sql_bin_formula_matches_python(self):
+        """CEIL(LN(v) / log_gamma) в SQL дает те же корзины, что и add()"""
+        sketch = DDSketch()
+        # Значения по обе стороны границ корзин gamma^k
+        values = [0.013, 0.5, 1.0, 2.75, 31.4, 600.0]
+        values += [sketch.gamma ** k * factor for k in (-40, 7, 300) for factor in (0.9999, 1.0001)]
+        engine = create_engine("sqlite://")
+        with engine.connect() as conn:
+            try:
+                for value in values:
+                    sql_key = conn.execute(
+                        text("SELECT CAST(CEIL(LN(:value) / :log_gamma) AS INTEGER)"),
+                        {"value": value, "log_gamma": sketch.log_gamma}
+                    ).scalar()
+                    assert sql_key == sketch.key(value)
+            except OperationalError:
+                pytest.skip("SQLite built without math functions")
+
+    def test_add_bucket(self):
+        sketch = DDSketch()
+        sketch.add_bucket(sketch.key(5.0), 3, 15.0, 5.0, 5.0)
+        sketch.add_bucket(None, 1)
+        assert sketch.count == 4
+        assert sketch.quantile(1.0) == pytest.approx(5.0, rel=0.01)
+
+
+class TestRollupQuantiles:
+    """Tests for quantiles assembled from rollup groups"""
+
+    def test_quantiles_by_category(self):
+        result = RollupResult("generation_metrics")
+        day = date(2024, 5, 6)
+        result.add(day, "game", "none", (3, 3, 6.0, 6.0), [0] * 24, value_sketch=DDSketch().update([1.0, 2.0, 3.0]))
+        result.add(day, "exercise", "none", (1, 1, 40.0, 40.0), [0] * 24, value_sketch=DDSketch().update([40.0]))
+
+        assert result.quantiles((0.5,), categories=["game"])[0.5] == pytest.approx(2.0, rel=0.01)
+        assert result.quantiles((1.0,))[1.0] == pytest.approx(40.0, rel=0.01)
+        assert result.value_sketch(categories=["lesson_plan"]).is_empty()
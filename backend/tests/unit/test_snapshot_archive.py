@@ -0,0 +1,78 @@
+"""
+Unit tests for the columnar analytics snapshot archive
+"""
+import pytest
+import sys
+import os
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'backend'))
+
+from app.services.analytics.snapshot_archive import SnapshotArchive, flatten_snapshot, month_key
+
+START = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+
+def snapshot(moment: datetime, n: int, **extra):
+    return {
+        "date": moment,
+        "total_users": 1000 + n,
+        "average_user_balance": n / 2,
+        "generations_by_type": {"game": n * 2, "exercise": n},
+        "tariff_distribution": {},
+        **extra
+    }
+
+
+def build_archive(path, hours: int):
+    archive = SnapshotArchive(str(path))
+    by_month = {}
+    for n in range(hours):
+        moment = START + timedelta(hours=n)
+        by_month.setdefault(month_key(moment), []).append(flatten_snapshot(snapshot(moment, n)))
+    for month, rows in by_month.items():
+        archive.write_month(month, rows)
+    return archive
+
+
+class TestSnapshotArchive:
+    """Tests for partitioned columnar reads"""
+
+    def test_range_read_across_months(self, tmp_path):
+        archive = build_archive(tmp_path, 24 * 90)
+        assert archive.months() == ["2024-01", "2024-02", "2024-03"]
+
+        start, end = START + timedelta(days=20), START + timedelta(days=50)
+        result = archive.read(["total_users", "generations_by_type.game"], start, end)
+
+        assert len(result["ts"]) == 30 * 24
+        assert result["ts"][0] == start
+        assert result["ts"][-1] == end - timedelta(hours=1)
+        assert result["total_users"][0] == 1000 + 20 * 24
+        assert result["generations_by_type.game"][-1] == (50 * 24 - 1) * 2.0
+
+    def test_missing_column_reads_as_zeros(self, tmp_path):
+        archive = build_archive(tmp_path, 48)
+        result = archive.read(["generations_by_type.course"], START, START + timedelta(days=1))
+        assert result["generations_by_type.course"] == [0] * 24
+
+    def test_merge_replaces_same_timestamp(self, tmp_path):
+        archive = build_archive(tmp_path, 24)
+        archive.merge_month("2024-01", [
+            flatten_snapshot(snapshot(START, 0, total_users=5)),
+            flatten_snapshot(snapshot(START + timedelta(days=2), 0)),
+        ])
+        rows = archive.read_month("2024-01")
+        assert len(rows) == 25
+        assert rows[0]["total_users"] == 5
+        assert "generations_by_type.game" in archive.columns()
+
+    def test_drop_months_before(self, tmp_path):
+        archive = build_archive(tmp_path, 24 * 90)
+        assert archive.drop_months_before("2024-03") == ["2024-01", "2024-02"]
+        assert archive.months() == ["2024-03"]
+        assert archive.drop_months_before("2024-03") == []
+        assert not [path for path in tmp_path.iterdir() if path.name.startswith(".")]
+
+        result = archive.read(["total_users"], START, START + timedelta(days=90))
+        assert result["ts"][0] == datetime(2024, 3, 1, tzinfo=timezone.utc)
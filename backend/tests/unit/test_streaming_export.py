@@ -0,0 +1,73 @@
+"""
+Unit tests for streaming CSV/JSON/XLSX export writers
+"""
+import pytest
+import sys
+import os
+import json
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'backend'))
+
+from openpyxl import load_workbook
+
+from app.services.export.streaming import (
+    ExportColumn,
+    XlsxStreamWriter,
+    stream_csv,
+    stream_json
+)
+
+COLUMNS = [ExportColumn("id", "ID"), ExportColumn("text", "Текст"), ExportColumn("created_at", "Дата")]
+CREATED_AT = datetime(2024, 5, 2, 13, 45, tzinfo=timezone.utc)
+
+
+async def _batches(count: int, size: int):
+    for start in range(0, count, size):
+        yield [
+            {"id": i, "text": f"row {i}", "created_at": CREATED_AT}
+            for i in range(start, min(start + size, count))
+        ]
+
+
+async def _collect(stream) -> bytes:
+    return b"".join([chunk async for chunk in stream])
+
+
+class TestTextWriters:
+    """Tests for CSV and JSON streams"""
+
+    @pytest.mark.asyncio
+    async def test_csv(self):
+        data = (await _collect(stream_csv(_batches(5, 2), COLUMNS))).decode("utf-8")
+        lines = data.lstrip("\ufeff").splitlines()
+        assert lines[0] == "ID,Текст,Дата"
+        assert len(lines) == 6
+        assert lines[1] == f"0,row 0,{CREATED_AT.isoformat()}"
+
+    @pytest.mark.asyncio
+    async def test_json_is_valid_array(self):
+        data = json.loads(await _collect(stream_json(_batches(5, 2), COLUMNS)))
+        assert [item["id"] for item in data] == [0, 1, 2, 3, 4]
+
+    @pytest.mark.asyncio
+    async def test_json_empty(self):
+        assert json.loads(await _collect(stream_json(_batches(0, 2), COLUMNS))) == []
+
+
+class TestXlsxStreamWriter:
+    """Tests for the write-only XLSX writer"""
+
+    def test_sheet_rollover_and_cleanup(self, tmp_path):
+        writer = XlsxStreamWriter(COLUMNS, "Data", max_rows_per_sheet=3)
+        writer.append_rows([{"id": i, "text": "a\x01b", "created_at": CREATED_AT} for i in range(5)])
+        path = tmp_path / "export.xlsx"
+        writer.save(str(path))
+
+        workbook = load_workbook(path, read_only=True)
+        assert workbook.sheetnames == ["Data", "Data (2)", "Data (3)"]
+        rows = list(workbook["Data"].iter_rows(values_only=True))
+        assert rows[0] == ("ID", "Текст", "Дата")
+        # Управляющие символы удаляются, дата пишется в UTC без tzinfo
+        assert rows[1] == (0, "ab", CREATED_AT.replace(tzinfo=None))
+        assert writer.rows_written == 5
@@ -0,0 +1,146 @@
+"""
+Unit tests for the long-text map-reduce pipeline
+"""
+import pytest
+import sys
+import os
+import asyncio
+import random
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'backend'))
+
+from app.core.exceptions import GenerationError
+from app.services.content.text_pipeline import TextPipeline, estimate_tokens, split_text
+
+WORDS = ["the", "teacher", "reads", "a", "long", "story", "about", "river", "city", "students", "learn", "new", "words"]
+
+
+def make_text(sentences, seed=3):
+    rng = random.Random(seed)
+    paragraphs = []
+    for _ in range(sentences // 8):
+        paragraphs.append(" ".join(
+            " ".join(rng.choices(WORDS, k=rng.randint(6, 16))).capitalize() + "." for _ in range(8)
+        ))
+    return "\n\n".join(paragraphs)
+
+
+class FakeCache:
+    """Словарь вместо Redis"""
+
+    def __init__(self):
+        self.data = {}
+
+    async def get_cached_data(self, key):
+        return self.data.get(key)
+
+    async def cache_data(self, key, data, ttl=None):
+        self.data[key] = data
+        return True
+
+
+class FakeGenerator:
+    """Считает вызовы и одновременные запросы"""
+
+    def __init__(self, fail_on=None):
+        self.prompts = []
+        self.active = 0
+        self.max_active = 0
+        self.fail_on = fail_on
+
+    async def __call__(self, prompt):
+        self.prompts.append(prompt)
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        await asyncio.sleep(0.01)
+        self.active -= 1
+        if self.fail_on and self.fail_on in prompt:
+            return "Не удалось сгенерировать контент. Пожалуйста, попробуйте позже."
+        return f"summary of {len(prompt)} chars"
+
+
+class TestChunking:
+    """Tests for token-aware, content-defined chunking"""
+
+    def test_estimate_tokens(self):
+        assert estimate_tokens("a" * 400) == 101
+        assert estimate_tokens("б" * 250) == 101
+        assert estimate_tokens("字" * 100) == 101
+
+    def test_chunks_cover_text_within_limit(self):
+        text = make_text(400)
+        chunks = split_text(text, max_tokens=300, overlap_tokens=40)
+
+        assert len(chunks) > 5
+        assert "".join(chunk.text for chunk in chunks) == text
+        assert all(chunk.tokens <= 300 for chunk in chunks)
+        assert chunks[0].context == ""
+        assert all(chunk.context and chunks[i].text.endswith(chunk.context) for i, chunk in enumerate(chunks[1:]))
+
+    def test_long_sentence_without_spaces_is_cut(self):
+        chunks = split_text("字" * 1000, max_tokens=300)
+        assert [len(chunk.text) for chunk in chunks] == [300, 300, 300, 100]
+
+    def test_edit_changes_only_nearby_chunks(self):
+        text = make_text(800)
+        sentences = text.split(". ")
+        middle = len(sentences) // 2
+        sentences[middle] = sentences[middle] + " and a few extra words"
+        edited = ". ".join(sentences)
+
+        before = {chunk.text for chunk in split_text(text, max_tokens=300)}
+        after = [chunk.text for chunk in split_text(edited, max_tokens=300)]
+
+        assert len(after) > 8
+        assert len([chunk for chunk in after if chunk not in before]) <= 2
+
+
+class TestTextPipeline:
+    """Tests for map-reduce, bounded concurrency and per-chunk caching"""
+
+    @pytest.mark.asyncio
+    async def test_map_reduce_with_bounded_concurrency(self):
+        generate = FakeGenerator()
+        pipeline = TextPipeline(generate, cache=FakeCache(), max_chunk_tokens=300, overlap_tokens=40, concurrency=3)
+        text = make_text(400)
+
+        result = await pipeline.map_reduce(text, lambda chunk: f"MAP {chunk.with_context}", lambda parts: f"REDUCE {parts}")
+
+        assert result.startswith("summary of")
+        assert generate.max_active == 3
+        assert pipeline.stats["llm_calls"] == pipeline.stats["chunks"] + 1
+        assert generate.prompts[-1].startswith("REDUCE")
+
+    @pytest.mark.asyncio
+    async def test_edit_reruns_only_changed_chunks(self):
+        cache = FakeCache()
+        text = make_text(800)
+        first = TextPipeline(FakeGenerator(), cache=cache, max_chunk_tokens=300, overlap_tokens=40)
+        await first.map_reduce(text, lambda chunk: f"MAP {chunk.with_context}", lambda parts: f"REDUCE {parts}")
+
+        edited = text.replace("students", "pupils", 1)
+        generate = FakeGenerator()
+        second = TextPipeline(generate, cache=cache, max_chunk_tokens=300, overlap_tokens=40)
+        await second.map_reduce(edited, lambda chunk: f"MAP {chunk.with_context}", lambda parts: f"REDUCE {parts}")
+
+        map_calls = [prompt for prompt in generate.prompts if prompt.startswith("MAP")]
+        assert 1 <= len(map_calls) <= 2
+        assert second.stats["cached"] >= second.stats["chunks"] - 2
+
+    @pytest.mark.asyncio
+    async def test_failed_chunk_raises_and_is_not_cached(self):
+        cache = FakeCache()
+        pipeline = TextPipeline(FakeGenerator(fail_on="MAP"), cache=cache, max_chunk_tokens=300)
+
+        with pytest.raises(GenerationError):
+            await pipeline.map_reduce(make_text(400), lambda chunk: f"MAP {chunk.text}", lambda parts: parts)
+        assert cache.data == {}
+
+    @pytest.mark.asyncio
+    async def test_reduce_groups_parts_that_do_not_fit(self):
+        generate = FakeGenerator()
+        pipeline = TextPipeline(generate, max_chunk_tokens=100)
+
+        await pipeline.reduce(["x" * 150] * 6, lambda parts: f"REDUCE {parts}")
+
+        assert len(generate.prompts) == 4
@@ -0,0 +1,165 @@
+"""
+Unit tests for the token budget estimator and TPM accounting
+"""
+import pytest
+import sys
+import os
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'backend'))
+
+from app.core.constants import ContentType
+from app.services.content.token_budget import MIN_OUTPUT_TOKENS, TokenBudget, TokenPlan
+from app.utils.gemini_rate_limiter import GeminiRateLimiter
+from app.utils.tokenizer import count_tokens, estimate_tokens, model_family
+
+
+class FakeResult:
+
+    def __init__(self, rows):
+        self.rows = rows
+
+    def mappings(self):
+        return self
+
+    def all(self):
+        return self.rows
+
+
+class FakeSession:
+    """Сессия с заранее заданными строками профилей"""
+
+    def __init__(self, store):
+        self.store = store
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        return False
+
+    async def execute(self, statement, params=None):
+        self.store["queries"] += 1
+        return FakeResult(self.store["rows"])
+
+    def add(self, obj):
+        self.store["added"].append(obj)
+
+    async def commit(self):
+        pass
+
+
+def make_budget(rows, clock=lambda: 0.0):
+    store = {"rows": rows, "queries": 0, "added": []}
+    budget = TokenBudget(
+        session_factory=lambda: FakeSession(store),
+        percentile=0.9, headroom=1.25, lookback_days=14, min_samples=20, refresh_seconds=60, clock=clock
+    )
+    return budget, store
+
+
+def profile(kind, samples, predicted, truncated=0.0, content_type="LESSON_PLAN"):
+    return {"content_type": content_type, "request_kind": kind, "samples": samples,
+            "predicted": predicted, "truncated": truncated}
+
+
+class TestTokenizer:
+    """Tests for local token counting"""
+
+    def test_model_family(self):
+        assert model_family("gpt-4o-mini") == "o200k_base"
+        assert model_family("openai/gpt-4.1") == "o200k_base"
+        assert model_family("gemini-2.0-flash") == "cl100k_base"
+        assert model_family(None) == "cl100k_base"
+
+    def test_count_tokens(self):
+        assert count_tokens("") == 0
+        assert count_tokens(None) == 0
+        assert 0 < count_tokens("Составь план урока по теме Present Perfect") <= estimate_tokens("x" * 200)
+
+
+class TestTokenBudget:
+    """Tests for history-calibrated max_tokens"""
+
+    @pytest.mark.asyncio
+    async def test_uses_percentile_with_headroom_below_heuristic(self):
+        budget, _ = make_budget([profile("основной план", 200, 4000.0)])
+
+        plan = await budget.plan(ContentType.LESSON_PLAN, "Составь план урока", "основной план", 17000)
+
+        assert plan.predicted_tokens == 4000
+        assert plan.max_tokens == 5000
+        assert plan.prompt_tokens > 0
+        assert plan.total_tokens == plan.prompt_tokens + 5000
+
+    @pytest.mark.asyncio
+    async def test_falls_back_to_heuristic(self):
+        budget, _ = make_budget([
+            profile("основной план", 5, 4000.0),
+            profile("детализация плана", 200, 3000.0, truncated=0.2),
+            profile("одно упражнение", 200, 9000.0, content_type="EXERCISE"),
+            profile("основная игра", 200, 100.0, content_type="GAME"),
+        ])
+
+        few_samples = await budget.plan(ContentType.LESSON_PLAN, "p", "основной план", 17000)
+        truncated = await budget.plan(ContentType.LESSON_PLAN, "p", "детализация плана", 6000)
+        capped = await budget.plan(ContentType.EXERCISE, "p", "одно упражнение", 4000)
+        floor = await budget.plan(ContentType.GAME, "p", "основная игра", 10000)
+        unknown = await budget.plan(ContentType.COURSE, "p", "генерация курса", 19000)
+
+        assert (few_samples.max_tokens, few_samples.predicted_tokens) == (17000, None)
+        assert (truncated.max_tokens, truncated.predicted_tokens) == (6000, None)
+        assert capped.max_tokens == 4000
+        assert floor.max_tokens == MIN_OUTPUT_TOKENS
+        assert unknown.max_tokens == 19000
+
+    @pytest.mark.asyncio
+    async def test_profiles_are_refreshed_periodically(self):
+        now = [0.0]
+        budget, store = make_budget([], clock=lambda: now[0])
+
+        for _ in range(5):
+            await budget.plan(ContentType.GAME, "p", "основная игра", 10000)
+        assert store["queries"] == 1
+
+        now[0] = 61
+        store["rows"] = [profile("основная игра", 100, 2000.0, content_type="GAME")]
+        plan = await budget.plan(ContentType.GAME, "p", "основная игра", 10000)
+        assert store["queries"] == 2
+        assert plan.max_tokens == 2500
+
+    @pytest.mark.asyncio
+    async def test_record_stores_prediction_and_actual(self):
+        budget, store = make_budget([])
+        plan = TokenPlan(ContentType.GAME, "основная игра", prompt_tokens=120, max_tokens=2500, predicted_tokens=2000)
+
+        await budget.record(7, plan, "prompt " * 200, "word " * 400, 1.5)
+        await budget.record(0, plan, "prompt", "word", 1.0)
+
+        assert len(store["added"]) == 1
+        metrics = store["added"][0]
+        assert metrics.tokens_used == count_tokens("word " * 400)
+        assert (metrics.prompt_tokens, metrics.predicted_tokens, metrics.max_tokens) == (120, 2000, 2500)
+        assert metrics.request_kind == "основная игра"
+        assert len(metrics.prompt) == 500
+
+
+class TestGeminiTokensPerMinute:
+    """Tests for TPM accounting in the Gemini rate limiter"""
+
+    def test_key_rotates_when_tokens_do_not_fit(self, monkeypatch):
+        monkeypatch.setenv("GEMINI_API_KEY", "key-one")
+        monkeypatch.setenv("GEMINI_EXTRA_API_KEYS", "key-two")
+        monkeypatch.setenv("ENABLE_KEY_ROTATION", "true")
+        monkeypatch.setenv("USE_RATE_LIMITER", "false")
+        limiter = GeminiRateLimiter()
+        limiter.enabled = True
+
+        limiter.record_usage("key-one", "gemini-2.0-flash", tokens=50000)
+
+        assert limiter.is_key_available("key-one", "gemini-2.0-flash", tokens=5000)
+        assert not limiter.is_key_available("key-one", "gemini-2.0-flash", tokens=20000)
+        assert limiter.get_available_key_and_model(tokens=20000) == ("key-one", "gemini-1.5-flash")
+
+        limiter.record_usage("key-one", "gemini-1.5-flash", tokens=50000)
+        limiter.record_usage("key-one", "gemini-1.5-pro", tokens=15000)
+        assert limiter.get_available_key_and_model(tokens=20000) == ("key-two", "gemini-2.0-flash")
@@ -0,0 +1,143 @@
+"""
+Unit tests for failure isolation, spill replay and shutdown of the tracking event bus
+"""
+import asyncio
+import json
+import pytest
+import sys
+import os
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'backend'))
+
+from sqlalchemy.exc import IntegrityError, OperationalError
+
+from app.models import UsageLog
+from app.services.tracking.event_bus import DEAD_LETTER_DIR, EVENT_ROW, TrackingEventBus
+
+
+def event(action):
+    return {"kind": EVENT_ROW, "table": UsageLog.__tablename__, "row": {"user_id": 1, "action_type": action}}
+
+
+class FakeDatabase:
+    """Подменяет запись пачки: строки "bad" нарушают ограничение, down - БД недоступна"""
+
+    def __init__(self):
+        self.written = []
+        self.down = False
+        self.writes = 0
+
+    async def write_batch(self, batch):
+        self.writes += 1
+        if self.down:
+            raise OperationalError("INSERT", {}, ConnectionRefusedError("connection refused"))
+        if any(e["row"]["action_type"] == "bad" for e in batch):
+            raise IntegrityError("INSERT", {}, Exception("violates check constraint"))
+        self.written.extend(e["row"]["action_type"] for e in batch)
+        return set()
+
+
+def make_bus(tmp_path, batch_size=4):
+    bus = TrackingEventBus(session_factory=object, maxsize=100, batch_size=batch_size,
+                           flush_interval=0.01, enqueue_timeout=0.01, spill_dir=str(tmp_path))
+    database = FakeDatabase()
+    bus._write_batch = database.write_batch
+    bus._flush_lock = asyncio.Lock()
+    return bus, database
+
+
+def read_dir(directory):
+    events = []
+    for path in sorted(directory.glob("tracking-*.jsonl")):
+        events += [json.loads(line) for line in path.read_text().splitlines()]
+    return events
+
+
+class TestFailureIsolation:
+    """Tests for splitting batches that fail because of their data"""
+
+    @pytest.mark.asyncio
+    async def test_bad_row_is_dead_lettered_and_rest_written(self, tmp_path):
+        bus, database = make_bus(tmp_path, batch_size=8)
+        batch = [event(f"ok{i}") for i in range(7)]
+        batch.insert(5, event("bad"))
+
+        assert await bus._flush_batch(batch) is True
+
+        assert database.written == [f"ok{i}" for i in range(7)]
+        dead = read_dir(tmp_path / DEAD_LETTER_DIR)
+        assert [e["row"]["action_type"] for e in dead] == ["bad"]
+        assert "check constraint" in dead[0]["error"]
+        assert read_dir(tmp_path) == []
+        assert bus.stats["dead_lettered"] == 1
+
+    @pytest.mark.asyncio
+    async def test_unavailable_database_spills_whole_batch(self, tmp_path):
+        bus, database = make_bus(tmp_path)
+        database.down = True
+
+        assert await bus._flush_batch([event("a"), event("b")]) is False
+
+        assert database.writes == 1
+        assert [e["row"]["action_type"] for e in read_dir(tmp_path)] == ["a", "b"]
+
+
+class TestSpillReplay:
+    """Tests for draining spill files"""
+
+    @pytest.mark.asyncio
+    async def test_poisoned_spill_file_does_not_block_replay(self, tmp_path):
+        bus, database = make_bus(tmp_path)
+        bus._write_spill_file([event("a"), event("bad"), event("b")])
+        bus._write_spill_file([event("c")])
+
+        assert await bus.replay_spill() == 4
+
+        assert database.written == ["a", "b", "c"]
+        assert read_dir(tmp_path) == []
+        assert len(read_dir(tmp_path / DEAD_LETTER_DIR)) == 1
+
+    @pytest.mark.asyncio
+    async def test_replay_is_bounded_and_keeps_remainder(self, tmp_path):
+        bus, database = make_bus(tmp_path, batch_size=2)
+        bus._write_spill_file([event(f"e{i}") for i in range(5)])
+
+        assert await bus.replay_spill(max_events=2) == 2
+        assert database.written == ["e0", "e1"]
+        assert bus._spill_pending is True
+        assert [e["row"]["action_type"] for e in read_dir(tmp_path)] == ["e2", "e3", "e4"]
+
+        database.down = True
+        assert await bus.replay_spill(max_events=2) == 0
+        assert bus._spill_pending is False
+        assert len(read_dir(tmp_path)) == 3
+
+    @pytest.mark.asyncio
+    async def test_flusher_replays_spill_under_steady_load(self, tmp_path):
+        bus, database = make_bus(tmp_path, batch_size=2)
+        bus._write_spill_file([event(f"old{i}") for i in range(4)])
+        bus._spill_pending = True
+
+        for i in range(6):
+            await bus.publish(event(f"live{i}"))
+            await asyncio.sleep(0.005)
+        await bus.stop()
+
+        assert sorted(database.written) == sorted([f"old{i}" for i in range(4)] + [f"live{i}" for i in range(6)])
+        assert read_dir(tmp_path) == []
+
+
+class TestStop:
+    """Tests for draining the queue on shutdown"""
+
+    @pytest.mark.asyncio
+    async def test_stop_writes_queued_events(self, tmp_path):
+        bus, database = make_bus(tmp_path, batch_size=50)
+        bus.flush_interval = 5.0
+        for i in range(20):
+            await bus.publish(event(f"e{i}"))
+
+        await bus.stop()
+
+        assert sorted(database.written) == sorted(f"e{i}" for i in range(20))
+        assert bus._queue.empty()
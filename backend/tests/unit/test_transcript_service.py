@@ -0,0 +1,127 @@
+"""
+Unit tests for the shared transcript fetcher
+"""
+import pytest
+import sys
+import os
+import asyncio
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'backend'))
+
+from app.services.content.transcript_service import (
+    TranscriptService,
+    TranscriptSource,
+    TranscriptUnavailableError,
+    chunk_segments,
+    encode_segments,
+    extract_video_id,
+    iter_segments
+)
+
+VIDEO = "dQw4w9WgXcQ"
+BROKEN = "AAAAAAAAAAA"
+
+
+class FakeTranscriptSource(TranscriptSource):
+    """Локальный источник: блокирующая загрузка с задержкой и счетчик вызовов"""
+
+    def __init__(self, transcripts, delay=0.05):
+        self.transcripts = transcripts
+        self.delay = delay
+        self.calls = []
+        self.threads = set()
+
+    def fetch(self, video_id, language):
+        self.calls.append((video_id, language))
+        self.threads.add(threading.get_ident())
+        time.sleep(self.delay)
+        if (video_id, language) not in self.transcripts:
+            raise LookupError("No transcripts were found")
+        return self.transcripts[(video_id, language)]
+
+
+def make_service(source, clock=time.monotonic):
+    return TranscriptService(session_factory=None, source=source, workers=2, failure_ttl=60, clock=clock)
+
+
+def segments(count):
+    return [{"text": f"segment number {i}", "start": i * 2.5, "duration": 2.5} for i in range(count)]
+
+
+class TestEncoding:
+    """Tests for compressed storage and chunking"""
+
+    def test_round_trip(self):
+        blob = encode_segments([{"text": "hello\nworld", "start": 1.0}, {"text": "  ", "start": 2.0}] + segments(50000))
+        decoded = list(iter_segments(blob))
+
+        assert decoded[0] == (1.0, "hello world")
+        assert len(decoded) == 50001
+        assert decoded[-1] == (49999 * 2.5, "segment number 49999")
+
+    def test_chunks_respect_limit_and_boundaries(self):
+        segment = "word " * 9 + "end"
+        chunks = list(chunk_segments([(float(i), segment) for i in range(100)] + [(100.0, "x" * 250)], 100))
+
+        assert all(len(chunk.text) <= 100 for chunk in chunks)
+        assert [chunk.index for chunk in chunks] == list(range(len(chunks)))
+        assert chunks[0].text == f"{segment} {segment}"
+        assert (chunks[0].start, chunks[0].end) == (0.0, 1.0)
+        assert "".join(chunk.text for chunk in chunks[-3:]) == "x" * 250
+
+    def test_extract_video_id(self):
+        assert extract_video_id(VIDEO) == VIDEO
+        assert extract_video_id(f"https://www.youtube.com/watch?v={VIDEO}&t=10") == VIDEO
+        assert extract_video_id(f"https://youtu.be/{VIDEO}") == VIDEO
+        assert extract_video_id("not a video") is None
+
+
+class TestTranscriptService:
+    """Tests for shared fetches and negative caching"""
+
+    @pytest.mark.asyncio
+    async def test_concurrent_requests_share_one_fetch(self):
+        source = FakeTranscriptSource({(VIDEO, "en"): segments(10)})
+        service = make_service(source)
+        try:
+            results = await asyncio.gather(*(service.get_transcript(VIDEO, "en") for _ in range(20)))
+        finally:
+            service.shutdown()
+
+        assert len(source.calls) == 1
+        assert threading.get_ident() not in source.threads
+        assert set(results) == {" ".join(f"segment number {i}" for i in range(10))}
+        assert service.stats["shared"] == 19
+
+    @pytest.mark.asyncio
+    async def test_failures_are_cached_briefly(self):
+        now = [0.0]
+        source = FakeTranscriptSource({}, delay=0)
+        service = make_service(source, clock=lambda: now[0])
+        try:
+            for _ in range(3):
+                with pytest.raises(TranscriptUnavailableError):
+                    await service.get_transcript(BROKEN, "en")
+            assert len(source.calls) == 1
+
+            now[0] = 61
+            with pytest.raises(TranscriptUnavailableError):
+                await service.get_transcript(BROKEN, "en")
+            assert len(source.calls) == 2
+        finally:
+            service.shutdown()
+
+    @pytest.mark.asyncio
+    async def test_iter_chunks(self):
+        source = FakeTranscriptSource({(VIDEO, "ru"): segments(1000)}, delay=0)
+        service = make_service(source)
+        try:
+            chunks = [chunk async for chunk in service.iter_chunks(f"https://youtu.be/{VIDEO}", "ru", max_chars=500)]
+        finally:
+            service.shutdown()
+
+        assert len(chunks) > 1
+        assert all(len(chunk.text) <= 500 for chunk in chunks)
+        assert " ".join(chunk.text for chunk in chunks) == " ".join(f"segment number {i}" for i in range(1000))